@@ -0,0 +1,47 @@
+"""
+Backfill денних фактів аналітики (analytics_daily_*, services/analytics_facts)
+
+    python backfill_analytics_facts.py                       # вся історія до вчора
+    python backfill_analytics_facts.py --start 2025-01-01    # з дати до вчора
+    python backfill_analytics_facts.py --start 2025-01-01 --end 2025-07-01
+    python backfill_analytics_facts.py --recheck 30          # лише останні 30 днів (для cron)
+
+Перебудова йде порціями по місяцю з commit після кожної.
+"""
+import argparse
+from datetime import datetime
+
+from database_rentalhub import get_rh_db_sync
+from services.analytics_facts import backfill, ensure_fact_tables, recheck_recent
+
+
+def parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill analytics_daily_* fact tables")
+    parser.add_argument("--start", type=parse_day, help="перший день (YYYY-MM-DD), за замовчуванням - початок історії")
+    parser.add_argument("--end", type=parse_day, help="день після останнього (YYYY-MM-DD), за замовчуванням - сьогодні")
+    parser.add_argument("--recheck", type=int, metavar="DAYS", help="перерахувати лише останні DAYS днів")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    db = get_rh_db_sync()
+    try:
+        ensure_fact_tables(db)
+        if args.recheck:
+            written = recheck_recent(db, days=args.recheck)
+        else:
+            written = backfill(db, args.start, args.end, log=lambda msg: print(f"  {msg}"))
+        print(f"✅ Analytics facts: {written} rows in {(datetime.now() - started).total_seconds():.1f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
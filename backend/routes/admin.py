@@ -6,6 +6,8 @@ from fastapi import APIRouter, HTTPException, Depends, Header
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from database_rentalhub import get_rh_db
+from services.company_config import invalidate_everywhere as invalidate_settings_everywhere, settings_cache
+from services.template_loader import invalidate_template_cache
 from datetime import datetime
 import bcrypt
 import jwt
@@ -697,10 +699,18 @@ async def update_settings(
                 ON DUPLICATE KEY UPDATE setting_value = :v
             """), {"k": key, "v": str(value) if value else ""})
         rh_db.commit()
-        return {"success": True}
     except Exception as e:
         rh_db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
+    await invalidate_settings_everywhere()
+    return {"success": True}
+
+
+@router.get("/settings/cache")
+async def get_settings_cache_stats(authorization: str = Header(None)):
+    """Лічильники кешу налаштувань (hit rate)"""
+    require_admin(authorization)
+    return settings_cache.stats()
 
 
 # ============================================================
@@ -826,6 +836,7 @@ async def save_template(
         ON DUPLICATE KEY UPDATE template_content = :content, updated_by = :by
     """), {"dt": doc_type, "content": content, "by": user.get("email", "admin")})
     rh_db.commit()
+    invalidate_template_cache(doc_type)
     return {"success": True, "message": "Шаблон збережено"}
 
 
@@ -841,6 +852,7 @@ async def reset_template(
 
     rh_db.execute(text("DELETE FROM document_templates WHERE doc_type = :dt"), {"dt": doc_type})
     rh_db.commit()
+    invalidate_template_cache(doc_type)
 
     # Return file content
     file_path = TEMPLATE_FILE_MAP.get(doc_type)
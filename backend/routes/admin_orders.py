@@ -9,6 +9,7 @@ from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel
 from database_rentalhub import get_rh_db
+from services.finance_rollup import mark_dirty, mark_payment_dirty
 
 router = APIRouter(prefix="/api/admin/orders-management", tags=["admin-orders"])
 
@@ -233,6 +234,7 @@ async def add_payment(order_id: int, data: PaymentCreate, db: Session = Depends(
         VALUES (:ptype, :method, :amount, 'UAH', :occurred_at, :order_id, :tx_id, 'confirmed', :note, NOW())
     """), {"ptype": data.payment_type, "method": data.method, "amount": data.amount,
            "occurred_at": occurred, "order_id": order_id, "tx_id": tx_id, "note": data.note})
+    mark_dirty(db, occurred)
     db.commit()
     return {"ok": True, "tx_id": tx_id}
 
@@ -248,6 +250,7 @@ async def delete_payment(order_id: int, payment_id: int, db: Session = Depends(g
     if tx_id:
         db.execute(text("DELETE FROM fin_ledger_entries WHERE tx_id = :tx_id"), {"tx_id": tx_id})
         db.execute(text("DELETE FROM fin_transactions WHERE id = :tx_id"), {"tx_id": tx_id})
+    mark_payment_dirty(db, payment_id)
     db.execute(text("DELETE FROM fin_payments WHERE id = :pid"), {"pid": payment_id})
     db.commit()
     return {"ok": True}
@@ -286,6 +289,9 @@ async def update_payment(order_id: int, payment_id: int, data: PaymentUpdate, db
         tx_f.append("tx_type = :tx_type"); params["tx_type"] = tx_map.get(data.payment_type, "rent_payment")
     
     if fp_f:
+        # старий і (якщо змінено) новий день оплати
+        mark_payment_dirty(db, payment_id)
+        mark_dirty(db, data.occurred_at)
         db.execute(text(f"UPDATE fin_payments SET {', '.join(fp_f)} WHERE id = :pid"), params)
     if tx_f and row[0]:
         db.execute(text(f"UPDATE fin_transactions SET {', '.join(tx_f)} WHERE id = :tx_id"), params)
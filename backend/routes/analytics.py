@@ -6,6 +6,9 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from database_rentalhub import get_rh_db
+from utils.period_range import day_range
+from services.analytics_facts import COMPLETED_STATUSES, fact_source
+from services.export_engine import ExportSpec, build_spec, export_builder, start_export
 from datetime import datetime, timedelta
 import json
 
@@ -45,7 +48,7 @@ def get_date_range(period: str = "month"):
 # ================== ORDER DAMAGE FEE ==================
 
 @router.get("/order-damage-fee/{order_id}")
-async def get_order_damage_fee(
+def get_order_damage_fee(
     order_id: int,
     db: Session = Depends(get_rh_db)
 ):
@@ -110,79 +113,61 @@ async def get_order_damage_fee(
 # ================== OVERVIEW DASHBOARD ==================
 
 @router.get("/overview")
-async def get_overview(
+def get_overview(
     period: str = Query("month"),
     db: Session = Depends(get_rh_db)
 ):
-    """Головний дашборд - огляд всіх ключових метрик"""
+    """Головний дашборд - огляд всіх ключових метрик (з денних фактів, services/analytics_facts)"""
     start_date, end_date = get_date_range(period)
+    range_start, range_end = day_range(start_date, end_date)
     
     try:
-        revenue_result = db.execute(text("""
-            SELECT 
-                COALESCE(SUM(CASE WHEN status IN ('issued', 'on_rent', 'returned', 'closed') 
-                    THEN total_price ELSE 0 END), 0) as rent_revenue,
-                COUNT(CASE WHEN status IN ('issued', 'on_rent', 'returned', 'closed') THEN 1 END) as completed_orders,
-                COUNT(*) as total_orders
-            FROM orders 
-            WHERE DATE(created_at) BETWEEN :start AND :end
-        """), {"start": start_date, "end": end_date})
-        revenue = revenue_result.fetchone()
-        
-        damage_result = db.execute(text("""
-            SELECT COALESCE(SUM(fee), 0) as damage_revenue
-            FROM product_damage_history
-            WHERE DATE(created_at) BETWEEN :start AND :end
-        """), {"start": start_date, "end": end_date})
-        damage_rev = damage_result.fetchone()
-        
-        status_result = db.execute(text("""
-            SELECT status, COUNT(*) as cnt
-            FROM orders
-            WHERE DATE(created_at) BETWEEN :start AND :end
-            GROUP BY status
-        """), {"start": start_date, "end": end_date})
-        status_counts = {row[0]: row[1] for row in status_result}
-        
-        avg_result = db.execute(text("""
-            SELECT COALESCE(AVG(total_price), 0) as avg_rent
-            FROM orders 
-            WHERE status IN ('issued', 'on_rent', 'returned', 'closed')
-            AND DATE(created_at) BETWEEN :start AND :end
-        """), {"start": start_date, "end": end_date})
-        avg_data = avg_result.fetchone()
-        
-        avg_damage_result = db.execute(text("""
-            SELECT COALESCE(AVG(fee), 0) as avg_damage, COUNT(DISTINCT order_id) as damaged_orders
-            FROM product_damage_history
-            WHERE DATE(created_at) BETWEEN :start AND :end AND fee > 0
-        """), {"start": start_date, "end": end_date})
-        avg_damage = avg_damage_result.fetchone()
-        
-        daily_result = db.execute(text("""
-            SELECT DATE(created_at) as day, COALESCE(SUM(total_price), 0) as rent
-            FROM orders
-            WHERE DATE(created_at) BETWEEN :start AND :end
-            AND status IN ('issued', 'on_rent', 'returned', 'closed')
-            GROUP BY DATE(created_at)
-            ORDER BY day
-        """), {"start": start_date, "end": end_date})
-        daily_rent = [{"day": str(row[0]), "rent": float(row[1])} for row in daily_result]
-        
-        daily_damage_result = db.execute(text("""
-            SELECT DATE(created_at) as day, COALESCE(SUM(fee), 0) as damage
-            FROM product_damage_history
-            WHERE DATE(created_at) BETWEEN :start AND :end
-            GROUP BY DATE(created_at)
-            ORDER BY day
-        """), {"start": start_date, "end": end_date})
+        orders_src, params = fact_source(db, "orders", range_start, range_end)
+        damage_src, damage_params = fact_source(db, "damage", range_start, range_end)
+        params.update(damage_params)
+        
+        orders_result = db.execute(text(f"""
+            SELECT f.day, f.status, SUM(f.orders_cnt) as cnt, SUM(f.revenue) as revenue
+            FROM {orders_src} f
+            GROUP BY f.day, f.status
+            ORDER BY f.day
+        """), params)
+        
+        status_counts = {}
+        daily_rent = {}
+        total_orders = completed_orders = 0
+        rent_revenue = 0.0
+        for day, status, cnt, revenue in orders_result:
+            cnt, revenue = int(cnt or 0), float(revenue or 0)
+            status = status or None
+            status_counts[status] = status_counts.get(status, 0) + cnt
+            total_orders += cnt
+            if status in COMPLETED_STATUSES:
+                completed_orders += cnt
+                rent_revenue += revenue
+                daily_rent[str(day)] = daily_rent.get(str(day), 0) + revenue
+        
+        damage_totals = db.execute(text(f"""
+            SELECT COALESCE(SUM(f.fee), 0) as damage_revenue, COALESCE(SUM(f.paid_fee), 0) as paid_fee,
+                COALESCE(SUM(f.paid_cnt), 0) as paid_cnt,
+                COUNT(DISTINCT CASE WHEN f.paid_cnt > 0 THEN NULLIF(f.order_id, 0) END) as damaged_orders
+            FROM {damage_src} f
+        """), params).fetchone()
+        
+        daily_damage_result = db.execute(text(f"""
+            SELECT f.day, COALESCE(SUM(f.fee), 0) as damage
+            FROM {damage_src} f
+            GROUP BY f.day
+        """), params)
         daily_damage = {str(row[0]): float(row[1]) for row in daily_damage_result}
         
-        for item in daily_rent:
-            item["damage"] = daily_damage.get(item["day"], 0)
+        daily_chart = [
+            {"day": day, "rent": rent, "damage": daily_damage.get(day, 0)}
+            for day, rent in sorted(daily_rent.items())
+        ]
         
-        rent_revenue = float(revenue[0]) if revenue else 0
-        damage_revenue = float(damage_rev[0]) if damage_rev else 0
+        damage_revenue = float(damage_totals[0]) if damage_totals else 0
+        paid_cnt = int(damage_totals[2] or 0) if damage_totals else 0
         
         return {
             "period": {"start": str(start_date), "end": str(end_date)},
@@ -190,15 +175,15 @@ async def get_overview(
                 "total_revenue": rent_revenue + damage_revenue,
                 "rent_revenue": rent_revenue,
                 "damage_revenue": damage_revenue,
-                "total_orders": revenue[2] if revenue else 0,
-                "completed_orders": revenue[1] if revenue else 0,
-                "avg_rent_check": float(avg_data[0]) if avg_data else 0,
-                "avg_damage_check": float(avg_damage[0]) if avg_damage else 0,
-                "damaged_orders": avg_damage[1] if avg_damage else 0,
+                "total_orders": total_orders,
+                "completed_orders": completed_orders,
+                "avg_rent_check": rent_revenue / completed_orders if completed_orders else 0,
+                "avg_damage_check": float(damage_totals[1]) / paid_cnt if paid_cnt else 0,
+                "damaged_orders": damage_totals[3] if damage_totals else 0,
                 "damage_percent": round(damage_revenue / rent_revenue * 100, 1) if rent_revenue > 0 else 0
             },
             "orders_by_status": status_counts,
-            "daily_chart": daily_rent
+            "daily_chart": daily_chart
         }
         
     except Exception as e:
@@ -208,51 +193,54 @@ async def get_overview(
 # ================== ORDERS REPORT ==================
 
 @router.get("/orders")
-async def get_orders_report(
+def get_orders_report(
     period: str = Query("month"),
     group_by: str = Query("day"),
     db: Session = Depends(get_rh_db)
 ):
     """Звіт по замовленнях: виручка, кількість, середній чек"""
     start_date, end_date = get_date_range(period)
+    range_start, range_end = day_range(start_date, end_date)
     
     date_format = {"day": "%Y-%m-%d", "week": "%Y-%u", "month": "%Y-%m"}.get(group_by, "%Y-%m-%d")
     
     try:
-        result = db.execute(text("""
+        orders_src, params = fact_source(db, "orders", range_start, range_end)
+        result = db.execute(text(f"""
             SELECT 
-                DATE_FORMAT(created_at, :fmt) as period,
-                COUNT(*) as orders_count,
-                COALESCE(SUM(CASE WHEN status IN ('issued','on_rent','returned','closed') 
-                    THEN total_price ELSE 0 END), 0) as rent_revenue,
-                COALESCE(AVG(CASE WHEN status IN ('issued','on_rent','returned','closed') 
-                    THEN total_price END), 0) as avg_check
-            FROM orders
-            WHERE DATE(created_at) BETWEEN :start AND :end
-            GROUP BY DATE_FORMAT(created_at, :fmt)
+                DATE_FORMAT(f.day, :fmt) as period,
+                SUM(f.orders_cnt) as orders_count,
+                COALESCE(SUM(CASE WHEN f.status IN ('issued','on_rent','returned','closed') 
+                    THEN f.revenue ELSE 0 END), 0) as rent_revenue,
+                SUM(CASE WHEN f.status IN ('issued','on_rent','returned','closed') 
+                    THEN f.orders_cnt ELSE 0 END) as completed_count,
+                SUM(CASE WHEN f.status = 'closed' THEN f.orders_cnt ELSE 0 END) as closed_count
+            FROM {orders_src} f
+            GROUP BY DATE_FORMAT(f.day, :fmt)
             ORDER BY period
-        """), {"start": start_date, "end": end_date, "fmt": date_format})
-        
-        data = [{"period": row[0], "orders_count": row[1], "rent_revenue": float(row[2]), "avg_check": float(row[3])} for row in result]
+        """), {**params, "fmt": date_format})
         
-        totals_result = db.execute(text("""
-            SELECT COUNT(*) as total_orders,
-                COALESCE(SUM(CASE WHEN status IN ('issued','on_rent','returned','closed') THEN total_price ELSE 0 END), 0) as total_rent,
-                COALESCE(AVG(CASE WHEN status IN ('issued','on_rent','returned','closed') THEN total_price END), 0) as avg_check,
-                COUNT(CASE WHEN status = 'closed' THEN 1 END) as closed
-            FROM orders WHERE DATE(created_at) BETWEEN :start AND :end
-        """), {"start": start_date, "end": end_date})
-        totals = totals_result.fetchone()
+        data = []
+        total_orders = completed = closed = 0
+        total_rent = 0.0
+        for row in result:
+            orders_count, rent, completed_count = int(row[1] or 0), float(row[2] or 0), int(row[3] or 0)
+            data.append({"period": row[0], "orders_count": orders_count, "rent_revenue": rent,
+                         "avg_check": rent / completed_count if completed_count else 0.0})
+            total_orders += orders_count
+            total_rent += rent
+            completed += completed_count
+            closed += int(row[4] or 0)
         
         return {
             "period": {"start": str(start_date), "end": str(end_date)},
             "group_by": group_by,
             "data": data,
             "totals": {
-                "orders": totals[0],
-                "rent_revenue": float(totals[1]),
-                "avg_check": float(totals[2]),
-                "by_status": {"closed": totals[3]}
+                "orders": total_orders,
+                "rent_revenue": total_rent,
+                "avg_check": total_rent / completed if completed else 0.0,
+                "by_status": {"closed": closed}
             }
         }
     except Exception as e:
@@ -262,7 +250,7 @@ async def get_orders_report(
 # ================== PRODUCTS REPORT ==================
 
 @router.get("/products")
-async def get_products_report(
+def get_products_report(
     period: str = Query("month"),
     sort_by: str = Query("revenue"),
     limit: int = Query(20),
@@ -270,37 +258,50 @@ async def get_products_report(
 ):
     """Звіт по товарах: ROI, найприбутковіші, простоюючі"""
     start_date, end_date = get_date_range(period)
+    range_start, range_end = day_range(start_date, end_date)
     
     try:
-        result = db.execute(text("""
+        products_src, params = fact_source(db, "products", range_start, range_end)
+        result = db.execute(text(f"""
             SELECT 
-                oi.product_id,
+                f.product_id,
                 p.name as product_name,
                 p.sku,
                 p.price as buy_price,
-                COUNT(DISTINCT oi.order_id) as rental_count,
-                COALESCE(SUM(oi.price * oi.quantity), 0) as rent_revenue,
-                COALESCE((SELECT SUM(fee) FROM product_damage_history WHERE product_id = oi.product_id AND DATE(created_at) BETWEEN :start AND :end), 0) as damage_cost
-            FROM order_items oi
-            JOIN orders o ON oi.order_id = o.order_id
-            LEFT JOIN products p ON oi.product_id = p.product_id
-            WHERE DATE(o.created_at) BETWEEN :start AND :end AND o.status IN ('issued', 'on_rent', 'returned', 'closed')
-            GROUP BY oi.product_id, p.name, p.sku, p.price
-            ORDER BY rent_revenue DESC
+                f.rental_count,
+                f.rent_revenue
+            FROM (
+                SELECT product_id, SUM(rentals) as rental_count, SUM(revenue) as rent_revenue
+                FROM {products_src} f
+                WHERE f.completed = 1
+                GROUP BY product_id
+            ) f
+            LEFT JOIN products p ON f.product_id = p.product_id
+            ORDER BY f.rent_revenue DESC
             LIMIT :limit
-        """), {"start": start_date, "end": end_date, "limit": limit})
+        """), {**params, "limit": limit})
+        rows = result.fetchall()
+        
+        damage_cost = {}
+        if rows:
+            damage_src, damage_params = fact_source(db, "damage", range_start, range_end)
+            damage_result = db.execute(text(f"""
+                SELECT f.product_id, COALESCE(SUM(f.fee), 0) FROM {damage_src} f
+                WHERE f.product_id IN :ids GROUP BY f.product_id
+            """), {**damage_params, "ids": tuple(row[0] for row in rows)})
+            damage_cost = {row[0]: float(row[1]) for row in damage_result}
         
         top_products = []
-        for row in result:
+        for row in rows:
             buy_price = float(row[3]) if row[3] else 1
-            rent_revenue = float(row[5])
-            damage_cost = float(row[6])
-            profit = rent_revenue - damage_cost
+            rent_revenue = float(row[5] or 0)
+            product_damage = damage_cost.get(row[0], 0.0)
+            profit = rent_revenue - product_damage
             roi = round((profit / buy_price) * 100, 1) if buy_price > 0 else 0
             
             top_products.append({
                 "product_id": row[0], "name": row[1] or f"Товар #{row[0]}", "sku": row[2],
-                "rental_count": row[4], "rent_revenue": rent_revenue, "damage_cost": damage_cost,
+                "rental_count": int(row[4] or 0), "rent_revenue": rent_revenue, "damage_cost": product_damage,
                 "profit": profit, "roi": roi
             })
         
@@ -309,17 +310,15 @@ async def get_products_report(
         elif sort_by == "rentals":
             top_products.sort(key=lambda x: x["rental_count"], reverse=True)
         
-        idle_result = db.execute(text("""
+        idle_result = db.execute(text(f"""
             SELECT p.product_id, p.name, p.sku, p.price, p.last_rented_date,
                 DATEDIFF(NOW(), COALESCE(p.last_rented_date, p.created_at)) as days_idle
             FROM products p
             WHERE p.product_id NOT IN (
-                SELECT DISTINCT oi.product_id FROM order_items oi
-                JOIN orders o ON oi.order_id = o.order_id
-                WHERE DATE(o.created_at) BETWEEN :start AND :end
+                SELECT DISTINCT f.product_id FROM {products_src} f
             ) AND p.status = 'active'
             ORDER BY days_idle DESC LIMIT 20
-        """), {"start": start_date, "end": end_date})
+        """), params)
         
         idle_products = [{"product_id": row[0], "name": row[1] or f"Товар #{row[0]}", "sku": row[2], 
                          "price": float(row[3]) if row[3] else 0, "last_rented": str(row[4]) if row[4] else "Ніколи",
@@ -342,42 +341,65 @@ async def get_products_report(
 # ================== CLIENTS REPORT ==================
 
 @router.get("/clients")
-async def get_clients_report(
+def get_clients_report(
     period: str = Query("month"),
     limit: int = Query(20),
     db: Session = Depends(get_rh_db)
 ):
     """Звіт по клієнтах: топ по витратах, нові vs повторні"""
     start_date, end_date = get_date_range(period)
+    range_start, range_end = day_range(start_date, end_date)
     
     try:
-        result = db.execute(text("""
-            SELECT c.client_id, c.name as client_name, c.phone, COUNT(o.order_id) as orders_count,
-                COALESCE(SUM(o.total_price), 0) as rent_spent,
-                COALESCE((SELECT SUM(fee) FROM product_damage_history pdh JOIN orders o2 ON pdh.order_id = o2.order_id 
-                    WHERE o2.customer_id = c.client_id AND DATE(pdh.created_at) BETWEEN :start AND :end), 0) as damage_spent,
-                MIN(o.created_at) as first_order
-            FROM clients c
-            JOIN orders o ON o.customer_id = c.client_id
-            WHERE DATE(o.created_at) BETWEEN :start AND :end
-            GROUP BY c.client_id, c.name, c.phone
-            ORDER BY rent_spent DESC LIMIT :limit
-        """), {"start": start_date, "end": end_date, "limit": limit})
-        
-        top_clients = [{"client_id": row[0], "name": row[1], "phone": row[2], "orders_count": row[3],
-                       "rent_spent": float(row[4]), "damage_spent": float(row[5]), 
-                       "total_spent": float(row[4]) + float(row[5]), "first_order": str(row[6]) if row[6] else None} for row in result]
-        
-        new_vs_returning = db.execute(text("""
-            SELECT CASE WHEN (SELECT COUNT(*) FROM orders o2 WHERE o2.customer_id = o.customer_id AND o2.created_at < :start) = 0 
-                THEN 'new' ELSE 'returning' END as client_type,
-                COUNT(DISTINCT o.customer_id) as client_count, COALESCE(AVG(o.total_price), 0) as avg_check
-            FROM orders o WHERE DATE(o.created_at) BETWEEN :start AND :end GROUP BY client_type
-        """), {"start": start_date, "end": end_date})
-        
-        client_types = {"new": {"count": 0, "avg_check": 0}, "returning": {"count": 0, "avg_check": 0}}
-        for row in new_vs_returning:
-            client_types[row[0]] = {"count": row[1], "avg_check": float(row[2])}
+        clients_src, params = fact_source(db, "clients", range_start, range_end)
+        result = db.execute(text(f"""
+            SELECT c.client_id, c.name as client_name, c.phone, f.orders_count, f.rent_spent, f.first_order
+            FROM (
+                SELECT customer_id, SUM(orders_cnt) as orders_count, SUM(revenue) as rent_spent,
+                    MIN(first_order) as first_order
+                FROM {clients_src} f
+                GROUP BY customer_id
+            ) f
+            JOIN clients c ON c.client_id = f.customer_id
+            ORDER BY f.rent_spent DESC LIMIT :limit
+        """), {**params, "limit": limit})
+        rows = result.fetchall()
+        
+        damage_spent = {}
+        if rows:
+            damage_src, damage_params = fact_source(db, "damage", range_start, range_end)
+            damage_result = db.execute(text(f"""
+                SELECT o.customer_id, COALESCE(SUM(f.fee), 0)
+                FROM {damage_src} f JOIN orders o ON f.order_id = o.order_id
+                WHERE o.customer_id IN :ids
+                GROUP BY o.customer_id
+            """), {**damage_params, "ids": tuple(row[0] for row in rows)})
+            damage_spent = {row[0]: float(row[1]) for row in damage_result}
+        
+        top_clients = [{"client_id": row[0], "name": row[1], "phone": row[2], "orders_count": int(row[3] or 0),
+                       "rent_spent": float(row[4] or 0), "damage_spent": damage_spent.get(row[0], 0.0),
+                       "total_spent": float(row[4] or 0) + damage_spent.get(row[0], 0.0),
+                       "first_order": str(row[5]) if row[5] else None} for row in rows]
+        
+        # Повторний клієнт - має замовлення до початку періоду (ще не побудовані дні - наживо)
+        history_src, history_params = fact_source(db, "clients", None, range_start, prefix="history")
+        new_vs_returning = db.execute(text(f"""
+            SELECT f.customer_id, SUM(f.orders_cnt), SUM(f.revenue),
+                EXISTS(SELECT 1 FROM {history_src} h WHERE h.customer_id = f.customer_id) as is_returning
+            FROM {clients_src} f
+            GROUP BY f.customer_id
+        """), {**params, **history_params})
+        
+        totals = {"new": [0, 0, 0.0], "returning": [0, 0, 0.0]}  # клієнти, замовлення, сума
+        for customer_id, orders_count, revenue, is_returning in new_vs_returning:
+            client_type = "returning" if customer_id and is_returning else "new"
+            totals[client_type][0] += 1 if customer_id else 0
+            totals[client_type][1] += int(orders_count or 0)
+            totals[client_type][2] += float(revenue or 0)
+        client_types = {
+            key: {"count": count, "avg_check": revenue / orders if orders else 0}
+            for key, (count, orders, revenue) in totals.items()
+        }
         
         total_clients = client_types["new"]["count"] + client_types["returning"]["count"]
         
@@ -400,66 +422,81 @@ async def get_clients_report(
 # ================== DAMAGE REPORT ==================
 
 @router.get("/damage")
-async def get_damage_report(
+def get_damage_report(
     period: str = Query("month"),
     limit: int = Query(20),
     db: Session = Depends(get_rh_db)
 ):
     """Звіт по пошкодженнях: загальна сума, топ товарів"""
     start_date, end_date = get_date_range(period)
+    range_start, range_end = day_range(start_date, end_date)
     
     try:
-        totals_result = db.execute(text("""
-            SELECT COUNT(*) as damage_count, COALESCE(SUM(fee), 0) as total_damage,
-                COALESCE(AVG(fee), 0) as avg_damage, COUNT(DISTINCT product_id) as products_damaged,
-                COUNT(DISTINCT order_id) as orders_affected
-            FROM product_damage_history WHERE DATE(created_at) BETWEEN :start AND :end
-        """), {"start": start_date, "end": end_date})
-        totals = totals_result.fetchone()
-        
-        rent_result = db.execute(text("""
-            SELECT COALESCE(SUM(total_price), 0) as rent_revenue FROM orders
-            WHERE DATE(created_at) BETWEEN :start AND :end AND status IN ('issued', 'on_rent', 'returned', 'closed')
-        """), {"start": start_date, "end": end_date})
+        damage_src, params = fact_source(db, "damage", range_start, range_end)
+        totals = db.execute(text(f"""
+            SELECT COALESCE(SUM(f.cnt), 0) as damage_count, COALESCE(SUM(f.fee), 0) as total_damage,
+                COALESCE(SUM(f.fee_cnt), 0) as fee_count,
+                COUNT(DISTINCT NULLIF(f.product_id, 0)) as products_damaged,
+                COUNT(DISTINCT NULLIF(f.order_id, 0)) as orders_affected
+            FROM {damage_src} f
+        """), params).fetchone()
+        
+        orders_src, orders_params = fact_source(db, "orders", range_start, range_end)
+        rent_result = db.execute(text(f"""
+            SELECT COALESCE(SUM(f.revenue), 0) as rent_revenue FROM {orders_src} f
+            WHERE f.status IN ('issued', 'on_rent', 'returned', 'closed')
+        """), orders_params)
         rent_revenue = float(rent_result.fetchone()[0])
         
         total_damage = float(totals[1])
         damage_percent = round(total_damage / rent_revenue * 100, 1) if rent_revenue > 0 else 0
         
-        products_result = db.execute(text("""
-            SELECT pdh.product_id, pdh.product_name, pdh.sku, COUNT(*) as damage_count, SUM(pdh.fee) as total_fee,
-                COALESCE((SELECT SUM(oi.price * oi.quantity) FROM order_items oi JOIN orders o ON oi.order_id = o.order_id
-                    WHERE oi.product_id = pdh.product_id AND DATE(o.created_at) BETWEEN :start AND :end), 0) as product_revenue
-            FROM product_damage_history pdh WHERE DATE(pdh.created_at) BETWEEN :start AND :end
-            GROUP BY pdh.product_id, pdh.product_name, pdh.sku ORDER BY total_fee DESC LIMIT :limit
-        """), {"start": start_date, "end": end_date, "limit": limit})
+        products_result = db.execute(text(f"""
+            SELECT f.product_id, MAX(f.product_name), MAX(f.sku), SUM(f.cnt) as damage_count, SUM(f.fee) as total_fee
+            FROM {damage_src} f
+            GROUP BY f.product_id ORDER BY total_fee DESC LIMIT :limit
+        """), {**params, "limit": limit})
+        product_rows = products_result.fetchall()
+        
+        product_revenue = {}
+        if product_rows:
+            products_src, products_params = fact_source(db, "products", range_start, range_end)
+            revenue_result = db.execute(text(f"""
+                SELECT f.product_id, COALESCE(SUM(f.revenue), 0) FROM {products_src} f
+                WHERE f.product_id IN :ids GROUP BY f.product_id
+            """), {**products_params, "ids": tuple(row[0] for row in product_rows)})
+            product_revenue = {row[0]: float(row[1]) for row in revenue_result}
         
         damaged_products = []
-        for row in products_result:
-            product_revenue = float(row[5])
-            product_damage = float(row[4])
+        for row in product_rows:
+            revenue = product_revenue.get(row[0], 0.0)
+            product_damage = float(row[4] or 0)
             damaged_products.append({
-                "product_id": row[0], "name": row[1] or f"Товар #{row[0]}", "sku": row[2],
-                "damage_count": row[3], "total_fee": product_damage, "revenue": product_revenue,
-                "damage_ratio": round(product_damage / product_revenue * 100, 1) if product_revenue > 0 else 100
+                "product_id": row[0] or None, "name": row[1] or f"Товар #{row[0]}", "sku": row[2],
+                "damage_count": int(row[3] or 0), "total_fee": product_damage, "revenue": revenue,
+                "damage_ratio": round(product_damage / revenue * 100, 1) if revenue > 0 else 100
             })
         
-        by_type_result = db.execute(text("""
-            SELECT damage_type, COUNT(*) as cnt, SUM(fee) as total FROM product_damage_history
-            WHERE DATE(created_at) BETWEEN :start AND :end GROUP BY damage_type ORDER BY total DESC
-        """), {"start": start_date, "end": end_date})
-        by_type = [{"type": row[0], "count": row[1], "total": float(row[2])} for row in by_type_result]
-        
-        daily_result = db.execute(text("""
-            SELECT DATE(created_at) as day, COUNT(*) as cnt, SUM(fee) as total FROM product_damage_history
-            WHERE DATE(created_at) BETWEEN :start AND :end GROUP BY DATE(created_at) ORDER BY day
-        """), {"start": start_date, "end": end_date})
-        daily_trend = [{"day": str(row[0]), "count": row[1], "total": float(row[2])} for row in daily_result]
-        
+        by_type_result = db.execute(text(f"""
+            SELECT f.damage_type, SUM(f.cnt) as cnt, SUM(f.fee) as total FROM {damage_src} f
+            GROUP BY f.damage_type ORDER BY total DESC
+        """), params)
+        by_type = [{"type": row[0] or None, "count": int(row[1] or 0), "total": float(row[2] or 0)}
+                   for row in by_type_result]
+        
+        daily_result = db.execute(text(f"""
+            SELECT f.day, SUM(f.cnt) as cnt, SUM(f.fee) as total FROM {damage_src} f
+            GROUP BY f.day ORDER BY f.day
+        """), params)
+        daily_trend = [{"day": str(row[0]), "count": int(row[1] or 0), "total": float(row[2] or 0)}
+                       for row in daily_result]
+        
+        fee_count = int(totals[2] or 0)
         return {
             "period": {"start": str(start_date), "end": str(end_date)},
             "kpi": {
-                "total_damage": total_damage, "damage_count": totals[0], "avg_damage": float(totals[2]),
+                "total_damage": total_damage, "damage_count": int(totals[0] or 0),
+                "avg_damage": total_damage / fee_count if fee_count else 0.0,
                 "products_damaged": totals[3], "orders_affected": totals[4], "rent_revenue": rent_revenue,
                 "damage_percent": damage_percent, "is_critical": damage_percent > 10
             },
@@ -473,62 +510,73 @@ async def get_damage_report(
 
 # ================== EXPORT ==================
 
+_REPORTS = {
+    "orders": (
+        """
+            SELECT o.order_number, o.customer_name, o.status, o.total_price, o.created_at
+            FROM orders o WHERE o.created_at >= :start AND o.created_at < :end ORDER BY o.created_at DESC
+        """,
+        ["Номер", "Клієнт", "Статус", "Сума оренди", "Дата"],
+        lambda row: [row[0], row[1], row[2], row[3], str(row[4])],
+    ),
+    "products": (
+        """
+            SELECT p.sku, p.name, COUNT(DISTINCT oi.order_id) as rentals, SUM(oi.price * oi.quantity) as revenue
+            FROM products p LEFT JOIN order_items oi ON p.product_id = oi.product_id
+            LEFT JOIN orders o ON oi.order_id = o.order_id AND o.created_at >= :start AND o.created_at < :end
+            GROUP BY p.product_id, p.sku, p.name ORDER BY revenue DESC
+        """,
+        ["Артикул", "Назва", "Кількість оренд", "Виручка"],
+        lambda row: [row[0], row[1], row[2], float(row[3]) if row[3] else 0],
+    ),
+    "damage": (
+        """
+            SELECT pdh.product_name, pdh.sku, pdh.damage_type, pdh.severity, pdh.fee, pdh.order_number, pdh.created_at
+            FROM product_damage_history pdh WHERE pdh.created_at >= :start AND pdh.created_at < :end ORDER BY pdh.created_at DESC
+        """,
+        ["Товар", "Артикул", "Тип", "Рівень", "Сума", "Замовлення", "Дата"],
+        lambda row: [row[0], row[1], row[2], row[3], float(row[4] or 0), row[5], str(row[6])],
+    ),
+}
+
+
+@export_builder("analytics")
+def analytics_export(db: Session, report_type: str, period: str = "month") -> ExportSpec:
+    if report_type not in _REPORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown report type: {report_type}")
+    sql, headers, row = _REPORTS[report_type]
+    start_date, end_date = get_date_range(period)
+    range_start, range_end = day_range(start_date, end_date)
+    return ExportSpec(
+        name="analytics",
+        sql=sql,
+        params={"start": range_start, "end": range_end},
+        columns=headers,
+        row=row,
+        filename=f"{report_type}_{start_date}_{end_date}",
+        sheet_title=report_type,
+    )
+
+
 @router.get("/export/{report_type}")
-async def export_report(
+def export_report(
     report_type: str,
     period: str = Query("month"),
     format: str = Query("csv"),
+    background: bool = Query(False),
     db: Session = Depends(get_rh_db)
 ):
-    """Експорт звіту у CSV або JSON"""
-    from fastapi.responses import Response
-    import csv
-    import io
-    
-    start_date, end_date = get_date_range(period)
-    
+    """Експорт звіту у CSV, XLSX (потоково, services/export_engine) або JSON"""
     try:
-        if report_type == "orders":
-            result = db.execute(text("""
-                SELECT o.order_number, o.customer_name, o.status, o.total_price, o.created_at
-                FROM orders o WHERE DATE(o.created_at) BETWEEN :start AND :end ORDER BY o.created_at DESC
-            """), {"start": start_date, "end": end_date})
-            headers = ["Номер", "Клієнт", "Статус", "Сума оренди", "Дата"]
-            rows = [[row[0], row[1], row[2], row[3], str(row[4])] for row in result]
-            
-        elif report_type == "products":
-            result = db.execute(text("""
-                SELECT p.sku, p.name, COUNT(DISTINCT oi.order_id) as rentals, SUM(oi.price * oi.quantity) as revenue
-                FROM products p LEFT JOIN order_items oi ON p.product_id = oi.product_id
-                LEFT JOIN orders o ON oi.order_id = o.order_id AND DATE(o.created_at) BETWEEN :start AND :end
-                GROUP BY p.product_id, p.sku, p.name ORDER BY revenue DESC
-            """), {"start": start_date, "end": end_date})
-            headers = ["Артикул", "Назва", "Кількість оренд", "Виручка"]
-            rows = [[row[0], row[1], row[2], float(row[3]) if row[3] else 0] for row in result]
-            
-        elif report_type == "damage":
-            result = db.execute(text("""
-                SELECT pdh.product_name, pdh.sku, pdh.damage_type, pdh.severity, pdh.fee, pdh.order_number, pdh.created_at
-                FROM product_damage_history pdh WHERE DATE(pdh.created_at) BETWEEN :start AND :end ORDER BY pdh.created_at DESC
-            """), {"start": start_date, "end": end_date})
-            headers = ["Товар", "Артикул", "Тип", "Рівень", "Сума", "Замовлення", "Дата"]
-            rows = [[row[0], row[1], row[2], row[3], float(row[4]), row[5], str(row[6])] for row in result]
-        else:
-            raise HTTPException(status_code=400, detail=f"Unknown report type: {report_type}")
-        
         if format == "json":
-            data = [dict(zip(headers, row)) for row in rows]
+            spec = build_spec(db, "analytics", report_type=report_type, period=period)
+            result = db.execute(text(spec.sql), spec.params)
+            data = [dict(zip(spec.columns, spec.row(row))) for row in result]
+            start_date, end_date = get_date_range(period)
             return {"data": data, "period": {"start": str(start_date), "end": str(end_date)}}
         
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(headers)
-        writer.writerows(rows)
-        
-        return Response(
-            content=output.getvalue().encode('utf-8-sig'),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={report_type}_{start_date}_{end_date}.csv"}
-        )
+        return start_export(db, "analytics", format, background, report_type=report_type, period=period)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Export error: {str(e)}")
@@ -13,6 +13,12 @@ import html
 from database import get_db as get_oc_db  # OpenCart DB (for fallback)
 from database_rentalhub import get_rh_db  # RentalHub DB (primary)
 from utils.image_helper import normalize_image_url
+from services.product_search import get_product_search, search_text
+from services.export_engine import ExportSpec, export_builder, start_export
+from services.audit_state import (
+    backfill as backfill_audit_state, ensure_audit_state, forget_product, record_audit, record_bulk_audit,
+    record_quantity_change,
+)
 from models_sqlalchemy import (
     OpenCartProduct,
     OpenCartProductDescription,
@@ -72,7 +78,8 @@ async def get_audit_items(
     ✅ MIGRATED: Using RentalHub DB (products + inventory tables)
     """
     try:
-        # ✅ UPDATED: Using products + audit_records for status
+        # Останній стан переобліку - з проєкції product_audit_state (PK по товару)
+        ensure_audit_state(db)
         sql_parts = ["""
             SELECT 
                 p.product_id,
@@ -95,7 +102,7 @@ async def get_audit_items(
                 p.cleaning_status,
                 p.product_state,
                 p.last_audit_date,
-                ar.status as audit_status,
+                pas.status as audit_status,
                 p.height_cm,
                 p.width_cm,
                 p.depth_cm,
@@ -104,13 +111,7 @@ async def get_audit_items(
                 p.hashtags,
                 p.status as product_status
             FROM products p
-            LEFT JOIN (
-                SELECT product_id, status 
-                FROM audit_records ar1
-                WHERE ar1.id = (
-                    SELECT ar2.id FROM audit_records ar2 WHERE ar2.product_id = ar1.product_id ORDER BY ar2.audit_date DESC LIMIT 1
-                )
-            ) ar ON p.product_id = ar.product_id
+            LEFT JOIN product_audit_state pas ON pas.product_id = p.product_id
         """]
         
         # Default: show active only. 'disabled' filter overrides this.
@@ -124,12 +125,8 @@ async def get_audit_items(
         # Status filter — based on last_audit_date (same logic as stats)
         if status_filter and status_filter != 'all':
             if status_filter == 'critical':
-                # Products marked critical in audit_records
-                sql_parts.append("""AND p.product_id IN (
-                    SELECT ar_c.product_id FROM audit_records ar_c
-                    WHERE ar_c.status = 'critical'
-                    AND ar_c.audit_date = (SELECT MAX(ar_c2.audit_date) FROM audit_records ar_c2 WHERE ar_c2.product_id = ar_c.product_id)
-                )""")
+                # Останній переоблік товару позначений як critical
+                sql_parts.append("AND pas.status = 'critical'")
             elif status_filter == 'needs_recount' or status_filter == 'minor':
                 sql_parts.append("AND (p.last_audit_date IS NULL OR DATEDIFF(CURDATE(), p.last_audit_date) > 180)")
             elif status_filter == 'ok':
@@ -148,17 +145,13 @@ async def get_audit_items(
             sql_parts.append("AND p.subcategory_name = :subcategory")
             params['subcategory'] = subcategory
         
-        # Search filter (SKU, name, category)
+        # Search filter (SKU, name, category) - повнотекстовий індекс
         if q:
-            sql_parts.append("""
-                AND (
-                    p.sku LIKE :search
-                    OR p.name LIKE :search
-                    OR p.category_name LIKE :search
-                    OR p.subcategory_name LIKE :search
-                )
-            """)
-            params['search'] = f"%{q}%"
+            search_ids = get_product_search().search(db, q, active_only=False).ids
+            if not search_ids:
+                return []
+            sql_parts.append("AND p.product_id IN :search_ids")
+            params['search_ids'] = search_ids
         
         # Sorting
         if sort_by == 'category':
@@ -175,7 +168,7 @@ async def get_audit_items(
             sql_parts.append(f"LIMIT {limit}")
         
         final_sql = " ".join(sql_parts)
-        results = db.execute(text(final_sql), params).fetchall()
+        results = db.execute(search_text(final_sql, params), params).fetchall()
         
         # ✅ NEW: Format results from RentalHub DB
         audit_items = []
@@ -575,6 +568,10 @@ async def mark_audited_new_working_endpoint(item_id: str, audit_data: dict, db:
             'qty_actual': quantity_actual,
             'notes': audit_data.get('notes', '')
         })
+        record_audit(
+            db, product_id, audit_id, audited_by, audit_data.get('audit_status', 'ok'),
+            quantity_expected, quantity_actual, audit_date=today,
+        )
         
         db.commit()
         
@@ -714,6 +711,8 @@ async def get_audit_stats(
     - crit (Критичні) = товари що є в кабінеті шкоди
     """
     try:
+        ensure_audit_state(db)
+
         # Підрахунок по переобліку
         stats_query = text("""
             SELECT 
@@ -738,10 +737,9 @@ async def get_audit_stats(
         
         # Підрахунок критичних (активні записи в product_damage_history)
         damages_query = text("""
-            SELECT COUNT(DISTINCT ar_c.product_id) as critical_count
-            FROM audit_records ar_c
-            WHERE ar_c.status = 'critical'
-            AND ar_c.audit_date = (SELECT MAX(ar_c2.audit_date) FROM audit_records ar_c2 WHERE ar_c2.product_id = ar_c.product_id)
+            SELECT COUNT(*) as critical_count
+            FROM product_audit_state
+            WHERE status = 'critical'
         """)
         
         damages_result = db.execute(damages_query).fetchone()
@@ -764,6 +762,20 @@ async def get_audit_stats(
         )
 
 
+@router.post("/state/backfill")
+async def backfill_audit_state_endpoint(db: Session = Depends(get_rh_db)):
+    """
+    Перебудувати product_audit_state з історії audit_records
+    (після ручних правок audit_records або міграцій)
+    """
+    try:
+        products = backfill_audit_state(db)
+        return {'success': True, 'products': products}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Помилка: {str(e)}")
+
+
 @router.post("/calculate-lifecycle/{product_id}")
 async def calculate_lifecycle_metrics(
     product_id: int,
@@ -883,6 +895,7 @@ async def update_quantity(
         db.execute(text("""
             UPDATE products SET quantity = :qty WHERE product_id = :id
         """), {"qty": new_qty, "id": product_id})
+        record_quantity_change(db, product_id, old_qty, new_qty, data.get('changed_by'))
         
         db.commit()
         
@@ -2131,6 +2144,7 @@ async def mark_category_audited(
         """)
         
         result = rh_db.execute(update_query, params)
+        record_bulk_audit(rh_db, where_clause, params, audited_by, audit_date=params['audit_date'])
         rh_db.commit()
         
         updated_count = result.rowcount
@@ -2185,6 +2199,7 @@ async def delete_product(
         product_id = int(item_id.replace('A-', ''))
         # Видалити пов'язані записи
         db.execute(text("DELETE FROM audit_records WHERE product_id = :pid"), {"pid": product_id})
+        forget_product(db, product_id)
         db.execute(text("DELETE FROM product_damage_history WHERE product_id = :pid"), {"pid": product_id})
         # Видалити сам товар
         result = db.execute(text("DELETE FROM products WHERE product_id = :pid"), {"pid": product_id})
@@ -2200,43 +2215,32 @@ async def delete_product(
 
 
 
-@router.get("/export")
-async def export_audit_to_excel(
-    category: Optional[str] = 'all',
-    subcategory: Optional[str] = 'all',
-    q: Optional[str] = None,
-    rh_db: Session = Depends(get_rh_db)
-):
-    """
-    Експорт даних переобліку в Excel
-    Враховує фільтри: категорія, підкатегорія, пошук
-    """
-    try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from io import BytesIO
-        from fastapi.responses import StreamingResponse
-        
-        # Побудувати запит з фільтрами
-        where_conditions = ["p.status = 1"]
-        params = {}
-        
-        if category and category != 'all':
-            where_conditions.append("p.category_name LIKE :category")
-            params['category'] = f"%{category}%"
-        
-        if subcategory and subcategory != 'all':
-            where_conditions.append("p.subcategory_name LIKE :subcategory")
-            params['subcategory'] = f"%{subcategory}%"
-        
-        if q:
-            where_conditions.append("(p.name LIKE :q OR p.sku LIKE :q OR p.description LIKE :q)")
-            params['q'] = f"%{q}%"
-        
-        where_clause = " AND ".join(where_conditions)
-        
-        # Запит даних
-        query = text(f"""
+@export_builder("audit")
+def audit_export(rh_db: Session, category: Optional[str] = 'all', subcategory: Optional[str] = 'all',
+                 q: Optional[str] = None) -> ExportSpec:
+    """Переоблік з фільтрами (категорія, підкатегорія, пошук) для export_engine"""
+    where_conditions = ["p.status = 1"]
+    params = {}
+    
+    if category and category != 'all':
+        where_conditions.append("p.category_name LIKE :category")
+        params['category'] = f"%{category}%"
+    
+    if subcategory and subcategory != 'all':
+        where_conditions.append("p.subcategory_name LIKE :subcategory")
+        params['subcategory'] = f"%{subcategory}%"
+    
+    if q:
+        search_ids = get_product_search().search(rh_db, q).ids
+        where_conditions.append("p.product_id IN :search_ids")
+        params['search_ids'] = tuple(search_ids) or (0,)
+    
+    where_clause = " AND ".join(where_conditions)
+    ensure_audit_state(rh_db)
+    
+    return ExportSpec(
+        name="audit",
+        sql=f"""
             SELECT 
                 p.product_id,
                 p.sku,
@@ -2256,84 +2260,48 @@ async def export_audit_to_excel(
                 p.cleaning_status,
                 p.product_state,
                 p.description,
-                p.care_instructions
+                p.care_instructions,
+                pas.status,
+                pas.audited_by
             FROM products p
+            LEFT JOIN product_audit_state pas ON pas.product_id = p.product_id
             WHERE {where_clause}
             ORDER BY p.category_name, p.subcategory_name, p.name
-        """)
-        
-        results = rh_db.execute(query, params).fetchall()
-        
-        # Створити Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Переоблік"
-        
-        # Заголовки
-        headers = [
+        """,
+        params=params,
+        columns=[
             'ID', 'SKU', 'Назва', 'Категорія', 'Підкатегорія',
             'Ціна купівлі', 'Ціна оренди/день',
             'Кількість', 'Колір', 'Матеріал', 'Розміри',
             'Зона', 'Ряд', 'Полиця', 'Дата переобліку', 
-            'Чистота', 'Стан', 'Опис', 'Інструкція по догляду'
-        ]
-        
-        # Стилі заголовків
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=11)
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
-        
-        # Дані
-        for row_idx, row_data in enumerate(results, 2):
-            for col_idx, value in enumerate(row_data, 1):
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.border = border
-                cell.alignment = Alignment(wrap_text=True, vertical='top')
-        
-        # Автоширина колонок
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column].width = adjusted_width
-        
-        # Зберегти в пам'ять
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        # Ім'я файлу
-        from datetime import datetime
-        from urllib.parse import quote
-        filename = f"Audit_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.xlsx"
-        filename_encoded = quote(filename)
-        
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{filename_encoded}"
-            }
-        )
-        
+            'Чистота', 'Стан', 'Опис', 'Інструкція по догляду',
+            'Статус переобліку', 'Переоблік провів'
+        ],
+        # Write-only книга не вміє автоширину - фіксовані ширини під типовий вміст
+        widths=[8, 14, 40, 20, 20, 12, 14, 10, 12, 14, 14, 8, 8, 8, 18, 12, 12, 50, 40, 16, 18],
+        filename=f"Audit_{datetime.now().strftime('%Y-%m-%d_%H-%M')}",
+        sheet_title="Переоблік",
+    )
+
+
+@router.get("/export")
+async def export_audit_to_excel(
+    category: Optional[str] = 'all',
+    subcategory: Optional[str] = 'all',
+    q: Optional[str] = None,
+    background: bool = False,
+    rh_db: Session = Depends(get_rh_db)
+):
+    """
+    Експорт даних переобліку в Excel
+    Враховує фільтри: категорія, підкатегорія, пошук.
+    Рядки читаються потоково, книга пишеться у write-only режимі (services/export_engine)
+    """
+    try:
+        return start_export(rh_db, "audit", "xlsx", background,
+                            category=category, subcategory=subcategory, q=q)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -2381,7 +2349,7 @@ async def import_audit_from_excel(
                     continue  # Пропустити порожні рядки
                 
                 # Перевірити чи існує товар
-                check_query = text("SELECT product_id FROM products WHERE sku = :sku")
+                check_query = text("SELECT product_id, quantity FROM products WHERE sku = :sku")
                 existing = rh_db.execute(check_query, {'sku': sku}).fetchone()
                 
                 if existing:
@@ -2426,6 +2394,8 @@ async def import_audit_from_excel(
                         'description': description,
                         'care_instructions': care_instructions
                     })
+                    if (existing[1] or 0) != (quantity or 0):
+                        record_quantity_change(rh_db, existing[0], existing[1] or 0, quantity or 0, 'Імпорт Excel')
                     updated_count += 1
                 else:
                     # Створити новий
@@ -2469,6 +2439,7 @@ async def import_audit_from_excel(
                         'description': description,
                         'care_instructions': care_instructions
                     })
+                    record_bulk_audit(rh_db, "product_id = :pid", {'pid': new_product_id}, 'Імпорт Excel')
                     created_count += 1
                     
             except Exception as e:
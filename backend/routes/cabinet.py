@@ -7,9 +7,10 @@ from pydantic import BaseModel
 from typing import Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 
 from database_rentalhub import get_rh_db
+from services.dashboard_snapshot import get_dashboard_snapshots
 from utils.user_tracking_helper import get_current_user_dependency
 
 router = APIRouter(prefix="/api/cabinet", tags=["cabinet"])
@@ -144,65 +145,55 @@ async def get_my_tasks(
 
 # === Focus: tasks due today + overdue ===
 
-@router.get("/focus")
-async def get_daily_focus(
-    user: dict = Depends(require_auth),
-    db: Session = Depends(get_rh_db)
-):
-    uid = user.get("user_id") or user.get("id")
-    today = date.today().isoformat()
-
-    overdue = db.execute(text(f"""
+def _focus_overdue(db: Session, uid):
+    rows = db.execute(text(f"""
         {_TASK_SELECT}
         WHERE t.assigned_to_id = :uid AND t.status != 'done'
           AND t.due_date IS NOT NULL AND DATE(t.due_date) < :today
         ORDER BY t.due_date ASC
-    """), {"uid": uid, "today": today}).fetchall()
+    """), {"uid": uid, "today": date.today().isoformat()}).fetchall()
+    return [_format_task(r) for r in rows]
 
-    due_today = db.execute(text(f"""
+
+def _focus_due_today(db: Session, uid):
+    rows = db.execute(text(f"""
         {_TASK_SELECT}
         WHERE t.assigned_to_id = :uid AND t.status != 'done'
           AND DATE(t.due_date) = :today
         ORDER BY FIELD(t.priority, 'high', 'medium', 'low')
-    """), {"uid": uid, "today": today}).fetchall()
+    """), {"uid": uid, "today": date.today().isoformat()}).fetchall()
+    return [_format_task(r) for r in rows]
+
 
-    in_progress = db.execute(text(f"""
+def _focus_in_progress(db: Session, uid):
+    rows = db.execute(text(f"""
         {_TASK_SELECT}
         WHERE t.assigned_to_id = :uid AND t.status = 'in_progress'
         ORDER BY FIELD(t.priority, 'high', 'medium', 'low')
     """), {"uid": uid}).fetchall()
+    return [_format_task(r) for r in rows]
+
 
-    # Week calendar: tasks per day for next 7 days
+def _focus_week(db: Session, uid):
+    """Week calendar: tasks per day for next 7 days"""
     week_start = date.today()
-    week_data = []
-    for i in range(7):
-        d = week_start + __import__('datetime').timedelta(days=i)
-        cnt = db.execute(text("""
-            SELECT COUNT(*) FROM tasks
+    days = [week_start + timedelta(days=i) for i in range(7)]
+    counts = {
+        (r[0].isoformat() if hasattr(r[0], "isoformat") else str(r[0])): r[1]
+        for r in db.execute(text("""
+            SELECT DATE(due_date) AS d, COUNT(*) FROM tasks
             WHERE assigned_to_id = :uid AND status != 'done'
-              AND DATE(due_date) = :d
-        """), {"uid": uid, "d": d.isoformat()}).scalar()
-        week_data.append({"date": d.isoformat(), "day_name": d.strftime("%a"), "count": cnt or 0})
-
-    return {
-        "overdue": [_format_task(r) for r in overdue],
-        "due_today": [_format_task(r) for r in due_today],
-        "in_progress": [_format_task(r) for r in in_progress],
-        "week": week_data,
+              AND due_date >= :start AND due_date < :end
+            GROUP BY DATE(due_date)
+        """), {"uid": uid, "start": days[0].isoformat(), "end": (days[-1] + timedelta(days=1)).isoformat()}).fetchall()
     }
+    return [{"date": d.isoformat(), "day_name": d.strftime("%a"), "count": counts.get(d.isoformat()) or 0}
+            for d in days]
 
 
 # === My Stats ===
 
-@router.get("/stats")
-async def get_my_stats(
-    user: dict = Depends(require_auth),
-    db: Session = Depends(get_rh_db)
-):
-    uid = user.get("user_id") or user.get("id")
-    today = date.today().isoformat()
-
-    # Task stats
+def _stats_tasks(db: Session, uid):
     task_stats = db.execute(text("""
         SELECT
             COUNT(*) as total,
@@ -213,42 +204,83 @@ async def get_my_stats(
         FROM tasks
         WHERE assigned_to_id = :uid
     """), {"uid": uid}).fetchone()
+    return {
+        "total": task_stats[0] or 0,
+        "todo": task_stats[1] or 0,
+        "in_progress": task_stats[2] or 0,
+        "done": task_stats[3] or 0,
+        "overdue": task_stats[4] or 0,
+    }
 
-    # Tasks completed today
-    today_done = db.execute(text("""
+
+def _stats_tasks_completed(db: Session, uid):
+    """Tasks completed today"""
+    return db.execute(text("""
         SELECT COUNT(*) FROM tasks
         WHERE assigned_to_id = :uid AND status = 'done'
           AND DATE(completed_at) = :today
-    """), {"uid": uid, "today": today}).scalar()
+    """), {"uid": uid, "today": date.today().isoformat()}).scalar() or 0
+
 
-    # Orders stats (from order_internal_notes as activity indicator)
-    notes_today = db.execute(text("""
+def _stats_notes_written(db: Session, uid):
+    """Orders stats (from order_internal_notes as activity indicator)"""
+    return db.execute(text("""
         SELECT COUNT(*) FROM order_internal_notes
         WHERE user_id = :uid AND DATE(created_at) = :today
-    """), {"uid": uid, "today": today}).scalar()
+    """), {"uid": uid, "today": date.today().isoformat()}).scalar() or 0
+
 
-    # Chat messages today
-    msgs_today = db.execute(text("""
+def _stats_messages_sent(db: Session, uid):
+    """Chat messages today"""
+    return db.execute(text("""
         SELECT COUNT(*) FROM chat_messages
         WHERE user_id = :uid AND DATE(created_at) = :today
-    """), {"uid": uid, "today": today}).scalar()
+    """), {"uid": uid, "today": date.today().isoformat()}).scalar() or 0
 
+
+def _stats_payload(sections: dict) -> dict:
     return {
-        "tasks": {
-            "total": task_stats[0] or 0,
-            "todo": task_stats[1] or 0,
-            "in_progress": task_stats[2] or 0,
-            "done": task_stats[3] or 0,
-            "overdue": task_stats[4] or 0,
-        },
+        "tasks": sections["tasks"],
         "today": {
-            "tasks_completed": today_done or 0,
-            "notes_written": notes_today or 0,
-            "messages_sent": msgs_today or 0,
+            "tasks_completed": sections["tasks_completed"],
+            "notes_written": sections["notes_written"],
+            "messages_sent": sections["messages_sent"],
         },
     }
 
 
+# Ранковий кабінет: секції паралельно, знімок на користувача кешується (services/dashboard_snapshot)
+_snapshots = get_dashboard_snapshots()
+_snapshots.register(
+    "cabinet_focus",
+    {"overdue": _focus_overdue, "due_today": _focus_due_today,
+     "in_progress": _focus_in_progress, "week": _focus_week},
+    defaults={"overdue": [], "due_today": [], "in_progress": [], "week": []},
+    tables={"tasks": None},
+)
+_snapshots.register(
+    "cabinet_stats",
+    {"tasks": _stats_tasks, "tasks_completed": _stats_tasks_completed,
+     "notes_written": _stats_notes_written, "messages_sent": _stats_messages_sent},
+    defaults={"tasks": {"total": 0, "todo": 0, "in_progress": 0, "done": 0, "overdue": 0},
+              "tasks_completed": 0, "notes_written": 0, "messages_sent": 0},
+    finalize=_stats_payload,
+    tables={"tasks": None, "order_internal_notes": None, "chat_messages": None},
+)
+
+
+@router.get("/focus")
+def get_daily_focus(user: dict = Depends(require_auth)):
+    uid = user.get("user_id") or user.get("id")
+    return _snapshots.get("cabinet_focus", key=uid, uid=uid)
+
+
+@router.get("/stats")
+def get_my_stats(user: dict = Depends(require_auth)):
+    uid = user.get("user_id") or user.get("id")
+    return _snapshots.get("cabinet_stats", key=uid, uid=uid)
+
+
 # === Team Overview ===
 
 @router.get("/team")
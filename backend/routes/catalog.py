@@ -5,10 +5,18 @@ Catalog API routes - inventory management
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from datetime import datetime
+from datetime import datetime, date
 
 from database_rentalhub import get_rh_db
 from utils.image_helper import normalize_image_url
+from services.image_derivatives import attach_image_variants
+from services.product_search import get_product_search, rank_rows, search_text
+from services.availability_engine import (
+    get_availability_engine,
+    STATUS_RESERVED,
+    STATUS_IN_RENT,
+    STATUS_ACTIVE,
+)
 
 router = APIRouter(prefix="/api/catalog", tags=["catalog"])
 
@@ -175,39 +183,19 @@ async def get_items_by_category(
             params = {}
             
         elif rent_filter:
-            # Знайти товари в оренді або резерві
+            # Знайти товари в оренді або резерві (з індексу availability engine)
+            engine = get_availability_engine()
             if availability == 'in_rent':
-                # Товари в реальній оренді
-                rent_sql = """
-                    SELECT DISTINCT oi.product_id
-                    FROM order_items oi
-                    JOIN orders o ON oi.order_id = o.order_id
-                    WHERE o.status IN ('issued', 'on_rent')
-                """
-                # + Товари в часткових поверненнях (pending)
-                partial_sql = """
-                    SELECT DISTINCT prvi.product_id
-                    FROM partial_return_version_items prvi
-                    JOIN partial_return_versions prv ON prvi.version_id = prv.version_id
-                    WHERE prvi.status = 'pending' AND prv.status = 'active'
-                """
-                # Об'єднуємо
-                combined_sql = f"SELECT product_id FROM ({rent_sql} UNION {partial_sql}) as combined"
+                # Товари в реальній оренді + товари в часткових поверненнях (pending)
+                rent_product_ids = (
+                    engine.product_ids_with_orders(db, STATUS_IN_RENT)
+                    | engine.product_ids_with_partial_returns(db)
+                )
             else:  # reserved
-                combined_sql = """
-                    SELECT DISTINCT oi.product_id
-                    FROM order_items oi
-                    JOIN orders o ON oi.order_id = o.order_id
-                    WHERE o.status IN ('processing', 'ready_for_issue', 'awaiting_customer', 'pending')
-                    AND o.rental_end_date >= CURDATE()
-                """
-            
-            try:
-                rent_result = db.execute(text(combined_sql)).fetchall()
-            except Exception:
-                # Fallback якщо таблиці часткових повернень не існують
-                rent_result = db.execute(text(rent_sql if availability == 'in_rent' else combined_sql)).fetchall()
-            rent_product_ids = [row[0] for row in rent_result]
+                rent_product_ids = engine.product_ids_with_orders(
+                    db, STATUS_RESERVED, date_from=date.today()
+                )
+            rent_product_ids = sorted(rent_product_ids)
             
             if not rent_product_ids:
                 return {"items": [], "stats": {"total": 0, "available": 0, "in_rent": 0, "reserved": 0, "on_wash": 0, "on_restoration": 0, "on_laundry": 0}, "date_filter_active": bool(date_from and date_to)}
@@ -281,23 +269,29 @@ async def get_items_by_category(
             sql_parts.append("AND p.quantity <= :max_qty")
             params['max_qty'] = max_qty
         
-        # Search filter
+        # Search filter - повнотекстовий індекс замість LIKE '%...%' по всій таблиці
+        search_result = None
         if search:
-            sql_parts.append("""
-                AND (
-                    p.sku LIKE :search 
-                    OR p.name LIKE :search 
-                    OR p.color LIKE :search 
-                    OR p.material LIKE :search
-                )
-            """)
-            params['search'] = f"%{search}%"
-        
-        sql_parts.append("ORDER BY p.category_name, p.subcategory_name, p.name")
-        sql_parts.append(f"LIMIT {limit}")
+            search_result = get_product_search().search(
+                db, search,
+                category=category if category and category != 'all' else None,
+                subcategory=subcategory if subcategory and subcategory != 'all' else None,
+                colors=[c.strip() for c in color.split(',')] if color and color != 'all' else (),
+                materials=[m.strip() for m in material.split(',')] if material and material != 'all' else (),
+            )
+            if not search_result.ids:
+                return {"items": [], "stats": {"total": 0, "available": 0, "in_rent": 0, "reserved": 0, "on_wash": 0, "on_restoration": 0, "on_laundry": 0}, "date_filter_active": bool(date_from and date_to), "facets": search_result.facets}
+            sql_parts.append("AND p.product_id IN :search_ids")
+            params['search_ids'] = search_result.ids
+        else:
+            sql_parts.append("ORDER BY p.category_name, p.subcategory_name, p.name")
+            sql_parts.append(f"LIMIT {limit}")
         
         final_sql = " ".join(sql_parts)
-        results = db.execute(text(final_sql), params).fetchall()
+        results = db.execute(search_text(final_sql, params), params).fetchall()
+        if search_result:
+            # Порядок - за релевантністю
+            results = rank_rows(results, search_result.ids)[:limit]
         
         # Отримати всі product_ids для оптимізації запитів
         product_ids = [row[0] for row in results]
@@ -308,144 +302,51 @@ async def get_items_by_category(
         # Якщо вказані дати - перевіряємо доступність на конкретний період
         use_date_filter = date_from and date_to
         
+        # Резерви, оренда і "у кого" - з in-memory індексу замість трьох запитів на сторінку
+        engine = get_availability_engine()
         if use_date_filter:
-            # Резерви на конкретний період (перетинання дат)
-            reserved_result = db.execute(text("""
-                SELECT oi.product_id, COALESCE(SUM(oi.quantity), 0) as reserved
-                FROM order_items oi
-                JOIN orders o ON oi.order_id = o.order_id
-                WHERE oi.product_id IN :product_ids
-                AND o.status IN ('processing', 'ready_for_issue', 'awaiting_customer', 'pending')
-                AND o.rental_start_date <= :date_to
-                AND o.rental_end_date >= :date_from
-                GROUP BY oi.product_id
-            """).bindparams(product_ids=tuple(product_ids) if len(product_ids) > 1 else (product_ids[0],)), 
-            {"date_from": date_from, "date_to": date_to})
-            reserved_dict = {row[0]: int(row[1]) for row in reserved_result}
-            
-            # В оренді на конкретний період
-            in_rent_result = db.execute(text("""
-                SELECT oi.product_id, COALESCE(SUM(oi.quantity), 0) as in_rent
-                FROM order_items oi
-                JOIN orders o ON oi.order_id = o.order_id
-                WHERE oi.product_id IN :product_ids
-                AND o.status IN ('issued', 'on_rent')
-                AND o.rental_start_date <= :date_to
-                AND o.rental_end_date >= :date_from
-                GROUP BY oi.product_id
-            """).bindparams(product_ids=tuple(product_ids) if len(product_ids) > 1 else (product_ids[0],)),
-            {"date_from": date_from, "date_to": date_to})
-            in_rent_dict = {row[0]: int(row[1]) for row in in_rent_result}
-            
-            # У кого в оренді на цей період
-            who_has_result = db.execute(text("""
-                SELECT 
-                    oi.product_id, 
-                    o.order_number, 
-                    o.customer_name,
-                    o.customer_phone,
-                    o.rental_start_date,
-                    o.rental_end_date,
-                    oi.quantity,
-                    o.status
-                FROM order_items oi
-                JOIN orders o ON oi.order_id = o.order_id
-                WHERE oi.product_id IN :product_ids
-                AND o.status IN ('processing', 'ready_for_issue', 'issued', 'on_rent', 'awaiting_customer', 'pending')
-                AND o.rental_start_date <= :date_to
-                AND o.rental_end_date >= :date_from
-                ORDER BY o.rental_start_date
-            """).bindparams(product_ids=tuple(product_ids) if len(product_ids) > 1 else (product_ids[0],)),
-            {"date_from": date_from, "date_to": date_to})
+            # Перетинання дат з конкретним періодом
+            window_from, window_to = date_from, date_to
+            who_has_from = date_from
         else:
-            # Без дат - показуємо поточний стан: один запит замість трьох
-            combined_result = db.execute(text("""
-                SELECT 
-                    oi.product_id,
-                    SUM(CASE WHEN o.status IN ('processing', 'ready_for_issue', 'awaiting_customer', 'pending') THEN oi.quantity ELSE 0 END) as reserved,
-                    SUM(CASE WHEN o.status IN ('issued', 'on_rent') THEN oi.quantity ELSE 0 END) as in_rent
-                FROM order_items oi
-                JOIN orders o ON oi.order_id = o.order_id
-                WHERE oi.product_id IN :product_ids
-                AND o.status IN ('processing', 'ready_for_issue', 'awaiting_customer', 'pending', 'issued', 'on_rent')
-                AND o.rental_end_date >= CURDATE()
-                GROUP BY oi.product_id
-            """).bindparams(product_ids=tuple(product_ids) if len(product_ids) > 1 else (product_ids[0],)))
-            reserved_dict = {}
-            in_rent_dict = {}
-            for row in combined_result:
-                reserved_dict[row[0]] = int(row[1] or 0)
-                in_rent_dict[row[0]] = int(row[2] or 0)
-            
-            who_has_result = db.execute(text("""
-                SELECT 
-                    oi.product_id, 
-                    o.order_number, 
-                    o.customer_name,
-                    o.customer_phone,
-                    o.rental_start_date,
-                    o.rental_end_date,
-                    oi.quantity,
-                    o.status
-                FROM order_items oi
-                JOIN orders o ON oi.order_id = o.order_id
-                WHERE oi.product_id IN :product_ids
-                AND o.status IN ('processing', 'ready_for_issue', 'issued', 'on_rent', 'pending', 'awaiting_customer')
-                ORDER BY o.rental_start_date
-            """).bindparams(product_ids=tuple(product_ids) if len(product_ids) > 1 else (product_ids[0],)))
+            # Без дат - показуємо поточний стан (замовлення що ще не завершились)
+            window_from, window_to = date.today(), None
+            who_has_from = None
+        
+        reserved_dict = engine.max_reserved(db, product_ids, window_from, window_to, STATUS_RESERVED)
+        in_rent_dict = engine.max_reserved(db, product_ids, window_from, window_to, STATUS_IN_RENT)
+        # Попит декораторів (soft-резерви мудбордів Event Tool) - інформаційно, не зменшує available
+        soft_dict = engine.max_soft_reserved(db, product_ids, window_from, window_to)
         
         who_has_dict = {}
-        for row in who_has_result:
-            pid = row[0]
-            if pid not in who_has_dict:
-                who_has_dict[pid] = []
-            who_has_dict[pid].append({
-                "order_number": row[1],
-                "customer": row[2] or '',  # client_name
-                "phone": row[3],  # client_phone
-                "start_date": str(row[4]) if row[4] else None,
-                "return_date": str(row[5]) if row[5] else None,
-                "qty": row[6],
-                "status": row[7]
-            })
+        for pid, intervals in engine.order_intervals(db, product_ids, who_has_from, window_to, STATUS_ACTIVE).items():
+            who_has_dict[pid] = [{
+                "order_number": it.order_number,
+                "customer": it.customer_name or '',  # client_name
+                "phone": it.customer_phone,  # client_phone
+                "start_date": str(it.rental_start_date) if it.rental_start_date else None,
+                "return_date": str(it.rental_end_date) if it.rental_end_date else None,
+                "qty": it.quantity,
+                "status": it.status
+            } for it in intervals]
         
         # ========== ЧАСТКОВІ ПОВЕРНЕННЯ ==========
         # Товари що ще у клієнта (активні версії часткових повернень)
         partial_return_dict = {}
-        try:
-            partial_return_result = db.execute(text("""
-                SELECT 
-                    prvi.product_id,
-                    prv.display_number,
-                    prv.customer_name,
-                    prv.customer_phone,
-                    prv.rental_end_date,
-                    prvi.qty,
-                    DATEDIFF(CURDATE(), prv.rental_end_date) as days_overdue
-                FROM partial_return_version_items prvi
-                JOIN partial_return_versions prv ON prvi.version_id = prv.version_id
-                WHERE prvi.product_id IN :product_ids
-                AND prvi.status = 'pending'
-                AND prv.status = 'active'
-            """).bindparams(product_ids=tuple(product_ids) if len(product_ids) > 1 else (product_ids[0],)))
-            
-            for row in partial_return_result:
-                pid = row[0]
-                if pid not in partial_return_dict:
-                    partial_return_dict[pid] = {"qty": 0, "orders": []}
-                partial_return_dict[pid]["qty"] += row[5]
-                partial_return_dict[pid]["orders"].append({
-                    "order_number": row[1],
-                    "customer": row[2] or '',
-                    "phone": row[3],
-                    "return_date": str(row[4]) if row[4] else None,
-                    "qty": row[5],
-                    "days_overdue": row[6] or 0,
+        today_ordinal = date.today().toordinal()
+        for pid, holds in engine.partial_returns(db, product_ids).items():
+            partial_return_dict[pid] = {
+                "qty": sum(h.qty for h in holds),
+                "orders": [{
+                    "order_number": h.display_number,
+                    "customer": h.customer_name or '',
+                    "phone": h.customer_phone,
+                    "return_date": str(h.rental_end_date) if h.rental_end_date else None,
+                    "qty": h.qty,
+                    "days_overdue": (today_ordinal - h.rental_end_date.toordinal()) if h.rental_end_date else 0,
                     "status": "partial_return"
-                })
-        except Exception as e:
-            # Таблиці можуть не існувати
-            pass
+                } for h in holds]
+            }
         # ========== КІНЕЦЬ ЧАСТКОВИХ ПОВЕРНЕНЬ ==========
         
         # Тепер рахуємо реальні дані обробки з product_damage_history
@@ -485,7 +386,8 @@ async def get_items_by_category(
             "reserved": 0,
             "on_wash": 0,
             "on_restoration": 0,
-            "on_laundry": 0
+            "on_laundry": 0,
+            "soft_reserved": 0
         }
         
         for row in results:
@@ -493,6 +395,7 @@ async def get_items_by_category(
             total_qty = row[8] or 0
             reserved_qty = reserved_dict.get(product_id, 0)
             in_rent_qty = in_rent_dict.get(product_id, 0)
+            soft_reserved_qty = soft_dict.get(product_id, 0)
             
             # ✅ Додаємо товари з часткових повернень до "в оренді"
             partial_return_info = partial_return_dict.get(product_id, {"qty": 0, "orders": []})
@@ -521,6 +424,7 @@ async def get_items_by_category(
             stats["on_wash"] += on_wash_qty
             stats["on_restoration"] += on_restoration_qty
             stats["on_laundry"] += on_laundry_qty
+            stats["soft_reserved"] += soft_reserved_qty
             
             # Availability filter
             if availability == 'available' and available_qty == 0:
@@ -556,6 +460,7 @@ async def get_items_by_category(
                 "available": available_qty,
                 "reserved": reserved_qty,
                 "in_rent": in_rent_qty,
+                "soft_reserved": soft_reserved_qty,
                 "on_wash": on_wash_qty,
                 "on_restoration": on_restoration_qty,
                 "on_laundry": on_laundry_qty,
@@ -575,13 +480,18 @@ async def get_items_by_category(
                 "family_id": family_id
             })
         
-        return {
+        attach_image_variants(db, items, url_key="image")
+        
+        response = {
             "items": items, 
             "stats": stats,
             "date_filter_active": use_date_filter,
             "date_from": date_from,
             "date_to": date_to
         }
+        if search_result:
+            response["facets"] = search_result.facets
+        return response
         
     except Exception as e:
         import traceback
@@ -616,17 +526,23 @@ async def get_catalog_items(
     
     params = {}
     
+    search_ids = None
     if search:
-        sql += " AND (p.name LIKE :search OR p.sku LIKE :search)"
-        params['search'] = f"%{search}%"
+        search_ids = get_product_search().search(db, search).ids
+        if not search_ids:
+            return []
+        sql += " AND p.product_id IN :search_ids"
+        params['search_ids'] = search_ids
     
     if category:
         sql += " AND (p.category_name LIKE :category OR p.subcategory_name LIKE :category)"
         params['category'] = f"%{category}%"
     
-    sql += f" ORDER BY p.product_id DESC LIMIT {limit}"
-    
-    result = db.execute(text(sql), params)
+    if search_ids:
+        result = rank_rows(db.execute(search_text(sql, params), params).fetchall(), search_ids)[:limit]
+    else:
+        sql += f" ORDER BY p.product_id DESC LIMIT {limit}"
+        result = db.execute(text(sql), params)
     
     # Оптимізація: отримати статистику для всіх товарів одним запитом
     reserved_dict = {}
@@ -769,7 +685,7 @@ async def get_catalog_items(
             } if family_id else None
         })
     
-    return items
+    return attach_image_variants(db, items, url_key="image")
 
 
 
@@ -886,17 +802,23 @@ async def get_products_lite(
     """
     params = {}
     
+    search_ids = None
     if search:
-        sql += " AND (p.name LIKE :search OR p.sku LIKE :search)"
-        params['search'] = f"%{search}%"
+        search_ids = get_product_search().search(db, search).ids
+        if not search_ids:
+            return []
+        sql += " AND p.product_id IN :search_ids"
+        params['search_ids'] = search_ids
     
     if category:
         sql += " AND (p.category_name LIKE :category OR p.subcategory_name LIKE :category)"
         params['category'] = f"%{category}%"
     
-    sql += f" ORDER BY p.product_id DESC LIMIT {limit}"
-    
-    result = db.execute(text(sql), params).fetchall()
+    if search_ids:
+        result = rank_rows(db.execute(search_text(sql, params), params).fetchall(), search_ids)[:limit]
+    else:
+        sql += f" ORDER BY p.product_id DESC LIMIT {limit}"
+        result = db.execute(text(sql), params).fetchall()
     
     items = []
     for row in result:
@@ -914,7 +836,61 @@ async def get_products_lite(
             "quantity": row[7] or 0
         })
     
-    return items
+    return attach_image_variants(db, items, url_key="image", thumb_width=160)
+
+
+@router.get("/search")
+async def search_catalog(
+    q: str = "",
+    category: str = None,
+    subcategory: str = None,
+    color: str = None,
+    material: str = None,
+    include_inactive: bool = False,
+    limit: int = 50,
+    db: Session = Depends(get_rh_db)
+):
+    """
+    Ранжований пошук по індексу товарів + фасети (category / color / material).
+    color / material - через кому, як у items-by-category.
+    """
+    result = get_product_search().search(
+        db, q,
+        category=category, subcategory=subcategory,
+        colors=[c.strip() for c in color.split(',')] if color else (),
+        materials=[m.strip() for m in material.split(',')] if material else (),
+        active_only=not include_inactive,
+        limit=limit,
+    )
+    items = []
+    if result.ids:
+        rows = db.execute(text("""
+            SELECT p.product_id, p.sku, p.name, p.image_url, p.category_name, p.subcategory_name,
+                   p.color, p.material, p.quantity, p.rental_price
+            FROM products p
+            WHERE p.product_id IN :ids
+        """), {"ids": tuple(result.ids)}).fetchall()
+        for row in rank_rows(rows, result.ids):
+            items.append({
+                "product_id": row[0],
+                "sku": row[1],
+                "name": row[2],
+                "image": normalize_image_url(row[3]),
+                "category": row[4],
+                "subcategory": row[5],
+                "color": row[6],
+                "material": row[7],
+                "quantity": row[8] or 0,
+                "rental_price": float(row[9]) if row[9] else 0.0,
+                "score": round(result.scores.get(row[0], 0.0), 3)
+            })
+    attach_image_variants(db, items, url_key="image", thumb_width=160)
+    return {
+        "items": items,
+        "total": result.total,
+        "facets": result.facets,
+        "took_ms": round(result.took_ms, 2)
+    }
 
 
 @router.get("/families")
@@ -2,7 +2,7 @@
 Client Users API - CRUD для клієнтів/контактів
 Один email = один клієнт
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import Optional, List
@@ -11,6 +11,10 @@ from datetime import datetime
 import logging
 
 from database_rentalhub import get_rh_db
+from services.client_summary import (
+    TERM_NAME, email_key as summary_email_key, ensure_fresh as ensure_client_summary,
+    is_agreement_active, phone_key as summary_phone_key, search_condition,
+)
 
 router = APIRouter(prefix="/api/clients", tags=["clients"])
 logger = logging.getLogger(__name__)
@@ -97,14 +101,21 @@ class ClientResponse(BaseModel):
 
 @router.get("")
 async def list_clients(
+    response: Response,
     search: Optional[str] = None,
     source: Optional[str] = None,
     has_payer: Optional[bool] = None,
     skip: int = 0,
     limit: int = 500,  # Збільшено ліміт для завантаження всіх клієнтів
+    cursor: Optional[str] = None,
     db: Session = Depends(get_rh_db)
 ):
-    """Список клієнтів з пошуком та фільтрами"""
+    """
+    Список клієнтів з пошуком та фільтрами - з проєкції client_summary.
+    Keyset-пагінація: наступна сторінка - ?cursor=<X-Next-Cursor попередньої відповіді>
+    (skip лишається для сумісності).
+    """
+    ensure_client_summary(db)
     
     sql = """
         SELECT 
@@ -112,46 +123,52 @@ async def list_clients(
             c.company_hint, c.source, c.notes, c.preferred_contact,
             c.is_active, c.created_at, c.updated_at,
             c.payer_type, c.tax_id, c.bank_details,
-            COUNT(DISTINCT o.order_id) as orders_count,
-            COUNT(DISTINCT cpl.payer_profile_id) as payers_count,
-            (SELECT payer_profile_id FROM client_payer_links 
-             WHERE client_user_id = c.id AND is_default = TRUE LIMIT 1) as default_payer_id,
-            ma.id as ma_id, ma.contract_number as ma_number, ma.status as ma_status,
+            cs.orders_count, cs.payers_count, cs.default_payer_id,
+            cs.ma_id, cs.ma_number, cs.ma_status,
             c.is_regular, c.company, c.rating, c.rating_labels, c.internal_notes,
-            c.total_revenue, c.last_order_date, c.instagram
-        FROM client_users c
-        LEFT JOIN orders o ON o.client_user_id = c.id
-        LEFT JOIN client_payer_links cpl ON cpl.client_user_id = c.id
-        LEFT JOIN master_agreements ma ON ma.client_user_id = c.id 
-            AND ma.status IN ('draft', 'sent', 'signed')
-            AND (ma.valid_until IS NULL OR ma.valid_until >= CURDATE())
+            cs.total_revenue, cs.last_order_date, c.instagram,
+            cs.ma_valid_until, cs.default_payer_name, cs.sort_at
+        FROM client_summary cs
+        JOIN client_users c ON c.id = cs.client_user_id
         WHERE 1=1
     """
     params = {}
     
     if search:
-        sql += """ AND (
-            c.email LIKE :search OR 
-            c.full_name LIKE :search OR 
-            c.phone LIKE :search OR
-            c.company_hint LIKE :search OR
-            c.company LIKE :search OR
-            c.instagram LIKE :search
-        )"""
-        params["search"] = f"%{search}%"
+        condition, search_params = search_condition(search)
+        if condition:
+            sql += f" AND {condition}"
+            params.update(search_params)
     
     if source:
-        sql += " AND c.source = :source"
+        sql += " AND cs.source = :source"
         params["source"] = source
     
-    sql += " GROUP BY c.id ORDER BY c.updated_at DESC LIMIT :limit OFFSET :skip"
+    if has_payer is not None:
+        sql += " AND cs.payers_count > 0" if has_payer else " AND cs.payers_count = 0"
+    
+    if cursor:
+        try:
+            cursor_at, cursor_id = cursor.rsplit("|", 1)
+            params["cursor_at"] = datetime.fromisoformat(cursor_at)
+            params["cursor_id"] = int(cursor_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Невірний cursor")
+        sql += """ AND (cs.sort_at < :cursor_at
+                        OR (cs.sort_at = :cursor_at AND cs.client_user_id < :cursor_id))"""
+    
+    sql += " ORDER BY cs.sort_at DESC, cs.client_user_id DESC LIMIT :limit"
     params["limit"] = limit
-    params["skip"] = skip
+    if skip and not cursor:
+        sql += " OFFSET :skip"
+        params["skip"] = skip
     
-    result = db.execute(text(sql), params)
+    rows = db.execute(text(sql), params).fetchall()
+    if len(rows) == limit and rows[-1][31]:
+        response.headers["X-Next-Cursor"] = f"{rows[-1][31].isoformat()}|{rows[-1][0]}"
     
     clients = []
-    for row in result:
+    for row in rows:
         import json as json_lib
         bank_details = None
         if row[14]:
@@ -160,6 +177,9 @@ async def list_clients(
             except:
                 pass
         
+        # Договір, чинність якого минула після останнього перерахунку, не показуємо
+        has_agreement = is_agreement_active(row[20], row[29])
+        
         clients.append({
             "id": row[0],
             "email": row[1],
@@ -179,9 +199,10 @@ async def list_clients(
             "orders_count": row[15] or 0,
             "payers_count": row[16] or 0,
             "default_payer_id": row[17],
-            "has_agreement": bool(row[18]),
-            "agreement_number": row[19],
-            "agreement_status": row[20],
+            "default_payer_name": row[30],
+            "has_agreement": has_agreement,
+            "agreement_number": row[19] if has_agreement else None,
+            "agreement_status": row[20] if has_agreement else None,
             "is_regular": bool(row[21]) if row[21] is not None else False,
             "company": row[22],
             "rating": row[23] or 0,
@@ -192,13 +213,6 @@ async def list_clients(
             "instagram": row[28]
         })
     
-    # Фільтр has_payer після агрегації
-    if has_payer is not None:
-        if has_payer:
-            clients = [c for c in clients if c["payers_count"] > 0]
-        else:
-            clients = [c for c in clients if c["payers_count"] == 0]
-    
     return clients
 
 
@@ -220,46 +234,46 @@ async def find_client_match(
     if not name and not phone and not email:
         return {"found": False, "message": "Вкажіть name, phone або email"}
     
-    # Normalize phone (remove spaces, dashes, +38)
-    if phone:
-        phone_clean = phone.replace(" ", "").replace("-", "").replace("+38", "").replace("+", "")
-        if len(phone_clean) == 10:
-            phone_clean = phone_clean  # Ukrainian format without country code
-        phone_pattern = f"%{phone_clean[-9:]}%"  # Last 9 digits
+    ensure_client_summary(db)
     
     sql = """
         SELECT 
             c.id, c.email, c.full_name, c.phone, c.payer_type, c.tax_id,
-            ma.id as ma_id, ma.contract_number as ma_number, ma.status as ma_status
-        FROM client_users c
-        LEFT JOIN master_agreements ma ON ma.client_user_id = c.id 
-            AND ma.status IN ('draft', 'sent', 'signed')
-            AND (ma.valid_until IS NULL OR ma.valid_until >= CURDATE())
-        WHERE c.is_active = 1 AND (
+            cs.ma_id, cs.ma_number, cs.ma_status, cs.ma_valid_until
+        FROM client_summary cs
+        JOIN client_users c ON c.id = cs.client_user_id
+        WHERE cs.is_active = 1 AND (
     """
     
     conditions = []
     params = {}
     
-    if email:
-        conditions.append("LOWER(TRIM(c.email)) = LOWER(TRIM(:email))")
-        params["email"] = email
+    if email and summary_email_key(email):
+        conditions.append("cs.email_key = :email")
+        params["email"] = summary_email_key(email)
     
-    if phone:
-        conditions.append("c.phone LIKE :phone")
-        params["phone"] = phone_pattern
+    # Телефон - за останніми 9 цифрами (без +38 / 0)
+    if phone and summary_phone_key(phone):
+        conditions.append("cs.phone_key = :phone")
+        params["phone"] = summary_phone_key(phone)
     
     if name:
-        # Fuzzy match by name
-        conditions.append("c.full_name LIKE :name")
-        params["name"] = f"%{name}%"
+        # Усі слова імені - префікси термів імені (у транслітерації)
+        condition, name_params = search_condition(name, kinds=(TERM_NAME,))
+        if condition:
+            conditions.append(f"({condition})")
+            params.update(name_params)
+    
+    if not conditions:
+        return {"found": False, "message": "Клієнта не знайдено"}
     
-    sql += " OR ".join(conditions) + ") ORDER BY c.updated_at DESC LIMIT 5"
+    sql += " OR ".join(conditions) + ") ORDER BY cs.sort_at DESC LIMIT 5"
     
     result = db.execute(text(sql), params)
     matches = []
     
     for row in result:
+        has_agreement = is_agreement_active(row[8], row[9])
         matches.append({
             "id": row[0],
             "email": row[1],
@@ -267,9 +281,9 @@ async def find_client_match(
             "phone": row[3],
             "payer_type": row[4] or "individual",
             "tax_id": row[5],
-            "has_agreement": bool(row[6]),
-            "agreement_number": row[7],
-            "agreement_status": row[8]
+            "has_agreement": has_agreement,
+            "agreement_number": row[7] if has_agreement else None,
+            "agreement_status": row[8] if has_agreement else None
         })
     
     if matches:
@@ -17,6 +17,7 @@ import json
 import os
 
 from database_rentalhub import get_rh_db
+from services.notification_outbox import enqueue_email, result_hook
 
 router = APIRouter(prefix="/api/documents", tags=["document-email"])
 
@@ -56,10 +57,11 @@ async def send_document_email(
 ):
     """
     Send document via email with PDF/HTML attachment.
-    Logs the send in document_emails table for audit.
-    Uses configurable email provider (Resend/SendGrid/Dummy).
+    The email is queued in notification_outbox and returned immediately;
+    the final result is logged in document_emails table for audit.
+    Uses configurable email provider (SMTP/Resend/SendGrid/Dummy).
     """
-    from services.email_provider import get_email_provider, EmailResult
+    from services.email_provider import get_email_provider
     
     # Get document info
     doc = db.execute(text("""
@@ -103,61 +105,64 @@ async def send_document_email(
     </div>
     """
     
-    # Send email via provider
+    # Queue email via provider (sent by the notification_outbox dispatcher)
     provider = get_email_provider()
-    result: EmailResult = await provider.send(
-        to=request.to,
-        subject=subject,
-        html=html_body,
-        cc=request.cc
-    )
-    
-    # Log the email send attempt
-    try:
-        db.execute(text("""
-            INSERT INTO document_emails (
-                document_id, sent_to, subject, message,
-                sent_at, document_version, sent_by_user_id, sent_by_user_name,
-                status, provider, provider_email_id
-            ) VALUES (
-                :doc_id, :to, :subject, :message,
-                NOW(), :version, :user_id, :user_name,
-                :status, :provider, :provider_id
-            )
-        """), {
-            "doc_id": document_id,
-            "to": request.to,
-            "subject": subject,
+    outbox_id = enqueue_email(
+        db, request.to, subject, html_body,
+        cc=request.cc,
+        provider=provider.name,
+        result_hook="document_emails",
+        hook_data={
+            "document_id": document_id,
             "message": message,
             "version": doc_version,
             "user_id": request.sent_by_user_id,
-            "user_name": request.sent_by_user_name,
-            "status": "sent" if result.success else "failed",
-            "provider": result.provider,
-            "provider_id": result.email_id
-        })
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        # Still return success if email was sent but logging failed
-    
-    if not result.success:
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Email sending failed: {result.error}"
-        )
+            "user_name": request.sent_by_user_name
+        }
+    )
+    db.commit()
     
     return {
         "success": True,
+        "queued": True,
+        "outbox_id": outbox_id,
         "document_id": document_id,
         "sent_to": request.to,
         "subject": subject,
         "document_version": doc_version,
-        "provider": result.provider,
-        "email_id": result.email_id
+        "provider": provider.name,
+        "email_id": None
     }
 
 
+@result_hook("document_emails")
+def log_document_email(db: Session, message, outcome):
+    """Log the final send result in document_emails (audit trail)"""
+    data = message.hook_data
+    db.execute(text("""
+        INSERT INTO document_emails (
+            document_id, sent_to, subject, message,
+            sent_at, document_version, sent_by_user_id, sent_by_user_name,
+            status, provider, provider_email_id
+        ) VALUES (
+            :doc_id, :to, :subject, :message,
+            NOW(), :version, :user_id, :user_name,
+            :status, :provider, :provider_id
+        )
+    """), {
+        "doc_id": data.get("document_id"),
+        "to": message.recipient,
+        "subject": message.subject,
+        "message": data.get("message"),
+        "version": data.get("version") or 1,
+        "user_id": data.get("user_id"),
+        "user_name": data.get("user_name"),
+        "status": "sent" if outcome.success else "failed",
+        "provider": outcome.provider,
+        "provider_id": outcome.provider_message_id
+    })
+
+
 class SendPreviewEmailRequest(BaseModel):
     to: str
     subject: str
@@ -176,9 +181,9 @@ async def send_preview_email(
     """
     Send document preview email directly (without saving document to DB).
     Useful for sending quotes and draft documents.
-    Still logs the send for audit purposes.
+    Queued like send-email; still logs the send for audit purposes.
     """
-    from services.email_provider import get_email_provider, EmailResult
+    from services.email_provider import get_email_provider
     
     # Build HTML email wrapper
     html_body = f"""
@@ -195,53 +200,30 @@ async def send_preview_email(
     </div>
     """
     
-    # Send email via provider
+    # Queue email via provider (sent by the notification_outbox dispatcher)
     provider = get_email_provider()
-    result: EmailResult = await provider.send(
-        to=request.to,
-        subject=request.subject,
-        html=html_body
-    )
-    
-    # Log the send (without document_id)
-    try:
-        db.execute(text("""
-            INSERT INTO document_emails (
-                document_id, sent_to, subject, message,
-                sent_at, document_version, sent_by_user_id, sent_by_user_name,
-                status, provider, provider_email_id
-            ) VALUES (
-                :doc_id, :to, :subject, :message,
-                NOW(), 1, :user_id, :user_name,
-                :status, :provider, :provider_id
-            )
-        """), {
-            "doc_id": f"preview_{request.doc_type or 'unknown'}_{request.order_id or 0}",
-            "to": request.to,
-            "subject": request.subject,
+    outbox_id = enqueue_email(
+        db, request.to, request.subject, html_body,
+        provider=provider.name,
+        result_hook="document_emails",
+        hook_data={
+            "document_id": f"preview_{request.doc_type or 'unknown'}_{request.order_id or 0}",
             "message": "Preview email",
+            "version": 1,
             "user_id": request.sent_by_user_id,
-            "user_name": request.sent_by_user_name,
-            "status": "sent" if result.success else "failed",
-            "provider": result.provider,
-            "provider_id": result.email_id
-        })
-        db.commit()
-    except Exception as e:
-        db.rollback()
-    
-    if not result.success:
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Email sending failed: {result.error}"
-        )
+            "user_name": request.sent_by_user_name
+        }
+    )
+    db.commit()
     
     return {
         "success": True,
+        "queued": True,
+        "outbox_id": outbox_id,
         "sent_to": request.to,
         "subject": request.subject,
-        "provider": result.provider,
-        "email_id": result.email_id
+        "provider": provider.name,
+        "email_id": None
     }
 
 
@@ -16,6 +16,7 @@ from datetime import datetime
 from typing import Optional, Dict, Any
 from pydantic import BaseModel
 import os
+import shutil
 import uuid
 
 from database_rentalhub import get_rh_db
@@ -25,6 +26,7 @@ from routes.document_render import (
     DOCUMENT_TEMPLATES,
     get_watermark_text
 )
+from services.pdf_render_service import get_pdf_render_service, PdfQueueFull, PdfRenderTimeout
 
 router = APIRouter(prefix="/api/documents", tags=["document-pdf"])
 
@@ -96,24 +98,26 @@ def html_to_pdf(html_content: str, output_path: str) -> bool:
         return False
 
 
-# ============================================================
-# API ENDPOINTS
-# ============================================================
+async def html_to_pdf_async(html_content: str, output_path: str) -> bool:
+    """html_to_pdf через пул рендеру: event loop не блокується, однаковий HTML береться з кешу"""
+    if not WEASYPRINT_AVAILABLE:
+        return html_to_pdf(html_content, output_path)
+    try:
+        cached_path = await get_pdf_render_service().render(html_content)
+    except PdfQueueFull:
+        raise HTTPException(status_code=503, detail="PDF render queue is full, try again later")
+    except PdfRenderTimeout:
+        raise HTTPException(status_code=504, detail="PDF render timed out")
+    except Exception as e:
+        print(f"PDF generation error: {e}")
+        return False
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    shutil.copyfile(cached_path, output_path)
+    return True
 
-@router.post("/generate-pdf")
-async def generate_pdf(
-    request: GeneratePdfRequest,
-    db: Session = Depends(get_rh_db)
-):
-    """
-    Generate PDF document from template.
-    
-    1. Builds context from database
-    2. Renders HTML template
-    3. Converts to PDF (if WeasyPrint available)
-    4. Stores file and returns URL
-    """
-    
+
+def render_document_html(request: GeneratePdfRequest, db: Session):
+    """Контекст + шаблон -> (html_content, doc_number)"""
     if request.doc_type not in DOCUMENT_TEMPLATES:
         raise HTTPException(
             status_code=400,
@@ -140,13 +144,36 @@ async def generate_pdf(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Template error: {str(e)}")
     
-    # Generate filename and path
     doc_number = context["meta"].get("doc_number", str(uuid.uuid4())[:8])
+    return html_content, doc_number
+
+
+# ============================================================
+# API ENDPOINTS
+# ============================================================
+
+@router.post("/generate-pdf")
+async def generate_pdf(
+    request: GeneratePdfRequest,
+    db: Session = Depends(get_rh_db)
+):
+    """
+    Generate PDF document from template.
+    
+    1. Builds context from database
+    2. Renders HTML template
+    3. Converts to PDF (if WeasyPrint available)
+    4. Stores file and returns URL
+    """
+    
+    html_content, doc_number = render_document_html(request, db)
+    
+    # Generate filename and path
     filename = generate_pdf_filename(request.doc_type, doc_number)
     output_path = os.path.join(PDF_STORAGE_DIR, filename)
     
     # Convert to PDF
-    pdf_success = html_to_pdf(html_content, output_path)
+    pdf_success = await html_to_pdf_async(html_content, output_path)
     
     # Build response
     if pdf_success:
@@ -199,13 +226,58 @@ async def download_document(year: str, filename: str):
     )
 
 
+@router.post("/pdf-jobs")
+async def submit_pdf_job(
+    request: GeneratePdfRequest,
+    db: Session = Depends(get_rh_db)
+):
+    """
+    Queue PDF rendering in the background.
+    Poll GET /pdf-jobs/{job_id} for status, then download GET /pdf-jobs/{job_id}/file.
+    """
+    if not WEASYPRINT_AVAILABLE:
+        raise HTTPException(status_code=503, detail="WeasyPrint not available")
+    
+    html_content, doc_number = render_document_html(request, db)
+    try:
+        job = get_pdf_render_service().submit(html_content)
+    except PdfQueueFull:
+        raise HTTPException(status_code=503, detail="PDF render queue is full, try again later")
+    
+    return {**job.to_dict(), "doc_type": request.doc_type, "doc_number": doc_number}
+
+
+@router.get("/pdf-jobs/{job_id}")
+async def get_pdf_job(job_id: str):
+    """PDF render job status: queued, rendering, done, failed, timeout"""
+    job = get_pdf_render_service().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    result = job.to_dict()
+    if job.status == "done":
+        result["file_url"] = f"/api/documents/pdf-jobs/{job_id}/file"
+    return result
+
+
+@router.get("/pdf-jobs/{job_id}/file")
+async def download_pdf_job(job_id: str):
+    """Download rendered PDF of a finished job"""
+    job = get_pdf_render_service().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "done" or not job.path or not os.path.exists(job.path):
+        raise HTTPException(status_code=409, detail=f"Job is not ready: {job.status}")
+    return FileResponse(path=job.path, media_type="application/pdf", filename=f"{job_id}.pdf")
+
+
 @router.get("/status")
 async def get_pdf_status():
     """Check PDF generation capabilities"""
     return {
         "weasyprint_available": WEASYPRINT_AVAILABLE,
         "storage_dir": PDF_STORAGE_DIR,
-        "storage_exists": os.path.exists(PDF_STORAGE_DIR)
+        "storage_exists": os.path.exists(PDF_STORAGE_DIR),
+        "render_pool": get_pdf_render_service().stats()
     }
 
 
@@ -2,7 +2,7 @@
 Documents API - генерація, перегляд та управління документами
 """
 from fastapi import APIRouter, Depends, HTTPException, Response, Query
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, FileResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime
@@ -37,7 +37,9 @@ def _email_to_name(val: str) -> str:
     return val
 from services.doc_engine.registry import DOC_REGISTRY, get_doc_config, get_docs_for_entity
 from services.doc_engine.data_builders import build_document_data
-from services.doc_engine.render import render_html, render_pdf, get_template_path
+from services.doc_engine.render import render_html, render_pdf, get_template_path, PRINT_CSS, WEASYPRINT_AVAILABLE
+from services.pdf_render_service import get_pdf_render_service, PdfQueueFull, PdfRenderTimeout
+from services.notification_outbox import result_hook
 from services.doc_engine.numbering import generate_doc_number
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
@@ -201,11 +203,20 @@ async def download_pdf(document_id: str, db: Session = Depends(get_rh_db)):
     if not doc:
         raise HTTPException(status_code=404, detail="Документ не знайдено")
     
-    # Генеруємо PDF з HTML
-    pdf_bytes = render_pdf(doc["html_content"])
-    
     filename = f"{doc['doc_number']}.pdf"
     
+    # Генеруємо PDF з HTML у пулі рендеру (незмінений документ віддається з файлового кешу)
+    if WEASYPRINT_AVAILABLE:
+        try:
+            pdf_path = await get_pdf_render_service().render(doc["html_content"], css=PRINT_CSS)
+        except PdfQueueFull:
+            raise HTTPException(status_code=503, detail="Черга генерації PDF заповнена, спробуйте пізніше")
+        except PdfRenderTimeout:
+            raise HTTPException(status_code=504, detail="Генерація PDF перевищила час очікування")
+        return FileResponse(path=pdf_path, media_type="application/pdf", filename=filename)
+    
+    pdf_bytes = render_pdf(doc["html_content"])
+    
     return Response(
         content=pdf_bytes,
         media_type="application/pdf",
@@ -395,8 +406,9 @@ async def send_document_email(
     """
     Відправляє документ на email як HTML в тілі листа.
     Відправляється тільки сам документ без додаткових обгорток.
+    Лист ставиться в чергу notification_outbox, document_email_log пишеться після доставки.
     """
-    from services.email_service import send_email
+    from services.email_service import queue_email
     
     doc = get_document_by_id(db, document_id)
     if not doc:
@@ -411,36 +423,48 @@ async def send_document_email(
     doc_type_name = DOC_REGISTRY.get(doc["doc_type"], {}).get("name", doc["doc_type"])
     subject = f"FarforDecorOrenda - {doc_type_name} {doc['doc_number']}"
     
-    try:
-        result = send_email(
-            to_email=request.email,
-            subject=subject,
-            html_content=html_content  # Відправляємо документ як є
-        )
-        
-        if not result["success"]:
-            raise Exception(result["message"])
-        
-        # Логуємо відправку
-        db.execute(text("""
-            INSERT INTO document_email_log (document_id, email, sent_at, status)
-            VALUES (:doc_id, :email, NOW(), 'sent')
-        """), {"doc_id": document_id, "email": request.email})
-        db.commit()
-        
-        return {"success": True, "message": f"Документ відправлено на {request.email}"}
-    except Exception as e:
+    result = queue_email(
+        db,
+        to_email=request.email,
+        subject=subject,
+        html_content=html_content,  # Відправляємо документ як є
+        result_hook="document_email_log",
+        hook_data={"document_id": document_id}
+    )
+    
+    if not result["success"]:
         # Логуємо помилку
         try:
             db.execute(text("""
                 INSERT INTO document_email_log (document_id, email, sent_at, status, error)
                 VALUES (:doc_id, :email, NOW(), 'failed', :error)
-            """), {"doc_id": document_id, "email": request.email, "error": str(e)})
+            """), {"doc_id": document_id, "email": request.email, "error": result["message"]})
             db.commit()
         except:
             pass
         
-        raise HTTPException(status_code=500, detail=f"Помилка відправки email: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Помилка відправки email: {result['message']}")
+    
+    db.commit()
+    return {
+        "success": True,
+        "message": f"Документ поставлено в чергу на {request.email}",
+        "outbox_id": result["outbox_id"]
+    }
+
+
+@result_hook("document_email_log")
+def log_document_email(db: Session, message, outcome):
+    """Фінальний результат відправки документа з черги -> document_email_log"""
+    db.execute(text("""
+        INSERT INTO document_email_log (document_id, email, sent_at, status, error)
+        VALUES (:doc_id, :email, NOW(), :status, :error)
+    """), {
+        "doc_id": message.hook_data.get("document_id"),
+        "email": message.recipient,
+        "status": "sent" if outcome.success else "failed",
+        "error": outcome.error
+    })
 
 
 @router.post("/{document_id}/regenerate")
@@ -1177,7 +1201,7 @@ class SendEstimateEmailRequest(BaseModel):
 @router.post("/estimate/{order_id}/send-email")
 async def send_estimate_email(order_id: int, request: SendEstimateEmailRequest, db: Session = Depends(get_rh_db)):
     """Send estimate (Кошторис) via email"""
-    from services.email_service import send_document_email
+    from services.email_service import queue_document_email
     
     order, items = _get_order_with_items(db, order_id)
     if not order:
@@ -1278,8 +1302,9 @@ async def send_estimate_email(order_id: int, request: SendEstimateEmailRequest,
     template = jinja_env.get_template("documents/quote_email.html")
     html_content = template.render(**template_data)
     
-    # Send email
-    result = send_document_email(
+    # Поставити email в чергу (відправить диспетчер notification_outbox)
+    result = queue_document_email(
+        db,
         to_email=request.recipient_email,
         document_type="estimate",
         document_html=html_content,
@@ -1290,7 +1315,12 @@ async def send_estimate_email(order_id: int, request: SendEstimateEmailRequest,
     if not result["success"]:
         raise HTTPException(status_code=500, detail=result["message"])
     
-    return {"success": True, "message": f"Кошторис відправлено на {request.recipient_email}"}
+    db.commit()
+    return {
+        "success": True,
+        "message": f"Кошторис поставлено в чергу на {request.recipient_email}",
+        "outbox_id": result["outbox_id"]
+    }
 
 
 # ============================================================
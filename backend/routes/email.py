@@ -11,6 +11,7 @@ from email.mime.multipart import MIMEMultipart
 import os
 
 from database import get_db
+from database_rentalhub import get_rh_db
 from models_sqlalchemy import OpenCartOrder
 
 router = APIRouter(prefix="/api/email", tags=["email"])
@@ -144,7 +145,7 @@ class SendDocumentByTypeRequest(BaseModel):
 
 
 @router.post("/send-document")
-async def send_document_to_client(request: SendDocumentRequest):
+async def send_document_to_client(request: SendDocumentRequest, rh_db: Session = Depends(get_rh_db)):
     """
     Відправити документ клієнту на email (з готовим HTML)
     
@@ -152,8 +153,10 @@ async def send_document_to_client(request: SendDocumentRequest):
     - document_html: HTML вміст документа
     - order_number: Номер замовлення
     - customer_name: Ім'я клієнта (опціонально)
+    
+    Лист ставиться в чергу notification_outbox, відповідь повертається одразу.
     """
-    from services.email_service import send_document_email
+    from services.email_service import queue_document_email
     
     if not request.to_email:
         raise HTTPException(status_code=400, detail="Email не вказано")
@@ -161,7 +164,8 @@ async def send_document_to_client(request: SendDocumentRequest):
     if not request.document_html:
         raise HTTPException(status_code=400, detail="Документ порожній")
     
-    result = send_document_email(
+    result = queue_document_email(
+        rh_db,
         to_email=request.to_email,
         document_type=request.document_type,
         document_html=request.document_html,
@@ -172,6 +176,7 @@ async def send_document_to_client(request: SendDocumentRequest):
     if not result["success"]:
         raise HTTPException(status_code=500, detail=result["message"])
     
+    rh_db.commit()
     return result
 
 
@@ -185,7 +190,7 @@ async def send_document_by_type(request: SendDocumentByTypeRequest):
     - entity_type: 'order' або 'issue'
     - recipient_email: Email отримувача
     """
-    from services.email_service import send_document_email
+    from services.email_service import queue_document_email
     from services.doc_engine.data_builders import build_document_data
     from services.doc_engine.generator import generate_document_html
     from database_rentalhub import get_rh_db_sync
@@ -205,14 +210,17 @@ async def send_document_by_type(request: SendDocumentByTypeRequest):
         if not order_number and doc_data:
             order_number = doc_data.get('order', {}).get('order_number', request.entity_id)
         
-        # Відправляємо email
-        result = send_document_email(
+        # Ставимо email в чергу (відправить диспетчер notification_outbox)
+        result = queue_document_email(
+            db,
             to_email=request.recipient_email,
             document_type=request.doc_type,
             document_html=html_content,
             order_number=order_number or request.entity_id,
             customer_name=request.recipient_name
         )
+        if result["success"]:
+            db.commit()
         
         db.close()
         
@@ -221,7 +229,8 @@ async def send_document_by_type(request: SendDocumentByTypeRequest):
         
         return {
             "success": True,
-            "message": f"Документ відправлено на {request.recipient_email}"
+            "message": f"Документ поставлено в чергу на {request.recipient_email}",
+            "outbox_id": result["outbox_id"]
         }
         
     except HTTPException:
@@ -250,3 +259,40 @@ async def test_smtp_connection():
         "smtp_port": SMTP_PORT,
         "from_email": SMTP_FROM_EMAIL
     }
+
+
+@router.get("/outbox")
+async def get_outbox_status(rh_db: Session = Depends(get_rh_db)):
+    """
+    Стан черги notification_outbox: кількість по статусах і останні помилки
+    """
+    from sqlalchemy import text
+    from services.notification_outbox import ensure_outbox_table
+    
+    ensure_outbox_table(rh_db)
+    counts = rh_db.execute(text("""
+        SELECT channel, status, COUNT(*) FROM notification_outbox GROUP BY channel, status
+    """)).fetchall()
+    failed = rh_db.execute(text("""
+        SELECT id, channel, provider, recipient, subject, attempts, last_error, created_at
+        FROM notification_outbox
+        WHERE status = 'failed'
+        ORDER BY id DESC
+        LIMIT 20
+    """)).fetchall()
+    
+    by_status = {}
+    for channel, status, count in counts:
+        by_status.setdefault(channel, {})[status] = count
+    
+    return {
+        "counts": by_status,
+        "recent_failed": [
+            {
+                "id": row[0], "channel": row[1], "provider": row[2], "recipient": row[3],
+                "subject": row[4], "attempts": row[5], "error": row[6],
+                "created_at": row[7].isoformat() if row[7] else None
+            }
+            for row in failed
+        ]
+    }
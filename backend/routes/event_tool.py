@@ -6,18 +6,30 @@ Event Tool API Routes
 from fastapi import APIRouter, Depends, HTTPException, status, Header, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import List, Optional
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from datetime import datetime, timedelta, date
 from pydantic import BaseModel
 import uuid
+import hashlib
 import logging
 import os
 import json
+import threading
 from functools import lru_cache
 import time
 
 from database_rentalhub import get_rh_db
 from utils.image_helper import normalize_image_url
+from services.image_derivatives import attach_image_variants
+from services.product_search import get_product_search, rank_rows, search_text
+from services.soft_reservations import ensure_reservation_schema, release_board_holds, sync_board_holds
+from services.availability_engine import (
+    get_availability_engine,
+    STATUS_RESERVED,
+    STATUS_IN_RENT,
+    STATUS_ACTIVE,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -152,25 +164,106 @@ def decode_token(token: str) -> dict:
         logger.error(f"JWT decode error: {e}")
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# ============================================================================
+# PRINCIPAL CACHE (токен -> декоратор)
+# ============================================================================
+
+PRINCIPAL_CACHE_TTL = int(os.environ.get("EVENT_PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_SIZE = 5000
+
+
+class PrincipalCache:
+    """
+    Декоратор за токеном на короткий TTL (не довше за exp токена), щоб кожен запит
+    Event Tool не робив decode + SELECT event_customers. Ключ - sha256 токена.
+    """
+
+    def __init__(self, ttl: int = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_SIZE, clock=time.time):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # token id -> (expires_at, customer)
+        self._by_customer: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def token_id(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self.token_id(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self._clock():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry[1])
+
+    def put(self, token: str, customer: dict, token_exp: Optional[float] = None):
+        if self.ttl <= 0:
+            return
+        key = self.token_id(token)
+        expires_at = self._clock() + self.ttl
+        if token_exp:
+            expires_at = min(expires_at, float(token_exp))
+        with self._lock:
+            self._entries[key] = (expires_at, dict(customer))
+            self._entries.move_to_end(key)
+            self._by_customer.setdefault(customer["customer_id"], set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_customer(self, customer_id: int):
+        """Скинути всі токени декоратора (зміна профілю / деактивація)"""
+        with self._lock:
+            for key in list(self._by_customer.get(customer_id, ())):
+                self._drop(key)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_customer.get(entry[1]["customer_id"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_customer[entry[1]["customer_id"]]
+
+
+principal_cache = PrincipalCache()
+
+
 def get_current_customer(token: str, db: Session):
     """Отримати поточного користувача з токена"""
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
+
     payload = decode_token(token)
     customer_id = payload.get("sub")
     if not customer_id:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    result = db.execute(text("SELECT * FROM event_customers WHERE customer_id = :id"), {"id": customer_id})
+    result = db.execute(text("""
+        SELECT customer_id, email, firstname, lastname, telephone
+        FROM event_customers WHERE customer_id = :id
+    """), {"id": customer_id})
     row = result.fetchone()
     if not row:
         raise HTTPException(status_code=401, detail="Customer not found")
     
-    return {
+    customer = {
         "customer_id": row[0],
         "email": row[1],
-        "firstname": row[3],
-        "lastname": row[4],
-        "telephone": row[5]
+        "firstname": row[2],
+        "lastname": row[3],
+        "telephone": row[4]
     }
+    principal_cache.put(token, customer, payload.get("exp"))
+    return customer
 
 def get_token_from_header(authorization: Optional[str] = Header(None)) -> str:
     """Витягти токен з Authorization header"""
@@ -245,25 +338,8 @@ def init_event_tables(db: Session):
         )
     """))
     
-    # Soft Reservations (тимчасові резервації в мудбордах)
-    db.execute(text("""
-        CREATE TABLE IF NOT EXISTS event_soft_reservations (
-            id VARCHAR(36) PRIMARY KEY,
-            board_id VARCHAR(36) NOT NULL,
-            product_id INT NOT NULL,
-            quantity INT NOT NULL,
-            reserved_from DATE NOT NULL,
-            reserved_until DATE NOT NULL,
-            expires_at DATETIME NOT NULL,
-            customer_id INT NOT NULL,
-            status VARCHAR(20) DEFAULT 'active',
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            INDEX idx_soft_res_board (board_id),
-            INDEX idx_soft_res_product (product_id),
-            INDEX idx_soft_res_dates (reserved_from, reserved_until),
-            INDEX idx_soft_res_expires (expires_at)
-        )
-    """))
+    # Soft Reservations (тимчасові резервації в мудбордах) + архів
+    ensure_reservation_schema(db)
     
     db.commit()
     logger.info("✅ Event Tool tables initialized")
@@ -378,9 +454,18 @@ async def get_products(
     """
     params = {}
     
+    search_ids = None
     if search:
-        sql += " AND (name LIKE :search OR sku LIKE :search OR color LIKE :search OR material LIKE :search)"
-        params["search"] = f"%{search}%"
+        # Індекс уже враховує всі фільтри ендпоінта - з БД читаємо лише сторінку
+        search_ids = get_product_search().search(
+            db, search,
+            category=category_name, subcategory=subcategory_name,
+            colors=[color] if color else (),
+        ).ids[skip:skip + limit]
+        if not search_ids:
+            return []
+        sql += " AND product_id IN :search_ids"
+        params["search_ids"] = search_ids
     
     if category_name:
         sql += " AND category_name = :category_name"
@@ -394,71 +479,30 @@ async def get_products(
         sql += " AND color LIKE :color"
         params["color"] = f"%{color}%"
     
-    sql += " ORDER BY category_name, subcategory_name, name LIMIT :limit OFFSET :skip"
-    params["limit"] = limit
-    params["skip"] = skip
-    
-    result = db.execute(text(sql), params)
-    rows = result.fetchall()
+    if search_ids:
+        rows = rank_rows(db.execute(search_text(sql, params), params).fetchall(), search_ids)
+    else:
+        sql += " ORDER BY category_name, subcategory_name, name LIMIT :limit OFFSET :skip"
+        params["limit"] = limit
+        params["skip"] = skip
+        rows = db.execute(text(sql), params).fetchall()
     
     if not rows:
         return []
     
     product_ids = [row[0] for row in rows]
     
-    # Перевірка доступності на дати (як в RentalHub каталозі)
-    reserved_dict = {}
-    in_rent_dict = {}
-    
+    # Перевірка доступності на дати (як в RentalHub каталозі) - з in-memory індексу
+    engine = get_availability_engine()
     if date_from and date_to:
         # Резерви на конкретний період (перетинання дат)
-        reserved_result = db.execute(text("""
-            SELECT oi.product_id, COALESCE(SUM(oi.quantity), 0) as reserved
-            FROM order_items oi
-            JOIN orders o ON oi.order_id = o.order_id
-            WHERE oi.product_id IN :product_ids
-            AND o.status IN ('processing', 'ready_for_issue', 'awaiting_customer', 'pending')
-            AND o.rental_start_date <= :date_to
-            AND o.rental_end_date >= :date_from
-            GROUP BY oi.product_id
-        """), {"product_ids": tuple(product_ids), "date_from": date_from, "date_to": date_to})
-        reserved_dict = {row[0]: int(row[1]) for row in reserved_result}
-        
-        # В оренді на конкретний період
-        in_rent_result = db.execute(text("""
-            SELECT oi.product_id, COALESCE(SUM(oi.quantity), 0) as in_rent
-            FROM order_items oi
-            JOIN orders o ON oi.order_id = o.order_id
-            WHERE oi.product_id IN :product_ids
-            AND o.status IN ('issued', 'on_rent')
-            AND o.rental_start_date <= :date_to
-            AND o.rental_end_date >= :date_from
-            GROUP BY oi.product_id
-        """), {"product_ids": tuple(product_ids), "date_from": date_from, "date_to": date_to})
-        in_rent_dict = {row[0]: int(row[1]) for row in in_rent_result}
+        window_from, window_to = date_from, date_to
     else:
         # Без дат - поточний стан
-        reserved_result = db.execute(text("""
-            SELECT oi.product_id, COALESCE(SUM(oi.quantity), 0) as reserved
-            FROM order_items oi
-            JOIN orders o ON oi.order_id = o.order_id
-            WHERE oi.product_id IN :product_ids
-            AND o.status IN ('processing', 'ready_for_issue', 'awaiting_customer', 'pending')
-            AND o.rental_end_date >= CURDATE()
-            GROUP BY oi.product_id
-        """), {"product_ids": tuple(product_ids)})
-        reserved_dict = {row[0]: int(row[1]) for row in reserved_result}
-        
-        in_rent_result = db.execute(text("""
-            SELECT oi.product_id, COALESCE(SUM(oi.quantity), 0) as in_rent
-            FROM order_items oi
-            JOIN orders o ON oi.order_id = o.order_id
-            WHERE oi.product_id IN :product_ids
-            AND o.status IN ('issued', 'on_rent')
-            AND o.rental_end_date >= CURDATE()
-            GROUP BY oi.product_id
-        """), {"product_ids": tuple(product_ids)})
-        in_rent_dict = {row[0]: int(row[1]) for row in in_rent_result}
+        window_from, window_to = date.today(), None
+    
+    reserved_dict = engine.max_reserved(db, product_ids, window_from, window_to, STATUS_RESERVED)
+    in_rent_dict = engine.max_reserved(db, product_ids, window_from, window_to, STATUS_IN_RENT)
     
     # Побудова результату
     products = []
@@ -494,7 +538,7 @@ async def get_products(
             "price": float(row[13]) if row[13] else 0
         })
     
-    return products
+    return attach_image_variants(db, products, url_key="image_url")
 
 @router.get("/products/{product_id}")
 async def get_product(product_id: int, db: Session = Depends(get_rh_db)):
@@ -677,37 +721,17 @@ async def check_availability(data: AvailabilityCheck, db: Session = Depends(get_
     frozen_quantity = product[3] or 0
     base_available = total_quantity - frozen_quantity
     
+    engine = get_availability_engine()
+    
     # Перевірити перетин з існуючими замовленнями
-    reserved_result = db.execute(text("""
-        SELECT COALESCE(SUM(oi.quantity), 0) as reserved_qty
-        FROM order_items oi
-        JOIN orders o ON oi.order_id = o.order_id
-        WHERE oi.product_id = :product_id
-        AND o.status NOT IN ('cancelled', 'returned', 'completed')
-        AND o.rental_start_date <= :end_date
-        AND o.rental_end_date >= :start_date
-    """), {
-        "product_id": data.product_id,
-        "start_date": data.reserved_from,
-        "end_date": data.reserved_until
-    })
-    reserved_qty = reserved_result.fetchone()[0] or 0
+    reserved_qty = engine.max_reserved(
+        db, [data.product_id], data.reserved_from, data.reserved_until, STATUS_ACTIVE
+    ).get(data.product_id, 0)
     
     # Перевірити soft reservations з інших бордів
-    soft_reserved_result = db.execute(text("""
-        SELECT COALESCE(SUM(quantity), 0) as soft_reserved
-        FROM event_soft_reservations
-        WHERE product_id = :product_id
-        AND status = 'active'
-        AND expires_at > NOW()
-        AND reserved_from <= :end_date
-        AND reserved_until >= :start_date
-    """), {
-        "product_id": data.product_id,
-        "start_date": data.reserved_from,
-        "end_date": data.reserved_until
-    })
-    soft_reserved = soft_reserved_result.fetchone()[0] or 0
+    soft_reserved = engine.max_soft_reserved(
+        db, [data.product_id], data.reserved_from, data.reserved_until
+    ).get(data.product_id, 0)
     
     available_for_dates = base_available - reserved_qty - soft_reserved
     is_available = available_for_dates >= data.quantity
@@ -728,66 +752,70 @@ async def check_availability(data: AvailabilityCheck, db: Session = Depends(get_
 # EVENT BOARDS ENDPOINTS
 # ============================================================================
 
-@router.get("/boards")
-async def get_boards(
-    status: Optional[str] = None,
-    db: Session = Depends(get_rh_db),
-    token: str = Depends(get_token_from_header)
-):
-    """Отримати мудборди декоратора"""
-    customer = get_current_customer(token, db)
-    
-    sql = """
-        SELECT id, customer_id, board_name, event_date, event_type,
+_BOARD_COLUMNS = """id, customer_id, board_name, event_date, event_type,
                rental_start_date, rental_end_date, rental_days, status,
                notes, budget, estimated_total, cover_image, canvas_layout,
-               created_at, updated_at, converted_to_order_id
-        FROM event_boards WHERE customer_id = :customer_id
+               created_at, updated_at, converted_to_order_id"""
+
+# Кожна зміна борду чи його товарів зсуває updated_at строго вперед (DATETIME - секунди),
+# тож ETag змінюється навіть при кількох правках за секунду
+_TOUCH_BOARD = "updated_at = GREATEST(NOW(), COALESCE(updated_at, NOW()) + INTERVAL 1 SECOND)"
+
+
+def board_etag(board_id: str, updated_at, items: Optional[List[dict]] = None) -> str:
     """
-    params = {"customer_id": customer["customer_id"]}
-    
-    if status:
-        sql += " AND status = :status"
-        params["status"] = status
-    
-    sql += " ORDER BY updated_at DESC"
-    
-    result = db.execute(text(sql), params)
-    boards = []
-    
-    for row in result:
-        board = {
-            "id": row[0],
-            "customer_id": row[1],
-            "board_name": row[2],
-            "event_date": row[3].isoformat() if row[3] else None,
-            "event_type": row[4],
-            "rental_start_date": row[5].isoformat() if row[5] else None,
-            "rental_end_date": row[6].isoformat() if row[6] else None,
-            "rental_days": row[7],
-            "status": row[8],
-            "notes": row[9],
-            "budget": float(row[10]) if row[10] else None,
-            "estimated_total": float(row[11]) if row[11] else 0,
-            "cover_image": row[12],
-            "canvas_layout": row[13],
-            "created_at": row[14].isoformat() if row[14] else None,
-            "updated_at": row[15].isoformat() if row[15] else None,
-            "converted_to_order_id": row[16]
-        }
-        
-        # Завантажити items
-        items_result = db.execute(text("""
-            SELECT ebi.id, ebi.board_id, ebi.product_id, ebi.quantity, ebi.notes, 
-                   ebi.section, ebi.position, ebi.added_at,
-                   p.sku, p.name, p.rental_price, p.image_url, p.color, p.material
-            FROM event_board_items ebi
-            JOIN products p ON ebi.product_id = p.product_id
-            WHERE ebi.board_id = :board_id
-            ORDER BY ebi.position
-        """), {"board_id": row[0]})
-        
-        board["items"] = [{
+    updated_at покриває сам борд і його позиції; назви / ціни / фото товарів змінюються
+    в products без дотику до борду (і без updated_at), тож до ETag додається їх відбиток
+    """
+    stamp = updated_at.isoformat() if hasattr(updated_at, "isoformat") else str(updated_at or "")
+    if not items:
+        return f'W/"{board_id}:{stamp}"'
+    products = json.dumps([[item["product_id"], item["product"]] for item in items],
+                          ensure_ascii=False, sort_keys=True, default=str)
+    digest = hashlib.sha1(products.encode("utf-8")).hexdigest()[:16]
+    return f'W/"{board_id}:{stamp}:{digest}"'
+
+
+def _board_payload(row) -> dict:
+    return {
+        "id": row[0],
+        "customer_id": row[1],
+        "board_name": row[2],
+        "event_date": row[3].isoformat() if row[3] else None,
+        "event_type": row[4],
+        "rental_start_date": row[5].isoformat() if row[5] else None,
+        "rental_end_date": row[6].isoformat() if row[6] else None,
+        "rental_days": row[7],
+        "status": row[8],
+        "notes": row[9],
+        "budget": float(row[10]) if row[10] else None,
+        "estimated_total": float(row[11]) if row[11] else 0,
+        "cover_image": row[12],
+        "canvas_layout": row[13],
+        "created_at": row[14].isoformat() if row[14] else None,
+        "updated_at": row[15].isoformat() if row[15] else None,
+        "converted_to_order_id": row[16]
+    }
+
+
+def hydrate_board_items(db: Session, boards: List[dict]) -> List[dict]:
+    """Товари всіх бордів одним запитом IN (...) -> board["items"]"""
+    for board in boards:
+        board["items"] = []
+    if not boards:
+        return boards
+    by_id = {board["id"]: board for board in boards}
+    items_result = db.execute(text("""
+        SELECT ebi.id, ebi.board_id, ebi.product_id, ebi.quantity, ebi.notes, 
+               ebi.section, ebi.position, ebi.added_at,
+               p.sku, p.name, p.rental_price, p.image_url, p.color, p.material
+        FROM event_board_items ebi
+        JOIN products p ON ebi.product_id = p.product_id
+        WHERE ebi.board_id IN :board_ids
+        ORDER BY ebi.board_id, ebi.position
+    """), {"board_ids": tuple(by_id)})
+    for item in items_result:
+        by_id[item[1]]["items"].append({
             "id": item[0],
             "board_id": item[1],
             "product_id": item[2],
@@ -804,10 +832,33 @@ async def get_boards(
                 "color": item[12],
                 "material": item[13]
             }
-        } for item in items_result]
-        
-        boards.append(board)
+        })
+    return boards
+
+
+@router.get("/boards")
+async def get_boards(
+    status: Optional[str] = None,
+    db: Session = Depends(get_rh_db),
+    token: str = Depends(get_token_from_header)
+):
+    """Отримати мудборди декоратора"""
+    customer = get_current_customer(token, db)
+    
+    sql = f"""
+        SELECT {_BOARD_COLUMNS}
+        FROM event_boards WHERE customer_id = :customer_id
+    """
+    params = {"customer_id": customer["customer_id"]}
+    
+    if status:
+        sql += " AND status = :status"
+        params["status"] = status
+    
+    sql += " ORDER BY updated_at DESC"
     
+    boards = [_board_payload(row) for row in db.execute(text(sql), params).fetchall()]
+    hydrate_board_items(db, boards)
     return boards
 
 @router.post("/boards")
@@ -870,17 +921,16 @@ async def create_board(
 @router.get("/boards/{board_id}")
 async def get_board(
     board_id: str,
+    response: Response = None,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_rh_db),
     token: str = Depends(get_token_from_header)
 ):
-    """Отримати мудборд з товарами"""
+    """Отримати мудборд з товарами (ETag з updated_at і даних товарів - для умовних запитів канви)"""
     customer = get_current_customer(token, db)
     
-    result = db.execute(text("""
-        SELECT id, customer_id, board_name, event_date, event_type,
-               rental_start_date, rental_end_date, rental_days, status,
-               notes, budget, estimated_total, cover_image, canvas_layout,
-               created_at, updated_at, converted_to_order_id
+    result = db.execute(text(f"""
+        SELECT {_BOARD_COLUMNS}
         FROM event_boards WHERE id = :id AND customer_id = :customer_id
     """), {"id": board_id, "customer_id": customer["customer_id"]})
     row = result.fetchone()
@@ -888,62 +938,21 @@ async def get_board(
     if not row:
         raise HTTPException(status_code=404, detail="Board not found")
     
-    board = {
-        "id": row[0],
-        "customer_id": row[1],
-        "board_name": row[2],
-        "event_date": row[3].isoformat() if row[3] else None,
-        "event_type": row[4],
-        "rental_start_date": row[5].isoformat() if row[5] else None,
-        "rental_end_date": row[6].isoformat() if row[6] else None,
-        "rental_days": row[7],
-        "status": row[8],
-        "notes": row[9],
-        "budget": float(row[10]) if row[10] else None,
-        "estimated_total": float(row[11]) if row[11] else 0,
-        "cover_image": row[12],
-        "canvas_layout": row[13],
-        "created_at": row[14].isoformat() if row[14] else None,
-        "updated_at": row[15].isoformat() if row[15] else None,
-        "converted_to_order_id": row[16]
-    }
-    
-    # Items з повною інформацією про товар
-    items_result = db.execute(text("""
-        SELECT ebi.id, ebi.board_id, ebi.product_id, ebi.quantity, ebi.notes, 
-               ebi.section, ebi.position, ebi.added_at,
-               p.sku, p.name, p.rental_price, p.image_url, p.color, p.material
-        FROM event_board_items ebi
-        JOIN products p ON ebi.product_id = p.product_id
-        WHERE ebi.board_id = :board_id
-        ORDER BY ebi.position
-    """), {"board_id": board_id})
-    
-    board["items"] = [{
-        "id": item[0],
-        "board_id": item[1],
-        "product_id": item[2],
-        "quantity": item[3],
-        "notes": item[4],
-        "section": item[5],
-        "position": item[6],
-        "added_at": item[7].isoformat() if item[7] else None,
-        "product": {
-            "sku": item[8],
-            "name": item[9],
-            "rental_price": float(item[10]) if item[10] else 0,
-            "image_url": normalize_image_url(item[11]),
-            "color": item[12],
-            "material": item[13]
-        }
-    } for item in items_result]
-    
+    board = _board_payload(row)
+    hydrate_board_items(db, [board])
+    etag = board_etag(row[0], row[15], board["items"])
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+    if response is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
     return board
 
 @router.patch("/boards/{board_id}")
 async def update_board(
     board_id: str,
     data: EventBoardUpdate,
+    response: Response,
     db: Session = Depends(get_rh_db),
     token: str = Depends(get_token_from_header)
 ):
@@ -997,11 +1006,14 @@ async def update_board(
         updates.append("rental_days = DATEDIFF(COALESCE(:rental_end_date, rental_end_date), COALESCE(:rental_start_date, rental_start_date)) + 1")
     
     if updates:
-        sql = f"UPDATE event_boards SET {', '.join(updates)}, updated_at = NOW() WHERE id = :id"
+        sql = f"UPDATE event_boards SET {', '.join(updates)}, {_TOUCH_BOARD} WHERE id = :id"
         db.execute(text(sql), params)
+        if data.rental_start_date is not None or data.rental_end_date is not None:
+            # Нові дати - перевиставити всі резерви борду одним пакетом
+            sync_board_holds(db, board_id)
         db.commit()
     
-    return await get_board(board_id, db=db, token=token)
+    return await get_board(board_id, response=response, if_none_match=None, db=db, token=token)
 
 @router.delete("/boards/{board_id}")
 async def delete_board(
@@ -1015,6 +1027,8 @@ async def delete_board(
     result = db.execute(text("""
         DELETE FROM event_boards WHERE id = :id AND customer_id = :customer_id
     """), {"id": board_id, "customer_id": customer["customer_id"]})
+    if result.rowcount:
+        release_board_holds(db, board_id)
     db.commit()
     
     if result.rowcount == 0:
@@ -1098,24 +1112,10 @@ async def add_item_to_board(
             WHERE id = :board_id
         """), {"board_id": board_id, "days": board[3]})
     
-    # Створити soft reservation якщо є дати
-    if board[1] and board[2]:
-        expires_at = datetime.utcnow() + timedelta(minutes=30)
-        db.execute(text("""
-            INSERT INTO event_soft_reservations (id, board_id, product_id, quantity, reserved_from, reserved_until, expires_at, customer_id, status)
-            VALUES (:id, :board_id, :product_id, :quantity, :reserved_from, :reserved_until, :expires_at, :customer_id, 'active')
-            ON DUPLICATE KEY UPDATE quantity = :quantity, expires_at = :expires_at
-        """), {
-            "id": str(uuid.uuid4()),
-            "board_id": board_id,
-            "product_id": data.product_id,
-            "quantity": data.quantity,
-            "reserved_from": board[1],
-            "reserved_until": board[2],
-            "expires_at": expires_at,
-            "customer_id": customer["customer_id"]
-        })
+    # Створити / продовжити soft reservations борду (якщо є дати)
+    sync_board_holds(db, board_id)
     
+    db.execute(text(f"UPDATE event_boards SET {_TOUCH_BOARD} WHERE id = :id"), {"id": board_id})
     db.commit()
     
     logger.info(f"✅ Item added to board: {board_id}, product: {data.product_id}")
@@ -1159,6 +1159,9 @@ async def update_board_item(
     if updates:
         sql = f"UPDATE event_board_items SET {', '.join(updates)} WHERE id = :id"
         db.execute(text(sql), params)
+        if data.quantity is not None:
+            sync_board_holds(db, board_id)
+        db.execute(text(f"UPDATE event_boards SET {_TOUCH_BOARD} WHERE id = :id"), {"id": board_id})
         db.commit()
     
     return {"id": item_id, "updated": True}
@@ -1191,6 +1194,7 @@ async def delete_board_item(
     
     # Видалити item
     db.execute(text("DELETE FROM event_board_items WHERE id = :id"), {"id": item_id})
+    db.execute(text(f"UPDATE event_boards SET {_TOUCH_BOARD} WHERE id = :id"), {"id": board_id})
     db.commit()
     
     logger.info(f"✅ Item deleted from board: {board_id}")
@@ -1460,11 +1464,11 @@ async def convert_to_order(
             logger.warning(f"Could not save lifecycle: {e}")
         
         # Видалити soft reservations
-        db.execute(text("DELETE FROM event_soft_reservations WHERE board_id = :board_id"), {"board_id": board_id})
+        release_board_holds(db, board_id)
         
         # Оновити board
-        db.execute(text("""
-            UPDATE event_boards SET converted_to_order_id = :order_id, status = 'converted', updated_at = NOW()
+        db.execute(text(f"""
+            UPDATE event_boards SET converted_to_order_id = :order_id, status = 'converted', {_TOUCH_BOARD}
             WHERE id = :board_id
         """), {"order_id": new_order_id, "board_id": board_id})
         
@@ -1,434 +1,463 @@
 """
 Export API - Експорт даних в Excel/CSV
 Endpoints для експорту фінансових даних та кейсів шкоди
+
+Усі експорти потокові (services/export_engine): ?format=csv|xlsx, а ?background=true
+ставить експорт у фонову задачу - статус і посилання на файл у /api/export/jobs/{id}.
+Handlers - звичайні def: XLSX збирається синхронно (export_response) і виконується в threadpool,
+а не в event loop.
 """
 from fastapi import APIRouter, Depends, Query, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from typing import Optional
-from datetime import datetime, date
-import csv
-import io
+from datetime import datetime
+import os
 
 from database_rentalhub import get_rh_db
+from services.export_engine import ExportSpec, content_disposition, export_builder, get_export_jobs, start_export
+from utils.period_range import month_range
 
 router = APIRouter(prefix="/api/export", tags=["Export"])
 
 
-def make_csv_response(data: list, filename: str, columns: list) -> StreamingResponse:
-    """Create CSV response from data with UTF-8 BOM for Excel compatibility"""
-    output = io.StringIO()
-    
-    # Write UTF-8 BOM for Excel compatibility
-    output.write('\ufeff')
-    
-    writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
-    
-    # Write header with Ukrainian column names
-    writer.writerow(columns)
-    
-    # Write data rows
-    for row in data:
-        writer.writerow(row)
-    
-    output.seek(0)
-    
-    # Create response with proper headers for download
-    response = StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv; charset=utf-8"
-    )
-    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-    response.headers["Access-Control-Expose-Headers"] = "Content-Disposition"
-    
-    return response
+def _month_filter(column: str, month: Optional[str], params: dict) -> str:
+    """YYYY-MM -> умова-діапазон по індексованій колонці"""
+    if not month:
+        return ""
+    try:
+        year, month_num = (int(part) for part in month.split("-")[:2])
+        params["month_start"], params["month_end"] = month_range(year, month_num)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="month має бути у форматі YYYY-MM")
+    return f"WHERE {column} >= :month_start AND {column} < :month_end"
 
 
 # ============================================
 # FINANCE CONSOLE EXPORTS
 # ============================================
 
-@router.get("/ledger")
-async def export_ledger(
-    month: Optional[str] = None,  # YYYY-MM
-    db: Session = Depends(get_rh_db)
-):
-    """Експорт транзакцій (Ledger) в CSV"""
-    
-    where_clause = ""
+@export_builder("ledger")
+def ledger_export(db: Session, month: Optional[str] = None) -> ExportSpec:
     params = {}
-    
-    if month:
-        where_clause = "WHERE DATE_FORMAT(t.occurred_at, '%Y-%m') = :month"
-        params["month"] = month
-    
-    query = f"""
-        SELECT 
-            DATE_FORMAT(t.occurred_at, '%Y-%m-%d %H:%i') as date,
-            t.tx_type,
-            t.amount,
-            t.note,
-            t.entity_type,
-            t.accepted_by_name
-        FROM fin_transactions t
-        {where_clause}
-        ORDER BY t.occurred_at DESC
-    """
-    
-    rows = db.execute(text(query), params).fetchall()
-    
-    data = []
-    for row in rows:
-        data.append([
+    where_clause = _month_filter("t.occurred_at", month, params)
+    return ExportSpec(
+        name="ledger",
+        sql=f"""
+            SELECT
+                DATE_FORMAT(t.occurred_at, '%Y-%m-%d %H:%i') as date,
+                t.tx_type,
+                t.amount,
+                t.note,
+                t.entity_type,
+                t.accepted_by_name
+            FROM fin_transactions t
+            {where_clause}
+            ORDER BY t.occurred_at DESC
+        """,
+        params=params,
+        columns=["Дата", "Тип операції", "Сума (₴)", "Примітка", "Тип сутності", "Автор"],
+        row=lambda row: [
             row[0] or "",  # date
             row[1] or "",  # tx_type
             str(row[2]) if row[2] else "0",  # amount
             row[3] or "",  # note
             row[4] or "",  # entity_type
             row[5] or "",  # accepted_by_name
-        ])
-    
-    columns = ["Дата", "Тип операції", "Сума (₴)", "Примітка", "Тип сутності", "Автор"]
-    filename = f"ledger_{month or 'all'}_{datetime.now().strftime('%Y%m%d')}.csv"
-    
-    return make_csv_response(data, filename, columns)
+        ],
+        filename=f"ledger_{month or 'all'}_{datetime.now().strftime('%Y%m%d')}",
+        sheet_title="Ledger",
+    )
 
 
-@router.get("/expenses")
-async def export_expenses(
+@router.get("/ledger")
+def export_ledger(
     month: Optional[str] = None,  # YYYY-MM
+    format: str = Query("csv"),
+    background: bool = Query(False),
     db: Session = Depends(get_rh_db)
 ):
-    """Експорт витрат в CSV"""
-    
-    where_clause = ""
+    """Експорт транзакцій (Ledger) в CSV / XLSX"""
+    return start_export(db, "ledger", format, background, month=month)
+
+
+_EXPENSE_FUNDING = {"general": "Каса", "damage_pool": "Бюджет шкоди"}
+_EXPENSE_METHODS = {"cash": "Готівка", "bank": "Безготівка"}
+
+
+@export_builder("expenses")
+def expenses_export(db: Session, month: Optional[str] = None) -> ExportSpec:
     params = {}
-    
-    if month:
-        where_clause = "WHERE DATE_FORMAT(e.occurred_at, '%Y-%m') = :month"
-        params["month"] = month
-    
-    query = f"""
-        SELECT 
-            DATE_FORMAT(e.occurred_at, '%Y-%m-%d') as date,
-            e.expense_type,
-            c.name as category_name,
-            e.amount,
-            e.method,
-            COALESCE(e.funding_source, 'general') as funding_source,
-            e.note,
-            e.status
-        FROM fin_expenses e
-        LEFT JOIN fin_categories c ON e.category_id = c.id
-        {where_clause}
-        ORDER BY e.occurred_at DESC
-    """
-    
-    rows = db.execute(text(query), params).fetchall()
-    
-    funding_map = {"general": "Каса", "damage_pool": "Бюджет шкоди"}
-    method_map = {"cash": "Готівка", "bank": "Безготівка"}
-    
-    data = []
-    for row in rows:
-        data.append([
+    where_clause = _month_filter("e.occurred_at", month, params)
+    return ExportSpec(
+        name="expenses",
+        sql=f"""
+            SELECT
+                DATE_FORMAT(e.occurred_at, '%Y-%m-%d') as date,
+                e.expense_type,
+                c.name as category_name,
+                e.amount,
+                e.method,
+                COALESCE(e.funding_source, 'general') as funding_source,
+                e.note,
+                e.status
+            FROM fin_expenses e
+            LEFT JOIN fin_categories c ON e.category_id = c.id
+            {where_clause}
+            ORDER BY e.occurred_at DESC
+        """,
+        params=params,
+        columns=["Дата", "Тип", "Категорія", "Сума (₴)", "Метод", "Джерело", "Примітка", "Статус"],
+        row=lambda row: [
             row[0] or "",  # date
             row[1] or "",  # expense_type
             row[2] or "Без категорії",  # category_name
             str(row[3]) if row[3] else "0",  # amount
-            method_map.get(row[4], row[4] or ""),  # method
-            funding_map.get(row[5], row[5] or ""),  # funding_source
+            _EXPENSE_METHODS.get(row[4], row[4] or ""),  # method
+            _EXPENSE_FUNDING.get(row[5], row[5] or ""),  # funding_source
             row[6] or "",  # note
             row[7] or "",  # status
-        ])
-    
-    columns = ["Дата", "Тип", "Категорія", "Сума (₴)", "Метод", "Джерело", "Примітка", "Статус"]
-    filename = f"expenses_{month or 'all'}_{datetime.now().strftime('%Y%m%d')}.csv"
-    
-    return make_csv_response(data, filename, columns)
+        ],
+        filename=f"expenses_{month or 'all'}_{datetime.now().strftime('%Y%m%d')}",
+        sheet_title="Витрати",
+    )
 
 
-@router.get("/orders-finance")
-async def export_orders_finance(
-    status: Optional[str] = None,
+@router.get("/expenses")
+def export_expenses(
+    month: Optional[str] = None,  # YYYY-MM
+    format: str = Query("csv"),
+    background: bool = Query(False),
     db: Session = Depends(get_rh_db)
 ):
-    """Експорт ордерів з фінансовими даними"""
-    
+    """Експорт витрат в CSV / XLSX"""
+    return start_export(db, "expenses", format, background, month=month)
+
+
+_ORDER_STATUSES = {
+    "draft": "Чернетка",
+    "confirmed": "Підтверджено",
+    "active": "Активне",
+    "returned": "Повернено",
+    "completed": "Завершено",
+    "cancelled": "Скасовано"
+}
+
+
+@export_builder("orders_finance")
+def orders_finance_export(db: Session, status: Optional[str] = None) -> ExportSpec:
     where_clause = "WHERE o.is_archived = FALSE"
     params = {}
-    
+
     if status:
         where_clause += " AND o.status = :status"
         params["status"] = status
-    
-    query = f"""
-        SELECT 
-            o.order_number,
-            o.status,
-            o.customer_name,
-            o.customer_phone,
-            o.total_price as total_rental,
-            o.deposit_amount as total_deposit,
-            o.damage_fee,
-            DATE_FORMAT(o.created_at, '%Y-%m-%d') as created_date
-        FROM orders o
-        {where_clause}
-        ORDER BY o.created_at DESC
-        LIMIT 1000
-    """
-    
-    rows = db.execute(text(query), params).fetchall()
-    
-    status_map = {
-        "draft": "Чернетка",
-        "confirmed": "Підтверджено",
-        "active": "Активне",
-        "returned": "Повернено",
-        "completed": "Завершено",
-        "cancelled": "Скасовано"
-    }
-    
-    data = []
-    for row in rows:
-        data.append([
+
+    return ExportSpec(
+        name="orders_finance",
+        sql=f"""
+            SELECT
+                o.order_number,
+                o.status,
+                o.customer_name,
+                o.customer_phone,
+                o.total_price as total_rental,
+                o.deposit_amount as total_deposit,
+                o.damage_fee,
+                DATE_FORMAT(o.created_at, '%Y-%m-%d') as created_date
+            FROM orders o
+            {where_clause}
+            ORDER BY o.created_at DESC
+            LIMIT 1000
+        """,
+        params=params,
+        columns=[
+            "Номер ордера", "Статус", "Клієнт", "Телефон",
+            "Оренда (₴)", "Застава (₴)", "Шкода (₴)", "Дата створення"
+        ],
+        row=lambda row: [
             row[0] or "",  # order_number
-            status_map.get(row[1], row[1] or ""),  # status
+            _ORDER_STATUSES.get(row[1], row[1] or ""),  # status
             row[2] or "",  # customer_name
             row[3] or "",  # customer_phone
             str(row[4]) if row[4] else "0",  # total_rental
             str(row[5]) if row[5] else "0",  # total_deposit
             str(row[6]) if row[6] else "0",  # damage_fee
             row[7] or "",  # created_date
-        ])
-    
-    columns = [
-        "Номер ордера", "Статус", "Клієнт", "Телефон", 
-        "Оренда (₴)", "Застава (₴)", "Шкода (₴)", "Дата створення"
-    ]
-    filename = f"orders_finance_{datetime.now().strftime('%Y%m%d')}.csv"
-    
-    return make_csv_response(data, filename, columns)
+        ],
+        filename=f"orders_finance_{datetime.now().strftime('%Y%m%d')}",
+        sheet_title="Ордери",
+    )
+
+
+@router.get("/orders-finance")
+def export_orders_finance(
+    status: Optional[str] = None,
+    format: str = Query("csv"),
+    background: bool = Query(False),
+    db: Session = Depends(get_rh_db)
+):
+    """Експорт ордерів з фінансовими даними"""
+    return start_export(db, "orders_finance", format, background, status=status)
 
 
 # ============================================
 # DAMAGE HUB EXPORTS
 # ============================================
 
-@router.get("/damage-cases")
-async def export_damage_cases(
-    status: Optional[str] = None,
-    db: Session = Depends(get_rh_db)
-):
-    """Експорт кейсів шкоди"""
-    
+_PROCESSING_TYPES = {
+    "none": "Не призначено",
+    "wash": "Мийка",
+    "restoration": "Реставрація",
+    "laundry": "Хімчистка"
+}
+
+_DAMAGE_STATUSES = {
+    "pending": "Очікує",
+    "in_progress": "В роботі",
+    "completed": "Завершено",
+    "failed": "Невдача"
+}
+
+_SEVERITIES = {
+    "low": "Низька",
+    "medium": "Середня",
+    "high": "Висока",
+    "critical": "Критична"
+}
+
+
+@export_builder("damage_cases")
+def damage_cases_export(db: Session, status: Optional[str] = None) -> ExportSpec:
     where_clause = ""
     params = {}
-    
+
     if status:
         where_clause = "WHERE pdh.processing_status = :status"
         params["status"] = status
-    
-    query = f"""
-        SELECT 
-            pdh.order_number,
-            pdh.product_name,
-            pdh.sku,
-            pdh.category,
-            pdh.damage_type,
-            pdh.severity,
-            pdh.fee,
-            pdh.processing_type,
-            pdh.processing_status,
-            pdh.note,
-            DATE_FORMAT(pdh.created_at, '%Y-%m-%d') as created_date
-        FROM product_damage_history pdh
-        {where_clause}
-        ORDER BY pdh.created_at DESC
-    """
-    
-    rows = db.execute(text(query), params).fetchall()
-    
-    processing_type_map = {
-        "none": "Не призначено",
-        "wash": "Мийка",
-        "restoration": "Реставрація",
-        "laundry": "Хімчистка"
-    }
-    
-    status_map = {
-        "pending": "Очікує",
-        "in_progress": "В роботі",
-        "completed": "Завершено",
-        "failed": "Невдача"
-    }
-    
-    severity_map = {
-        "low": "Низька",
-        "medium": "Середня",
-        "high": "Висока",
-        "critical": "Критична"
-    }
-    
-    data = []
-    for row in rows:
-        data.append([
+
+    return ExportSpec(
+        name="damage_cases",
+        sql=f"""
+            SELECT
+                pdh.order_number,
+                pdh.product_name,
+                pdh.sku,
+                pdh.category,
+                pdh.damage_type,
+                pdh.severity,
+                pdh.fee,
+                pdh.processing_type,
+                pdh.processing_status,
+                pdh.note,
+                DATE_FORMAT(pdh.created_at, '%Y-%m-%d') as created_date
+            FROM product_damage_history pdh
+            {where_clause}
+            ORDER BY pdh.created_at DESC
+        """,
+        params=params,
+        columns=[
+            "Номер ордера", "Товар", "SKU", "Категорія",
+            "Тип шкоди", "Серйозність", "Компенсація (₴)",
+            "Тип обробки", "Статус", "Примітка", "Дата"
+        ],
+        row=lambda row: [
             row[0] or "",  # order_number
             row[1] or "",  # product_name
             row[2] or "",  # sku
             row[3] or "",  # category
             row[4] or "",  # damage_type
-            severity_map.get(row[5], row[5] or ""),  # severity
+            _SEVERITIES.get(row[5], row[5] or ""),  # severity
             str(row[6]) if row[6] else "0",  # fee
-            processing_type_map.get(row[7], row[7] or ""),  # processing_type
-            status_map.get(row[8], row[8] or ""),  # processing_status
+            _PROCESSING_TYPES.get(row[7], row[7] or ""),  # processing_type
+            _DAMAGE_STATUSES.get(row[8], row[8] or ""),  # processing_status
             row[9] or "",  # note
             row[10] or "",  # created_date
-        ])
-    
-    columns = [
-        "Номер ордера", "Товар", "SKU", "Категорія", 
-        "Тип шкоди", "Серйозність", "Компенсація (₴)",
-        "Тип обробки", "Статус", "Примітка", "Дата"
-    ]
-    filename = f"damage_cases_{datetime.now().strftime('%Y%m%d')}.csv"
-    
-    return make_csv_response(data, filename, columns)
+        ],
+        filename=f"damage_cases_{datetime.now().strftime('%Y%m%d')}",
+        sheet_title="Шкода",
+    )
 
 
-@router.get("/tasks")
-async def export_tasks(
-    task_type: Optional[str] = None,  # washing, restoration
+@router.get("/damage-cases")
+def export_damage_cases(
     status: Optional[str] = None,
+    format: str = Query("csv"),
+    background: bool = Query(False),
     db: Session = Depends(get_rh_db)
 ):
-    """Експорт задач (мийка, реставрація)"""
-    
+    """Експорт кейсів шкоди"""
+    return start_export(db, "damage_cases", format, background, status=status)
+
+
+_TASK_TYPES = {
+    "washing": "Мийка",
+    "restoration": "Реставрація",
+    "laundry": "Хімчистка"
+}
+
+_TASK_STATUSES = {
+    "pending": "Очікує",
+    "in_progress": "В роботі",
+    "completed": "Завершено",
+    "cancelled": "Скасовано"
+}
+
+_TASK_PRIORITIES = {
+    "low": "Низький",
+    "normal": "Звичайний",
+    "high": "Високий",
+    "urgent": "Терміновий"
+}
+
+
+@export_builder("tasks")
+def tasks_export(db: Session, task_type: Optional[str] = None, status: Optional[str] = None) -> ExportSpec:
     where_clauses = []
     params = {}
-    
+
     if task_type:
         where_clauses.append("t.task_type = :task_type")
         params["task_type"] = task_type
-    
+
     if status:
         where_clauses.append("t.status = :status")
         params["status"] = status
-    
+
     where_clause = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-    
-    query = f"""
-        SELECT 
-            t.id,
-            t.task_type,
-            t.order_number,
-            t.title,
-            t.description,
-            t.status,
-            t.priority,
-            t.assigned_to,
-            DATE_FORMAT(t.created_at, '%Y-%m-%d') as created_date,
-            DATE_FORMAT(t.completed_at, '%Y-%m-%d') as completed_date
-        FROM tasks t
-        {where_clause}
-        ORDER BY t.created_at DESC
-    """
-    
-    rows = db.execute(text(query), params).fetchall()
-    
-    task_type_map = {
-        "washing": "Мийка",
-        "restoration": "Реставрація",
-        "laundry": "Хімчистка"
-    }
-    
-    status_map = {
-        "pending": "Очікує",
-        "in_progress": "В роботі",
-        "completed": "Завершено",
-        "cancelled": "Скасовано"
-    }
-    
-    priority_map = {
-        "low": "Низький",
-        "normal": "Звичайний",
-        "high": "Високий",
-        "urgent": "Терміновий"
-    }
-    
-    data = []
-    for row in rows:
-        data.append([
+
+    return ExportSpec(
+        name="tasks",
+        sql=f"""
+            SELECT
+                t.id,
+                t.task_type,
+                t.order_number,
+                t.title,
+                t.description,
+                t.status,
+                t.priority,
+                t.assigned_to,
+                DATE_FORMAT(t.created_at, '%Y-%m-%d') as created_date,
+                DATE_FORMAT(t.completed_at, '%Y-%m-%d') as completed_date
+            FROM tasks t
+            {where_clause}
+            ORDER BY t.created_at DESC
+        """,
+        params=params,
+        columns=[
+            "ID", "Тип", "Ордер", "Назва", "Опис",
+            "Статус", "Пріоритет", "Виконавець", "Створено", "Завершено"
+        ],
+        row=lambda row: [
             str(row[0]) if row[0] else "",  # id
-            task_type_map.get(row[1], row[1] or ""),  # task_type
+            _TASK_TYPES.get(row[1], row[1] or ""),  # task_type
             row[2] or "",  # order_number
             row[3] or "",  # title
             row[4] or "",  # description
-            status_map.get(row[5], row[5] or ""),  # status
-            priority_map.get(row[6], row[6] or ""),  # priority
+            _TASK_STATUSES.get(row[5], row[5] or ""),  # status
+            _TASK_PRIORITIES.get(row[6], row[6] or ""),  # priority
             row[7] or "",  # assigned_to
             row[8] or "",  # created_date
             row[9] or "",  # completed_date
-        ])
-    
-    columns = [
-        "ID", "Тип", "Ордер", "Назва", "Опис", 
-        "Статус", "Пріоритет", "Виконавець", "Створено", "Завершено"
-    ]
-    
-    type_suffix = task_type or "all"
-    filename = f"tasks_{type_suffix}_{datetime.now().strftime('%Y%m%d')}.csv"
-    
-    return make_csv_response(data, filename, columns)
+        ],
+        filename=f"tasks_{task_type or 'all'}_{datetime.now().strftime('%Y%m%d')}",
+        sheet_title="Задачі",
+    )
 
 
-@router.get("/laundry-queue")
-async def export_laundry_queue(
+@router.get("/tasks")
+def export_tasks(
+    task_type: Optional[str] = None,  # washing, restoration
+    status: Optional[str] = None,
+    format: str = Query("csv"),
+    background: bool = Query(False),
     db: Session = Depends(get_rh_db)
 ):
-    """Експорт черги хімчистки з product_damage_history"""
-    
-    query = """
-        SELECT 
-            pdh.order_number,
-            pdh.product_name,
-            pdh.sku,
-            pdh.damage_type,
-            pdh.processing_status,
-            pdh.laundry_batch_id,
-            DATE_FORMAT(pdh.created_at, '%Y-%m-%d') as created_date,
-            DATE_FORMAT(pdh.sent_to_processing_at, '%Y-%m-%d') as sent_date
-        FROM product_damage_history pdh
-        WHERE pdh.processing_type = 'laundry'
-        ORDER BY pdh.created_at DESC
-    """
-    
-    rows = db.execute(text(query)).fetchall()
-    
-    status_map = {
-        "pending": "В черзі",
-        "in_progress": "Відправлено",
-        "completed": "Повернуто",
-        "failed": "Проблема"
-    }
-    
-    data = []
-    for row in rows:
-        data.append([
+    """Експорт задач (мийка, реставрація)"""
+    return start_export(db, "tasks", format, background, task_type=task_type, status=status)
+
+
+_LAUNDRY_STATUSES = {
+    "pending": "В черзі",
+    "in_progress": "Відправлено",
+    "completed": "Повернуто",
+    "failed": "Проблема"
+}
+
+
+@export_builder("laundry_queue")
+def laundry_queue_export(db: Session) -> ExportSpec:
+    return ExportSpec(
+        name="laundry_queue",
+        sql="""
+            SELECT
+                pdh.order_number,
+                pdh.product_name,
+                pdh.sku,
+                pdh.damage_type,
+                pdh.processing_status,
+                pdh.laundry_batch_id,
+                DATE_FORMAT(pdh.created_at, '%Y-%m-%d') as created_date,
+                DATE_FORMAT(pdh.sent_to_processing_at, '%Y-%m-%d') as sent_date
+            FROM product_damage_history pdh
+            WHERE pdh.processing_type = 'laundry'
+            ORDER BY pdh.created_at DESC
+        """,
+        columns=[
+            "Ордер", "Товар", "SKU", "Тип шкоди", "Статус", "Партія", "Створено", "Відправлено"
+        ],
+        row=lambda row: [
             row[0] or "",  # order_number
             row[1] or "",  # product_name
             row[2] or "",  # sku
             row[3] or "",  # damage_type
-            status_map.get(row[4], row[4] or ""),  # processing_status
+            _LAUNDRY_STATUSES.get(row[4], row[4] or ""),  # processing_status
             row[5] or "",  # laundry_batch_id
             row[6] or "",  # created_date
             row[7] or "",  # sent_date
-        ])
-    
-    columns = [
-        "Ордер", "Товар", "SKU", "Тип шкоди", "Статус", "Партія", "Створено", "Відправлено"
-    ]
-    filename = f"laundry_queue_{datetime.now().strftime('%Y%m%d')}.csv"
-    
-    return make_csv_response(data, filename, columns)
+        ],
+        filename=f"laundry_queue_{datetime.now().strftime('%Y%m%d')}",
+        sheet_title="Хімчистка",
+    )
+
+
+@router.get("/laundry-queue")
+def export_laundry_queue(
+    format: str = Query("csv"),
+    background: bool = Query(False),
+    db: Session = Depends(get_rh_db)
+):
+    """Експорт черги хімчистки з product_damage_history"""
+    return start_export(db, "laundry_queue", format, background)
+
+
+# ============================================
+# BACKGROUND JOBS
+# ============================================
+
+@router.get("/jobs/{job_id}")
+def get_export_job(job_id: str, db: Session = Depends(get_rh_db)):
+    """Статус фонового експорту (download_url - коли готово)"""
+    job = get_export_jobs().get(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задачу експорту не знайдено")
+    job.pop("file_path", None)
+    return job
+
+
+@router.get("/jobs/{job_id}/download")
+def download_export_job(job_id: str, db: Session = Depends(get_rh_db)):
+    """Файл готового фонового експорту"""
+    job = get_export_jobs().get(db, job_id)
+    if not job or job["status"] != "done" or not job["file_path"] or not os.path.exists(job["file_path"]):
+        raise HTTPException(status_code=404, detail="Файл експорту не готовий або вже видалений")
+    return FileResponse(
+        job["file_path"],
+        media_type=None,
+        filename=None,
+        headers={
+            "Content-Disposition": content_disposition(job["filename"]),
+            "Access-Control-Expose-Headers": "Content-Disposition",
+        },
+    )
@@ -8,6 +8,7 @@ from sqlalchemy import text
 from typing import Optional
 
 from database_rentalhub import get_rh_db
+from services.product_search import get_product_search, rank_rows, search_text
 
 router = APIRouter(prefix="/api/extended-catalog", tags=["extended-catalog"])
 
@@ -38,9 +39,13 @@ async def search_products(
     
     params = {}
     
+    search_result = None
     if query:
-        sql += " AND (p.name LIKE :query OR p.sku LIKE :query OR p.description LIKE :query)"
-        params['query'] = f"%{query}%"
+        search_result = get_product_search().search(db, query)
+        if not search_result.ids:
+            return {"products": [], "total": 0, "limit": limit, "offset": offset, "facets": search_result.facets}
+        sql += " AND p.product_id IN :search_ids"
+        params['search_ids'] = search_result.ids
     
     if category:
         sql += " AND (p.category_name LIKE :category OR p.subcategory_name LIKE :category)"
@@ -57,9 +62,13 @@ async def search_products(
     if in_stock:
         sql += " AND p.quantity > 0"
     
-    sql += f" ORDER BY p.name LIMIT {limit} OFFSET {offset}"
-    
-    result = db.execute(text(sql), params)
+    if search_result:
+        # Ціна / наявність - у SQL, порядок і сторінка - за релевантністю
+        matched = rank_rows(db.execute(search_text(sql, params), params).fetchall(), search_result.ids)
+        result = matched[offset:offset + limit]
+    else:
+        sql += f" ORDER BY p.name LIMIT {limit} OFFSET {offset}"
+        result = db.execute(text(sql), params)
     
     products = []
     for row in result:
@@ -83,14 +92,21 @@ async def search_products(
             "in_stock": quantity > 0
         })
     
+    if search_result:
+        return {
+            "products": products,
+            "total": len(matched),
+            "limit": limit,
+            "offset": offset,
+            "facets": search_result.facets
+        }
+    
     # Count total
     count_sql = """
         SELECT COUNT(*) FROM products p
         WHERE p.status = 1
     """
     
-    if query:
-        count_sql += " AND (p.name LIKE :query OR p.sku LIKE :query OR p.description LIKE :query)"
     if category:
         count_sql += " AND (p.category_name LIKE :category OR p.subcategory_name LIKE :category)"
     if min_price is not None:
@@ -12,6 +12,12 @@ from decimal import Decimal
 import json
 
 from database_rentalhub import get_rh_db
+from utils.period_range import month_range, period_filter, period_range
+from services.ledger_posting import LedgerImbalance, LedgerPosting, account_cache, post_transactions
+from services.finance_rollup import (
+    EXPENSE_SOURCE, PAYMENT_SOURCE, check_consistency, mark_dirty, mark_payment_dirty,
+    rebuild_range, refresh_days_now, rename_category, rollup_totals, sum_totals, totals_by,
+)
 
 router = APIRouter(prefix="/api/finance", tags=["finance"])
 
@@ -96,21 +102,9 @@ class PayrollCreate(BaseModel):
 # HELPER: LEDGER POSTING
 # ============================================================
 
-def get_account_id(db: Session, code: str, retry: int = 3) -> int:
-    """Get account ID by code with retry for connection issues"""
-    for attempt in range(retry):
-        try:
-            result = db.execute(text("SELECT id FROM fin_accounts WHERE code = :code"), {"code": code})
-            row = result.fetchone()
-            if not row:
-                raise ValueError(f"Account not found: {code}")
-            return row[0]
-        except Exception as e:
-            if attempt < retry - 1 and "Lost connection" in str(e):
-                import time
-                time.sleep(0.5)
-                continue
-            raise
+def get_account_id(db: Session, code: str) -> int:
+    """Get account ID by code (cached in process)"""
+    return account_cache.resolve(db, [code])[code]
 
 def post_transaction(
     db: Session,
@@ -129,38 +123,22 @@ def post_transaction(
     occurred_at: Optional[datetime] = None
 ) -> int:
     """Create a ledger transaction with double-entry bookkeeping."""
-    if occurred_at is None:
-        occurred_at = datetime.now()
-    
-    db.execute(text("""
-        INSERT INTO fin_transactions (tx_type, amount, occurred_at, entity_type, entity_id, category_id, note)
-        VALUES (:tx_type, :amount, :occurred_at, :entity_type, :entity_id, :category_id, :note)
-    """), {
-        "tx_type": tx_type, "amount": amount, "occurred_at": occurred_at,
-        "entity_type": entity_type, "entity_id": entity_id, "category_id": category_id, "note": note
-    })
-    
-    result = db.execute(text("SELECT LAST_INSERT_ID()"))
-    tx_id = result.fetchone()[0]
-    
-    debit_acc_id = get_account_id(db, debit_account)
-    credit_acc_id = get_account_id(db, credit_account)
-    
-    # Debit entry
-    db.execute(text("""
-        INSERT INTO fin_ledger_entries (tx_id, account_id, direction, amount, order_id, damage_case_id, vendor_id, employee_id)
-        VALUES (:tx_id, :account_id, 'D', :amount, :order_id, :damage_case_id, :vendor_id, :employee_id)
-    """), {"tx_id": tx_id, "account_id": debit_acc_id, "amount": amount,
-           "order_id": order_id, "damage_case_id": damage_case_id, "vendor_id": vendor_id, "employee_id": employee_id})
-    
-    # Credit entry
-    db.execute(text("""
-        INSERT INTO fin_ledger_entries (tx_id, account_id, direction, amount, order_id, damage_case_id, vendor_id, employee_id)
-        VALUES (:tx_id, :account_id, 'C', :amount, :order_id, :damage_case_id, :vendor_id, :employee_id)
-    """), {"tx_id": tx_id, "account_id": credit_acc_id, "amount": amount,
-           "order_id": order_id, "damage_case_id": damage_case_id, "vendor_id": vendor_id, "employee_id": employee_id})
-    
-    return tx_id
+    return post_transaction_batch(db, [LedgerPosting(
+        tx_type=tx_type, amount=amount, debit_account=debit_account, credit_account=credit_account,
+        entity_type=entity_type, entity_id=entity_id, category_id=category_id, order_id=order_id,
+        damage_case_id=damage_case_id, vendor_id=vendor_id, employee_id=employee_id,
+        note=note, occurred_at=occurred_at
+    )])[0]
+
+def post_transaction_batch(db: Session, postings: List[LedgerPosting]) -> List[int]:
+    """Post many ledger transactions with multi-row inserts (caller commits)."""
+    now = datetime.now()
+    for p in postings:
+        if p.occurred_at is None:
+            p.occurred_at = now
+    # Оплати/витрати цих транзакцій потрапляють у ті самі дні - перерахувати ролапи перед commit
+    mark_dirty(db, *[p.occurred_at for p in postings])
+    return post_transactions(db, postings)
 
 
 # ============================================================
@@ -215,6 +193,42 @@ async def list_categories(type: Optional[str] = None, db: Session = Depends(get_
 # DASHBOARD / OVERVIEW
 # ============================================================
 
+PAID_STATUSES = ("completed", "confirmed")
+INCOME_PAYMENT_TYPES = ("rent", "additional", "damage", "late")
+
+
+def _payout_totals(db: Session) -> dict:
+    """
+    Накопичені суми для payouts-stats (v1/v2) з fin_daily_rollups замість
+    SUM(...) по всьому fin_payments / fin_expenses.
+    Витрати/внесення рахуються без фільтра статусу - як і раніше.
+    """
+    payments = rollup_totals(db, PAYMENT_SOURCE)
+    expenses = rollup_totals(db, EXPENSE_SOURCE)
+
+    def paid(kind, methods):
+        return sum_totals(payments, kinds=[kind], methods=methods, statuses=PAID_STATUSES)
+
+    def spent(codes, methods=None):
+        return sum_totals(expenses, categories=codes, methods=methods)
+
+    return {
+        "rent_cash_income": paid("rent", ["cash"]),
+        "damage_cash_income": paid("damage", ["cash"]),
+        "rent_bank_income": paid("rent", ["card", "bank"]),
+        "damage_bank_income": paid("damage", ["card", "bank"]),
+        "rent_cash_expenses": spent(["RENT_EXPENSE", "RENT_CASH_EXPENSE"], ["cash"]),
+        "damage_cash_expenses": spent(["DAMAGE_EXPENSE"], ["cash"]),
+        "rent_bank_expenses": spent(["RENT_BANK_EXPENSE"], ["bank"]),
+        "damage_bank_expenses": spent(["DAMAGE_BANK_EXPENSE"], ["bank"]),
+        "rent_cash_deposits": spent(["RENT_CASH_DEPOSIT"]),
+        "damage_cash_deposits": spent(["DAMAGE_CASH_DEPOSIT"]),
+        "rent_revenue": paid("rent", None),
+        "rent_revenue_any_status": sum_totals(payments, kinds=["rent"]),
+        "damage_paid_any_status": sum_totals(payments, kinds=["damage"]),
+    }
+
+
 @router.get("/payouts-stats")
 async def get_payouts_stats(db: Session = Depends(get_rh_db)):
     """Payout statistics for Finance Hub:
@@ -224,79 +238,23 @@ async def get_payouts_stats(db: Session = Depends(get_rh_db)):
     - Безготівка зі шкоди (з врахуванням витрат)
     """
     try:
-        # === ГОТІВКА ===
-        # Cash income from rent
-        rent_cash_income = db.execute(text("""
-            SELECT COALESCE(SUM(amount), 0) FROM fin_payments 
-            WHERE payment_type = 'rent' AND method = 'cash' AND status IN ('completed', 'confirmed')
-        """)).fetchone()[0]
-        
-        # Cash income from damage
-        damage_cash_income = db.execute(text("""
-            SELECT COALESCE(SUM(amount), 0) FROM fin_payments 
-            WHERE payment_type = 'damage' AND method = 'cash' AND status IN ('completed', 'confirmed')
-        """)).fetchone()[0]
-        
-        # Cash expenses from rent budget
-        rent_cash_expenses = db.execute(text("""
-            SELECT COALESCE(SUM(e.amount), 0) FROM fin_expenses e 
-            LEFT JOIN fin_categories c ON c.id = e.category_id
-            WHERE e.method = 'cash' AND (c.code = 'RENT_EXPENSE' OR c.code = 'RENT_CASH_EXPENSE')
-        """)).fetchone()[0]
-        
-        # Cash expenses from damage budget
-        damage_cash_expenses = db.execute(text("""
-            SELECT COALESCE(SUM(e.amount), 0) FROM fin_expenses e 
-            LEFT JOIN fin_categories c ON c.id = e.category_id
-            WHERE e.method = 'cash' AND c.code = 'DAMAGE_EXPENSE'
-        """)).fetchone()[0]
-        
-        # Cash deposits (внесення готівки)
-        rent_cash_deposits = db.execute(text("""
-            SELECT COALESCE(SUM(e.amount), 0) FROM fin_expenses e 
-            LEFT JOIN fin_categories c ON c.id = e.category_id
-            WHERE c.code = 'RENT_CASH_DEPOSIT'
-        """)).fetchone()[0]
-        
-        damage_cash_deposits = db.execute(text("""
-            SELECT COALESCE(SUM(e.amount), 0) FROM fin_expenses e 
-            LEFT JOIN fin_categories c ON c.id = e.category_id
-            WHERE c.code = 'DAMAGE_CASH_DEPOSIT'
-        """)).fetchone()[0]
-        
-        # === БЕЗГОТІВКА ===
-        # Bank income from rent
-        rent_bank_income = db.execute(text("""
-            SELECT COALESCE(SUM(amount), 0) FROM fin_payments 
-            WHERE payment_type = 'rent' AND method IN ('card', 'bank') AND status IN ('completed', 'confirmed')
-        """)).fetchone()[0]
-        
-        # Bank income from damage
-        damage_bank_income = db.execute(text("""
-            SELECT COALESCE(SUM(amount), 0) FROM fin_payments 
-            WHERE payment_type = 'damage' AND method IN ('card', 'bank') AND status IN ('completed', 'confirmed')
-        """)).fetchone()[0]
-        
-        # Bank expenses from rent budget
-        rent_bank_expenses = db.execute(text("""
-            SELECT COALESCE(SUM(e.amount), 0) FROM fin_expenses e 
-            LEFT JOIN fin_categories c ON c.id = e.category_id
-            WHERE e.method = 'bank' AND (c.code = 'RENT_BANK_EXPENSE')
-        """)).fetchone()[0]
-        
-        # Bank expenses from damage budget
-        damage_bank_expenses = db.execute(text("""
-            SELECT COALESCE(SUM(e.amount), 0) FROM fin_expenses e 
-            LEFT JOIN fin_categories c ON c.id = e.category_id
-            WHERE e.method = 'bank' AND c.code = 'DAMAGE_BANK_EXPENSE'
-        """)).fetchone()[0]
+        totals = _payout_totals(db)
+        rent_cash_income = totals["rent_cash_income"]
+        damage_cash_income = totals["damage_cash_income"]
+        rent_bank_income = totals["rent_bank_income"]
+        damage_bank_income = totals["damage_bank_income"]
+        rent_cash_expenses = totals["rent_cash_expenses"]
+        damage_cash_expenses = totals["damage_cash_expenses"]
+        rent_bank_expenses = totals["rent_bank_expenses"]
+        damage_bank_expenses = totals["damage_bank_expenses"]
+        rent_cash_deposits = totals["rent_cash_deposits"]
+        damage_cash_deposits = totals["damage_cash_deposits"]
         
         # === DUE AMOUNTS ===
         due_damage = db.execute(text("""
-            SELECT COALESCE(SUM(fee), 0) - COALESCE(
-                (SELECT SUM(amount) FROM fin_payments WHERE payment_type = 'damage'), 0
-            ) FROM product_damage_history WHERE fee > 0
+            SELECT COALESCE(SUM(fee), 0) FROM product_damage_history WHERE fee > 0
         """)).fetchone()[0]
+        due_damage = float(due_damage or 0) - totals["damage_paid_any_status"]
         
         # === CALCULATE BALANCES ===
         # Готівка = доходи - витрати + внесення
@@ -308,9 +266,7 @@ async def get_payouts_stats(db: Session = Depends(get_rh_db)):
         damage_bank_balance = float(damage_bank_income or 0) - float(damage_bank_expenses or 0)
         
         # Total rent revenue
-        rent_revenue = db.execute(text("""
-            SELECT COALESCE(SUM(amount), 0) FROM fin_payments WHERE payment_type = 'rent'
-        """)).fetchone()[0]
+        rent_revenue = totals["rent_revenue_any_status"]
         
         return {
             # Готівка балансі (з врахуванням витрат)
@@ -497,10 +453,8 @@ async def create_payment(data: PaymentCreate):
         debit_acc, credit_acc = mapping[data.payment_type]
         
         # Get account IDs
-        cursor.execute("SELECT id FROM fin_accounts WHERE code = %s", (debit_acc,))
-        debit_acc_id = cursor.fetchone()['id']
-        cursor.execute("SELECT id FROM fin_accounts WHERE code = %s", (credit_acc,))
-        credit_acc_id = cursor.fetchone()['id']
+        account_ids = account_cache.resolve_cursor(cursor, (debit_acc, credit_acc))
+        debit_acc_id, credit_acc_id = account_ids[debit_acc], account_ids[credit_acc]
         
         # Create transaction with user info
         cursor.execute("""
@@ -531,6 +485,7 @@ async def create_payment(data: PaymentCreate):
         payment_id = cursor.lastrowid
         
         conn.commit()
+        refresh_days_now(occurred_at)
         return {"success": True, "payment_id": payment_id, "tx_id": tx_id, "annex_id": data.annex_id}
     except Exception as e:
         conn.rollback()
@@ -589,10 +544,8 @@ async def create_expense(data: ExpenseCreate):
         credit_acc = "CASH" if data.method == "cash" else "BANK"
         
         # Get account IDs
-        cursor.execute("SELECT id FROM fin_accounts WHERE code = %s", (debit_acc,))
-        debit_acc_id = cursor.fetchone()['id']
-        cursor.execute("SELECT id FROM fin_accounts WHERE code = %s", (credit_acc,))
-        credit_acc_id = cursor.fetchone()['id']
+        account_ids = account_cache.resolve_cursor(cursor, (debit_acc, credit_acc))
+        debit_acc_id, credit_acc_id = account_ids[debit_acc], account_ids[credit_acc]
         
         # Create transaction
         cursor.execute("""
@@ -625,6 +578,7 @@ async def create_expense(data: ExpenseCreate):
         expense_id = cursor.lastrowid
         
         conn.commit()
+        refresh_days_now(occurred_at)
         return {"success": True, "expense_id": expense_id, "tx_id": tx_id}
     except HTTPException:
         conn.rollback()
@@ -765,12 +719,9 @@ async def create_collection(data: CollectionCreate):
         # Debit account = owner withdrawal
         debit_acc = "OPEX"
         
-        cursor.execute("SELECT id FROM fin_accounts WHERE code = %s", (debit_acc,))
-        debit_acc_row = cursor.fetchone()
-        cursor.execute("SELECT id FROM fin_accounts WHERE code = %s", (credit_acc,))
-        credit_acc_row = cursor.fetchone()
-        
-        if not debit_acc_row or not credit_acc_row:
+        try:
+            account_ids = account_cache.resolve_cursor(cursor, (debit_acc, credit_acc))
+        except ValueError:
             raise HTTPException(status_code=500, detail="Accounts not configured")
         
         # Create transaction
@@ -790,11 +741,11 @@ async def create_collection(data: CollectionCreate):
         cursor.execute("""
             INSERT INTO fin_ledger_entries (tx_id, account_id, direction, amount)
             VALUES (%s, %s, 'D', %s)
-        """, (tx_id, debit_acc_row['id'], data.amount))
+        """, (tx_id, account_ids[debit_acc], data.amount))
         cursor.execute("""
             INSERT INTO fin_ledger_entries (tx_id, account_id, direction, amount)
             VALUES (%s, %s, 'C', %s)
-        """, (tx_id, credit_acc_row['id'], data.amount))
+        """, (tx_id, account_ids[credit_acc], data.amount))
         
         # Create expense record
         cursor.execute("""
@@ -817,13 +768,9 @@ async def create_collection(data: CollectionCreate):
 @router.get("/collections")
 async def list_collections(period: str = "month", db: Session = Depends(get_rh_db)):
     """Список інкасацій за період."""
-    date_filter = ""
-    if period == "day":
-        date_filter = "AND e.occurred_at >= CURDATE()"
-    elif period == "week":
-        date_filter = "AND e.occurred_at >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)"
-    elif period == "month":
-        date_filter = "AND MONTH(e.occurred_at) = MONTH(CURDATE()) AND YEAR(e.occurred_at) = YEAR(CURDATE())"
+    date_filter, params = "", {}
+    if period in ("day", "week", "month"):
+        date_filter, params = period_filter("e.occurred_at", period)
     
     rows = db.execute(text(f"""
         SELECT e.id, e.amount, e.method, e.occurred_at, e.note
@@ -831,7 +778,7 @@ async def list_collections(period: str = "month", db: Session = Depends(get_rh_d
         WHERE e.expense_type = 'collection' AND e.status = 'posted'
         {date_filter}
         ORDER BY e.occurred_at DESC
-    """)).fetchall()
+    """), params).fetchall()
     
     items = []
     total_cash = 0
@@ -1049,6 +996,42 @@ async def list_transactions(tx_type: Optional[str] = None, account_code: Optiona
     return {"transactions": transactions}
 
 
+class LedgerPostingCreate(BaseModel):
+    tx_type: str
+    amount: float
+    debit_account: str
+    credit_account: str
+    entity_type: Optional[str] = None
+    entity_id: Optional[int] = None
+    category_id: Optional[int] = None
+    order_id: Optional[int] = None
+    damage_case_id: Optional[int] = None
+    vendor_id: Optional[int] = None
+    employee_id: Optional[int] = None
+    note: Optional[str] = None
+    occurred_at: Optional[str] = None
+
+@router.post("/ledger/batch")
+async def post_ledger_batch(postings: List[LedgerPostingCreate], db: Session = Depends(get_rh_db)):
+    """Провести пакет транзакцій (імпорт оплат тощо) однією DB-транзакцією"""
+    if not postings:
+        raise HTTPException(status_code=400, detail="Порожній пакет")
+    try:
+        batch = [LedgerPosting(**{
+            **p.dict(),
+            "occurred_at": datetime.fromisoformat(p.occurred_at) if p.occurred_at else None
+        }) for p in postings]
+        tx_ids = post_transaction_batch(db, batch)
+        db.commit()
+        return {"success": True, "count": len(tx_ids), "tx_ids": tx_ids}
+    except (ValueError, LedgerImbalance) as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/migrate-tables")
 async def migrate_tables(db: Session = Depends(get_rh_db)):
     """Migrate tables to correct structure"""
@@ -1424,10 +1407,8 @@ async def create_deposit_with_currency(data: DepositCreate):
         debit_acc = "CASH" if data.method == "cash" else "BANK"
         
         # Get account IDs
-        cursor.execute("SELECT id FROM fin_accounts WHERE code = %s", (debit_acc,))
-        debit_acc_id = cursor.fetchone()['id']
-        cursor.execute("SELECT id FROM fin_accounts WHERE code = %s", ("DEP_LIAB",))
-        credit_acc_id = cursor.fetchone()['id']
+        account_ids = account_cache.resolve_cursor(cursor, (debit_acc, "DEP_LIAB"))
+        debit_acc_id, credit_acc_id = account_ids[debit_acc], account_ids["DEP_LIAB"]
         
         entity_type = "order" if data.order_id else "client"
         entity_id = data.order_id or data.client_user_id
@@ -1784,6 +1765,7 @@ async def update_order_charge(order_id: int, charge_id: int, data: dict, db: Ses
                 UPDATE product_damage_history SET fee = :fee, note = COALESCE(:note, note) WHERE id = :id
             """), {"id": charge_id, "fee": amount, "note": note})
         else:
+            mark_payment_dirty(db, charge_id)
             db.execute(text("""
                 UPDATE fin_payments SET amount = :amount, note = COALESCE(:note, note) WHERE id = :id AND payment_type = 'late'
             """), {"id": charge_id, "amount": amount, "note": note})
@@ -1805,6 +1787,7 @@ async def delete_order_charge(order_id: int, charge_id: int, charge_type: str =
         if charge_type == "damage":
             db.execute(text("DELETE FROM product_damage_history WHERE id = :id"), {"id": charge_id})
         else:
+            mark_payment_dirty(db, charge_id)
             db.execute(text("DELETE FROM fin_payments WHERE id = :id AND payment_type = 'late'"), {"id": charge_id})
         
         db.commit()
@@ -1833,6 +1816,7 @@ async def pay_order_charge(order_id: int, charge_id: int, data: dict, db: Sessio
             raise HTTPException(status_code=404, detail="Донарахування не знайдено або вже оплачено")
         
         # Оновити статус на оплачено
+        mark_payment_dirty(db, charge_id)
         db.execute(text("""
             UPDATE fin_payments SET status = 'confirmed', method = :method WHERE id = :id
         """), {"id": charge_id, "method": method})
@@ -1921,7 +1905,8 @@ async def update_order_discount(order_id: int, data: dict, db: Session = Depends
         """), {"order_id": order_id}).fetchone()
         
         if existing:
-            # Оновлюємо існуючий
+            # Оновлюємо існуючий (occurred_at переїжджає на сьогодні - старий день перерахувати)
+            mark_payment_dirty(db, existing[0])
             db.execute(text("""
                 UPDATE fin_payments 
                 SET amount = :amount, note = :note, occurred_at = NOW()
@@ -1990,9 +1975,13 @@ async def create_expense_category(data: dict, db: Session = Depends(get_rh_db)):
 async def update_expense_category(category_id: int, data: dict, db: Session = Depends(get_rh_db)):
     """Оновити категорію витрат"""
     try:
+        old = db.execute(text("SELECT code FROM fin_categories WHERE id = :id"), {"id": category_id}).fetchone()
         db.execute(text("""
             UPDATE fin_categories SET name = :name, code = :code, is_active = :is_active WHERE id = :id
         """), {"id": category_id, "name": data.get("name"), "code": data.get("code"), "is_active": data.get("is_active", True)})
+        if old:
+            # Ролапи витрат ключуються кодом категорії - перенести в тій самій транзакції
+            rename_category(db, category_id, old[0], data.get("code"))
         db.commit()
         return {"success": True}
     except Exception as e:
@@ -2044,25 +2033,20 @@ async def get_hub_overview(db: Session = Depends(get_rh_db)):
         else:
             work_year, work_month = current_year, current_month
         
-        result = db.execute(text("""
-            SELECT 
-                -- Безготівка (накопичена)
-                (SELECT COALESCE(SUM(CASE WHEN method = 'bank' AND payment_type IN ('rent', 'additional', 'damage', 'late') THEN amount ELSE 0 END), 0)
-                 - COALESCE(SUM(CASE WHEN method = 'bank' AND payment_type = 'refund' THEN amount ELSE 0 END), 0)
-                 FROM fin_payments WHERE status IN ('completed', 'confirmed')) as bank_balance,
-                -- Виручка робочого місяця
-                (SELECT COALESCE(SUM(amount), 0) FROM fin_payments 
-                 WHERE status IN ('completed', 'confirmed') 
-                 AND payment_type IN ('rent', 'additional', 'damage', 'late')
-                 AND MONTH(occurred_at) = :wm AND YEAR(occurred_at) = :wy) as month_revenue,
-                -- Витрати робочого місяця
-                (SELECT COALESCE(SUM(amount), 0) FROM fin_expenses 
-                 WHERE status = 'posted' AND MONTH(occurred_at) = :wm2 AND YEAR(occurred_at) = :wy2) as month_expenses,
-                -- Кількість ордерів
-                (SELECT COUNT(*) FROM orders WHERE status NOT IN ('cancelled', 'archived')) as total_orders
-        """), {"wm": work_month, "wy": work_year, "wm2": work_month, "wy2": work_year})
-        
-        row = result.fetchone()
+        work_start, work_end = month_range(work_year, work_month)
+        payments = rollup_totals(db, PAYMENT_SOURCE)
+        month_payments = rollup_totals(db, PAYMENT_SOURCE, start=work_start, end=work_end)
+        month_expenses = rollup_totals(db, EXPENSE_SOURCE, start=work_start, end=work_end)
+        
+        # Безготівка (накопичена)
+        bank = (sum_totals(payments, kinds=INCOME_PAYMENT_TYPES, methods=["bank"], statuses=PAID_STATUSES)
+                - sum_totals(payments, kinds=["refund"], methods=["bank"], statuses=PAID_STATUSES))
+        # Виручка / витрати робочого місяця
+        revenue = sum_totals(month_payments, kinds=INCOME_PAYMENT_TYPES, statuses=PAID_STATUSES)
+        expenses = sum_totals(month_expenses, statuses=["posted"])
+        total_orders = int(db.execute(text("""
+            SELECT COUNT(*) FROM orders WHERE status NOT IN ('cancelled', 'archived')
+        """)).scalar() or 0)
         
         # Готівка = фактичний залишок каси з cash_summaries
         cash_row = db.execute(text("""
@@ -2073,12 +2057,8 @@ async def get_hub_overview(db: Session = Depends(get_rh_db)):
         if cash_row:
             cash = float(cash_row[0] or 0)
         else:
-            cash_fallback = db.execute(text("""
-                SELECT COALESCE(SUM(CASE WHEN payment_type IN ('rent', 'additional', 'damage', 'late') THEN amount ELSE 0 END), 0)
-                     - COALESCE(SUM(CASE WHEN payment_type = 'refund' THEN amount ELSE 0 END), 0)
-                FROM fin_payments WHERE method = 'cash' AND status IN ('completed', 'confirmed')
-            """)).fetchone()
-            cash = float(cash_fallback[0] or 0) if cash_fallback else 0
+            cash = (sum_totals(payments, kinds=INCOME_PAYMENT_TYPES, methods=["cash"], statuses=PAID_STATUSES)
+                    - sum_totals(payments, kinds=["refund"], methods=["cash"], statuses=PAID_STATUSES))
         
         # Застави по валютах
         deposits_result = db.execute(text("""
@@ -2104,11 +2084,6 @@ async def get_hub_overview(db: Session = Depends(get_rh_db)):
                 "count": r[5] or 0
             }
         
-        bank = float(row[0] or 0) if row else 0
-        revenue = float(row[1] or 0) if row else 0
-        expenses = float(row[2] or 0) if row else 0
-        total_orders = int(row[3] or 0) if row else 0
-        
         month_label = f"{work_month:02d}/{work_year}"
         
         return {
@@ -2283,6 +2258,8 @@ async def get_monthly_report(
             year = datetime.now().year
         if not month:
             month = datetime.now().month
+        month_start, month_end = month_range(year, month)
+        range_params = {"month_start": month_start, "month_end": month_end}
         
         # Доходи по типах
         income = db.execute(text("""
@@ -2293,9 +2270,9 @@ async def get_monthly_report(
                 SUM(amount) as total
             FROM fin_payments
             WHERE status = 'completed'
-            AND MONTH(created_at) = :month AND YEAR(created_at) = :year
+            AND created_at >= :month_start AND created_at < :month_end
             GROUP BY payment_type, method
-        """), {"month": month, "year": year})
+        """), range_params)
         
         income_breakdown = {}
         for r in income:
@@ -2316,9 +2293,9 @@ async def get_monthly_report(
             FROM fin_expenses e
             LEFT JOIN fin_categories c ON c.id = e.category_id
             WHERE e.status = 'posted'
-            AND MONTH(e.occurred_at) = :month AND YEAR(e.occurred_at) = :year
+            AND e.occurred_at >= :month_start AND e.occurred_at < :month_end
             GROUP BY c.name, e.method
-        """), {"month": month, "year": year})
+        """), range_params)
         
         expenses_breakdown = {}
         for r in expenses:
@@ -2337,9 +2314,9 @@ async def get_monthly_report(
             FROM fin_payroll p
             JOIN fin_employees e ON e.id = p.employee_id
             WHERE p.status = 'paid'
-            AND MONTH(p.paid_at) = :month AND YEAR(p.paid_at) = :year
+            AND p.paid_at >= :month_start AND p.paid_at < :month_end
             GROUP BY e.name
-        """), {"month": month, "year": year})
+        """), range_params)
         
         payroll_breakdown = {r[0]: float(r[1] or 0) for r in payroll}
         
@@ -2350,8 +2327,8 @@ async def get_monthly_report(
                 COUNT(*) as count
             FROM fin_encashments
             WHERE status = 'completed'
-            AND MONTH(created_at) = :month AND YEAR(created_at) = :year
-        """), {"month": month, "year": year}).fetchone()
+            AND created_at >= :month_start AND created_at < :month_end
+        """), range_params).fetchone()
         
         # Підсумки
         total_income = sum(v["total"] for v in income_breakdown.values())
@@ -2798,46 +2775,22 @@ async def get_order_finance_snapshot(order_id: int, db: Session = Depends(get_rh
 @router.get("/payouts-stats-v2")
 async def get_payouts_stats_optimized(db: Session = Depends(get_rh_db)):
     """
-    Оптимізована версія payouts-stats: 2 SQL запити замість 12.
-    Використовує SUM(CASE WHEN ...) для агрегації.
+    Оптимізована версія payouts-stats: суми з fin_daily_rollups замість 12 запитів.
     """
     try:
-        # === ОДИН ЗАПИТ ДЛЯ ВСІХ PAYMENTS ===
-        payments_stats = db.execute(text("""
-            SELECT 
-                SUM(CASE WHEN payment_type = 'rent' AND method = 'cash' AND status IN ('completed', 'confirmed') THEN amount ELSE 0 END) as rent_cash,
-                SUM(CASE WHEN payment_type = 'rent' AND method IN ('card', 'bank') AND status IN ('completed', 'confirmed') THEN amount ELSE 0 END) as rent_bank,
-                SUM(CASE WHEN payment_type = 'damage' AND method = 'cash' AND status IN ('completed', 'confirmed') THEN amount ELSE 0 END) as damage_cash,
-                SUM(CASE WHEN payment_type = 'damage' AND method IN ('card', 'bank') AND status IN ('completed', 'confirmed') THEN amount ELSE 0 END) as damage_bank,
-                SUM(CASE WHEN payment_type = 'rent' AND status IN ('completed', 'confirmed') THEN amount ELSE 0 END) as total_rent
-            FROM fin_payments
-        """)).fetchone()
-        
-        rent_cash_income = float(payments_stats[0] or 0)
-        rent_bank_income = float(payments_stats[1] or 0)
-        damage_cash_income = float(payments_stats[2] or 0)
-        damage_bank_income = float(payments_stats[3] or 0)
-        total_rent = float(payments_stats[4] or 0)
-        
-        # === ОДИН ЗАПИТ ДЛЯ ВСІХ EXPENSES ===
-        expenses_stats = db.execute(text("""
-            SELECT 
-                SUM(CASE WHEN c.code IN ('RENT_EXPENSE', 'RENT_CASH_EXPENSE') AND e.method = 'cash' THEN e.amount ELSE 0 END) as rent_cash_exp,
-                SUM(CASE WHEN c.code = 'DAMAGE_EXPENSE' AND e.method = 'cash' THEN e.amount ELSE 0 END) as damage_cash_exp,
-                SUM(CASE WHEN c.code = 'RENT_BANK_EXPENSE' AND e.method = 'bank' THEN e.amount ELSE 0 END) as rent_bank_exp,
-                SUM(CASE WHEN c.code = 'DAMAGE_BANK_EXPENSE' AND e.method = 'bank' THEN e.amount ELSE 0 END) as damage_bank_exp,
-                SUM(CASE WHEN c.code = 'RENT_CASH_DEPOSIT' THEN e.amount ELSE 0 END) as rent_cash_dep,
-                SUM(CASE WHEN c.code = 'DAMAGE_CASH_DEPOSIT' THEN e.amount ELSE 0 END) as damage_cash_dep
-            FROM fin_expenses e
-            LEFT JOIN fin_categories c ON c.id = e.category_id
-        """)).fetchone()
-        
-        rent_cash_expenses = float(expenses_stats[0] or 0)
-        damage_cash_expenses = float(expenses_stats[1] or 0)
-        rent_bank_expenses = float(expenses_stats[2] or 0)
-        damage_bank_expenses = float(expenses_stats[3] or 0)
-        rent_cash_deposits = float(expenses_stats[4] or 0)
-        damage_cash_deposits = float(expenses_stats[5] or 0)
+        totals = _payout_totals(db)
+        rent_cash_income = totals["rent_cash_income"]
+        rent_bank_income = totals["rent_bank_income"]
+        damage_cash_income = totals["damage_cash_income"]
+        damage_bank_income = totals["damage_bank_income"]
+        total_rent = totals["rent_revenue"]
+        
+        rent_cash_expenses = totals["rent_cash_expenses"]
+        damage_cash_expenses = totals["damage_cash_expenses"]
+        rent_bank_expenses = totals["rent_bank_expenses"]
+        damage_bank_expenses = totals["damage_bank_expenses"]
+        rent_cash_deposits = totals["rent_cash_deposits"]
+        damage_cash_deposits = totals["damage_cash_deposits"]
         
         # === DEPOSITS HELD ===
         deposits_held = db.execute(text("""
@@ -2917,21 +2870,13 @@ async def get_kasa_data(
     """
     try:
         # Date filter
-        date_filter_payments = ""
-        date_filter_expenses = ""
-        params = {}
-        
-        if period == "day":
-            date_filter_payments = "AND p.occurred_at >= CURDATE()"
-            date_filter_expenses = "AND e.occurred_at >= CURDATE()"
-        elif period == "week":
-            date_filter_payments = "AND p.occurred_at >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)"
-            date_filter_expenses = "AND e.occurred_at >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)"
-        elif period == "month":
-            date_filter_payments = "AND MONTH(p.occurred_at) = MONTH(CURDATE()) AND YEAR(p.occurred_at) = YEAR(CURDATE())"
-            date_filter_expenses = "AND MONTH(e.occurred_at) = MONTH(CURDATE()) AND YEAR(e.occurred_at) = YEAR(CURDATE())"
-        elif period == "all":
-            pass  # no filter
+        date_filter_payments, payment_params = "", {}
+        date_filter_expenses, expense_params = "", {}
+        
+        if period in ("day", "week", "month"):
+            date_filter_payments, payment_params = period_filter("p.occurred_at", period)
+            date_filter_expenses, expense_params = period_filter("e.occurred_at", period)
+        # period == "all" (або інший) - без фільтра
         
         # === 1. INCOME (rent/damage/late/additional payments) ===
         income_rows = db.execute(text(f"""
@@ -2945,7 +2890,7 @@ async def get_kasa_data(
             AND p.status IN ('completed', 'confirmed')
             {date_filter_payments}
             ORDER BY p.occurred_at DESC
-        """))
+        """), payment_params)
         
         income = []
         income_cash_total = 0
@@ -3035,17 +2980,12 @@ async def get_kasa_data(
             })
         
         # Deposit payments (to know cash/bank)
-        dep_payments = db.execute(text(f"""
-            SELECT p.method, SUM(p.amount) as total
-            FROM fin_payments p
-            WHERE p.payment_type = 'deposit'
-            AND p.status IN ('completed', 'confirmed')
-            {date_filter_payments}
-            GROUP BY p.method
-        """))
+        period_start, period_end = period_range(period) if period in ("day", "week", "month") else (None, None)
+        period_payments = rollup_totals(db, PAYMENT_SOURCE, start=period_start, end=period_end)
         dep_by_method = {}
-        for r in dep_payments:
-            dep_by_method[r[0] or 'cash'] = float(r[1] or 0)
+        for method, total in totals_by(period_payments, "method", kinds=["deposit"], statuses=PAID_STATUSES).items():
+            key = method or 'cash'
+            dep_by_method[key] = dep_by_method.get(key, 0) + total
         
         # === 3. EXPENSES ===
         expense_rows = db.execute(text(f"""
@@ -3058,7 +2998,7 @@ async def get_kasa_data(
             WHERE e.status = 'posted'
             {date_filter_expenses}
             ORDER BY e.occurred_at DESC
-        """))
+        """), expense_params)
         
         expenses = []
         expenses_cash_total = 0
@@ -3097,7 +3037,7 @@ async def get_kasa_data(
             AND p.status IN ('completed', 'confirmed')
             {date_filter_payments}
             ORDER BY p.occurred_at DESC
-        """))
+        """), payment_params)
         
         refunds = []
         for r in refund_rows:
@@ -3119,20 +3059,14 @@ async def get_kasa_data(
             })
         
         # Collection (Інкасація) totals
-        collection_rows = db.execute(text(f"""
-            SELECT e.method, SUM(e.amount) as total
-            FROM fin_expenses e
-            WHERE e.expense_type = 'collection' AND e.status = 'posted'
-            {date_filter_expenses}
-            GROUP BY e.method
-        """)).fetchall()
+        period_expenses = rollup_totals(db, EXPENSE_SOURCE, start=period_start, end=period_end)
         collection_cash = 0
         collection_bank = 0
-        for r in collection_rows:
-            if (r[0] or 'cash') == 'cash':
-                collection_cash += float(r[1] or 0)
+        for method, total in totals_by(period_expenses, "method", kinds=["collection"], statuses=["posted"]).items():
+            if (method or 'cash') == 'cash':
+                collection_cash += total
             else:
-                collection_bank += float(r[1] or 0)
+                collection_bank += total
         
         # === CLOSED MONTHS: summaries only (items stay in their arrays) ===
         _ensure_monthly_reports_table(db)
@@ -3543,6 +3477,10 @@ async def close_month(
         }
     }
     
+    # Денні ролапи закритого місяця перебудувати з сирих таблиць
+    rollup_start, rollup_end = month_range(year, month)
+    rebuild_range(db, rollup_start, rollup_end)
+    
     # Save to DB
     db.execute(text("""
         INSERT INTO monthly_reports (year, month, report_data, closed_by, closed_by_id, note)
@@ -3628,6 +3566,35 @@ async def delete_monthly_report(report_id: int, db: Session = Depends(get_rh_db)
     return {"success": True}
 
 
+@router.get("/rollups/check")
+async def check_finance_rollups(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    db: Session = Depends(get_rh_db)
+):
+    """
+    Звірка денних ролапів (fin_daily_rollups) з fin_payments / fin_expenses.
+    start/end - YYYY-MM-DD, [start, end); виправлення - POST /rollups/repair
+    """
+    try:
+        return check_consistency(db, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/rollups/repair")
+async def repair_finance_rollups(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    db: Session = Depends(get_rh_db)
+):
+    """Звірка ролапів і перерахунок днів з розбіжностями (start/end - як у /rollups/check)"""
+    try:
+        return check_consistency(db, start, end, repair=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 
 # ============================================================
 # PLAN: Expected Income (План надходжень)
@@ -3647,6 +3614,7 @@ async def get_expected_income(
     now = dt.now()
     target_month = month or now.month
     target_year = year or now.year
+    month_start, month_end = month_range(target_year, target_month)
     
     try:
         # All orders with event START in the target month (each order belongs to ONE month only)
@@ -3681,9 +3649,9 @@ async def get_expected_income(
             FROM orders o
             LEFT JOIN users u ON u.user_id = o.manager_id
             WHERE o.status NOT IN ('cancelled', 'deleted')
-            AND MONTH(o.rental_start_date) = :month AND YEAR(o.rental_start_date) = :year
+            AND o.rental_start_date >= :month_start AND o.rental_start_date < :month_end
             ORDER BY o.rental_start_date ASC
-        """), {"month": target_month, "year": target_year})
+        """), {"month_start": month_start, "month_end": month_end})
         
         items = []
         total_expected = 0
@@ -4024,20 +3992,9 @@ async def get_expense_report(
 ):
     """Звіт по статтях витрат з фільтрами"""
     try:
-        date_filter = ""
-        if period == "day":
-            date_filter = "AND e.occurred_at >= CURDATE()"
-        elif period == "week":
-            date_filter = "AND e.occurred_at >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)"
-        elif period == "month":
-            date_filter = "AND MONTH(e.occurred_at) = MONTH(CURDATE()) AND YEAR(e.occurred_at) = YEAR(CURDATE())"
-        elif period == "quarter":
-            date_filter = "AND e.occurred_at >= DATE_SUB(CURDATE(), INTERVAL 3 MONTH)"
-        elif period == "year":
-            date_filter = "AND YEAR(e.occurred_at) = YEAR(CURDATE())"
+        date_filter, params = period_filter("e.occurred_at", period)
         
         cat_filter = ""
-        params = {}
         if category_code:
             cat_filter = "AND c.code = :cat_code"
             params["cat_code"] = category_code
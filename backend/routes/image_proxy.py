@@ -5,19 +5,25 @@
 Використовується тільки для preview середовища
 В production - прямий доступ до uploads через nginx
 """
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, HTTPException, Request
+from functools import lru_cache
 import logging
 from pathlib import Path
 
+from utils.static_assets import serve_bytes, serve_file
+
 router = APIRouter(prefix="/api/image-proxy", tags=["image-proxy"])
 logger = logging.getLogger(__name__)
 
 # Локальна директорія uploads
 LOCAL_UPLOADS = Path("/app/backend/uploads")
 
+PLACEHOLDER_HEADERS = {"Access-Control-Allow-Origin": "*"}
+PLACEHOLDER_CACHE_CONTROL = "public, max-age=3600"
+
+
 @router.get("/{path:path}")
-async def proxy_image(path: str):
+async def proxy_image(path: str, request: Request):
     """
     Віддає зображення тільки з uploads/
     Якщо немає - повертає placeholder
@@ -26,19 +32,16 @@ async def proxy_image(path: str):
         # Тільки uploads/ - єдине джерело правди
         if path.startswith('uploads/'):
             local_path = LOCAL_UPLOADS / path.replace('uploads/', '')
-            if local_path.exists() and local_path.is_file():
-                logger.info(f"✅ Serving from uploads: {local_path}")
-                return FileResponse(local_path)
+            if local_path.is_file():
+                # ETag / 304 / Range; на кожен хіт не логуємо - каталог шле їх сотнями
+                logger.debug(f"Serving from uploads: {local_path}")
+                return serve_file(request, local_path)
             else:
-                logger.warning(f"⚠️ Image not found in uploads: {path}")
+                logger.debug(f"Image not found in uploads: {path}")
                 # Повертаємо placeholder
-                return StreamingResponse(
-                    iter([generate_placeholder_svg(path)]),
-                    media_type="image/svg+xml",
-                    headers={
-                        "Cache-Control": "public, max-age=3600",
-                        "Access-Control-Allow-Origin": "*"
-                    }
+                return serve_bytes(
+                    request, generate_placeholder_svg(path), "image/svg+xml",
+                    cache_control=PLACEHOLDER_CACHE_CONTROL, headers=PLACEHOLDER_HEADERS
                 )
         else:
             # Якщо шлях не починається з uploads/ - це помилка
@@ -49,9 +52,9 @@ async def proxy_image(path: str):
         raise
     except Exception as e:
         logger.error(f"Error serving image {path}: {type(e).__name__} - {str(e)}")
-        return StreamingResponse(
-            iter([generate_placeholder_svg(path)]),
-            media_type="image/svg+xml"
+        return serve_bytes(
+            request, generate_placeholder_svg(path), "image/svg+xml",
+            cache_control="no-cache", headers=PLACEHOLDER_HEADERS
         )
 
 
@@ -62,7 +65,12 @@ def generate_placeholder_svg(path: str) -> bytes:
     # Отримати ім'я файлу з шляху
     filename = path.split('/')[-1] if '/' in path else path
     filename = filename[:20] + '...' if len(filename) > 20 else filename
-    
+    return _placeholder_svg(filename)
+
+
+@lru_cache(maxsize=2048)
+def _placeholder_svg(filename: str) -> bytes:
+    """SVG для скороченого імені файлу (мемоізовано)"""
     svg = f'''<svg xmlns="http://www.w3.org/2000/svg" width="400" height="400" viewBox="0 0 400 400">
   <rect width="400" height="400" fill="#f1f5f9"/>
   <text x="50%" y="45%" dominant-baseline="middle" text-anchor="middle" 
@@ -12,6 +12,7 @@ from pydantic import BaseModel
 import json
 
 from database_rentalhub import get_rh_db
+from services.notification_outbox import result_hook
 
 router = APIRouter(prefix="/api/agreements", tags=["master-agreements"])
 
@@ -578,7 +579,7 @@ async def send_agreement(
 ):
     """Send agreement HTML to email"""
     from services.pdf_generator import generate_master_agreement_html
-    from services.email_service import send_email
+    from services.email_service import queue_email
     
     # Get agreement with client data
     agreement = db.execute(text("""
@@ -641,33 +642,40 @@ async def send_agreement(
     </html>
     """
     
-    # Send email with HTML body (no PDF attachment)
-    email_result = send_email(
+    # Queue email with HTML body (no PDF attachment); status -> 'sent' after delivery
+    email_result = queue_email(
+        db,
         to_email=data.email,
         subject=subject,
-        html_content=html_body
+        html_content=html_body,
+        result_hook="master_agreement_sent",
+        hook_data={"agreement_id": agreement_id}
     )
     
     if not email_result.get("success"):
         raise HTTPException(status_code=500, detail=f"Помилка відправки email: {email_result.get('message')}")
     
-    # Update status to 'sent' if was draft
-    try:
-        db.execute(text("""
-            UPDATE master_agreements 
-            SET status = 'sent' 
-            WHERE id = :id AND status = 'draft'
-        """), {"id": agreement_id})
-        db.commit()
-    except:
-        pass
+    db.commit()
     
     return {
         "success": True,
-        "message": f"Договір {agreement[1]} відправлено на {data.email}"
+        "message": f"Договір {agreement[1]} поставлено в чергу на {data.email}",
+        "outbox_id": email_result["outbox_id"]
     }
 
 
+@result_hook("master_agreement_sent")
+def mark_agreement_sent(db: Session, message, outcome):
+    """Update status to 'sent' if was draft, once the email is delivered"""
+    if not outcome.success:
+        return
+    db.execute(text("""
+        UPDATE master_agreements 
+        SET status = 'sent' 
+        WHERE id = :id AND status = 'draft'
+    """), {"id": message.hook_data.get("agreement_id")})
+
+
 # ============================================================
 # PREVIEW AGREEMENT (HTML)
 # ============================================================
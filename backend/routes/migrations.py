@@ -380,6 +380,72 @@ async def migrate_finance_hub_v2():
         )
 
 
+# ============================================================
+# FINANCE PERIOD INDEXES
+# ============================================================
+
+# (table, index_name, columns) - під діапазонні фільтри utils/period_range
+# (`col >= :start AND col < :end`) у finance / analytics
+FINANCE_PERIOD_INDEXES = [
+    ("fin_payments", "idx_payments_status_occurred", "status, occurred_at, payment_type, method, amount"),
+    ("fin_payments", "idx_payments_status_created", "status, created_at, payment_type, method, amount"),
+    ("fin_expenses", "idx_expenses_status_occurred", "status, occurred_at, method, category_id, amount"),
+    ("fin_expenses", "idx_expenses_type_status_occurred", "expense_type, status, occurred_at"),
+    ("fin_payroll", "idx_payroll_status_paid", "status, paid_at"),
+    ("fin_encashments", "idx_encashments_status_created", "status, created_at, amount"),
+    ("orders", "idx_orders_created_status", "created_at, status, total_price"),
+    ("orders", "idx_orders_rental_start_status", "rental_start_date, status"),
+    ("product_damage_history", "idx_pdh_created_fee", "created_at, fee, product_id"),
+]
+
+
+@router.post("/finance-period-indexes-v1")
+async def migrate_finance_period_indexes_v1():
+    """
+    Композитні індекси для фінансових/аналітичних звітів за період.
+    Запити фільтрують діапазоном по даті (sargable), ці індекси покривають
+    фільтр + агреговані колонки.
+    
+    Safe to run multiple times.
+    """
+    try:
+        db = get_rh_db_sync()
+        results = []
+        
+        for table, index_name, columns in FINANCE_PERIOD_INDEXES:
+            try:
+                check = db.execute(text("""
+                    SELECT COUNT(*) FROM information_schema.STATISTICS 
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table 
+                    AND INDEX_NAME = :index_name
+                """), {"table": table, "index_name": index_name}).scalar()
+                
+                if not check:
+                    db.execute(text(f"CREATE INDEX {index_name} ON {table}({columns})"))
+                    db.commit()
+                    results.append(f"{index_name}: created")
+                else:
+                    results.append(f"{index_name}: already exists")
+            except Exception as e:
+                results.append(f"{index_name}: error - {str(e)}")
+                db.rollback()
+        
+        db.close()
+        
+        return {
+            "success": True,
+            "migration": "finance-period-indexes-v1",
+            "results": results
+        }
+        
+    except Exception as e:
+        logger.error(f"Finance period indexes migration failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Помилка міграції: {str(e)}"
+        )
+
+
 @router.post("/documents-engine-v3")
 async def migrate_documents_engine_v3():
     """
@@ -2,7 +2,8 @@
 Order Sync API - Real-time синхронізація змін в ордерах
 
 Архітектура:
-1. WebSocket Hub - тримає з'єднання всіх клієнтів
+1. WebSocket Hub - тримає з'єднання клієнтів воркера; події та присутність між воркерами
+   ходять через services/realtime_backplane (REALTIME_BACKPLANE=memory|database)
 2. Версіонування по секціях (header, items, progress, comments)
 3. Бродкаст подій без затирання локальної роботи
 4. REST endpoints для версій (fallback для polling)
@@ -21,8 +22,12 @@ from datetime import datetime
 from typing import Dict, Set, Optional, List
 import json
 import asyncio
+import uuid
 
 from database_rentalhub import get_rh_db
+from services.realtime_backplane import (
+    REALTIME_PRESENCE_HEARTBEAT_SECONDS, Backplane, ConnectionSender, PresenceRegistry, get_backplane
+)
 
 router = APIRouter(prefix="/api/orders", tags=["order-sync"])
 
@@ -30,54 +35,121 @@ router = APIRouter(prefix="/api/orders", tags=["order-sync"])
 # ============================================================
 # WebSocket Connection Manager
 # ============================================================
+PRESENCE_CHANNEL = "presence"
+
+
+def _room_channel(order_id: int) -> str:
+    return f"order:{order_id}"
+
+
+def _coalesce_key(message: dict):
+    """Ключ, за яким невідправлене повідомлення замінюється новішим (None - не коалесцюється)"""
+    msg_type = message.get("type")
+    if msg_type == "order.section.updated":
+        return ("section", message.get("section"))
+    if msg_type == "user.typing":
+        return ("typing", message.get("user_id"))
+    if msg_type in ("user.joined", "user.left"):
+        # обидва несуть повний список присутніх - досить останнього
+        return ("presence",)
+    return None
+
+
 class OrderSyncManager:
-    """Менеджер WebSocket з'єднань для синхронізації ордерів"""
+    """
+    Менеджер WebSocket з'єднань для синхронізації ордерів.
+    Сокети - локальні для воркера, події і присутність ходять через backplane
+    (services/realtime_backplane), тож доходять до клієнтів усіх воркерів.
+    """
     
-    def __init__(self):
-        # order_id -> set of WebSocket connections
+    def __init__(self, backplane: Optional[Backplane] = None):
+        # order_id -> set of WebSocket connections (цього воркера)
         self.active_connections: Dict[int, Set[WebSocket]] = {}
-        # websocket -> {user_id, user_name, order_id, role}
+        # websocket -> {conn_id, user_id, user_name, order_id, role, connected_at}
         self.connection_info: Dict[WebSocket, dict] = {}
+        self.senders: Dict[WebSocket, ConnectionSender] = {}
+        # присутні в кімнатах усіх воркерів
+        self.presence = PresenceRegistry()
+        self._backplane = backplane
+        self._started = False
+        self._heartbeat_task: Optional[asyncio.Task] = None
+    
+    @property
+    def backplane(self) -> Backplane:
+        if self._backplane is None:
+            self._backplane = get_backplane()
+        return self._backplane
+    
+    async def start(self):
+        """Підписатися на backplane і попросити інші воркери надіслати своїх присутніх"""
+        if self._started:
+            return
+        self._started = True
+        self.backplane.subscribe(self._on_event)
+        try:
+            await self.backplane.start()
+        except Exception as e:
+            # Події цього воркера доставляються і без шини
+            print(f"[WS] Realtime backplane unavailable, local delivery only: {e}")
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        await self.backplane.publish(PRESENCE_CHANNEL, {"action": "sync_request", "worker": self.backplane.worker_id})
+    
+    async def stop(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        for sender in self.senders.values():
+            sender.close()
+        await self.backplane.stop()
+        self._started = False
         
     async def connect(self, websocket: WebSocket, order_id: int, user_id: int, user_name: str, role: str = "manager"):
         """Підключити клієнта до кімнати ордера"""
         await websocket.accept()
+        await self.start()
         
         if order_id not in self.active_connections:
             self.active_connections[order_id] = set()
         
         self.active_connections[order_id].add(websocket)
-        self.connection_info[websocket] = {
+        info = {
+            "conn_id": uuid.uuid4().hex,
             "user_id": user_id,
             "user_name": user_name,
             "role": role,
             "order_id": order_id,
             "connected_at": datetime.now().isoformat()
         }
+        self.connection_info[websocket] = info
+        sender = ConnectionSender(websocket.send_text, on_overflow=lambda: self._drop_slow(websocket))
+        self.senders[websocket] = sender
+        sender.start()
         
-        # Notify others that someone joined
-        await self.broadcast(order_id, {
-            "type": "user.joined",
-            "user_id": user_id,
-            "user_name": user_name,
-            "role": role,
-            "users_count": len(self.active_connections[order_id]),
-            "users": self.get_active_users(order_id)
-        }, exclude=websocket)
+        # Notify others that someone joined (на всіх воркерах)
+        await self.backplane.publish(PRESENCE_CHANNEL, {
+            "action": "join",
+            "worker": self.backplane.worker_id,
+            "order_id": order_id,
+            "conn": info["conn_id"],
+            "info": info,
+        })
         
         # Send current users to the new connection
-        await websocket.send_text(json.dumps({
+        sender.push(json.dumps({
             "type": "sync.connected",
             "order_id": order_id,
             "users": self.get_active_users(order_id),
             "timestamp": datetime.now().isoformat()
         }, ensure_ascii=False))
         
-        print(f"[WS] {user_name} ({role}) connected to order {order_id}. Total: {len(self.active_connections[order_id])}")
+        print(f"[WS] {user_name} ({role}) connected to order {order_id}. Total: {self.presence.connections(order_id)}")
     
     def disconnect(self, websocket: WebSocket):
         """Відключити клієнта"""
-        info = self.connection_info.get(websocket)
+        info = self.connection_info.pop(websocket, None)
+        sender = self.senders.pop(websocket, None)
+        if sender:
+            sender.close()
         if info:
             order_id = info["order_id"]
             if order_id in self.active_connections:
@@ -86,41 +158,113 @@ class OrderSyncManager:
                 # Cleanup empty rooms
                 if not self.active_connections[order_id]:
                     del self.active_connections[order_id]
-                else:
-                    # Notify others
-                    asyncio.create_task(self.broadcast(order_id, {
-                        "type": "user.left",
-                        "user_id": info["user_id"],
-                        "user_name": info["user_name"],
-                        "role": info["role"],
-                        "users_count": len(self.active_connections.get(order_id, set())),
-                        "users": self.get_active_users(order_id)
-                    }))
             
-            del self.connection_info[websocket]
+            # Notify others (на всіх воркерах)
+            asyncio.create_task(self.backplane.publish(PRESENCE_CHANNEL, {
+                "action": "leave",
+                "worker": self.backplane.worker_id,
+                "order_id": order_id,
+                "conn": info["conn_id"],
+                "info": info,
+            }))
             print(f"[WS] {info['user_name']} disconnected from order {order_id}")
     
-    async def broadcast(self, order_id: int, message: dict, exclude: Optional[WebSocket] = None):
-        """Відправити повідомлення всім в кімнаті ордера"""
-        if order_id not in self.active_connections:
+    def _drop_slow(self, websocket: WebSocket):
+        """Сокет не встигає читати - закрити, клієнт перепідключиться і перечитає стан"""
+        if websocket not in self.connection_info:
             return
-        
+        self.disconnect(websocket)
+        asyncio.create_task(self._close_quietly(websocket))
+    
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+    
+    async def broadcast(self, order_id: int, message: dict, exclude: Optional[WebSocket] = None):
+        """Відправити повідомлення всім в кімнаті ордера (на всіх воркерах)"""
         message["timestamp"] = datetime.now().isoformat()
+        exclude_info = self.connection_info.get(exclude) if exclude is not None else None
+        await self.backplane.publish(_room_channel(order_id), {
+            "order_id": order_id,
+            "message": message,
+            "exclude": exclude_info["conn_id"] if exclude_info else None,
+        })
+    
+    def _deliver(self, order_id: int, message: dict, exclude: Optional[str] = None):
+        """Поставити повідомлення в черги локальних сокетів кімнати (без очікування мережі)"""
+        connections = self.active_connections.get(order_id)
+        if not connections:
+            return
         message_json = json.dumps(message, ensure_ascii=False)
-        
-        disconnected = []
-        for connection in self.active_connections[order_id]:
-            if connection == exclude:
+        key = _coalesce_key(message)
+        for connection in list(connections):
+            info = self.connection_info.get(connection)
+            sender = self.senders.get(connection)
+            if not info or not sender or info["conn_id"] == exclude:
                 continue
+            sender.push(message_json, key)
+    
+    async def _on_event(self, channel: str, payload: dict):
+        if channel == PRESENCE_CHANNEL:
+            await self._on_presence(payload)
+        elif channel.startswith("order:"):
+            self._deliver(int(payload["order_id"]), payload["message"], payload.get("exclude"))
+    
+    async def _on_presence(self, payload: dict):
+        action, worker = payload.get("action"), payload.get("worker")
+        if action == "sync_request":
+            if worker != self.backplane.worker_id:
+                await self._publish_snapshot()
+            return
+        if action == "snapshot":
+            self.presence.replace_worker(worker, {})
+            for order_id, conn, info in payload.get("connections", []):
+                self.presence.join(worker, int(order_id), conn, info)
+            return
+        
+        order_id, info = int(payload["order_id"]), payload["info"]
+        if action == "join":
+            self.presence.join(worker, order_id, payload["conn"], info)
+            msg_type = "user.joined"
+        elif action == "leave":
+            self.presence.leave(worker, order_id, payload["conn"])
+            msg_type = "user.left"
+        else:
+            return
+        self._deliver(order_id, {
+            "type": msg_type,
+            "user_id": info["user_id"],
+            "user_name": info["user_name"],
+            "role": info["role"],
+            "users_count": self.presence.connections(order_id),
+            "users": self.get_active_users(order_id),
+            "timestamp": datetime.now().isoformat()
+        }, exclude=payload["conn"])
+    
+    async def _publish_snapshot(self):
+        await self.backplane.publish(PRESENCE_CHANNEL, {
+            "action": "snapshot",
+            "worker": self.backplane.worker_id,
+            "connections": [[info["order_id"], info["conn_id"], info] for info in self.connection_info.values()],
+        })
+    
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(REALTIME_PRESENCE_HEARTBEAT_SECONDS)
             try:
-                await connection.send_text(message_json)
+                await self._publish_snapshot()
+                self.presence.expire(keep=self.backplane.worker_id)
             except Exception as e:
-                print(f"[WS] Failed to send message: {e}")
-                disconnected.append(connection)
-        
-        # Cleanup disconnected
-        for conn in disconnected:
-            self.disconnect(conn)
+                print(f"[WS] Presence heartbeat failed: {e}")
+    
+    def send(self, websocket: WebSocket, message: dict):
+        """Відповідь одному сокету через його чергу"""
+        sender = self.senders.get(websocket)
+        if sender:
+            sender.push(json.dumps(message, ensure_ascii=False))
     
     async def notify_section_update(self, order_id: int, section: str, 
                                      updated_by_id: int, updated_by_name: str,
@@ -146,15 +290,11 @@ class OrderSyncManager:
         })
     
     def get_active_users(self, order_id: int) -> list:
-        """Отримати список активних користувачів в ордері"""
-        if order_id not in self.active_connections:
-            return []
-        
+        """Отримати список активних користувачів в ордері (усі воркери)"""
         users = []
         seen_ids = set()
-        for ws in self.active_connections[order_id]:
-            info = self.connection_info.get(ws)
-            if info and info["user_id"] not in seen_ids:
+        for info in self.presence.members(order_id):
+            if info["user_id"] not in seen_ids:
                 seen_ids.add(info["user_id"])
                 users.append({
                     "user_id": info["user_id"],
@@ -386,7 +526,7 @@ async def websocket_order_sync(
                 msg_type = message.get("type", "")
                 
                 if msg_type == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong", "timestamp": datetime.now().isoformat()}))
+                    sync_manager.send(websocket, {"type": "pong", "timestamp": datetime.now().isoformat()})
                 
                 elif msg_type == "typing":
                     # Хтось друкує коментар
@@ -15,6 +15,9 @@ import os
 from database_rentalhub import get_rh_db
 from utils.image_helper import normalize_image_url
 from utils.user_tracking_helper import get_current_user_dependency
+from services.order_hydrator import hydrate_orders, load_order_item_rows, load_damage_rows
+from services.finance_rollup import mark_dirty
+from services.product_search import get_product_search, rank_rows, search_text
 
 router = APIRouter(prefix="/api/orders", tags=["orders"])
 
@@ -72,159 +75,23 @@ class OrderCreate(BaseModel):
 # HELPER FUNCTIONS
 # ============================================================
 
-def parse_order_row(row, db: Session = None):
-    """Parse order row from database"""
+def parse_order_row(row, db: Session = None, hydrated: Optional[dict] = None):
+    """Parse order row from database
+    
+    hydrated - готові items/packing_progress/оплати з hydrate_orders (для списків).
+    Якщо не передано - завантажуємо для одного замовлення.
+    """
     if not row:
         return None
     
-    # Get items if needed
-    items = []
-    packing_progress = 0  # ✅ Прогрес комплектації
-    
-    if db and row[0]:  # order_id exists
-        items_result = db.execute(text("""
-            SELECT oi.id, oi.order_id, oi.product_id, oi.product_name, 
-                   oi.quantity, oi.price, oi.total_rental,
-                   COALESCE(p.image_url, oi.image_url) as image_url,
-                   p.price as loss_value, p.quantity as available_qty,
-                   p.sku, p.zone, p.aisle, p.shelf, p.cleaning_status, p.product_state,
-                   p.category_name
-            FROM order_items oi
-            LEFT JOIN products p ON oi.product_id = p.product_id
-            WHERE oi.order_id = :order_id
-              AND (oi.status IS NULL OR oi.status != 'refused')
-        """), {"order_id": row[0]})
-        
-        for item_row in items_result:
-            # order_items: [0]id, [1]order_id, [2]product_id, [3]product_name, [4]quantity, [5]price, [6]total_rental, 
-            #              [7]image_url, [8]loss_value, [9]available_qty, [10]sku, [11]zone, [12]aisle, [13]shelf, [14]cleaning_status, [15]product_state, [16]category_name
-            loss_value = float(item_row[8]) if item_row[8] else 0.0
-            quantity = item_row[4] or 1
-            available = int(item_row[9]) if item_row[9] else 0
-            deposit_per_unit = loss_value / 2  # Застава = половина від вартості втрати
-            
-            # Обробка image_url
-            image_url = normalize_image_url(item_row[7])
-            
-            items.append({
-                "inventory_id": str(item_row[2]) if item_row[2] else "",
-                "article": item_row[10] or str(item_row[2]),  # SKU (article) або product_id
-                "sku": item_row[10] or str(item_row[2]),  # SKU або product_id
-                "name": item_row[3],
-                "category": item_row[16] or "Реквізит",  # Категорія товару для пошкоджень
-                "quantity": quantity,
-                "qty": quantity,  # Для IssueCard
-                "price_per_day": float(item_row[5]) if item_row[5] else 0.0,
-                "total_rental": float(item_row[6]) if item_row[6] else 0.0,
-                "deposit": deposit_per_unit,  # Застава = EAN / 2
-                "damage_cost": loss_value,  # Збиток (EAN) - повна вартість втрати
-                "total_deposit": deposit_per_unit * quantity,  # Загальна застава за товар
-                "image": image_url,  # Фото товару (оброблений URL)
-                "photo": image_url,  # Альтернативна назва для IssueCard
-                # Дані наявності з products
-                "available_qty": available,
-                "available": available,
-                "reserved_qty": 0,  # TODO: рахувати з order_items WHERE status != 'completed'
-                "reserved": 0,
-                "in_rent_qty": 0,  # TODO: рахувати з orders WHERE status = 'shipped'
-                "in_rent": 0,
-                "in_restore_qty": 0,  # TODO: рахувати з damages
-                "in_restore": 0,
-                # Локація на складі
-                "location": {
-                    "zone": item_row[11] or "",
-                    "aisle": item_row[12] or "",
-                    "shelf": item_row[13] or "",
-                    "state": item_row[15] or "shelf"
-                },
-                "pack": "",  # TODO: додати якщо є в products
-                "pre_damage": []  # will be enriched below
-            })
-        
-        # ✅ Enrich items with damage history
-        item_pids = [it.get('inventory_id') for it in items if it.get('inventory_id')]
-        if item_pids:
-            pids_str = ','.join(str(int(p)) for p in item_pids if p.isdigit())
-            if pids_str:
-                try:
-                    dmg_rows = db.execute(text(f"""
-                        SELECT product_id, damage_type, damage_code, note, severity, 
-                               processing_status, created_at, photo_url, stage, 
-                               order_number, qty, fee, created_by, id
-                        FROM product_damage_history
-                        WHERE product_id IN ({pids_str})
-                        ORDER BY created_at DESC
-                    """)).fetchall()
-                    dmg_by_pid = {}
-                    for dr in dmg_rows:
-                        k = str(dr[0])
-                        if k not in dmg_by_pid:
-                            dmg_by_pid[k] = []
-                        dmg_by_pid[k].append({
-                            'id': dr[13],
-                            'type': dr[1] or dr[2] or '',
-                            'damage_type': dr[1] or dr[2] or '',
-                            'notes': dr[3] or '',
-                            'note': dr[3] or '',
-                            'severity': dr[4] or 'low',
-                            'status': dr[5] or '',
-                            'date': dr[6].isoformat() if dr[6] else None,
-                            'created_at': dr[6].strftime('%d.%m.%Y %H:%M') if dr[6] else None,
-                            'photo_url': dr[7],
-                            'stage': dr[8] or '',
-                            'stage_label': 'До видачі' if dr[8] == 'pre_issue' else 'При поверненні' if dr[8] == 'return' else 'Аудит' if dr[8] else '',
-                            'order_number': dr[9] or '',
-                            'qty': int(dr[10] or 1),
-                            'fee': float(dr[11] or 0),
-                            'created_by': dr[12] or '',
-                        })
-                    for it in items:
-                        pid = it.get('inventory_id', '')
-                        it['damage_history'] = dmg_by_pid.get(pid, [])
-                        it['has_damage_history'] = len(it['damage_history']) > 0
-                        it['total_damages'] = len(it['damage_history'])
-                        it['pre_damage'] = it['damage_history'][:3]  # top 3 for preview
-                except:
-                    pass
-        
-        # ✅ Обчислити прогрес комплектації з issue_cards
-        try:
-            issue_card_result = db.execute(text("""
-                SELECT items FROM issue_cards WHERE order_id = :order_id
-            """), {"order_id": row[0]})
-            ic_row = issue_card_result.fetchone()
-            if ic_row and ic_row[0]:
-                import json
-                ic_items = json.loads(ic_row[0]) if isinstance(ic_row[0], str) else ic_row[0]
-                if ic_items and len(ic_items) > 0:
-                    total_qty = sum(it.get('qty', 1) for it in ic_items)
-                    picked_qty = sum(it.get('picked_qty', 0) for it in ic_items)
-                    if total_qty > 0:
-                        packing_progress = int((picked_qty / total_qty) * 100)
-        except Exception as e:
-            print(f"[parse_order_row] Error calculating packing progress: {e}")
-            packing_progress = 0
+    if hydrated is None and db and row[0]:  # order_id exists
+        hydrated = hydrate_orders(db, [row[0]]).get(row[0])
+    hydrated = hydrated or {}
     
-    # ✅ Завантажити суми оплат для замовлення
-    paid_rent = 0.0
-    paid_deposit = 0.0
-    if db and row[0]:  # order_id exists
-        try:
-            payments_result = db.execute(text("""
-                SELECT 
-                    COALESCE(SUM(CASE WHEN ft.tx_type IN ('rent_payment', 'additional_payment') THEN ft.amount ELSE 0 END), 0) as paid_rent,
-                    COALESCE(SUM(CASE WHEN ft.tx_type = 'deposit_payment' THEN ft.amount ELSE 0 END), 0) as paid_deposit
-                FROM fin_transactions ft
-                WHERE ft.entity_type = 'order' AND ft.entity_id = :order_id
-            """), {"order_id": row[0]})
-            pay_row = payments_result.fetchone()
-            if pay_row:
-                paid_rent = float(pay_row[0]) if pay_row[0] else 0.0
-                paid_deposit = float(pay_row[1]) if pay_row[1] else 0.0
-        except Exception as e:
-            print(f"[parse_order_row] Error loading payments: {e}")
-            paid_rent = 0.0
-            paid_deposit = 0.0
+    items = hydrated.get("items", [])
+    packing_progress = hydrated.get("packing_progress", 0)  # ✅ Прогрес комплектації
+    paid_rent = hydrated.get("paid_rent", 0.0)
+    paid_deposit = hydrated.get("paid_deposit", 0.0)
     
     # Визначимо індекси полів у row - залежить від того, скільки полів повернуто
     # Формат 1 (новий з issue_date/return_date): 16+ колонок
@@ -358,12 +225,14 @@ async def get_orders(
     archived: Optional[str] = None,
     limit: int = 100,
     offset: int = 0,
+    fields: Optional[str] = None,
     db: Session = Depends(get_rh_db)
 ):
     """
     Отримати список замовлень з повною фільтрацією
     ✅ MIGRATED: Full business logic preserved
     archived: 'true' - тільки архівні, 'false' - тільки неархівні, 'all' - всі
+    fields: 'summary' - без позицій (items: []) для таблиць дашборду
     """
     sql = """
         SELECT 
@@ -426,11 +295,14 @@ async def get_orders(
     
     sql += f" ORDER BY created_at DESC LIMIT {limit} OFFSET {offset}"
     
-    result = db.execute(text(sql), params)
+    rows = db.execute(text(sql), params).fetchall()
+    
+    # Позиції, історія пошкоджень, комплектація та оплати - для всієї сторінки одразу
+    hydrated = hydrate_orders(db, [row[0] for row in rows], include_items=(fields != 'summary'))
     
     orders = []
-    for row in result:
-        order = parse_order_row(row, db)
+    for row in rows:
+        order = parse_order_row(row, db, hydrated=hydrated.get(row[0], {}))
         if order:
             orders.append(order)
     
@@ -675,18 +547,7 @@ async def get_order_details(
     order["total_to_pay"] = round(total_after_discount + service_fee, 2)
     
     # Завантажити items
-    items_result = db.execute(text("""
-        SELECT oi.id, oi.order_id, oi.product_id, oi.product_name, 
-               oi.quantity, oi.price, oi.total_rental,
-               COALESCE(p.image_url, oi.image_url) as image_url,
-               p.price as loss_value, p.quantity as available_qty,
-               p.sku, p.zone, p.aisle, p.shelf, p.cleaning_status, p.product_state,
-               p.category_name
-        FROM order_items oi
-        LEFT JOIN products p ON oi.product_id = p.product_id
-        WHERE oi.order_id = :order_id
-          AND (oi.status IS NULL OR oi.status != 'refused')
-    """), {"order_id": row[0]})
+    items_result = load_order_item_rows(db, [row[0]]).get(row[0], [])
     
     items = []
     for item_row in items_result:
@@ -727,22 +588,11 @@ async def get_order_details(
     # ✅ Enrich items with damage history from product_damage_history
     product_ids = [it.get('inventory_id') for it in items if it.get('inventory_id')]
     if product_ids:
-        ids_str = ','.join(str(int(pid)) for pid in product_ids if pid.isdigit())
-        if ids_str:
-            dmg_result = db.execute(text(f"""
-                SELECT product_id, id, processing_type, note, severity, 
-                       processing_status, created_at, damage_type, damage_code,
-                       photo_url, stage, order_number, qty, fee, created_by
-                FROM product_damage_history
-                WHERE product_id IN ({ids_str})
-                ORDER BY created_at DESC
-            """)).fetchall()
+        if any(pid.isdigit() for pid in product_ids):
+            dmg_rows = load_damage_rows(db, product_ids)
             dmg_map = {}
-            for d in dmg_result:
-                pid = str(d[0])
-                if pid not in dmg_map:
-                    dmg_map[pid] = []
-                dmg_map[pid].append({
+            for pid, pid_rows in dmg_rows.items():
+                dmg_map[pid] = [{
                     'id': d[1],
                     'type': d[2] or d[7] or '',
                     'damage_type': d[7] or d[2] or '',
@@ -760,7 +610,7 @@ async def get_order_details(
                     'qty': int(d[12] or 1),
                     'fee': float(d[13] or 0),
                     'created_by': d[14] or '',
-                })
+                } for d in pid_rows]
             for it in items:
                 pid = it.get('inventory_id', '')
                 it['damage_history'] = dmg_map.get(pid, [])
@@ -1969,15 +1819,18 @@ async def search_inventory(
     Пошук інвентарю для замовлення
     ✅ MIGRATED - використовує products.quantity замість inventory
     """
-    result = db.execute(text("""
+    search_ids = get_product_search().search(db, query, limit=limit).ids
+    if not search_ids:
+        return {"products": [], "total": 0}
+    
+    params = {"search_ids": search_ids}
+    result = rank_rows(db.execute(search_text("""
         SELECT 
             p.product_id, p.sku, p.name, p.price, p.rental_price, p.image_url,
             p.quantity, p.zone, p.aisle, p.shelf
         FROM products p
-        WHERE p.status = 1 
-        AND (p.name LIKE :query OR p.sku LIKE :query)
-        LIMIT :limit
-    """), {"query": f"%{query}%", "limit": limit})
+        WHERE p.product_id IN :search_ids
+    """, params), params).fetchall(), search_ids)
     
     products = []
     for row in result:
@@ -2207,13 +2060,14 @@ async def get_decor_orders(
     status: Optional[str] = None,
     archived: Optional[str] = None,
     limit: int = 1000,
+    fields: Optional[str] = None,
     db: Session = Depends(get_rh_db)
 ):
     """
     Отримати замовлення (алиас для основного GET /orders)
     ✅ MIGRATED: Using RentalHub DB
     """
-    return await get_orders(status=status, archived=archived, limit=limit, db=db)
+    return await get_orders(status=status, archived=archived, limit=limit, fields=fields, db=db)
 
 
 @decor_router.get("/{order_id}")
@@ -3048,18 +2902,79 @@ async def complete_return(
         )
 
 
+def _confirmation_order_data(db: Session, order_id: int) -> Optional[dict]:
+    """Дані для order_confirmation_v2.html / Telegram-повідомлення про замовлення"""
+    row = db.execute(text("""
+        SELECT order_id, order_number, customer_name, customer_email,
+               rental_start_date, rental_end_date, rental_days,
+               total_price, deposit_amount, COALESCE(discount_amount, 0), COALESCE(service_fee, 0)
+        FROM orders WHERE order_id = :order_id
+    """), {"order_id": order_id}).fetchone()
+    if not row:
+        return None
+    items = []
+    for item_row in load_order_item_rows(db, [order_id]).get(order_id, []):
+        loss_value = float(item_row[8]) if item_row[8] else 0.0
+        items.append({
+            "sku": item_row[10] or str(item_row[2] or ""),
+            "name": item_row[3],
+            "quantity": item_row[4] or 1,
+            "price_per_day": float(item_row[5]) if item_row[5] else 0.0,
+            "deposit": loss_value / 2,
+            "damage_cost": loss_value,
+            "image": normalize_image_url(item_row[7]),
+        })
+    total_rental = round(max(0.0, float(row[7] or 0) - float(row[9])) + float(row[10]), 2)
+    return {
+        "order_id": row[0],
+        "order_number": row[1],
+        "client_name": row[2] or "",
+        "client_email": row[3],
+        "issue_date": row[4].strftime("%d.%m.%Y") if row[4] else "",
+        "rent_date": row[4].strftime("%d.%m.%Y") if row[4] else "",
+        "return_date": row[5].strftime("%d.%m.%Y") if row[5] else "",
+        "rental_days": int(row[6]) if row[6] else 1,
+        "total_rental": total_rental,
+        "total_deposit": float(row[8]) if row[8] else 0.0,
+        "prepayment": round(total_rental / 2, 2),
+        "items": items,
+        "changes": [],
+    }
+
+
 @decor_router.post("/{order_id}/send-confirmation-email")
 async def send_confirmation_email(
     order_id: int,
+    telegram_chat_id: Optional[str] = None,
     db: Session = Depends(get_rh_db)
 ):
     """
-    Відправити email підтвердження (placeholder)
-    ✅ MIGRATED: Using RentalHub DB
+    Поставити лист підтвердження замовлення (і, якщо вказано telegram_chat_id, повідомлення
+    в Telegram) у чергу notification_outbox - відправляє фоновий диспетчер після commit
     """
+    from utils.email_sender import get_email_sender
+    from utils.telegram_sender import queue_order_confirmation_telegram
+
+    order_data = _confirmation_order_data(db, order_id)
+    if not order_data:
+        raise HTTPException(status_code=404, detail="Замовлення не знайдено")
+    if not order_data["client_email"] and not telegram_chat_id:
+        raise HTTPException(status_code=400, detail="У замовленні немає email клієнта")
+
+    email_outbox_id = None
+    if order_data["client_email"]:
+        email_outbox_id = get_email_sender().queue_order_confirmation(
+            db, order_data["client_email"], order_data["client_name"], order_data
+        )
+        if email_outbox_id is None:
+            raise HTTPException(status_code=500, detail="Шаблон листа підтвердження не знайдено")
+    telegram_outbox_id = queue_order_confirmation_telegram(db, telegram_chat_id, order_data) if telegram_chat_id else None
+    db.commit()
     return {
         "success": True,
-        "message": "Email буде відправлено (функціонал потребує налаштування SMTP)"
+        "message": "Підтвердження поставлено в чергу відправки",
+        "email_outbox_id": email_outbox_id,
+        "telegram_outbox_id": telegram_outbox_id,
     }
 
 
@@ -3499,6 +3414,10 @@ async def mark_image_project(order_id: int, db: Session = Depends(get_rh_db)):
     """), {"oid": order_id})
     
     # Cancel pending damage/late payments
+    pending_days = db.execute(text("""
+        SELECT DISTINCT DATE(occurred_at) FROM fin_payments WHERE order_id = :oid AND status = 'pending'
+    """), {"oid": order_id}).fetchall()
+    mark_dirty(db, *[r[0] for r in pending_days])
     db.execute(text("""
         DELETE FROM fin_payments 
         WHERE order_id = :oid AND status = 'pending'
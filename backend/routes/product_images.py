@@ -5,13 +5,15 @@ Product Images Upload API
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from sqlalchemy import text
 from database_rentalhub import get_rh_db_sync
-from PIL import Image
 import os
 import logging
-import shutil
 from pathlib import Path
 from typing import List
 
+from services.image_derivatives import (
+    backfill_assets, get_image_derivative_service, load_image_maps, store_original,
+)
+
 router = APIRouter(prefix="/api/products", tags=["product-images"])
 logger = logging.getLogger(__name__)
 
@@ -32,40 +34,6 @@ ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
 
-def create_thumbnail(image_path: str, size: tuple) -> str:
-    """Створити thumbnail зображення"""
-    try:
-        img = Image.open(image_path)
-        
-        # Convert RGBA to RGB if needed
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        
-        # Resize keeping aspect ratio
-        img.thumbnail(size, Image.Resampling.LANCZOS)
-        
-        # Save thumbnail
-        filename = os.path.basename(image_path)
-        name, ext = os.path.splitext(filename)
-        
-        if size == (300, 300):
-            thumb_path = os.path.join(PRODUCTS_DIR, "thumbnails", f"{name}_thumb{ext}")
-        else:
-            thumb_path = os.path.join(PRODUCTS_DIR, "medium", f"{name}_medium{ext}")
-        
-        img.save(thumb_path, quality=85, optimize=True)
-        logger.info(f"Created thumbnail: {thumb_path}")
-        return thumb_path
-        
-    except Exception as e:
-        logger.error(f"Error creating thumbnail: {str(e)}")
-        return None
-
-
 @router.post("/{sku}/upload-image")
 async def upload_product_image(
     sku: str,
@@ -104,27 +72,17 @@ async def upload_product_image(
         
         product_id, product_name = result
         
-        # Generate safe filename: SKU_timestamp.ext
-        import time
-        safe_sku = sku.replace("/", "_").replace("\\", "_").replace(" ", "_")
-        timestamp = int(time.time())
-        filename = f"{safe_sku}_{timestamp}{file_ext}"
+        # Save original file (однаковий вміст -> вже збережений файл)
+        relative_path, content_hash, duplicate, variants_status = store_original(
+            db, file.file.read(), sku, file_ext, PRODUCTS_DIR
+        )
+        filename = os.path.basename(relative_path)
         file_path = os.path.join(PRODUCTS_DIR, filename)
         
-        # Save original file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"Saved image: {file_path}")
-        
-        # Create thumbnails
-        thumbnail_path = create_thumbnail(file_path, (300, 300))
-        medium_path = create_thumbnail(file_path, (800, 800))
+        logger.info(f"Saved image: {file_path}" + (" (duplicate)" if duplicate else ""))
         
         # Update database with new image path
         # Store relative path from uploads root
-        relative_path = f"uploads/products/{filename}"
-        
         update_query = text("""
             UPDATE products 
             SET image_url = :image_url
@@ -135,14 +93,22 @@ async def upload_product_image(
         
         logger.info(f"Updated image URL for SKU {sku}: {relative_path}")
         
+        # WebP-варіанти та thumbnails/medium - у фоні (дублікат без готових варіантів - теж)
+        if variants_status != "ready":
+            get_image_derivative_service().submit(content_hash, file_path, legacy_dir=PRODUCTS_DIR)
+        name, ext = os.path.splitext(filename)
+        
         return {
             "success": True,
             "message": f"Зображення завантажено для {product_name}",
             "sku": sku,
             "image_url": relative_path,
             "original": filename,
-            "thumbnail": os.path.basename(thumbnail_path) if thumbnail_path else None,
-            "medium": os.path.basename(medium_path) if medium_path else None
+            "thumbnail": f"{name}_thumb{ext}",
+            "medium": f"{name}_medium{ext}",
+            "content_hash": content_hash,
+            "duplicate": duplicate,
+            "variants_status": variants_status
         }
         
     except HTTPException:
@@ -197,24 +163,14 @@ async def bulk_upload_images(
             
             product_id, product_name = result
             
-            # Generate safe filename
-            import time
-            safe_sku = sku.replace("/", "_").replace("\\", "_").replace(" ", "_")
-            timestamp = int(time.time())
-            new_filename = f"{safe_sku}_{timestamp}{file_ext}"
-            file_path = os.path.join(PRODUCTS_DIR, new_filename)
-            
             # Save file
             file.file.seek(0)
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            # Create thumbnails
-            create_thumbnail(file_path, (300, 300))
-            create_thumbnail(file_path, (800, 800))
+            relative_path, content_hash, _, variants_status = store_original(
+                db, file.file.read(), sku, file_ext, PRODUCTS_DIR
+            )
+            file_path = os.path.join(PRODUCTS_DIR, os.path.basename(relative_path))
             
             # Update database
-            relative_path = f"uploads/products/{new_filename}"
             update_query = text("""
                 UPDATE products 
                 SET image_url = :image_url
@@ -223,6 +179,9 @@ async def bulk_upload_images(
             db.execute(update_query, {"image_url": relative_path, "sku": sku})
             db.commit()
             
+            if variants_status != "ready":
+                get_image_derivative_service().submit(content_hash, file_path, legacy_dir=PRODUCTS_DIR)
+            
             results["success"].append({
                 "filename": filename,
                 "sku": sku,
@@ -291,3 +250,47 @@ async def get_product_image_info(sku: str, db = Depends(get_rh_db_sync)):
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         db.close()
+
+
+@router.get("/{sku}/image-variants")
+async def get_product_image_variants(sku: str, db = Depends(get_rh_db_sync)):
+    """
+    srcset-мапа WebP/AVIF варіантів зображення товару
+    """
+    try:
+        result = db.execute(text("SELECT image_url FROM products WHERE sku = :sku"), {"sku": sku}).fetchone()
+        if not result:
+            raise HTTPException(status_code=404, detail="Товар не знайдено")
+        image_url = result[0]
+        variants = load_image_maps(db, [image_url]).get(image_url)
+        return {
+            "sku": sku,
+            "image_url": image_url,
+            "status": "ready" if variants else "pending",
+            "variants": variants
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting image variants for {sku}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+
+@router.post("/images/backfill-variants")
+async def backfill_image_variants(limit: int = 500, db = Depends(get_rh_db_sync)):
+    """
+    Зареєструвати старі зображення без варіантів і поставити pending у чергу
+    """
+    try:
+        registered = backfill_assets(db, PRODUCTS_DIR, limit=limit)
+        service = get_image_derivative_service()
+        queued = service.requeue_pending(db, PRODUCTS_DIR, limit=limit)
+        return {"registered": registered, "queued": queued, "service": service.stats()}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error backfilling image variants: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
@@ -11,6 +11,7 @@ import base64
 
 from database_rentalhub import get_rh_db  # RentalHub DB
 from utils.image_helper import normalize_image_url
+from services.product_search import get_product_search, rank_rows, search_text
 
 router = APIRouter(prefix="/api/products", tags=["products"])
 
@@ -340,23 +341,20 @@ async def search_products(
     Пошук товарів за назвою, SKU або категорією
     """
     try:
-        sql = """
+        search_ids = get_product_search().search(
+            db, q, category=category, active_only=False, limit=limit
+        ).ids
+        if not search_ids:
+            return []
+        
+        params = {"search_ids": search_ids}
+        result = db.execute(search_text("""
             SELECT 
                 product_id, sku, name, category_name, quantity, price
             FROM products
-            WHERE (name LIKE :query OR sku LIKE :query)
-        """
-        
-        params = {"query": f"%{q}%"}
-        
-        if category:
-            sql += " AND category_name = :category"
-            params["category"] = category
-        
-        sql += " ORDER BY name LIMIT :limit"
-        params["limit"] = limit
-        
-        result = db.execute(text(sql), params)
+            WHERE product_id IN :search_ids
+        """, params), params).fetchall()
+        result = rank_rows(result, search_ids)
         
         products = []
         for row in result:
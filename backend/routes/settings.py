@@ -8,6 +8,7 @@ from models import (
     DetectTablesRequest, DetectTablesResponse
 )
 from config_manager import config_manager
+from services.company_config import invalidate_everywhere as invalidate_settings_everywhere
 from typing import Dict, Any
 import logging
 
@@ -64,6 +65,7 @@ async def save_settings(config_update: AppConfigUpdate):
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to save configuration"
             )
+        await invalidate_settings_everywhere()
         
         return {
             "success": True,
@@ -179,6 +181,7 @@ async def reset_to_defaults():
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to reset configuration"
             )
+        await invalidate_settings_everywhere()
         
         return {
             "success": True,
@@ -39,6 +39,46 @@ async def trigger_sync():
         raise HTTPException(status_code=500, detail=f"Помилка запуску синхронізації: {str(e)}")
 
 
+def _load_sync_stats():
+    """Етапи останнього запуску (sync_runs) та high-water marks (sync_state)"""
+    from sqlalchemy import text
+    from database_rentalhub import get_rh_db_sync
+    
+    db = get_rh_db_sync()
+    try:
+        last_run_id = db.execute(text(
+            "SELECT run_id FROM sync_runs ORDER BY started_at DESC, id DESC LIMIT 1"
+        )).scalar()
+        stages = []
+        if last_run_id:
+            rows = db.execute(text("""
+                SELECT stage, status, started_at, duration_ms, rows_fetched, rows_written, error
+                FROM sync_runs WHERE run_id = :run_id ORDER BY id
+            """), {"run_id": last_run_id}).fetchall()
+            stages = [{
+                "stage": r[0], "status": r[1],
+                "started_at": r[2].isoformat() if r[2] else None,
+                "duration_ms": r[3], "rows_fetched": r[4], "rows_written": r[5], "error": r[6]
+            } for r in rows]
+        marks = db.execute(text("SELECT stage, hwm_value, hwm_id, updated_at FROM sync_state")).fetchall()
+        return {
+            "last_run": {
+                "run_id": last_run_id,
+                "stages": stages,
+                "total_ms": sum(s["duration_ms"] or 0 for s in stages),
+            },
+            "high_water_marks": {
+                r[0]: {"value": r[1], "id": r[2], "updated_at": r[3].isoformat() if r[3] else None}
+                for r in marks
+            },
+        }
+    except Exception as e:
+        # Таблиці sync_* створюються першим запуском sync_all.py
+        return {"last_run": None, "high_water_marks": {}, "stats_error": str(e)}
+    finally:
+        db.close()
+
+
 @router.get("/status")
 async def get_sync_status():
     """
@@ -66,7 +106,8 @@ async def get_sync_status():
             "is_running": is_running,
             "log_file": log_path,
             "last_log_lines": [line.strip() for line in last_lines],
-            "supervisor_status": "Автоматична синхронізація кожні 30 хвилин"
+            "supervisor_status": "Автоматична синхронізація кожні 30 хвилин",
+            **_load_sync_stats()
         }
         
     except Exception as e:
@@ -1,16 +1,25 @@
 """
 Team Chat API — внутрішній месенджер для команди (MySQL)
 Канали (загальний, тематичні) + особисті повідомлення + threads + фото
+
+Список каналів і непрочитані - з підтримуваного стану (services/chat_state).
+Нові повідомлення, відповіді в тредах і зміни unread пушаться через WebSocket
+/api/chat/ws (між воркерами - services/realtime_backplane), тож polling не обов'язковий.
 """
-from fastapi import APIRouter, Depends, HTTPException, Header, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Header, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-import os, uuid, shutil
+from datetime import datetime
+import asyncio, json, logging, os, uuid, shutil
 
 from database_rentalhub import get_rh_db
-from utils.user_tracking_helper import get_current_user_dependency
+from services import chat_state
+from services.realtime_backplane import Backplane, ConnectionSender, get_backplane
+from utils.user_tracking_helper import get_current_user_dependency, get_current_user_from_header
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
@@ -25,6 +34,134 @@ def require_auth(current_user: dict = Depends(get_current_user_dependency)):
     return current_user
 
 
+# === Push hub ===
+
+CHAT_CHANNEL = "chat"
+
+
+class ChatHub:
+    """
+    WebSocket-з'єднання чату цього воркера (user_id -> сокети). Події публікуються
+    в backplane і доставляються адресатам на всіх воркерах через черги ConnectionSender.
+    """
+
+    def __init__(self, backplane: Optional[Backplane] = None):
+        self.connections: Dict[int, Dict[WebSocket, ConnectionSender]] = {}
+        self._backplane = backplane
+        self._started = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def backplane(self) -> Backplane:
+        if self._backplane is None:
+            self._backplane = get_backplane()
+        return self._backplane
+
+    async def start(self):
+        if self._started:
+            return
+        self._started = True
+        # publish_soon() з потоків threadpool (sync-роути, задачі) планує публікацію в цей loop
+        self._loop = asyncio.get_running_loop()
+        self.backplane.subscribe(self._on_event)
+        try:
+            await self.backplane.start()
+        except Exception as e:
+            logger.warning(f"[Chat WS] Realtime backplane unavailable, local delivery only: {e}")
+
+    async def connect(self, websocket: WebSocket, user_id: int):
+        await websocket.accept()
+        await self.start()
+        sender = ConnectionSender(websocket.send_text, on_overflow=lambda: self._drop_slow(websocket, user_id))
+        self.connections.setdefault(user_id, {})[websocket] = sender
+        sender.start()
+
+    def disconnect(self, websocket: WebSocket, user_id: int):
+        sockets = self.connections.get(user_id)
+        sender = sockets.pop(websocket, None) if sockets else None
+        if sender:
+            sender.close()
+        if sockets is not None and not sockets:
+            del self.connections[user_id]
+
+    def _drop_slow(self, websocket: WebSocket, user_id: int):
+        self.disconnect(websocket, user_id)
+        asyncio.create_task(self._close_quietly(websocket))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def send(self, websocket: WebSocket, user_id: int, message: dict):
+        sender = self.connections.get(user_id, {}).get(websocket)
+        if sender:
+            sender.push(json.dumps(message, ensure_ascii=False))
+
+    async def publish(self, event: dict, recipients: Optional[List[int]] = None, author_id: Optional[int] = None):
+        """recipients None - усі підключені; author_id не отримує unread_delta"""
+        event["timestamp"] = datetime.now().isoformat()
+        await self.backplane.publish(CHAT_CHANNEL, {"event": event, "recipients": recipients, "author": author_id})
+
+    def publish_soon(self, event: dict, recipients: Optional[List[int]] = None, author_id: Optional[int] = None):
+        """
+        publish() із синхронного коду (інтеграція з задачами): у event loop - як задача,
+        з потоку threadpool - через loop, збережений у start()
+        """
+        coro = self.publish(event, recipients, author_id)
+        try:
+            asyncio.get_running_loop().create_task(coro)
+            return
+        except RuntimeError:
+            pass
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            coro.close()
+            logger.warning(f"[Chat WS] Hub not started, {event.get('type')} event not pushed")
+            return
+        asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def _on_event(self, channel: str, payload: dict):
+        if channel != CHAT_CHANNEL:
+            return
+        event, recipients, author = payload["event"], payload.get("recipients"), payload.get("author")
+        user_ids = list(self.connections) if recipients is None else [u for u in recipients if u in self.connections]
+        key = ("read", event.get("channel_id")) if event.get("type") == "chat.read" else None
+        for uid in user_ids:
+            if event.get("type") in ("chat.message", "chat.thread_reply"):
+                message = dict(event, unread_delta=0 if uid == author else 1)
+            else:
+                message = event
+            message_json = json.dumps(message, ensure_ascii=False)
+            for sender in list(self.connections.get(uid, {}).values()):
+                sender.push(message_json, key)
+
+
+_chat_hub = ChatHub()
+
+
+def get_chat_hub() -> ChatHub:
+    return _chat_hub
+
+
+def _message_event(message: dict) -> dict:
+    return {
+        "type": "chat.thread_reply" if message.get("reply_to") else "chat.message",
+        "channel_id": message["channel_id"],
+        "message": message,
+    }
+
+
+async def _push_read(db: Session, uid: int, channel_id: int):
+    """Іншим вкладкам користувача: канал прочитано"""
+    await _chat_hub.publish({
+        "type": "chat.read", "channel_id": channel_id, "unread": 0,
+        "total_unread": chat_state.total_unread(db, uid),
+    }, recipients=[uid])
+
+
 # === Models ===
 
 class ChannelCreate(BaseModel):
@@ -46,70 +183,7 @@ async def list_channels(
     db: Session = Depends(get_rh_db)
 ):
     uid = user.get("user_id") or user.get("id")
-
-    # All public channels + DMs where user is a member
-    rows = db.execute(text("""
-        SELECT DISTINCT c.id, c.name, c.type, c.description, c.pinned, c.created_at, c.updated_at
-        FROM chat_channels c
-        LEFT JOIN chat_channel_members m ON c.id = m.channel_id
-        WHERE c.type IN ('general', 'topic')
-           OR (c.type = 'dm' AND m.user_id = :uid)
-        ORDER BY c.pinned DESC, c.updated_at DESC
-    """), {"uid": uid}).fetchall()
-
-    result = []
-    for r in rows:
-        ch_id = r[0]
-
-        # Unread count
-        read_row = db.execute(text("""
-            SELECT last_read_at FROM chat_read_status
-            WHERE user_id = :uid AND channel_id = :ch_id
-        """), {"uid": uid, "ch_id": ch_id}).fetchone()
-        last_read = read_row[0] if read_row else "2000-01-01"
-
-        unread = db.execute(text("""
-            SELECT COUNT(*) FROM chat_messages
-            WHERE channel_id = :ch_id AND created_at > :lr AND user_id != :uid
-        """), {"ch_id": ch_id, "lr": last_read, "uid": uid}).scalar()
-
-        # Last message
-        last_msg = db.execute(text("""
-            SELECT cm.message, u.firstname, u.lastname, cm.created_at
-            FROM chat_messages cm
-            JOIN users u ON cm.user_id = u.user_id
-            WHERE cm.channel_id = :ch_id
-            ORDER BY cm.created_at DESC LIMIT 1
-        """), {"ch_id": ch_id}).fetchone()
-
-        # Members for DM display name
-        members = []
-        if r[2] == "dm":
-            mem_rows = db.execute(text("""
-                SELECT m.user_id, u.firstname, u.lastname
-                FROM chat_channel_members m
-                JOIN users u ON m.user_id = u.user_id
-                WHERE m.channel_id = :ch_id
-            """), {"ch_id": ch_id}).fetchall()
-            members = [{"id": mr[0], "name": f"{mr[1] or ''} {mr[2] or ''}".strip()} for mr in mem_rows]
-
-        result.append({
-            "id": ch_id,
-            "name": r[1],
-            "type": r[2],
-            "description": r[3] or "",
-            "pinned": bool(r[4]),
-            "members": members,
-            "unread": unread or 0,
-            "last_message": {
-                "text": last_msg[0][:60] if last_msg else None,
-                "user_name": f"{last_msg[1] or ''} {last_msg[2] or ''}".strip() if last_msg else None,
-                "created_at": last_msg[3].isoformat() if last_msg else None,
-            } if last_msg else None,
-            "updated_at": r[6].isoformat() if r[6] else r[5].isoformat() if r[5] else None,
-        })
-
-    return result
+    return chat_state.list_channels(db, uid)
 
 
 @router.post("/channels")
@@ -159,6 +233,7 @@ async def delete_channel(
     if ch[0] == "general":
         raise HTTPException(400, "Не можна видалити загальний канал")
     db.execute(text("DELETE FROM chat_channels WHERE id = :id"), {"id": channel_id})
+    chat_state.forget_channel(db, channel_id)
     db.commit()
     return {"message": "Канал видалено"}
 
@@ -202,6 +277,7 @@ async def get_or_create_dm(
     # Add both users as members
     db.execute(text("INSERT INTO chat_channel_members (channel_id, user_id) VALUES (:ch, :u1), (:ch, :u2)"),
                {"ch": ch_id, "u1": uid, "u2": target_user_id})
+    chat_state.set_dm_members(db, ch_id, [{"id": uid, "name": my_name}, {"id": target_user_id, "name": target_name}])
     db.commit()
 
     return {"id": ch_id, "name": f"{my_name} & {target_name}", "type": "dm"}
@@ -240,12 +316,9 @@ async def get_messages(
     rows = list(reversed(rows))
 
     # Mark as read
-    db.execute(text("""
-        INSERT INTO chat_read_status (user_id, channel_id, last_read_at)
-        VALUES (:uid, :ch_id, NOW())
-        ON DUPLICATE KEY UPDATE last_read_at = NOW()
-    """), {"uid": uid, "ch_id": channel_id})
+    chat_state.mark_read(db, uid, channel_id)
     db.commit()
+    await _push_read(db, uid, channel_id)
 
     return [{
         "id": r[0], "channel_id": r[1], "user_id": r[2],
@@ -330,12 +403,11 @@ async def send_message(
     msg_id = db.execute(text("SELECT LAST_INSERT_ID()")).scalar()
 
     db.execute(text("UPDATE chat_channels SET updated_at = NOW() WHERE id = :ch_id"), {"ch_id": channel_id})
-    db.execute(text("""
-        INSERT INTO chat_read_status (user_id, channel_id, last_read_at)
-        VALUES (:uid, :ch_id, NOW())
-        ON DUPLICATE KEY UPDATE last_read_at = NOW()
-    """), {"uid": uid, "ch_id": channel_id})
+    message, recipients = chat_state.record_message(db, msg_id)
+    chat_state.mark_read(db, uid, channel_id)
     db.commit()
+    if message:
+        await _chat_hub.publish(_message_event(message), recipients, author_id=uid)
 
     return {
         "id": msg_id, "channel_id": channel_id, "user_id": uid,
@@ -343,7 +415,7 @@ async def send_message(
         "user_role": user.get("role", ""),
         "message": data.message.strip(),
         "reply_to": data.reply_to,
-        "created_at": None,
+        "created_at": message["created_at"] if message else None,
     }
 
 
@@ -388,12 +460,11 @@ async def upload_chat_file(
 
     msg_id = db.execute(text("SELECT LAST_INSERT_ID()")).scalar()
     db.execute(text("UPDATE chat_channels SET updated_at = NOW() WHERE id = :ch_id"), {"ch_id": channel_id})
-    db.execute(text("""
-        INSERT INTO chat_read_status (user_id, channel_id, last_read_at)
-        VALUES (:uid, :ch_id, NOW())
-        ON DUPLICATE KEY UPDATE last_read_at = NOW()
-    """), {"uid": uid, "ch_id": channel_id})
+    message, recipients = chat_state.record_message(db, msg_id)
+    chat_state.mark_read(db, uid, channel_id)
     db.commit()
+    if message:
+        await _chat_hub.publish(_message_event(message), recipients, author_id=uid)
 
     return {
         "id": msg_id, "channel_id": channel_id, "user_id": uid,
@@ -458,7 +529,10 @@ def notify_task_in_chat(db: Session, user_id: int, user_name: str, task_title: s
 
     msg_id = db.execute(text("SELECT LAST_INSERT_ID()")).scalar()
     db.execute(text("UPDATE chat_channels SET updated_at = NOW() WHERE id = :ch_id"), {"ch_id": general[0]})
+    message, recipients = chat_state.record_message(db, msg_id)
     db.commit()
+    if message:
+        _chat_hub.publish_soon(_message_event(message), recipients, author_id=user_id)
     return msg_id
 
 
@@ -485,8 +559,12 @@ def notify_task_status_change(db: Session, user_id: int, task_id: str, new_statu
         VALUES (:ch_id, :uid, :msg, :parent, :tid)
     """), {"ch_id": orig[1], "uid": user_id, "msg": msg_text, "parent": orig[0], "tid": task_id})
 
+    msg_id = db.execute(text("SELECT LAST_INSERT_ID()")).scalar()
     db.execute(text("UPDATE chat_channels SET updated_at = NOW() WHERE id = :ch_id"), {"ch_id": orig[1]})
+    message, recipients = chat_state.record_message(db, msg_id)
     db.commit()
+    if message:
+        _chat_hub.publish_soon(_message_event(message), recipients, author_id=user_id)
 
 
 # === Team Members ===
@@ -519,19 +597,7 @@ async def get_total_unread(
 ):
     uid = user.get("user_id") or user.get("id")
 
-    total = db.execute(text("""
-        SELECT COALESCE(SUM(unread), 0) FROM (
-            SELECT COUNT(*) as unread
-            FROM chat_channels c
-            LEFT JOIN chat_channel_members m ON c.id = m.channel_id
-            JOIN chat_messages cm ON cm.channel_id = c.id
-            LEFT JOIN chat_read_status rs ON rs.user_id = :uid AND rs.channel_id = c.id
-            WHERE (c.type IN ('general', 'topic') OR (c.type = 'dm' AND m.user_id = :uid))
-              AND cm.user_id != :uid
-              AND cm.created_at > COALESCE(rs.last_read_at, '2000-01-01')
-        ) t
-    """), {"uid": uid}).scalar()
-
+    total = chat_state.total_unread(db, uid)
     return {"unread": total or 0}
 
 
@@ -561,3 +627,40 @@ async def init_default_channels(
             created.append(name)
     db.commit()
     return {"created": created, "message": f"Створено {len(created)} каналів" if created else "Канали вже існують"}
+
+
+# === WebSocket ===
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, token: str = ""):
+    """
+    Push-канал чату (браузер не передає Authorization у WebSocket - JWT у ?token=)
+
+    Клієнт отримує події:
+    - chat.message / chat.thread_reply - нове повідомлення / відповідь у треді
+      (message у форматі /channels/{id}/messages, unread_delta - на скільки зріс unread каналу)
+    - chat.read - канал прочитано в іншій вкладці (unread, total_unread)
+
+    Клієнт може відправляти:
+    - {"type": "ping"} - heartbeat
+    """
+    user = get_current_user_from_header(f"Bearer {token}" if token else None)
+    uid = user.get("user_id") or user.get("id")
+    if not uid or user.get("name") == "System":
+        await websocket.close(code=4401)
+        return
+
+    await _chat_hub.connect(websocket, uid)
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                if json.loads(data).get("type") == "ping":
+                    _chat_hub.send(websocket, uid, {"type": "pong", "timestamp": datetime.now().isoformat()})
+            except (json.JSONDecodeError, AttributeError):
+                pass
+    except WebSocketDisconnect:
+        _chat_hub.disconnect(websocket, uid)
+    except Exception as e:
+        logger.warning(f"[Chat WS] Error: {e}")
+        _chat_hub.disconnect(websocket, uid)
@@ -14,6 +14,7 @@ import json
 from database_rentalhub import get_rh_db
 from services.doc_engine.registry import DOC_REGISTRY
 from services.doc_engine.render import TEMPLATES_DIR, render_html
+from services.template_loader import invalidate_template_cache
 
 router = APIRouter(prefix="/api/admin/templates", tags=["Admin Templates"])
 
@@ -158,6 +159,7 @@ async def update_template(
     # Save new content
     with open(template_path, 'w', encoding='utf-8') as f:
         f.write(request.content)
+    invalidate_template_cache(doc_type)
     
     return {
         "success": True,
@@ -287,6 +289,7 @@ async def restore_backup(doc_type: str, backup_filename: str, version: str = "v1
     
     # Restore
     shutil.copy(backup_path, template_path)
+    invalidate_template_cache(doc_type)
     
     return {
         "success": True,
@@ -327,6 +330,7 @@ async def update_base_template(request: TemplateUpdateRequest):
     # Save
     with open(base_path, 'w', encoding='utf-8') as f:
         f.write(request.content)
+    invalidate_template_cache()
     
     return {
         "success": True,
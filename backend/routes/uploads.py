@@ -2,12 +2,12 @@
 Uploads API - роздача завантажених файлів через API
 Використовується коли nginx не налаштований для статичних файлів
 """
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Request
 from pathlib import Path
-import mimetypes
 import os
 
+from utils.static_assets import serve_file
+
 router = APIRouter(prefix="/api/uploads", tags=["uploads"])
 
 # Визначаємо шлях до uploads
@@ -21,48 +21,54 @@ else:
     UPLOAD_ROOT = LOCAL_UPLOAD_ROOT
 
 @router.get("/damage_photos/{filename}")
-async def get_damage_photo(filename: str):
+async def get_damage_photo(filename: str, request: Request):
     """Віддає фото пошкодження"""
     file_path = UPLOAD_ROOT / "damage_photos" / filename
     
-    if not file_path.exists():
+    if not file_path.is_file():
         raise HTTPException(status_code=404, detail="Файл не знайдено")
     
-    mime_type, _ = mimetypes.guess_type(str(file_path))
-    return FileResponse(path=file_path, media_type=mime_type or "image/jpeg")
+    return serve_file(request, file_path)
 
 @router.get("/products/{filename}")
-async def get_product_image(filename: str):
+async def get_product_image(filename: str, request: Request):
     """Віддає фото товару (оригінал)"""
     file_path = UPLOAD_ROOT / "products" / filename
     
-    if not file_path.exists():
+    if not file_path.is_file():
         raise HTTPException(status_code=404, detail="Файл не знайдено")
     
-    mime_type, _ = mimetypes.guess_type(str(file_path))
-    return FileResponse(path=file_path, media_type=mime_type or "image/jpeg")
+    return serve_file(request, file_path)
 
 @router.get("/products/thumbnails/{filename}")
-async def get_product_thumbnail(filename: str):
+async def get_product_thumbnail(filename: str, request: Request):
     """Віддає thumbnail товару"""
     file_path = UPLOAD_ROOT / "products" / "thumbnails" / filename
     
-    if not file_path.exists():
+    if not file_path.is_file():
         raise HTTPException(status_code=404, detail="Файл не знайдено")
     
-    mime_type, _ = mimetypes.guess_type(str(file_path))
-    return FileResponse(path=file_path, media_type=mime_type or "image/jpeg")
+    return serve_file(request, file_path)
 
 @router.get("/products/medium/{filename}")
-async def get_product_medium(filename: str):
+async def get_product_medium(filename: str, request: Request):
     """Віддає medium розмір фото товару"""
     file_path = UPLOAD_ROOT / "products" / "medium" / filename
     
-    if not file_path.exists():
+    if not file_path.is_file():
         # Fallback на оригінал якщо medium не існує
         file_path = UPLOAD_ROOT / "products" / filename
-        if not file_path.exists():
+        if not file_path.is_file():
             raise HTTPException(status_code=404, detail="Файл не знайдено")
     
-    mime_type, _ = mimetypes.guess_type(str(file_path))
-    return FileResponse(path=file_path, media_type=mime_type or "image/jpeg")
+    return serve_file(request, file_path)
+
+@router.get("/products/variants/{prefix}/{digest}/{filename}")
+async def get_product_image_variant(prefix: str, digest: str, filename: str, request: Request):
+    """Віддає WebP/AVIF варіант фото товару (content-addressed, immutable)"""
+    file_path = UPLOAD_ROOT / "products" / "variants" / prefix / digest / filename
+    
+    if not file_path.is_file():
+        raise HTTPException(status_code=404, detail="Файл не знайдено")
+    
+    return serve_file(request, file_path)
@@ -9,6 +9,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_, cast, String, text
 from datetime import datetime, timedelta, date
 from database_rentalhub import get_rh_db  # ✅ Using RentalHub DB
+from services.calendar_index import ensure_fresh as ensure_calendar_index
+from services.order_hydrator import parse_card_items
 import json
 
 router = APIRouter(prefix="/api/warehouse", tags=["warehouse"])
@@ -95,118 +97,20 @@ async def warehouse_calendar(
     """
     Календар подій для реквізиторів
     Видачі та повернення на обраний період
-    ✅ MIGRATED: Using RentalHub DB (issue_cards + return_cards + orders)
+    ✅ MIGRATED: Using RentalHub DB (calendar_event_index, feed='warehouse')
     """
     try:
         start = datetime.fromisoformat(from_date)
         end = datetime.fromisoformat(to_date)
         
-        events = []
-        
-        # ✅ Issue Cards (Видачі) - using RentalHub DB
-        issue_result = db.execute(text("""
-            SELECT 
-                ic.id, ic.order_number, ic.status, ic.items,
-                o.customer_name, o.rental_start_date
-            FROM issue_cards ic
-            JOIN orders o ON ic.order_id = o.order_id
-            WHERE o.rental_start_date >= :start AND o.rental_start_date <= :end
-            ORDER BY o.rental_start_date
-        """), {"start": start.date(), "end": end.date()})
-        
-        for row in issue_result:
-            card_id, order_number, status, items_json, customer_name, rent_date = row
-            
-            # Parse items JSON
-            items = []
-            if items_json:
-                try:
-                    items = json.loads(items_json) if isinstance(items_json, str) else items_json
-                except:
-                    items = []
-            
-            items_count = len(items) if items else 0
-            
-            # Визначити категорії товарів
-            categories = set()
-            for item in items:
-                name = item.get('name', '').lower() if isinstance(item, dict) else ''
-                if 'меблі' in name or 'стіл' in name or 'стілець' in name:
-                    categories.add('Меблі')
-                elif 'текстиль' in name or 'скатертина' in name or 'серветка' in name:
-                    categories.add('текстиль')
-                elif 'посуд' in name or 'тарілка' in name or 'келих' in name:
-                    categories.add('посуд')
-                elif 'ваза' in name or 'свічник' in name or 'декор' in name:
-                    categories.add('Вази + свічники')
-            
-            items_summary = ', '.join(categories) if categories else 'Реквізит'
-            
-            events.append({
-                "id": card_id,
-                "order_id": order_number,
-                "type": "issue",
-                "time": rent_date.strftime("%H:%M") if rent_date else "10:00",
-                "date": rent_date.isoformat() if rent_date else None,
-                "client": customer_name or "Клієнт",
-                "label": "Видача",
-                "color": "emerald",
-                "status": status,
-                "itemsSummary": items_summary,
-                "itemsCount": items_count,
-                "warehouseZone": "Зона A · Стелаж 3",  # TODO: брати з бази
-            })
-        
-        # ✅ Return Cards (Повернення) - using RentalHub DB
-        return_result = db.execute(text("""
-            SELECT 
-                rc.id, rc.order_number, rc.status, rc.items_returned,
-                o.customer_name, o.rental_end_date
-            FROM return_cards rc
-            JOIN orders o ON rc.order_id = o.order_id
-            WHERE o.rental_end_date >= :start AND o.rental_end_date <= :end
-            ORDER BY o.rental_end_date
+        # Картки видачі / повернення з уже порахованими категоріями і кількістю позицій
+        ensure_calendar_index(db)
+        result = db.execute(text("""
+            SELECT payload FROM calendar_event_index
+            WHERE feed = 'warehouse' AND event_date BETWEEN :start AND :end
+            ORDER BY event_date
         """), {"start": start.date(), "end": end.date()})
-        
-        for row in return_result:
-            card_id, order_number, status, items_json, customer_name, return_date = row
-            
-            # Parse items JSON
-            items = []
-            if items_json:
-                try:
-                    items = json.loads(items_json) if isinstance(items_json, str) else items_json
-                except:
-                    items = []
-            
-            items_count = len(items) if items else 0
-            
-            categories = set()
-            for item in items:
-                name = item.get('name', '').lower() if isinstance(item, dict) else ''
-                if 'ваза' in name or 'свічник' in name:
-                    categories.add('Вази + свічники')
-                elif 'посуд' in name:
-                    categories.add('посуд')
-                elif 'текстиль' in name:
-                    categories.add('текстиль')
-            
-            items_summary = ', '.join(categories) if categories else 'Реквізит'
-            
-            events.append({
-                "id": card_id,
-                "order_id": order_number,
-                "type": "return",
-                "time": return_date.strftime("%H:%M") if return_date else "15:00",
-                "date": return_date.isoformat() if return_date else None,
-                "client": customer_name or "Клієнт",
-                "label": "Повернення",
-                "color": "amber",
-                "status": status,
-                "itemsSummary": items_summary,
-                "itemsCount": items_count,
-                "warehouseZone": "Зона B · Мийка",  # TODO: брати з бази
-            })
+        events = [json.loads(row[0]) for row in result]
         
         # Сортувати по часу
         events.sort(key=lambda x: (x.get('date', ''), x.get('time', '')))
@@ -374,12 +278,7 @@ async def get_packing_orders(
              order_id, customer_name, rent_date, return_date) = row
             
             # Parse items JSON
-            items = []
-            if items_json:
-                try:
-                    items = json.loads(items_json) if isinstance(items_json, str) else items_json
-                except:
-                    items = []
+            items = parse_card_items(items_json)
             
             items_count = sum(item.get('quantity', 0) for item in items) if items else 0
             sku_count = len(items) if items else 0
@@ -449,12 +348,7 @@ async def get_packing_order_details(
          order_db_id, customer_name, rent_date, return_date) = row
         
         # Parse items JSON
-        items = []
-        if items_json:
-            try:
-                items = json.loads(items_json) if isinstance(items_json, str) else items_json
-            except:
-                items = []
+        items = parse_card_items(items_json)
         
         items_count = sum(item.get('quantity', 0) for item in items) if items else 0
         sku_count = len(items) if items else 0
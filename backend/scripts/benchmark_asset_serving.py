@@ -0,0 +1,131 @@
+"""
+Benchmark: 1000 запитів мініатюр - FileResponse без кешування vs serve_file (200 / 304 / Range)
+
+Запуск (з каталогу backend):
+    python scripts/benchmark_asset_serving.py [--requests 1000] [--files 50]
+    python scripts/benchmark_asset_serving.py --url https://backrentalhub.farforrent.com.ua \\
+        --path /api/uploads/products/thumbnails/<file>_thumb.jpg
+
+Без --url піднімає застосунок в процесі (httpx ASGITransport) на синтетичних файлах,
+тож вимірює лише накладні витрати FastAPI/роздачі, без мережі.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse
+
+from routes import uploads
+from utils.static_assets import CachedStaticFiles
+
+
+def build_app(root: str) -> FastAPI:
+    uploads.UPLOAD_ROOT = Path(root)
+    app = FastAPI()
+
+    @app.get("/legacy/thumbnails/{filename}")
+    async def legacy_thumbnail(filename: str):
+        # Як було до ETag/304: exists() + FileResponse без Cache-Control
+        path = os.path.join(root, "products", "thumbnails", filename)
+        return FileResponse(path, media_type="image/jpeg")
+
+    app.include_router(uploads.router)
+    app.mount("/uploads", CachedStaticFiles(directory=root), name="uploads")
+    return app
+
+
+def make_files(root: str, count: int, size: int) -> list:
+    thumbs = os.path.join(root, "products", "thumbnails")
+    os.makedirs(thumbs, exist_ok=True)
+    names = []
+    for i in range(count):
+        name = f"SKU{i}_1700000000_thumb.jpg"
+        with open(os.path.join(thumbs, name), "wb") as f:
+            f.write(os.urandom(size))
+        names.append(name)
+    return names
+
+
+async def fetch_all(client: httpx.AsyncClient, urls: list, headers_for=None, concurrency: int = 20):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+    transferred = 0
+
+    async def one(url):
+        nonlocal transferred
+        async with semaphore:
+            response = await client.get(url, headers=headers_for(url) if headers_for else None)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            transferred += len(response.content)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(u) for u in urls))
+    elapsed = time.perf_counter() - started
+    return elapsed, statuses, transferred
+
+
+def report(label: str, n: int, elapsed: float, statuses: dict, transferred: int):
+    print(f"{label:<34} {n / elapsed:>9.0f} req/s  {elapsed * 1000:>8.0f} ms  "
+          f"{transferred / 1024:>9.0f} KiB  {statuses}")
+
+
+async def run_local(args):
+    with tempfile.TemporaryDirectory() as root:
+        names = make_files(root, args.files, args.size)
+        app = build_app(root)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            scenarios = {
+                "legacy FileResponse": "/legacy/thumbnails/{}",
+                "/api/uploads handler": "/api/uploads/products/thumbnails/{}",
+                "/uploads mount": "/uploads/products/thumbnails/{}",
+            }
+            for label, pattern in scenarios.items():
+                urls = [pattern.format(names[i % len(names)]) for i in range(args.requests)]
+                report(label + " (cold)", args.requests, *await fetch_all(client, urls))
+                if label.startswith("legacy"):
+                    continue
+                etags = {}
+                for url in set(urls):
+                    etags[url] = (await client.get(url)).headers["etag"]
+                report(label + " (If-None-Match)", args.requests,
+                       *await fetch_all(client, urls, lambda u: {"If-None-Match": etags[u]}))
+            urls = [f"/api/uploads/products/thumbnails/{names[i % len(names)]}" for i in range(args.requests)]
+            report("/api/uploads handler (Range 1KiB)", args.requests,
+                   *await fetch_all(client, urls, lambda u: {"Range": "bytes=0-1023"}))
+
+
+async def run_remote(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+        urls = [args.path] * args.requests
+        report("remote (cold)", args.requests, *await fetch_all(client, urls))
+        etag = (await client.get(args.path)).headers.get("etag")
+        if etag:
+            report("remote (If-None-Match)", args.requests,
+                   *await fetch_all(client, urls, lambda u: {"If-None-Match": etag}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--size", type=int, default=30 * 1024, help="розмір синтетичної мініатюри, байт")
+    parser.add_argument("--url", help="базовий URL живого бекенду")
+    parser.add_argument("--path", help="шлях мініатюри для --url")
+    args = parser.parse_args()
+    if args.url and not args.path:
+        parser.error("--url потребує --path")
+    asyncio.run(run_remote(args) if args.url else run_local(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: check_order_availability по позиціях vs batched на синтетичному замовленні
+
+Запуск (з каталогу backend, потрібен доступ до RH_DB_HOST):
+    python scripts/benchmark_availability.py [--items 100] [--runs 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import event, text
+from database_rentalhub import rh_engine, get_rh_db_sync
+from services.availability_engine import get_availability_engine
+from utils.availability_checker import check_order_availability
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def build_synthetic_order(db, size: int):
+    rows = db.execute(text("""
+        SELECT product_id FROM products WHERE status = 1 ORDER BY product_id LIMIT :limit
+    """), {"limit": size}).fetchall()
+    rng = random.Random(42)
+    return [{"product_id": row[0], "quantity": rng.randint(1, 20)} for row in rows]
+
+
+def run(db, counter, items, start_date, end_date, batched: bool, runs: int):
+    timings = []
+    queries = 0
+    result = None
+    for _ in range(runs):
+        before = counter.count
+        started = time.perf_counter()
+        result = check_order_availability(db, items, start_date, end_date, batched=batched)
+        timings.append(time.perf_counter() - started)
+        queries = counter.count - before
+    return result, timings, queries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    db = get_rh_db_sync()
+    counter = QueryCounter(rh_engine)
+    try:
+        items = build_synthetic_order(db, args.items)
+        start_date = (date.today() + timedelta(days=7)).isoformat()
+        end_date = (date.today() + timedelta(days=10)).isoformat()
+
+        # Прогріти індекс availability engine, щоб обидва шляхи були в рівних умовах
+        get_availability_engine().ensure_fresh(db)
+
+        per_item, per_item_t, per_item_q = run(db, counter, items, start_date, end_date, False, args.runs)
+        batched, batched_t, batched_q = run(db, counter, items, start_date, end_date, True, args.runs)
+
+        print(f"Order: {len(items)} items, {start_date} .. {end_date}, {args.runs} runs")
+        print(f"  per-item: {min(per_item_t) * 1000:8.1f} ms best, {per_item_q:4d} queries")
+        print(f"  batched:  {min(batched_t) * 1000:8.1f} ms best, {batched_q:4d} queries")
+        print(f"  speedup:  {min(per_item_t) / max(min(batched_t), 1e-9):.1f}x")
+
+        if per_item != batched:
+            print("❌ Payload mismatch between per-item and batched paths")
+            sys.exit(1)
+        print("✅ Identical payloads")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
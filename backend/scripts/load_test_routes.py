@@ -0,0 +1,157 @@
+"""
+Load test: латентність конкурентних запитів до API (до/після DB_THREADPOOL_ROUTERS)
+
+Поки йде навантаження на DB-роутери, окремо пінгується /api/health - якщо handlers блокують
+event loop, латентність health росте разом з навантаженням.
+
+Запуск (сервер уже піднятий):
+    DB_THREADPOOL_ROUTERS=off uvicorn server:app --port 8001
+    python scripts/load_test_routes.py --base-url http://localhost:8001 --label before
+
+    DB_THREADPOOL_ROUTERS=orders,finance,catalog,audit uvicorn server:app --port 8001
+    python scripts/load_test_routes.py --base-url http://localhost:8001 --label after
+
+    # порівняти збережені результати
+    python scripts/load_test_routes.py --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import httpx
+
+DEFAULT_PATHS = [
+    "/api/orders?limit=50",
+    "/api/orders?limit=50&fields=summary",
+    "/api/catalog/items-by-category",
+    "/api/finance/dashboard",
+    "/api/audit/items?limit=50",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, errors, elapsed):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else 0,
+    }
+
+
+async def worker(client, paths, deadline, latencies, counters, offset):
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            res = await client.get(path)
+            if res.status_code >= 500:
+                counters["errors"] += 1
+        except httpx.HTTPError:
+            counters["errors"] += 1
+        latencies.append(time.perf_counter() - started)
+
+
+async def health_probe(client, deadline, latencies, interval):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            await client.get("/api/health")
+        except httpx.HTTPError:
+            pass
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+
+async def run(base_url, paths, concurrency, duration, headers):
+    limits = httpx.Limits(max_connections=concurrency + 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits, headers=headers) as client:
+        # прогрів (кеші, пул з'єднань БД)
+        for path in paths:
+            try:
+                await client.get(path)
+            except httpx.HTTPError:
+                pass
+
+        api_latencies, health_latencies = [], []
+        counters = {"errors": 0}
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(
+            health_probe(client, deadline, health_latencies, 0.05),
+            *[worker(client, paths, deadline, api_latencies, counters, n) for n in range(concurrency)]
+        )
+        elapsed = time.perf_counter() - started
+
+    return {
+        "base_url": base_url,
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "paths": paths,
+        "api": summarize(api_latencies, counters["errors"], elapsed),
+        "health": summarize(health_latencies, 0, elapsed),
+    }
+
+
+def print_result(label, result):
+    print(f"[{label}] concurrency={result['concurrency']} duration={result['duration_s']}s")
+    for key in ("api", "health"):
+        r = result[key]
+        print(f"  {key:7s} {r['requests']:6d} req  {r['rps']:7.1f} rps  "
+              f"p50 {r['p50_ms']:8.1f} ms  p95 {r['p95_ms']:8.1f} ms  p99 {r['p99_ms']:8.1f} ms  errors {r['errors']}")
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print_result(before_path, before)
+    print_result(after_path, after)
+    for key in ("api", "health"):
+        b, a = before[key], after[key]
+        print(f"  {key}: p95 {b['p95_ms']} -> {a['p95_ms']} ms, rps {b['rps']} -> {a['rps']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--path", action="append", dest="paths", help="GET path (можна кілька)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--token", help="Bearer token для захищених endpoints")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    result = asyncio.run(run(args.base_url, args.paths or DEFAULT_PATHS, args.concurrency, args.duration, headers))
+    print_result(args.label, result)
+
+    out_path = f"{args.label}.json"
+    with open(out_path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved {out_path}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,4 @@
 from fastapi import FastAPI, APIRouter, Request
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -11,13 +10,15 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+from utils.static_assets import CachedStaticFiles
+
 # Import route modules AFTER loading env
 from routes import inventory, clients, orders, tasks, damages, finance, test_orders, settings, pdf, users, issue_cards, return_cards, photos, qr_codes, email, catalog, archive, warehouse, extended_catalog, audit, products, auth, image_proxy, price_sync, damage_cases, admin, product_damage_history, product_reservations, inventory_adjustments, sync, product_cleaning, migrations, product_images, event_tool_integration, user_tracking, laundry, documents, analytics, product_sets, expense_management, export, template_admin, order_modifications, order_internal_notes, order_sync, partial_returns, uploads, payer_profiles, dashboard_overview, calendar_events, return_versions, event_tool, master_agreements, order_annexes, document_policy, document_render, document_signatures, document_pdf, document_manual_fields, document_email, team_chat, cabinet, admin_orders, bulk_products
 
 # Create the main app
 app = FastAPI(title="Rental Hub API")
 
-# Налаштувати статичні файли для завантажених зображень
+# Налаштувати статичні файли для завантажених зображень (ETag/304/Range, immutable для хеш-імен)
 UPLOAD_ROOT = ROOT_DIR / "uploads"
 UPLOAD_ROOT.mkdir(exist_ok=True)
 (UPLOAD_ROOT / "products").mkdir(exist_ok=True)
@@ -25,15 +26,15 @@ UPLOAD_ROOT.mkdir(exist_ok=True)
 (UPLOAD_ROOT / "qr").mkdir(exist_ok=True)
 (UPLOAD_ROOT / "damage_photos").mkdir(exist_ok=True)
 (UPLOAD_ROOT / "chat").mkdir(exist_ok=True)
-app.mount("/api/uploads", StaticFiles(directory=str(UPLOAD_ROOT)), name="api_uploads")
-app.mount("/uploads", StaticFiles(directory=str(UPLOAD_ROOT)), name="uploads")
+app.mount("/api/uploads", CachedStaticFiles(directory=str(UPLOAD_ROOT)), name="api_uploads")
+app.mount("/uploads", CachedStaticFiles(directory=str(UPLOAD_ROOT)), name="uploads")
 
 # Налаштувати статичні файли для мігрованих зображень товарів
 STATIC_ROOT = ROOT_DIR / "static"
 STATIC_ROOT.mkdir(exist_ok=True)
 (STATIC_ROOT / "images").mkdir(exist_ok=True)
 (STATIC_ROOT / "images" / "products").mkdir(exist_ok=True)
-app.mount("/static", StaticFiles(directory=str(STATIC_ROOT)), name="static")
+app.mount("/static", CachedStaticFiles(directory=str(STATIC_ROOT)), name="static")
 
 # Add CORS middleware (MUST be before routers)
 cors_origins = os.environ.get('CORS_ORIGINS', '')
@@ -74,6 +75,10 @@ app.add_middleware(
     max_age=600,
 )
 
+# Blocking DB handlers -> threadpool (router by router, see DB_THREADPOOL_ROUTERS)
+from utils.db_offload import offload_blocking_routers
+print(f"[DB offload] {', '.join(offload_blocking_routers()) or 'disabled'}")
+
 # Include routers
 app.include_router(inventory.router)
 app.include_router(clients.router)
@@ -152,6 +157,231 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@app.on_event("startup")
+def precompile_document_templates():
+    """Прогріти кеш Jinja для шаблонів документів з реєстру"""
+    from services.doc_engine.render import precompile_registry_templates
+    try:
+        results = precompile_registry_templates()
+        failed = {name: err for name, err in results.items() if err != "ok"}
+        logger.info(f"Precompiled {len(results) - len(failed)}/{len(results)} document templates")
+        for name, err in failed.items():
+            logger.warning(f"Template precompile failed: {name}: {err}")
+    except Exception as e:
+        logger.warning(f"Template precompile skipped: {e}")
+
+
+@app.on_event("startup")
+def build_finance_rollups():
+    """Довести fin_daily_rollups до вчора у фоні (перший запуск будує всю історію)"""
+    from services.finance_rollup import build_in_background
+    build_in_background()
+
+
+@app.on_event("startup")
+def build_client_summary():
+    """Побудувати/звірити проєкцію client_summary у фоні і підключити відстеження змін"""
+    import threading
+    from services.client_summary import ensure_fresh
+    from database_rentalhub import get_rh_db_sync
+
+    def build():
+        db = get_rh_db_sync()
+        try:
+            ensure_fresh(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Client summary build skipped: {e}")
+        finally:
+            db.close()
+
+    threading.Thread(target=build, name="client-summary", daemon=True).start()
+
+
+@app.on_event("startup")
+def build_calendar_index():
+    """Побудувати calendar_event_index у фоні і підключити відстеження змін"""
+    import threading
+    from services.calendar_index import ensure_fresh
+    from database_rentalhub import get_rh_db_sync
+
+    def build():
+        db = get_rh_db_sync()
+        try:
+            ensure_fresh(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Calendar index build skipped: {e}")
+        finally:
+            db.close()
+
+    threading.Thread(target=build, name="calendar-index", daemon=True).start()
+
+
+@app.on_event("startup")
+def build_analytics_facts():
+    """Довести денні факти аналітики до вчора у фоні і підключити відстеження змін"""
+    from services.analytics_facts import build_in_background, install_change_tracking
+
+    install_change_tracking()
+    build_in_background()
+
+
+@app.on_event("startup")
+def build_chat_state():
+    """Перебудувати стан каналів чату у фоні, якщо він ще порожній"""
+    import threading
+    from services.chat_state import ensure_built
+    from database_rentalhub import get_rh_db_sync
+
+    def build():
+        db = get_rh_db_sync()
+        try:
+            ensure_built(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Chat state build skipped: {e}")
+        finally:
+            db.close()
+
+    threading.Thread(target=build, name="chat-state", daemon=True).start()
+
+
+@app.on_event("startup")
+def warm_product_search():
+    """Побудувати пошуковий індекс товарів у фоні, щоб перший пошук не чекав"""
+    import threading
+    from services.product_search import get_product_search
+    from database_rentalhub import get_rh_db_sync
+
+    def build():
+        db = get_rh_db_sync()
+        try:
+            get_product_search().ensure_fresh(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Product search warm-up skipped: {e}")
+        finally:
+            db.close()
+
+    threading.Thread(target=build, name="product-search-warmup", daemon=True).start()
+
+
+@app.on_event("startup")
+def requeue_image_derivatives():
+    """Догнати варіанти зображень, що лишились pending після рестарту"""
+    from services.image_derivatives import get_image_derivative_service
+    from routes.product_images import PRODUCTS_DIR
+    from database_rentalhub import get_rh_db_sync
+
+    db = get_rh_db_sync()
+    try:
+        queued = get_image_derivative_service().requeue_pending(db, PRODUCTS_DIR)
+        if queued:
+            logger.info(f"Queued {queued} pending image derivative jobs")
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Image derivative requeue skipped: {e}")
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+def fail_interrupted_exports():
+    """Фонові експорти, перервані рестартом, лишались queued / running назавжди"""
+    from services.export_engine import get_export_jobs
+    from database_rentalhub import get_rh_db_sync
+
+    db = get_rh_db_sync()
+    try:
+        failed = get_export_jobs().fail_interrupted(db)
+        db.commit()
+        if failed:
+            logger.info(f"Marked {failed} interrupted export jobs as failed")
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Export job recovery skipped: {e}")
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+def start_notification_dispatcher():
+    """Фонова розсилка email / Telegram з notification_outbox"""
+    from services.notification_outbox import get_notification_dispatcher
+    get_notification_dispatcher().start()
+
+
+@app.on_event("startup")
+def start_soft_reservation_sweeper():
+    """Архівація прострочених soft-резервів мудбордів Event Tool"""
+    from services.soft_reservations import get_soft_reservation_sweeper
+    get_soft_reservation_sweeper().start()
+
+
+@app.on_event("startup")
+async def start_realtime_backplane():
+    """WebSocket-події order_sync між воркерами (REALTIME_BACKPLANE)"""
+    from routes.order_sync import get_sync_manager
+    await get_sync_manager().start()
+
+
+@app.on_event("startup")
+async def start_chat_hub():
+    """Push-події чату: backplane і event loop для publish_soon() з threadpool"""
+    from routes.team_chat import get_chat_hub
+    await get_chat_hub().start()
+
+
+@app.on_event("startup")
+async def start_config_invalidation_listener():
+    """Інвалідації кешу налаштувань компанії з інших воркерів"""
+    from services.company_config import start_invalidation_listener
+    await start_invalidation_listener()
+
+
+@app.on_event("shutdown")
+async def stop_realtime_backplane():
+    from routes.order_sync import get_sync_manager
+    await get_sync_manager().stop()
+
+
+@app.on_event("shutdown")
+def stop_notification_dispatcher():
+    from services.notification_outbox import get_notification_dispatcher
+    get_notification_dispatcher().stop()
+
+
+@app.on_event("shutdown")
+def stop_soft_reservation_sweeper():
+    from services.soft_reservations import get_soft_reservation_sweeper
+    get_soft_reservation_sweeper().stop()
+
+
+@app.on_event("shutdown")
+def stop_pdf_render_pool():
+    from services.pdf_render_service import get_pdf_render_service
+    get_pdf_render_service().shutdown()
+
+
+@app.on_event("shutdown")
+def stop_image_derivative_pool():
+    from services.image_derivatives import get_image_derivative_service
+    get_image_derivative_service().shutdown()
+
+
+@app.on_event("shutdown")
+def stop_dashboard_snapshot_pool():
+    from services.dashboard_snapshot import get_dashboard_snapshots
+    get_dashboard_snapshots().shutdown()
+
+
+@app.on_event("shutdown")
+def stop_export_job_pool():
+    from services.export_engine import get_export_jobs
+    get_export_jobs().shutdown()
+
 # Health check
 @app.get("/api/")
 async def root():
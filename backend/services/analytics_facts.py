@@ -0,0 +1,596 @@
+"""
+Analytics facts - денні факт-таблиці для /api/analytics/*.
+
+get_overview виконував сім запитів по orders / product_damage_history за весь період,
+а /orders, /products, /clients, /damage рахували схожі агрегати заново - "рік"
+означав сканування всієї історії. Тут сирі таблиці згортаються по днях:
+
+    analytics_daily_orders    (day, status)                           -> orders_cnt, revenue
+    analytics_daily_damage    (day, product_id, order_id, damage_type) -> cnt, fee, paid_cnt, paid_fee
+    analytics_daily_products  (day, product_id, completed)            -> rentals, revenue
+    analytics_daily_clients   (day, customer_id)                      -> orders_cnt, revenue, first_order
+
+    day - DATE(orders.created_at) / DATE(product_damage_history.created_at);
+    NULL id / тип зберігаються як 0 / ''.
+
+Правила (як finance_rollup):
+- факти будуються для днів < сьогодні (built_through = вчора); дні після built_through
+  (сьогодні, або вся історія до першої побудови) читаються з сирих таблиць - fact_source()
+  склеює обидві частини через UNION ALL
+- раз на день (старт сервера / перше читання / sync_all) факти доводяться до вчора і
+  перераховуються ще ANALYTICS_FACTS_RECHECK_DAYS попередніх днів - у фоновому потоці
+  (build_in_background); читачі не чекають на побудову
+- записи через rh_engine у orders / order_items / product_damage_history запам'ятовуються
+  і після commit автора (on_commit) перераховують дні зачеплених замовлень і шкод у фоновому
+  потоці - транзакція автора не тримає локів analytics_daily_*
+- повна історія - backfill_analytics_facts.py (CLI), порціями по місяцю
+
+Usage:
+    source, params = fact_source(db, "orders", range_start, range_end)
+    rows = db.execute(text(f"SELECT status, SUM(orders_cnt) FROM {source} f GROUP BY status"), params)
+"""
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from utils.commit_tracking import on_commit, param_values, parse_write, set_clause, track_writes, write_pattern
+
+logger = logging.getLogger(__name__)
+
+FACTS_RECHECK_DAYS = int(os.environ.get("ANALYTICS_FACTS_RECHECK_DAYS", "7"))
+
+COMPLETED_STATUSES = ("issued", "on_rent", "returned", "closed")
+
+_PENDING_KEY = "analytics_facts_pending"
+
+
+@dataclass
+class Fact:
+    name: str
+    table: str
+    column: str  # дата, за якою рядок потрапляє в день
+    columns: Tuple[str, ...]  # колонки таблиці = колонки select, day - перша
+    ddl: str
+    select: str  # {where} - умова по column
+    indexes: List[str] = field(default_factory=list)
+
+
+_COMPLETED_SQL = ", ".join(f"'{s}'" for s in COMPLETED_STATUSES)
+
+FACTS: Dict[str, Fact] = {
+    "orders": Fact(
+        name="orders",
+        table="analytics_daily_orders",
+        column="o.created_at",
+        columns=("day", "status", "orders_cnt", "revenue"),
+        ddl="""
+            day DATE NOT NULL,
+            status VARCHAR(50) NOT NULL DEFAULT '',
+            orders_cnt INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, status)
+        """,
+        select="""
+            SELECT DATE(o.created_at) AS day, COALESCE(o.status, '') AS status,
+                   COUNT(*) AS orders_cnt, COALESCE(SUM(o.total_price), 0) AS revenue
+            FROM orders o
+            WHERE {where}
+            GROUP BY DATE(o.created_at), COALESCE(o.status, '')
+        """,
+    ),
+    "damage": Fact(
+        name="damage",
+        table="analytics_daily_damage",
+        column="pdh.created_at",
+        columns=("day", "product_id", "order_id", "damage_type", "product_name", "sku",
+                 "cnt", "fee_cnt", "fee", "paid_cnt", "paid_fee"),
+        ddl="""
+            day DATE NOT NULL,
+            product_id INT NOT NULL DEFAULT 0,
+            order_id INT NOT NULL DEFAULT 0,
+            damage_type VARCHAR(100) NOT NULL DEFAULT '',
+            product_name VARCHAR(255) NULL,
+            sku VARCHAR(100) NULL,
+            cnt INT NOT NULL DEFAULT 0,
+            fee_cnt INT NOT NULL DEFAULT 0,
+            fee DECIMAL(14,2) NOT NULL DEFAULT 0,
+            paid_cnt INT NOT NULL DEFAULT 0,
+            paid_fee DECIMAL(14,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product_id, order_id, damage_type)
+        """,
+        select="""
+            SELECT DATE(pdh.created_at) AS day, COALESCE(pdh.product_id, 0) AS product_id,
+                   COALESCE(pdh.order_id, 0) AS order_id, COALESCE(pdh.damage_type, '') AS damage_type,
+                   MAX(pdh.product_name) AS product_name, MAX(pdh.sku) AS sku,
+                   COUNT(*) AS cnt, COUNT(pdh.fee) AS fee_cnt, COALESCE(SUM(pdh.fee), 0) AS fee,
+                   SUM(CASE WHEN pdh.fee > 0 THEN 1 ELSE 0 END) AS paid_cnt,
+                   COALESCE(SUM(CASE WHEN pdh.fee > 0 THEN pdh.fee END), 0) AS paid_fee
+            FROM product_damage_history pdh
+            WHERE {where}
+            GROUP BY DATE(pdh.created_at), COALESCE(pdh.product_id, 0), COALESCE(pdh.order_id, 0),
+                     COALESCE(pdh.damage_type, '')
+        """,
+    ),
+    "products": Fact(
+        name="products",
+        table="analytics_daily_products",
+        column="o.created_at",
+        columns=("day", "product_id", "completed", "rentals", "revenue"),
+        ddl="""
+            day DATE NOT NULL,
+            product_id INT NOT NULL,
+            completed TINYINT NOT NULL DEFAULT 0,
+            rentals INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product_id, completed)
+        """,
+        select=f"""
+            SELECT DATE(o.created_at) AS day, oi.product_id AS product_id,
+                   CASE WHEN o.status IN ({_COMPLETED_SQL}) THEN 1 ELSE 0 END AS completed,
+                   COUNT(DISTINCT oi.order_id) AS rentals,
+                   COALESCE(SUM(oi.price * oi.quantity), 0) AS revenue
+            FROM order_items oi
+            JOIN orders o ON oi.order_id = o.order_id
+            WHERE {{where}} AND oi.product_id IS NOT NULL
+            GROUP BY DATE(o.created_at), oi.product_id,
+                     CASE WHEN o.status IN ({_COMPLETED_SQL}) THEN 1 ELSE 0 END
+        """,
+    ),
+    "clients": Fact(
+        name="clients",
+        table="analytics_daily_clients",
+        column="o.created_at",
+        columns=("day", "customer_id", "orders_cnt", "revenue", "first_order"),
+        ddl="""
+            day DATE NOT NULL,
+            customer_id INT NOT NULL DEFAULT 0,
+            orders_cnt INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+            first_order DATETIME NULL,
+            PRIMARY KEY (day, customer_id)
+        """,
+        select="""
+            SELECT DATE(o.created_at) AS day, COALESCE(o.customer_id, 0) AS customer_id,
+                   COUNT(*) AS orders_cnt, COALESCE(SUM(o.total_price), 0) AS revenue,
+                   MIN(o.created_at) AS first_order
+            FROM orders o
+            WHERE {where}
+            GROUP BY DATE(o.created_at), COALESCE(o.customer_id, 0)
+        """,
+        # нові vs повторні клієнти: чи є у клієнта дні до початку періоду
+        indexes=["INDEX idx_analytics_clients_customer (customer_id, day)"],
+    ),
+}
+
+_lock = threading.Lock()
+_tables_ready = False
+_built_through: Optional[date] = None
+_build_thread: Optional[threading.Thread] = None
+_build_thread_lock = threading.Lock()
+# закомічені, ще не перераховані зміни (on_commit -> фоновий потік)
+_queued: Optional[dict] = None
+_refresh_thread: Optional[threading.Thread] = None
+_queued_lock = threading.Lock()
+
+
+def _as_date(value) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    return value
+
+
+def _midnight(value: date) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+def ensure_fact_tables(db: Session):
+    """Створити analytics_daily_* / analytics_facts_state якщо немає"""
+    global _tables_ready
+    if _tables_ready:
+        return
+    for fact in FACTS.values():
+        body = ",\n".join([fact.ddl.strip()] + fact.indexes)
+        db.execute(text(f"CREATE TABLE IF NOT EXISTS {fact.table} ({body})"))
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS analytics_facts_state (
+            id INT NOT NULL PRIMARY KEY,
+            built_through DATE NULL,
+            updated_at DATETIME NULL
+        )
+    """))
+    _tables_ready = True
+
+
+def _range_where(column: str, start: Optional[date], end: Optional[date], prefix: str = "range") -> Tuple[str, Dict]:
+    """Умова по дням [start, end) (None - без межі); рядки з NULL-датою не потрапляють нікуди"""
+    parts, params = [f"{column} IS NOT NULL"], {}
+    if start is not None:
+        parts.append(f"{column} >= :{prefix}_start")
+        params[f"{prefix}_start"] = _midnight(start)
+    if end is not None:
+        parts.append(f"{column} < :{prefix}_end")
+        params[f"{prefix}_end"] = _midnight(end)
+    return " AND ".join(parts), params
+
+
+def rebuild_range(db: Session, start: Optional[date], end: date, today: Optional[date] = None,
+                  facts: Optional[Iterable[str]] = None) -> int:
+    """
+    Перерахувати факти за дні [start, end) із сирих таблиць (start=None - з початку).
+    end обрізається до сьогодні - сьогоднішні рядки завжди читаються наживо.
+    Не комітить - виконується в транзакції викликача.
+    """
+    ensure_fact_tables(db)
+    start = _as_date(start)
+    end = min(_as_date(end), _as_date(today) or date.today())
+    if start is not None and start >= end:
+        return 0
+    inserted = 0
+    for name in (facts or FACTS):
+        fact = FACTS[name]
+        delete_sql = f"DELETE FROM {fact.table} WHERE day < :end_day"
+        delete_params = {"end_day": end}
+        if start is not None:
+            delete_sql += " AND day >= :start_day"
+            delete_params["start_day"] = start
+        db.execute(text(delete_sql), delete_params)
+
+        where, params = _range_where(fact.column, start, end)
+        columns = ", ".join(fact.columns)
+        result = db.execute(text(f"""
+            INSERT INTO {fact.table} ({columns})
+            SELECT {columns} FROM ({fact.select.format(where=where)}) g
+        """), params)
+        inserted += max(result.rowcount or 0, 0)
+    return inserted
+
+
+def refresh_days(db: Session, days: Iterable) -> int:
+    """Перерахувати окремі дні (лише вже побудовані: < сьогодні і <= built_through)"""
+    built = read_built_through(db)
+    if built is None:
+        return 0
+    today = date.today()
+    inserted = 0
+    # сусідні дні - одним діапазоном (recheck - FACTS_RECHECK_DAYS днів поспіль)
+    start = end = None
+    for day in sorted({_as_date(d) for d in days if d is not None}):
+        if day >= today or day > built:
+            continue
+        if end != day:
+            if start is not None:
+                inserted += rebuild_range(db, start, end)
+            start = day
+        end = day + timedelta(days=1)
+    if start is not None:
+        inserted += rebuild_range(db, start, end)
+    return inserted
+
+
+def read_built_through(db: Session) -> Optional[date]:
+    ensure_fact_tables(db)
+    row = db.execute(text("SELECT built_through FROM analytics_facts_state WHERE id = 1")).fetchone()
+    return _as_date(row[0]) if row else None
+
+
+def _write_built_through(db: Session, day: date):
+    params = {"day": day, "now": datetime.now()}
+    result = db.execute(text("""
+        UPDATE analytics_facts_state SET built_through = :day, updated_at = :now WHERE id = 1
+    """), params)
+    if not result.rowcount:
+        db.execute(text("""
+            INSERT INTO analytics_facts_state (id, built_through, updated_at) VALUES (1, :day, :now)
+        """), params)
+
+
+def ensure_built(db: Session, today: Optional[date] = None) -> date:
+    """
+    Довести факти до вчорашнього дня. Перший виклик будує всю історію,
+    далі раз на день - нові дні + FACTS_RECHECK_DAYS попередніх
+    (статуси замовлень змінюються ще тижнями після створення).
+    """
+    global _built_through
+    today = _as_date(today) or date.today()
+    target = today - timedelta(days=1)
+    if _built_through is not None and _built_through >= target:
+        return _built_through
+
+    with _lock:
+        built = read_built_through(db)
+        if built is None:
+            rebuild_range(db, None, today, today)
+        elif built < target:
+            rebuild_range(db, built - timedelta(days=FACTS_RECHECK_DAYS - 1), today, today)
+        if built is None or built < target:
+            _write_built_through(db, target)
+            db.commit()
+            logger.info("analytics facts built through %s", target)
+            built = target
+        _built_through = built
+    return built
+
+
+def _spawn(target, name: str) -> threading.Thread:
+    """Запуск фонового потоку (тести підміняють)"""
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def _build():
+    from database_rentalhub import get_rh_db_sync
+
+    db = get_rh_db_sync()
+    try:
+        ensure_built(db)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Analytics facts build skipped: {e}")
+    finally:
+        db.close()
+
+
+def build_in_background():
+    """ensure_built у фоновому потоці (не більше одного одночасно)"""
+    global _build_thread
+    with _build_thread_lock:
+        if _lock.locked() or (_build_thread is not None and _build_thread.is_alive()):
+            return
+        _build_thread = _spawn(_build, "analytics-facts")
+
+
+def facts_through(db: Session, today: Optional[date] = None) -> Optional[date]:
+    """
+    Останній день, за який факти вже побудовані - без очікування на _lock.
+    Якщо факти відстають від вчорашнього дня - запускає фонову побудову.
+    """
+    global _built_through
+    today = _as_date(today) or date.today()
+    target = today - timedelta(days=1)
+    if _built_through is not None and _built_through >= target:
+        return _built_through
+    built = read_built_through(db)
+    if built is not None and built >= target:
+        # побудовано іншим воркером
+        _built_through = built
+        return built
+    build_in_background()
+    return built
+
+
+def recheck_recent(db: Session, days: int = FACTS_RECHECK_DAYS, today: Optional[date] = None) -> int:
+    """Перерахувати останні days днів (після записів повз rh_engine, напр. sync_all); комітить"""
+    today = _as_date(today) or date.today()
+    ensure_built(db, today)
+    inserted = rebuild_range(db, today - timedelta(days=days), today, today)
+    db.commit()
+    return inserted
+
+
+def backfill(db: Session, start: Optional[date] = None, end: Optional[date] = None,
+             today: Optional[date] = None, log=None) -> int:
+    """
+    Перебудувати факти за [start, end) (None - вся історія / до сьогодні) порціями
+    по календарному місяцю, commit після кожної - без довгої транзакції на всю історію.
+    """
+    today = _as_date(today) or date.today()
+    end = min(_as_date(end) or today, today)
+    start = _as_date(start)
+    built = read_built_through(db)
+    # built_through можна посунути, лише якщо перед start уже немає непобудованих днів
+    extends_history = start is None or (built is not None and start <= built + timedelta(days=1))
+    if start is None:
+        firsts = [db.execute(text(f"SELECT MIN({column}) FROM {table}")).fetchone()
+                  for table, column in (("orders", "created_at"), ("product_damage_history", "created_at"))]
+        days = [_as_date(r[0]) for r in firsts if r and r[0]]
+        start = min(days) if days else end
+        for fact in FACTS.values():
+            db.execute(text(f"DELETE FROM {fact.table} WHERE day < :start_day"), {"start_day": start})
+
+    inserted = 0
+    chunk_start = start
+    while chunk_start < end:
+        next_month = (chunk_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        chunk_end = min(next_month, end)
+        written = rebuild_range(db, chunk_start, chunk_end, today)
+        db.commit()
+        inserted += written
+        if log:
+            log(f"{chunk_start:%Y-%m}: {written} rows")
+        chunk_start = chunk_end
+
+    target = end - timedelta(days=1)
+    if extends_history and (built is None or built < target):
+        _write_built_through(db, target)
+    db.commit()
+    return inserted
+
+
+# ============================================================
+# READ
+# ============================================================
+
+def fact_source(db: Session, name: str, start: Optional[datetime], end: Optional[datetime],
+                prefix: Optional[str] = None, today: Optional[date] = None) -> Tuple[str, Dict]:
+    """
+    Підзапит з рядками факту за [start, end) (межі - північ; None - без межі):
+    дні до built_through включно - з analytics_daily_*, далі (сьогодні, або все, поки
+    факти будуються у фоні) - з сирих таблиць.
+    prefix - імена параметрів, якщо в одному запиті кілька джерел.
+    """
+    for bound in (start, end):
+        if isinstance(bound, datetime) and bound != _midnight(bound.date()):
+            raise ValueError(f"Analytics range bounds must be midnight, got {bound}")
+    fact = FACTS[name]
+    prefix = prefix or name
+    today = _as_date(today) or date.today()
+    built = facts_through(db, today)
+    # перший день, що читається з сирих таблиць
+    live_from = min(built + timedelta(days=1), today) if built is not None else None
+    start_day, end_day = _as_date(start), _as_date(end)
+    columns = ", ".join(fact.columns)
+    parts, params = [], {}
+
+    if live_from is not None and (start_day is None or start_day < live_from):
+        fact_end = min(end_day, live_from) if end_day else live_from
+        sql = f"SELECT {columns} FROM {fact.table} WHERE day < :{prefix}_fact_end"
+        params[f"{prefix}_fact_end"] = fact_end
+        if start_day is not None:
+            sql += f" AND day >= :{prefix}_fact_start"
+            params[f"{prefix}_fact_start"] = start_day
+        parts.append(sql)
+
+    if live_from is None or end_day is None or end_day > live_from:
+        if live_from is None:
+            live_start = start_day
+        else:
+            live_start = max(start_day, live_from) if start_day else live_from
+        where, live_params = _range_where(fact.column, live_start, end_day, prefix=f"{prefix}_live")
+        parts.append(f"SELECT {columns} FROM ({fact.select.format(where=where)}) {prefix}_live")
+        params.update(live_params)
+
+    return "(" + " UNION ALL ".join(parts) + ")", params
+
+
+# ============================================================
+# CHANGE TRACKING
+# ============================================================
+
+_WRITE_RE = write_pattern("orders", "order_items", "product_damage_history")
+_ORDER_COLUMNS_RE = re.compile(r"\b(status|total_price|customer_id|created_at)\s*=", re.IGNORECASE)
+_ORDER_KEYS = ("order_id", "oid", "orders_order_id")
+_DAMAGE_KEYS = ("pdh_id", "damage_id", "id", "product_damage_history_id")
+
+
+def _new_pending() -> dict:
+    return {"orders": set(), "damage": set(), "damage_orders": set(), "recheck": False}
+
+
+def note_write(info: dict, statement: str, parameters, lastrowid: Optional[int] = None) -> None:
+    """Розібрати запис у orders / order_items / product_damage_history -> info[_PENDING_KEY]"""
+    parsed = parse_write(_WRITE_RE, statement, parameters)
+    if not parsed:
+        return
+    verb, table, params_list = parsed
+    if verb in ("INSERT", "REPLACE") and table != "order_items" and not re.search(
+            r"\bcreated_at\b", statement, re.IGNORECASE):
+        # нові замовлення / шкоди з created_at = NOW() потрапляють у сьогодні - читається наживо
+        return
+    if table == "orders" and verb == "UPDATE":
+        if not _ORDER_COLUMNS_RE.search(set_clause(statement)):
+            return
+    pending = info.setdefault(_PENDING_KEY, _new_pending())
+
+    orders = param_values(params_list, _ORDER_KEYS + (("id",) if table == "orders" else ()))
+    if table == "orders" and verb == "INSERT" and lastrowid:
+        orders.add(lastrowid)
+    if table == "product_damage_history":
+        damage = param_values(params_list, _DAMAGE_KEYS)
+        if verb == "INSERT" and lastrowid:
+            damage.add(lastrowid)
+        pending["damage"].update(damage)
+        pending["damage_orders"].update(orders)
+        resolved = damage or orders
+    else:
+        pending["orders"].update(orders)
+        resolved = orders
+    if verb == "DELETE" or not resolved:
+        # видалений рядок уже не підкаже свій день - перерахувати останні дні
+        pending["recheck"] = True
+
+
+def flush_pending(db: Session, pending: dict) -> int:
+    """Перерахувати дні зачеплених замовлень / шкод (у поточній транзакції)"""
+    days = set()
+    if pending["orders"]:
+        days.update(r[0] for r in db.execute(text(
+            "SELECT DISTINCT DATE(created_at) FROM orders WHERE order_id IN :ids"
+        ), {"ids": tuple(pending["orders"])}).fetchall())
+    if pending["damage"]:
+        days.update(r[0] for r in db.execute(text(
+            "SELECT DISTINCT DATE(created_at) FROM product_damage_history WHERE id IN :ids"
+        ), {"ids": tuple(pending["damage"])}).fetchall())
+    if pending["damage_orders"]:
+        days.update(r[0] for r in db.execute(text(
+            "SELECT DISTINCT DATE(created_at) FROM product_damage_history WHERE order_id IN :ids"
+        ), {"ids": tuple(pending["damage_orders"])}).fetchall())
+    if pending["recheck"]:
+        today = date.today()
+        days.update(today - timedelta(days=n) for n in range(1, FACTS_RECHECK_DAYS + 1))
+    return refresh_days(db, days)
+
+
+def _merge_pending(target: dict, pending: dict):
+    for key in ("orders", "damage", "damage_orders"):
+        target[key].update(pending[key])
+    target["recheck"] = target["recheck"] or pending["recheck"]
+
+
+def queue_pending(pending: dict):
+    """Після commit автора: додати зміни до черги і перерахувати їх у фоні"""
+    global _queued, _refresh_thread
+    if not _tables_ready:
+        # таблиць фактів цей процес ще не торкався (скрипти) - дрейф виправить щоденний recheck
+        return
+    with _queued_lock:
+        if _queued is None:
+            _queued = _new_pending()
+        _merge_pending(_queued, pending)
+        if _refresh_thread is None:
+            _refresh_thread = _spawn(_refresh_queued, "analytics-facts-refresh")
+
+
+def _take_queued() -> Optional[dict]:
+    global _queued, _refresh_thread
+    with _queued_lock:
+        pending, _queued = _queued, None
+        if pending is None:
+            _refresh_thread = None
+        return pending
+
+
+def _refresh_queued():
+    """Фоновий потік: перераховує чергу, поки вона не порожня"""
+    from database_rentalhub import get_rh_db_sync
+
+    while True:
+        pending = _take_queued()
+        if pending is None:
+            return
+        db = get_rh_db_sync()
+        try:
+            with _lock:
+                flush_pending(db, pending)
+                db.commit()
+        except Exception as e:
+            # дрейф виправить щоденний recheck
+            db.rollback()
+            logger.warning(f"Analytics facts refresh failed: {e}")
+        finally:
+            db.close()
+
+
+_tracking_installed = False
+
+
+def install_change_tracking():
+    """Підключити відстеження записів rh_engine (один раз на процес)"""
+    global _tracking_installed
+    if _tracking_installed:
+        return
+    _tracking_installed = True
+    from database_rentalhub import rh_engine
+    track_writes(rh_engine, _PENDING_KEY, note_write)
+    on_commit(_PENDING_KEY, queue_pending)
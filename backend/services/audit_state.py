@@ -0,0 +1,195 @@
+"""
+Product audit state - останній стан переобліку по кожному товару.
+
+Кабінет переобліку шукав останній audit_records кожного товару подвійно корельованим
+підзапитом (WHERE ar1.id = (SELECT ... ORDER BY audit_date DESC LIMIT 1)), а фільтр / лічильник
+"critical" - ще одним MAX(audit_date) на кожен рядок. Тут це одна таблиця з PK по товару:
+
+    product_audit_state  product_id -> last_audit_id, last_audit_date, status, audited_by,
+                         quantity_expected, quantity_actual, delta
+
+Записується в тій самій транзакції, що й audit_records / products:
+- record_audit()          - mark-as-audited (новий audit_records)
+- record_quantity_change()- update_quantity та імпорт з Excel (дельта кількості, статус не змінюється)
+- record_bulk_audit()     - mark-category-audited (дата й аудитор для всієї категорії)
+- backfill()              - повна перебудова з audit_records (POST /api/audit/state/backfill,
+                            автоматично при першому читанні порожньої таблиці)
+
+Usage:
+    ensure_audit_state(db)
+    ... LEFT JOIN product_audit_state pas ON pas.product_id = p.product_id
+"""
+import logging
+import threading
+from datetime import date, datetime
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+_lock = threading.Lock()
+_table_ready = False
+_checked = False
+
+
+def ensure_audit_state_table(db: Session):
+    global _table_ready
+    if _table_ready:
+        return
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS product_audit_state (
+            product_id INT NOT NULL PRIMARY KEY,
+            last_audit_id VARCHAR(36) NULL,
+            last_audit_date DATETIME NULL,
+            status VARCHAR(20) NULL,
+            audited_by VARCHAR(100) NULL,
+            quantity_expected INT NULL,
+            quantity_actual INT NULL,
+            delta INT NULL,
+            updated_at DATETIME NULL,
+            INDEX idx_pas_status (status, product_id),
+            INDEX idx_pas_date (last_audit_date)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """))
+    _table_ready = True
+
+
+def _delta(expected, actual) -> Optional[int]:
+    if expected is None or actual is None:
+        return None
+    return int(actual) - int(expected)
+
+
+_UPSERT_SQL = """
+    INSERT INTO product_audit_state (
+        product_id, last_audit_id, last_audit_date, status, audited_by,
+        quantity_expected, quantity_actual, delta, updated_at
+    ) VALUES (
+        :product_id, :last_audit_id, :last_audit_date, :status, :audited_by,
+        :quantity_expected, :quantity_actual, :delta, NOW()
+    )
+    ON DUPLICATE KEY UPDATE
+        last_audit_id = VALUES(last_audit_id), last_audit_date = VALUES(last_audit_date),
+        status = VALUES(status), audited_by = VALUES(audited_by),
+        quantity_expected = VALUES(quantity_expected), quantity_actual = VALUES(quantity_actual),
+        delta = VALUES(delta), updated_at = NOW()
+"""
+
+
+def record_audit(db: Session, product_id: int, audit_id: str, audited_by: Optional[str],
+                 status: Optional[str], quantity_expected=None, quantity_actual=None,
+                 audit_date: Optional[datetime] = None):
+    """Новий audit_records стає останнім станом товару"""
+    ensure_audit_state_table(db)
+    db.execute(text(_UPSERT_SQL), {
+        "product_id": product_id,
+        "last_audit_id": audit_id,
+        "last_audit_date": audit_date or datetime.now(),
+        "status": status or "ok",
+        "audited_by": audited_by,
+        "quantity_expected": quantity_expected,
+        "quantity_actual": quantity_actual,
+        "delta": _delta(quantity_expected, quantity_actual),
+    })
+
+
+def record_quantity_change(db: Session, product_id: int, old_qty, new_qty, changed_by: Optional[str] = None):
+    """Корекція кількості поза фіксацією переобліку: оновити дельту, статус і дату не чіпати"""
+    ensure_audit_state_table(db)
+    db.execute(text("""
+        INSERT INTO product_audit_state (
+            product_id, audited_by, quantity_expected, quantity_actual, delta, updated_at
+        ) VALUES (:product_id, :audited_by, :old_qty, :new_qty, :delta, NOW())
+        ON DUPLICATE KEY UPDATE
+            audited_by = COALESCE(VALUES(audited_by), audited_by),
+            quantity_expected = VALUES(quantity_expected), quantity_actual = VALUES(quantity_actual),
+            delta = VALUES(delta), updated_at = NOW()
+    """), {
+        "product_id": product_id,
+        "audited_by": changed_by,
+        "old_qty": old_qty,
+        "new_qty": new_qty,
+        "delta": _delta(old_qty, new_qty),
+    })
+
+
+def record_bulk_audit(db: Session, where_clause: str, params: Dict, audited_by: Optional[str],
+                      audit_date: Optional[date] = None) -> int:
+    """
+    Переоблік цілої категорії (products WHERE <where_clause>): дата й аудитор,
+    статус останнього запису (напр. critical) лишається, audit_records не створюються
+    """
+    ensure_audit_state_table(db)
+    result = db.execute(text(f"""
+        INSERT INTO product_audit_state (product_id, last_audit_date, status, audited_by, updated_at)
+        SELECT product_id, :state_audit_date, NULL, :state_audited_by, NOW()
+        FROM products
+        WHERE {where_clause}
+        ON DUPLICATE KEY UPDATE
+            last_audit_date = VALUES(last_audit_date), audited_by = VALUES(audited_by), updated_at = NOW()
+    """), {**params, "state_audit_date": audit_date or date.today(), "state_audited_by": audited_by})
+    return result.rowcount
+
+
+def forget_product(db: Session, product_id: int):
+    ensure_audit_state_table(db)
+    db.execute(text("DELETE FROM product_audit_state WHERE product_id = :pid"), {"pid": product_id})
+
+
+def backfill(db: Session) -> int:
+    """
+    Перебудувати product_audit_state з audit_records одним проходом
+    (останній запис кожного товару за audit_date) і закомітити
+    """
+    ensure_audit_state_table(db)
+    started = datetime.now()
+    latest: Dict[int, tuple] = {}
+    rows = db.execute(text("""
+        SELECT product_id, id, audit_date, status, audited_by, quantity_expected, quantity_actual
+        FROM audit_records
+        ORDER BY product_id, audit_date, id
+    """))
+    for row in rows:
+        latest[row[0]] = row
+
+    db.execute(text("DELETE FROM product_audit_state"))
+    batch = []
+    for row in latest.values():
+        batch.append({
+            "product_id": row[0],
+            "last_audit_id": row[1],
+            "last_audit_date": row[2],
+            "status": row[3] or "ok",
+            "audited_by": row[4],
+            "quantity_expected": row[5],
+            "quantity_actual": row[6],
+            "delta": _delta(row[5], row[6]),
+        })
+        if len(batch) >= BATCH_SIZE:
+            db.execute(text(_UPSERT_SQL), batch)
+            batch = []
+    if batch:
+        db.execute(text(_UPSERT_SQL), batch)
+    db.commit()
+    logger.info("product_audit_state backfilled: %d products in %.0f ms",
+                len(latest), (datetime.now() - started).total_seconds() * 1000)
+    return len(latest)
+
+
+def ensure_audit_state(db: Session):
+    """Перед читанням: таблиця існує, порожня таблиця при наявній історії - backfill"""
+    global _checked
+    if _checked:
+        return
+    with _lock:
+        if _checked:
+            return
+        ensure_audit_state_table(db)
+        has_state = db.execute(text("SELECT 1 FROM product_audit_state LIMIT 1")).fetchone()
+        if not has_state and db.execute(text("SELECT 1 FROM audit_records LIMIT 1")).fetchone():
+            backfill(db)
+        _checked = True
@@ -0,0 +1,565 @@
+"""
+Availability Engine - єдине місце для розрахунку резервів товарів.
+
+Тримає в пам'яті процесу інтервали резервування по кожному товару з трьох джерел:
+- order_items + orders (активні статуси замовлень)
+- event_soft_reservations (тимчасові резерви мудбордів Event Tool)
+- partial_return_version_items (товари що ще у клієнта після часткового повернення)
+
+і відповідає на питання "максимальна одночасно зарезервована кількість у [start, end]"
+для тисяч SKU за один виклик без звернень до MySQL.
+
+Оновлення:
+- перше звернення - повне завантаження (3 запити)
+- запис у orders / order_items / partial_return_* / event_soft_reservations через rh_engine
+  позначає змінені замовлення "брудними" після COMMIT, і наступний запит перезавантажує лише їх
+- раз на AVAILABILITY_ENGINE_MAX_AGE секунд - повне перезавантаження
+  (підстраховка для записів з інших процесів, наприклад cron sync_all.py)
+
+Usage:
+    from services.availability_engine import get_availability_engine, STATUS_RESERVED
+    engine = get_availability_engine()
+    reserved = engine.max_reserved(db, product_ids, date_from, date_to, STATUS_RESERVED)
+"""
+import os
+import re
+import bisect
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event, text
+
+from utils.commit_tracking import discard_pending, on_commit
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# СТАТУСИ ЗАМОВЛЕНЬ
+# ============================================================
+
+# Очікують видачі (резерв)
+STATUS_RESERVED = ('processing', 'ready_for_issue', 'awaiting_customer', 'pending')
+# Видані клієнту (в оренді)
+STATUS_IN_RENT = ('issued', 'on_rent')
+# Заморожені - підтверджені менеджером (див. ORDER_STATUS_DIAGRAM.md)
+STATUS_FROZEN = ('processing', 'ready_for_issue', 'issued', 'on_rent')
+# Всі статуси, що блокують товар
+STATUS_ACTIVE = STATUS_RESERVED + STATUS_IN_RENT
+
+MAX_AGE_SECONDS = int(os.environ.get("AVAILABILITY_ENGINE_MAX_AGE", 120))
+
+_OPEN_START = date.min.toordinal()
+_OPEN_END = date.max.toordinal()
+
+_TRACKED_WRITE_RE = re.compile(
+    r"^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?"
+    r"(orders|order_items|partial_return_versions|partial_return_version_items|event_soft_reservations)`?\b",
+    re.IGNORECASE
+)
+
+
+def to_ordinal(value) -> Optional[int]:
+    """date / datetime / 'YYYY-MM-DD' -> ordinal (None якщо дати немає)"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return date.fromisoformat(str(value)[:10]).toordinal()
+
+
+# ============================================================
+# ЗАПИСИ ІНДЕКСУ
+# ============================================================
+
+@dataclass
+class OrderInterval:
+    """Рядок order_items в межах дат оренди замовлення"""
+    order_id: int
+    product_id: int
+    quantity: int
+    status: str
+    start: int
+    end: int
+    order_number: Optional[str] = None
+    customer_name: Optional[str] = None
+    customer_phone: Optional[str] = None
+    rental_start_date: Optional[date] = None
+    rental_end_date: Optional[date] = None
+
+
+@dataclass
+class SoftHold:
+    """Активний рядок event_soft_reservations"""
+    hold_id: str
+    board_id: str
+    product_id: int
+    quantity: int
+    start: int
+    end: int
+    expires_at: Optional[datetime] = None
+    customer_id: Optional[int] = None
+
+
+@dataclass
+class PartialReturnHold:
+    """Товар з активної версії часткового повернення (ще у клієнта, дата повернення невідома)"""
+    version_id: int
+    parent_order_id: int
+    product_id: int
+    qty: int
+    display_number: Optional[str] = None
+    customer_name: Optional[str] = None
+    customer_phone: Optional[str] = None
+    rental_end_date: Optional[date] = None
+    daily_rate: float = 0.0
+    created_at: Optional[datetime] = None
+
+
+class ProductIntervals:
+    """
+    Sweep-line індекс інтервалів одного товару.
+    Інтервали відсортовані за початком - bisect відсікає все що починається після кінця запиту.
+    """
+
+    __slots__ = ("starts", "items")
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.items: List = []
+
+    def add(self, item) -> None:
+        pos = bisect.bisect_right(self.starts, item.start)
+        self.starts.insert(pos, item.start)
+        self.items.insert(pos, item)
+
+    def remove_where(self, predicate) -> None:
+        keep = [(s, it) for s, it in zip(self.starts, self.items) if not predicate(it)]
+        self.starts = [s for s, _ in keep]
+        self.items = [it for _, it in keep]
+
+    def overlapping(self, start: int, end: int) -> List:
+        """Інтервали що перетинають [start, end] (межі включно)"""
+        hi = bisect.bisect_right(self.starts, end)
+        return [it for it in self.items[:hi] if it.end >= start]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+def max_concurrent(intervals: Iterable, start: int, end: int) -> int:
+    """
+    Максимальна одночасна сума quantity у [start, end].
+    Кожен інтервал обрізається по вікну запиту; в один день спочатку знімаємо ті, що завершились.
+    """
+    events = []
+    for it in intervals:
+        events.append((max(it.start, start), it.quantity))
+        events.append((min(it.end, end) + 1, -it.quantity))
+    if not events:
+        return 0
+    events.sort()
+    current = 0
+    peak = 0
+    for _, delta in events:
+        current += delta
+        if current > peak:
+            peak = current
+    return peak
+
+
+# ============================================================
+# ENGINE
+# ============================================================
+
+class AvailabilityEngine:
+    """In-memory індекс резервів з інкрементальним оновленням"""
+
+    def __init__(self, max_age: int = MAX_AGE_SECONDS):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loaded_at: float = 0.0
+        self._orders: Dict[int, List[OrderInterval]] = {}
+        self._order_index: Dict[int, ProductIntervals] = {}
+        self._soft_index: Dict[int, ProductIntervals] = {}
+        self._partial: Dict[int, List[PartialReturnHold]] = {}
+        self._dirty_orders: Set[int] = set()
+        self._dirty_all = True
+        self._dirty_soft = False
+        self._dirty_partial = False
+
+    # ---------------- invalidation ----------------
+
+    def invalidate(self) -> None:
+        """Повне перезавантаження при наступному запиті"""
+        with self._lock:
+            self._dirty_all = True
+
+    def invalidate_orders(self, order_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._dirty_orders.update(int(o) for o in order_ids if o is not None)
+
+    def invalidate_soft_reservations(self) -> None:
+        with self._lock:
+            self._dirty_soft = True
+
+    def invalidate_partial_returns(self) -> None:
+        with self._lock:
+            self._dirty_partial = True
+
+    # ---------------- loading ----------------
+
+    def ensure_fresh(self, db) -> None:
+        """Довантажити зміни (або все, якщо індекс застарів)"""
+        with self._lock:
+            if self._dirty_all or time.monotonic() - self._loaded_at > self.max_age:
+                self._load_all(db)
+                return
+            if self._dirty_orders:
+                order_ids = list(self._dirty_orders)
+                self._dirty_orders.clear()
+                self._reload_orders(db, order_ids)
+            if self._dirty_soft:
+                self._dirty_soft = False
+                self._load_soft(db)
+            if self._dirty_partial:
+                self._dirty_partial = False
+                self._load_partial(db)
+
+    def _load_all(self, db) -> None:
+        started = time.monotonic()
+        self._orders = {}
+        self._order_index = {}
+        self._dirty_orders.clear()
+        self._add_order_rows(self._fetch_order_rows(db))
+        self._load_soft(db)
+        self._load_partial(db)
+        self._dirty_all = False
+        self._dirty_soft = False
+        self._dirty_partial = False
+        self._loaded_at = time.monotonic()
+        logger.info(
+            f"Availability engine loaded: {sum(len(v) for v in self._orders.values())} order items, "
+            f"{sum(len(v) for v in self._soft_index.values())} soft holds, "
+            f"{sum(len(v) for v in self._partial.values())} partial returns "
+            f"in {(self._loaded_at - started) * 1000:.0f} ms"
+        )
+
+    def _fetch_order_rows(self, db, order_ids: Optional[List[int]] = None):
+        sql = """
+            SELECT o.order_id, oi.product_id, oi.quantity, o.status,
+                   o.rental_start_date, o.rental_end_date,
+                   o.order_number, o.customer_name, o.customer_phone
+            FROM order_items oi
+            JOIN orders o ON oi.order_id = o.order_id
+            WHERE o.status IN :statuses
+        """
+        params = {"statuses": STATUS_ACTIVE}
+        if order_ids:
+            sql += " AND o.order_id IN :order_ids"
+            params["order_ids"] = tuple(order_ids)
+        return db.execute(text(sql), params).fetchall()
+
+    def _add_order_rows(self, rows) -> None:
+        undated = sorted({row[0] for row in rows if not self._add_order_row(row)})
+        if undated:
+            sample = ", ".join(str(o) for o in undated[:20])
+            logger.warning(
+                f"Availability engine: {len(undated)} active orders without rental dates are not counted "
+                f"as reserved (order_id: {sample}{', ...' if len(undated) > 20 else ''})"
+            )
+
+    def _add_order_row(self, row) -> bool:
+        start = to_ordinal(row[4])
+        end = to_ordinal(row[5])
+        if start is None or end is None:
+            # Без дат оренди замовлення не перетинається з жодним періодом
+            return False
+        interval = OrderInterval(
+            order_id=row[0],
+            product_id=row[1],
+            quantity=int(row[2] or 0),
+            status=row[3],
+            start=start,
+            end=end,
+            order_number=row[6],
+            customer_name=row[7],
+            customer_phone=row[8],
+            rental_start_date=row[4],
+            rental_end_date=row[5],
+        )
+        self._orders.setdefault(interval.order_id, []).append(interval)
+        self._order_index.setdefault(interval.product_id, ProductIntervals()).add(interval)
+        return True
+
+    def _reload_orders(self, db, order_ids: List[int]) -> None:
+        """Інкрементально: прибрати старі інтервали замовлень і завантажити актуальні"""
+        ids = set(order_ids)
+        touched_products = set()
+        for order_id in ids:
+            for interval in self._orders.pop(order_id, []):
+                touched_products.add(interval.product_id)
+        for product_id in touched_products:
+            index = self._order_index.get(product_id)
+            if index is not None:
+                index.remove_where(lambda it: it.order_id in ids)
+        self._add_order_rows(self._fetch_order_rows(db, list(ids)))
+
+    def _load_soft(self, db) -> None:
+        index: Dict[int, ProductIntervals] = {}
+        try:
+            rows = db.execute(text("""
+                SELECT id, board_id, product_id, quantity, reserved_from, reserved_until,
+                       expires_at, customer_id
+                FROM event_soft_reservations
+                WHERE status = 'active' AND expires_at > NOW()
+            """)).fetchall()
+        except Exception:
+            # Таблиця створюється Event Tool при першому зверненні
+            rows = []
+        for row in rows:
+            start = to_ordinal(row[4])
+            end = to_ordinal(row[5])
+            if start is None or end is None:
+                continue
+            hold = SoftHold(
+                hold_id=row[0],
+                board_id=row[1],
+                product_id=row[2],
+                quantity=int(row[3] or 0),
+                start=start,
+                end=end,
+                expires_at=row[6],
+                customer_id=row[7],
+            )
+            index.setdefault(hold.product_id, ProductIntervals()).add(hold)
+        self._soft_index = index
+
+    def _load_partial(self, db) -> None:
+        partial: Dict[int, List[PartialReturnHold]] = {}
+        try:
+            rows = db.execute(text("""
+                SELECT prvi.product_id, prv.version_id, prv.parent_order_id, prv.display_number,
+                       prv.customer_name, prv.customer_phone, prv.rental_end_date,
+                       prvi.qty, prvi.daily_rate, prv.created_at
+                FROM partial_return_version_items prvi
+                JOIN partial_return_versions prv ON prvi.version_id = prv.version_id
+                WHERE prvi.status = 'pending'
+                AND prv.status = 'active'
+            """)).fetchall()
+        except Exception:
+            # Таблиці можуть не існувати
+            rows = []
+        for row in rows:
+            partial.setdefault(row[0], []).append(PartialReturnHold(
+                product_id=row[0],
+                version_id=row[1],
+                parent_order_id=row[2],
+                display_number=row[3],
+                customer_name=row[4],
+                customer_phone=row[5],
+                rental_end_date=row[6],
+                qty=int(row[7] or 0),
+                daily_rate=float(row[8]) if row[8] else 0.0,
+                created_at=row[9],
+            ))
+        for holds in partial.values():
+            holds.sort(key=lambda h: h.rental_end_date or date.min, reverse=True)
+        self._partial = partial
+
+    # ---------------- queries ----------------
+
+    def order_intervals(
+        self,
+        db,
+        product_ids: Iterable[int],
+        date_from=None,
+        date_to=None,
+        statuses: Iterable[str] = STATUS_ACTIVE,
+        exclude_order_id: Optional[int] = None
+    ) -> Dict[int, List[OrderInterval]]:
+        """
+        Рядки замовлень що перетинають [date_from, date_to] (None = відкрита межа),
+        відсортовані за rental_start_date.
+        """
+        self.ensure_fresh(db)
+        start = to_ordinal(date_from)
+        end = to_ordinal(date_to)
+        start = _OPEN_START if start is None else start
+        end = _OPEN_END if end is None else end
+        statuses = set(statuses)
+        result: Dict[int, List[OrderInterval]] = {}
+        with self._lock:
+            for product_id in product_ids:
+                index = self._order_index.get(product_id)
+                if index is None:
+                    continue
+                matched = [
+                    it for it in index.overlapping(start, end)
+                    if it.status in statuses and it.order_id != exclude_order_id
+                ]
+                if matched:
+                    result[product_id] = matched
+        return result
+
+    def max_reserved(
+        self,
+        db,
+        product_ids: Iterable[int],
+        date_from=None,
+        date_to=None,
+        statuses: Iterable[str] = STATUS_ACTIVE,
+        exclude_order_id: Optional[int] = None
+    ) -> Dict[int, int]:
+        """Максимальна одночасно зарезервована кількість замовленнями у [date_from, date_to]"""
+        start = to_ordinal(date_from)
+        end = to_ordinal(date_to)
+        start = _OPEN_START if start is None else start
+        end = _OPEN_END if end is None else end
+        intervals = self.order_intervals(db, product_ids, date_from, date_to, statuses, exclude_order_id)
+        return {pid: max_concurrent(items, start, end) for pid, items in intervals.items()}
+
+    def max_soft_reserved(
+        self,
+        db,
+        product_ids: Iterable[int],
+        date_from=None,
+        date_to=None,
+        exclude_board_id: Optional[str] = None
+    ) -> Dict[int, int]:
+        """Максимальна одночасна кількість у soft-резервах мудбордів (не прострочених)"""
+        self.ensure_fresh(db)
+        start = to_ordinal(date_from)
+        end = to_ordinal(date_to)
+        start = _OPEN_START if start is None else start
+        end = _OPEN_END if end is None else end
+        now = datetime.now()
+        result: Dict[int, int] = {}
+        with self._lock:
+            for product_id in product_ids:
+                index = self._soft_index.get(product_id)
+                if index is None:
+                    continue
+                holds = [
+                    h for h in index.overlapping(start, end)
+                    if h.board_id != exclude_board_id and (h.expires_at is None or h.expires_at > now)
+                ]
+                peak = max_concurrent(holds, start, end)
+                if peak:
+                    result[product_id] = peak
+        return result
+
+    def partial_returns(self, db, product_ids: Iterable[int]) -> Dict[int, List[PartialReturnHold]]:
+        """Товари з активних часткових повернень (відсортовані за rental_end_date DESC)"""
+        self.ensure_fresh(db)
+        with self._lock:
+            return {pid: list(self._partial[pid]) for pid in product_ids if pid in self._partial}
+
+    def product_ids_with_orders(
+        self,
+        db,
+        statuses: Iterable[str],
+        date_from=None,
+        date_to=None
+    ) -> Set[int]:
+        """Товари що мають хоча б одне замовлення з вказаними статусами у періоді"""
+        self.ensure_fresh(db)
+        with self._lock:
+            product_ids = list(self._order_index.keys())
+        return set(self.order_intervals(db, product_ids, date_from, date_to, statuses).keys())
+
+    def product_ids_with_partial_returns(self, db) -> Set[int]:
+        self.ensure_fresh(db)
+        with self._lock:
+            return set(self._partial.keys())
+
+
+# ============================================================
+# CHANGE TRACKING
+# ============================================================
+
+def _note_write(conn, statement, parameters) -> None:
+    match = _TRACKED_WRITE_RE.match(statement or "")
+    if not match:
+        return
+    table = match.group(1).lower()
+    pending = conn.info.setdefault("availability_pending", {"orders": set(), "all": False, "soft": False, "partial": False})
+    if table == "event_soft_reservations":
+        pending["soft"] = True
+        return
+    if table.startswith("partial_return"):
+        pending["partial"] = True
+    params_list = parameters if isinstance(parameters, (list, tuple)) else [parameters]
+    order_ids = [p.get("order_id") for p in params_list if isinstance(p, dict)]
+    if order_ids and all(o is not None for o in order_ids):
+        pending["orders"].update(order_ids)
+    elif table in ("orders", "order_items"):
+        # Не знаємо яке саме замовлення змінилось
+        pending["all"] = True
+
+
+def install_change_tracking(sa_engine) -> None:
+    """Слухати записи у відстежувані таблиці і інвалідувати індекс після COMMIT"""
+
+    @event.listens_for(sa_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        _note_write(conn, statement, parameters)
+
+    @event.listens_for(sa_engine, "rollback")
+    def _on_rollback(conn):
+        discard_pending(conn, "availability_pending")
+
+    # Інвалідація - після фактичного COMMIT (подія рушія "commit" - до нього)
+    on_commit("availability_pending", _apply_pending)
+
+
+def _apply_pending(pending) -> None:
+    engine = get_availability_engine()
+    if pending["all"]:
+        engine.invalidate()
+    if pending["orders"]:
+        engine.invalidate_orders(pending["orders"])
+    if pending["soft"]:
+        engine.invalidate_soft_reservations()
+    if pending["partial"]:
+        engine.invalidate_partial_returns()
+
+
+# ============================================================
+# SINGLETON
+# ============================================================
+
+_engine_instance: Optional[AvailabilityEngine] = None
+_tracking_installed = False
+_instance_lock = threading.Lock()
+
+
+def get_availability_engine() -> AvailabilityEngine:
+    """Singleton engine процесу (з підключеним відстеженням змін rh_engine)"""
+    global _engine_instance, _tracking_installed
+
+    if _engine_instance is not None and _tracking_installed:
+        return _engine_instance
+
+    with _instance_lock:
+        if _engine_instance is None:
+            _engine_instance = AvailabilityEngine()
+
+        if not _tracking_installed:
+            _tracking_installed = True
+            from database_rentalhub import rh_engine
+            install_change_tracking(rh_engine)
+
+        return _engine_instance
+
+
+def reset_availability_engine():
+    """Скинути індекс (корисно для тестів)"""
+    global _engine_instance
+    _engine_instance = None
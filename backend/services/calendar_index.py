@@ -0,0 +1,759 @@
+"""
+Calendar event index - матеріалізована стрічка подій для календарів.
+
+GET /api/calendar/events на кожен запит збирав події з orders (OR по чотирьох
+BETWEEN), product_damage_history, fin_payments, fin_deposit_holds і tasks, а
+GET /api/warehouse/calendar окремо парсив JSON issue_cards.items /
+return_cards.items_returned і класифікував категорії по підрядках назв. Тут
+події передраховані:
+
+    calendar_event_index        (event_date, event_type, entity_type, entity_id) ->
+                                feed ('calendar' | 'warehouse'), order_id, sort_priority,
+                                search_text, payload (готовий JSON події для фронту)
+    calendar_event_index_state  source -> built_at, stale
+
+Місяць у календарі - один range scan по (feed, event_date).
+
+Прострочення повернень залежить від "сьогодні", тож в індексі лежить return_issued,
+а return_overdue визначає resolve_event() при читанні.
+
+Оновлення:
+- записи в orders / issue_cards / return_cards / tasks / laundry_batches /
+  product_damage_history / fin_payments / fin_deposit_holds через rh_engine
+  запам'ятовуються (after_cursor_execute) і перераховуються для своїх замовлень /
+  сутностей у тій самій транзакції перед commit сесії
+- запис без ключів у параметрах позначає джерело stale - його перебудує фоновий потік;
+  до того читання віддають попередній стан індексу
+- записи поза сесією (sync_all) - етап calendar_index у sync_all і повна перебудова
+  у фоні раз на CALENDAR_INDEX_REBUILD_MINUTES
+
+Usage:
+    ensure_fresh(db)
+    events = [resolve_event(json.loads(row.payload)) for row in ...]
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services.order_hydrator import parse_card_items
+from utils.commit_tracking import (
+    before_commit, param_values, parse_write, run_in_savepoint, set_clause, track_writes, write_pattern,
+)
+from utils.named_lock import named_lock
+
+logger = logging.getLogger(__name__)
+
+REBUILD_MINUTES = int(os.environ.get("CALENDAR_INDEX_REBUILD_MINUTES", "30"))
+BATCH_SIZE = 500
+
+FEED_CALENDAR, FEED_WAREHOUSE = "calendar", "warehouse"
+
+NOT_ISSUED_STATUSES = ('awaiting_customer', 'awaiting', 'pending', 'processing', 'packing', 'ready_for_issue', 'ready')
+ISSUED_STATUSES = ('issued', 'on_rent', 'shipped', 'delivered', 'returning', 'partial_return')
+
+_PENDING_KEY = "calendar_index_pending"
+_REBUILD_LOCK = "calendar_event_index_rebuild"
+
+_lock = threading.Lock()
+_tables_ready = False
+_rebuild_thread: Optional[threading.Thread] = None
+_rebuild_thread_lock = threading.Lock()
+
+
+# ============================================================
+# ДОПОМІЖНІ
+# ============================================================
+
+def to_date(value) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def priority_value(priority) -> int:
+    """Пріоритет події для сортування (завдання мають 'high' / 'medium' / 'low')"""
+    if priority is None:
+        return 5
+    if isinstance(priority, int):
+        return priority
+    return {'high': 1, 'medium': 3, 'low': 5}.get(str(priority).lower(), 5)
+
+
+def items_summary(items: list) -> str:
+    """Категорії позицій картки по назвах ('Реквізит' якщо жодна не впізнана)"""
+    categories = []
+    for item in items:
+        name = (item.get('name') or '').lower() if isinstance(item, dict) else ''
+        if 'меблі' in name or 'стіл' in name or 'стілець' in name:
+            category = 'Меблі'
+        elif 'текстиль' in name or 'скатертина' in name or 'серветка' in name:
+            category = 'текстиль'
+        elif 'посуд' in name or 'тарілка' in name or 'келих' in name:
+            category = 'посуд'
+        elif 'ваза' in name or 'свічник' in name or 'декор' in name:
+            category = 'Вази + свічники'
+        else:
+            continue
+        if category not in categories:
+            categories.append(category)
+    return ', '.join(categories) if categories else 'Реквізит'
+
+
+def _search_text(*values) -> str:
+    return "\n".join(str(v).lower() for v in values if v)[:1000]
+
+
+def search_pattern(query: str) -> str:
+    """LIKE-шаблон для search_text (пошук підрядка без урахування регістру)"""
+    escaped = query.strip().lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def resolve_event(payload: dict, today: Optional[date] = None) -> dict:
+    """Подія з індексу -> подія для відповіді (повернення в оренді з минулою датою - прострочене)"""
+    if payload.get("type") == "return_issued":
+        today_str = (today or date.today()).isoformat()
+        if (payload.get("date") or "") < today_str:
+            payload["type"] = "return_overdue"
+            payload["priority"] = 1
+    return payload
+
+
+# ============================================================
+# ДЖЕРЕЛА ПОДІЙ
+# ============================================================
+
+@dataclass(frozen=True)
+class Source:
+    """
+    Джерело подій: SQL з {where}, колонки для фільтра по сутності / замовленню
+    і функція рядок -> список подій.
+    """
+    name: str
+    sql: str
+    entity_column: str
+    order_column: Optional[str]
+    build: Callable[[tuple], List[Dict]]
+
+
+def _event(source: str, entity_id, event_date: date, payload: dict, feed: str = FEED_CALENDAR,
+           order_id: Optional[int] = None, search: Iterable = ()) -> Dict:
+    return {
+        "event_date": event_date,
+        "event_type": payload["type"],
+        "entity_type": source,
+        "entity_id": str(entity_id),
+        "feed": feed,
+        "order_id": order_id,
+        "sort_priority": priority_value(payload.get("priority")),
+        "search_text": _search_text(*search),
+        "payload": payload,
+    }
+
+
+def _issue_type(status: str) -> str:
+    if status in ('awaiting_customer', 'awaiting', 'pending'):
+        return 'issue_awaiting'
+    if status in ('ready_for_issue', 'ready'):
+        return 'issue_ready'
+    return 'issue_processing'
+
+
+def _order_events(row) -> List[Dict]:
+    (order_id, order_number, customer_name, customer_phone, status, total_price, deposit,
+     start_date, end_date, rental_days, issue_date, return_date, delivery_type, city, order_event_type) = row
+    base = {
+        "order_id": order_id,
+        "order_number": order_number,
+        "customer_name": customer_name,
+        "customer_phone": customer_phone,
+        "total_price": float(total_price or 0),
+        "deposit": float(deposit or 0),
+        "delivery_type": delivery_type,
+        "city": city,
+        "rental_days": rental_days,
+        "order_status": status,
+        "order_event_type": order_event_type,
+        "title": f"#{order_number} {customer_name}",
+    }
+    search = (base["title"], order_number, customer_name)
+
+    # Видача - тільки поки замовлення НЕ видане, повернення - тільки після видачі
+    if status in NOT_ISSUED_STATUSES:
+        event_date = to_date(issue_date or start_date)
+        if event_date:
+            subtitle = f"Видача · {delivery_type or 'самовивіз'}"
+            return [_event("order", order_id, event_date, {
+                **base, "id": f"order-issue-{order_id}", "type": _issue_type(status),
+                "date": event_date.isoformat(), "subtitle": subtitle, "priority": 2,
+            }, order_id=order_id, search=search + (subtitle,))]
+    elif status in ISSUED_STATUSES:
+        event_date = to_date(return_date or end_date)
+        if event_date:
+            subtitle = f"Повернення · {rental_days or '?'} дн."
+            return_type = 'return_processing' if status in ('returning', 'partial_return') else 'return_issued'
+            return [_event("order", order_id, event_date, {
+                **base, "id": f"order-return-{order_id}", "type": return_type,
+                "date": event_date.isoformat(), "subtitle": subtitle, "priority": 2,
+            }, order_id=order_id, search=search + (subtitle,))]
+    return []
+
+
+def _card_events(kind: str) -> Callable[[tuple], List[Dict]]:
+    label, color, zone, default_time = {
+        "issue": ("Видача", "emerald", "Зона A · Стелаж 3", "10:00"),
+        "return": ("Повернення", "amber", "Зона B · Мийка", "15:00"),
+    }[kind]
+
+    def build(row) -> List[Dict]:
+        card_id, order_id, order_number, status, items_json, customer_name, event_dt = row
+        event_date = to_date(event_dt)
+        if not event_date:
+            return []
+        items = parse_card_items(items_json)
+        return [_event(f"{kind}_card", card_id, event_date, {
+            "id": card_id,
+            "order_id": order_number,
+            "type": kind,
+            "time": event_dt.strftime("%H:%M") if hasattr(event_dt, "strftime") else default_time,
+            "date": event_dt.isoformat() if hasattr(event_dt, "isoformat") else str(event_dt),
+            "client": customer_name or "Клієнт",
+            "label": label,
+            "color": color,
+            "status": status,
+            "itemsSummary": items_summary(items),
+            "itemsCount": len(items),
+            "warehouseZone": zone,  # TODO: брати з бази
+        }, feed=FEED_WAREHOUSE, order_id=order_id, search=(order_number, customer_name))]
+
+    return build
+
+
+def _cleaning_events(row) -> List[Dict]:
+    pdh_id, order_id, product_id, sku, processing_type, processing_status, created_at, note = row
+    event_date = to_date(created_at)
+    if not event_date:
+        return []
+    event_type = "repair" if processing_type == "restoration" else (
+        "laundry" if processing_type == "laundry" else "cleaning"
+    )
+    title = f"{sku or product_id} · {processing_type}"
+    subtitle = f"{processing_status} · {note or ''}"
+    return [_event("cleaning", pdh_id, event_date, {
+        "id": f"cleaning-{pdh_id}", "type": event_type, "date": event_date.isoformat(),
+        "title": title, "subtitle": subtitle, "cleaning_id": pdh_id, "product_id": product_id,
+        "sku": sku, "status": processing_status, "priority": 3,
+    }, order_id=order_id, search=(title, subtitle))]
+
+
+def _damage_events(row) -> List[Dict]:
+    pdh_id, order_id, damage_type, fee, created_at, order_number, customer_name = row
+    event_date = to_date(created_at)
+    if not event_date:
+        return []
+    amount = float(fee or 0)
+    title = f"Шкода #{order_number or order_id}"
+    subtitle = f"₴{amount:,.0f} · {damage_type}"
+    return [_event("damage", pdh_id, event_date, {
+        "id": f"damage-{pdh_id}", "type": "damage", "date": event_date.isoformat(),
+        "title": title, "subtitle": subtitle, "damage_id": pdh_id, "order_id": order_id,
+        "order_number": order_number, "customer_name": customer_name, "amount": amount,
+        "damage_type": damage_type, "priority": 1,
+    }, order_id=order_id, search=(title, subtitle, order_number, customer_name))]
+
+
+def _payment_events(row) -> List[Dict]:
+    payment_id, order_id, amount, payment_type, created_at, order_number, customer_name = row
+    event_date = to_date(created_at)
+    if not event_date:
+        return []
+    amount = float(amount or 0)
+    title = f"#{order_number} {customer_name or ''}"
+    subtitle = f"Очікується ₴{amount:,.0f} · {payment_type}"
+    return [_event("payment", payment_id, event_date, {
+        "id": f"payment-{payment_id}", "type": "payment_due", "date": event_date.isoformat(),
+        "title": title, "subtitle": subtitle, "payment_id": payment_id, "order_id": order_id,
+        "amount": amount, "payment_type": payment_type, "priority": 2,
+    }, order_id=order_id, search=(title, subtitle))]
+
+
+def _deposit_events(row) -> List[Dict]:
+    (deposit_id, order_id, held, opened_at, order_number, customer_name, return_date,
+     currency, used, refunded) = row
+    event_date = to_date(return_date or opened_at)
+    available = float(held or 0) - float(used or 0) - float(refunded or 0)
+    if not event_date or available <= 0:
+        return []
+    currency_symbol = "$" if currency == "USD" else ("€" if currency == "EUR" else "₴")
+    title = f"#{order_number} {customer_name or ''}"
+    subtitle = f"Повернути заставу {currency_symbol}{available:,.0f}"
+    return [_event("deposit", deposit_id, event_date, {
+        "id": f"deposit-{deposit_id}", "type": "deposit_return", "date": event_date.isoformat(),
+        "title": title, "subtitle": subtitle, "deposit_id": deposit_id, "order_id": order_id,
+        "amount": available, "currency": currency, "priority": 2,
+    }, order_id=order_id, search=(title, subtitle))]
+
+
+def _task_events(row) -> List[Dict]:
+    task_id, title, description, status, priority, due_date, created_at = row
+    event_date = to_date(due_date or created_at)
+    if not event_date:
+        return []
+    title = title or "Завдання"
+    subtitle = description[:50] if description else status
+    return [_event("task", task_id, event_date, {
+        "id": f"task-{task_id}", "type": "task", "date": event_date.isoformat(),
+        "title": title, "subtitle": subtitle, "task_id": task_id, "status": status,
+        "priority": priority or 3,
+    }, search=(title, subtitle))]
+
+
+def _laundry_batch_events(row) -> List[Dict]:
+    batch_id, batch_number, company, status, expected_return_date, total_items, returned_items = row
+    event_date = to_date(expected_return_date)
+    if not event_date:
+        return []
+    title = f"{batch_number or batch_id} · {company or 'пральня'}"
+    subtitle = f"{status} · {returned_items or 0}/{total_items or 0} од."
+    return [_event("laundry_batch", batch_id, event_date, {
+        "id": f"laundry-batch-{batch_id}", "type": "laundry", "date": event_date.isoformat(),
+        "title": title, "subtitle": subtitle, "batch_id": batch_id, "status": status,
+        "total_items": total_items, "returned_items": returned_items, "priority": 3,
+    }, search=(title, subtitle))]
+
+
+SOURCES: Dict[str, Source] = {source.name: source for source in (
+    Source("order", """
+        SELECT o.order_id, o.order_number, o.customer_name, o.customer_phone,
+               o.status, o.total_price, o.deposit_amount,
+               o.rental_start_date, o.rental_end_date, o.rental_days,
+               o.issue_date, o.return_date, o.delivery_type, o.city, o.event_type
+        FROM orders o
+        WHERE o.is_archived = 0 AND o.status NOT IN ('returned', 'completed', 'cancelled', 'rejected') AND {where}
+    """, "o.order_id", "o.order_id", _order_events),
+    Source("issue_card", """
+        SELECT ic.id, ic.order_id, ic.order_number, ic.status, ic.items,
+               o.customer_name, o.rental_start_date
+        FROM issue_cards ic
+        JOIN orders o ON ic.order_id = o.order_id
+        WHERE {where}
+    """, "ic.id", "ic.order_id", _card_events("issue")),
+    Source("return_card", """
+        SELECT rc.id, rc.order_id, rc.order_number, rc.status, rc.items_returned,
+               o.customer_name, o.rental_end_date
+        FROM return_cards rc
+        JOIN orders o ON rc.order_id = o.order_id
+        WHERE {where}
+    """, "rc.id", "rc.order_id", _card_events("return")),
+    Source("cleaning", """
+        SELECT pdh.id, pdh.order_id, pdh.product_id, pdh.sku, pdh.processing_type,
+               pdh.processing_status, pdh.created_at, pdh.note
+        FROM product_damage_history pdh
+        WHERE COALESCE(pdh.processing_status, '') NOT IN ('completed', 'returned_to_stock', 'hidden', 'deleted')
+          AND pdh.processing_type IN ('wash', 'restoration', 'laundry')
+          AND (COALESCE(pdh.qty, 1) - COALESCE(pdh.processed_qty, 0)) > 0
+          AND {where}
+    """, "pdh.id", "pdh.order_id", _cleaning_events),
+    Source("damage", """
+        SELECT pdh.id, pdh.order_id, pdh.damage_type, pdh.fee, pdh.created_at,
+               o.order_number, o.customer_name
+        FROM product_damage_history pdh
+        LEFT JOIN orders o ON pdh.order_id = o.order_id
+        WHERE pdh.fee > 0 AND {where}
+    """, "pdh.id", "pdh.order_id", _damage_events),
+    Source("payment", """
+        SELECT fp.id, fp.order_id, fp.amount, fp.payment_type, fp.created_at,
+               o.order_number, o.customer_name
+        FROM fin_payments fp
+        LEFT JOIN orders o ON fp.order_id = o.order_id
+        WHERE fp.status = 'pending' AND {where}
+    """, "fp.id", "fp.order_id", _payment_events),
+    Source("deposit", """
+        SELECT dh.id, dh.order_id, dh.held_amount, dh.opened_at, o.order_number,
+               o.customer_name, o.return_date, dh.currency, dh.used_amount, dh.refunded_amount
+        FROM fin_deposit_holds dh
+        LEFT JOIN orders o ON dh.order_id = o.order_id
+        WHERE dh.status = 'holding' AND o.status = 'returned' AND {where}
+    """, "dh.id", "dh.order_id", _deposit_events),
+    Source("task", """
+        SELECT t.id, t.title, t.description, t.status, t.priority, t.due_date, t.created_at
+        FROM tasks t
+        WHERE t.status NOT IN ('completed', 'cancelled') AND {where}
+    """, "t.id", None, _task_events),
+    Source("laundry_batch", """
+        SELECT lb.id, lb.batch_number, lb.laundry_company, lb.status, lb.expected_return_date,
+               lb.total_items, lb.returned_items
+        FROM laundry_batches lb
+        WHERE lb.status NOT IN ('returned', 'completed') AND {where}
+    """, "lb.id", None, _laundry_batch_events),
+)}
+
+ORDER_SOURCES = tuple(name for name, source in SOURCES.items() if source.order_column)
+
+
+# ============================================================
+# SCHEMA
+# ============================================================
+
+def ensure_index_tables(db: Session):
+    """Створити calendar_event_index / calendar_event_index_state якщо немає"""
+    global _tables_ready
+    if _tables_ready:
+        return
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS calendar_event_index (
+            event_date DATE NOT NULL,
+            event_type VARCHAR(30) NOT NULL,
+            entity_type VARCHAR(20) NOT NULL,
+            entity_id VARCHAR(64) NOT NULL,
+            feed VARCHAR(10) NOT NULL,
+            order_id INT NULL,
+            sort_priority INT NOT NULL DEFAULT 5,
+            search_text VARCHAR(1000) NULL,
+            payload TEXT NOT NULL,
+            updated_at DATETIME NULL,
+            PRIMARY KEY (event_date, event_type, entity_type, entity_id),
+            INDEX idx_cei_feed_date (feed, event_date, sort_priority),
+            INDEX idx_cei_entity (entity_type, entity_id),
+            INDEX idx_cei_order (order_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """))
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS calendar_event_index_state (
+            source VARCHAR(20) NOT NULL PRIMARY KEY,
+            built_at DATETIME NULL,
+            stale INT NOT NULL DEFAULT 0
+        )
+    """))
+    _tables_ready = True
+
+
+# ============================================================
+# BUILD
+# ============================================================
+
+def compute_events(db: Session, source: str, entity_ids: Optional[Iterable] = None,
+                   order_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+    """Події джерела (усі, для сутностей або для замовлень)"""
+    spec = SOURCES[source]
+    if entity_ids is not None:
+        where, params = f"{spec.entity_column} IN :ids", {"ids": tuple(entity_ids)}
+    elif order_ids is not None:
+        where, params = f"{spec.order_column} IN :ids", {"ids": tuple(order_ids)}
+    else:
+        where, params = "1=1", {}
+    events = []
+    for row in db.execute(text(spec.sql.format(where=where)), params).fetchall():
+        events.extend(spec.build(tuple(row)))
+    return events
+
+
+_UPSERT_SQL = """
+    INSERT INTO calendar_event_index (
+        event_date, event_type, entity_type, entity_id, feed, order_id,
+        sort_priority, search_text, payload, updated_at
+    ) VALUES (
+        :event_date, :event_type, :entity_type, :entity_id, :feed, :order_id,
+        :sort_priority, :search_text, :payload, :updated_at
+    )
+    ON DUPLICATE KEY UPDATE
+        feed = VALUES(feed), order_id = VALUES(order_id), sort_priority = VALUES(sort_priority),
+        search_text = VALUES(search_text), payload = VALUES(payload), updated_at = VALUES(updated_at)
+"""
+
+
+def _write(db: Session, events: List[Dict]):
+    now = datetime.now()
+    rows = [{**e, "payload": json.dumps(e["payload"], ensure_ascii=False, default=str), "updated_at": now}
+            for e in events]
+    for i in range(0, len(rows), BATCH_SIZE):
+        db.execute(text(_UPSERT_SQL), rows[i:i + BATCH_SIZE])
+
+
+def refresh_entities(db: Session, source: str, entity_ids: Iterable) -> int:
+    """Перерахувати події сутностей одного джерела (у поточній транзакції, без commit)"""
+    entity_ids = sorted({str(e) for e in entity_ids if e is not None and e != ""})
+    if not entity_ids:
+        return 0
+    ensure_index_tables(db)
+    written = 0
+    for i in range(0, len(entity_ids), BATCH_SIZE):
+        chunk = tuple(entity_ids[i:i + BATCH_SIZE])
+        db.execute(text("""
+            DELETE FROM calendar_event_index WHERE entity_type = :source AND entity_id IN :ids
+        """), {"source": source, "ids": chunk})
+        events = compute_events(db, source, entity_ids=chunk)
+        _write(db, events)
+        written += len(events)
+    return written
+
+
+def refresh_orders(db: Session, order_ids: Iterable[int]) -> int:
+    """Перерахувати всі події замовлень: саме замовлення, картки, шкода, платежі, застави"""
+    order_ids = sorted({int(o) for o in order_ids if o})
+    if not order_ids:
+        return 0
+    ensure_index_tables(db)
+    written = 0
+    for i in range(0, len(order_ids), BATCH_SIZE):
+        chunk = tuple(order_ids[i:i + BATCH_SIZE])
+        db.execute(text("""
+            DELETE FROM calendar_event_index WHERE entity_type IN :sources AND order_id IN :ids
+        """), {"sources": ORDER_SOURCES, "ids": chunk})
+        for source in ORDER_SOURCES:
+            events = compute_events(db, source, order_ids=chunk)
+            _write(db, events)
+            written += len(events)
+    return written
+
+
+def rebuild_sources(db: Session, sources: Iterable[str], seen: Optional[Dict[str, int]] = None) -> int:
+    """
+    Повна перебудова джерел (і commit). seen - значення stale на момент рішення:
+    позначка, поставлена під час перебудови, не скидається.
+    """
+    ensure_index_tables(db)
+    sources = [s for s in sources if s in SOURCES]
+    if not sources:
+        return 0
+    seen = seen or {}
+    started = time.monotonic()
+    written = 0
+    for source in sources:
+        events = compute_events(db, source)
+        db.execute(text("DELETE FROM calendar_event_index WHERE entity_type = :source"), {"source": source})
+        _write(db, events)
+        written += len(events)
+        params = {"source": source, "now": datetime.now(), "seen": seen.get(source, 0)}
+        result = db.execute(text("""
+            UPDATE calendar_event_index_state
+            SET built_at = :now, stale = GREATEST(stale - :seen, 0)
+            WHERE source = :source
+        """), params)
+        if not result.rowcount:
+            db.execute(text("""
+                INSERT INTO calendar_event_index_state (source, built_at, stale) VALUES (:source, :now, 0)
+            """), params)
+    db.commit()
+    logger.info("calendar_event_index rebuilt (%s): %d events in %.0f ms",
+                ", ".join(sources), written, (time.monotonic() - started) * 1000)
+    return written
+
+
+def rebuild_all(db: Session) -> int:
+    return rebuild_sources(db, SOURCES)
+
+
+def mark_stale(db: Session, sources: Iterable[str]):
+    """Позначити джерела для фонової перебудови при наступному читанні"""
+    sources = tuple(sorted(set(sources)))
+    if sources:
+        ensure_index_tables(db)
+        db.execute(text("UPDATE calendar_event_index_state SET stale = stale + 1 WHERE source IN :sources"),
+                   {"sources": sources})
+
+
+def _rebuild(sources: List[str], seen: Optional[Dict[str, int]]):
+    from database_rentalhub import get_rh_db_sync
+    db = get_rh_db_sync()
+    try:
+        # Інший воркер уже перебудовує - його результат побачить наступне читання
+        with named_lock(db, _REBUILD_LOCK) as acquired:
+            if acquired:
+                rebuild_sources(db, sources, seen=seen)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"calendar_event_index rebuild failed: {e}")
+    finally:
+        db.close()
+
+
+def _spawn(target, name: str) -> threading.Thread:
+    """Запуск фонового потоку (тести підміняють)"""
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def _rebuild_in_background(sources: Iterable[str] = SOURCES, seen: Optional[Dict[str, int]] = None):
+    """Перебудова джерел у фоні; поки попередня ще йде, нова не стартує"""
+    global _rebuild_thread
+    sources = list(sources)
+    with _rebuild_thread_lock:
+        if _rebuild_thread is not None and _rebuild_thread.is_alive():
+            return
+        _rebuild_thread = _spawn(lambda: _rebuild(sources, seen), "calendar-index-rebuild")
+
+
+def _read_state(db: Session):
+    """(state source -> (built_at, stale), ще не побудовані джерела, stale-джерела -> stale)"""
+    state = {row[0]: (row[1], row[2]) for row in db.execute(text(
+        "SELECT source, built_at, stale FROM calendar_event_index_state")).fetchall()}
+    missing = [s for s in SOURCES if state.get(s, (None, 0))[0] is None]
+    stale = {s: state[s][1] for s in SOURCES if s not in missing and state[s][1]}
+    return state, missing, stale
+
+
+def ensure_fresh(db: Session):
+    """
+    Викликати перед читанням індексу: перша побудова джерела - синхронно (віддати нічого),
+    stale-джерела - у фоні (до того читання бачать попередній стан), повна перебудова
+    у фоні раз на REBUILD_MINUTES.
+    """
+    _install_change_tracking()
+    ensure_index_tables(db)
+    state, missing, stale = _read_state(db)
+    if missing:
+        with _lock:
+            # Поки чекали на _lock, інший запит міг уже побудувати ці джерела:
+            # новий snapshot (commit) і повторна перевірка
+            db.commit()
+            state, missing, stale = _read_state(db)
+            if missing:
+                rebuild_sources(db, missing, seen={s: state.get(s, (None, 0))[1] for s in missing})
+                state, missing, stale = _read_state(db)
+    if stale:
+        _rebuild_in_background(stale, seen=stale)
+        return
+    oldest = min(built_at for built_at, _ in state.values() if built_at is not None)
+    if datetime.now() - oldest > timedelta(minutes=REBUILD_MINUTES):
+        # built_at зсуваємо одразу, щоб інші воркери не запускали ту саму перебудову
+        db.execute(text("UPDATE calendar_event_index_state SET built_at = :now"), {"now": datetime.now()})
+        db.commit()
+        _rebuild_in_background()
+
+
+# ============================================================
+# CHANGE TRACKING
+# ============================================================
+
+_WRITE_RE = write_pattern("orders", "issue_cards", "return_cards", "tasks", "laundry_batches",
+                          "product_damage_history", "fin_payments", "fin_deposit_holds")
+_ORDER_COLUMNS_RE = re.compile(
+    r"\b(status|order_number|customer_name|customer_phone|total_price|deposit_amount|rental_start_date|"
+    r"rental_end_date|rental_days|issue_date|return_date|delivery_type|city|event_type|is_archived)\s*=",
+    re.IGNORECASE
+)
+_ORDER_KEYS = ("order_id", "oid", "orders_order_id")
+
+# таблиця -> (джерела подій, ключі id сутності в параметрах)
+_ENTITY_TABLES = {
+    "tasks": (("task",), ("task_id", "id", "tasks_id")),
+    "laundry_batches": (("laundry_batch",), ("batch_id", "bid", "id", "laundry_batches_id")),
+    "product_damage_history": (("cleaning", "damage"), ("pdh_id", "damage_id", "id", "product_damage_history_id")),
+    "fin_payments": (("payment",), ("payment_id", "id", "fin_payments_id")),
+    "fin_deposit_holds": (("deposit",), ("deposit_id", "hold_id", "id", "fin_deposit_holds_id")),
+}
+_CARD_KEYS = ("card_id", "issue_card_id", "return_card_id", "id", "issue_cards_id", "return_cards_id")
+
+
+def _new_pending() -> dict:
+    return {"orders": set(), "cards": {"issue_cards": set(), "return_cards": set()},
+            "entities": {}, "stale": set()}
+
+
+def note_write(info: dict, statement: str, parameters, lastrowid: Optional[int] = None) -> None:
+    """Розібрати запис у відстежувані таблиці -> info[_PENDING_KEY]"""
+    parsed = parse_write(_WRITE_RE, statement, parameters)
+    if not parsed:
+        return
+    verb, table, params_list = parsed
+    if table == "orders" and verb == "UPDATE":
+        if not _ORDER_COLUMNS_RE.search(set_clause(statement)):
+            # нотатки / реквізити / суми позицій - на календар не впливають
+            return
+    pending = info.setdefault(_PENDING_KEY, _new_pending())
+
+    if table == "orders":
+        orders = param_values(params_list, _ORDER_KEYS + ("id",), cast=None)
+        if verb == "INSERT" and lastrowid:
+            orders.add(lastrowid)
+        if orders:
+            pending["orders"].update(orders)
+        else:
+            pending["stale"].update(ORDER_SOURCES)
+        return
+
+    orders = param_values(params_list, _ORDER_KEYS, cast=None)
+    if table in ("issue_cards", "return_cards"):
+        if orders:
+            pending["orders"].update(orders)
+            return
+        cards = param_values(params_list, _CARD_KEYS, cast=None)
+        if cards:
+            pending["cards"][table].update(cards)
+        else:
+            pending["stale"].add("issue_card" if table == "issue_cards" else "return_card")
+        return
+
+    sources, keys = _ENTITY_TABLES[table]
+    ids = param_values(params_list, keys, cast=None)
+    if verb == "INSERT" and lastrowid:
+        ids.add(lastrowid)
+    if ids:
+        for source in sources:
+            pending["entities"].setdefault(source, set()).update(ids)
+    if orders and SOURCES[sources[0]].order_column:
+        pending["orders"].update(orders)
+    elif not ids:
+        pending["stale"].update(sources)
+
+
+def flush_pending(db: Session, pending: dict) -> int:
+    """Застосувати зібрані зміни (у поточній транзакції)"""
+    orders = {int(o) for o in pending["orders"] if str(o).isdigit()}
+    for table, cards in pending["cards"].items():
+        if cards:
+            orders.update(r[0] for r in db.execute(
+                text(f"SELECT order_id FROM {table} WHERE id IN :ids"), {"ids": tuple(cards)}
+            ).fetchall() if r[0])
+    written = refresh_orders(db, orders)
+    for source, ids in pending["entities"].items():
+        if source not in pending["stale"]:
+            written += refresh_entities(db, source, ids)
+    mark_stale(db, pending["stale"])
+    return written
+
+
+def _affected_sources(pending: dict) -> Set[str]:
+    sources = set(pending["stale"]) | {source for source, ids in pending["entities"].items() if ids}
+    if pending["orders"] or any(pending["cards"].values()):
+        sources.update(ORDER_SOURCES)
+    return sources
+
+
+def _refresh_pending_events(session: Session, pending: dict):
+    # SAVEPOINT: збій після DELETE не лишає подій видаленими, запис автора зберігається;
+    # зачеплені джерела перебудує наступне читання
+    if not run_in_savepoint(session, "calendar_event_index refresh", lambda: flush_pending(session, pending)):
+        run_in_savepoint(session, "calendar_event_index mark stale",
+                         lambda: mark_stale(session, _affected_sources(pending)))
+
+
+_tracking_installed = False
+
+
+def _install_change_tracking():
+    global _tracking_installed
+    if _tracking_installed:
+        return
+    _tracking_installed = True
+    from database_rentalhub import rh_engine
+    track_writes(rh_engine, _PENDING_KEY, note_write)
+    before_commit(_PENDING_KEY, _refresh_pending_events)
@@ -0,0 +1,289 @@
+"""
+Chat state - підтримуваний стан каналів командного чату.
+
+GET /api/chat/channels на кожен канал робив 3-4 запити (read status, COUNT(*) непрочитаних,
+останнє повідомлення, учасники DM), а /api/chat/unread - COUNT(*) з кількома JOIN по всій
+історії повідомлень; фронт опитував обидва. Тут стан ведеться при записі:
+
+    chat_channel_state    channel_id -> знімок останнього повідомлення (id, автор, текст, час)
+                          і учасники DM (JSON) для назви в списку
+    chat_channel_unread   (user_id, channel_id) -> unread
+
+Оновлення:
+- record_message() у транзакції нового повідомлення: знімок каналу + unread + 1 для всіх,
+  хто бачить канал (активні користувачі для general/topic, учасники для DM), крім автора
+- mark_read() - chat_read_status.last_read_at і unread = 0
+- повна перебудова з chat_messages / chat_read_status - якщо стан порожній (перший запуск)
+
+Список каналів - один запит (list_channels), загальна кількість - SUM по рядках користувача.
+"""
+import json
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_TYPES = ("general", "topic")
+SNAPSHOT_TEXT_LENGTH = 255
+PREVIEW_LENGTH = 60
+
+_lock = threading.Lock()
+_tables_ready = False
+_built = False
+
+
+def _full_name(firstname, lastname) -> str:
+    return f"{firstname or ''} {lastname or ''}".strip()
+
+
+def _iso(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+# ============================================================
+# SCHEMA
+# ============================================================
+
+def ensure_state_tables(db: Session):
+    """Створити chat_channel_state / chat_channel_unread якщо немає"""
+    global _tables_ready
+    if _tables_ready:
+        return
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS chat_channel_state (
+            channel_id INT NOT NULL PRIMARY KEY,
+            last_message_id INT NULL,
+            last_user_id INT NULL,
+            last_user_name VARCHAR(200) NULL,
+            last_text VARCHAR(255) NULL,
+            last_at DATETIME NULL,
+            dm_members TEXT NULL,
+            updated_at DATETIME NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """))
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS chat_channel_unread (
+            user_id INT NOT NULL,
+            channel_id INT NOT NULL,
+            unread INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, channel_id),
+            INDEX idx_ccu_channel (channel_id)
+        ) ENGINE=InnoDB
+    """))
+    _tables_ready = True
+
+
+# ============================================================
+# WRITE PATH
+# ============================================================
+
+def _dm_member_ids(db: Session, channel_id: int) -> List[int]:
+    return [r[0] for r in db.execute(text(
+        "SELECT user_id FROM chat_channel_members WHERE channel_id = :ch_id"), {"ch_id": channel_id}).fetchall()]
+
+
+def record_message(db: Session, message_id: int) -> Tuple[Optional[Dict], Optional[List[int]]]:
+    """
+    Оновити стан каналу після INSERT повідомлення (до commit).
+    Повертає (повідомлення у форматі API, отримувачі): отримувачі None - усі (general/topic),
+    для DM - id учасників.
+    """
+    ensure_state_tables(db)
+    row = db.execute(text("""
+        SELECT cm.id, cm.channel_id, cm.user_id, u.firstname, u.lastname, u.role,
+               cm.message, cm.reply_to, cm.created_at,
+               cm.attachment_url, cm.attachment_type, cm.task_id, c.type
+        FROM chat_messages cm
+        JOIN chat_channels c ON c.id = cm.channel_id
+        LEFT JOIN users u ON u.user_id = cm.user_id
+        WHERE cm.id = :mid
+    """), {"mid": message_id}).fetchone()
+    if not row:
+        return None, None
+
+    channel_id, author_id, user_name = row[1], row[2], _full_name(row[3], row[4])
+    public = row[12] in PUBLIC_TYPES
+    members_only = "" if public else \
+        "AND u.user_id IN (SELECT m.user_id FROM chat_channel_members m WHERE m.channel_id = :ch_id)"
+    db.execute(text("""
+        INSERT INTO chat_channel_state
+            (channel_id, last_message_id, last_user_id, last_user_name, last_text, last_at, updated_at)
+        VALUES (:ch_id, :mid, :uid, :name, :text, :at, NOW())
+        ON DUPLICATE KEY UPDATE
+            last_message_id = VALUES(last_message_id), last_user_id = VALUES(last_user_id),
+            last_user_name = VALUES(last_user_name), last_text = VALUES(last_text),
+            last_at = VALUES(last_at), updated_at = NOW()
+    """), {"ch_id": channel_id, "mid": row[0], "uid": author_id, "name": user_name,
+           "text": (row[6] or "")[:SNAPSHOT_TEXT_LENGTH], "at": row[8]})
+    db.execute(text(f"""
+        INSERT INTO chat_channel_unread (user_id, channel_id, unread)
+        SELECT u.user_id, :ch_id, 1 FROM users u
+        WHERE u.is_active = 1 AND u.user_id != :uid
+          {members_only}
+        ON DUPLICATE KEY UPDATE unread = unread + 1
+    """), {"ch_id": channel_id, "uid": author_id})
+
+    message = {
+        "id": row[0], "channel_id": channel_id, "user_id": author_id,
+        "user_name": user_name, "user_role": row[5] or "",
+        "message": row[6], "reply_to": row[7],
+        "attachment_url": row[9], "attachment_type": row[10], "task_id": row[11],
+        "created_at": _iso(row[8]),
+    }
+    return message, (None if public else _dm_member_ids(db, channel_id))
+
+
+def mark_read(db: Session, user_id: int, channel_id: int):
+    """Канал прочитано користувачем (до commit)"""
+    ensure_state_tables(db)
+    db.execute(text("""
+        INSERT INTO chat_read_status (user_id, channel_id, last_read_at)
+        VALUES (:uid, :ch_id, NOW())
+        ON DUPLICATE KEY UPDATE last_read_at = NOW()
+    """), {"uid": user_id, "ch_id": channel_id})
+    db.execute(text("""
+        INSERT INTO chat_channel_unread (user_id, channel_id, unread) VALUES (:uid, :ch_id, 0)
+        ON DUPLICATE KEY UPDATE unread = 0
+    """), {"uid": user_id, "ch_id": channel_id})
+
+
+def set_dm_members(db: Session, channel_id: int, members: List[Dict]):
+    """Учасники DM для назви каналу в списку ([{id, name}])"""
+    ensure_state_tables(db)
+    db.execute(text("""
+        INSERT INTO chat_channel_state (channel_id, dm_members, updated_at) VALUES (:ch_id, :members, NOW())
+        ON DUPLICATE KEY UPDATE dm_members = VALUES(dm_members), updated_at = NOW()
+    """), {"ch_id": channel_id, "members": json.dumps(members, ensure_ascii=False)})
+
+
+def forget_channel(db: Session, channel_id: int):
+    """Прибрати стан видаленого каналу (до commit)"""
+    ensure_state_tables(db)
+    db.execute(text("DELETE FROM chat_channel_state WHERE channel_id = :ch_id"), {"ch_id": channel_id})
+    db.execute(text("DELETE FROM chat_channel_unread WHERE channel_id = :ch_id"), {"ch_id": channel_id})
+
+
+def total_unread(db: Session, user_id: int) -> int:
+    ensure_built(db)
+    return int(db.execute(text(
+        "SELECT COALESCE(SUM(unread), 0) FROM chat_channel_unread WHERE user_id = :uid"
+    ), {"uid": user_id}).scalar() or 0)
+
+
+# ============================================================
+# READ PATH
+# ============================================================
+
+def channel_payload(row) -> Dict:
+    """Рядок list_channels -> формат GET /api/chat/channels"""
+    (ch_id, name, ch_type, description, pinned, created_at, updated_at,
+     last_text, last_user_name, last_at, dm_members, unread) = row
+    members = []
+    if ch_type == "dm" and dm_members:
+        try:
+            members = json.loads(dm_members)
+        except (TypeError, ValueError):
+            members = []
+    return {
+        "id": ch_id,
+        "name": name,
+        "type": ch_type,
+        "description": description or "",
+        "pinned": bool(pinned),
+        "members": members,
+        "unread": int(unread or 0),
+        "last_message": {
+            "text": (last_text or "")[:PREVIEW_LENGTH],
+            "user_name": last_user_name or "",
+            "created_at": _iso(last_at),
+        } if last_at is not None else None,
+        "updated_at": _iso(updated_at) or _iso(created_at),
+    }
+
+
+def list_channels(db: Session, user_id: int) -> List[Dict]:
+    """Канали користувача зі знімком останнього повідомлення і unread - одним запитом"""
+    ensure_built(db)
+    rows = db.execute(text("""
+        SELECT c.id, c.name, c.type, c.description, c.pinned, c.created_at, c.updated_at,
+               s.last_text, s.last_user_name, s.last_at, s.dm_members, COALESCE(cu.unread, 0)
+        FROM chat_channels c
+        LEFT JOIN chat_channel_state s ON s.channel_id = c.id
+        LEFT JOIN chat_channel_unread cu ON cu.channel_id = c.id AND cu.user_id = :uid
+        WHERE c.type IN ('general', 'topic')
+           OR (c.type = 'dm' AND EXISTS (
+                SELECT 1 FROM chat_channel_members m WHERE m.channel_id = c.id AND m.user_id = :uid))
+        ORDER BY c.pinned DESC, c.updated_at DESC
+    """), {"uid": user_id}).fetchall()
+    return [channel_payload(r) for r in rows]
+
+
+# ============================================================
+# REBUILD
+# ============================================================
+
+def rebuild(db: Session) -> int:
+    """Перерахувати знімки і лічильники з chat_messages / chat_read_status; повертає кількість каналів"""
+    ensure_state_tables(db)
+    db.execute(text("DELETE FROM chat_channel_state"))
+    db.execute(text("DELETE FROM chat_channel_unread"))
+    db.execute(text("""
+        INSERT INTO chat_channel_state
+            (channel_id, last_message_id, last_user_id, last_user_name, last_text, last_at, updated_at)
+        SELECT cm.channel_id, cm.id, cm.user_id,
+               TRIM(CONCAT(COALESCE(u.firstname, ''), ' ', COALESCE(u.lastname, ''))),
+               LEFT(cm.message, 255), cm.created_at, NOW()
+        FROM chat_messages cm
+        JOIN (SELECT channel_id, MAX(id) AS id FROM chat_messages GROUP BY channel_id) lm ON lm.id = cm.id
+        LEFT JOIN users u ON u.user_id = cm.user_id
+    """))
+
+    members: Dict[int, List[Dict]] = {}
+    for ch_id, uid, firstname, lastname in db.execute(text("""
+        SELECT m.channel_id, m.user_id, u.firstname, u.lastname
+        FROM chat_channel_members m
+        JOIN chat_channels c ON c.id = m.channel_id AND c.type = 'dm'
+        JOIN users u ON u.user_id = m.user_id
+        ORDER BY m.channel_id
+    """)).fetchall():
+        members.setdefault(ch_id, []).append({"id": uid, "name": _full_name(firstname, lastname)})
+    for ch_id, channel_members in members.items():
+        set_dm_members(db, ch_id, channel_members)
+
+    db.execute(text("""
+        INSERT INTO chat_channel_unread (user_id, channel_id, unread)
+        SELECT u.user_id, c.id, COUNT(cm.id)
+        FROM chat_channels c
+        JOIN users u ON u.is_active = 1 AND (
+            c.type IN ('general', 'topic')
+            OR EXISTS (SELECT 1 FROM chat_channel_members m WHERE m.channel_id = c.id AND m.user_id = u.user_id))
+        LEFT JOIN chat_read_status rs ON rs.user_id = u.user_id AND rs.channel_id = c.id
+        JOIN chat_messages cm ON cm.channel_id = c.id AND cm.user_id != u.user_id
+             AND cm.created_at > COALESCE(rs.last_read_at, '2000-01-01')
+        GROUP BY u.user_id, c.id
+    """))
+    channels = db.execute(text("SELECT COUNT(*) FROM chat_channel_state")).scalar() or 0
+    db.commit()
+    return int(channels)
+
+
+def ensure_built(db: Session):
+    """Перебудувати стан, якщо він порожній, а повідомлення вже є (перший запуск)"""
+    global _built
+    if _built:
+        return
+    ensure_state_tables(db)
+    with _lock:
+        if _built:
+            return
+        has_state = db.execute(text("SELECT 1 FROM chat_channel_state LIMIT 1")).fetchone()
+        has_messages = db.execute(text("SELECT 1 FROM chat_messages LIMIT 1")).fetchone()
+        if has_messages and not has_state:
+            logger.info(f"Chat state rebuilt for {rebuild(db)} channels")
+        _built = True
@@ -0,0 +1,614 @@
+"""
+Client summary - проєкція клієнтів для CRM-списку та пошуку/матчингу.
+
+GET /api/clients на кожне відкриття CRM робив GROUP BY c.id з LEFT JOIN orders /
+client_payer_links / master_agreements, корельованим підзапитом платника за замовчуванням і
+шістьма LIKE '%...%'; find-match повторював схожий скан. Тут усе передраховано:
+
+    client_summary         client_user_id -> orders_count, payers_count, default payer,
+                           активний договір (MA), total_revenue, last_order_date,
+                           sort_at (= COALESCE(updated_at, created_at, SORT_AT_FLOOR) -
+                           ніколи не NULL, інакше keyset-курсор їх пропускає), email_key, phone_key
+    client_search_terms    (term, kind, client_user_id) - нормалізовані токени для пошуку
+                           за префіксом по індексу: ім'я/компанія в транслітерації,
+                           email (повністю, локальна частина, домен), телефон (цифри),
+                           instagram
+    client_summary_state   built_at / client_hwm / order_hwm
+
+Нормалізація: телефон - лише цифри (останні 9 + варіанти 0XXXXXXXXX / 380XXXXXXXXX),
+email - lower/trim, ім'я - транслітерація (КМУ 2010), тож "Іван", "ivan" і "Ivan"
+знаходять одне й те саме. Запит з самих цифр телефону шукається і як підрядок
+client_summary.phone_key ("4567" знаходить 067-123-45-67), як колись LIKE '%...%'.
+
+Оновлення:
+- записи в client_users / orders / client_payer_links / master_agreements / payer_profiles
+  через rh_engine запам'ятовуються (after_cursor_execute) і перераховуються для своїх
+  клієнтів у тій самій транзакції перед commit сесії
+- записи поза сесією (sync_all, прямий pymysql) ловить reconcile(): client_users.updated_at
+  та нові order_id після high-water marks, раз на CLIENT_SUMMARY_RECONCILE_SECONDS
+- повна перебудова - при першому читанні і раз на CLIENT_SUMMARY_REBUILD_HOURS (у фоні)
+
+Usage:
+    ensure_fresh(db)
+    where, params = search_condition("петренко 067")
+"""
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from utils.commit_tracking import (
+    before_commit, param_values, parse_write, run_in_savepoint, set_clause, track_writes, write_pattern,
+)
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_SECONDS = int(os.environ.get("CLIENT_SUMMARY_RECONCILE_SECONDS", "60"))
+REBUILD_HOURS = int(os.environ.get("CLIENT_SUMMARY_REBUILD_HOURS", "24"))
+BATCH_SIZE = 500
+
+ACTIVE_MA_STATUSES = ("draft", "sent", "signed")
+NON_REVENUE_STATUSES = ("cancelled",)
+
+TERM_NAME, TERM_COMPANY, TERM_EMAIL, TERM_PHONE, TERM_INSTAGRAM = "name", "company", "email", "phone", "instagram"
+
+_PENDING_KEY = "client_summary_pending"
+
+# Ключ сортування клієнтів без дат: в кінці списку, за client_user_id
+SORT_AT_FLOOR = datetime(1970, 1, 1)
+
+_lock = threading.Lock()
+_tables_ready = False
+_built = False
+_reconciled_at = 0.0
+
+
+# ============================================================
+# НОРМАЛІЗАЦІЯ
+# ============================================================
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "g", "д": "d", "е": "e", "є": "ie", "ж": "zh",
+    "з": "z", "и": "y", "і": "i", "ї": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n",
+    "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ь": "", "ю": "iu", "я": "ia",
+    "ы": "y", "э": "e", "ё": "e", "ъ": "",
+    "'": "", "’": "", "ʼ": "", "`": "",
+}
+_WORD_RE = re.compile(r"[0-9a-z]+")
+_PHONE_QUERY_RE = re.compile(r"^[\d\s()+\-]+$")
+MAX_TERM_LENGTH = 64
+
+
+def transliterate(value: Optional[str]) -> str:
+    return "".join(_TRANSLIT.get(ch, ch) for ch in (value or "").lower())
+
+
+def name_tokens(value: Optional[str]) -> List[str]:
+    return _WORD_RE.findall(transliterate(value))
+
+
+def phone_digits(value: Optional[str]) -> str:
+    return "".join(ch for ch in (value or "") if ch.isdigit())
+
+
+def phone_key(value: Optional[str]) -> Optional[str]:
+    """Останні 9 цифр - номер без коду країни/нуля"""
+    digits = phone_digits(value)
+    return digits[-9:] if len(digits) >= 9 else None
+
+
+def email_key(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip().lower()
+    return value or None
+
+
+def search_terms(full_name=None, email=None, phone=None, company=None,
+                 company_hint=None, instagram=None) -> Set[Tuple[str, str]]:
+    """(term, kind) для client_search_terms"""
+    terms: Set[Tuple[str, str]] = set()
+    for token in name_tokens(full_name):
+        terms.add((token, TERM_NAME))
+    for value in (company, company_hint):
+        for token in name_tokens(value):
+            terms.add((token, TERM_COMPANY))
+    email_value = email_key(email)
+    if email_value:
+        terms.add((email_value, TERM_EMAIL))
+        local, _, domain = email_value.partition("@")
+        for part in (local, domain):
+            if part:
+                terms.add((part, TERM_EMAIL))
+    key = phone_key(phone)
+    if key:
+        for variant in (key, "0" + key, "380" + key):
+            terms.add((variant, TERM_PHONE))
+    handle = (instagram or "").strip().lower().lstrip("@")
+    if handle:
+        handle = handle.rstrip("/").rsplit("/", 1)[-1]
+        terms.add((handle, TERM_INSTAGRAM))
+        for token in _WORD_RE.findall(handle):
+            terms.add((token, TERM_INSTAGRAM))
+    return {(term[:MAX_TERM_LENGTH], kind) for term, kind in terms if term}
+
+
+def query_tokens(query: Optional[str]) -> List[str]:
+    """Токени пошукового запиту (кожен - префікс терму)"""
+    query = (query or "").strip()
+    if not query:
+        return []
+    if _PHONE_QUERY_RE.match(query) and len(phone_digits(query)) >= 3:
+        # "+38 (067) 123-45" - один цифровий токен
+        return [phone_digits(query)[:MAX_TERM_LENGTH]]
+    tokens = []
+    for part in query.lower().split():
+        if "@" in part:
+            tokens.append(part.strip()[:MAX_TERM_LENGTH])
+        else:
+            tokens.extend(t[:MAX_TERM_LENGTH] for t in name_tokens(part))
+    return list(dict.fromkeys(tokens))
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_condition(query: Optional[str], kinds: Iterable[str] = (), alias: str = "cs") -> Tuple[str, Dict]:
+    """
+    SQL-умова "клієнт має терм з префіксом для кожного токена" (range по PK client_search_terms).
+    Телефонний запит - ще й підрядок {alias}.phone_key. Порожній запит -> ("", {}).
+    """
+    tokens = query_tokens(query)
+    if not tokens:
+        return "", {}
+    kinds = tuple(kinds)
+    parts, params = [], {}
+    phone_query = _PHONE_QUERY_RE.match(query.strip()) is not None
+    for i, token in enumerate(tokens):
+        kind_sql = f" AND kind IN :term_kinds" if kinds else ""
+        condition = (
+            f"{alias}.client_user_id IN (SELECT client_user_id FROM client_search_terms "
+            f"WHERE term LIKE :term_{i}{kind_sql})"
+        )
+        if phone_query and token.isdigit() and len(token) <= 9 and (not kinds or TERM_PHONE in kinds):
+            # середина номера: скан вузької client_summary, префікси - як і раніше, по індексу
+            condition = f"({condition} OR {alias}.phone_key LIKE :phone_{i})"
+            params[f"phone_{i}"] = f"%{token}%"
+        parts.append(condition)
+        params[f"term_{i}"] = _escape_like(token) + "%"
+    if kinds:
+        params["term_kinds"] = kinds
+    return " AND ".join(parts), params
+
+
+# ============================================================
+# SCHEMA
+# ============================================================
+
+def ensure_summary_tables(db: Session):
+    """Створити client_summary / client_search_terms / client_summary_state якщо немає"""
+    global _tables_ready
+    if _tables_ready:
+        return
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS client_summary (
+            client_user_id INT NOT NULL PRIMARY KEY,
+            orders_count INT NOT NULL DEFAULT 0,
+            payers_count INT NOT NULL DEFAULT 0,
+            default_payer_id INT NULL,
+            default_payer_name VARCHAR(255) NULL,
+            ma_id INT NULL,
+            ma_number VARCHAR(100) NULL,
+            ma_status VARCHAR(20) NULL,
+            ma_valid_until DATE NULL,
+            total_revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+            last_order_date DATE NULL,
+            is_active TINYINT(1) NOT NULL DEFAULT 1,
+            source VARCHAR(50) NULL,
+            sort_at DATETIME NULL,
+            email_key VARCHAR(255) NULL,
+            phone_key VARCHAR(20) NULL,
+            refreshed_at DATETIME NULL,
+            INDEX idx_cs_sort (sort_at, client_user_id),
+            INDEX idx_cs_source_sort (source, sort_at, client_user_id),
+            INDEX idx_cs_email (email_key),
+            INDEX idx_cs_phone (phone_key)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """))
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS client_search_terms (
+            term VARCHAR(64) NOT NULL,
+            kind VARCHAR(10) NOT NULL,
+            client_user_id INT NOT NULL,
+            PRIMARY KEY (term, kind, client_user_id),
+            INDEX idx_cst_client (client_user_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+    """))
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS client_summary_state (
+            id INT NOT NULL PRIMARY KEY,
+            built_at DATETIME NULL,
+            client_hwm DATETIME NULL,
+            order_hwm INT NULL
+        )
+    """))
+    # Рядки, побудовані до COALESCE'd sort_at (NULL < курсор - хибно, keyset їх пропускав)
+    db.execute(text("UPDATE client_summary SET sort_at = :floor WHERE sort_at IS NULL"), {"floor": SORT_AT_FLOOR})
+    _tables_ready = True
+
+
+# ============================================================
+# BUILD
+# ============================================================
+
+def _ids_filter(column: str, client_ids: Optional[List[int]]) -> Tuple[str, Dict]:
+    if client_ids is None:
+        return "1=1", {}
+    return f"{column} IN :client_ids", {"client_ids": tuple(client_ids)}
+
+
+def compute_rows(db: Session, client_ids: Optional[List[int]] = None) -> Tuple[List[Dict], List[Dict]]:
+    """(рядки client_summary, рядки client_search_terms) для клієнтів (None - для всіх)"""
+    where, params = _ids_filter("c.id", client_ids)
+    clients = db.execute(text(f"""
+        SELECT c.id, c.email, c.full_name, c.phone, c.company, c.company_hint, c.instagram,
+               c.is_active, c.source, COALESCE(c.updated_at, c.created_at) AS sort_at
+        FROM client_users c
+        WHERE {where}
+    """), params).fetchall()
+    if not clients:
+        return [], []
+
+    where, params = _ids_filter("o.client_user_id", client_ids)
+    orders = {}
+    for row in db.execute(text(f"""
+        SELECT o.client_user_id, COUNT(*) AS orders_count,
+               COALESCE(SUM(CASE WHEN o.status NOT IN :non_revenue THEN o.total_price ELSE 0 END), 0) AS revenue,
+               MAX(o.created_at) AS last_order_at
+        FROM orders o
+        WHERE {where} AND o.client_user_id IS NOT NULL
+        GROUP BY o.client_user_id
+    """), {**params, "non_revenue": NON_REVENUE_STATUSES}).fetchall():
+        orders[row[0]] = row
+
+    where, params = _ids_filter("cpl.client_user_id", client_ids)
+    payers: Dict[int, Dict] = {}
+    for row in db.execute(text(f"""
+        SELECT cpl.client_user_id, cpl.payer_profile_id, cpl.is_default, pp.display_name
+        FROM client_payer_links cpl
+        LEFT JOIN payer_profiles pp ON pp.id = cpl.payer_profile_id
+        WHERE {where}
+        ORDER BY cpl.client_user_id, cpl.id
+    """), params).fetchall():
+        entry = payers.setdefault(row[0], {"ids": set(), "default_id": None, "default_name": None})
+        entry["ids"].add(row[1])
+        if row[2] and entry["default_id"] is None:
+            entry["default_id"], entry["default_name"] = row[1], row[3]
+
+    where, params = _ids_filter("ma.client_user_id", client_ids)
+    agreements = {}
+    for row in db.execute(text(f"""
+        SELECT ma.client_user_id, ma.id, ma.contract_number, ma.status, ma.valid_until
+        FROM master_agreements ma
+        WHERE {where} AND ma.status IN :ma_statuses
+        ORDER BY ma.client_user_id, (ma.valid_until IS NULL) DESC, ma.valid_until DESC, ma.id DESC
+    """), {**params, "ma_statuses": ACTIVE_MA_STATUSES}).fetchall():
+        # Найдовше чинний договір - якщо він прострочений, то й усі інші
+        agreements.setdefault(row[0], row)
+
+    now = datetime.now()
+    summary_rows, term_rows = [], []
+    for c in clients:
+        client_id = c[0]
+        order = orders.get(client_id)
+        payer = payers.get(client_id, {"ids": (), "default_id": None, "default_name": None})
+        ma = agreements.get(client_id)
+        last_order_at = order[3] if order else None
+        summary_rows.append({
+            "client_user_id": client_id,
+            "orders_count": int(order[1]) if order else 0,
+            "payers_count": len(payer["ids"]),
+            "default_payer_id": payer["default_id"],
+            "default_payer_name": payer["default_name"],
+            "ma_id": ma[1] if ma else None,
+            "ma_number": ma[2] if ma else None,
+            "ma_status": ma[3] if ma else None,
+            "ma_valid_until": ma[4] if ma else None,
+            "total_revenue": float(order[2] or 0) if order else 0.0,
+            "last_order_date": last_order_at.date() if isinstance(last_order_at, datetime) else last_order_at,
+            "is_active": 1 if c[7] is None or c[7] else 0,
+            "source": c[8],
+            "sort_at": c[9] or SORT_AT_FLOOR,
+            "email_key": email_key(c[1]),
+            "phone_key": phone_key(c[3]),
+            "refreshed_at": now,
+        })
+        for term, kind in search_terms(c[2], c[1], c[3], c[4], c[5], c[6]):
+            term_rows.append({"term": term, "kind": kind, "client_user_id": client_id})
+    return summary_rows, term_rows
+
+
+_UPSERT_SQL = """
+    INSERT INTO client_summary (
+        client_user_id, orders_count, payers_count, default_payer_id, default_payer_name,
+        ma_id, ma_number, ma_status, ma_valid_until, total_revenue, last_order_date,
+        is_active, source, sort_at, email_key, phone_key, refreshed_at
+    ) VALUES (
+        :client_user_id, :orders_count, :payers_count, :default_payer_id, :default_payer_name,
+        :ma_id, :ma_number, :ma_status, :ma_valid_until, :total_revenue, :last_order_date,
+        :is_active, :source, :sort_at, :email_key, :phone_key, :refreshed_at
+    )
+    ON DUPLICATE KEY UPDATE
+        orders_count = VALUES(orders_count), payers_count = VALUES(payers_count),
+        default_payer_id = VALUES(default_payer_id), default_payer_name = VALUES(default_payer_name),
+        ma_id = VALUES(ma_id), ma_number = VALUES(ma_number), ma_status = VALUES(ma_status),
+        ma_valid_until = VALUES(ma_valid_until), total_revenue = VALUES(total_revenue),
+        last_order_date = VALUES(last_order_date), is_active = VALUES(is_active),
+        source = VALUES(source), sort_at = VALUES(sort_at), email_key = VALUES(email_key),
+        phone_key = VALUES(phone_key), refreshed_at = VALUES(refreshed_at)
+"""
+_INSERT_TERMS_SQL = """
+    INSERT IGNORE INTO client_search_terms (term, kind, client_user_id) VALUES (:term, :kind, :client_user_id)
+"""
+
+
+def _write(db: Session, summary_rows: List[Dict], term_rows: List[Dict]):
+    for i in range(0, len(summary_rows), BATCH_SIZE):
+        db.execute(text(_UPSERT_SQL), summary_rows[i:i + BATCH_SIZE])
+    for i in range(0, len(term_rows), BATCH_SIZE):
+        db.execute(text(_INSERT_TERMS_SQL), term_rows[i:i + BATCH_SIZE])
+
+
+def refresh_clients(db: Session, client_ids: Iterable[int]) -> int:
+    """Перерахувати проєкцію для клієнтів (у поточній транзакції, без commit)"""
+    client_ids = sorted({int(c) for c in client_ids if c})
+    if not client_ids:
+        return 0
+    ensure_summary_tables(db)
+    refreshed = 0
+    for i in range(0, len(client_ids), BATCH_SIZE):
+        chunk = client_ids[i:i + BATCH_SIZE]
+        summary_rows, term_rows = compute_rows(db, chunk)
+        db.execute(
+            text("DELETE FROM client_search_terms WHERE client_user_id IN :ids"), {"ids": tuple(chunk)}
+        )
+        gone = set(chunk) - {row["client_user_id"] for row in summary_rows}
+        if gone:
+            db.execute(text("DELETE FROM client_summary WHERE client_user_id IN :ids"), {"ids": tuple(gone)})
+        _write(db, summary_rows, term_rows)
+        refreshed += len(summary_rows)
+    return refreshed
+
+
+def _read_hwms(db: Session) -> Tuple[Optional[datetime], Optional[int]]:
+    row = db.execute(text("""
+        SELECT (SELECT MAX(updated_at) FROM client_users), (SELECT MAX(order_id) FROM orders)
+    """)).fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+
+def _write_state(db: Session, client_hwm, order_hwm, built: bool):
+    params = {"client_hwm": client_hwm, "order_hwm": order_hwm, "now": datetime.now()}
+    built_sql = "built_at = :now, " if built else ""
+    result = db.execute(text(f"""
+        UPDATE client_summary_state SET {built_sql}client_hwm = :client_hwm, order_hwm = :order_hwm WHERE id = 1
+    """), params)
+    if not result.rowcount:
+        db.execute(text("""
+            INSERT INTO client_summary_state (id, built_at, client_hwm, order_hwm)
+            VALUES (1, :now, :client_hwm, :order_hwm)
+        """), params)
+
+
+def rebuild_all(db: Session) -> int:
+    """Повна перебудова проєкції (і commit)"""
+    ensure_summary_tables(db)
+    started = time.monotonic()
+    client_hwm, order_hwm = _read_hwms(db)
+    summary_rows, term_rows = compute_rows(db, None)
+    db.execute(text("DELETE FROM client_search_terms"))
+    db.execute(text("DELETE FROM client_summary"))
+    _write(db, summary_rows, term_rows)
+    _write_state(db, client_hwm, order_hwm, built=True)
+    db.commit()
+    logger.info("client_summary rebuilt: %d clients in %.0f ms",
+                len(summary_rows), (time.monotonic() - started) * 1000)
+    return len(summary_rows)
+
+
+def reconcile(db: Session) -> int:
+    """
+    Догнати записи поза SQLAlchemy-сесією: клієнти з updated_at після client_hwm
+    і клієнти нових замовлень (order_id > order_hwm). Повертає кількість перерахованих.
+    """
+    ensure_summary_tables(db)
+    state = db.execute(text("SELECT client_hwm, order_hwm FROM client_summary_state WHERE id = 1")).fetchone()
+    if not state:
+        return 0
+    client_hwm, order_hwm = state
+    ids = set()
+    if client_hwm is not None:
+        ids.update(r[0] for r in db.execute(text(
+            "SELECT id FROM client_users WHERE updated_at > :hwm"), {"hwm": client_hwm}).fetchall())
+    if order_hwm is not None:
+        ids.update(r[0] for r in db.execute(text("""
+            SELECT DISTINCT client_user_id FROM orders
+            WHERE order_id > :hwm AND client_user_id IS NOT NULL
+        """), {"hwm": order_hwm}).fetchall())
+    new_client_hwm, new_order_hwm = _read_hwms(db)
+    refreshed = refresh_clients(db, ids)
+    if (new_client_hwm, new_order_hwm) != (client_hwm, order_hwm):
+        _write_state(db, new_client_hwm, new_order_hwm, built=False)
+    db.commit()
+    return refreshed
+
+
+def _rebuild_in_background():
+    from database_rentalhub import get_rh_db_sync
+
+    def run():
+        db = get_rh_db_sync()
+        try:
+            rebuild_all(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"client_summary rebuild failed: {e}")
+        finally:
+            db.close()
+
+    _spawn(run, "client-summary-rebuild")
+
+
+def _spawn(target, name: str) -> threading.Thread:
+    """Запуск фонового потоку (тести підміняють)"""
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def ensure_fresh(db: Session):
+    """
+    Викликати перед читанням проєкції: перша побудова (синхронно), reconcile
+    раз на RECONCILE_SECONDS, повна перебудова у фоні раз на REBUILD_HOURS.
+    """
+    global _built, _reconciled_at
+    _install_change_tracking()
+    now = time.monotonic()
+    if _built and now - _reconciled_at < RECONCILE_SECONDS:
+        return
+    with _lock:
+        if _built and now - _reconciled_at < RECONCILE_SECONDS:
+            return
+        ensure_summary_tables(db)
+        built_at = db.execute(text("SELECT built_at FROM client_summary_state WHERE id = 1")).scalar()
+        if built_at is None:
+            rebuild_all(db)
+        else:
+            reconcile(db)
+            if datetime.now() - built_at > timedelta(hours=REBUILD_HOURS):
+                # built_at зсуваємо одразу, щоб інші воркери не запускали ту саму перебудову
+                db.execute(text("UPDATE client_summary_state SET built_at = :now WHERE id = 1"),
+                           {"now": datetime.now()})
+                db.commit()
+                _rebuild_in_background()
+        _built = True
+        _reconciled_at = time.monotonic()
+
+
+def is_agreement_active(status: Optional[str], valid_until, today: Optional[date] = None) -> bool:
+    if not status or status not in ACTIVE_MA_STATUSES:
+        return False
+    if valid_until is None:
+        return True
+    if isinstance(valid_until, datetime):
+        valid_until = valid_until.date()
+    return valid_until >= (today or date.today())
+
+
+# ============================================================
+# CHANGE TRACKING
+# ============================================================
+
+_WRITE_RE = write_pattern("client_users", "orders", "client_payer_links", "master_agreements", "payer_profiles")
+_ORDER_COLUMNS_RE = re.compile(r"\b(client_user_id|status|total_price|created_at)\s*=", re.IGNORECASE)
+_CLIENT_KEYS = ("client_user_id", "client_id", "client", "cid")
+
+
+def note_write(info: dict, statement: str, parameters, lastrowid: Optional[int] = None) -> None:
+    """Розібрати запис у відстежувані таблиці -> info[_PENDING_KEY]"""
+    parsed = parse_write(_WRITE_RE, statement, parameters)
+    if not parsed:
+        return
+    verb, table, params_list = parsed
+    if table == "orders" and verb == "UPDATE":
+        if not _ORDER_COLUMNS_RE.search(set_clause(statement)):
+            # нотатки / дати / реквізити - на проєкцію не впливають
+            return
+    pending = info.setdefault(_PENDING_KEY, {"clients": set(), "orders": set(), "payers": set(),
+                                             "agreements": set(), "all": False})
+
+    if table == "orders":
+        clients = param_values(params_list, _CLIENT_KEYS)
+        pending["clients"].update(clients)
+        if verb == "INSERT":
+            return
+        orders = param_values(params_list, ("order_id", "oid", "id"))
+        pending["orders"].update(orders)
+        if not clients and not orders:
+            pending["all"] = True
+        return
+
+    if table == "client_users":
+        ids = param_values(params_list, ("id",) + _CLIENT_KEYS)
+        if verb == "INSERT" and lastrowid:
+            ids.add(lastrowid)
+    elif table == "client_payer_links":
+        ids = param_values(params_list, _CLIENT_KEYS)
+        if not ids:
+            payers = param_values(params_list, ("payer", "payer_profile_id", "payer_id"))
+            pending["payers"].update(payers)
+            if payers:
+                return
+    elif table == "master_agreements":
+        ids = param_values(params_list, _CLIENT_KEYS)
+        if not ids:
+            agreements = param_values(params_list, ("id", "agreement_id", "ma_id"))
+            pending["agreements"].update(agreements)
+            if agreements:
+                return
+    else:  # payer_profiles
+        payers = param_values(params_list, ("id", "payer_id", "payer_profile_id"))
+        pending["payers"].update(payers)
+        if payers or verb == "INSERT":
+            return
+        ids = set()
+
+    if ids:
+        pending["clients"].update(ids)
+    elif not (table == "client_users" and verb == "INSERT"):
+        # новий клієнт без id у параметрах - підхопить reconcile (updated_at)
+        pending["all"] = True
+
+
+def _resolve_clients(db: Session, pending: dict) -> Set[int]:
+    clients = set(pending["clients"])
+    lookups = (
+        ("orders", "SELECT DISTINCT client_user_id FROM orders WHERE order_id IN :ids"),
+        ("payers", "SELECT DISTINCT client_user_id FROM client_payer_links WHERE payer_profile_id IN :ids"),
+        ("agreements", "SELECT DISTINCT client_user_id FROM master_agreements WHERE id IN :ids"),
+    )
+    for key, sql in lookups:
+        if pending[key]:
+            clients.update(r[0] for r in db.execute(text(sql), {"ids": tuple(pending[key])}).fetchall() if r[0])
+    return clients
+
+
+def _refresh_pending_clients(session: Session, pending: dict):
+    global _reconciled_at
+    if pending["all"]:
+        # масовий запис без ключів - одразу звірити по high-water marks, решту дожене перебудова
+        _reconciled_at = 0.0
+    # SAVEPOINT: збій після DELETE FROM client_search_terms не лишає клієнтів без термінів,
+    # а запис автора зберігається; дрейф виправить reconcile / перебудова
+    if not run_in_savepoint(session, "client_summary refresh",
+                            lambda: refresh_clients(session, _resolve_clients(session, pending))):
+        _reconciled_at = 0.0
+
+
+_tracking_installed = False
+
+
+def _install_change_tracking():
+    global _tracking_installed
+    if _tracking_installed:
+        return
+    _tracking_installed = True
+    from database_rentalhub import rh_engine
+    track_writes(rh_engine, _PENDING_KEY, note_write)
+    before_commit(_PENDING_KEY, _refresh_pending_clients)
@@ -1,10 +1,33 @@
 """
 Company Config - центральне місце для отримання даних компанії з БД.
 Використовується в шаблонах документів (company.*, landlord.*).
+
+system_settings читається не на кожен виклик, а через кеш процесу (settings_cache):
+- знімок живе CONFIG_CACHE_TTL_SECONDS і скидається invalidate() (версія +1)
+- PUT /api/admin/settings і POST /api/settings викликають invalidate_everywhere() -
+  локально і на інших воркерах через services/realtime_backplane
+- в межах сесії БД (один запит / один рендер документа) знімок фіксується в db.info,
+  тож рендер бачить одні й ті самі налаштування
+- лічильники hits / memo_hits / misses - settings_cache.stats()
 """
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping, Optional
+
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
+logger = logging.getLogger(__name__)
+
+CONFIG_CACHE_TTL_SECONDS = float(os.environ.get("CONFIG_CACHE_TTL_SECONDS", "60"))
+CONFIG_CHANNEL = "config"
+
+_MEMO_KEY = "company_settings_snapshot"
+
 DEFAULTS = {
     "name": "Фізична особа-підприємець Николенко Наталя Станіславівна",
     "short_name": "FarforDecorOrenda",
@@ -22,8 +45,7 @@ DEFAULTS = {
 }
 
 
-def get_settings_from_db(db: Session) -> dict:
-    """Fetch raw settings from system_settings table."""
+def _load_settings(db: Session) -> dict:
     try:
         rows = db.execute(text("SELECT setting_key, setting_value FROM system_settings")).fetchall()
         if rows:
@@ -33,9 +55,117 @@ def get_settings_from_db(db: Session) -> dict:
     return {}
 
 
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    """Незмінний знімок system_settings"""
+    version: int
+    loaded_at: float
+    values: Mapping[str, str] = field(default_factory=dict)
+
+    def get(self, key: str, default=None):
+        return self.values.get(key, default)
+
+
+class SettingsCache:
+    """Кеш system_settings на процес з версією для інвалідації і per-session memo"""
+
+    def __init__(self, ttl: float = CONFIG_CACHE_TTL_SECONDS, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._snapshot: Optional[SettingsSnapshot] = None
+        self.version = 0
+        self.hits = 0
+        self.memo_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _fresh(self, snapshot: Optional[SettingsSnapshot]) -> bool:
+        return (snapshot is not None and snapshot.version == self.version
+                and self._clock() - snapshot.loaded_at < self.ttl)
+
+    def get(self, db: Session) -> SettingsSnapshot:
+        memo = getattr(db, "info", None)
+        snapshot = memo.get(_MEMO_KEY) if memo is not None else None
+        if self._fresh(snapshot):
+            self.memo_hits += 1
+            return snapshot
+
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            self.hits += 1
+        else:
+            with self._lock:
+                snapshot = self._snapshot
+                if self._fresh(snapshot):
+                    self.hits += 1
+                else:
+                    version = self.version
+                    snapshot = SettingsSnapshot(version, self._clock(), MappingProxyType(_load_settings(db)))
+                    self.misses += 1
+                    if version == self.version:
+                        self._snapshot = snapshot
+        if memo is not None:
+            memo[_MEMO_KEY] = snapshot
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._snapshot = None
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.memo_hits + self.misses
+        return {
+            "version": self.version,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "memo_hits": self.memo_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.memo_hits) / lookups, 4) if lookups else None,
+        }
+
+
+settings_cache = SettingsCache()
+
+
+def _on_config_event(channel: str, payload: dict):
+    from services.realtime_backplane import WORKER_ID
+    if channel == CONFIG_CHANNEL and payload.get("worker") != WORKER_ID:
+        settings_cache.invalidate()
+
+
+async def start_invalidation_listener():
+    """Підписатися на інвалідації інших воркерів (startup)"""
+    from services.realtime_backplane import get_backplane
+    backplane = get_backplane()
+    backplane.subscribe(_on_config_event)
+    try:
+        await backplane.start()
+    except Exception as e:
+        logger.warning(f"Config invalidation listener: backplane unavailable: {e}")
+
+
+async def invalidate_everywhere():
+    """Скинути кеш налаштувань на цьому і на інших воркерах"""
+    from services.realtime_backplane import WORKER_ID, get_backplane
+    settings_cache.invalidate()
+    try:
+        await get_backplane().publish(CONFIG_CHANNEL, {"action": "invalidate", "worker": WORKER_ID})
+    except Exception as e:
+        logger.warning(f"Config invalidation publish failed: {e}")
+
+
+def get_settings_from_db(db: Session) -> dict:
+    """Raw settings from system_settings (через settings_cache)."""
+    return dict(settings_cache.get(db).values)
+
+
 def get_landlord_config(db: Session) -> dict:
     """Landlord dict for templates using landlord.* variables."""
-    settings = get_settings_from_db(db)
+    settings = settings_cache.get(db)
     return {
         "name": settings.get("name", DEFAULTS["name"]),
         "tax_status": settings.get("tax_status", DEFAULTS["tax_status"]),
@@ -59,7 +189,7 @@ def get_company_config(db: Session) -> dict:
     - company.tax_id, company.edrpou, company.iban, company.bank_name
     - company.director_name, company.tax_status
     """
-    settings = get_settings_from_db(db)
+    settings = settings_cache.get(db)
     legal_name = settings.get("name", DEFAULTS["name"])
     short_name = settings.get("short_name", DEFAULTS["short_name"])
     return {
@@ -0,0 +1,326 @@
+"""
+Dashboard snapshot - кешований знімок дашборду менеджера та кабінету працівника.
+
+/api/manager/dashboard/overview виконував п'ять незалежних секцій (замовлення, що чекають
+клієнта, активні замовлення, картки видачі, фінанси, мийка) одну за одною, а
+/api/cabinet/focus і /stats повторювали схожі запити для кожного, хто відкрив застосунок
+зранку. Тут:
+
+- секції view виконуються паралельно (кожна у своїй сесії get_rh_db_sync) у спільному пулі
+- зібраний payload кешується на DASHBOARD_SNAPSHOT_TTL_SECONDS; знімків (view, key) - не більше
+  DASHBOARD_SNAPSHOT_MAX_ENTRIES (кабінет кешується на кожного користувача), LRU
+- single-flight: поки знімок будується, інші запити з тим самим ключем чекають на нього,
+  а не запускають ті самі запити ще раз
+- записи через rh_engine у таблиці view (наприклад зміна orders.status) інвалідують
+  його після COMMIT; знімок, що будувався під час інвалідації, віддається, але не кешується
+- у відповідь додається "_snapshot": cached, age_ms, built_ms і час кожної секції (sections),
+  щоб було видно, яка секція повільна
+
+Кеш - у пам'яті процесу (як product_search): інші воркери дізнаються про зміну після TTL.
+
+Usage:
+    snapshots = get_dashboard_snapshots()
+    snapshots.register("overview", {"orders_awaiting": load_awaiting, ...},
+                       tables={"orders": ("status", "is_archived")})
+    return snapshots.get("overview")
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+
+from utils.commit_tracking import discard_pending, on_commit
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL_SECONDS = float(os.environ.get("DASHBOARD_SNAPSHOT_TTL_SECONDS", "15"))
+SNAPSHOT_WORKERS = int(os.environ.get("DASHBOARD_SNAPSHOT_WORKERS", "8"))
+SNAPSHOT_MAX_ENTRIES = int(os.environ.get("DASHBOARD_SNAPSHOT_MAX_ENTRIES", "512"))
+
+_PENDING_KEY = "dashboard_snapshot_pending"
+
+_WRITE_RE = re.compile(
+    r"^\s*(INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?(\w+)`?",
+    re.IGNORECASE
+)
+
+Section = Callable[..., Any]
+
+
+@dataclass
+class View:
+    name: str
+    sections: Dict[str, Section]
+    defaults: Dict[str, Any]
+    finalize: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]]
+    # таблиця -> колонки, UPDATE яких інвалідує view (None - будь-який запис)
+    tables: Dict[str, Optional[Tuple[str, ...]]]
+
+
+@dataclass
+class Snapshot:
+    payload: Dict[str, Any]
+    sections: Dict[str, float]
+    errors: Dict[str, str]
+    built_ms: float
+    built_at: float
+    generation: int = 0
+
+
+@dataclass
+class _Flight:
+    future: Future = field(default_factory=Future)
+    generation: int = 0
+
+
+class DashboardSnapshots:
+    """Реєстр view -> секції, TTL-кеш знімків і single-flight побудова"""
+
+    def __init__(self, ttl: float = SNAPSHOT_TTL_SECONDS, workers: int = SNAPSHOT_WORKERS,
+                 session_factory: Optional[Callable[[], Any]] = None, clock=time.monotonic,
+                 max_entries: int = SNAPSHOT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.workers = workers
+        self.max_entries = max(1, max_entries)
+        self.clock = clock
+        self._session_factory = session_factory
+        self._views: Dict[str, View] = {}
+        self._cache: "OrderedDict[Tuple[str, Hashable], Snapshot]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, Hashable], _Flight] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def register(self, view: str, sections: Dict[str, Section], defaults: Optional[Dict[str, Any]] = None,
+                 finalize: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+                 tables: Optional[Dict[str, Optional[Iterable[str]]]] = None):
+        """
+        sections: ім'я -> fn(db, **params); результат секції кладеться в payload під її ім'ям
+        defaults: значення секції, якщо вона впала (за замовчуванням None)
+        finalize: payload секцій -> відповідь
+        tables: записи в ці таблиці інвалідують view
+        """
+        self._views[view] = View(
+            name=view,
+            sections=dict(sections),
+            defaults=dict(defaults or {}),
+            finalize=finalize,
+            tables={table.lower(): (tuple(c.lower() for c in columns) if columns else None)
+                    for table, columns in (tables or {}).items()},
+        )
+
+    # --------------------------------------------------------
+    # READ
+    # --------------------------------------------------------
+
+    def get(self, view: str, key: Hashable = None, **params) -> Dict[str, Any]:
+        """Знімок view (з кешу, з побудови, що вже йде, або новий)"""
+        cache_key = (view, key)
+        now = self.clock()
+        with self._lock:
+            generation = self._generations.get(view, 0)
+            snapshot = self._cache.get(cache_key)
+            if snapshot and snapshot.generation == generation and now - snapshot.built_at < self.ttl:
+                self._cache.move_to_end(cache_key)
+                return self._respond(snapshot, cached=True)
+            flight = self._inflight.get(cache_key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[cache_key] = _Flight(generation=generation)
+
+        if not leader:
+            return self._respond(flight.future.result(), cached=True)
+
+        try:
+            snapshot = self.build(view, **params)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+            flight.future.set_exception(e)
+            raise
+        snapshot.generation = flight.generation
+        with self._lock:
+            if self._generations.get(view, 0) == flight.generation:
+                self._store(cache_key, snapshot)
+            self._inflight.pop(cache_key, None)
+        flight.future.set_result(snapshot)
+        return self._respond(snapshot, cached=False)
+
+    def _store(self, cache_key: Tuple[str, Hashable], snapshot: Snapshot):
+        """Під self._lock: покласти знімок, витіснивши прострочені, потім найдавніше використані"""
+        self._cache[cache_key] = snapshot
+        self._cache.move_to_end(cache_key)
+        if len(self._cache) <= self.max_entries:
+            return
+        now = self.clock()
+        for key in [k for k, s in self._cache.items() if now - s.built_at >= self.ttl]:
+            del self._cache[key]
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _respond(self, snapshot: Snapshot, cached: bool) -> Dict[str, Any]:
+        return {
+            **snapshot.payload,
+            "_snapshot": {
+                "cached": cached,
+                "age_ms": round((self.clock() - snapshot.built_at) * 1000, 1),
+                "built_ms": snapshot.built_ms,
+                "sections": snapshot.sections,
+                "errors": snapshot.errors,
+            },
+        }
+
+    # --------------------------------------------------------
+    # BUILD
+    # --------------------------------------------------------
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix="dashboard-snapshot")
+        return self._executor
+
+    def _open_session(self):
+        if self._session_factory is None:
+            from database_rentalhub import get_rh_db_sync
+            self._session_factory = get_rh_db_sync
+        return self._session_factory()
+
+    def _run_section(self, fn: Section, params: Dict[str, Any]) -> Tuple[Any, float, Optional[str]]:
+        started = time.perf_counter()
+        db = self._open_session()
+        try:
+            value, error = fn(db, **params), None
+        except Exception as e:
+            db.rollback()
+            value, error = None, str(e)
+        finally:
+            db.close()
+        return value, round((time.perf_counter() - started) * 1000, 1), error
+
+    def build(self, view: str, **params) -> Snapshot:
+        """Виконати всі секції view паралельно і зібрати payload (без кешу)"""
+        spec = self._views[view]
+        started = time.perf_counter()
+        futures = {name: self._pool().submit(self._run_section, fn, params) for name, fn in spec.sections.items()}
+        payload, timings, errors = {}, {}, {}
+        for name, future in futures.items():
+            value, elapsed, error = future.result()
+            timings[name] = elapsed
+            if error is not None:
+                logger.warning("Dashboard section %s.%s failed: %s", view, name, error)
+                errors[name] = error
+                value = spec.defaults.get(name)
+            payload[name] = value
+        if spec.finalize:
+            payload = spec.finalize(payload)
+        return Snapshot(
+            payload=payload,
+            sections=timings,
+            errors=errors,
+            built_ms=round((time.perf_counter() - started) * 1000, 1),
+            built_at=self.clock(),
+        )
+
+    # --------------------------------------------------------
+    # INVALIDATION
+    # --------------------------------------------------------
+
+    def invalidate(self, views: Optional[Iterable[str]] = None):
+        """Скинути знімки view (None - усі); побудови, що вже йдуть, не потраплять у кеш"""
+        with self._lock:
+            views = set(self._views) if views is None else set(views)
+            for view in views:
+                self._generations[view] = self._generations.get(view, 0) + 1
+            for cache_key in [k for k in self._cache if k[0] in views]:
+                del self._cache[cache_key]
+
+    def views_for_write(self, statement: str) -> set:
+        """View, які інвалідує SQL-запис"""
+        match = _WRITE_RE.match(statement or "")
+        if not match:
+            return set()
+        verb, table = match.group(1).split()[0].upper(), match.group(2).lower()
+        set_clause = None
+        if verb == "UPDATE":
+            set_clause = re.split(r"\bWHERE\b", statement, maxsplit=1, flags=re.IGNORECASE)[0].lower()
+        views = set()
+        for view in self._views.values():
+            if table not in view.tables:
+                continue
+            columns = view.tables[table]
+            if set_clause is not None and columns and not any(
+                    re.search(rf"\b{column}\s*=", set_clause) for column in columns):
+                continue
+            views.add(view.name)
+        return views
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# ============================================================
+# CHANGE TRACKING
+# ============================================================
+
+def install_change_tracking(sa_engine, snapshots: DashboardSnapshots) -> None:
+    """Слухати записи в таблиці view і інвалідувати знімки після COMMIT"""
+
+    @event.listens_for(sa_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        views = snapshots.views_for_write(statement)
+        if views:
+            conn.info.setdefault(_PENDING_KEY, set()).update(views)
+
+    @event.listens_for(sa_engine, "rollback")
+    def _on_rollback(conn):
+        discard_pending(conn, _PENDING_KEY)
+
+    # Інвалідація - після фактичного COMMIT (подія рушія "commit" - до нього): інакше знімок,
+    # зібраний між інвалідацією і комітом, кешується зі старими даними на весь TTL
+    on_commit(_PENDING_KEY, snapshots.invalidate)
+
+
+def timestamp(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """finalize: час побудови знімка в payload"""
+    return {**payload, "timestamp": datetime.now().isoformat()}
+
+
+# ============================================================
+# SINGLETON
+# ============================================================
+
+_snapshots: Optional[DashboardSnapshots] = None
+_tracking_installed = False
+_instance_lock = threading.Lock()
+
+
+def get_dashboard_snapshots() -> DashboardSnapshots:
+    """Singleton процесу (з підключеним відстеженням змін rh_engine)"""
+    global _snapshots, _tracking_installed
+
+    if _snapshots is not None and _tracking_installed:
+        return _snapshots
+
+    with _instance_lock:
+        if _snapshots is None:
+            _snapshots = DashboardSnapshots()
+
+        if not _tracking_installed:
+            _tracking_installed = True
+            from database_rentalhub import rh_engine
+            install_change_tracking(rh_engine, _snapshots)
+
+        return _snapshots
@@ -7,6 +7,18 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session
 import json
 from services.company_config import get_company_config
+from services.image_derivatives import smallest_image_urls
+
+# Мініатюри в документах 40-50px - досить WebP-варіанта ~160px замість оригіналу
+DOCUMENT_THUMB_WIDTH = 160
+
+
+def _use_document_thumbs(db: Session, items: list, key: str = "image_url"):
+    """Підмінити оригінали зображень на найменший придатний варіант (якщо вже згенерований)"""
+    thumbs = smallest_image_urls(db, (it.get(key) for it in items), DOCUMENT_THUMB_WIDTH)
+    for it in items:
+        if it.get(key) in thumbs:
+            it[key] = thumbs[it[key]]
 
 # ============================================================
 # КОНВЕРТАЦІЯ СУМИ В СЛОВА (УКРАЇНСЬКА)
@@ -229,6 +241,8 @@ def build_order_data(db: Session, order_id: str, options: dict) -> dict:
         total_rent += total_rental
         total_deposit += item_deposit
     
+    _use_document_thumbs(db, items)
+    
     # Use calculated totals or order totals
     if not total_rent:
         total_rent = order["total_price"]
@@ -816,6 +830,7 @@ def build_issue_card_data(db: Session, issue_card_id: str, options: dict) -> dic
                 "location": location,
                 "image_url": item_row[7]
             })
+        _use_document_thumbs(db, items)
     
     # Use customer_phone or phone fallback
     phone = row[8] or row[9] or ""
@@ -1059,6 +1074,7 @@ def build_return_data(db: Session, order_id: str, options: dict) -> dict:
             "price_per_day": float(r[3] or 0), "sku": r[5] or "",
             "image_url": r[6] or "",
         }
+    _use_document_thumbs(db, list(order_items_map.values()))
     
     # --- Damage records (ALL types) ---
     dmg_result = db.execute(text("""
@@ -69,6 +69,66 @@ def render_html(template_path: str, data: dict) -> str:
     template = jinja_env.get_template(template_path)
     return template.render(**data)
 
+def precompile_registry_templates() -> dict:
+    """
+    Скомпілювати всі шаблони з DOC_REGISTRY (викликається при старті сервера),
+    щоб перший рендер документа не платив за компіляцію.
+    """
+    from services.doc_engine.registry import DOC_REGISTRY
+    from services.template_loader import precompile_templates
+    names = sorted({cfg["template"] for cfg in DOC_REGISTRY.values() if cfg.get("template")})
+    return precompile_templates(jinja_env, names)
+
+# CSS для друку (A4) - використовується render_pdf та ключем PDF-кешу
+PRINT_CSS = '''
+    @page {
+        size: A4;
+        margin: 15mm;
+    }
+    body {
+        font-family: "DejaVu Sans", "Arial", sans-serif;
+        font-size: 10pt;
+        line-height: 1.4;
+    }
+    table {
+        width: 100%;
+        border-collapse: collapse;
+    }
+    th, td {
+        border: 1px solid #ddd;
+        padding: 6px 8px;
+        text-align: left;
+    }
+    th {
+        background-color: #f5f5f5;
+        font-weight: bold;
+    }
+    .header {
+        margin-bottom: 20px;
+    }
+    .footer {
+        margin-top: 30px;
+    }
+    .signature-block {
+        margin-top: 40px;
+        display: flex;
+        justify-content: space-between;
+    }
+    .signature-line {
+        width: 200px;
+        border-bottom: 1px solid #000;
+        margin-top: 30px;
+    }
+    .text-right { text-align: right; }
+    .text-center { text-align: center; }
+    .font-bold { font-weight: bold; }
+    .text-sm { font-size: 9pt; }
+    .text-lg { font-size: 12pt; }
+    .mb-2 { margin-bottom: 8px; }
+    .mb-4 { margin-bottom: 16px; }
+    .mt-4 { margin-top: 16px; }
+'''
+
 def render_pdf(html_content: str, base_url: str = None) -> bytes:
     """
     Генерує PDF з HTML.
@@ -100,56 +160,7 @@ def render_pdf(html_content: str, base_url: str = None) -> bytes:
         return print_html.encode('utf-8')
     
     font_config = FontConfiguration()
-    
-    # CSS для друку
-    css = CSS(string='''
-        @page {
-            size: A4;
-            margin: 15mm;
-        }
-        body {
-            font-family: "DejaVu Sans", "Arial", sans-serif;
-            font-size: 10pt;
-            line-height: 1.4;
-        }
-        table {
-            width: 100%;
-            border-collapse: collapse;
-        }
-        th, td {
-            border: 1px solid #ddd;
-            padding: 6px 8px;
-            text-align: left;
-        }
-        th {
-            background-color: #f5f5f5;
-            font-weight: bold;
-        }
-        .header {
-            margin-bottom: 20px;
-        }
-        .footer {
-            margin-top: 30px;
-        }
-        .signature-block {
-            margin-top: 40px;
-            display: flex;
-            justify-content: space-between;
-        }
-        .signature-line {
-            width: 200px;
-            border-bottom: 1px solid #000;
-            margin-top: 30px;
-        }
-        .text-right { text-align: right; }
-        .text-center { text-align: center; }
-        .font-bold { font-weight: bold; }
-        .text-sm { font-size: 9pt; }
-        .text-lg { font-size: 12pt; }
-        .mb-2 { margin-bottom: 8px; }
-        .mb-4 { margin-bottom: 16px; }
-        .mt-4 { margin-top: 16px; }
-    ''', font_config=font_config)
+    css = CSS(string=PRINT_CSS, font_config=font_config)
     
     html = HTML(string=html_content, base_url=base_url)
     return html.write_pdf(stylesheets=[css], font_config=font_config)
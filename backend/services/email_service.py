@@ -8,9 +8,11 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
-from typing import Optional, List
+from typing import Optional, List, Tuple
 import logging
 
+from sqlalchemy.orm import Session
+
 logger = logging.getLogger(__name__)
 
 # SMTP Configuration from environment
@@ -23,6 +25,65 @@ SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL", "info@farforrent.com.ua")
 SMTP_FROM_NAME = os.getenv("SMTP_FROM_NAME", "FarforRent")
 
 
+def build_message(
+    to_email: str,
+    subject: str,
+    html_content: str,
+    plain_content: Optional[str] = None,
+    attachments: Optional[List[dict]] = None,
+    reply_to: Optional[str] = None,
+    cc: Optional[str] = None
+) -> MIMEMultipart:
+    """Зібрати MIME повідомлення (спільне для send_email і диспетчера notification_outbox)"""
+    # Використовуємо "mixed" якщо є вкладення, інакше "alternative"
+    if attachments:
+        msg = MIMEMultipart("mixed")
+        # Створюємо внутрішню частину для тексту
+        msg_alt = MIMEMultipart("alternative")
+    else:
+        msg = MIMEMultipart("alternative")
+        msg_alt = msg
+        
+    msg["Subject"] = subject
+    msg["From"] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
+    msg["To"] = to_email
+    
+    if cc:
+        msg["Cc"] = cc
+    if reply_to:
+        msg["Reply-To"] = reply_to
+    
+    # Додаємо текстову версію
+    if plain_content:
+        part1 = MIMEText(plain_content, "plain", "utf-8")
+        msg_alt.attach(part1)
+    
+    # Додаємо HTML версію
+    part2 = MIMEText(html_content, "html", "utf-8")
+    msg_alt.attach(part2)
+    
+    # Якщо є вкладення - додаємо текстову частину до основного повідомлення
+    if attachments:
+        msg.attach(msg_alt)
+    
+    # Додаємо вкладення
+    for attachment in attachments or []:
+        content_type = attachment.get("content_type", "application/octet-stream")
+        maintype, subtype = content_type.split("/", 1) if "/" in content_type else ("application", "octet-stream")
+        
+        part = MIMEBase(maintype, subtype)
+        part.set_payload(attachment["content"])
+        encoders.encode_base64(part)
+        part.add_header(
+            "Content-Disposition",
+            "attachment",
+            filename=attachment['filename']
+        )
+        msg.attach(part)
+    
+    return msg
+
+
 def send_email(
     to_email: str,
     subject: str,
@@ -50,51 +111,7 @@ def send_email(
         return {"success": False, "message": "SMTP не налаштовано"}
     
     try:
-        # Створюємо повідомлення
-        # Використовуємо "mixed" якщо є вкладення, інакше "alternative"
-        if attachments:
-            msg = MIMEMultipart("mixed")
-            # Створюємо внутрішню частину для тексту
-            msg_alt = MIMEMultipart("alternative")
-        else:
-            msg = MIMEMultipart("alternative")
-            msg_alt = msg
-            
-        msg["Subject"] = subject
-        msg["From"] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
-        msg["To"] = to_email
-        
-        if reply_to:
-            msg["Reply-To"] = reply_to
-        
-        # Додаємо текстову версію
-        if plain_content:
-            part1 = MIMEText(plain_content, "plain", "utf-8")
-            msg_alt.attach(part1)
-        
-        # Додаємо HTML версію
-        part2 = MIMEText(html_content, "html", "utf-8")
-        msg_alt.attach(part2)
-        
-        # Якщо є вкладення - додаємо текстову частину до основного повідомлення
-        if attachments:
-            msg.attach(msg_alt)
-        
-        # Додаємо вкладення
-        if attachments:
-            for attachment in attachments:
-                content_type = attachment.get("content_type", "application/octet-stream")
-                maintype, subtype = content_type.split("/", 1) if "/" in content_type else ("application", "octet-stream")
-                
-                part = MIMEBase(maintype, subtype)
-                part.set_payload(attachment["content"])
-                encoders.encode_base64(part)
-                part.add_header(
-                    "Content-Disposition",
-                    "attachment",
-                    filename=attachment['filename']
-                )
-                msg.attach(part)
+        msg = build_message(to_email, subject, html_content, plain_content, attachments, reply_to)
         
         # Відправляємо
         context = ssl.create_default_context()
@@ -125,23 +142,10 @@ def send_email(
         return {"success": False, "message": f"Помилка відправки: {str(e)}"}
 
 
-def send_document_email(
-    to_email: str,
-    document_type: str,
-    document_html: str,
-    order_number: str,
-    customer_name: Optional[str] = None
-) -> dict:
+def build_document_email(document_type: str, document_html: str, order_number: str) -> Tuple[str, str, str]:
     """
-    Відправити документ клієнту
+    (тема, HTML, текст) листа з документом
     Документ відправляється як є - з тим самим дизайном що й в адмінці
-    
-    Args:
-        to_email: Email клієнта
-        document_type: Тип документа (invoice_offer, contract_rent, etc.)
-        document_html: HTML вміст документа
-        order_number: Номер замовлення
-        customer_name: Ім'я клієнта
     """
     # Назви документів українською
     doc_names = {
@@ -159,10 +163,6 @@ def send_document_email(
     doc_name = doc_names.get(document_type, document_type)
     subject = f"{doc_name} - Замовлення {order_number} | FarforRent"
     
-    # Відправляємо документ як є - той самий дизайн що в адмінці
-    # Просто додаємо базову обгортку для email клієнтів
-    html_content = document_html
-    
     # Текстова версія для email клієнтів без HTML підтримки
     plain_content = f"""
 {doc_name} - Замовлення {order_number}
@@ -175,6 +175,29 @@ def send_document_email(
 info@farforrent.com.ua
     """
     
+    return subject, document_html, plain_content
+
+
+def send_document_email(
+    to_email: str,
+    document_type: str,
+    document_html: str,
+    order_number: str,
+    customer_name: Optional[str] = None
+) -> dict:
+    """
+    Відправити документ клієнту
+    Документ відправляється як є - з тим самим дизайном що й в адмінці
+    
+    Args:
+        to_email: Email клієнта
+        document_type: Тип документа (invoice_offer, contract_rent, etc.)
+        document_html: HTML вміст документа
+        order_number: Номер замовлення
+        customer_name: Ім'я клієнта
+    """
+    subject, html_content, plain_content = build_document_email(document_type, document_html, order_number)
+    
     return send_email(
         to_email=to_email,
         subject=subject,
@@ -183,6 +206,66 @@ info@farforrent.com.ua
     )
 
 
+def queue_email(
+    db: Session,
+    to_email: str,
+    subject: str,
+    html_content: str,
+    plain_content: Optional[str] = None,
+    attachments: Optional[List[dict]] = None,
+    reply_to: Optional[str] = None,
+    result_hook: Optional[str] = None,
+    hook_data: Optional[dict] = None
+) -> dict:
+    """
+    Поставити email в чергу notification_outbox (відправить фоновий диспетчер).
+    Лист потрапляє в чергу разом з комітом транзакції db.
+    
+    Returns:
+        {"success": True/False, "message": "...", "outbox_id": ...}
+    """
+    from services.notification_outbox import enqueue_email
+    
+    if not SMTP_USERNAME or not SMTP_PASSWORD:
+        logger.error("SMTP credentials not configured")
+        return {"success": False, "message": "SMTP не налаштовано"}
+    
+    outbox_id = enqueue_email(
+        db, to_email, subject, html_content,
+        plain_content=plain_content,
+        attachments=attachments,
+        reply_to=reply_to,
+        provider="smtp",
+        result_hook=result_hook,
+        hook_data=hook_data
+    )
+    return {"success": True, "message": f"Email поставлено в чергу на {to_email}", "outbox_id": outbox_id}
+
+
+def queue_document_email(
+    db: Session,
+    to_email: str,
+    document_type: str,
+    document_html: str,
+    order_number: str,
+    customer_name: Optional[str] = None,
+    result_hook: Optional[str] = None,
+    hook_data: Optional[dict] = None
+) -> dict:
+    """Те саме що send_document_email, але через чергу notification_outbox"""
+    subject, html_content, plain_content = build_document_email(document_type, document_html, order_number)
+    
+    return queue_email(
+        db,
+        to_email=to_email,
+        subject=subject,
+        html_content=html_content,
+        plain_content=plain_content,
+        result_hook=result_hook,
+        hook_data=hook_data
+    )
+
+
 async def send_email_with_attachment(
     to_email: str,
     subject: str,
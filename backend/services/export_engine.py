@@ -0,0 +1,454 @@
+"""
+Export engine - потоковий експорт CSV / XLSX з server-side курсором і фоновими задачами.
+
+make_csv_response будував увесь CSV у StringIO, а експорт переобліку та аналітики
+вантажив усі рядки і цілий openpyxl Workbook у пам'ять - річний ledger чи повний
+каталог давали піки пам'яті і таймаути проксі. Тут:
+
+- рядки читаються небуферизованим курсором (stream_results -> pymysql SSCursor) на
+  окремому з'єднанні порціями по EXPORT_CHUNK_ROWS; з'єднання живе, поки клієнт
+  читає відповідь (сесія запиту на той момент уже закрита)
+- CSV віддається по порції: BOM + заголовок одразу, далі рядки по мірі читання
+- XLSX пишеться openpyxl у write-only режимі в SpooledTemporaryFile (у пам'яті до
+  EXPORT_SPOOL_MAX_BYTES, далі на диску) і стрімиться шматками
+- великі експорти - фонові задачі (export_jobs): файл у EXPORT_JOBS_DIR, статус і
+  посилання на завантаження через /api/export/jobs/{id}; файли живуть EXPORT_JOB_TTL_HOURS.
+  Задачі виконуються в процесі воркера: queued / running, старші за EXPORT_JOB_STALE_MINUTES
+  (воркер перезапустився посеред експорту), позначаються failed при старті і при cleanup
+
+Експорт описується ExportSpec і реєструється під іменем (@export_builder), щоб
+фонова задача могла відтворити його з параметрів запиту.
+
+Usage:
+    @export_builder("ledger")
+    def ledger_export(db, month=None) -> ExportSpec: ...
+
+    return export_response(db, "ledger", "csv", month=month)
+    job_id = get_export_jobs().submit(db, "ledger", "xlsx", {"month": month})
+"""
+import csv
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+from urllib.parse import quote
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(__file__))
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "2000"))
+EXPORT_SPOOL_MAX_BYTES = int(os.environ.get("EXPORT_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+EXPORT_NET_WRITE_TIMEOUT = int(os.environ.get("EXPORT_NET_WRITE_TIMEOUT", "600"))
+EXPORT_JOBS_DIR = os.environ.get("EXPORT_JOBS_DIR", os.path.join(BACKEND_DIR, "generated_exports"))
+EXPORT_JOB_WORKERS = int(os.environ.get("EXPORT_JOB_WORKERS", "2"))
+EXPORT_JOB_TTL_HOURS = int(os.environ.get("EXPORT_JOB_TTL_HOURS", "24"))
+EXPORT_JOB_STALE_MINUTES = int(os.environ.get("EXPORT_JOB_STALE_MINUTES", "60"))
+STREAM_BLOCK_BYTES = 64 * 1024
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# Символи, які openpyxl не приймає у клітинках (керуючі, крім \t \n \r)
+_ILLEGAL_XLSX_RE = re.compile(r"[\000-\010]|[\013-\014]|[\016-\037]")
+
+
+@dataclass
+class ExportSpec:
+    """
+    Опис експорту: SQL + параметри, заголовки, перетворення рядка БД у рядок файлу.
+    widths - ширини колонок XLSX (write-only режим не вміє автопідбір після запису).
+    """
+    name: str
+    sql: str
+    columns: List[str]
+    params: Dict[str, Any] = field(default_factory=dict)
+    row: Callable[[Sequence], Sequence] = list
+    filename: str = "export"
+    sheet_title: str = "Export"
+    widths: Optional[List[int]] = None
+
+
+_BUILDERS: Dict[str, Callable[..., ExportSpec]] = {}
+
+
+def export_builder(name: str):
+    """Зареєструвати fn(db, **params) -> ExportSpec під іменем (для фонових задач)"""
+    def decorator(fn):
+        _BUILDERS[name] = fn
+        return fn
+    return decorator
+
+
+def build_spec(db: Session, name: str, **params) -> ExportSpec:
+    if name not in _BUILDERS:
+        raise HTTPException(status_code=404, detail=f"Невідомий експорт: {name}")
+    return _BUILDERS[name](db, **params)
+
+
+def check_format(fmt: str) -> str:
+    fmt = (fmt or "csv").lower()
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Непідтримуваний формат: {fmt}")
+    return fmt
+
+
+# ============================================================
+# READ
+# ============================================================
+
+def _connect():
+    from database_rentalhub import rh_engine
+    return rh_engine.connect()
+
+
+def stream_rows(spec: ExportSpec, chunk_rows: int = EXPORT_CHUNK_ROWS,
+                connect: Callable[[], Any] = None) -> Iterator[List[Sequence]]:
+    """
+    Порції рядків (уже перетворених spec.row) з небуферизованого курсора
+    на окремому з'єднанні.
+    """
+    conn = (connect or _connect)()
+    finished = False
+    try:
+        try:
+            # Повільний клієнт не повинен обірвати потік з боку MySQL
+            conn.execute(text(f"SET SESSION net_write_timeout = {int(EXPORT_NET_WRITE_TIMEOUT)}"))
+        except Exception:
+            pass
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(
+            text(spec.sql), spec.params
+        )
+        while True:
+            rows = result.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield [spec.row(row) for row in rows]
+        finished = True
+    finally:
+        if not finished:
+            # Клієнт обірвав завантаження: не дочитувати решту результату, а викинути з'єднання
+            conn.invalidate()
+        conn.close()
+
+
+# ============================================================
+# CSV
+# ============================================================
+
+def csv_chunks(spec: ExportSpec, chunks: Iterable[List[Sequence]]) -> Iterator[bytes]:
+    """UTF-8 CSV з BOM (для Excel): заголовок, далі по порції рядків"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
+    buffer.write('\ufeff')
+    writer.writerow(spec.columns)
+    yield buffer.getvalue().encode("utf-8")
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def write_csv(spec: ExportSpec, chunks: Iterable[List[Sequence]], fileobj) -> int:
+    """CSV у файл (фонова задача); повертає кількість рядків"""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for rows in chunks:
+            count += len(rows)
+            yield rows
+
+    for block in csv_chunks(spec, counted()):
+        fileobj.write(block)
+    return count
+
+
+# ============================================================
+# XLSX
+# ============================================================
+
+def _xlsx_value(value):
+    if isinstance(value, str):
+        return _ILLEGAL_XLSX_RE.sub("", value)
+    return value
+
+
+def write_xlsx(spec: ExportSpec, chunks: Iterable[List[Sequence]], fileobj) -> int:
+    """Write-only книга (рядки не тримаються в пам'яті); повертає кількість рядків"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=spec.sheet_title[:31])
+    widths = spec.widths or [min(max(len(c) + 4, 12), 50) for c in spec.columns]
+    for index, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+    ws.freeze_panes = "A2"
+
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF", size=11)
+    header = []
+    for title in spec.columns:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+        header.append(cell)
+    ws.append(header)
+
+    count = 0
+    for rows in chunks:
+        for row in rows:
+            ws.append([_xlsx_value(v) for v in row])
+        count += len(rows)
+    wb.save(fileobj)
+    return count
+
+
+def _iter_file(fileobj) -> Iterator[bytes]:
+    try:
+        while True:
+            block = fileobj.read(STREAM_BLOCK_BYTES)
+            if not block:
+                break
+            yield block
+    finally:
+        fileobj.close()
+
+
+# ============================================================
+# RESPONSES
+# ============================================================
+
+def download_filename(spec: ExportSpec, fmt: str) -> str:
+    return f"{spec.filename}.{fmt}"
+
+
+def content_disposition(filename: str) -> str:
+    if filename.isascii():
+        return f"attachment; filename={filename}"
+    return f"attachment; filename*=UTF-8''{quote(filename)}"
+
+
+def export_response(db: Session, name: str, fmt: str = "csv", **params) -> StreamingResponse:
+    """StreamingResponse для зареєстрованого експорту"""
+    fmt = check_format(fmt)
+    spec = build_spec(db, name, **params)
+    if fmt == "csv":
+        body = csv_chunks(spec, stream_rows(spec))
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+        try:
+            write_xlsx(spec, stream_rows(spec), spool)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        body = _iter_file(spool)
+    response = StreamingResponse(body, media_type=FORMATS[fmt])
+    response.headers["Content-Disposition"] = content_disposition(download_filename(spec, fmt))
+    response.headers["Access-Control-Expose-Headers"] = "Content-Disposition"
+    return response
+
+
+def start_export(db: Session, name: str, fmt: str = "csv", background: bool = False, **params):
+    """Відповідь одразу (стрімінг) або фонова задача з посиланням на статус"""
+    if not background:
+        return export_response(db, name, fmt, **params)
+    job_id = get_export_jobs().submit(db, name, fmt, params)
+    return {"job_id": job_id, "status": "queued", "status_url": f"/api/export/jobs/{job_id}"}
+
+
+# ============================================================
+# BACKGROUND JOBS
+# ============================================================
+
+class ExportJobs:
+    """Фонові експорти: export_jobs (стан) + файли в EXPORT_JOBS_DIR"""
+
+    def __init__(self, directory: str = EXPORT_JOBS_DIR, workers: int = EXPORT_JOB_WORKERS,
+                 session_factory: Optional[Callable[[], Session]] = None):
+        self.directory = directory
+        self.workers = workers
+        self._session_factory = session_factory
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def _open_session(self) -> Session:
+        if self._session_factory is None:
+            from database_rentalhub import get_rh_db_sync
+            self._session_factory = get_rh_db_sync
+        return self._session_factory()
+
+    def ensure_table(self, db: Session):
+        if self._table_ready:
+            return
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS export_jobs (
+                id VARCHAR(36) NOT NULL PRIMARY KEY,
+                export_name VARCHAR(50) NOT NULL,
+                format VARCHAR(10) NOT NULL,
+                params TEXT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                filename VARCHAR(255) NULL,
+                file_path VARCHAR(500) NULL,
+                rows_written INT NULL,
+                error TEXT NULL,
+                created_by VARCHAR(100) NULL,
+                created_at DATETIME NOT NULL,
+                finished_at DATETIME NULL,
+                INDEX idx_export_jobs_created (created_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """))
+        self._table_ready = True
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export-job")
+            return self._executor
+
+    def submit(self, db: Session, name: str, fmt: str, params: Dict[str, Any],
+               created_by: Optional[str] = None) -> str:
+        """Поставити експорт у чергу (commit); повертає id задачі"""
+        fmt = check_format(fmt)
+        if name not in _BUILDERS:
+            raise HTTPException(status_code=404, detail=f"Невідомий експорт: {name}")
+        self.ensure_table(db)
+        self.cleanup(db)
+        job_id = str(uuid.uuid4())
+        db.execute(text("""
+            INSERT INTO export_jobs (id, export_name, format, params, status, created_by, created_at)
+            VALUES (:id, :name, :format, :params, 'queued', :created_by, :now)
+        """), {"id": job_id, "name": name, "format": fmt, "params": json.dumps(params, default=str),
+               "created_by": created_by, "now": datetime.now()})
+        db.commit()
+        self._pool().submit(self.run, job_id, name, fmt, params)
+        return job_id
+
+    def run(self, job_id: str, name: str, fmt: str, params: Dict[str, Any]):
+        """Виконати задачу (у фоновому потоці, своя сесія)"""
+        db = self._open_session()
+        path = None
+        try:
+            self.ensure_table(db)
+            db.execute(text("UPDATE export_jobs SET status = 'running' WHERE id = :id"), {"id": job_id})
+            db.commit()
+            spec = build_spec(db, name, **params)
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{job_id}.{fmt}")
+            with open(path, "wb") as f:
+                if fmt == "csv":
+                    count = write_csv(spec, stream_rows(spec), f)
+                else:
+                    count = write_xlsx(spec, stream_rows(spec), f)
+            db.execute(text("""
+                UPDATE export_jobs
+                SET status = 'done', filename = :filename, file_path = :path,
+                    rows_written = :rows, finished_at = :now
+                WHERE id = :id
+            """), {"id": job_id, "filename": download_filename(spec, fmt), "path": path,
+                   "rows": count, "now": datetime.now()})
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning("Export job %s (%s) failed: %s", job_id, name, e)
+            if path and os.path.exists(path):
+                os.remove(path)
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            db.execute(text("""
+                UPDATE export_jobs SET status = 'failed', error = :error, finished_at = :now WHERE id = :id
+            """), {"id": job_id, "error": str(detail)[:2000], "now": datetime.now()})
+            db.commit()
+        finally:
+            db.close()
+
+    def get(self, db: Session, job_id: str) -> Optional[Dict[str, Any]]:
+        self.ensure_table(db)
+        row = db.execute(text("""
+            SELECT id, export_name, format, status, filename, file_path, rows_written, error,
+                   created_at, finished_at
+            FROM export_jobs WHERE id = :id
+        """), {"id": job_id}).fetchone()
+        if not row:
+            return None
+        return {
+            "id": row[0],
+            "export": row[1],
+            "format": row[2],
+            "status": row[3],
+            "filename": row[4],
+            "file_path": row[5],
+            "rows": row[6],
+            "error": row[7],
+            "created_at": row[8].isoformat() if row[8] else None,
+            "finished_at": row[9].isoformat() if row[9] else None,
+            "download_url": f"/api/export/jobs/{row[0]}/download" if row[3] == "done" else None,
+        }
+
+    def fail_interrupted(self, db: Session) -> int:
+        """
+        queued / running задачі, старші за EXPORT_JOB_STALE_MINUTES, -> failed: пул потоків
+        живе в процесі, тож після рестарту їх ніхто не дороблює. Молодші можуть виконуватися
+        іншим воркером - їх не чіпаємо.
+        """
+        self.ensure_table(db)
+        now = datetime.now()
+        result = db.execute(text("""
+            UPDATE export_jobs
+            SET status = 'failed', error = :error, finished_at = :now
+            WHERE status IN ('queued', 'running') AND created_at < :cutoff
+        """), {"error": "Експорт перервано перезапуском сервера, запустіть його ще раз", "now": now,
+               "cutoff": now - timedelta(minutes=EXPORT_JOB_STALE_MINUTES)})
+        return result.rowcount or 0
+
+    def cleanup(self, db: Session) -> int:
+        """Видалити задачі і файли, старші за EXPORT_JOB_TTL_HOURS; позначити перервані задачі"""
+        self.fail_interrupted(db)
+        cutoff = datetime.now() - timedelta(hours=EXPORT_JOB_TTL_HOURS)
+        rows = db.execute(text("SELECT id, file_path FROM export_jobs WHERE created_at < :cutoff"),
+                          {"cutoff": cutoff}).fetchall()
+        for _, path in rows:
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning("Export file cleanup failed: %s", e)
+        if rows:
+            db.execute(text("DELETE FROM export_jobs WHERE id IN :ids"), {"ids": tuple(r[0] for r in rows)})
+        return len(rows)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+_jobs: Optional[ExportJobs] = None
+
+
+def get_export_jobs() -> ExportJobs:
+    global _jobs
+    if _jobs is None:
+        _jobs = ExportJobs()
+    return _jobs
@@ -0,0 +1,571 @@
+"""
+Finance daily rollups - передагреговані суми fin_payments / fin_expenses по днях.
+
+Finance Hub (payouts-stats, hub/overview, каса) рахував баланси SUM(...) по всьому
+журналу з початку часів. Тут журнал згортається в таблицю fin_daily_rollups:
+
+    (day, source, kind, category, method, currency, status) -> total, cnt
+
+    source   - 'payment' | 'expense'
+    kind     - payment_type (оплати) / expense_type (витрати)
+    category - код категорії витрати (для оплат '')
+    NULL-значення зберігаються як ''; рядки з occurred_at = NULL - у дні ROLLUP_EPOCH.
+
+Правила:
+- ролапи будуються лише для днів < сьогодні (built_through = вчора), дні після built_through
+  (сьогодні, або вся історія до першої побудови) читаються з сирих таблиць - усі записи
+  з occurred_at = NOW() не потребують оновлення ролапів
+- побудова - у фоновому потоці (старт сервера / перше читання після опівночі), під
+  GET_LOCK - лише один воркер; читачі не чекають на побудову і не комітять
+- записи в минулі дні (явний occurred_at, зміна/видалення старих оплат) позначають день
+  через mark_dirty(db, ...) - день перераховується в тій самій транзакції перед commit
+- при щоденному "перекочуванні" built_through перераховуються ще ROLLUP_RECHECK_DAYS
+  попередніх днів; close_month перебудовує свій місяць
+- check_consistency() порівнює ролапи з сирими таблицями (і за потреби виправляє)
+
+Usage:
+    rows = rollup_totals(db, PAYMENT_SOURCE, start=month_start, end=month_end)
+    cash = sum_totals(rows, kinds=["rent"], methods=["cash"], statuses=["completed", "confirmed"])
+"""
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from utils.commit_tracking import before_commit, run_in_savepoint
+from utils.named_lock import named_lock
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_SOURCE = "payment"
+EXPENSE_SOURCE = "expense"
+SOURCES = (PAYMENT_SOURCE, EXPENSE_SOURCE)
+
+ROLLUP_EPOCH = date(1970, 1, 1)
+ROLLUP_RECHECK_DAYS = int(os.environ.get("FIN_ROLLUP_RECHECK_DAYS", "7"))
+
+_DIRTY_KEY = "fin_rollup_dirty_days"
+_BUILD_LOCK = "fin_daily_rollups_build"
+
+# (kind, category, method, currency, status) -> [total, cnt]
+RollupKey = Tuple[str, str, str, str, str]
+RollupTotals = Dict[RollupKey, List]
+
+_SOURCE_SQL = {
+    PAYMENT_SOURCE: {
+        "column": "p.occurred_at",
+        "select": """
+            SELECT {day} AS day, COALESCE(p.payment_type, '') AS kind, '' AS category,
+                   COALESCE(p.method, '') AS method, COALESCE(p.currency, '') AS currency,
+                   COALESCE(p.status, '') AS status,
+                   COALESCE(SUM(p.amount), 0) AS total, COUNT(*) AS cnt
+            FROM fin_payments p
+            WHERE {where}
+            GROUP BY day, kind, category, method, currency, status
+        """,
+    },
+    EXPENSE_SOURCE: {
+        "column": "e.occurred_at",
+        "select": """
+            SELECT {day} AS day, COALESCE(e.expense_type, '') AS kind, COALESCE(c.code, '') AS category,
+                   COALESCE(e.method, '') AS method, COALESCE(e.currency, '') AS currency,
+                   COALESCE(e.status, '') AS status,
+                   COALESCE(SUM(e.amount), 0) AS total, COUNT(*) AS cnt
+            FROM fin_expenses e
+            LEFT JOIN fin_categories c ON c.id = e.category_id
+            WHERE {where}
+            GROUP BY day, kind, category, method, currency, status
+        """,
+    },
+}
+
+_lock = threading.Lock()
+_tables_ready = False
+_built_through: Optional[date] = None
+_build_thread: Optional[threading.Thread] = None
+_build_thread_lock = threading.Lock()
+
+
+def _as_date(value) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    return value
+
+
+def _midnight(value: date) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+def ensure_rollup_tables(db: Session):
+    """
+    Створити fin_daily_rollups / fin_rollup_state якщо немає.
+    DDL - в окремому з'єднанні: у MySQL CREATE TABLE неявно комітить поточну транзакцію,
+    а викликач може бути посеред запису (before_commit hook).
+    """
+    global _tables_ready
+    if _tables_ready:
+        return
+    bind = db.get_bind()
+    with getattr(bind, "engine", bind).connect() as conn:
+        _create_rollup_tables(conn)
+        conn.commit()
+    _tables_ready = True
+
+
+def _create_rollup_tables(db):
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS fin_daily_rollups (
+            day DATE NOT NULL,
+            source VARCHAR(10) NOT NULL,
+            kind VARCHAR(50) NOT NULL DEFAULT '',
+            category VARCHAR(50) NOT NULL DEFAULT '',
+            method VARCHAR(20) NOT NULL DEFAULT '',
+            currency VARCHAR(10) NOT NULL DEFAULT '',
+            status VARCHAR(20) NOT NULL DEFAULT '',
+            total DECIMAL(14,2) NOT NULL DEFAULT 0,
+            cnt INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, source, kind, category, method, currency, status)
+        )
+    """))
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS fin_rollup_state (
+            id INT NOT NULL PRIMARY KEY,
+            built_through DATE NULL,
+            updated_at DATETIME NULL
+        )
+    """))
+
+
+def _range_where(column: str, start: Optional[date], end: Optional[date]) -> Tuple[str, Dict]:
+    """Умова по дням [start, end); start=None або <= ROLLUP_EPOCH - разом з occurred_at IS NULL"""
+    parts, params = [], {}
+    if start is not None and start > ROLLUP_EPOCH:
+        parts.append(f"{column} >= :range_start")
+        params["range_start"] = _midnight(start)
+    if end is not None:
+        parts.append(f"{column} < :range_end")
+        params["range_end"] = _midnight(end)
+    where = " AND ".join(parts) or "1=1"
+    if start is None or start <= ROLLUP_EPOCH:
+        where = f"(({where}) OR {column} IS NULL)"
+    return where, params
+
+
+def rebuild_range(db: Session, start: Optional[date], end: date, today: Optional[date] = None) -> int:
+    """
+    Перерахувати ролапи за дні [start, end) із сирих таблиць (start=None - з початку).
+    end обрізається до сьогодні - сьогоднішні рядки завжди читаються наживо.
+    Не комітить - виконується в транзакції викликача.
+    """
+    ensure_rollup_tables(db)
+    start = _as_date(start)
+    end = min(_as_date(end), _as_date(today) or date.today())
+    if start is not None and start >= end:
+        return 0
+    inserted = 0
+    for source in SOURCES:
+        spec = _SOURCE_SQL[source]
+        column = spec["column"]
+        delete_sql = "DELETE FROM fin_daily_rollups WHERE source = :source AND day < :end_day"
+        delete_params = {"source": source, "end_day": end}
+        if start is not None:
+            delete_sql += " AND day >= :start_day"
+            delete_params["start_day"] = start
+        db.execute(text(delete_sql), delete_params)
+
+        where, params = _range_where(column, start, end)
+        select_sql = spec["select"].format(day=f"COALESCE(DATE({column}), :epoch)", where=where)
+        result = db.execute(text(f"""
+            INSERT INTO fin_daily_rollups (day, source, kind, category, method, currency, status, total, cnt)
+            SELECT g.day, :source, g.kind, g.category, g.method, g.currency, g.status, g.total, g.cnt
+            FROM ({select_sql}) g
+        """), {**params, "source": source, "epoch": ROLLUP_EPOCH})
+        inserted += max(result.rowcount or 0, 0)
+    return inserted
+
+
+def refresh_days(db: Session, days: Iterable) -> int:
+    """Перерахувати окремі дні (лише вже побудовані: < сьогодні і <= built_through)"""
+    built = read_built_through(db)
+    if built is None:
+        return 0
+    today = date.today()
+    inserted = 0
+    for day in sorted({_as_date(d) for d in days if d is not None}):
+        if day >= today or day > built:
+            continue
+        inserted += rebuild_range(db, day, day + timedelta(days=1))
+    return inserted
+
+
+def read_built_through(db: Session) -> Optional[date]:
+    ensure_rollup_tables(db)
+    row = db.execute(text("SELECT built_through FROM fin_rollup_state WHERE id = 1")).fetchone()
+    return _as_date(row[0]) if row else None
+
+
+def _write_built_through(db: Session, day: date):
+    params = {"day": day, "now": datetime.now()}
+    result = db.execute(text("""
+        UPDATE fin_rollup_state SET built_through = :day, updated_at = :now WHERE id = 1
+    """), params)
+    if not result.rowcount:
+        db.execute(text("""
+            INSERT INTO fin_rollup_state (id, built_through, updated_at) VALUES (1, :day, :now)
+        """), params)
+
+
+def ensure_built(db: Session, today: Optional[date] = None) -> date:
+    """
+    Довести ролапи до вчорашнього дня. Перший виклик будує всю історію,
+    далі раз на день - нові дні + ROLLUP_RECHECK_DAYS попередніх.
+    """
+    global _built_through
+    today = _as_date(today) or date.today()
+    target = today - timedelta(days=1)
+    if _built_through is not None and _built_through >= target:
+        return _built_through
+
+    with _lock, named_lock(db, _BUILD_LOCK) as acquired:
+        built = read_built_through(db)
+        if not acquired:
+            # будує інший воркер
+            return built
+        if built is None:
+            rebuild_range(db, None, today, today)
+        elif built < target:
+            rebuild_range(db, built - timedelta(days=ROLLUP_RECHECK_DAYS - 1), today, today)
+        if built is None or built < target:
+            _write_built_through(db, target)
+            db.commit()
+            logger.info("fin_daily_rollups built through %s", target)
+            built = target
+        _built_through = built
+    return built
+
+
+def _build():
+    from database_rentalhub import get_rh_db_sync
+
+    db = get_rh_db_sync()
+    try:
+        logger.info(f"Finance rollups built through {ensure_built(db)}")
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Finance rollups build skipped: {e}")
+    finally:
+        db.close()
+
+
+def _spawn(target, name: str) -> threading.Thread:
+    """Запуск фонового потоку (тести підміняють)"""
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def build_in_background():
+    """ensure_built у фоновому потоці (не більше одного одночасно)"""
+    global _build_thread
+    with _build_thread_lock:
+        if _lock.locked() or (_build_thread is not None and _build_thread.is_alive()):
+            return
+        _build_thread = _spawn(_build, "finance-rollups")
+
+
+def rollups_through(db: Session, today: Optional[date] = None) -> Optional[date]:
+    """
+    Останній день, за який ролапи вже побудовані - без очікування на побудову.
+    Якщо ролапи відстають від вчорашнього дня - запускає фонову побудову.
+    """
+    global _built_through
+    today = _as_date(today) or date.today()
+    target = today - timedelta(days=1)
+    if _built_through is not None and _built_through >= target:
+        return _built_through
+    built = read_built_through(db)
+    if built is not None and built >= target:
+        # побудовано іншим воркером
+        _built_through = built
+        return built
+    build_in_background()
+    return built
+
+
+# ============================================================
+# WRITE HOOKS
+# ============================================================
+
+def mark_dirty(db: Session, *moments):
+    """Позначити дні (datetime/date/ISO-рядок) для перерахунку перед db.commit()"""
+    days = db.info.setdefault(_DIRTY_KEY, set())
+    for moment in moments:
+        if moment is not None:
+            days.add(_as_date(moment))
+
+
+def _mark_row_dirty(db: Session, table: str, row_id):
+    row = db.execute(text(f"SELECT occurred_at FROM {table} WHERE id = :id"), {"id": row_id}).fetchone()
+    if row:
+        # NULL occurred_at живе в дні ROLLUP_EPOCH
+        mark_dirty(db, row[0] or ROLLUP_EPOCH)
+
+
+def mark_payment_dirty(db: Session, payment_id):
+    """Викликати ДО зміни/видалення оплати - перерахувати її (старий) день"""
+    _mark_row_dirty(db, "fin_payments", payment_id)
+
+
+def mark_expense_dirty(db: Session, expense_id):
+    _mark_row_dirty(db, "fin_expenses", expense_id)
+
+
+def _refresh_dirty_days(session: Session, days: set):
+    today = date.today()
+    if all(day >= today for day in days):
+        return
+    # Ролапи не повинні ламати запис: при збої SAVEPOINT відкочує і DELETE дня,
+    # тож лишаються попередні рядки, а дрейф виправить recheck / check_consistency
+    run_in_savepoint(session, f"fin_daily_rollups refresh for {sorted(days)}", lambda: refresh_days(session, days))
+
+
+before_commit(_DIRTY_KEY, _refresh_dirty_days, session_info=True)
+
+
+def rename_category(db: Session, category_id: int, old_code: Optional[str], new_code: Optional[str]) -> None:
+    """
+    Код категорії витрат змінено (ролапи ключуються кодом). Виконується в транзакції
+    викликача ПІСЛЯ UPDATE fin_categories:
+    - старий код більше ніде не використовується - рядки переносяться під новий код
+      (з додаванням до вже наявних рядків нового коду)
+    - старий код лишився в іншої категорії - дні зі старим кодом перераховуються перед commit
+    """
+    old, new = old_code or "", new_code or ""
+    if old == new:
+        return
+    ensure_rollup_tables(db)
+    params = {"source": EXPENSE_SOURCE, "old": old, "new": new, "id": category_id}
+    shared = db.execute(text("""
+        SELECT COUNT(*) FROM fin_categories WHERE COALESCE(code, '') = :old AND id <> :id
+    """), params).scalar()
+    if shared:
+        days = db.execute(text("""
+            SELECT DISTINCT day FROM fin_daily_rollups WHERE source = :source AND category = :old
+        """), params).fetchall()
+        mark_dirty(db, *[row[0] for row in days])
+        return
+    db.execute(text("""
+        INSERT INTO fin_daily_rollups (day, source, kind, category, method, currency, status, total, cnt)
+        SELECT g.day, g.source, g.kind, :new, g.method, g.currency, g.status, g.total, g.cnt
+        FROM (
+            SELECT day, source, kind, method, currency, status, total, cnt
+            FROM fin_daily_rollups WHERE source = :source AND category = :old
+        ) g
+        ON DUPLICATE KEY UPDATE total = fin_daily_rollups.total + VALUES(total),
+                                cnt = fin_daily_rollups.cnt + VALUES(cnt)
+    """), params)
+    db.execute(text("""
+        DELETE FROM fin_daily_rollups WHERE source = :source AND category = :old
+    """), params)
+
+
+def refresh_days_now(*moments):
+    """Для записів поза SQLAlchemy-сесією (прямий pymysql): перерахувати минулі дні"""
+    today = date.today()
+    days = {_as_date(m) for m in moments if m is not None}
+    if not any(day < today for day in days):
+        return
+    from database_rentalhub import get_rh_db_sync
+    db = get_rh_db_sync()
+    try:
+        mark_dirty(db, *days)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning("fin_daily_rollups refresh failed for %s: %s", sorted(days), e)
+    finally:
+        db.close()
+
+
+# ============================================================
+# READ
+# ============================================================
+
+def _add_row(totals: RollupTotals, row):
+    key = (row.kind or "", row.category or "", row.method or "", row.currency or "", row.status or "")
+    bucket = totals.setdefault(key, [0.0, 0])
+    bucket[0] += float(row.total or 0)
+    bucket[1] += int(row.cnt or 0)
+
+
+def rollup_totals(
+    db: Session,
+    source: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    today: Optional[date] = None,
+) -> RollupTotals:
+    """
+    Суми за [start, end) (межі - північ; None - без межі):
+    дні до built_through включно - з fin_daily_rollups, далі (сьогодні, або все, поки
+    ролапи будуються у фоні) - з сирої таблиці.
+    """
+    for bound in (start, end):
+        if isinstance(bound, datetime) and bound != _midnight(bound.date()):
+            raise ValueError(f"Rollup range bounds must be midnight, got {bound}")
+    today = _as_date(today) or date.today()
+    built = rollups_through(db, today)
+    # перший день, що читається з сирої таблиці
+    live_from = min(built + timedelta(days=1), today) if built is not None else None
+    start_day, end_day = _as_date(start), _as_date(end)
+    totals: RollupTotals = {}
+
+    if live_from is not None and (start_day is None or start_day < live_from):
+        rollup_end = min(end_day, live_from) if end_day else live_from
+        sql = """
+            SELECT kind, category, method, currency, status, SUM(total) AS total, SUM(cnt) AS cnt
+            FROM fin_daily_rollups
+            WHERE source = :source AND day < :rollup_end
+        """
+        params = {"source": source, "rollup_end": rollup_end}
+        if start_day is not None:
+            sql += " AND day >= :start_day"
+            params["start_day"] = start_day
+        sql += " GROUP BY kind, category, method, currency, status"
+        for row in db.execute(text(sql), params):
+            _add_row(totals, row)
+
+    if live_from is None or end_day is None or end_day > live_from:
+        spec = _SOURCE_SQL[source]
+        if live_from is None:
+            live_start = start_day
+        else:
+            live_start = max(start_day, live_from) if start_day else live_from
+        where, params = _range_where(spec["column"], live_start, end_day)
+        for row in db.execute(text(spec["select"].format(day="''", where=where)), params):
+            _add_row(totals, row)
+    return totals
+
+
+def sum_totals(
+    totals: RollupTotals,
+    kinds: Optional[Iterable[str]] = None,
+    categories: Optional[Iterable[str]] = None,
+    methods: Optional[Iterable[str]] = None,
+    statuses: Optional[Iterable[str]] = None,
+    field: int = 0,
+) -> float:
+    """Сума (field=0) або кількість (field=1) по рядках, що проходять фільтри (None - будь-які)"""
+    kinds, categories, methods, statuses = [
+        set(v) if v is not None else None for v in (kinds, categories, methods, statuses)
+    ]
+    result = 0
+    for (kind, category, method, _currency, status), values in totals.items():
+        if kinds is not None and kind not in kinds:
+            continue
+        if categories is not None and category not in categories:
+            continue
+        if methods is not None and method not in methods:
+            continue
+        if statuses is not None and status not in statuses:
+            continue
+        result += values[field]
+    return result
+
+
+def totals_by(totals: RollupTotals, field: str, **filters) -> Dict[str, float]:
+    """Суми, згруповані по одному з полів ключа: kind/category/method/currency/status"""
+    index = ("kind", "category", "method", "currency", "status").index(field)
+    filter_name = {"kind": "kinds", "category": "categories", "method": "methods",
+                   "status": "statuses"}.get(field)
+    grouped: Dict[str, float] = {}
+    for value in {key[index] for key in totals}:
+        if filter_name:
+            grouped[value] = sum_totals(totals, **{**filters, filter_name: [value]})
+        else:
+            grouped[value] = sum_totals(
+                {k: v for k, v in totals.items() if k[index] == value}, **filters
+            )
+    return grouped
+
+
+# ============================================================
+# CONSISTENCY
+# ============================================================
+
+def check_consistency(
+    db: Session,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    repair: bool = False,
+    tolerance: float = 0.005,
+) -> dict:
+    """
+    Порівняти ролапи з сирими таблицями по днях [start, end) (end за замовчуванням - сьогодні;
+    обрізається до built_through - пізніші дні читаються наживо і не мають ролапів).
+    repair=True - перерахувати дні з розбіжностями.
+    """
+    built = rollups_through(db)
+    start, end = _as_date(start), _as_date(end) or date.today()
+    if built is not None:
+        end = min(end, built + timedelta(days=1))
+    mismatched_days = set()
+    mismatches = []
+    # до першої побудови порівнювати нічого
+    for source in (SOURCES if built is not None else ()):
+        spec = _SOURCE_SQL[source]
+        where, params = _range_where(spec["column"], start, end)
+        raw_sql = spec["select"].format(day=f"COALESCE(DATE({spec['column']}), :epoch)", where=where)
+        raw = {}
+        for row in db.execute(text(raw_sql), {**params, "epoch": ROLLUP_EPOCH}):
+            key = (_as_date(row.day), row.kind, row.category, row.method, row.currency, row.status)
+            raw[key] = (float(row.total or 0), int(row.cnt or 0))
+
+        sql = """
+            SELECT day, kind, category, method, currency, status, total, cnt
+            FROM fin_daily_rollups WHERE source = :source AND day < :end_day
+        """
+        rollup_params = {"source": source, "end_day": end}
+        if start is not None:
+            sql += " AND day >= :start_day"
+            rollup_params["start_day"] = start
+        stored = {}
+        for row in db.execute(text(sql), rollup_params):
+            key = (_as_date(row.day), row.kind, row.category, row.method, row.currency, row.status)
+            stored[key] = (float(row.total or 0), int(row.cnt or 0))
+
+        for key in set(raw) | set(stored):
+            raw_total, raw_cnt = raw.get(key, (0.0, 0))
+            rollup_total, rollup_cnt = stored.get(key, (0.0, 0))
+            if abs(raw_total - rollup_total) > tolerance or raw_cnt != rollup_cnt:
+                mismatched_days.add(key[0])
+                mismatches.append({
+                    "source": source, "day": key[0].isoformat(),
+                    "kind": key[1], "category": key[2], "method": key[3],
+                    "currency": key[4], "status": key[5],
+                    "raw_total": raw_total, "rollup_total": rollup_total,
+                    "raw_count": raw_cnt, "rollup_count": rollup_cnt,
+                })
+
+    repaired = 0
+    if repair and mismatched_days:
+        for day in sorted(mismatched_days):
+            rebuild_range(db, day, day + timedelta(days=1))
+            repaired += 1
+        db.commit()
+
+    return {
+        "consistent": not mismatches,
+        "range": {"start": start.isoformat() if start else None, "end": end.isoformat()},
+        "mismatched_days": len(mismatched_days),
+        "mismatches": sorted(mismatches, key=lambda m: (m["day"], m["source"]))[:200],
+        "repaired_days": repaired,
+    }
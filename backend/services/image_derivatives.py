@@ -0,0 +1,552 @@
+"""
+Image Derivatives - WebP/AVIF варіанти зображень товарів у фоновому пулі процесів.
+
+Раніше upload_product_image, bulk_upload_images та sync_all.download_product_image робили
+thumbnails/ (300px) і medium/ (800px) JPEG через PIL LANCZOS прямо в запиті / циклі cron,
+а каталог та Event Tool вантажили повнорозмірні оригінали. Тут:
+
+- оригінал зберігається і запит одразу повертається; варіанти рахуються в пулі процесів
+  (IMAGE_DERIVATIVE_WORKERS) з обмеженою чергою (IMAGE_DERIVATIVE_QUEUE_SIZE)
+- фіксована драбина ширин IMAGE_VARIANT_WIDTHS у WebP (та AVIF, якщо IMAGE_VARIANT_AVIF=1),
+  без збільшення: uploads/products/variants/<hash[:2]>/<hash>/<width>.<format>
+- ключ - sha256 вмісту; однакові завантаження використовують один файл і одні варіанти
+- image_assets (content_hash -> status, variants) - стан задач, image_asset_sources
+  (products.image_url -> content_hash); pending-рядки доганяються при старті (requeue_pending)
+  і в sync_all
+- image_map() / pick_variant() - srcset-мапа для API та найменший придатний варіант
+- legacy thumbnails/ та medium/ JPEG генеруються там же, у фоні
+
+Usage:
+    source_path, content_hash, duplicate, status = store_original(db, data, sku, ".jpg", PRODUCTS_DIR)
+    db.commit()
+    if status != "ready":
+        get_image_derivative_service().submit(content_hash, os.path.join(PRODUCTS_DIR, ...))
+
+    attach_image_variants(db, items, url_key="image", thumb_width=320)
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(__file__))
+IMAGE_VARIANTS_DIR = os.environ.get(
+    "IMAGE_VARIANTS_DIR", os.path.join(BACKEND_DIR, "uploads", "products", "variants")
+)
+IMAGE_VARIANTS_URL = "uploads/products/variants"
+IMAGE_VARIANT_WIDTHS = tuple(
+    int(w) for w in os.environ.get("IMAGE_VARIANT_WIDTHS", "160,320,640,1024,1600").split(",") if w.strip()
+)
+IMAGE_VARIANT_AVIF = os.environ.get("IMAGE_VARIANT_AVIF", "0").lower() in ("1", "true", "yes")
+IMAGE_DERIVATIVE_WORKERS = int(os.environ.get("IMAGE_DERIVATIVE_WORKERS", "2"))
+IMAGE_DERIVATIVE_QUEUE_SIZE = int(os.environ.get("IMAGE_DERIVATIVE_QUEUE_SIZE", "64"))
+MAX_ATTEMPTS = 3
+MISSING_RECHECK_HOURS = 24
+
+FORMAT_OPTIONS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "avif": {"format": "AVIF", "quality": 55},
+}
+LEGACY_SIZES = {"thumbnails": ((300, 300), "_thumb"), "medium": ((800, 800), "_medium")}
+
+
+def variant_formats() -> Tuple[str, ...]:
+    return ("webp", "avif") if IMAGE_VARIANT_AVIF else ("webp",)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ============================================================
+# WORKER (виконується у процесі пулу)
+# ============================================================
+
+def ladder_widths(source_width: int, widths: Sequence[int] = IMAGE_VARIANT_WIDTHS) -> List[int]:
+    """Ширини драбини без збільшення; вузьке зображення отримує один варіант у своїй ширині"""
+    ladder = sorted(w for w in set(widths) if w < source_width)
+    if source_width <= max(widths) and source_width not in ladder:
+        ladder.append(source_width)
+    return ladder or [source_width]
+
+
+def _atomic_save(img, path: str, **options):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # тимчасовий файл з тим самим розширенням - PIL визначає за ним формат
+    tmp_path = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.{os.path.basename(path)}")
+    img.save(tmp_path, **options)
+    os.replace(tmp_path, path)
+
+
+def _flatten(img):
+    """RGBA/P -> RGB на білому фоні (для JPEG)"""
+    from PIL import Image
+    if img.mode in ("RGBA", "LA", "P"):
+        if img.mode == "P":
+            img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1] if img.mode in ("RGBA", "LA") else None)
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def build_derivatives(
+    source_path: str,
+    digest: str,
+    out_dir: str = IMAGE_VARIANTS_DIR,
+    widths: Sequence[int] = IMAGE_VARIANT_WIDTHS,
+    formats: Sequence[str] = None,
+    legacy_dir: Optional[str] = None,
+) -> dict:
+    """
+    Оригінал -> драбина варіантів. Повертає
+    {"width", "height", "variants": [{"format", "width", "height", "bytes", "path"}]},
+    path - відносно out_dir.
+    """
+    from PIL import Image, ImageOps
+
+    formats = tuple(formats or variant_formats())
+    with Image.open(source_path) as opened:
+        rotated = opened.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+        width, height = (opened.size[1], opened.size[0]) if rotated else opened.size
+        ladder = ladder_widths(width, widths)
+        # JPEG декодується одразу в зменшеному масштабі, не меншому за найбільший варіант
+        opened.draft("RGB", (max(ladder), max(ladder)))
+        img = ImageOps.exif_transpose(opened)
+        img.load()
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.mode or img.mode == "P" else "RGB")
+
+    variants = []
+    current = img
+    # від більшого до меншого: кожен крок зменшує попередній результат, а не оригінал
+    for target in sorted(ladder, reverse=True):
+        if current.size[0] > target:
+            current = current.resize(
+                (target, max(1, round(current.size[1] * target / current.size[0]))),
+                Image.Resampling.LANCZOS
+            )
+        for fmt in formats:
+            rel_path = f"{digest[:2]}/{digest}/{current.size[0]}.{fmt}"
+            path = os.path.join(out_dir, rel_path)
+            _atomic_save(current, path, **FORMAT_OPTIONS[fmt])
+            variants.append({
+                "format": fmt, "width": current.size[0], "height": current.size[1],
+                "bytes": os.path.getsize(path), "path": rel_path,
+            })
+
+    if legacy_dir:
+        name, ext = os.path.splitext(os.path.basename(source_path))
+        flat = _flatten(img)
+        for subdir, (size, suffix) in LEGACY_SIZES.items():
+            thumb = flat.copy()
+            thumb.thumbnail(size, Image.Resampling.LANCZOS)
+            _atomic_save(thumb, os.path.join(legacy_dir, subdir, f"{name}{suffix}{ext}"), quality=85, optimize=True)
+
+    variants.sort(key=lambda v: (v["format"], v["width"]))
+    return {"width": width, "height": height, "variants": variants}
+
+
+# ============================================================
+# VARIANT MAP
+# ============================================================
+
+def variant_url(rel_path: str) -> str:
+    return f"{IMAGE_VARIANTS_URL}/{rel_path}"
+
+
+def image_map(source_path: str, width: int, height: int, variants: List[dict]) -> dict:
+    """srcset-мапа для API: {"original", "width", "height", "sources": {fmt: {w: url}}, "srcset": {fmt: str}}"""
+    sources: Dict[str, Dict[str, str]] = {}
+    for v in sorted(variants, key=lambda v: v["width"]):
+        sources.setdefault(v["format"], {})[str(v["width"])] = variant_url(v["path"])
+    return {
+        "original": source_path,
+        "width": width,
+        "height": height,
+        "sources": sources,
+        "srcset": {
+            fmt: ", ".join(f"{url} {w}w" for w, url in urls.items())
+            for fmt, urls in sources.items()
+        },
+    }
+
+
+def pick_variant(mapping: Optional[dict], width: int, formats: Sequence[str] = ("webp",)) -> Optional[str]:
+    """Найменший варіант не вужчий за width (або найбільший з наявних); без варіантів - оригінал"""
+    if not mapping:
+        return None
+    for fmt in formats:
+        urls = mapping.get("sources", {}).get(fmt)
+        if not urls:
+            continue
+        ordered = sorted(urls.items(), key=lambda kv: int(kv[0]))
+        for w, url in ordered:
+            if int(w) >= width:
+                return url
+        return ordered[-1][1]
+    return mapping.get("original")
+
+
+# ============================================================
+# DB: image_assets
+# ============================================================
+
+_tables_ready = False
+
+
+def ensure_image_tables(db: Session):
+    global _tables_ready
+    if _tables_ready:
+        return
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS image_assets (
+            content_hash CHAR(64) NOT NULL PRIMARY KEY,
+            source_path VARCHAR(500) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            width INT NULL,
+            height INT NULL,
+            variants JSON NULL,
+            error TEXT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_image_assets_status (status)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """))
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS image_asset_sources (
+            source_path VARCHAR(255) NOT NULL PRIMARY KEY,
+            content_hash CHAR(64) NOT NULL,
+            INDEX idx_image_asset_sources_hash (content_hash)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """))
+    # products.image_url без файлу на диску - backfill_assets не вибирає їх щоразу знову
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS image_asset_missing (
+            source_path VARCHAR(255) NOT NULL PRIMARY KEY,
+            checked_at DATETIME NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """))
+    _tables_ready = True
+
+
+def register_asset(db: Session, digest: str, source_path: str):
+    """
+    Оригінал -> image_assets (pending, якщо вміст новий) + image_asset_sources.
+    source_path в image_assets - файл, з якого пул будує варіанти.
+    """
+    ensure_image_tables(db)
+    db.execute(text("""
+        INSERT INTO image_assets (content_hash, source_path, status, created_at, updated_at)
+        VALUES (:hash, :path, 'pending', NOW(), NOW())
+        ON DUPLICATE KEY UPDATE source_path = VALUES(source_path), updated_at = NOW()
+    """), {"hash": digest, "path": source_path})
+    db.execute(text("""
+        INSERT INTO image_asset_sources (source_path, content_hash) VALUES (:path, :hash)
+        ON DUPLICATE KEY UPDATE content_hash = VALUES(content_hash)
+    """), {"hash": digest, "path": source_path})
+
+
+def store_original(
+    db: Session, data: bytes, sku: str, ext: str, products_dir: str
+) -> Tuple[str, str, bool, str]:
+    """
+    Зберегти оригінал (або знайти вже збережений з тим самим вмістом).
+    Повторне завантаження вмісту з failed-варіантами повертає його в pending
+    (з новим лімітом спроб) - його треба знову поставити в чергу.
+
+    Returns:
+        (relative_path "uploads/products/...", content_hash, duplicate, status варіантів)
+    """
+    ensure_image_tables(db)
+    digest = content_hash(data)
+    existing = db.execute(text(
+        "SELECT source_path, status FROM image_assets WHERE content_hash = :hash"
+    ), {"hash": digest}).fetchone()
+    if existing and os.path.exists(os.path.join(products_dir, os.path.basename(existing[0]))):
+        source_path, status = existing[0], existing[1] or "pending"
+        if status == "failed":
+            db.execute(text("""
+                UPDATE image_assets
+                SET status = 'pending', attempts = 0, error = NULL, updated_at = NOW()
+                WHERE content_hash = :hash
+            """), {"hash": digest})
+            status = "pending"
+        return source_path, digest, True, status
+
+    safe_sku = sku.replace("/", "_").replace("\\", "_").replace(" ", "_")
+    filename = f"{safe_sku}_{int(time.time())}_{digest[:8]}{ext}"
+    path = os.path.join(products_dir, filename)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    relative_path = f"uploads/products/{filename}"
+    register_asset(db, digest, relative_path)
+    return relative_path, digest, False, "pending"
+
+
+def save_result(db: Session, digest: str, result: Optional[dict] = None, error: Optional[str] = None):
+    if result is not None:
+        db.execute(text("""
+            UPDATE image_assets
+            SET status = 'ready', width = :width, height = :height, variants = :variants,
+                error = NULL, updated_at = NOW()
+            WHERE content_hash = :hash
+        """), {
+            "hash": digest, "width": result["width"], "height": result["height"],
+            "variants": json.dumps(result["variants"]),
+        })
+    else:
+        db.execute(text("""
+            UPDATE image_assets
+            SET status = IF(attempts + 1 >= :max_attempts, 'failed', 'pending'),
+                attempts = attempts + 1, error = :error, updated_at = NOW()
+            WHERE content_hash = :hash
+        """), {"hash": digest, "error": (error or "")[:2000], "max_attempts": MAX_ATTEMPTS})
+
+
+def _parse_variants(value) -> List[dict]:
+    if not value:
+        return []
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+
+def load_image_maps(db: Session, image_urls: Iterable[Optional[str]]) -> Dict[str, dict]:
+    """{source_path: image_map} для готових варіантів"""
+    paths = sorted({u for u in image_urls if u and u.startswith("uploads/products/")})
+    if not paths:
+        return {}
+    rows = db.execute(text("""
+        SELECT s.source_path, a.width, a.height, a.variants
+        FROM image_asset_sources s
+        JOIN image_assets a ON a.content_hash = s.content_hash
+        WHERE s.source_path IN :paths AND a.status = 'ready'
+    """).bindparams(bindparam("paths", expanding=True)), {"paths": paths}).fetchall()
+    return {r[0]: image_map(r[0], r[1], r[2], _parse_variants(r[3])) for r in rows}
+
+
+def attach_image_variants(
+    db: Session, items: List[dict], url_key: str = "image", thumb_width: int = 320
+) -> List[dict]:
+    """Додати до items "image_variants" (srcset-мапа) та "image_thumb" (найменший придатний варіант)"""
+    try:
+        maps = load_image_maps(db, (it.get(url_key) for it in items))
+    except Exception as e:
+        # image_assets ще не створена - віддаємо оригінали
+        logger.warning(f"Image variants unavailable: {e}")
+        maps = {}
+    for it in items:
+        mapping = maps.get(it.get(url_key))
+        it["image_variants"] = mapping
+        it["image_thumb"] = pick_variant(mapping, thumb_width) or it.get(url_key)
+    return items
+
+
+def smallest_image_urls(db: Session, image_urls: Iterable[Optional[str]], width: int) -> Dict[str, str]:
+    """{original: найменший варіант >= width} - для документів з мініатюрами"""
+    try:
+        maps = load_image_maps(db, image_urls)
+    except Exception as e:
+        logger.warning(f"Image variants unavailable: {e}")
+        return {}
+    return {path: pick_variant(mapping, width) for path, mapping in maps.items()}
+
+
+# ============================================================
+# SERVICE
+# ============================================================
+
+def _save_to_db(digest: str, result: Optional[dict], error: Optional[str]):
+    from database_rentalhub import get_rh_db_sync
+    db = get_rh_db_sync()
+    try:
+        save_result(db, digest, result, error)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Could not save image variants for {digest}: {e}")
+    finally:
+        db.close()
+
+
+class ImageDerivativeService:
+    """
+    Черга задач генерації варіантів. submit() не блокує: задача йде в пул процесів,
+    результат пишеться в image_assets з потоку-колбеку. Працює і з async handlers,
+    і з handlers, винесених у threadpool (utils.db_offload).
+    """
+
+    def __init__(
+        self,
+        workers: int = IMAGE_DERIVATIVE_WORKERS,
+        max_queue: int = IMAGE_DERIVATIVE_QUEUE_SIZE,
+        out_dir: str = IMAGE_VARIANTS_DIR,
+        executor_factory: Callable = None,
+        build_func: Callable = build_derivatives,
+        on_done: Callable[[str, Optional[dict], Optional[str]], None] = _save_to_db,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.out_dir = out_dir
+        self.build_func = build_func
+        self.on_done = on_done
+        self._executor_factory = executor_factory or self._default_executor
+        self._executor = None
+        self._inflight: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def _default_executor(self):
+        # spawn: не успадковувати потоки/з'єднання БД батьківського процесу
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = self._executor_factory()
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "inflight": len(self._inflight),
+            "completed": self.completed,
+            "failed": self.failed,
+            "formats": list(variant_formats()),
+            "widths": list(IMAGE_VARIANT_WIDTHS),
+        }
+
+    def submit(self, digest: str, source_file: str, legacy_dir: Optional[str] = None) -> bool:
+        """
+        Поставити генерацію в чергу. False - черга повна (рядок лишається pending
+        і буде підхоплений requeue_pending).
+        """
+        with self._lock:
+            if digest in self._inflight:
+                return True
+            if len(self._inflight) >= self.workers + self.max_queue:
+                return False
+            future = self.executor.submit(self.build_func, source_file, digest, self.out_dir, legacy_dir=legacy_dir)
+            self._inflight[digest] = future
+        future.add_done_callback(lambda f: self._finish(digest, f))
+        return True
+
+    def _finish(self, digest: str, future):
+        result, error = None, None
+        try:
+            result = future.result()
+            self.completed += 1
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            self.failed += 1
+            logger.warning(f"Image variants failed for {digest}: {error}")
+        try:
+            self.on_done(digest, result, error)
+        finally:
+            with self._lock:
+                self._inflight.pop(digest, None)
+
+    def requeue_pending(self, db: Session, products_dir: str, limit: int = 200) -> int:
+        """Поставити в чергу pending-рядки (після рестарту або переповнення черги)"""
+        queued = 0
+        for digest, source_file in pending_assets(db, products_dir, limit):
+            if not self.submit(digest, source_file, legacy_dir=products_dir):
+                break
+            queued += 1
+        return queued
+
+
+def pending_assets(db: Session, products_dir: str, limit: int = 200) -> List[Tuple[str, str]]:
+    """[(content_hash, шлях до оригіналу)] для pending; відсутні файли позначаються помилкою"""
+    ensure_image_tables(db)
+    rows = db.execute(text("""
+        SELECT content_hash, source_path FROM image_assets
+        WHERE status = 'pending' ORDER BY updated_at LIMIT :limit
+    """), {"limit": limit}).fetchall()
+    pending = []
+    for digest, source_path in rows:
+        source_file = os.path.join(products_dir, os.path.basename(source_path))
+        if os.path.exists(source_file):
+            pending.append((digest, source_file))
+        else:
+            save_result(db, digest, error=f"Source file missing: {source_path}")
+    db.commit()
+    return pending
+
+
+def backfill_assets(db: Session, products_dir: str, limit: int = 500) -> int:
+    """
+    Зареєструвати локальні зображення товарів, завантажені до появи image_assets.
+    Шляхи без файлу записуються в image_asset_missing і перевіряються знову
+    не раніше ніж через MISSING_RECHECK_HOURS - інакше вони займали б кожну порцію.
+    """
+    ensure_image_tables(db)
+    rows = db.execute(text("""
+        SELECT DISTINCT p.image_url
+        FROM products p
+        LEFT JOIN image_asset_sources s ON s.source_path = p.image_url
+        LEFT JOIN image_asset_missing m ON m.source_path = p.image_url
+        WHERE p.image_url LIKE 'uploads/products/%' AND s.source_path IS NULL
+          AND (m.source_path IS NULL OR m.checked_at < :recheck_before)
+        LIMIT :limit
+    """), {
+        "limit": limit,
+        "recheck_before": datetime.now() - timedelta(hours=MISSING_RECHECK_HOURS),
+    }).fetchall()
+    registered = 0
+    for (image_url,) in rows:
+        path = os.path.join(products_dir, os.path.basename(image_url))
+        if not os.path.exists(path):
+            db.execute(text("""
+                INSERT INTO image_asset_missing (source_path, checked_at) VALUES (:path, NOW())
+                ON DUPLICATE KEY UPDATE checked_at = NOW()
+            """), {"path": image_url})
+            continue
+        register_asset(db, file_hash(path), image_url)
+        db.execute(text("DELETE FROM image_asset_missing WHERE source_path = :path"), {"path": image_url})
+        registered += 1
+    db.commit()
+    return registered
+
+
+_service: Optional[ImageDerivativeService] = None
+
+
+def get_image_derivative_service() -> ImageDerivativeService:
+    global _service
+    if _service is None:
+        _service = ImageDerivativeService()
+    return _service
@@ -0,0 +1,203 @@
+"""
+Ledger Posting - пакетне проведення транзакцій подвійного запису.
+
+post_transaction() робив на кожну проводку INSERT, SELECT LAST_INSERT_ID(), два пошуки
+рахунків (з sleep-retry) і два INSERT у fin_ledger_entries. Тут:
+
+- коди рахунків fin_accounts -> id кешуються в процесі (AccountCache)
+- fin_transactions - по одному INSERT на проводку з id з відповіді сервера (lastrowid, без
+  SELECT LAST_INSERT_ID()); послідовні id multi-row INSERT не гарантовані
+  (innodb_autoinc_lock_mode=2, auto_increment_increment > 1)
+- fin_ledger_entries - multi-row INSERT-и в транзакції викликача
+- до запису перевіряються суми і рахунки; обидві ноги проводки пишуться з однієї
+  суми, округленої до копійок, тож баланс D/C має сенс перевіряти лише в БД -
+  після запису, до commit, по кожній транзакції окремо (verify_posted)
+
+Usage:
+    tx_ids = post_transactions(db, [
+        LedgerPosting("rent_payment", 1200, "CASH", "RENT_REV", order_id=42),
+        LedgerPosting("deposit_refund", 500, "DEP_LIAB", "BANK", order_id=42),
+    ])
+    db.commit()
+"""
+import math
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+BATCH_SIZE = 500
+_CENT = Decimal("0.01")
+
+
+class LedgerImbalance(Exception):
+    """Сума дебету не дорівнює сумі кредиту"""
+
+
+@dataclass
+class LedgerPosting:
+    tx_type: str
+    amount: float
+    debit_account: str
+    credit_account: str
+    entity_type: Optional[str] = None
+    entity_id: Optional[int] = None
+    category_id: Optional[int] = None
+    order_id: Optional[int] = None
+    damage_case_id: Optional[int] = None
+    vendor_id: Optional[int] = None
+    employee_id: Optional[int] = None
+    note: Optional[str] = None
+    occurred_at: Optional[datetime] = None
+
+
+class AccountCache:
+    """fin_accounts.code -> id; перечитується, якщо код не знайдено"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session):
+        rows = db.execute(text("SELECT code, id FROM fin_accounts")).fetchall()
+        with self._lock:
+            self._ids = {r[0]: r[1] for r in rows}
+
+    def _load_cursor(self, cursor):
+        cursor.execute("SELECT code, id FROM fin_accounts")
+        rows = cursor.fetchall()
+        with self._lock:
+            self._ids = {r["code"]: r["id"] for r in rows}
+
+    def resolve(self, db: Session, codes: Iterable[str]) -> Dict[str, int]:
+        return self._resolve(codes, lambda: self._load(db))
+
+    def resolve_cursor(self, cursor, codes: Iterable[str]) -> Dict[str, int]:
+        """resolve() для pymysql DictCursor (routes/finance)"""
+        return self._resolve(codes, lambda: self._load_cursor(cursor))
+
+    def _resolve(self, codes: Iterable[str], load) -> Dict[str, int]:
+        codes = set(codes)
+        if codes - self._ids.keys():
+            load()
+        missing = codes - self._ids.keys()
+        if missing:
+            raise ValueError(f"Account not found: {', '.join(sorted(missing))}")
+        return {code: self._ids[code] for code in codes}
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = {}
+
+
+account_cache = AccountCache()
+
+
+def _to_cents(amount) -> Decimal:
+    if amount is None or (isinstance(amount, float) and not math.isfinite(amount)):
+        raise ValueError(f"Invalid amount: {amount}")
+    return Decimal(str(amount)).quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def validate_postings(postings: List[LedgerPosting]) -> List[Decimal]:
+    """Перевірка до запису; повертає суми проводок, округлені до копійок"""
+    amounts = []
+    for p in postings:
+        amount = _to_cents(p.amount)
+        if amount < 0:
+            raise ValueError(f"Negative amount for {p.tx_type}: {p.amount}")
+        if p.debit_account == p.credit_account:
+            raise ValueError(f"{p.tx_type}: debit and credit account are the same ({p.debit_account})")
+        amounts.append(amount)
+    return amounts
+
+
+def _insert_many(db: Session, sql_head: str, columns: List[str], rows: List[Dict]):
+    """INSERT ... VALUES (...), (...) пачками по BATCH_SIZE"""
+    for offset in range(0, len(rows), BATCH_SIZE):
+        chunk = rows[offset:offset + BATCH_SIZE]
+        values, params = [], {}
+        for i, row in enumerate(chunk):
+            values.append("(" + ", ".join(f":{col}_{i}" for col in columns) + ")")
+            for col in columns:
+                params[f"{col}_{i}"] = row[col]
+        db.execute(text(f"{sql_head} VALUES {', '.join(values)}"), params)
+
+
+def post_transactions(db: Session, postings: List[LedgerPosting], cache: AccountCache = None) -> List[int]:
+    """
+    Провести список транзакцій. Не комітить: усе пишеться в поточній транзакції сесії,
+    щоб викликач зберіг разом з проводками свої записи (оплати, застави, ...).
+
+    Returns:
+        tx_id для кожної проводки в тому ж порядку
+    """
+    if not postings:
+        return []
+    cache = cache or account_cache
+    amounts = validate_postings(postings)
+    account_ids = cache.resolve(db, {p.debit_account for p in postings} | {p.credit_account for p in postings})
+
+    now = datetime.now()
+    tx_ids: List[int] = []
+    insert_tx = text("""
+        INSERT INTO fin_transactions (tx_type, amount, occurred_at, entity_type, entity_id, category_id, note)
+        VALUES (:tx_type, :amount, :occurred_at, :entity_type, :entity_id, :category_id, :note)
+    """)
+    for p, amount in zip(postings, amounts):
+        result = db.execute(insert_tx, {
+            "tx_type": p.tx_type, "amount": amount, "occurred_at": p.occurred_at or now,
+            "entity_type": p.entity_type, "entity_id": p.entity_id,
+            "category_id": p.category_id, "note": p.note,
+        })
+        tx_ids.append(int(result.lastrowid))
+
+    entries = []
+    for tx_id, p, amount in zip(tx_ids, postings, amounts):
+        for direction, account in (("D", p.debit_account), ("C", p.credit_account)):
+            entries.append({
+                "tx_id": tx_id, "account_id": account_ids[account], "direction": direction,
+                "amount": amount, "order_id": p.order_id, "damage_case_id": p.damage_case_id,
+                "vendor_id": p.vendor_id, "employee_id": p.employee_id,
+            })
+    _insert_many(
+        db,
+        "INSERT INTO fin_ledger_entries (tx_id, account_id, direction, amount, order_id, damage_case_id, vendor_id, employee_id)",
+        ["tx_id", "account_id", "direction", "amount", "order_id", "damage_case_id", "vendor_id", "employee_id"],
+        entries,
+    )
+
+    verify_posted(db, tx_ids, sum(amounts, Decimal("0")))
+    return tx_ids
+
+
+def verify_posted(db: Session, tx_ids: List[int], expected_total: Decimal):
+    """
+    Перевірка в БД перед commit: у кожної транзакції рівно 2 проводки, D == C == її amount,
+    а разом - expected_total
+    """
+    rows = db.execute(text("""
+        SELECT t.id, t.amount, COUNT(e.tx_id),
+               COALESCE(SUM(CASE WHEN e.direction = 'D' THEN e.amount ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN e.direction = 'C' THEN e.amount ELSE 0 END), 0)
+        FROM fin_transactions t
+        LEFT JOIN fin_ledger_entries e ON e.tx_id = t.id
+        WHERE t.id IN :tx_ids
+        GROUP BY t.id, t.amount
+    """).bindparams(bindparam("tx_ids", expanding=True)), {"tx_ids": tx_ids}).fetchall()
+    debit_total = Decimal("0")
+    bad = [] if len(rows) == len(set(tx_ids)) else ["missing transactions"]
+    for tx_id, amount, count, debit, credit in rows:
+        amount, debit, credit = _to_cents(amount or 0), _to_cents(debit or 0), _to_cents(credit or 0)
+        debit_total += debit
+        if int(count or 0) != 2 or debit != amount or credit != amount:
+            bad.append(f"tx {tx_id}: {count} entries, debit {debit}, credit {credit}, amount {amount}")
+    if bad or debit_total != expected_total:
+        raise LedgerImbalance(
+            f"Ledger check failed for {len(tx_ids)} transactions (debit {debit_total}, "
+            f"expected {expected_total}): {'; '.join(bad[:5])}"
+        )
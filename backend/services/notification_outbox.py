@@ -0,0 +1,623 @@
+"""
+Notification Outbox - черга вихідних email / Telegram повідомлень.
+
+Обробники більше не відкривають SMTP / HTTPS з'єднання всередині запиту: enqueue_email() /
+enqueue_telegram() пишуть рядок у notification_outbox в транзакції запиту і одразу повертають id.
+Фоновий диспетчер (NotificationDispatcher, окремий потік):
+- забирає пачку готових рядків (status = pending, next_attempt_at <= NOW()) з токеном блокування,
+  тож кілька воркерів uvicorn не відправлять один лист двічі
+- тримає з'єднання між листами: одна SMTP сесія (NOOP перед повторним використанням,
+  закривається після OUTBOX_SMTP_IDLE_SECONDS простою), requests.Session для Telegram Bot API
+- обмежує швидкість на провайдера (OUTBOX_RATE_LIMITS, token bucket)
+- повторює тимчасові помилки з експоненційною затримкою, постійні (400 від Telegram,
+  відхилений адресат) та вичерпані спроби -> status = failed
+- фінальний результат передає result hook (запис у document_emails / document_email_log тощо)
+
+Usage:
+    outbox_id = enqueue_email(db, "client@example.com", subject, html,
+                              result_hook="document_emails", hook_data={...})
+    db.commit()  # диспетчер прокидається після коміту
+
+    @result_hook("document_emails")
+    def log_document_email(db, message, outcome): ...
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = float(os.environ.get("OUTBOX_BACKOFF_SECONDS", "30"))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.environ.get("OUTBOX_MAX_BACKOFF_SECONDS", "3600"))
+OUTBOX_LOCK_SECONDS = int(os.environ.get("OUTBOX_LOCK_SECONDS", "300"))
+OUTBOX_SMTP_IDLE_SECONDS = float(os.environ.get("OUTBOX_SMTP_IDLE_SECONDS", "60"))
+# повідомлень на секунду на провайдера: "smtp=5,telegram=25"
+OUTBOX_RATE_LIMITS = os.environ.get("OUTBOX_RATE_LIMITS", "smtp=5,resend=10,sendgrid=10,telegram=25")
+
+CHANNEL_EMAIL = "email"
+CHANNEL_TELEGRAM = "telegram"
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+_WAKE_KEY = "notification_outbox_wake"
+_table_ready = False
+
+
+# ============================================================
+# ERRORS / DATA
+# ============================================================
+
+class DeliveryError(Exception):
+    """Тимчасова помилка доставки - буде повтор"""
+
+    permanent = False
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PermanentDeliveryError(DeliveryError):
+    """Повтор не допоможе (невірний адресат, заборонений чат)"""
+
+    permanent = True
+
+
+@dataclass
+class OutboxMessage:
+    id: int
+    channel: str
+    provider: str
+    recipient: str
+    subject: Optional[str]
+    payload: Dict[str, Any]
+    attempts: int = 1
+    result_hook: Optional[str] = None
+    hook_data: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class DeliveryOutcome:
+    success: bool
+    provider: str
+    provider_message_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+def backoff_delay(attempts: int) -> float:
+    """Затримка перед наступною спробою: 30с, 60с, 120с ... не більше OUTBOX_MAX_BACKOFF_SECONDS"""
+    return min(OUTBOX_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0)), OUTBOX_MAX_BACKOFF_SECONDS)
+
+
+def resolve_failure(attempts: int, error: DeliveryError):
+    """(status, затримка) після невдалої спроби"""
+    if error.permanent or attempts >= OUTBOX_MAX_ATTEMPTS:
+        return STATUS_FAILED, None
+    delay = backoff_delay(attempts)
+    if error.retry_after:
+        delay = max(delay, float(error.retry_after))
+    return STATUS_PENDING, delay
+
+
+def parse_rate_limits(spec: str) -> Dict[str, float]:
+    limits = {}
+    for part in (spec or "").split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() and rate.strip():
+            limits[name.strip().lower()] = float(rate)
+    return limits
+
+
+class RateLimiter:
+    """Token bucket: rate повідомлень на секунду, сплеск до burst"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.tokens = self.burst
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+
+    def acquire(self):
+        while True:
+            now = self._clock()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            self._sleep((1 - self.tokens) / self.rate)
+
+
+# ============================================================
+# RESULT HOOKS
+# ============================================================
+
+_result_hooks: Dict[str, Callable] = {}
+
+
+def result_hook(name: str):
+    """Зареєструвати обробник фінального результату: fn(db, message, outcome)"""
+    def register(fn):
+        _result_hooks[name] = fn
+        return fn
+    return register
+
+
+# ============================================================
+# ENQUEUE
+# ============================================================
+
+def ensure_outbox_table(db: Session):
+    global _table_ready
+    if _table_ready:
+        return
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            channel VARCHAR(20) NOT NULL,
+            provider VARCHAR(20) NOT NULL,
+            recipient VARCHAR(255) NOT NULL,
+            subject VARCHAR(500) NULL,
+            payload LONGTEXT NOT NULL,
+            result_hook VARCHAR(50) NULL,
+            hook_data TEXT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at DATETIME NOT NULL,
+            locked_by VARCHAR(64) NULL,
+            locked_until DATETIME NULL,
+            last_error TEXT NULL,
+            provider_message_id VARCHAR(255) NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            sent_at DATETIME NULL,
+            INDEX idx_outbox_due (status, next_attempt_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """))
+    _table_ready = True
+
+
+def enqueue(db: Session, channel: str, provider: str, recipient: str, payload: Dict[str, Any],
+            subject: Optional[str] = None, result_hook: Optional[str] = None,
+            hook_data: Optional[Dict[str, Any]] = None) -> int:
+    """Додати повідомлення в чергу (в транзакції викликача), повертає id рядка outbox"""
+    ensure_outbox_table(db)
+    result = db.execute(text("""
+        INSERT INTO notification_outbox (
+            channel, provider, recipient, subject, payload, result_hook, hook_data, status, next_attempt_at
+        ) VALUES (
+            :channel, :provider, :recipient, :subject, :payload, :result_hook, :hook_data, 'pending', NOW()
+        )
+    """), {
+        "channel": channel,
+        "provider": provider,
+        "recipient": recipient,
+        "subject": subject,
+        "payload": json.dumps(payload, ensure_ascii=False, default=str),
+        "result_hook": result_hook,
+        "hook_data": json.dumps(hook_data, ensure_ascii=False, default=str) if hook_data else None,
+    })
+    db.info[_WAKE_KEY] = True
+    return result.lastrowid
+
+
+def enqueue_email(db: Session, to_email: str, subject: str, html_content: str,
+                  plain_content: Optional[str] = None, attachments: Optional[List[dict]] = None,
+                  reply_to: Optional[str] = None, cc: Optional[str] = None, bcc: Optional[str] = None,
+                  provider: str = "smtp", result_hook: Optional[str] = None,
+                  hook_data: Optional[Dict[str, Any]] = None) -> int:
+    """
+    attachments: [{"filename", "content": bytes, "content_type"}] - зберігаються в base64
+    provider: smtp | resend | sendgrid | dummy
+    """
+    payload = {
+        "html": html_content,
+        "plain": plain_content,
+        "reply_to": reply_to,
+        "cc": cc,
+        "bcc": bcc,
+        "attachments": [
+            {
+                "filename": att["filename"],
+                "content": base64.b64encode(att["content"]).decode("ascii"),
+                "content_type": att.get("content_type", "application/octet-stream"),
+            }
+            for att in attachments or []
+        ],
+    }
+    return enqueue(db, CHANNEL_EMAIL, provider, to_email, payload, subject=subject,
+                   result_hook=result_hook, hook_data=hook_data)
+
+
+def enqueue_telegram(db: Session, chat_id: str, message: str, reply_markup: Optional[dict] = None,
+                     parse_mode: str = "HTML", result_hook: Optional[str] = None,
+                     hook_data: Optional[Dict[str, Any]] = None) -> int:
+    payload = {"text": message, "parse_mode": parse_mode, "reply_markup": reply_markup}
+    return enqueue(db, CHANNEL_TELEGRAM, "telegram", str(chat_id), payload,
+                   result_hook=result_hook, hook_data=hook_data)
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session: Session):
+    if session.info.pop(_WAKE_KEY, False) and _dispatcher is not None:
+        _dispatcher.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_wake(session: Session):
+    session.info.pop(_WAKE_KEY, None)
+
+
+# ============================================================
+# TRANSPORTS
+# ============================================================
+
+class SmtpTransport:
+    """Одна SMTP сесія на весь потік диспетчера (login один раз, NOOP перед повторним використанням)"""
+
+    def __init__(self, connect: Optional[Callable[[], smtplib.SMTP]] = None,
+                 idle_seconds: float = OUTBOX_SMTP_IDLE_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self._connect = connect or self._open
+        self.idle_seconds = idle_seconds
+        self._clock = clock
+        self._server = None
+        self._used_at = 0.0
+
+    @staticmethod
+    def _open() -> smtplib.SMTP:
+        import ssl
+        from services import email_service as cfg
+
+        context = ssl.create_default_context()
+        if cfg.SMTP_USE_SSL:
+            server = smtplib.SMTP_SSL(cfg.SMTP_HOST, cfg.SMTP_PORT, context=context, timeout=30)
+        else:
+            server = smtplib.SMTP(cfg.SMTP_HOST, cfg.SMTP_PORT, timeout=30)
+            server.starttls(context=context)
+        server.login(cfg.SMTP_USERNAME, cfg.SMTP_PASSWORD)
+        return server
+
+    def _session(self):
+        if self._server is not None:
+            if self._clock() - self._used_at > self.idle_seconds:
+                self.close()
+            else:
+                try:
+                    if self._server.noop()[0] == 250:
+                        return self._server
+                except smtplib.SMTPException:
+                    pass
+                self.close()
+        self._server = self._connect()
+        return self._server
+
+    def send(self, message: OutboxMessage) -> Optional[str]:
+        from services.email_service import SMTP_FROM_EMAIL, build_message
+
+        payload = message.payload
+        msg = build_message(
+            message.recipient, message.subject or "", payload.get("html") or "",
+            plain_content=payload.get("plain"),
+            attachments=[
+                {**att, "content": base64.b64decode(att["content"])} for att in payload.get("attachments") or []
+            ],
+            reply_to=payload.get("reply_to"),
+            cc=payload.get("cc"),
+        )
+        recipients = [message.recipient] + [r for r in (payload.get("cc"), payload.get("bcc")) if r]
+        for attempt in range(2):
+            server = self._session()
+            try:
+                server.sendmail(SMTP_FROM_EMAIL, recipients, msg.as_string())
+                self._used_at = self._clock()
+                return None
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+                if attempt:
+                    raise DeliveryError("SMTP з'єднання розірвано")
+            except smtplib.SMTPRecipientsRefused as e:
+                raise PermanentDeliveryError(f"Адресат відхилений: {e.recipients}")
+            except smtplib.SMTPResponseException as e:
+                if 500 <= e.smtp_code < 600:
+                    raise PermanentDeliveryError(f"SMTP {e.smtp_code}: {e.smtp_error!r}")
+                raise DeliveryError(f"SMTP {e.smtp_code}: {e.smtp_error!r}")
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def release_idle(self):
+        if self._server is not None and self._clock() - self._used_at > self.idle_seconds:
+            self.close()
+
+
+class ProviderTransport:
+    """Адаптер для services.email_provider (Resend / SendGrid / Dummy) з власним event loop"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self._loop = asyncio.new_event_loop()
+
+    def send(self, message: OutboxMessage) -> Optional[str]:
+        from services.email_provider import EmailAttachment
+
+        payload = message.payload
+        attachments = [EmailAttachment(**att) for att in payload.get("attachments") or []] or None
+        result = self._loop.run_until_complete(self.provider.send(
+            to=message.recipient,
+            subject=message.subject or "",
+            html=payload.get("html") or "",
+            attachments=attachments,
+            cc=payload.get("cc"),
+            bcc=payload.get("bcc"),
+        ))
+        if not result.success:
+            raise DeliveryError(result.error or f"{self.provider.name}: помилка відправки")
+        return result.email_id
+
+    def close(self):
+        self._loop.close()
+
+    def release_idle(self):
+        pass
+
+
+class TelegramTransport:
+    """Telegram Bot API через пул з'єднань requests.Session"""
+
+    API_URL = "https://api.telegram.org/bot{token}/sendMessage"
+
+    def __init__(self, token: Optional[str] = None, session=None):
+        self.token = token if token is not None else os.environ.get("TELEGRAM_BOT_TOKEN")
+        if session is None:
+            import requests
+            session = requests.Session()
+            session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session = session
+
+    def send(self, message: OutboxMessage) -> Optional[str]:
+        if not self.token:
+            raise PermanentDeliveryError("TELEGRAM_BOT_TOKEN не налаштований")
+        payload = message.payload
+        body = {"chat_id": message.recipient, "text": payload["text"], "parse_mode": payload.get("parse_mode")}
+        if payload.get("reply_markup"):
+            body["reply_markup"] = payload["reply_markup"]
+        try:
+            response = self.session.post(self.API_URL.format(token=self.token), json=body, timeout=10)
+        except Exception as e:
+            raise DeliveryError(f"Telegram: {e}")
+        if response.status_code == 200:
+            return str(response.json().get("result", {}).get("message_id") or "") or None
+        detail = f"Telegram {response.status_code}: {response.text[:300]}"
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                retry_after = None
+            raise DeliveryError(detail, retry_after=retry_after)
+        if 400 <= response.status_code < 500:
+            raise PermanentDeliveryError(detail)
+        raise DeliveryError(detail)
+
+    def close(self):
+        self.session.close()
+
+    def release_idle(self):
+        pass
+
+
+def create_transport(provider: str):
+    if provider == "smtp":
+        return SmtpTransport()
+    if provider == "telegram":
+        return TelegramTransport()
+    from services.email_provider import DummyEmailProvider, ResendEmailProvider, SendGridEmailProvider
+    providers = {"resend": ResendEmailProvider, "sendgrid": SendGridEmailProvider, "dummy": DummyEmailProvider}
+    if provider not in providers:
+        raise PermanentDeliveryError(f"Невідомий провайдер: {provider}")
+    return ProviderTransport(providers[provider]())
+
+
+# ============================================================
+# DISPATCHER
+# ============================================================
+
+class NotificationDispatcher:
+    """Фоновий потік, що розсилає notification_outbox"""
+
+    def __init__(self, session_factory: Optional[Callable[[], Session]] = None,
+                 transport_factory: Callable[[str], Any] = create_transport,
+                 rate_limits: Optional[Dict[str, float]] = None,
+                 batch_size: int = OUTBOX_BATCH_SIZE, poll_seconds: float = OUTBOX_POLL_SECONDS):
+        self._session_factory = session_factory
+        self._transport_factory = transport_factory
+        self._rate_limits = parse_rate_limits(OUTBOX_RATE_LIMITS) if rate_limits is None else rate_limits
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._transports: Dict[str, Any] = {}
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.token = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+    # ---- delivery ----
+
+    def _transport(self, provider: str):
+        if provider not in self._transports:
+            self._transports[provider] = self._transport_factory(provider)
+        return self._transports[provider]
+
+    def _limiter(self, provider: str) -> Optional[RateLimiter]:
+        rate = self._rate_limits.get(provider)
+        if not rate:
+            return None
+        if provider not in self._limiters:
+            self._limiters[provider] = RateLimiter(rate)
+        return self._limiters[provider]
+
+    def deliver(self, message: OutboxMessage) -> DeliveryOutcome:
+        """Відправити одне повідомлення; при DeliveryError повтор планує викликач"""
+        limiter = self._limiter(message.provider)
+        if limiter:
+            limiter.acquire()
+        try:
+            provider_id = self._transport(message.provider).send(message)
+        except DeliveryError:
+            raise
+        except Exception as e:
+            raise DeliveryError(str(e))
+        return DeliveryOutcome(success=True, provider=message.provider, provider_message_id=provider_id)
+
+    # ---- storage ----
+
+    def claim_batch(self, db: Session) -> List[OutboxMessage]:
+        ensure_outbox_table(db)
+        db.execute(text("""
+            UPDATE notification_outbox
+            SET status = 'sending', locked_by = :token, attempts = attempts + 1,
+                locked_until = NOW() + INTERVAL :lock_seconds SECOND
+            WHERE (status = 'pending' AND next_attempt_at <= NOW())
+               OR (status = 'sending' AND locked_until < NOW())
+            ORDER BY id
+            LIMIT :limit
+        """), {"token": self.token, "lock_seconds": OUTBOX_LOCK_SECONDS, "limit": self.batch_size})
+        rows = db.execute(text("""
+            SELECT id, channel, provider, recipient, subject, payload, attempts, result_hook, hook_data
+            FROM notification_outbox
+            WHERE locked_by = :token AND status = 'sending'
+            ORDER BY provider, id
+        """), {"token": self.token}).fetchall()
+        db.commit()
+        return [
+            OutboxMessage(
+                id=row[0], channel=row[1], provider=row[2], recipient=row[3], subject=row[4],
+                payload=json.loads(row[5]), attempts=row[6], result_hook=row[7],
+                hook_data=json.loads(row[8]) if row[8] else {},
+            )
+            for row in rows
+        ]
+
+    def _finish(self, db: Session, message: OutboxMessage, outcome: DeliveryOutcome):
+        hook = _result_hooks.get(message.result_hook) if message.result_hook else None
+        if message.result_hook and hook is None:
+            logger.warning(f"Outbox result hook not registered: {message.result_hook}")
+        if hook:
+            try:
+                hook(db, message, outcome)
+            except Exception as e:
+                logger.warning(f"Outbox result hook {message.result_hook} failed for #{message.id}: {e}")
+
+    def complete(self, db: Session, message: OutboxMessage, outcome: DeliveryOutcome):
+        db.execute(text("""
+            UPDATE notification_outbox
+            SET status = 'sent', sent_at = NOW(), locked_by = NULL, locked_until = NULL,
+                provider_message_id = :provider_id, last_error = NULL
+            WHERE id = :id
+        """), {"id": message.id, "provider_id": outcome.provider_message_id})
+        self._finish(db, message, outcome)
+        db.commit()
+
+    def fail(self, db: Session, message: OutboxMessage, error: DeliveryError):
+        status, delay = resolve_failure(message.attempts, error)
+        db.execute(text("""
+            UPDATE notification_outbox
+            SET status = :status, locked_by = NULL, locked_until = NULL, last_error = :error,
+                next_attempt_at = NOW() + INTERVAL :delay SECOND
+            WHERE id = :id
+        """), {"id": message.id, "status": status, "error": str(error)[:2000], "delay": int(delay or 0)})
+        if status == STATUS_FAILED:
+            logger.warning(f"Outbox #{message.id} ({message.provider} -> {message.recipient}) failed: {error}")
+            self._finish(db, message, DeliveryOutcome(success=False, provider=message.provider, error=str(error)))
+        db.commit()
+
+    def run_once(self, db: Session) -> int:
+        """Одна пачка: claim -> відправка через спільні з'єднання -> результати"""
+        messages = self.claim_batch(db)
+        for message in messages:
+            try:
+                outcome = self.deliver(message)
+            except DeliveryError as e:
+                self.fail(db, message, e)
+                continue
+            self.complete(db, message, outcome)
+        return len(messages)
+
+    # ---- thread ----
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="notification-outbox", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        if self._session_factory is None:
+            from database_rentalhub import get_rh_db_sync
+            self._session_factory = get_rh_db_sync
+        while not self._stop.is_set():
+            processed = 0
+            db = self._session_factory()
+            try:
+                processed = self.run_once(db)
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Notification outbox pass failed: {e}")
+            finally:
+                db.close()
+            if processed >= self.batch_size:
+                continue
+            for transport in self._transports.values():
+                transport.release_idle()
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        for transport in self._transports.values():
+            try:
+                transport.close()
+            except Exception:
+                pass
+        self._transports.clear()
+
+
+_dispatcher: Optional[NotificationDispatcher] = None
+
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = NotificationDispatcher()
+    return _dispatcher
@@ -0,0 +1,270 @@
+"""
+Order Hydrator - масове завантаження даних для списків замовлень.
+
+Замість N+1 (окремі запити items / damage history / issue_cards / оплати на кожне замовлення)
+завантажує все для сторінки фіксованою кількістю згрупованих запитів:
+- order_items + products            - один IN (...) по order_id
+- product_damage_history            - один IN (...) по product_id усіх позицій сторінки
+- issue_cards (прогрес комплектації) - один IN (...) по order_id
+- fin_transactions (оплати)         - один IN (...) з GROUP BY entity_id
+
+Usage:
+    hydrated = hydrate_orders(db, [row[0] for row in rows])
+    order = parse_order_row(row, db, hydrated=hydrated.get(row[0]))
+"""
+import json
+import logging
+from typing import Dict, Iterable, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from utils.image_helper import normalize_image_url
+from services.image_derivatives import attach_image_variants
+
+logger = logging.getLogger(__name__)
+
+
+def parse_card_items(raw) -> list:
+    """JSON поле items з issue_cards / return_cards -> список (порожній якщо не парситься)"""
+    if not raw:
+        return []
+    try:
+        items = json.loads(raw) if isinstance(raw, str) else raw
+    except Exception:
+        return []
+    return items or []
+
+
+def load_order_item_rows(db: Session, order_ids: Iterable[int]) -> Dict[int, List]:
+    """
+    Позиції замовлень (без відмовлених) з даними товару.
+    Колонки: [0]id, [1]order_id, [2]product_id, [3]product_name, [4]quantity, [5]price, [6]total_rental,
+             [7]image_url, [8]loss_value, [9]available_qty, [10]sku, [11]zone, [12]aisle, [13]shelf,
+             [14]cleaning_status, [15]product_state, [16]category_name
+    """
+    order_ids = [o for o in order_ids if o]
+    if not order_ids:
+        return {}
+    result = db.execute(text("""
+        SELECT oi.id, oi.order_id, oi.product_id, oi.product_name,
+               oi.quantity, oi.price, oi.total_rental,
+               COALESCE(p.image_url, oi.image_url) as image_url,
+               p.price as loss_value, p.quantity as available_qty,
+               p.sku, p.zone, p.aisle, p.shelf, p.cleaning_status, p.product_state,
+               p.category_name
+        FROM order_items oi
+        LEFT JOIN products p ON oi.product_id = p.product_id
+        WHERE oi.order_id IN :order_ids
+          AND (oi.status IS NULL OR oi.status != 'refused')
+        ORDER BY oi.order_id, oi.id
+    """), {"order_ids": tuple(order_ids)})
+    rows_by_order: Dict[int, List] = {}
+    for item_row in result:
+        rows_by_order.setdefault(item_row[1], []).append(item_row)
+    return rows_by_order
+
+
+def load_damage_rows(db: Session, product_ids: Iterable) -> Dict[str, List]:
+    """
+    Історія пошкоджень по товарах (новіші спочатку), ключ - product_id рядком.
+    Колонки: [0]product_id, [1]id, [2]processing_type, [3]note, [4]severity, [5]processing_status,
+             [6]created_at, [7]damage_type, [8]damage_code, [9]photo_url, [10]stage,
+             [11]order_number, [12]qty, [13]fee, [14]created_by
+    """
+    ids = sorted({int(p) for p in product_ids if str(p).isdigit()})
+    if not ids:
+        return {}
+    rows = db.execute(text("""
+        SELECT product_id, id, processing_type, note, severity,
+               processing_status, created_at, damage_type, damage_code,
+               photo_url, stage, order_number, qty, fee, created_by
+        FROM product_damage_history
+        WHERE product_id IN :product_ids
+        ORDER BY created_at DESC
+    """), {"product_ids": tuple(ids)}).fetchall()
+    rows_by_pid: Dict[str, List] = {}
+    for dr in rows:
+        rows_by_pid.setdefault(str(dr[0]), []).append(dr)
+    return rows_by_pid
+
+
+def load_packing_progress(db: Session, order_ids: Iterable[int]) -> Dict[int, int]:
+    """Прогрес комплектації (% зібраних одиниць) з issue_cards"""
+    order_ids = [o for o in order_ids if o]
+    if not order_ids:
+        return {}
+    result = db.execute(text("""
+        SELECT order_id, items FROM issue_cards WHERE order_id IN :order_ids ORDER BY id
+    """), {"order_ids": tuple(order_ids)})
+    progress: Dict[int, int] = {}
+    for order_id, raw_items in result:
+        if order_id in progress:
+            continue
+        progress[order_id] = 0
+        ic_items = parse_card_items(raw_items)
+        if ic_items:
+            total_qty = sum(it.get('qty', 1) for it in ic_items)
+            picked_qty = sum(it.get('picked_qty', 0) for it in ic_items)
+            if total_qty > 0:
+                progress[order_id] = int((picked_qty / total_qty) * 100)
+    return progress
+
+
+def load_paid_totals(db: Session, order_ids: Iterable[int]) -> Dict[int, tuple]:
+    """(paid_rent, paid_deposit) з fin_transactions"""
+    order_ids = [o for o in order_ids if o]
+    if not order_ids:
+        return {}
+    result = db.execute(text("""
+        SELECT
+            ft.entity_id,
+            COALESCE(SUM(CASE WHEN ft.tx_type IN ('rent_payment', 'additional_payment') THEN ft.amount ELSE 0 END), 0) as paid_rent,
+            COALESCE(SUM(CASE WHEN ft.tx_type = 'deposit_payment' THEN ft.amount ELSE 0 END), 0) as paid_deposit
+        FROM fin_transactions ft
+        WHERE ft.entity_type = 'order' AND ft.entity_id IN :order_ids
+        GROUP BY ft.entity_id
+    """), {"order_ids": tuple(order_ids)})
+    totals: Dict[int, tuple] = {}
+    for row in result:
+        totals[int(row[0])] = (
+            float(row[1]) if row[1] else 0.0,
+            float(row[2]) if row[2] else 0.0,
+        )
+    return totals
+
+
+def format_order_item(item_row) -> dict:
+    """Позиція замовлення для списків (OrderItem + поля для IssueCard)"""
+    loss_value = float(item_row[8]) if item_row[8] else 0.0
+    quantity = item_row[4] or 1
+    available = int(item_row[9]) if item_row[9] else 0
+    deposit_per_unit = loss_value / 2  # Застава = половина від вартості втрати
+
+    # Обробка image_url
+    image_url = normalize_image_url(item_row[7])
+
+    return {
+        "inventory_id": str(item_row[2]) if item_row[2] else "",
+        "article": item_row[10] or str(item_row[2]),  # SKU (article) або product_id
+        "sku": item_row[10] or str(item_row[2]),  # SKU або product_id
+        "name": item_row[3],
+        "category": item_row[16] or "Реквізит",  # Категорія товару для пошкоджень
+        "quantity": quantity,
+        "qty": quantity,  # Для IssueCard
+        "price_per_day": float(item_row[5]) if item_row[5] else 0.0,
+        "total_rental": float(item_row[6]) if item_row[6] else 0.0,
+        "deposit": deposit_per_unit,  # Застава = EAN / 2
+        "damage_cost": loss_value,  # Збиток (EAN) - повна вартість втрати
+        "total_deposit": deposit_per_unit * quantity,  # Загальна застава за товар
+        "image": image_url,  # Фото товару (оброблений URL)
+        "photo": image_url,  # Альтернативна назва для IssueCard
+        # Дані наявності з products
+        "available_qty": available,
+        "available": available,
+        "reserved_qty": 0,  # TODO: рахувати з order_items WHERE status != 'completed'
+        "reserved": 0,
+        "in_rent_qty": 0,  # TODO: рахувати з orders WHERE status = 'shipped'
+        "in_rent": 0,
+        "in_restore_qty": 0,  # TODO: рахувати з damages
+        "in_restore": 0,
+        # Локація на складі
+        "location": {
+            "zone": item_row[11] or "",
+            "aisle": item_row[12] or "",
+            "shelf": item_row[13] or "",
+            "state": item_row[15] or "shelf"
+        },
+        "pack": "",  # TODO: додати якщо є в products
+        "pre_damage": []  # will be enriched below
+    }
+
+
+def format_damage_entry(dr) -> dict:
+    """Запис історії пошкоджень для списків замовлень"""
+    return {
+        'id': dr[1],
+        'type': dr[7] or dr[8] or '',
+        'damage_type': dr[7] or dr[8] or '',
+        'notes': dr[3] or '',
+        'note': dr[3] or '',
+        'severity': dr[4] or 'low',
+        'status': dr[5] or '',
+        'date': dr[6].isoformat() if dr[6] else None,
+        'created_at': dr[6].strftime('%d.%m.%Y %H:%M') if dr[6] else None,
+        'photo_url': dr[9],
+        'stage': dr[10] or '',
+        'stage_label': 'До видачі' if dr[10] == 'pre_issue' else 'При поверненні' if dr[10] == 'return' else 'Аудит' if dr[10] else '',
+        'order_number': dr[11] or '',
+        'qty': int(dr[12] or 1),
+        'fee': float(dr[13] or 0),
+        'created_by': dr[14] or '',
+    }
+
+
+def hydrate_orders(
+    db: Session,
+    order_ids: Iterable[int],
+    include_items: bool = True
+) -> Dict[int, dict]:
+    """
+    Зібрати items / packing_progress / paid_rent / paid_deposit для сторінки замовлень.
+
+    include_items=False - не завантажувати позиції та історію пошкоджень (fields=summary)
+
+    Returns:
+        {order_id: {"items": [...], "packing_progress": int, "paid_rent": float, "paid_deposit": float}}
+    """
+    order_ids = [o for o in order_ids if o]
+    hydrated: Dict[int, dict] = {
+        order_id: {"items": [], "packing_progress": 0, "paid_rent": 0.0, "paid_deposit": 0.0}
+        for order_id in order_ids
+    }
+    if not order_ids:
+        return hydrated
+
+    if include_items:
+        item_rows = load_order_item_rows(db, order_ids)
+        for order_id, rows in item_rows.items():
+            hydrated[order_id]["items"] = [format_order_item(r) for r in rows]
+        attach_image_variants(db, [it for h in hydrated.values() for it in h["items"]], url_key="image")
+
+        # ✅ Enrich items with damage history
+        all_pids = [
+            it['inventory_id']
+            for h in hydrated.values() for it in h["items"]
+            if it.get('inventory_id')
+        ]
+        try:
+            dmg_by_pid = load_damage_rows(db, all_pids)
+        except Exception:
+            dmg_by_pid = None
+        if dmg_by_pid is not None:
+            for h in hydrated.values():
+                items = h["items"]
+                if not any(it.get('inventory_id', '').isdigit() for it in items):
+                    continue
+                for it in items:
+                    pid = it.get('inventory_id', '')
+                    it['damage_history'] = [format_damage_entry(dr) for dr in dmg_by_pid.get(pid, [])]
+                    it['has_damage_history'] = len(it['damage_history']) > 0
+                    it['total_damages'] = len(it['damage_history'])
+                    it['pre_damage'] = it['damage_history'][:3]  # top 3 for preview
+
+    # ✅ Обчислити прогрес комплектації з issue_cards
+    try:
+        for order_id, progress in load_packing_progress(db, order_ids).items():
+            hydrated[order_id]["packing_progress"] = progress
+    except Exception as e:
+        logger.warning(f"hydrate_orders: packing progress failed: {e}")
+
+    # ✅ Завантажити суми оплат
+    try:
+        for order_id, (paid_rent, paid_deposit) in load_paid_totals(db, order_ids).items():
+            if order_id in hydrated:
+                hydrated[order_id]["paid_rent"] = paid_rent
+                hydrated[order_id]["paid_deposit"] = paid_deposit
+    except Exception as e:
+        logger.warning(f"hydrate_orders: payments failed: {e}")
+
+    return hydrated
@@ -0,0 +1,385 @@
+"""
+PDF Render Service - рендеринг WeasyPrint поза event loop + файловий кеш PDF.
+
+- рендер виконується в обмеженому пулі процесів (PDF_RENDER_WORKERS), тож важкий акт чи рахунок
+  не блокує інших користувачів
+- обмежена черга (PDF_RENDER_QUEUE_SIZE): коли вона повна - PdfQueueFull (HTTP 503)
+- таймаут на задачу (PDF_RENDER_TIMEOUT): клієнт отримує PdfRenderTimeout, а результат, якщо
+  воркер все ж завершить, все одно потрапить у кеш
+- кеш на диску: ключ = sha256(фінальний HTML + CSS + base_url), повторне завантаження
+  незміненого документа віддається файлом без рендеру; файли старші за PDF_CACHE_MAX_AGE_HOURS
+  видаляються, а понад PDF_CACHE_MAX_MB - найдавніше використані (prune після запису, у потоці)
+- фонові задачі: submit() -> job_id, get_job() для polling статусу; стан задачі - JSON у
+  <cache>/jobs/, тож polling працює з будь-якого воркера uvicorn
+
+Usage:
+    service = get_pdf_render_service()
+    path = await service.render(html_content, css=PRINT_CSS)
+    return FileResponse(path, media_type="application/pdf", filename=...)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+PDF_CACHE_DIR = os.environ.get(
+    "PDF_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "pdf_cache")
+)
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", "2"))
+PDF_RENDER_QUEUE_SIZE = int(os.environ.get("PDF_RENDER_QUEUE_SIZE", "16"))
+PDF_RENDER_TIMEOUT = float(os.environ.get("PDF_RENDER_TIMEOUT", "60"))
+PDF_CACHE_MAX_MB = int(os.environ.get("PDF_CACHE_MAX_MB", "500"))
+PDF_CACHE_MAX_AGE_HOURS = float(os.environ.get("PDF_CACHE_MAX_AGE_HOURS", "168"))
+PDF_CACHE_PRUNE_SECONDS = 300
+MAX_TRACKED_JOBS = 500
+
+logger = logging.getLogger(__name__)
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class PdfQueueFull(Exception):
+    """Черга рендеру заповнена"""
+
+
+class PdfRenderTimeout(Exception):
+    """Рендер не вклався в таймаут"""
+
+
+def pdf_cache_key(html_content: str, css: Optional[str] = None, base_url: Optional[str] = None) -> str:
+    digest = hashlib.sha256()
+    for part in (html_content or "", css or "", base_url or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def render_pdf_bytes(html_content: str, css: Optional[str] = None, base_url: Optional[str] = None) -> bytes:
+    """HTML -> PDF (виконується у процесі пулу)"""
+    from weasyprint import HTML, CSS
+    from weasyprint.text.fonts import FontConfiguration
+    font_config = FontConfiguration()
+    stylesheets = [CSS(string=css, font_config=font_config)] if css else []
+    return HTML(string=html_content, base_url=base_url).write_pdf(
+        stylesheets=stylesheets, font_config=font_config
+    )
+
+
+def _atomic_write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class PdfFileCache:
+    """PDF на диску: <dir>/<key[:2]>/<key>.pdf, стан фонових задач - <dir>/jobs/<job_id>.json"""
+
+    def __init__(self, directory: str = PDF_CACHE_DIR, max_bytes: int = PDF_CACHE_MAX_MB * 1024 * 1024,
+                 max_age: float = PDF_CACHE_MAX_AGE_HOURS * 3600, prune_interval: float = PDF_CACHE_PRUNE_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self._pruned_at = 0.0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.pdf")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path(key)
+        try:
+            # mtime = останнє використання (для витіснення найдавніших)
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key: str, pdf_bytes: bytes) -> str:
+        path = self.path(key)
+        _atomic_write(path, pdf_bytes)
+        return path
+
+    # -- стан задач --
+
+    def job_path(self, job_id: str) -> Optional[str]:
+        if not _JOB_ID_RE.match(job_id or ""):
+            return None
+        return os.path.join(self.directory, "jobs", f"{job_id}.json")
+
+    def save_job(self, job: dict):
+        try:
+            _atomic_write(self.job_path(job["job_id"]), json.dumps(job).encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"PDF job state {job['job_id']} not saved: {e}")
+
+    def load_job(self, job_id: str) -> Optional[dict]:
+        path = self.job_path(job_id)
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    # -- обмеження розміру --
+
+    def maybe_prune(self) -> int:
+        """prune(), але не частіше ніж раз на prune_interval"""
+        if time.monotonic() - self._pruned_at < self.prune_interval:
+            return 0
+        self._pruned_at = time.monotonic()
+        return self.prune()
+
+    def prune(self) -> int:
+        """Видалити файли старші за max_age, потім найдавніше використані PDF понад max_bytes"""
+        now = time.time()
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        removed = 0
+        total = 0
+        keep = []
+        for mtime, size, path in files:
+            if now - mtime > self.max_age:
+                removed += self._remove(path)
+            elif path.endswith(".pdf"):
+                keep.append((mtime, size, path))
+                total += size
+        for mtime, size, path in sorted(keep):
+            if total <= self.max_bytes:
+                break
+            removed += self._remove(path)
+            total -= size
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+
+@dataclass
+class PdfJob:
+    job_id: str
+    cache_key: str
+    status: str = "queued"  # queued, rendering, done, failed, timeout
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    path: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "cache_key": self.cache_key,
+            "cached": self.cached,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PdfJob":
+        return cls(
+            job_id=data["job_id"], cache_key=data["cache_key"], status=data.get("status", "queued"),
+            created_at=data.get("created_at") or time.time(), finished_at=data.get("finished_at"),
+            path=data.get("path"), error=data.get("error"), cached=bool(data.get("cached")),
+        )
+
+
+class PdfRenderService:
+    def __init__(
+        self,
+        workers: int = PDF_RENDER_WORKERS,
+        max_queue: int = PDF_RENDER_QUEUE_SIZE,
+        timeout: float = PDF_RENDER_TIMEOUT,
+        cache: PdfFileCache = None,
+        executor_factory: Callable = None,
+        render_func: Callable = render_pdf_bytes,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.cache = cache or PdfFileCache()
+        self.render_func = render_func
+        self._executor_factory = executor_factory or self._default_executor
+        self._executor = None
+        self._pending = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._jobs: "OrderedDict[str, PdfJob]" = OrderedDict()
+
+    def _default_executor(self):
+        # spawn: не успадковувати потоки/з'єднання БД батьківського процесу
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = self._executor_factory()
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "inflight": len(self._inflight),
+            "timeout": self.timeout,
+            "cache_dir": self.cache.directory,
+        }
+
+    def get_job(self, job_id: str) -> Optional[PdfJob]:
+        """Задача цього процесу, або (якщо submit був в іншому воркері) - її стан з диска"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        data = self.cache.load_job(job_id)
+        return PdfJob.from_dict(data) if data else None
+
+    def _track(self, job: PdfJob):
+        self._jobs[job.job_id] = job
+        while len(self._jobs) > MAX_TRACKED_JOBS:
+            self._jobs.popitem(last=False)
+        self._save(job)
+
+    def _save(self, job: PdfJob):
+        if job.job_id in self._jobs:
+            self.cache.save_job({**job.to_dict(), "path": job.path})
+
+    async def render(
+        self,
+        html_content: str,
+        css: Optional[str] = None,
+        base_url: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Відрендерити (або взяти з кешу) PDF і повернути шлях до файлу"""
+        key = pdf_cache_key(html_content, css, base_url)
+        job = PdfJob(job_id=uuid.uuid4().hex, cache_key=key)
+        return await self._run(job, html_content, css, base_url, timeout)
+
+    def submit(
+        self,
+        html_content: str,
+        css: Optional[str] = None,
+        base_url: Optional[str] = None,
+    ) -> PdfJob:
+        """Поставити рендер у фон; статус - через get_job(job_id)"""
+        key = pdf_cache_key(html_content, css, base_url)
+        job = PdfJob(job_id=uuid.uuid4().hex, cache_key=key)
+        cached_path = self.cache.get(key)
+        if cached_path:
+            self._finish(job, "done", path=cached_path, cached=True)
+            self._track(job)
+            return job
+        self._reserve_slot(key)
+        self._track(job)
+        task = asyncio.ensure_future(self._run(job, html_content, css, base_url, None, reserved=True))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return job
+
+    def _reserve_slot(self, key: str):
+        if key in self._inflight:
+            return
+        if self._pending >= self.workers + self.max_queue:
+            raise PdfQueueFull("PDF render queue is full")
+
+    def _finish(self, job: PdfJob, status: str, path: str = None, error: str = None, cached: bool = False):
+        job.status = status
+        job.path = path
+        job.error = error
+        job.cached = cached
+        job.finished_at = time.time()
+        self._save(job)
+
+    async def _run(self, job, html_content, css, base_url, timeout, reserved=False) -> str:
+        key = job.cache_key
+        cached_path = self.cache.get(key)
+        if cached_path:
+            self._finish(job, "done", path=cached_path, cached=True)
+            return cached_path
+
+        future = self._inflight.get(key)
+        if future is None:
+            if not reserved:
+                self._reserve_slot(key)
+            future = self._start(key, html_content, css, base_url)
+
+        job.status = "rendering"
+        self._save(job)
+        try:
+            path = await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._finish(job, "timeout", error="PDF render timed out")
+            raise PdfRenderTimeout(job.error)
+        except Exception as e:
+            self._finish(job, "failed", error=str(e))
+            raise
+        self._finish(job, "done", path=path)
+        return path
+
+    def _start(self, key, html_content, css, base_url) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        render_future = loop.run_in_executor(self.executor, self.render_func, html_content, css, base_url)
+
+        async def store():
+            try:
+                pdf_bytes = await render_future
+                path = self.cache.put(key, pdf_bytes)
+                try:
+                    await asyncio.to_thread(self.cache.maybe_prune)
+                except Exception as e:
+                    logger.warning(f"PDF cache prune failed: {e}")
+                return path
+            finally:
+                self._pending -= 1
+                self._inflight.pop(key, None)
+
+        future = asyncio.ensure_future(store())
+        # Якщо всі очікувачі відпали по таймауту - не логувати "exception was never retrieved"
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        return future
+
+
+_service: Optional[PdfRenderService] = None
+
+
+def get_pdf_render_service() -> PdfRenderService:
+    global _service
+    if _service is None:
+        _service = PdfRenderService()
+    return _service
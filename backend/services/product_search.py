@@ -0,0 +1,558 @@
+"""
+Product Search - in-memory повнотекстовий індекс товарів для каталогу, переобліку та Event Tool.
+
+Пошук робився через LIKE '%term%' по name / sku / color / material / description - кожне
+натискання клавіші сканувало всю таблицю products. Тут індекс тримається в пам'яті процесу
+(як availability_engine):
+
+- нормалізація з урахуванням української: casefold, апострофи (' ’ ʼ) прибираються,
+  ґ->г, ї->і, є->е, ё->е, легкий стемер закінчень (келихи / келиха -> келих)
+- SKU додатково індексується без розділителів (ST-123 -> st123)
+- кожен токен запиту шукається як точне слово, префікс (bisect по відсортованих термах),
+  підрядок (як LIKE, через триграми термів; токени з 1-2 символів - перебором термів, бо
+  триграм у них немає) і нечітко (схожість триграм) - якщо нічого не знайдено
+- всі токени запиту мають знайтись (AND); ранжування - за вагою поля і типом збігу
+- фасети category / color / material по знайдених товарах
+
+Оновлення:
+- перше звернення - повне завантаження (1 запит)
+- INSERT / DELETE / UPDATE ... SET <індексовані колонки> у products через rh_engine
+  позначають товари "брудними" після COMMIT, наступний пошук перечитує лише їх
+- раз на SEARCH_INDEX_CHECK_SECONDS - перевірка sync_runs (новий запуск sync_all -> повне
+  перезавантаження), раз на SEARCH_INDEX_MAX_AGE - повне перезавантаження
+
+Usage:
+    from services.product_search import get_product_search
+    result = get_product_search().search(db, "келих червон", category="Посуд", limit=50)
+    result.ids, result.total, result.facets
+
+    # SQL-ендпоінти: AND p.product_id IN :search_ids, params["search_ids"] = result.ids,
+    # db.execute(search_text(sql, params), params), далі rank_rows(rows, result.ids)
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.sql.elements import TextClause
+
+from utils.commit_tracking import discard_pending, on_commit
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE_SECONDS = int(os.environ.get("SEARCH_INDEX_MAX_AGE", 600))
+CHECK_SECONDS = int(os.environ.get("SEARCH_INDEX_CHECK_SECONDS", 20))
+
+# Вага поля у ранжуванні
+FIELD_WEIGHTS = {
+    "sku": 5.0,
+    "name": 3.0,
+    "color": 2.0,
+    "material": 2.0,
+    "category": 1.5,
+    "subcategory": 1.5,
+    "description": 0.5,
+}
+# Множник за тип збігу токена
+MATCH_EXACT, MATCH_PREFIX, MATCH_INFIX, MATCH_FUZZY = 1.0, 0.8, 0.6, 0.35
+FUZZY_MIN_SIMILARITY = 0.4
+FACET_FIELDS = ("category", "color", "material")
+
+_INDEXED_COLUMNS = ("sku", "name", "category_name", "subcategory_name", "color", "material", "description", "status")
+_PRODUCTS_WRITE_RE = re.compile(
+    r"^\s*(INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?products`?\b",
+    re.IGNORECASE
+)
+_SET_COLUMNS_RE = re.compile(
+    r"\b(?:\w+\.)?(" + "|".join(_INDEXED_COLUMNS) + r")\s*=", re.IGNORECASE
+)
+
+
+# ============================================================
+# НОРМАЛІЗАЦІЯ
+# ============================================================
+
+_CHAR_MAP = str.maketrans({
+    "ґ": "г", "ї": "і", "є": "е", "ё": "е", "ъ": "",
+    "'": "", "’": "", "ʼ": "", "`": "", "‘": "",
+})
+_TOKEN_RE = re.compile(r"[0-9a-zа-яі]+")
+_ENDINGS = sorted([
+    "ами", "ями", "ові", "еві", "ого", "ому", "ими", "ій", "ий", "ая", "яя", "ою", "ею",
+    "их", "ах", "ях", "ам", "ям", "ом", "ем", "ів", "ки", "ка", "ку", "ці",
+    "а", "я", "и", "і", "у", "ю", "е", "о", "ь", "ы",
+], key=len, reverse=True)
+
+
+def normalize_text(value: Optional[str]) -> str:
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFC", str(value)).casefold()
+    # й -> и лише після NFC, щоб не зламати складені символи
+    return value.translate(_CHAR_MAP).replace("й", "и")
+
+
+def stem(token: str) -> str:
+    """Легкий стемер: відрізати одне закінчення, якщо основа лишається >= 4 символів"""
+    if len(token) < 5 or not ("а" <= token[0] <= "я" or token[0] == "і"):
+        return token
+    for ending in _ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= 4:
+            return token[:-len(ending)]
+    return token
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    return [stem(t) for t in _TOKEN_RE.findall(normalize_text(value))]
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _inner_trigrams(term: str) -> Set[str]:
+    """Триграми без падінгу - для пошуку підрядка"""
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+# ============================================================
+# INDEX
+# ============================================================
+
+@dataclass
+class ProductDoc:
+    product_id: int
+    name: str
+    sku: str
+    category: str
+    subcategory: str
+    color: str
+    material: str
+    active: bool
+    terms: Dict[str, float] = field(default_factory=dict)  # term -> вага найкращого поля
+
+
+@dataclass
+class SearchResult:
+    ids: List[int]
+    total: int
+    facets: Dict[str, Dict[str, int]]
+    scores: Dict[int, float]
+    took_ms: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {"ids": self.ids, "total": self.total, "facets": self.facets, "took_ms": round(self.took_ms, 2)}
+
+
+def build_doc(row) -> ProductDoc:
+    """row: product_id, sku, name, category_name, subcategory_name, color, material, description, status"""
+    product_id, sku, name, category, subcategory, color, material, description, status = row
+    terms: Dict[str, float] = {}
+    fields = {
+        "sku": sku, "name": name, "category": category, "subcategory": subcategory,
+        "color": color, "material": material, "description": description,
+    }
+    for field_name, value in fields.items():
+        weight = FIELD_WEIGHTS[field_name]
+        tokens = tokenize(value)
+        if field_name == "sku" and len(tokens) > 1:
+            tokens.append("".join(tokens))
+        for token in tokens:
+            if terms.get(token, 0) < weight:
+                terms[token] = weight
+    return ProductDoc(
+        product_id=int(product_id), name=name or "", sku=sku or "",
+        category=category or "", subcategory=subcategory or "",
+        color=color or "", material=material or "",
+        active=status is None or int(status) == 1, terms=terms,
+    )
+
+
+class ProductSearchIndex:
+    """Інвертований індекс: term -> {product_id: вага}, відсортовані терми, триграми термів"""
+
+    def __init__(self):
+        self.docs: Dict[int, ProductDoc] = {}
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.inactive: Set[int] = set()
+        self.facet_values: Dict[str, Dict[int, str]] = {name: {} for name in FACET_FIELDS}
+        self._sorted_terms: List[str] = []
+        self._trigram_terms: Dict[str, Set[str]] = defaultdict(set)
+        self._terms_dirty = False
+        self._name_rank: Dict[int, int] = {}
+        self._order_dirty = False
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, doc: ProductDoc) -> None:
+        self.remove(doc.product_id)
+        self.docs[doc.product_id] = doc
+        self._order_dirty = True
+        if not doc.active:
+            self.inactive.add(doc.product_id)
+        for name in FACET_FIELDS:
+            value = getattr(doc, name)
+            if value:
+                self.facet_values[name][doc.product_id] = value
+        for term, weight in doc.terms.items():
+            if term not in self.postings:
+                self._terms_dirty = True
+                for tri in _inner_trigrams(term) | trigrams(term):
+                    self._trigram_terms[tri].add(term)
+            self.postings[term][doc.product_id] = weight
+
+    def remove(self, product_id: int) -> None:
+        doc = self.docs.pop(product_id, None)
+        if doc is None:
+            return
+        self._order_dirty = True
+        self.inactive.discard(product_id)
+        for values in self.facet_values.values():
+            values.pop(product_id, None)
+        for term in doc.terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(product_id, None)
+            if not posting:
+                del self.postings[term]
+                self._terms_dirty = True
+                for tri in _inner_trigrams(term) | trigrams(term):
+                    bucket = self._trigram_terms.get(tri)
+                    if bucket is not None:
+                        bucket.discard(term)
+                        if not bucket:
+                            del self._trigram_terms[tri]
+
+    def _terms(self) -> List[str]:
+        if self._terms_dirty:
+            self._sorted_terms = sorted(self.postings)
+            self._terms_dirty = False
+        return self._sorted_terms
+
+    def _has_prefix(self, token: str) -> bool:
+        terms = self._terms()
+        pos = bisect.bisect_left(terms, token)
+        return pos < len(terms) and terms[pos].startswith(token)
+
+    def _name_order(self) -> Dict[int, int]:
+        """product_id -> позиція за назвою (другий ключ сортування при рівній релевантності)"""
+        if self._order_dirty:
+            ordered = sorted(self.docs.values(), key=lambda d: (d.name.casefold(), d.product_id))
+            self._name_rank = {doc.product_id: pos for pos, doc in enumerate(ordered)}
+            self._order_dirty = False
+        return self._name_rank
+
+    def expand(self, token: str) -> Dict[str, float]:
+        """Терми індексу, що відповідають токену запиту -> множник типу збігу"""
+        matches: Dict[str, float] = {}
+        if token in self.postings:
+            matches[token] = MATCH_EXACT
+        terms = self._terms()
+        start = bisect.bisect_left(terms, token)
+        for term in terms[start:]:
+            if not term.startswith(token):
+                break
+            matches.setdefault(term, MATCH_PREFIX)
+        if len(token) >= 3:
+            # підрядок (семантика LIKE '%token%'): терми з усіма триграмами токена
+            buckets = sorted((self._trigram_terms.get(t, set()) for t in _inner_trigrams(token)), key=len)
+            if buckets and buckets[0]:
+                candidates = set.intersection(*buckets) if len(buckets) > 1 else buckets[0]
+                for term in candidates:
+                    if token in term:
+                        matches.setdefault(term, MATCH_INFIX)
+        else:
+            # 1-2 символи ("12", "xl") - триграм немає, підрядок перебором термів
+            for term in terms:
+                if token in term:
+                    matches.setdefault(term, MATCH_INFIX)
+        if not matches and len(token) >= 4:
+            matches.update(self._fuzzy(token))
+        return matches
+
+    def _fuzzy(self, token: str) -> Dict[str, float]:
+        query_grams = trigrams(token)
+        shared: Counter = Counter()
+        for tri in query_grams:
+            for term in self._trigram_terms.get(tri, ()):
+                shared[term] += 1
+        result = {}
+        for term, common in shared.items():
+            similarity = common / len(query_grams | trigrams(term))
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                result[term] = MATCH_FUZZY * similarity
+        return result
+
+    def _score_token(self, token: str) -> Dict[int, float]:
+        token_scores: Dict[int, float] = {}
+        # найкращий збіг першим - далі оновлюються лише товари з кращим балом
+        for term, factor in sorted(self.expand(token).items(), key=lambda item: -item[1]):
+            posting = self.postings[term]
+            if not token_scores:
+                token_scores = dict(posting) if factor == 1.0 else {p: w * factor for p, w in posting.items()}
+                continue
+            for product_id, weight in posting.items():
+                score = weight * factor
+                if score > token_scores.get(product_id, 0):
+                    token_scores[product_id] = score
+        return token_scores
+
+    def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        subcategory: Optional[str] = None,
+        colors: Iterable[str] = (),
+        materials: Iterable[str] = (),
+        active_only: bool = True,
+        limit: Optional[int] = None,
+    ) -> SearchResult:
+        started = time.perf_counter()
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if len(tokens) > 1 and self._has_prefix("".join(tokens)):
+            # "ST-12" / "st 12" -> артикул без розділителів
+            tokens = ["".join(tokens)]
+        scores: Optional[Dict[int, float]] = None
+        for token in tokens:
+            token_scores = self._score_token(token)
+            if scores is None:
+                scores = token_scores
+            else:
+                if len(token_scores) < len(scores):
+                    scores, token_scores = token_scores, scores
+                scores = {pid: s + token_scores[pid] for pid, s in scores.items() if pid in token_scores}
+            if not scores:
+                break
+        if scores is None:
+            # порожній запит - усі товари (лише фільтри)
+            scores = dict.fromkeys(self.docs, 0.0)
+
+        if active_only and self.inactive:
+            scores = {pid: s for pid, s in scores.items() if pid not in self.inactive}
+        colors = [normalize_text(c) for c in colors if c]
+        materials = [normalize_text(m) for m in materials if m]
+        if category or subcategory or colors or materials:
+            docs = self.docs
+            scores = {
+                pid: s for pid, s in scores.items()
+                if (not category or docs[pid].category == category)
+                and (not subcategory or docs[pid].subcategory == subcategory)
+                and (not colors or any(c in normalize_text(docs[pid].color) for c in colors))
+                and (not materials or any(m in normalize_text(docs[pid].material) for m in materials))
+            }
+
+        facets = {}
+        for name in FACET_FIELDS:
+            counter = Counter(map(self.facet_values[name].get, scores))
+            counter.pop(None, None)
+            facets[name] = dict(counter.most_common())
+
+        # стабільні сортування з C-ключами: за назвою, потім за релевантністю
+        ranked = sorted(scores, key=self._name_order().__getitem__)
+        ranked.sort(key=scores.__getitem__, reverse=True)
+        if limit:
+            ranked = ranked[:limit]
+        return SearchResult(
+            ids=ranked,
+            total=len(scores),
+            facets=facets,
+            scores={pid: scores[pid] for pid in ranked},
+            took_ms=(time.perf_counter() - started) * 1000,
+        )
+
+
+# ============================================================
+# SERVICE (завантаження + інвалідація)
+# ============================================================
+
+_SELECT_PRODUCTS = """
+    SELECT product_id, sku, name, category_name, subcategory_name,
+           color, material, description, status
+    FROM products
+"""
+
+
+class ProductSearch:
+    def __init__(self, max_age: int = MAX_AGE_SECONDS, check_seconds: int = CHECK_SECONDS):
+        self.max_age = max_age
+        self.check_seconds = check_seconds
+        self.index = ProductSearchIndex()
+        self._lock = threading.RLock()
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._sync_marker = None
+        self._dirty_ids: Set[int] = set()
+        self._dirty_all = True
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._dirty_all = True
+
+    def invalidate_products(self, product_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._dirty_ids.update(int(p) for p in product_ids if p is not None)
+
+    def _read_sync_marker(self, db):
+        """Останній запуск sync_all (sync_runs) - зміни з іншого процесу"""
+        try:
+            return db.execute(text("SELECT MAX(id) FROM sync_runs")).scalar()
+        except Exception:
+            db.rollback()
+            return None
+
+    def ensure_fresh(self, db) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if not self._dirty_all and now - self._checked_at > self.check_seconds:
+                self._checked_at = now
+                if self._read_sync_marker(db) != self._sync_marker:
+                    self._dirty_all = True
+            if self._dirty_all or now - self._loaded_at > self.max_age:
+                self._load_all(db)
+            elif self._dirty_ids:
+                product_ids = sorted(self._dirty_ids)
+                self._dirty_ids.clear()
+                self._reload(db, product_ids)
+
+    def _load_all(self, db) -> None:
+        started = time.monotonic()
+        index = ProductSearchIndex()
+        for row in db.execute(text(_SELECT_PRODUCTS)).fetchall():
+            index.add(build_doc(row))
+        self.index = index
+        self._sync_marker = self._read_sync_marker(db)
+        self._dirty_all = False
+        self._dirty_ids.clear()
+        self._loaded_at = self._checked_at = time.monotonic()
+        logger.info(
+            f"Product search index loaded: {len(index)} products, {len(index.postings)} terms "
+            f"in {(self._loaded_at - started) * 1000:.0f} ms"
+        )
+
+    def _reload(self, db, product_ids: List[int]) -> None:
+        rows = db.execute(
+            text(_SELECT_PRODUCTS + " WHERE product_id IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": product_ids}
+        ).fetchall()
+        found = set()
+        for row in rows:
+            self.index.add(build_doc(row))
+            found.add(int(row[0]))
+        for product_id in set(product_ids) - found:
+            self.index.remove(product_id)
+
+    def search(self, db, query: str, **filters) -> SearchResult:
+        self.ensure_fresh(db)
+        with self._lock:
+            return self.index.search(query, **filters)
+
+
+def search_text(sql: str, params: dict) -> TextClause:
+    """
+    text(sql), де :search_ids (якщо є в params) - expanding bindparam:
+    IN зі списку id, порожній список не ламає SQL
+    """
+    clause = text(sql)
+    if "search_ids" in params:
+        clause = clause.bindparams(bindparam("search_ids", expanding=True))
+    return clause
+
+
+def rank_rows(rows, ids: List[int], id_index: int = 0) -> list:
+    """
+    Впорядкувати рядки SQL (відфільтровані `product_id IN :search_ids`) за релевантністю пошуку
+    """
+    positions = {pid: pos for pos, pid in enumerate(ids)}
+    return sorted(rows, key=lambda row: positions.get(row[id_index], len(positions)))
+
+
+# ============================================================
+# CHANGE TRACKING
+# ============================================================
+
+def _note_write(conn, statement, parameters) -> None:
+    match = _PRODUCTS_WRITE_RE.match(statement or "")
+    if not match:
+        return
+    if match.group(1).upper() == "UPDATE":
+        set_clause = re.split(r"\bWHERE\b", statement, maxsplit=1, flags=re.IGNORECASE)[0]
+        if not _SET_COLUMNS_RE.search(set_clause):
+            # кількості / стани - в індексі їх немає
+            return
+    pending = conn.info.setdefault("product_search_pending", {"ids": set(), "all": False})
+    params_list = parameters if isinstance(parameters, (list, tuple)) else [parameters]
+    product_ids = []
+    for params in params_list:
+        if isinstance(params, dict):
+            product_ids.append(params.get("product_id", params.get("pid")))
+    if product_ids and all(p is not None for p in product_ids):
+        pending["ids"].update(product_ids)
+    else:
+        pending["all"] = True
+
+
+def install_change_tracking(sa_engine) -> None:
+    """Слухати записи в products і інвалідувати індекс після COMMIT"""
+
+    @event.listens_for(sa_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        _note_write(conn, statement, parameters)
+
+    @event.listens_for(sa_engine, "rollback")
+    def _on_rollback(conn):
+        discard_pending(conn, "product_search_pending")
+
+    # Інвалідація - після фактичного COMMIT (подія рушія "commit" - до нього)
+    on_commit("product_search_pending", _apply_pending)
+
+
+def _apply_pending(pending) -> None:
+    search = get_product_search()
+    if pending["all"]:
+        search.invalidate()
+    elif pending["ids"]:
+        search.invalidate_products(pending["ids"])
+
+
+# ============================================================
+# SINGLETON
+# ============================================================
+
+_search_instance: Optional[ProductSearch] = None
+_tracking_installed = False
+_instance_lock = threading.Lock()
+
+
+def get_product_search() -> ProductSearch:
+    """Singleton індексу процесу (з підключеним відстеженням змін rh_engine)"""
+    global _search_instance, _tracking_installed
+
+    if _search_instance is not None and _tracking_installed:
+        return _search_instance
+
+    with _instance_lock:
+        if _search_instance is None:
+            _search_instance = ProductSearch()
+
+        if not _tracking_installed:
+            _tracking_installed = True
+            from database_rentalhub import rh_engine
+            install_change_tracking(rh_engine)
+
+        return _search_instance
+
+
+def reset_product_search():
+    """Скинути індекс (корисно для тестів)"""
+    global _search_instance
+    _search_instance = None
@@ -0,0 +1,402 @@
+"""
+Realtime backplane - доставка WebSocket-подій між воркерами uvicorn.
+
+OrderSyncManager тримав з'єднання в dict процесу: при кількох воркерах оновлення секції
+чи коментар з воркера A не доходили до менеджера, підключеного до воркера B, а список
+присутніх показував лише "своїх". Тут:
+
+- Backplane - шина подій між воркерами: publish(channel, message) доставляє повідомлення
+  обробнику (subscribe) у кожному воркері, включно з власним (одразу, без шини)
+    MemoryBackplane   - один воркер (за замовчуванням; hub можна розділити між екземплярами)
+    DatabaseBackplane - кілька воркерів / хостів: таблиця realtime_events у RentalHub MySQL
+                        як брокер, кожен воркер опитує нові рядки кожні REALTIME_POLL_MS;
+                        AUTO_INCREMENT id видаються до COMMIT, тож менший id може з'явитися
+                        пізніше за більший - кожне опитування перечитує останні
+                        REALTIME_POLL_WINDOW id і пропускає вже доставлені
+  вибір - REALTIME_BACKPLANE=memory|database
+- ConnectionSender - черга відправки одного сокета з власною задачею-відправником:
+  broadcast лише ставить повідомлення в чергу і не чекає повільний сокет; повідомлення з
+  однаковим ключем коалесцюються (у черзі лишається найсвіжіше), а сокет, черга якого
+  переповнена (REALTIME_SEND_QUEUE), закривається - клієнт перепідключиться і
+  перечитає стан через REST
+- PresenceRegistry - присутні у кімнатах усіх воркерів (join/leave + періодичні знімки
+  кожного воркера; записи воркера без знімка 3 інтервали поспіль вважаються мертвими)
+
+Usage:
+    backplane = get_backplane()
+    backplane.subscribe(on_event)          # fn(channel, message) - async або звичайна
+    await backplane.start()
+    await backplane.publish("order:42", {...})
+"""
+import asyncio
+import inspect
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from itertools import count
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+REALTIME_BACKPLANE = os.environ.get("REALTIME_BACKPLANE", "memory").lower()
+REALTIME_POLL_MS = int(os.environ.get("REALTIME_POLL_MS", "250"))
+REALTIME_POLL_WINDOW = int(os.environ.get("REALTIME_POLL_WINDOW", "200"))
+REALTIME_EVENT_RETENTION_SECONDS = int(os.environ.get("REALTIME_EVENT_RETENTION_SECONDS", "300"))
+REALTIME_SEND_QUEUE = int(os.environ.get("REALTIME_SEND_QUEUE", "200"))
+REALTIME_PRESENCE_HEARTBEAT_SECONDS = float(os.environ.get("REALTIME_PRESENCE_HEARTBEAT_SECONDS", "30"))
+
+Handler = Callable[[str, dict], Any]
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+async def _call(handler: Handler, channel: str, message: dict):
+    try:
+        result = handler(channel, message)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logger.warning("Realtime handler failed on %s: %s", channel, e)
+
+
+class Backplane:
+    """Шина подій між воркерами"""
+
+    def __init__(self, worker_id: str = WORKER_ID):
+        self.worker_id = worker_id
+        self._handlers: List[Handler] = []
+        self.started = False
+
+    def subscribe(self, handler: Handler):
+        self._handlers.append(handler)
+
+    async def _dispatch(self, channel: str, message: dict):
+        for handler in self._handlers:
+            await _call(handler, channel, message)
+
+    async def start(self):
+        self.started = True
+
+    async def stop(self):
+        self.started = False
+
+    async def publish(self, channel: str, message: dict):
+        raise NotImplementedError
+
+
+class MemoryBackplane(Backplane):
+    """
+    Один процес. hub - спільний список екземплярів (для кількох менеджерів у процесі,
+    напр. у тестах); за замовчуванням власний.
+    """
+
+    def __init__(self, worker_id: str = WORKER_ID, hub: Optional[list] = None):
+        super().__init__(worker_id)
+        self.hub = hub if hub is not None else []
+        self.hub.append(self)
+
+    async def publish(self, channel: str, message: dict):
+        await self._dispatch(channel, message)
+        for other in list(self.hub):
+            if other is not self and other.started:
+                await other._dispatch(channel, message)
+
+
+class DatabaseBackplane(Backplane):
+    """
+    Брокер у таблиці realtime_events: publish - INSERT, кожен воркер опитує рядки
+    з id > last_id - window (транзакції комітяться не в порядку id); доставлені id
+    пам'ятаються, поки не випадуть з вікна. Свої рядки пропускає (вже доставлені локально).
+    Рядки старші за REALTIME_EVENT_RETENTION_SECONDS видаляються.
+    """
+
+    def __init__(self, worker_id: str = WORKER_ID, engine=None,
+                 poll_interval: float = REALTIME_POLL_MS / 1000.0,
+                 retention: int = REALTIME_EVENT_RETENTION_SECONDS, batch: int = 500,
+                 window: int = REALTIME_POLL_WINDOW):
+        super().__init__(worker_id)
+        self._engine = engine
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.batch = batch
+        self.window = window
+        self.last_id = 0
+        self._seen: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._table_ready = False
+        self._last_cleanup = 0.0
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from database_rentalhub import rh_engine
+            self._engine = rh_engine
+        return self._engine
+
+    def ensure_table(self, conn):
+        if self._table_ready:
+            return
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS realtime_events (
+                id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                channel VARCHAR(100) NOT NULL,
+                origin VARCHAR(100) NOT NULL,
+                payload MEDIUMTEXT NOT NULL,
+                created_at DATETIME NOT NULL,
+                INDEX idx_realtime_events_created (created_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """))
+        self._table_ready = True
+
+    # -- blocking part (у потоці) --
+
+    def _insert(self, channel: str, payload: str):
+        with self.engine.begin() as conn:
+            self.ensure_table(conn)
+            conn.execute(text("""
+                INSERT INTO realtime_events (channel, origin, payload, created_at)
+                VALUES (:channel, :origin, :payload, :now)
+            """), {"channel": channel, "origin": self.worker_id, "payload": payload, "now": datetime.now()})
+
+    def _max_id(self) -> int:
+        with self.engine.begin() as conn:
+            self.ensure_table(conn)
+            row = conn.execute(text("SELECT MAX(id) FROM realtime_events")).fetchone()
+        return int(row[0] or 0) if row else 0
+
+    def _fetch(self, after_id: int) -> list:
+        with self.engine.begin() as conn:
+            rows = conn.execute(text("""
+                SELECT id, channel, origin, payload FROM realtime_events
+                WHERE id > :after_id ORDER BY id LIMIT :batch
+            """), {"after_id": after_id, "batch": self.batch}).fetchall()
+            if time.monotonic() - self._last_cleanup > self.retention / 5:
+                self._last_cleanup = time.monotonic()
+                conn.execute(text("DELETE FROM realtime_events WHERE created_at < :cutoff"),
+                             {"cutoff": datetime.now() - timedelta(seconds=self.retention)})
+        return rows
+
+    # -- async API --
+
+    async def start(self):
+        if self.started:
+            return
+        self.last_id = await asyncio.to_thread(self._max_id)
+        # події до старту не доставляються, але пізні коміти всередині вікна - так
+        self._seen = {int(row[0]) for row in await asyncio.to_thread(self._fetch, self._window_start())}
+        self.started = True
+        self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        self.started = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    async def publish(self, channel: str, message: dict):
+        await self._dispatch(channel, message)
+        try:
+            await asyncio.to_thread(self._insert, channel, json.dumps(message, ensure_ascii=False, default=str))
+        except Exception as e:
+            logger.warning("Realtime publish to %s failed: %s", channel, e)
+
+    def _window_start(self) -> int:
+        return max(0, self.last_id - self.window)
+
+    async def poll_once(self) -> int:
+        """Забрати нові події інших воркерів; повертає кількість доставлених"""
+        delivered = 0
+        after_id = self._window_start()
+        while True:
+            rows = await asyncio.to_thread(self._fetch, after_id)
+            for event_id, channel, origin, payload in rows:
+                event_id = int(event_id)
+                after_id = event_id
+                if event_id in self._seen:
+                    continue
+                self._seen.add(event_id)
+                self.last_id = max(self.last_id, event_id)
+                if origin == self.worker_id:
+                    continue
+                try:
+                    message = json.loads(payload)
+                except (TypeError, ValueError):
+                    continue
+                await self._dispatch(channel, message)
+                delivered += 1
+            # повна порція - далі є ще рядки (вікно не повинне з'їдати весь batch)
+            if len(rows) < self.batch:
+                break
+        floor = self._window_start()
+        self._seen = {event_id for event_id in self._seen if event_id > floor}
+        return delivered
+
+    async def _poll_loop(self):
+        while self.started:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Realtime poll failed: %s", e)
+                await asyncio.sleep(min(5.0, self.poll_interval * 10))
+            await asyncio.sleep(self.poll_interval)
+
+
+# ============================================================
+# SEND QUEUE
+# ============================================================
+
+class ConnectionSender:
+    """
+    Черга відправки одного сокета. push() не чекає мережу; повідомлення з однаковим
+    ключем замінюють те, що ще не відправлене (позиція в черзі зберігається).
+    Переповнена черга -> on_overflow (закрити сокет).
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[Any]], max_pending: int = REALTIME_SEND_QUEUE,
+                 on_overflow: Optional[Callable[[], Any]] = None):
+        self._send = send
+        self.max_pending = max_pending
+        self._on_overflow = on_overflow
+        self._pending: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._seq = count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.coalesced = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def push(self, payload: str, key: Optional[Hashable] = None) -> bool:
+        """Поставити в чергу; False - сокет закритий або переповнений"""
+        if self.closed:
+            return False
+        if key is not None and key in self._pending:
+            self._pending[key] = payload
+            self.coalesced += 1
+            return True
+        if len(self._pending) >= self.max_pending:
+            logger.warning("Realtime send queue overflow (%s pending) - dropping slow connection", len(self._pending))
+            self.close()
+            if self._on_overflow:
+                self._on_overflow()
+            return False
+        self._pending[key if key is not None else ("_", next(self._seq))] = payload
+        self._wakeup.set()
+        return True
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def _run(self):
+        while not self.closed:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            _, payload = self._pending.popitem(last=False)
+            try:
+                await self._send(payload)
+            except Exception as e:
+                logger.info("Realtime send failed: %s", e)
+                self.close()
+                if self._on_overflow:
+                    self._on_overflow()
+
+    def close(self):
+        self.closed = True
+        self._pending.clear()
+        self._wakeup.set()
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+
+# ============================================================
+# PRESENCE
+# ============================================================
+
+class PresenceRegistry:
+    """room -> {(worker, conn): info} для всіх воркерів"""
+
+    def __init__(self, ttl: float = REALTIME_PRESENCE_HEARTBEAT_SECONDS * 3, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._rooms: Dict[Hashable, Dict[tuple, dict]] = {}
+        self._seen: Dict[str, float] = {}
+
+    def join(self, worker: str, room: Hashable, conn: str, info: dict):
+        self._seen[worker] = self.clock()
+        self._rooms.setdefault(room, {})[(worker, conn)] = info
+
+    def leave(self, worker: str, room: Hashable, conn: str):
+        members = self._rooms.get(room)
+        if members is not None:
+            members.pop((worker, conn), None)
+            if not members:
+                del self._rooms[room]
+
+    def replace_worker(self, worker: str, rooms: Dict[Hashable, Dict[str, dict]]):
+        """Повний знімок присутніх одного воркера"""
+        self._seen[worker] = self.clock()
+        self._drop_worker(worker)
+        for room, members in rooms.items():
+            for conn, info in members.items():
+                self._rooms.setdefault(room, {})[(worker, conn)] = info
+
+    def _drop_worker(self, worker: str):
+        for room in list(self._rooms):
+            members = self._rooms[room]
+            for key in [k for k in members if k[0] == worker]:
+                del members[key]
+            if not members:
+                del self._rooms[room]
+
+    def expire(self, keep: Optional[str] = None) -> List[str]:
+        """Прибрати воркери без знімка довше за ttl (keep - свій воркер)"""
+        now = self.clock()
+        dead = [w for w, seen in self._seen.items() if w != keep and now - seen > self.ttl]
+        for worker in dead:
+            del self._seen[worker]
+            self._drop_worker(worker)
+        return dead
+
+    def members(self, room: Hashable) -> List[dict]:
+        return list(self._rooms.get(room, {}).values())
+
+    def connections(self, room: Hashable) -> int:
+        return len(self._rooms.get(room, {}))
+
+
+# ============================================================
+# SINGLETON
+# ============================================================
+
+_backplane: Optional[Backplane] = None
+
+
+def get_backplane() -> Backplane:
+    """Singleton процесу за REALTIME_BACKPLANE"""
+    global _backplane
+    if _backplane is None:
+        if REALTIME_BACKPLANE == "database":
+            _backplane = DatabaseBackplane()
+        else:
+            if REALTIME_BACKPLANE != "memory":
+                logger.warning("Unknown REALTIME_BACKPLANE=%s, using memory", REALTIME_BACKPLANE)
+            _backplane = MemoryBackplane()
+    return _backplane
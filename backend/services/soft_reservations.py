@@ -0,0 +1,317 @@
+"""
+Soft Reservations - життєвий цикл тимчасових резервів мудбордів Event Tool.
+
+Раніше рядки event_soft_reservations лише відфільтровувались за expires_at > NOW() при читанні:
+ніхто їх не прибирав, таблиця росла, а кожна перевірка доступності проходила по мертвих резервах.
+
+Тепер:
+- один резерв на (board_id, product_id) - унікальний ключ uq_soft_res_board_product,
+  тож створення і продовження - один INSERT ... SELECT ... ON DUPLICATE KEY UPDATE на весь борд
+  (sync_board_holds), у тому числі коли змінюються дати борду
+- фоновий SoftReservationSweeper пачками переносить прострочені / зняті резерви
+  в event_soft_reservations_archive і видаляє їх з робочої таблиці
+- активні резерви по товарах і датах тримає in-memory індекс availability engine
+  (max_soft_reserved); будь-який запис у таблицю інвалідує його після COMMIT
+
+Usage:
+    sync_board_holds(db, board_id)      # після зміни товарів або дат борду
+    release_board_holds(db, board_id)   # борд видалено / конвертовано в замовлення
+    db.commit()
+
+    get_soft_reservation_sweeper().start()
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+SOFT_HOLD_TTL_MINUTES = int(os.environ.get("SOFT_HOLD_TTL_MINUTES", "30"))
+SOFT_RESERVATION_SWEEP_SECONDS = float(os.environ.get("SOFT_RESERVATION_SWEEP_SECONDS", "60"))
+SOFT_RESERVATION_SWEEP_BATCH = int(os.environ.get("SOFT_RESERVATION_SWEEP_BATCH", "500"))
+# Скільки днів тримати архів (0 - не чистити)
+SOFT_RESERVATION_ARCHIVE_DAYS = int(os.environ.get("SOFT_RESERVATION_ARCHIVE_DAYS", "180"))
+
+STATUS_ACTIVE = "active"
+STATUS_EXPIRED = "expired"
+
+_UNIQUE_KEY = "uq_soft_res_board_product"
+_ACTIVE_INDEX = "idx_soft_res_active"
+
+# Резерв "мертвий": прострочений або знятий (status != active)
+_DEAD_HOLD = "(expires_at <= NOW() OR status <> 'active')"
+
+_schema_ready = False
+
+
+# ============================================================
+# SCHEMA
+# ============================================================
+
+def _index_exists(db: Session, table: str, index: str) -> bool:
+    return bool(db.execute(text("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND INDEX_NAME = :index
+    """), {"table": table, "index": index}).scalar())
+
+
+def ensure_reservation_schema(db: Session):
+    """
+    Таблиця резервів, архів і ключі.
+    Для вже існуючої таблиці: прибрати дублікати (board_id, product_id), залишивши найновіший,
+    і додати унікальний ключ та складений індекс активних резервів.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    db.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS event_soft_reservations (
+            id VARCHAR(36) PRIMARY KEY,
+            board_id VARCHAR(36) NOT NULL,
+            product_id INT NOT NULL,
+            quantity INT NOT NULL,
+            reserved_from DATE NOT NULL,
+            reserved_until DATE NOT NULL,
+            expires_at DATETIME NOT NULL,
+            customer_id INT NOT NULL,
+            status VARCHAR(20) DEFAULT 'active',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY {_UNIQUE_KEY} (board_id, product_id),
+            INDEX {_ACTIVE_INDEX} (status, product_id, reserved_from, reserved_until, expires_at),
+            INDEX idx_soft_res_expires (expires_at)
+        )
+    """))
+    db.execute(text("""
+        CREATE TABLE IF NOT EXISTS event_soft_reservations_archive (
+            id VARCHAR(36) PRIMARY KEY,
+            board_id VARCHAR(36) NOT NULL,
+            product_id INT NOT NULL,
+            quantity INT NOT NULL,
+            reserved_from DATE NOT NULL,
+            reserved_until DATE NOT NULL,
+            expires_at DATETIME NOT NULL,
+            customer_id INT NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            created_at DATETIME NULL,
+            archived_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_soft_res_archive_board (board_id),
+            INDEX idx_soft_res_archive_product (product_id, reserved_from),
+            INDEX idx_soft_res_archive_archived (archived_at)
+        )
+    """))
+    if not _index_exists(db, "event_soft_reservations", _UNIQUE_KEY):
+        removed = db.execute(text("""
+            DELETE older FROM event_soft_reservations older
+            JOIN event_soft_reservations newer
+              ON newer.board_id = older.board_id AND newer.product_id = older.product_id
+             AND (newer.created_at > older.created_at
+                  OR (newer.created_at = older.created_at AND newer.id > older.id))
+        """)).rowcount
+        db.execute(text(f"""
+            ALTER TABLE event_soft_reservations ADD UNIQUE KEY {_UNIQUE_KEY} (board_id, product_id)
+        """))
+        logger.info(f"event_soft_reservations: unique (board_id, product_id), {removed} duplicate holds removed")
+    if not _index_exists(db, "event_soft_reservations", _ACTIVE_INDEX):
+        db.execute(text(f"""
+            CREATE INDEX {_ACTIVE_INDEX}
+            ON event_soft_reservations (status, product_id, reserved_from, reserved_until, expires_at)
+        """))
+    _schema_ready = True
+
+
+# ============================================================
+# HOLDS
+# ============================================================
+
+def sync_board_holds(db: Session, board_id: str, ttl_minutes: Optional[int] = None) -> int:
+    """
+    Привести резерви борду у відповідність до його товарів і дат одним пакетом:
+    - товар є в борді -> резерв створюється або оновлюється (кількість, дати, новий expires_at)
+    - товару вже немає -> резерв видаляється
+    - у борду немає дат оренди або він вже конвертований -> всі резерви знімаються
+    Коміт - на викликачі. Повертає rowcount upsert (MySQL: 1 - створений резерв, 2 - продовжений).
+    """
+    ensure_reservation_schema(db)
+    ttl = SOFT_HOLD_TTL_MINUTES if ttl_minutes is None else ttl_minutes
+    params = {"board_id": board_id, "ttl": ttl}
+    db.execute(text("""
+        DELETE FROM event_soft_reservations
+        WHERE board_id = :board_id
+          AND product_id NOT IN (
+              SELECT ebi.product_id
+              FROM event_board_items ebi
+              JOIN event_boards eb ON eb.id = ebi.board_id
+              WHERE ebi.board_id = :board_id
+                AND eb.rental_start_date IS NOT NULL AND eb.rental_end_date IS NOT NULL
+                AND eb.converted_to_order_id IS NULL
+          )
+    """), params)
+    return db.execute(text("""
+        INSERT INTO event_soft_reservations
+            (id, board_id, product_id, quantity, reserved_from, reserved_until, expires_at, customer_id, status)
+        SELECT UUID(), ebi.board_id, ebi.product_id, ebi.quantity, eb.rental_start_date, eb.rental_end_date,
+               NOW() + INTERVAL :ttl MINUTE, eb.customer_id, 'active'
+        FROM event_board_items ebi
+        JOIN event_boards eb ON eb.id = ebi.board_id
+        WHERE ebi.board_id = :board_id
+          AND eb.rental_start_date IS NOT NULL AND eb.rental_end_date IS NOT NULL
+          AND eb.converted_to_order_id IS NULL
+        ON DUPLICATE KEY UPDATE
+            quantity = VALUES(quantity),
+            reserved_from = VALUES(reserved_from),
+            reserved_until = VALUES(reserved_until),
+            expires_at = VALUES(expires_at),
+            customer_id = VALUES(customer_id),
+            status = 'active'
+    """), params).rowcount
+
+
+def release_board_holds(db: Session, board_id: str) -> int:
+    """Зняти всі резерви борду (видалення / конвертація в замовлення). Коміт - на викликачі"""
+    ensure_reservation_schema(db)
+    return db.execute(text("""
+        DELETE FROM event_soft_reservations WHERE board_id = :board_id
+    """), {"board_id": board_id}).rowcount
+
+
+# ============================================================
+# SWEEP
+# ============================================================
+
+def sweep_expired(db: Session, batch_size: int = SOFT_RESERVATION_SWEEP_BATCH, max_batches: int = 20) -> int:
+    """
+    Перенести мертві резерви в архів пачками по batch_size (коміт на кожну пачку,
+    щоб не тримати довгих блокувань). Умова повторюється в INSERT і DELETE:
+    резерв, продовжений між вибіркою і видаленням, залишається в робочій таблиці.
+    Безпечно при паралельному запуску з кількох воркерів (INSERT IGNORE по id).
+    """
+    ensure_reservation_schema(db)
+    archived = 0
+    for _ in range(max_batches):
+        ids = [row[0] for row in db.execute(text(f"""
+            SELECT id FROM event_soft_reservations
+            WHERE {_DEAD_HOLD}
+            ORDER BY expires_at
+            LIMIT :limit
+        """), {"limit": batch_size}).fetchall()]
+        if not ids:
+            break
+        params = {"ids": tuple(ids)}
+        db.execute(text(f"""
+            INSERT IGNORE INTO event_soft_reservations_archive
+                (id, board_id, product_id, quantity, reserved_from, reserved_until,
+                 expires_at, customer_id, status, created_at, archived_at)
+            SELECT id, board_id, product_id, quantity, reserved_from, reserved_until,
+                   expires_at, customer_id,
+                   CASE WHEN status = 'active' THEN 'expired' ELSE status END,
+                   created_at, NOW()
+            FROM event_soft_reservations
+            WHERE id IN :ids AND {_DEAD_HOLD}
+        """), params)
+        archived += db.execute(text(f"""
+            DELETE FROM event_soft_reservations WHERE id IN :ids AND {_DEAD_HOLD}
+        """), params).rowcount
+        db.commit()
+        if len(ids) < batch_size:
+            break
+    return archived
+
+
+def purge_archive(db: Session, days: int = SOFT_RESERVATION_ARCHIVE_DAYS,
+                  batch_size: int = SOFT_RESERVATION_SWEEP_BATCH) -> int:
+    """Видалити з архіву записи старші за days днів (одна пачка за прохід)"""
+    if days <= 0:
+        return 0
+    ensure_reservation_schema(db)
+    removed = db.execute(text("""
+        DELETE FROM event_soft_reservations_archive
+        WHERE archived_at < NOW() - INTERVAL :days DAY
+        LIMIT :limit
+    """), {"days": days, "limit": batch_size}).rowcount
+    db.commit()
+    return removed
+
+
+class SoftReservationSweeper:
+    """Фоновий потік: раз на interval секунд архівує прострочені soft-резерви"""
+
+    def __init__(self, session_factory: Optional[Callable[[], Session]] = None,
+                 interval: float = SOFT_RESERVATION_SWEEP_SECONDS,
+                 batch_size: int = SOFT_RESERVATION_SWEEP_BATCH):
+        self._session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.passes = 0
+        self.archived = 0
+        self.purged = 0
+        self.last_run_at: Optional[float] = None
+        self.last_duration_ms = 0.0
+
+    def run_once(self, db: Session) -> int:
+        started = time.monotonic()
+        archived = sweep_expired(db, self.batch_size)
+        self.purged += purge_archive(db, batch_size=self.batch_size)
+        self.passes += 1
+        self.archived += archived
+        self.last_run_at = time.time()
+        self.last_duration_ms = (time.monotonic() - started) * 1000
+        if archived:
+            logger.info(f"Soft reservations: {archived} expired holds archived in {self.last_duration_ms:.0f} ms")
+        return archived
+
+    def stats(self) -> Dict:
+        return {
+            "passes": self.passes,
+            "archived": self.archived,
+            "purged": self.purged,
+            "last_run_at": self.last_run_at,
+            "last_duration_ms": round(self.last_duration_ms, 1),
+            "interval_seconds": self.interval,
+        }
+
+    # ---- thread ----
+
+    def start(self):
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="soft-reservation-sweeper", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        if self._session_factory is None:
+            from database_rentalhub import get_rh_db_sync
+            self._session_factory = get_rh_db_sync
+        while not self._stop.is_set():
+            db = self._session_factory()
+            try:
+                self.run_once(db)
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Soft reservation sweep failed: {e}")
+            finally:
+                db.close()
+            self._stop.wait(self.interval)
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_sweeper: Optional[SoftReservationSweeper] = None
+
+
+def get_soft_reservation_sweeper() -> SoftReservationSweeper:
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = SoftReservationSweeper()
+    return _sweeper
@@ -0,0 +1,304 @@
+"""
+Sync Engine - інкрементальна синхронізація OpenCart -> RentalHub.
+
+sync_all.py (cron, кожні 30 хв) раніше щоразу перечитував усі активні товари OpenCart і
+переписував до 10 000 товарів по одному UPDATE. Тут:
+
+- high-water marks у sync_state: (date_modified, product_id) для товарів, order_id для замовлень
+- контрольні суми блоків товарів (sync_checksums): залишки в OpenCart змінюються при
+  замовленнях без оновлення date_modified, тому зміни шукаються через BIT_XOR(CRC32(...))
+  по блоках product_id і перечитуються лише змінені блоки
+- вибірка keyset-пачками, запис - bulk upsert / bulk update по пачці
+- кожен етап пише час і кількість рядків у sync_runs; routes/sync.get_sync_status їх показує
+
+Працює з DB-API курсорами (mysql.connector / pymysql, плейсхолдери %s).
+
+Usage:
+    run = SyncRun(rh_conn)
+    with run.stage("products") as stats:
+        stats.fetched += len(rows)
+        stats.written += bulk_upsert(rh_cur, "products", columns, rows, update_columns)
+    run.finish()
+"""
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+BATCH_SIZE = 500
+CHECKSUM_BLOCK_SIZE = 500
+EPOCH = datetime(1970, 1, 1)
+
+
+def ensure_sync_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            stage VARCHAR(50) NOT NULL PRIMARY KEY,
+            hwm_value VARCHAR(64) NULL,
+            hwm_id BIGINT NULL,
+            updated_at DATETIME NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_checksums (
+            stage VARCHAR(50) NOT NULL,
+            block_id INT NOT NULL,
+            checksum VARCHAR(40) NOT NULL,
+            PRIMARY KEY (stage, block_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_runs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            run_id VARCHAR(32) NOT NULL,
+            stage VARCHAR(50) NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            started_at DATETIME NOT NULL,
+            duration_ms INT NOT NULL DEFAULT 0,
+            rows_fetched INT NOT NULL DEFAULT 0,
+            rows_written INT NOT NULL DEFAULT 0,
+            error TEXT NULL,
+            INDEX idx_sync_runs_run (run_id),
+            INDEX idx_sync_runs_started (started_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+
+# ============================================================
+# HIGH-WATER MARKS
+# ============================================================
+
+def get_hwm(cursor, stage: str) -> Tuple[Optional[str], Optional[int]]:
+    cursor.execute("SELECT hwm_value, hwm_id FROM sync_state WHERE stage = %s", (stage,))
+    row = cursor.fetchone()
+    if not row:
+        return None, None
+    if isinstance(row, dict):
+        return row["hwm_value"], row["hwm_id"]
+    return row[0], row[1]
+
+
+def set_hwm(cursor, stage: str, value=None, row_id: Optional[int] = None):
+    if isinstance(value, datetime):
+        value = value.strftime("%Y-%m-%d %H:%M:%S")
+    cursor.execute("""
+        INSERT INTO sync_state (stage, hwm_value, hwm_id, updated_at)
+        VALUES (%s, %s, %s, NOW())
+        ON DUPLICATE KEY UPDATE hwm_value = VALUES(hwm_value), hwm_id = VALUES(hwm_id), updated_at = NOW()
+    """, (stage, None if value is None else str(value), row_id))
+
+
+def parse_hwm_datetime(value: Optional[str]) -> datetime:
+    if not value:
+        return EPOCH
+    return datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S")
+
+
+def keyset_batches(
+    fetch: Callable[[object, int, int], List[dict]],
+    start_value,
+    start_id: int,
+    value_key: str,
+    id_key: str,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[List[dict]]:
+    """
+    Пачки за (value, id) > (start_value, start_id).
+    fetch(after_value, after_id, limit) має повертати рядки, відсортовані за (value, id).
+    """
+    after_value, after_id = start_value, start_id
+    while True:
+        rows = fetch(after_value, after_id, batch_size)
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]
+        after_value, after_id = last[value_key], last[id_key]
+        if len(rows) < batch_size:
+            return
+
+
+# ============================================================
+# BLOCK CHECKSUMS
+# ============================================================
+
+def load_checksums(cursor, stage: str) -> Dict[int, str]:
+    cursor.execute("SELECT block_id, checksum FROM sync_checksums WHERE stage = %s", (stage,))
+    result = {}
+    for row in cursor.fetchall():
+        if isinstance(row, dict):
+            result[int(row["block_id"])] = row["checksum"]
+        else:
+            result[int(row[0])] = row[1]
+    return result
+
+
+def changed_blocks(stored: Dict[int, str], current: Dict[int, str]) -> List[int]:
+    """Блоки, чия контрольна сума змінилась або яких раніше не було"""
+    return sorted(block for block, checksum in current.items() if stored.get(block) != checksum)
+
+
+def save_checksums(cursor, stage: str, checksums: Dict[int, str], removed: Iterable[int] = ()):
+    rows = [(stage, block, checksum) for block, checksum in checksums.items()]
+    for chunk in _chunks(rows, BATCH_SIZE):
+        placeholders = ", ".join(["(%s, %s, %s)"] * len(chunk))
+        cursor.execute(
+            f"INSERT INTO sync_checksums (stage, block_id, checksum) VALUES {placeholders} "
+            f"ON DUPLICATE KEY UPDATE checksum = VALUES(checksum)",
+            [value for row in chunk for value in row]
+        )
+    removed = list(removed)
+    if removed:
+        placeholders = ", ".join(["%s"] * len(removed))
+        cursor.execute(
+            f"DELETE FROM sync_checksums WHERE stage = %s AND block_id IN ({placeholders})",
+            [stage, *removed]
+        )
+
+
+def block_range(block: int, block_size: int = CHECKSUM_BLOCK_SIZE) -> Tuple[int, int]:
+    """[start_id, end_id) для блоку"""
+    return block * block_size, (block + 1) * block_size
+
+
+def invalidate_blocks(cursor, stage: str, ids: Iterable[int], block_size: int = CHECKSUM_BLOCK_SIZE):
+    """Скинути контрольні суми блоків з цими id - етап перечитає їх наступного разу"""
+    blocks = sorted({int(i) // block_size for i in ids})
+    if blocks:
+        save_checksums(cursor, stage, {}, removed=blocks)
+
+
+# ============================================================
+# BULK WRITES
+# ============================================================
+
+def _chunks(rows: Sequence, size: int) -> Iterator[Sequence]:
+    for offset in range(0, len(rows), size):
+        yield rows[offset:offset + size]
+
+
+def bulk_upsert(
+    cursor,
+    table: str,
+    columns: Sequence[str],
+    rows: Sequence[Sequence],
+    update_columns: Sequence[str] = (),
+    raw_values: Dict[str, str] = None,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    INSERT ... VALUES (...), (...) ON DUPLICATE KEY UPDATE col = VALUES(col).
+    raw_values - SQL-вирази для додаткових колонок (напр. {"synced_at": "NOW()"}).
+    """
+    raw_values = raw_values or {}
+    all_columns = list(columns) + list(raw_values)
+    row_sql = "(" + ", ".join(["%s"] * len(columns) + list(raw_values.values())) + ")"
+    update_sql = ", ".join(f"{col} = VALUES({col})" for col in update_columns)
+    written = 0
+    for chunk in _chunks(rows, batch_size):
+        sql = f"INSERT INTO {table} ({', '.join(all_columns)}) VALUES {', '.join([row_sql] * len(chunk))}"
+        if update_sql:
+            sql += f" ON DUPLICATE KEY UPDATE {update_sql}"
+        cursor.execute(sql, [value for row in chunk for value in row])
+        written += len(chunk)
+    return written
+
+
+def bulk_update(
+    cursor,
+    table: str,
+    key: str,
+    columns: Sequence[str],
+    rows: Sequence[Sequence],
+    set_sql: str,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    UPDATE table t JOIN (SELECT %s AS key, ... UNION ALL SELECT ...) v ON v.key = t.key SET <set_sql>.
+    rows - (key, *columns); у set_sql доступні t.* та v.*. Рядки без відповідника в table ігноруються.
+    """
+    names = [key] + list(columns)
+    first_row = "SELECT " + ", ".join(f"%s AS {name}" for name in names)
+    next_row = "SELECT " + ", ".join(["%s"] * len(names))
+    changed = 0
+    for chunk in _chunks(rows, batch_size):
+        derived = " UNION ALL ".join([first_row] + [next_row] * (len(chunk) - 1))
+        cursor.execute(
+            f"UPDATE {table} t JOIN ({derived}) v ON v.{key} = t.{key} SET {set_sql}",
+            [value for row in chunk for value in row]
+        )
+        changed += max(cursor.rowcount or 0, 0)
+    return changed
+
+
+# ============================================================
+# RUN / STAGE STATS
+# ============================================================
+
+@dataclass
+class StageStats:
+    stage: str
+    started_at: datetime = field(default_factory=datetime.now)
+    duration_ms: int = 0
+    fetched: int = 0
+    written: int = 0
+    status: str = "running"
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "stage": self.stage,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "rows_fetched": self.fetched,
+            "rows_written": self.written,
+            "error": self.error,
+        }
+
+
+class SyncRun:
+    """Статистика одного запуску sync_all: етапи -> sync_runs"""
+
+    def __init__(self, rh_conn=None, log: Callable[[str], None] = print):
+        self.run_id = uuid.uuid4().hex
+        self.rh_conn = rh_conn
+        self.log = log
+        self.stages: List[StageStats] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        stats = StageStats(stage=name)
+        self.stages.append(stats)
+        started = time.perf_counter()
+        try:
+            yield stats
+            # етапи sync_all ловлять свої винятки і лише заповнюють stats.error
+            stats.status = "failed" if stats.error else "ok"
+        except Exception as e:
+            stats.status = "failed"
+            stats.error = str(e)[:2000]
+            raise
+        finally:
+            stats.duration_ms = int((time.perf_counter() - started) * 1000)
+            self.log(f"  ⏱  {name}: {stats.duration_ms} ms, fetched {stats.fetched}, written {stats.written}")
+
+    def finish(self):
+        """Записати етапи в sync_runs (помилки запису статусу не ламають синхронізацію)"""
+        if self.rh_conn is None or not self.stages:
+            return
+        try:
+            cursor = self.rh_conn.cursor()
+            ensure_sync_tables(cursor)
+            bulk_upsert(
+                cursor, "sync_runs",
+                ["run_id", "stage", "status", "started_at", "duration_ms", "rows_fetched", "rows_written", "error"],
+                [(self.run_id, s.stage, s.status, s.started_at, s.duration_ms, s.fetched, s.written, s.error)
+                 for s in self.stages],
+            )
+            self.rh_conn.commit()
+            cursor.close()
+        except Exception as e:
+            self.log(f"  ⚠️  Could not save sync run stats: {e}")
@@ -1,34 +1,137 @@
 """
 DB-override Jinja2 Loader.
 Перевіряє document_templates таблицю перед файловою системою.
+
+Кеш DB-шаблонів:
+- усі overrides тримаються в пам'яті: doc_type -> (content, hash), де hash = sha1(updated_at + content)
+- uptodate() порівнює hash, тож Jinja перекомпілює шаблон лише коли він реально змінився
+- save/reset в адмінці викликають invalidate_template_cache()
+- для інших воркерів - дешевий probe версії таблиці (COUNT/MAX(updated_at)/CRC32) раз на
+  TEMPLATE_CACHE_PROBE_SECONDS секунд
 """
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
 from jinja2 import BaseLoader, TemplateNotFound
 from sqlalchemy import text
 
+PROBE_INTERVAL_SECONDS = float(os.environ.get("TEMPLATE_CACHE_PROBE_SECONDS", "30"))
+
+
+class DBTemplateCache:
+    """Снапшот document_templates з періодичною перевіркою версії"""
+
+    def __init__(self, probe_interval: float = PROBE_INTERVAL_SECONDS, session_factory=None):
+        self.probe_interval = probe_interval
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        self._templates: Dict[str, Tuple[str, str]] = {}
+        self._version = None
+        self._loaded = False
+        self._checked_at = 0.0
+
+    def invalidate(self, doc_type: Optional[str] = None):
+        """Примусово перечитати таблицю при наступному зверненні"""
+        with self._lock:
+            if doc_type:
+                self._templates.pop(doc_type, None)
+            self._loaded = False
+
+    def get(self, doc_type: str) -> Optional[Tuple[str, str]]:
+        """(content, hash) або None якщо DB override немає"""
+        self._refresh_if_due()
+        return self._templates.get(doc_type)
+
+    def current_hash(self, doc_type: str) -> Optional[str]:
+        entry = self.get(doc_type)
+        return entry[1] if entry else None
+
+    def _refresh_if_due(self):
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < self.probe_interval:
+            return
+        with self._lock:
+            if self._loaded and now - self._checked_at < self.probe_interval:
+                return
+            self._checked_at = now
+            try:
+                db = self._open_session()
+                try:
+                    version = self._probe_version(db)
+                    if not self._loaded or version != self._version:
+                        self._templates = self._load_all(db)
+                        self._version = version
+                    self._loaded = True
+                finally:
+                    db.close()
+            except Exception:
+                # БД недоступна / таблиці ще немає - лишаємо попередній снапшот
+                self._loaded = True
+
+    def _open_session(self):
+        if self.session_factory:
+            return self.session_factory()
+        from database_rentalhub import get_rh_db_sync
+        return get_rh_db_sync()
+
+    @staticmethod
+    def _probe_version(db):
+        row = db.execute(text("""
+            SELECT COUNT(*), MAX(updated_at), COALESCE(SUM(CRC32(template_content)), 0)
+            FROM document_templates
+        """)).fetchone()
+        return tuple(row) if row else None
+
+    @staticmethod
+    def _load_all(db) -> Dict[str, Tuple[str, str]]:
+        rows = db.execute(text(
+            "SELECT doc_type, template_content, updated_at FROM document_templates"
+        )).fetchall()
+        templates = {}
+        for doc_type, content, updated_at in rows:
+            if not content:
+                continue
+            digest = hashlib.sha1(f"{updated_at}\n{content}".encode("utf-8")).hexdigest()
+            templates[doc_type] = (content, digest)
+        return templates
+
+
+_template_cache = DBTemplateCache()
+
+
+def get_template_cache() -> DBTemplateCache:
+    return _template_cache
+
+
+def invalidate_template_cache(doc_type: Optional[str] = None):
+    """Викликати після зміни document_templates (save/reset в адмінці)"""
+    _template_cache.invalidate(doc_type)
+
 
 class DBOverrideLoader(BaseLoader):
     """Jinja2 loader: DB override → FileSystem fallback."""
 
-    def __init__(self, file_loader):
+    def __init__(self, file_loader, cache: DBTemplateCache = None):
         self.file_loader = file_loader
+        self.cache = cache or _template_cache
 
     def get_source(self, environment, template):
         doc_type = self._extract_doc_type(template)
         if doc_type:
-            try:
-                from database_rentalhub import get_rh_db_sync
-                db = get_rh_db_sync()
-                try:
-                    row = db.execute(text(
-                        "SELECT template_content FROM document_templates WHERE doc_type = :dt"
-                    ), {"dt": doc_type}).fetchone()
-                    if row and row[0]:
-                        return row[0], f"db:{doc_type}", lambda: False
-                finally:
-                    db.close()
-            except Exception:
-                pass
-        return self.file_loader.get_source(environment, template)
+            entry = self.cache.get(doc_type)
+            if entry:
+                content, digest = entry
+                return content, f"db:{doc_type}", lambda: self.cache.current_hash(doc_type) == digest
+        source, filename, file_uptodate = self.file_loader.get_source(environment, template)
+        if not doc_type:
+            return source, filename, file_uptodate
+        # Файловий шаблон застаріває також коли для нього з'явився DB override
+        return source, filename, lambda: (
+            self.cache.current_hash(doc_type) is None and (file_uptodate is None or file_uptodate())
+        )
 
     @staticmethod
     def _extract_doc_type(template):
@@ -50,3 +153,22 @@ class DBOverrideLoader(BaseLoader):
         if name.startswith("_") or name == "":
             return None
         return name
+
+
+def precompile_templates(environment, template_names: Iterable[str]) -> Dict[str, str]:
+    """
+    Скомпілювати шаблони заздалегідь (прогрів кешу Jinja при старті).
+
+    Returns:
+        {template_name: "ok" | текст помилки}
+    """
+    results = {}
+    for name in template_names:
+        try:
+            environment.get_template(name)
+            results[name] = "ok"
+        except TemplateNotFound:
+            results[name] = "not found"
+        except Exception as e:
+            results[name] = str(e)
+    return results
@@ -9,8 +9,22 @@ from datetime import datetime
 import time
 import os
 import requests
-from PIL import Image
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sqlalchemy import text
+
+from database_rentalhub import get_rh_db_sync
+from services.client_summary import reconcile as reconcile_client_summary
+from services.calendar_index import rebuild_all as rebuild_calendar_index
+from services.analytics_facts import recheck_recent as recheck_analytics_facts
+from services.image_derivatives import (
+    IMAGE_DERIVATIVE_WORKERS, IMAGE_VARIANTS_DIR, build_derivatives, pending_assets,
+    save_result, store_original,
+)
+from services.sync_engine import (
+    CHECKSUM_BLOCK_SIZE, SyncRun, block_range, bulk_update, bulk_upsert, changed_blocks,
+    ensure_sync_tables, get_hwm, invalidate_blocks, keyset_batches, load_checksums,
+    parse_hwm_datetime, save_checksums, set_hwm,
+)
 
 # Database configurations
 OC = {
@@ -115,43 +129,6 @@ def ensure_client_from_order(cursor, customer_name, phone, email):
 # IMAGE FUNCTIONS
 # ============================================================
 
-def create_thumbnail(image_path: str, size: tuple, output_subdir: str) -> str:
-    """
-    Створити thumbnail зображення
-    
-    Args:
-        image_path: Шлях до оригінального зображення
-        size: Розмір (width, height)
-        output_subdir: Піддиректорія ('thumbnails' або 'medium')
-    """
-    try:
-        img = Image.open(image_path)
-        
-        # Convert RGBA to RGB if needed
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        
-        # Resize keeping aspect ratio
-        img.thumbnail(size, Image.Resampling.LANCZOS)
-        
-        # Save thumbnail
-        filename = os.path.basename(image_path)
-        name, ext = os.path.splitext(filename)
-        
-        suffix = "_thumb" if output_subdir == "thumbnails" else "_medium"
-        thumb_path = os.path.join(PRODUCTS_DIR, output_subdir, f"{name}{suffix}{ext}")
-        
-        img.save(thumb_path, quality=85, optimize=True)
-        return thumb_path
-        
-    except Exception as e:
-        return None
-
-
 def download_image(url: str) -> bytes:
     """Скачати зображення з URL"""
     headers = {
@@ -170,9 +147,9 @@ def download_image(url: str) -> bytes:
     return None
 
 
-def download_product_image(product_id: int, sku: str, oc_image_path: str, rh_cur, rh_conn) -> bool:
+def download_product_image(product_id: int, sku: str, oc_image_path: str, db) -> bool:
     """
-    Скачати та обробити зображення одного товару
+    Скачати зображення одного товару (варіанти та thumbnails - етап image_variants)
     
     Returns:
         bool: True якщо успішно
@@ -195,32 +172,21 @@ def download_product_image(product_id: int, sku: str, oc_image_path: str, rh_cur
         if not file_ext or file_ext not in ALLOWED_EXTENSIONS:
             file_ext = ".jpg"
         
-        # Згенерувати безпечне ім'я файлу
-        safe_sku = sku.replace("/", "_").replace("\\", "_").replace(" ", "_")
-        timestamp = int(time.time())
-        filename = f"{safe_sku}_{timestamp}{file_ext}"
-        file_path = os.path.join(PRODUCTS_DIR, filename)
-        
-        # Зберегти оригінал
-        with open(file_path, "wb") as f:
-            f.write(image_content)
-        
-        # Створити thumbnails
-        create_thumbnail(file_path, (300, 300), "thumbnails")
-        create_thumbnail(file_path, (800, 800), "medium")
+        # Зберегти оригінал (однаковий вміст -> вже збережений файл)
+        relative_path, _, _, _ = store_original(db, image_content, sku, file_ext, PRODUCTS_DIR)
         
         # Оновити БД
-        relative_path = f"uploads/products/{filename}"
-        rh_cur.execute("""
+        db.execute(text("""
             UPDATE products 
-            SET image_url = %s
-            WHERE product_id = %s
-        """, (relative_path, product_id))
-        rh_conn.commit()
+            SET image_url = :image_url
+            WHERE product_id = :product_id
+        """), {"image_url": relative_path, "product_id": product_id})
+        db.commit()
         
         return True
         
     except Exception as e:
+        db.rollback()
         return False
 
 
@@ -275,7 +241,7 @@ def sync_product_images():
         # Скачати зображення
         success_count = 0
         failed_count = 0
-        rh_cur_update = rh.cursor()
+        db = get_rh_db_sync()
         
         for product in products_without_images:
             product_id = product['product_id']
@@ -287,7 +253,7 @@ def sync_product_images():
             # Беремо шлях напряму з OpenCart (не з RentalHub!)
             oc_image = oc_images[product_id]['image']
             
-            if download_product_image(product_id, sku, oc_image, rh_cur_update, rh):
+            if download_product_image(product_id, sku, oc_image, db):
                 success_count += 1
                 if success_count <= 10 or success_count % 20 == 0:
                     log(f"    ✅ Downloaded: {sku}")
@@ -300,7 +266,7 @@ def sync_product_images():
         
         oc_cur.close()
         rh_cur.close()
-        rh_cur_update.close()
+        db.close()
         oc.close()
         rh.close()
         
@@ -313,6 +279,51 @@ def sync_product_images():
         return 0
 
 
+def sync_image_variants(stats=None):
+    """
+    WebP-варіанти та thumbnails/medium для pending-зображень - у пулі процесів
+    (нові фото з OpenCart та завантаження, які веб-сервер не встиг обробити)
+    """
+    log("🖼️  Building image variants...")
+    db = get_rh_db_sync()
+    try:
+        pending = pending_assets(db, PRODUCTS_DIR, limit=200)
+        if stats:
+            stats.fetched += len(pending)
+        if not pending:
+            log("  ✅ No pending images")
+            return 0
+        
+        built = 0
+        with ProcessPoolExecutor(max_workers=IMAGE_DERIVATIVE_WORKERS) as pool:
+            futures = {
+                pool.submit(build_derivatives, source_file, digest, IMAGE_VARIANTS_DIR, legacy_dir=PRODUCTS_DIR): digest
+                for digest, source_file in pending
+            }
+            for future in as_completed(futures):
+                digest = futures[future]
+                try:
+                    save_result(db, digest, future.result())
+                    built += 1
+                except Exception as e:
+                    save_result(db, digest, error=str(e))
+        db.commit()
+        
+        if stats:
+            stats.written += built
+        log(f"  ✅ Built variants for {built}/{len(pending)} images")
+        return built
+    
+    except Exception as e:
+        db.rollback()
+        log(f"  ❌ Error: {e}")
+        if stats:
+            stats.error = str(e)
+        return 0
+    finally:
+        db.close()
+
+
 # ============================================================
 # SYNC FUNCTIONS
 # ============================================================
@@ -362,8 +373,59 @@ def sync_categories():
         return 0
 
 
-def sync_products_incremental():
-    """Sync only new products"""
+# Поля, які синхронізуються з OpenCart для вже наявних товарів.
+# ⚠️ color/material керуються локально в RentalHub; розміри - лише якщо в RH ще NULL
+# (не перезаписуємо ручні дані з переобліку), diameter_cm не чіпаємо
+PRODUCT_DETAIL_COLUMNS = ["sku", "quantity", "price", "rental_price", "height_cm", "width_cm", "depth_cm"]
+PRODUCT_DETAIL_SET = """
+    t.sku = v.sku, t.quantity = v.quantity, t.price = v.price, t.rental_price = v.rental_price,
+    t.height_cm = COALESCE(t.height_cm, v.height_cm),
+    t.width_cm = COALESCE(t.width_cm, v.width_cm),
+    t.depth_cm = COALESCE(t.depth_cm, v.depth_cm)
+"""
+
+
+def _positive(value):
+    value = float(value) if value else None
+    return value if value and value > 0 else None
+
+
+def product_detail_row(p):
+    """
+    Маппінг полів:
+    OpenCart model → RentalHub sku (артикул)
+    OpenCart price → RentalHub rental_price (ціна оренди за день)
+    OpenCart ean → RentalHub price (вартість товару/повний збиток)
+    OpenCart height/width/length → height_cm/width_cm/depth_cm
+    """
+    sku = (p['model'] or f"SKU-{p['product_id']}")[:100]
+    rental_price = float(p['price']) if p.get('price') else 0
+    purchase_price = float(p['ean']) if p.get('ean') else 0
+    return (
+        p['product_id'], sku, p['quantity'] or 0, purchase_price, rental_price,
+        _positive(p.get('height')), _positive(p.get('width')), _positive(p.get('length'))
+    )
+
+
+def fetch_product_attributes(oc_cur, product_ids):
+    """Колір/матеріал лише для переданих товарів"""
+    if not product_ids:
+        return {}
+    placeholders = ','.join(['%s'] * len(product_ids))
+    oc_cur.execute(f"""
+        SELECT pa.product_id,
+            MAX(CASE WHEN ad.name = 'Колір' THEN pa.text END) as color,
+            MAX(CASE WHEN ad.name = 'Матеріал' THEN pa.text END) as material
+        FROM oc_product_attribute pa
+        JOIN oc_attribute_description ad ON pa.attribute_id = ad.attribute_id AND ad.language_id = 4
+        WHERE pa.language_id = 4 AND pa.product_id IN ({placeholders})
+        GROUP BY pa.product_id
+    """, product_ids)
+    return {row['product_id']: row for row in oc_cur.fetchall()}
+
+
+def sync_products_incremental(stats=None):
+    """Sync new/changed products since the last high-water mark (oc_product.date_modified)"""
     log("📦 Syncing products (incremental)...")
     try:
         oc = mysql.connector.connect(**OC)
@@ -371,62 +433,72 @@ def sync_products_incremental():
         
         oc_cur = oc.cursor(dictionary=True)
         rh_cur = rh.cursor()
+        ensure_sync_tables(rh_cur)
         
-        # Get existing product IDs
-        rh_cur.execute("SELECT product_id FROM products")
-        existing_ids = set(row[0] for row in rh_cur.fetchall())
+        hwm_value, hwm_id = get_hwm(rh_cur, "products")
+        log(f"  📍 High-water mark: {hwm_value or '-'} / {hwm_id or 0}")
         
-        # Get all active products from OpenCart
-        oc_cur.execute("""
-            SELECT 
-                p.product_id, p.model, pd.name, pd.description, p.price, 
-                p.status, p.image, p.quantity, p.ean,
-                MAX(CASE WHEN ad.name = 'Колір' AND pa.language_id = 4 THEN pa.text END) as color,
-                MAX(CASE WHEN ad.name = 'Матеріал' AND pa.language_id = 4 THEN pa.text END) as material
-            FROM oc_product p
-            JOIN oc_product_description pd ON p.product_id = pd.product_id
-            LEFT JOIN oc_product_attribute pa ON p.product_id = pa.product_id
-            LEFT JOIN oc_attribute_description ad ON pa.attribute_id = ad.attribute_id AND ad.language_id = 4
-            WHERE pd.language_id = 4 AND p.status = 1
-            GROUP BY p.product_id
-        """)
+        def fetch(after_modified, after_id, limit):
+            oc_cur.execute("""
+                SELECT p.product_id, p.model, pd.name, pd.description, p.price,
+                       p.status, p.image, p.quantity, p.ean, p.height, p.width, p.length,
+                       p.date_modified
+                FROM oc_product p
+                JOIN oc_product_description pd ON p.product_id = pd.product_id AND pd.language_id = 4
+                WHERE p.date_modified > %s OR (p.date_modified = %s AND p.product_id > %s)
+                ORDER BY p.date_modified, p.product_id
+                LIMIT %s
+            """, (after_modified, after_modified, after_id, limit))
+            return oc_cur.fetchall()
         
-        all_products = oc_cur.fetchall()
-        new_products = [p for p in all_products if p['product_id'] not in existing_ids]
         count = 0
-        
-        for p in new_products:
-            sku = p['model'] or f"SKU-{p['product_id']}"
+        updated = 0
+        for batch in keyset_batches(fetch, parse_hwm_datetime(hwm_value), hwm_id or 0,
+                                    "date_modified", "product_id"):
+            if stats:
+                stats.fetched += len(batch)
+            ids = [p['product_id'] for p in batch]
+            rh_cur.execute(
+                f"SELECT product_id FROM products WHERE product_id IN ({','.join(['%s'] * len(ids))})", ids
+            )
+            existing_ids = set(row[0] for row in rh_cur.fetchall())
+            
+            # Нові активні товари - повний INSERT
+            new_products = [p for p in batch if p['product_id'] not in existing_ids and p['status'] == 1]
+            attributes = fetch_product_attributes(oc_cur, [p['product_id'] for p in new_products])
+            rows = []
+            for p in new_products:
+                attrs = attributes.get(p['product_id'], {})
+                detail = product_detail_row(p)
+                rows.append((
+                    p['product_id'], detail[1], p['name'][:500], (p['description'] or '')[:2000],
+                    detail[3], detail[4], p['status'], detail[2],
+                    (attrs.get('color') or '')[:100] or None,
+                    (attrs.get('material') or '')[:100] or None,
+                    (p['image'] or '')[:500] if p['image'] else None  # Тимчасово зберігаємо OC path
+                ))
+            count += bulk_upsert(
+                rh_cur, "products",
+                ["product_id", "sku", "name", "description", "price", "rental_price", "status", "quantity",
+                 "color", "material", "image_url"],
+                rows, update_columns=["synced_at"], raw_values={"synced_at": "NOW()"}
+            )
+            # нові товари ще не мають категорій - етап категорій перечитає їхні блоки
+            invalidate_blocks(rh_cur, "product_categories", [r[0] for r in rows])
             
-            # Маппінг полів:
-            # OpenCart price → RentalHub rental_price (ціна оренди за день)
-            # OpenCart ean → RentalHub price (вартість товару/повний збиток)
-            rental_price = float(p['price']) if p.get('price') else 0
-            purchase_price = float(p['ean']) if p.get('ean') else 0
+            # Наявні товари - оновити синхронізовані поля
+            updated += bulk_update(
+                rh_cur, "products", "product_id", PRODUCT_DETAIL_COLUMNS,
+                [product_detail_row(p) for p in batch if p['product_id'] in existing_ids],
+                PRODUCT_DETAIL_SET
+            )
             
-            rh_cur.execute("""
-                INSERT INTO products (
-                    product_id, sku, name, description, price, rental_price, status, quantity, 
-                    color, material, image_url, synced_at
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-            """, (
-                p['product_id'], 
-                sku[:100], 
-                p['name'][:500], 
-                (p['description'] or '')[:2000], 
-                purchase_price,  # OpenCart ean → вартість товару
-                rental_price,    # OpenCart price → ціна оренди
-                p['status'], 
-                p['quantity'] or 0,
-                (p['color'] or '')[:100] if p.get('color') else None,
-                (p['material'] or '')[:100] if p.get('material') else None,
-                (p['image'] or '')[:500] if p['image'] else None  # Тимчасово зберігаємо OC path
-            ))
-            count += 1
+            set_hwm(rh_cur, "products", batch[-1]['date_modified'], batch[-1]['product_id'])
+            rh.commit()
         
-        rh.commit()
-        log(f"  ✅ Synced {count} new products")
+        if stats:
+            stats.written += count + updated
+        log(f"  ✅ Synced {count} new products, updated {updated} changed")
         
         oc_cur.close()
         rh_cur.close()
@@ -436,13 +508,20 @@ def sync_products_incremental():
         
     except Exception as e:
         log(f"  ❌ Error: {e}")
+        if stats:
+            stats.error = str(e)
         import traceback
         traceback.print_exc()
         return 0
 
 
-def sync_product_categories():
-    """Update category info for products"""
+def _block_checksums(oc_cur, sql):
+    oc_cur.execute(sql, (CHECKSUM_BLOCK_SIZE,))
+    return {int(r['block_id']): f"{r['cnt']}:{r['crc']}" for r in oc_cur.fetchall()}
+
+
+def sync_product_categories(stats=None):
+    """Update category info for products in changed oc_product_to_category blocks"""
     log("🏷️  Updating product categories...")
     try:
         oc = mysql.connector.connect(**OC)
@@ -450,57 +529,80 @@ def sync_product_categories():
         
         oc_cur = oc.cursor(dictionary=True)
         rh_cur = rh.cursor()
+        ensure_sync_tables(rh_cur)
         
-        # Get all products (limit 200 для категорій)
-        rh_cur.execute("SELECT product_id FROM products")
-        product_ids = [row[0] for row in rh_cur.fetchall()]
-        
-        if not product_ids:
-            log("  ✅ No products to update")
-            oc_cur.close()
-            rh_cur.close()
-            oc.close()
-            rh.close()
-            return 0
-        
-        ids_str = ','.join(map(str, product_ids))
-        
-        # Get category mappings
-        oc_cur.execute(f"""
-            SELECT 
-                ptc.product_id, 
-                c.category_id, 
-                cd.name, 
-                c.parent_id, 
-                pcd.name as parent_name
-            FROM oc_product_to_category ptc
-            JOIN oc_category c ON ptc.category_id = c.category_id
+        current = _block_checksums(oc_cur, """
+            SELECT FLOOR(product_id / %s) AS block_id, COUNT(*) AS cnt,
+                   BIT_XOR(CRC32(CONCAT_WS('|', product_id, category_id))) AS crc
+            FROM oc_product_to_category
+            GROUP BY block_id
+        """)
+        # Перейменування/перенесення категорій змінює всі товари - блок -1 = дерево категорій
+        oc_cur.execute("""
+            SELECT COUNT(*) AS cnt, BIT_XOR(CRC32(CONCAT_WS('|', c.category_id, c.parent_id, cd.name))) AS crc
+            FROM oc_category c
             JOIN oc_category_description cd ON c.category_id = cd.category_id AND cd.language_id = 4
-            LEFT JOIN oc_category pc ON c.parent_id = pc.category_id
-            LEFT JOIN oc_category_description pcd ON pc.category_id = pcd.category_id AND pcd.language_id = 4
-            WHERE ptc.product_id IN ({ids_str})
         """)
+        tree = oc_cur.fetchone()
+        tree_checksum = f"{tree['cnt']}:{tree['crc']}"
+        
+        stored = load_checksums(rh_cur, "product_categories")
+        if stored.get(-1) != tree_checksum:
+            stored = {}
+        blocks = changed_blocks(stored, current)
+        log(f"  📦 {len(blocks)}/{len(current)} blocks changed")
         
         count = 0
-        for m in oc_cur.fetchall():
-            if m['parent_id'] == 0:
-                # Top-level category
-                rh_cur.execute("""
-                    UPDATE products 
-                    SET category_id = %s, category_name = %s 
-                    WHERE product_id = %s
-                """, (m['category_id'], m['name'], m['product_id']))
-            else:
-                # Subcategory
-                rh_cur.execute("""
-                    UPDATE products 
-                    SET category_id = %s, category_name = %s, 
-                        subcategory_id = %s, subcategory_name = %s
-                    WHERE product_id = %s
-                """, (m['parent_id'], m['parent_name'], m['category_id'], m['name'], m['product_id']))
-            count += 1
+        for block in blocks:
+            start_id, end_id = block_range(block)
+            oc_cur.execute("""
+                SELECT 
+                    ptc.product_id, 
+                    c.category_id, 
+                    cd.name, 
+                    c.parent_id, 
+                    pcd.name as parent_name
+                FROM oc_product_to_category ptc
+                JOIN oc_category c ON ptc.category_id = c.category_id
+                JOIN oc_category_description cd ON c.category_id = cd.category_id AND cd.language_id = 4
+                LEFT JOIN oc_category pc ON c.parent_id = pc.category_id
+                LEFT JOIN oc_category_description pcd ON pc.category_id = pcd.category_id AND pcd.language_id = 4
+                WHERE ptc.product_id >= %s AND ptc.product_id < %s
+                ORDER BY ptc.product_id, ptc.category_id
+            """, (start_id, end_id))
+            mappings = oc_cur.fetchall()
+            if stats:
+                stats.fetched += len(mappings)
+            
+            # Кілька категорій на товар: як і раніше, остання перемагає; top-level категорія
+            # не чіпає підкатегорію
+            per_product = {}
+            for m in mappings:
+                row = per_product.setdefault(m['product_id'], [m['product_id'], None, None, 0, None, None])
+                if m['parent_id'] == 0:
+                    row[1], row[2] = m['category_id'], m['name']
+                else:
+                    row[1], row[2] = m['parent_id'], m['parent_name']
+                    row[3], row[4], row[5] = 1, m['category_id'], m['name']
+            
+            count += bulk_update(
+                rh_cur, "products", "product_id",
+                ["category_id", "category_name", "has_sub", "subcategory_id", "subcategory_name"],
+                list(per_product.values()),
+                """
+                    t.category_id = v.category_id, t.category_name = v.category_name,
+                    t.subcategory_id = IF(v.has_sub = 1, v.subcategory_id, t.subcategory_id),
+                    t.subcategory_name = IF(v.has_sub = 1, v.subcategory_name, t.subcategory_name)
+                """
+            )
+            save_checksums(rh_cur, "product_categories", {block: current[block]})
+            rh.commit()
         
+        save_checksums(rh_cur, "product_categories", {-1: tree_checksum},
+                       removed=[b for b in stored if b != -1 and b not in current])
         rh.commit()
+        if stats:
+            stats.written += count
         log(f"  ✅ Updated {count} products")
         
         oc_cur.close()
@@ -511,13 +613,15 @@ def sync_product_categories():
         
     except Exception as e:
         log(f"  ❌ Error: {e}")
+        if stats:
+            stats.error = str(e)
         import traceback
         traceback.print_exc()
         return 0
 
 
-def sync_product_quantities():
-    """Update quantities, prices, SKU and dimensions (color/material managed locally in RentalHub)"""
+def sync_product_quantities(stats=None):
+    """Update quantities, prices, SKU and dimensions for changed product blocks (color/material managed locally in RentalHub)"""
     log("📊 Updating product details (sku, quantity, price, dimensions)...")
     try:
         oc = mysql.connector.connect(**OC)
@@ -525,75 +629,44 @@ def sync_product_quantities():
         
         oc_cur = oc.cursor(dictionary=True)
         rh_cur = rh.cursor()
-        
-        # Get all products (limit 10000 для оновлення)
-        rh_cur.execute("SELECT product_id FROM products LIMIT 10000")
-        product_ids = [row[0] for row in rh_cur.fetchall()]
-        
-        if not product_ids:
-            log("  ✅ No products to update")
-            oc_cur.close()
-            rh_cur.close()
-            oc.close()
-            rh.close()
-            return 0
-        
-        ids_str = ','.join(map(str, product_ids))
-        
-        # Get updated data from OpenCart (sku, quantity, price, ean + dimensions)
-        oc_cur.execute(f"""
-            SELECT p.product_id, p.model as sku, p.quantity, p.price, p.ean,
-                   p.height, p.width, p.length
-            FROM oc_product p
-            WHERE p.product_id IN ({ids_str})
+        ensure_sync_tables(rh_cur)
+        
+        # Залишки в OpenCart змінюються замовленнями без date_modified - шукаємо зміни по
+        # контрольних сумах блоків і перечитуємо лише змінені блоки
+        current = _block_checksums(oc_cur, """
+            SELECT FLOOR(product_id / %s) AS block_id, COUNT(*) AS cnt,
+                   BIT_XOR(CRC32(CONCAT_WS('|', product_id, model, quantity, price, ean, height, width, length))) AS crc
+            FROM oc_product
+            GROUP BY block_id
         """)
+        stored = load_checksums(rh_cur, "product_details")
+        blocks = changed_blocks(stored, current)
+        log(f"  📦 {len(blocks)}/{len(current)} blocks changed")
         
         count = 0
-        dims_count = 0
-        for p in oc_cur.fetchall():
-            # Маппінг полів:
-            # OpenCart model → RentalHub sku (артикул)
-            # OpenCart price → RentalHub rental_price (ціна оренди за день)
-            # OpenCart ean → RentalHub price (вартість товару/повний збиток)
-            sku = (p['sku'] or f"SKU-{p['product_id']}")[:100]
-            rental_price = float(p['price']) if p.get('price') else 0
-            purchase_price = float(p['ean']) if p.get('ean') else 0
-            
-            # Розміри: OC height→height_cm, OC width→width_cm, OC length→depth_cm
-            # diameter_cm — не чіпаємо (заповнюється з переобліку)
-            oc_height = float(p['height'] or 0) if p['height'] else None
-            oc_width = float(p['width'] or 0) if p['width'] else None
-            oc_depth = float(p['length'] or 0) if p['length'] else None
-            
-            has_dims = (oc_height and oc_height > 0) or (oc_width and oc_width > 0) or (oc_depth and oc_depth > 0)
-            
-            # ⚠️ НЕ оновлюємо color та material - вони керуються локально в RentalHub
-            # ✅ SKU оновлюється з OpenCart
-            # ✅ Розміри: COALESCE — тільки якщо в RH ще NULL (не перезаписуємо ручні дані з переобліку)
-            rh_cur.execute("""
-                UPDATE products 
-                SET sku = %s, quantity = %s, price = %s, rental_price = %s,
-                    height_cm = COALESCE(height_cm, %s),
-                    width_cm = COALESCE(width_cm, %s),
-                    depth_cm = COALESCE(depth_cm, %s)
-                WHERE product_id = %s
-            """, (
-                sku,             # OpenCart model → артикул
-                p['quantity'] or 0, 
-                purchase_price,  # OpenCart ean → вартість товару
-                rental_price,    # OpenCart price → ціна оренди
-                oc_height if oc_height and oc_height > 0 else None,
-                oc_width if oc_width and oc_width > 0 else None,
-                oc_depth if oc_depth and oc_depth > 0 else None,
-                p['product_id']
-            ))
-            if rh_cur.rowcount > 0:
-                count += 1
-            if has_dims:
-                dims_count += 1
+        for block in blocks:
+            start_id, end_id = block_range(block)
+            oc_cur.execute("""
+                SELECT p.product_id, p.model, p.quantity, p.price, p.ean,
+                       p.height, p.width, p.length
+                FROM oc_product p
+                WHERE p.product_id >= %s AND p.product_id < %s
+            """, (start_id, end_id))
+            products = oc_cur.fetchall()
+            if stats:
+                stats.fetched += len(products)
+            count += bulk_update(
+                rh_cur, "products", "product_id", PRODUCT_DETAIL_COLUMNS,
+                [product_detail_row(p) for p in products], PRODUCT_DETAIL_SET
+            )
+            save_checksums(rh_cur, "product_details", {block: current[block]})
+            rh.commit()
         
+        save_checksums(rh_cur, "product_details", {}, removed=[b for b in stored if b not in current])
         rh.commit()
-        log(f"  ✅ Updated {count} products ({dims_count} with dimensions, color/material preserved)")
+        if stats:
+            stats.written += count
+        log(f"  ✅ Updated {count} products (color/material preserved)")
         
         oc_cur.close()
         rh_cur.close()
@@ -603,12 +676,14 @@ def sync_product_quantities():
         
     except Exception as e:
         log(f"  ❌ Error: {e}")
+        if stats:
+            stats.error = str(e)
         import traceback
         traceback.print_exc()
         return 0
 
 
-def sync_orders_from_opencart():
+def sync_orders_from_opencart(stats=None):
     """
     ✅ PRODUCTION VERSION
     Синхронізує НОВІ замовлення з OpenCart (order_status_id = 2 "В обробці")
@@ -653,16 +728,16 @@ def sync_orders_from_opencart():
         
         new_orders = oc_cur.fetchall()
         log(f"  📦 Found {len(new_orders)} new orders with status=2")
-        
-        synced_count = 0
-        
-        for order in new_orders:
-            order_id = order['order_id']
-            customer_name = f"{order['firstname']} {order['lastname']}".strip()
-            
-            # Отримати товари замовлення з EAN для розрахунку депозиту
-            oc_cur.execute("""
+        if stats:
+            stats.fetched += len(new_orders)
+        
+        # Товари всіх нових замовлень з EAN для розрахунку депозиту - одним запитом
+        items_by_order = {}
+        if new_orders:
+            order_ids = [o['order_id'] for o in new_orders]
+            oc_cur.execute(f"""
                 SELECT 
+                    op.order_id,
                     op.order_product_id,
                     op.product_id,
                     op.name as product_name,
@@ -674,10 +749,19 @@ def sync_orders_from_opencart():
                     p.ean
                 FROM oc_order_product op
                 LEFT JOIN oc_product p ON op.product_id = p.product_id
-                WHERE op.order_id = %s
-            """, (order_id,))
+                WHERE op.order_id IN ({','.join(['%s'] * len(order_ids))})
+                ORDER BY op.order_id, op.order_product_id
+            """, order_ids)
+            for item in oc_cur.fetchall():
+                items_by_order.setdefault(item['order_id'], []).append(item)
+        
+        synced_count = 0
+        
+        for order in new_orders:
+            order_id = order['order_id']
+            customer_name = f"{order['firstname']} {order['lastname']}".strip()
             
-            order_items = oc_cur.fetchall()
+            order_items = items_by_order.get(order_id, [])
             
             if not order_items:
                 log(f"  ⚠️  Order {order_id} has no items, skipping")
@@ -801,6 +885,14 @@ def sync_orders_from_opencart():
                 continue
         
         log(f"  ✅ Successfully synced {synced_count} new orders")
+        if stats:
+            stats.written += synced_count
+        
+        # High-water mark для статусу (джерело істини - MAX(order_id) в orders)
+        ensure_sync_tables(rh_cur)
+        rh_cur.execute("SELECT MAX(order_id) FROM orders")
+        set_hwm(rh_cur, "orders", row_id=rh_cur.fetchone()[0] or 0)
+        rh_conn.commit()
         
         oc_cur.close()
         rh_cur.close()
@@ -811,11 +903,72 @@ def sync_orders_from_opencart():
         
     except Exception as e:
         log(f"  ❌ Error: {e}")
+        if stats:
+            stats.error = str(e)
         import traceback
         traceback.print_exc()
         return 0
 
 
+def sync_client_summary(stats=None):
+    """Перерахувати client_summary для клієнтів нових замовлень (ensure_client_from_order)"""
+    log("👥 Refreshing client summary...")
+    db = get_rh_db_sync()
+    try:
+        refreshed = reconcile_client_summary(db)
+        if stats:
+            stats.written += refreshed
+        log(f"  ✅ Refreshed {refreshed} clients")
+        return refreshed
+    except Exception as e:
+        db.rollback()
+        log(f"  ❌ Error: {e}")
+        if stats:
+            stats.error = str(e)
+        return 0
+    finally:
+        db.close()
+
+
+def sync_calendar_index(stats=None):
+    """Перебудувати calendar_event_index - нові/оновлені замовлення пишуться повз сесію"""
+    log("📅 Rebuilding calendar event index...")
+    db = get_rh_db_sync()
+    try:
+        written = rebuild_calendar_index(db)
+        if stats:
+            stats.written += written
+        log(f"  ✅ Indexed {written} events")
+        return written
+    except Exception as e:
+        db.rollback()
+        log(f"  ❌ Error: {e}")
+        if stats:
+            stats.error = str(e)
+        return 0
+    finally:
+        db.close()
+
+
+def sync_analytics_facts(stats=None):
+    """Перерахувати останні дні analytics_daily_* - замовлення з OpenCart пишуться повз сесію"""
+    log("📊 Refreshing analytics facts...")
+    db = get_rh_db_sync()
+    try:
+        written = recheck_analytics_facts(db)
+        if stats:
+            stats.written += written
+        log(f"  ✅ Refreshed {written} fact rows")
+        return written
+    except Exception as e:
+        db.rollback()
+        log(f"  ❌ Error: {e}")
+        if stats:
+            stats.error = str(e)
+        return 0
+    finally:
+        db.close()
+
 def main():
     print("=" * 60)
     print("🔄 RENTALHUB AUTO-SYNC (PRODUCTION)")
@@ -825,16 +978,41 @@ def main():
     
     total_start = time.time()
     
+    # Час і кількість рядків по етапах -> sync_runs (GET /api/sync/status)
+    try:
+        run = SyncRun(mysql.connector.connect(**RH), log=log)
+    except Exception as e:
+        log(f"⚠️  Sync stats disabled: {e}")
+        run = SyncRun(None, log=log)
+    
     # Sync everything
-    cat_count = sync_categories()
-    prod_count = sync_products_incremental()
-    cat_update_count = sync_product_categories()
-    qty_update_count = sync_product_quantities()
+    with run.stage("categories") as stats:
+        cat_count = stats.written = sync_categories()
+    with run.stage("products") as stats:
+        prod_count = sync_products_incremental(stats)
+    with run.stage("product_categories") as stats:
+        cat_update_count = sync_product_categories(stats)
+    with run.stage("product_details") as stats:
+        qty_update_count = sync_product_quantities(stats)
     
     # 🖼️ NEW: Download images for products without local photos
-    img_count = sync_product_images()
+    with run.stage("images") as stats:
+        img_count = stats.written = sync_product_images()
+    with run.stage("image_variants") as stats:
+        variant_count = sync_image_variants(stats)
+    
+    with run.stage("orders") as stats:
+        order_count = sync_orders_from_opencart(stats)
+    with run.stage("client_summary") as stats:
+        sync_client_summary(stats)
+    with run.stage("calendar_index") as stats:
+        sync_calendar_index(stats)
+    with run.stage("analytics_facts") as stats:
+        sync_analytics_facts(stats)
     
-    order_count = sync_orders_from_opencart()
+    run.finish()
+    if run.rh_conn is not None:
+        run.rh_conn.close()
     
     total_duration = time.time() - total_start
     
@@ -844,8 +1022,9 @@ def main():
     print(f"Categories: {cat_count}")
     print(f"New products: {prod_count}")
     print(f"Category updates: {cat_update_count}")
-    print(f"Quantity updates: {qty_update_count}")
+    print(f"Product detail updates: {qty_update_count}")
     print(f"🖼️  Images downloaded: {img_count}")
+    print(f"🖼️  Image variants built: {variant_count}")
     print(f"📦 NEW ORDERS: {order_count}")
     print(f"Duration: {total_duration:.1f}s")
     print("=" * 60)
@@ -0,0 +1,253 @@
+"""
+Analytics Facts Tests
+Tests for:
+1. analytics_daily_* build history up to yesterday, today is read live from raw tables
+2. fact_source aggregates match raw SUM(...) / COUNT(...) over the same period
+3. Past-day refresh after order status changes, change tracking of write statements
+4. Month-chunked backfill and built_through bookkeeping
+5. Readers never wait for the build: unbuilt days are read live, the build runs in the background
+6. Committed writes are refreshed after the commit in a background thread; a failed refresh keeps the facts
+(SQLite in-memory stands in for the RentalHub MySQL tables)
+"""
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services import analytics_facts
+from services.analytics_facts import (
+    FACTS, _PENDING_KEY, backfill, ensure_built, fact_source, note_write, read_built_through, refresh_days,
+)
+from utils import commit_tracking
+
+TODAY = date.today()
+YESTERDAY = TODAY - timedelta(days=1)
+LAST_WEEK = TODAY - timedelta(days=6)
+LONG_AGO = TODAY - timedelta(days=70)
+
+
+def at(day, hour=12):
+    return datetime(day.year, day.month, day.day, hour)
+
+
+def midnight(day):
+    return datetime(day.year, day.month, day.day)
+
+
+@pytest.fixture
+def background_builds(monkeypatch):
+    calls = []
+    monkeypatch.setattr(analytics_facts, "build_in_background", lambda: calls.append(1))
+    return calls
+
+
+@pytest.fixture
+def db(monkeypatch, background_builds):
+    monkeypatch.setattr(analytics_facts, "_tables_ready", False)
+    monkeypatch.setattr(analytics_facts, "_built_through", None)
+    # INDEX ... у CREATE TABLE - синтаксис MySQL
+    for fact in FACTS.values():
+        monkeypatch.setattr(fact, "indexes", [])
+    engine = create_engine("sqlite://")
+    session = sessionmaker(bind=engine)()
+    session.execute(text("""
+        CREATE TABLE orders (order_id INTEGER PRIMARY KEY, customer_id INTEGER, status TEXT,
+            total_price NUMERIC, created_at DATETIME)
+    """))
+    session.execute(text("""
+        CREATE TABLE order_items (id INTEGER PRIMARY KEY, order_id INTEGER, product_id INTEGER,
+            price NUMERIC, quantity INTEGER)
+    """))
+    session.execute(text("""
+        CREATE TABLE product_damage_history (id INTEGER PRIMARY KEY, order_id INTEGER, product_id INTEGER,
+            product_name TEXT, sku TEXT, damage_type TEXT, fee NUMERIC, created_at DATETIME)
+    """))
+    orders = [
+        (1, 10, "closed", 1000, at(LONG_AGO)),
+        (2, 10, "returned", 500, at(LAST_WEEK)),
+        (3, 11, "cancelled", 300, at(LAST_WEEK, 18)),
+        (4, None, "issued", 200, at(YESTERDAY)),
+        (5, 12, "processing", 700, at(TODAY, 9)),
+        (6, 12, "on_rent", 400, at(TODAY, 10)),
+    ]
+    for row in orders:
+        session.execute(text("""
+            INSERT INTO orders (order_id, customer_id, status, total_price, created_at)
+            VALUES (:id, :customer, :status, :total, :created)
+        """), dict(zip(("id", "customer", "status", "total", "created"), row)))
+    items = [(1, 100, 300, 2), (2, 100, 250, 2), (2, 101, 0, 1), (3, 101, 300, 1), (6, 100, 200, 2)]
+    for order_id, product_id, price, qty in items:
+        session.execute(text("""
+            INSERT INTO order_items (order_id, product_id, price, quantity) VALUES (:o, :p, :price, :q)
+        """), {"o": order_id, "p": product_id, "price": price, "q": qty})
+    damage = [
+        (2, 100, "Ваза", "V-1", "break", 150, at(LAST_WEEK)),
+        (2, 101, "Свічник", "S-1", "scratch", 0, at(YESTERDAY)),
+        (4, 100, "Ваза", "V-1", "break", 50, at(YESTERDAY)),
+        (6, 101, "Свічник", "S-1", None, 80, at(TODAY, 11)),
+    ]
+    for row in damage:
+        session.execute(text("""
+            INSERT INTO product_damage_history (order_id, product_id, product_name, sku, damage_type, fee, created_at)
+            VALUES (:o, :p, :name, :sku, :type, :fee, :created)
+        """), dict(zip(("o", "p", "name", "sku", "type", "fee", "created"), row)))
+    session.commit()
+    yield session
+    session.close()
+
+
+def scalar(db, sql, params=None):
+    return db.execute(text(sql), params or {}).fetchone()
+
+
+class TestFactsBuild:
+
+    def test_builds_through_yesterday_and_reads_today_live(self, db):
+        assert ensure_built(db) == YESTERDAY
+        assert read_built_through(db) == YESTERDAY
+        assert scalar(db, "SELECT COUNT(*) FROM analytics_daily_orders WHERE day >= :d", {"d": TODAY})[0] == 0
+
+        source, params = fact_source(db, "orders", midnight(LAST_WEEK), midnight(TODAY + timedelta(days=1)))
+        rows = dict(db.execute(text(f"SELECT status, SUM(orders_cnt) FROM {source} f GROUP BY status"), params).fetchall())
+        assert rows == {"returned": 1, "cancelled": 1, "issued": 1, "processing": 1, "on_rent": 1}
+
+    def test_aggregates_match_raw(self, db):
+        start, end = midnight(LONG_AGO), midnight(TODAY + timedelta(days=1))
+        raw = scalar(db, "SELECT COUNT(*), SUM(total_price) FROM orders WHERE created_at >= :s AND created_at < :e",
+                     {"s": start, "e": end})
+        source, params = fact_source(db, "orders", start, end)
+        facts = scalar(db, f"SELECT SUM(orders_cnt), SUM(revenue) FROM {source} f", params)
+        assert (facts[0], float(facts[1])) == (raw[0], float(raw[1]))
+
+        source, params = fact_source(db, "damage", start, end)
+        damage = scalar(db, f"""
+            SELECT SUM(cnt), SUM(fee), SUM(paid_cnt), COUNT(DISTINCT NULLIF(order_id, 0)) FROM {source} f
+        """, params)
+        assert (damage[0], float(damage[1]), damage[2], damage[3]) == (4, 280.0, 3, 3)
+
+        source, params = fact_source(db, "products", start, end)
+        products = dict(db.execute(text(f"""
+            SELECT product_id, SUM(revenue) FROM {source} f WHERE completed = 1 GROUP BY product_id
+        """), params).fetchall())
+        assert {k: float(v) for k, v in products.items()} == {100: 1500.0, 101: 0.0}
+
+    def test_reads_live_until_built(self, db, background_builds):
+        start, end = midnight(LONG_AGO), midnight(TODAY + timedelta(days=1))
+        source, params = fact_source(db, "orders", start, end)
+        assert "analytics_daily_orders" not in source and background_builds == [1]
+        total = scalar(db, f"SELECT SUM(orders_cnt) FROM {source} f", params)[0]
+        assert total == 6
+
+        # факти до LAST_WEEK: далі - наживо, побудова у фоні доганяє
+        ensure_built(db, today=LAST_WEEK + timedelta(days=1))
+        analytics_facts._built_through = None
+        source, params = fact_source(db, "orders", start, end)
+        assert "analytics_daily_orders" in source and params["orders_fact_end"] == LAST_WEEK + timedelta(days=1)
+        assert scalar(db, f"SELECT SUM(orders_cnt) FROM {source} f", params)[0] == 6
+        assert background_builds == [1, 1]
+
+        ensure_built(db)
+        fact_source(db, "orders", start, end)
+        assert background_builds == [1, 1]
+
+    def test_history_before_period_includes_unbuilt_days(self, db):
+        # нові vs повторні клієнти: історія до періоду, поки факти ще будуються - наживо
+        source, params = fact_source(db, "clients", None, midnight(LAST_WEEK), prefix="history")
+        customers = {r[0] for r in db.execute(text(f"SELECT customer_id FROM {source} h"), params)}
+        assert customers == {10} and all(key.startswith("history_") for key in params)
+
+    def test_bounds_must_be_midnight(self, db):
+        with pytest.raises(ValueError):
+            fact_source(db, "orders", datetime(2026, 1, 1, 10), None)
+
+
+class TestFactsMaintenance:
+
+    def test_refresh_days_after_status_change(self, db):
+        ensure_built(db)
+        db.execute(text("UPDATE orders SET status = 'closed' WHERE order_id = 3"))
+        refresh_days(db, [LAST_WEEK])
+        db.commit()
+        row = scalar(db, "SELECT orders_cnt FROM analytics_daily_orders WHERE day = :d AND status = 'closed'",
+                     {"d": LAST_WEEK})
+        assert row[0] == 1
+        assert scalar(db, "SELECT COUNT(*) FROM analytics_daily_orders WHERE status = 'cancelled'")[0] == 0
+
+    def test_note_write(self):
+        info = {}
+        note_write(info, "UPDATE orders SET status = :status WHERE order_id = :order_id",
+                   {"status": "closed", "order_id": 7})
+        note_write(info, "UPDATE orders SET manager_notes = :n WHERE order_id = :order_id", {"n": "x", "order_id": 8})
+        note_write(info, "INSERT INTO orders (order_number, status) VALUES (:n, 'new')", {"n": "OC-1"}, lastrowid=9)
+        note_write(info, "UPDATE product_damage_history SET fee = :fee WHERE id = :id", {"fee": 10, "id": 5})
+        pending = info[_PENDING_KEY]
+        assert pending["orders"] == {7} and pending["damage"] == {5} and not pending["recheck"]
+        note_write(info, "DELETE FROM order_items WHERE order_id = :order_id", {"order_id": 7})
+        assert pending["recheck"]
+
+    def test_backfill_in_month_chunks(self, db):
+        logged = []
+        written = backfill(db, log=logged.append)
+        assert written > 0 and len(logged) >= 3
+        assert read_built_through(db) == YESTERDAY
+        assert scalar(db, "SELECT SUM(orders_cnt) FROM analytics_daily_orders")[0] == 4
+
+    def test_partial_backfill_keeps_gap_unbuilt(self, db):
+        backfill(db, start=LAST_WEEK)
+        assert read_built_through(db) is None
+
+    @pytest.fixture
+    def refresh_queue(self, db, monkeypatch):
+        import database_rentalhub
+
+        spawned = []
+        monkeypatch.setattr(analytics_facts, "_queued", None)
+        monkeypatch.setattr(analytics_facts, "_refresh_thread", None)
+        monkeypatch.setattr(analytics_facts, "_spawn", lambda target, name: spawned.append((target, name)))
+        monkeypatch.setattr(database_rentalhub, "get_rh_db_sync", lambda: db)
+        monkeypatch.setitem(commit_tracking._handlers, _PENDING_KEY, analytics_facts.queue_pending)
+        ensure_built(db)
+        db.commit()
+        return spawned
+
+    def commit_status_change(self, db):
+        db.execute(text("UPDATE orders SET status = 'closed' WHERE order_id = 3"))
+        pending = analytics_facts._new_pending()
+        pending["orders"].add(3)
+        db.connection().info[_PENDING_KEY] = pending
+        db.commit()
+
+    def test_refresh_runs_after_commit_in_background(self, db, refresh_queue, monkeypatch):
+        # IN :ids з кортежем - синтаксис pymysql; дні замовлення 3 відомі
+        flushed = []
+        monkeypatch.setattr(analytics_facts, "flush_pending",
+                            lambda session, pending: flushed.append(pending) or refresh_days(session, [LAST_WEEK]))
+        self.commit_status_change(db)
+        cancelled = "SELECT COUNT(*) FROM analytics_daily_orders WHERE status = 'cancelled'"
+        assert scalar(db, cancelled)[0] == 1
+        [(target, name)] = refresh_queue
+        assert name == "analytics-facts-refresh"
+
+        target()
+        assert [p["orders"] for p in flushed] == [{3}]
+        assert scalar(db, cancelled)[0] == 0
+        assert analytics_facts._queued is None and analytics_facts._refresh_thread is None
+
+    def test_failed_refresh_keeps_facts_and_author_write(self, db, refresh_queue, monkeypatch):
+        def failing_flush(session, pending):
+            session.execute(text("DELETE FROM analytics_daily_orders"))
+            raise RuntimeError("deadlock")
+
+        monkeypatch.setattr(analytics_facts, "flush_pending", failing_flush)
+        facts_before = scalar(db, "SELECT COUNT(*) FROM analytics_daily_orders")[0]
+        self.commit_status_change(db)
+        [(target, _)] = refresh_queue
+        target()
+        assert scalar(db, "SELECT status FROM orders WHERE order_id = 3")[0] == "closed"
+        assert scalar(db, "SELECT COUNT(*) FROM analytics_daily_orders")[0] == facts_before > 0
+        assert _PENDING_KEY not in db.connection().info
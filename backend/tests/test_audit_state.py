@@ -0,0 +1,95 @@
+"""
+Product Audit State Projection Tests
+Tests for:
+1. Backfill keeps the latest audit_records row per product
+2. Quantity delta on mark-as-audited and quantity corrections
+3. Bulk (category) audit keeps the last status
+"""
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import services.audit_state as audit_state
+from services.audit_state import backfill, record_audit, record_bulk_audit, record_quantity_change
+
+
+class FakeResult:
+    def __init__(self, rows=None, rowcount=0):
+        self._rows = rows or []
+        self.rowcount = rowcount
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class FakeDB:
+    def __init__(self, audit_rows=()):
+        self.audit_rows = list(audit_rows)
+        self.writes = []
+        self.committed = False
+
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        if "FROM audit_records" in sql:
+            # ORDER BY product_id, audit_date, id
+            return FakeResult(sorted(self.audit_rows, key=lambda r: (r[0], r[2], r[1])))
+        self.writes.append((sql, params))
+        return FakeResult(rowcount=3)
+
+    def commit(self):
+        self.committed = True
+
+
+def setup_function():
+    audit_state._table_ready = True
+
+
+class TestBackfill:
+
+    def test_latest_record_per_product(self):
+        db = FakeDB([
+            (1, "a", datetime(2026, 3, 1), "ok", "Олена", 5, 5),
+            (1, "b", datetime(2026, 5, 1), "critical", "Іван", 5, 3),
+            (2, "c", datetime(2026, 4, 1), None, "Олена", None, 2),
+            (1, "d", datetime(2026, 4, 1), "minor", "Іван", 5, 4),
+        ])
+        assert backfill(db) == 2
+        assert db.committed
+        sqls = [sql for sql, _ in db.writes]
+        assert any("DELETE FROM product_audit_state" in sql for sql in sqls)
+        batch = db.writes[-1][1]
+        by_product = {row["product_id"]: row for row in batch}
+        assert (by_product[1]["last_audit_id"], by_product[1]["status"], by_product[1]["delta"]) == ("b", "critical", -2)
+        assert (by_product[2]["status"], by_product[2]["delta"]) == ("ok", None)
+
+    def test_empty_history(self):
+        db = FakeDB()
+        assert backfill(db) == 0
+        assert not any("INSERT" in sql for sql, _ in db.writes)
+
+
+class TestWrites:
+
+    def test_record_audit_delta(self):
+        db = FakeDB()
+        record_audit(db, 7, "id-1", "Іван", None, quantity_expected=10, quantity_actual=8,
+                     audit_date=date(2026, 6, 1))
+        params = db.writes[0][1]
+        assert (params["status"], params["delta"], params["last_audit_date"]) == ("ok", -2, date(2026, 6, 1))
+
+    def test_quantity_change_keeps_status(self):
+        db = FakeDB()
+        record_quantity_change(db, 7, 8, 12)
+        sql, params = db.writes[0]
+        assert params["delta"] == 4
+        assert "status" not in sql.split("ON DUPLICATE KEY UPDATE")[1]
+
+    def test_bulk_audit_keeps_status(self):
+        db = FakeDB()
+        assert record_bulk_audit(db, "category_name = :category", {"category": "Посуд"}, "Менеджер") == 3
+        sql, params = db.writes[0]
+        update = sql.split("ON DUPLICATE KEY UPDATE")[1]
+        assert "status" not in update and "last_audit_date" in update
+        assert params["category"] == "Посуд" and params["state_audited_by"] == "Менеджер"
@@ -0,0 +1,153 @@
+"""
+Batched check_order_availability Tests
+Tests for:
+1. Batched path returns the same payload as the per-item path
+2. Batched path runs a constant number of queries regardless of order size
+3. Orders without a start date and string ids do not fail the check
+"""
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import services.availability_engine as availability_engine
+from services.availability_engine import AvailabilityEngine
+from utils.availability_checker import check_order_availability, check_product_availability
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class FakeDB:
+    """Відповідає на запити checker та engine з синтетичних даних"""
+
+    def __init__(self, products, orders, awaiting, partial):
+        self.products = products  # pid -> (quantity, sku, name, frozen, in_laundry, state)
+        self.orders = orders
+        self.awaiting = awaiting  # pid -> qty
+        self.partial = partial
+        self.queries = 0
+
+    def execute(self, stmt, params=None):
+        self.queries += 1
+        sql = str(stmt)
+        params = params or {}
+        if "FROM order_items" in sql:
+            return FakeResult([r for r in self.orders if r[3] in params["statuses"]])
+        if "FROM event_soft_reservations" in sql:
+            return FakeResult([])
+        if "FROM partial_return_version_items" in sql:
+            return FakeResult(self.partial)
+        if "FROM product_damage_history" in sql:
+            if "product_ids" in params:
+                return FakeResult([(pid, q) for pid, q in self.awaiting.items() if pid in params["product_ids"]])
+            return FakeResult([(self.awaiting.get(params["product_id"], 0),)])
+        if "FROM products" in sql:
+            if "product_ids" in params:
+                return FakeResult([(pid,) + row for pid, row in self.products.items() if pid in params["product_ids"]])
+            row = self.products.get(params["product_id"])
+            if row is None:
+                return FakeResult([])
+            if "frozen_quantity" in sql:
+                return FakeResult([row[3:]])
+            return FakeResult([row[:3]])
+        raise AssertionError(f"Unexpected query: {sql}")
+
+
+def make_db(size=100):
+    products = {}
+    orders = []
+    awaiting = {}
+    partial = []
+    states = [None, 'on_repair', 'on_wash', 'on_laundry', 'damaged', 'available']
+    for pid in range(1, size + 1):
+        products[pid] = (pid % 17 + 3, f"SKU{pid}", f"Product {pid}", pid % 3, pid % 5 == 0 and 2 or 0, states[pid % 6])
+        if pid % 4 == 0:
+            awaiting[pid] = pid % 7
+        if pid % 2 == 0:
+            orders.append((1000 + pid, pid, pid % 4 + 1, 'processing', date(2026, 5, 1), date(2026, 5, 4), f"OC-{pid}", "A", "1"))
+        if pid % 3 == 0:
+            orders.append((2000 + pid, pid, 2, 'on_rent', date(2026, 4, 28), date(2026, 5, 2), f"OC-{pid}b", "B", "2"))
+        if pid % 10 == 0:
+            partial.append((pid, 50 + pid, 3000 + pid, f"OC-{pid}(1)", "C", "3", date(2026, 4, 1), 1, 25, datetime(2026, 4, 1)))
+    return FakeDB(products, orders, awaiting, partial)
+
+
+class TestBatchedOrderAvailability:
+
+    def setup_method(self):
+        availability_engine._engine_instance = AvailabilityEngine()
+        availability_engine._tracking_installed = True
+
+    def teardown_method(self):
+        availability_engine.reset_availability_engine()
+        availability_engine._tracking_installed = False
+
+    def test_identical_payload(self):
+        db = make_db()
+        items = [{"product_id": pid, "quantity": pid % 9 + 1} for pid in range(1, 101)]
+        items.append({"product_id": 999999, "quantity": 1})  # неіснуючий товар
+        per_item = check_order_availability(db, items, "2026-05-02", "2026-05-06", batched=False)
+        batched = check_order_availability(db, items, "2026-05-02", "2026-05-06", batched=True)
+        assert per_item == batched
+
+    def test_identical_payload_with_excluded_order(self):
+        db = make_db()
+        items = [{"product_id": pid, "quantity": 2} for pid in range(1, 21)]
+        per_item = check_order_availability(db, items, "2026-05-01", "2026-05-03", exclude_order_id=1002, batched=False)
+        batched = check_order_availability(db, items, "2026-05-01", "2026-05-03", exclude_order_id=1002, batched=True)
+        assert per_item == batched
+
+    def test_constant_query_count(self):
+        db = make_db()
+        check_order_availability(db, [{"product_id": 1, "quantity": 1}], "2026-05-02", "2026-05-06")
+        counts = []
+        for size in (1, 10, 100):
+            items = [{"product_id": pid, "quantity": 1} for pid in range(1, size + 1)]
+            before = db.queries
+            check_order_availability(db, items, "2026-05-02", "2026-05-06")
+            counts.append(db.queries - before)
+        assert counts[0] == counts[1] == counts[2] == 2
+
+
+class TestUndatedOrder:
+
+    def setup_method(self):
+        availability_engine._engine_instance = AvailabilityEngine()
+        availability_engine._tracking_installed = True
+
+    def teardown_method(self):
+        availability_engine.reset_availability_engine()
+        availability_engine._tracking_installed = False
+
+    def test_no_start_date_and_string_ids(self):
+        db = make_db(10)
+        result = check_product_availability(db, "2", 1, None, "2026-05-06", exclude_order_id="1002")
+        assert result["product_id"] == 2 and result["nearby_orders"] == []
+        dated = check_product_availability(db, "2", 1, "2026-05-02", "2026-05-06", exclude_order_id="1002")
+        assert dated == check_product_availability(db, 2, 1, "2026-05-02", "2026-05-06", exclude_order_id=1002)
+        assert all(o["order_id"] != 1002 for o in dated["nearby_orders"])
+
+    def test_batched_order_without_start_date(self):
+        db = make_db(20)
+        items = [{"product_id": str(pid), "quantity": 1} for pid in range(1, 21)]
+        batched = check_order_availability(db, items, None, "2026-05-06", exclude_order_id="1002", batched=True)
+        per_item = check_order_availability(db, items, None, "2026-05-06", exclude_order_id="1002", batched=False)
+        assert batched == per_item
+        assert all(item["nearby_orders"] == [] for item in batched["items"])
+        assert [item["product_id"] for item in batched["items"]] == list(range(1, 21))
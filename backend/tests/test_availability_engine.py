@@ -0,0 +1,199 @@
+"""
+Availability Engine Tests - in-memory interval index
+Tests for:
+1. max_concurrent sweep-line (overlap vs. sequential orders)
+2. ProductIntervals overlap lookup
+3. Incremental order reload after invalidation
+4. Soft holds expiry and partial returns
+"""
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.availability_engine import (
+    AvailabilityEngine,
+    OrderInterval,
+    ProductIntervals,
+    max_concurrent,
+    to_ordinal,
+    STATUS_RESERVED,
+    STATUS_IN_RENT,
+    STATUS_ACTIVE,
+)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class FakeDB:
+    """Мінімальна заміна сесії: відповідає на запити engine за ключовими словами"""
+
+    def __init__(self, order_rows=None, soft_rows=None, partial_rows=None):
+        self.order_rows = order_rows or []
+        self.soft_rows = soft_rows or []
+        self.partial_rows = partial_rows or []
+        self.queries = 0
+
+    def execute(self, stmt, params=None):
+        self.queries += 1
+        sql = str(stmt)
+        params = params or {}
+        if "FROM order_items" in sql:
+            rows = [r for r in self.order_rows if r[3] in params["statuses"]]
+            if "order_ids" in params:
+                rows = [r for r in rows if r[0] in params["order_ids"]]
+            return FakeResult(rows)
+        if "FROM event_soft_reservations" in sql:
+            return FakeResult(self.soft_rows)
+        if "FROM partial_return_version_items" in sql:
+            return FakeResult(self.partial_rows)
+        raise AssertionError(f"Unexpected query: {sql}")
+
+
+def order_row(order_id, product_id, qty, status, start, end):
+    return (order_id, product_id, qty, status, start, end, f"OC-{order_id}", "Client", "+380")
+
+
+def iv(start, end, qty):
+    return OrderInterval(order_id=0, product_id=1, quantity=qty, status="processing",
+                         start=to_ordinal(start), end=to_ordinal(end))
+
+
+class TestMaxConcurrent:
+    """Sweep-line: максимальна одночасна кількість"""
+
+    def test_sequential_orders_do_not_stack(self):
+        intervals = [iv("2026-01-01", "2026-01-03", 5), iv("2026-01-05", "2026-01-07", 5)]
+        assert max_concurrent(intervals, to_ordinal("2026-01-01"), to_ordinal("2026-01-10")) == 5
+
+    def test_overlapping_orders_stack(self):
+        intervals = [iv("2026-01-01", "2026-01-05", 5), iv("2026-01-05", "2026-01-07", 3)]
+        assert max_concurrent(intervals, to_ordinal("2026-01-01"), to_ordinal("2026-01-10")) == 8
+
+    def test_back_to_back_days_do_not_stack(self):
+        intervals = [iv("2026-01-01", "2026-01-04", 5), iv("2026-01-05", "2026-01-07", 3)]
+        assert max_concurrent(intervals, to_ordinal("2026-01-01"), to_ordinal("2026-01-10")) == 5
+
+    def test_window_clips_intervals(self):
+        intervals = [iv("2026-01-01", "2026-01-05", 5), iv("2026-01-05", "2026-01-07", 3)]
+        assert max_concurrent(intervals, to_ordinal("2026-01-06"), to_ordinal("2026-01-10")) == 3
+
+    def test_empty(self):
+        assert max_concurrent([], 0, 10) == 0
+
+
+class TestProductIntervals:
+
+    def test_overlapping_respects_inclusive_bounds(self):
+        index = ProductIntervals()
+        index.add(iv("2026-01-01", "2026-01-03", 1))
+        index.add(iv("2026-01-10", "2026-01-12", 1))
+        assert len(index.overlapping(to_ordinal("2026-01-03"), to_ordinal("2026-01-10"))) == 2
+        assert len(index.overlapping(to_ordinal("2026-01-04"), to_ordinal("2026-01-09"))) == 0
+
+
+class TestAvailabilityEngine:
+
+    def test_status_groups(self):
+        db = FakeDB(order_rows=[
+            order_row(1, 100, 2, "processing", date(2026, 3, 1), date(2026, 3, 5)),
+            order_row(2, 100, 4, "on_rent", date(2026, 3, 2), date(2026, 3, 4)),
+            order_row(3, 100, 7, "cancelled", date(2026, 3, 2), date(2026, 3, 4)),
+        ])
+        engine = AvailabilityEngine()
+        assert engine.max_reserved(db, [100], "2026-03-01", "2026-03-05", STATUS_RESERVED) == {100: 2}
+        assert engine.max_reserved(db, [100], "2026-03-01", "2026-03-05", STATUS_IN_RENT) == {100: 4}
+        assert engine.max_reserved(db, [100], "2026-03-01", "2026-03-05", STATUS_ACTIVE) == {100: 6}
+        assert engine.max_reserved(db, [100], "2026-03-01", "2026-03-05", STATUS_ACTIVE, exclude_order_id=2) == {100: 2}
+
+    def test_queries_hit_memory_after_load(self):
+        db = FakeDB(order_rows=[order_row(1, 100, 2, "processing", date(2026, 3, 1), date(2026, 3, 5))])
+        engine = AvailabilityEngine()
+        engine.max_reserved(db, [100], "2026-03-01", "2026-03-05")
+        loaded = db.queries
+        for _ in range(10):
+            engine.max_reserved(db, list(range(1000)), "2026-03-01", "2026-03-05")
+        assert db.queries == loaded
+
+    def test_incremental_reload_of_dirty_order(self):
+        db = FakeDB(order_rows=[
+            order_row(1, 100, 2, "processing", date(2026, 3, 1), date(2026, 3, 5)),
+            order_row(2, 100, 3, "processing", date(2026, 3, 1), date(2026, 3, 5)),
+        ])
+        engine = AvailabilityEngine()
+        assert engine.max_reserved(db, [100], "2026-03-01", "2026-03-05") == {100: 5}
+
+        db.order_rows[0] = order_row(1, 100, 2, "cancelled", date(2026, 3, 1), date(2026, 3, 5))
+        engine.invalidate_orders([1])
+        queries_before = db.queries
+        assert engine.max_reserved(db, [100], "2026-03-01", "2026-03-05") == {100: 3}
+        assert db.queries == queries_before + 1
+
+    def test_soft_holds_ignore_expired(self):
+        future = datetime.now() + timedelta(hours=1)
+        past = datetime.now() - timedelta(hours=1)
+        db = FakeDB(soft_rows=[
+            ("h1", "board-a", 100, 2, date(2026, 3, 1), date(2026, 3, 5), future, 1),
+            ("h2", "board-b", 100, 4, date(2026, 3, 1), date(2026, 3, 5), past, 2),
+        ])
+        engine = AvailabilityEngine()
+        assert engine.max_soft_reserved(db, [100], "2026-03-01", "2026-03-05") == {100: 2}
+        assert engine.max_soft_reserved(db, [100], "2026-03-01", "2026-03-05", exclude_board_id="board-a") == {}
+
+    def test_partial_returns(self):
+        db = FakeDB(partial_rows=[
+            (100, 7, 1, "OC-1(1)", "Client", "+380", date(2026, 2, 1), 3, 10, datetime(2026, 2, 1)),
+        ])
+        engine = AvailabilityEngine()
+        holds = engine.partial_returns(db, [100, 200])
+        assert list(holds.keys()) == [100]
+        assert holds[100][0].qty == 3
+        assert engine.product_ids_with_partial_returns(db) == {100}
+
+
+class TestChangeTracking:
+
+    def test_invalidation_after_dbapi_commit(self, monkeypatch):
+        from sqlalchemy import create_engine, event, text
+        from sqlalchemy.orm import sessionmaker
+        import services.availability_engine as availability_engine
+
+        engine = AvailabilityEngine()
+        engine._dirty_all = False
+        monkeypatch.setattr(availability_engine, "_engine_instance", engine)
+        monkeypatch.setattr(availability_engine, "_tracking_installed", True)
+        sa_engine = create_engine("sqlite://")
+        availability_engine.install_change_tracking(sa_engine)
+        seen_at_commit = []
+
+        @event.listens_for(sa_engine, "commit")
+        def _before_dbapi_commit(conn):
+            seen_at_commit.append(engine._dirty_all)
+
+        session = sessionmaker(bind=sa_engine)()
+        session.execute(text("CREATE TABLE orders (order_id INTEGER, status TEXT)"))
+        session.execute(text("UPDATE orders SET status = 'issued' WHERE order_id = :order_id"), {"order_id": 7})
+        session.rollback()
+        session.execute(text("UPDATE orders SET status = 'issued' WHERE order_id = :order_id"), {"order_id": 8})
+        session.commit()
+        # sqlite передає позиційні параметри -> невідоме замовлення -> повне перезавантаження
+        assert seen_at_commit == [False]
+        assert engine._dirty_all
+
+    def test_undated_orders_logged(self, caplog):
+        rows = [
+            (1, 10, 1, "processing", None, date(2026, 5, 3), "OC-1", "A", "1"),
+            (2, 10, 1, "processing", date(2026, 5, 1), date(2026, 5, 3), "OC-2", "B", "2"),
+        ]
+        engine = AvailabilityEngine()
+        with caplog.at_level("WARNING"):
+            engine.ensure_fresh(FakeDB(order_rows=rows))
+        assert "order_id: 1)" in caplog.text
+        assert list(engine._orders) == [2]
@@ -0,0 +1,211 @@
+"""
+Calendar Event Index Tests
+Tests for:
+1. Order events: issue before handover, return after, overdue resolved at read time
+2. Warehouse card events with precomputed category summary and item count
+3. Change tracking: order / card / task / laundry writes -> targeted refresh or stale source
+4. Failed refresh before commit rolls back to a savepoint and marks the sources stale
+5. ensure_fresh: first build rechecked under the lock, stale sources rebuilt in the background
+"""
+import json
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import services.calendar_index as calendar_index
+import utils.commit_tracking as commit_tracking
+from services.calendar_index import (
+    SOURCES, flush_pending, items_summary, note_write, resolve_event, search_pattern,
+)
+
+
+def order_row(status, **overrides):
+    row = dict(order_id=42, order_number="OC-42", customer_name="Олена", customer_phone="067",
+               status=status, total_price=1200, deposit=500, start=date(2026, 5, 10), end=date(2026, 5, 12),
+               rental_days=2, issue_date=None, return_date=None, delivery_type=None, city="Київ",
+               event_type="Весілля")
+    row.update(overrides)
+    return tuple(row.values())
+
+
+class TestOrderEvents:
+
+    def test_issue_before_handover(self):
+        [event] = SOURCES["order"].build(order_row("ready_for_issue"))
+        assert (event["event_date"], event["event_type"], event["entity_id"]) == (date(2026, 5, 10), "issue_ready", "42")
+        assert event["payload"]["subtitle"] == "Видача · самовивіз"
+        assert "oc-42" in event["search_text"]
+
+    def test_return_after_handover_and_overdue(self):
+        [event] = SOURCES["order"].build(order_row("issued", return_date=datetime(2026, 5, 13, 18, 0)))
+        assert (event["event_date"], event["event_type"]) == (date(2026, 5, 13), "return_issued")
+        payload = json.loads(json.dumps(event["payload"]))
+        assert resolve_event(dict(payload), today=date(2026, 5, 13))["type"] == "return_issued"
+        overdue = resolve_event(dict(payload), today=date(2026, 5, 14))
+        assert (overdue["type"], overdue["priority"]) == ("return_overdue", 1)
+
+    def test_no_event_without_date(self):
+        assert SOURCES["order"].build(order_row("pending", start=None)) == []
+
+
+class TestWarehouseEvents:
+
+    def test_card_summary(self):
+        items = json.dumps([{"name": "Стілець Chiavari"}, {"name": "Келих"}, {"name": "Стіл круглий"}, {"name": "Арка"}])
+        [event] = SOURCES["issue_card"].build(("issue_42", 42, "OC-42", "preparation", items, None, date(2026, 5, 10)))
+        assert event["feed"] == "warehouse" and event["order_id"] == 42
+        payload = event["payload"]
+        assert (payload["itemsSummary"], payload["itemsCount"]) == ("Меблі, посуд", 4)
+        assert (payload["order_id"], payload["client"], payload["date"]) == ("OC-42", "Клієнт", "2026-05-10")
+
+    def test_unrecognised_items(self):
+        assert items_summary([{"name": "Арка"}, "bad"]) == "Реквізит"
+
+    def test_search_pattern_escapes(self):
+        assert search_pattern(" 50%_Off ") == "%50\\%\\_off%"
+
+
+class FakeResult:
+    def __init__(self, rows=(), rowcount=0):
+        self._rows = list(rows)
+        self.rowcount = rowcount
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeDB:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt, params=None):
+        sql = " ".join(str(stmt).split())
+        self.statements.append((sql, params))
+        if sql.startswith("SELECT order_id FROM issue_cards"):
+            return FakeResult([(7,)])
+        return FakeResult()
+
+
+class TestChangeTracking:
+
+    def setup_method(self):
+        calendar_index._tables_ready = True
+
+    def test_irrelevant_order_update_ignored(self):
+        info = {}
+        note_write(info, "UPDATE orders SET manager_notes = :notes WHERE order_id = :order_id",
+                   {"notes": "x", "order_id": 1})
+        assert info == {}
+
+    def test_writes_collected(self):
+        info = {}
+        note_write(info, "UPDATE orders SET status = 'issued' WHERE order_id = :order_id", {"order_id": 5})
+        note_write(info, "UPDATE issue_cards SET status = :status WHERE id = :card_id",
+                   {"status": "ready", "card_id": "IC-7"})
+        note_write(info, "UPDATE tasks SET status = :status WHERE id = :task_id", {"status": "done", "task_id": "t-1"})
+        note_write(info, "UPDATE laundry_batches SET status = 'completed' WHERE id = :id", {"id": "BATCH-1"})
+        note_write(info, "INSERT INTO fin_payments (order_id, amount) VALUES (:order_id, :amount)",
+                   {"order_id": 5, "amount": 100}, lastrowid=9)
+        note_write(info, "UPDATE tasks SET status = 'done' WHERE id IN (:t0, :t1)", {"t0": "a", "t1": "b"})
+        pending = info[calendar_index._PENDING_KEY]
+        assert pending["orders"] == {5}
+        assert pending["cards"]["issue_cards"] == {"IC-7"}
+        assert pending["entities"] == {"task": {"t-1"}, "laundry_batch": {"BATCH-1"}, "payment": {9}}
+        assert pending["stale"] == {"task"}
+
+    def test_flush(self):
+        pending = calendar_index._new_pending()
+        pending["cards"]["issue_cards"].add("IC-7")
+        pending["entities"]["laundry_batch"] = {"BATCH-1"}
+        pending["stale"].add("damage")
+        db = FakeDB()
+        flush_pending(db, pending)
+        deletes = [params for sql, params in db.statements if sql.startswith("DELETE FROM calendar_event_index")]
+        assert deletes[0]["ids"] == (7,) and "issue_card" in deletes[0]["sources"]
+        assert deletes[1] == {"source": "laundry_batch", "ids": ("BATCH-1",)}
+        assert db.statements[-1][1] == {"sources": ("damage",)}
+
+
+class StateDB:
+    """calendar_event_index_state: кожне читання бере наступний знімок"""
+
+    def __init__(self, *snapshots):
+        self.snapshots = list(snapshots)
+        self.commits = 0
+
+    def execute(self, stmt, params=None):
+        assert "FROM calendar_event_index_state" in str(stmt)
+        return FakeResult(self.snapshots.pop(0) if len(self.snapshots) > 1 else self.snapshots[0])
+
+    def commit(self):
+        self.commits += 1
+
+
+class TestConsistency:
+
+    def setup_method(self):
+        calendar_index._tables_ready = True
+
+    def test_first_build_rechecked_under_lock(self, monkeypatch):
+        now = datetime.now()
+        missing = [(s, None if s == "task" else now, 0) for s in SOURCES]
+        fresh = [(s, now, 0) for s in SOURCES]
+        rebuilt = []
+        monkeypatch.setattr(calendar_index, "_tracking_installed", True)
+        monkeypatch.setattr(calendar_index, "rebuild_sources",
+                            lambda db, sources, seen: rebuilt.append(list(sources)))
+
+        db = StateDB(missing, fresh)
+        calendar_index.ensure_fresh(db)
+        assert rebuilt == [] and db.commits == 1
+
+        calendar_index.ensure_fresh(StateDB(missing, missing, fresh))
+        assert rebuilt == [["task"]]
+
+    def test_stale_source_served_and_rebuilt_in_background(self, monkeypatch):
+        now = datetime.now()
+        stale = [(s, now, 2 if s == "task" else 0) for s in SOURCES]
+        spawned, rebuilt = [], []
+        monkeypatch.setattr(calendar_index, "_tracking_installed", True)
+        monkeypatch.setattr(calendar_index, "_rebuild_thread", None)
+        monkeypatch.setattr(calendar_index, "_spawn", lambda target, name: spawned.append((target, name)))
+        monkeypatch.setattr(calendar_index, "rebuild_sources", lambda *args, **kwargs: rebuilt.append("sync"))
+        monkeypatch.setattr(calendar_index, "_rebuild", lambda sources, seen: rebuilt.append((sources, seen)))
+
+        db = StateDB(stale)
+        calendar_index.ensure_fresh(db)
+        assert rebuilt == [] and db.commits == 0
+        [(target, name)] = spawned
+        assert name == "calendar-index-rebuild"
+        target()
+        assert rebuilt == [(["task"], {"task": 2})]
+
+    def test_failed_refresh_keeps_events_and_marks_stale(self, monkeypatch):
+        from sqlalchemy import create_engine, text
+        from sqlalchemy.orm import sessionmaker
+
+        def failing_flush(db, pending):
+            db.execute(text("DELETE FROM calendar_event_index"))
+            raise RuntimeError("deadlock")
+
+        marked = []
+        monkeypatch.setitem(commit_tracking._before_commit_handlers, calendar_index._PENDING_KEY,
+                            (calendar_index._refresh_pending_events, False))
+        monkeypatch.setattr(calendar_index, "flush_pending", failing_flush)
+        monkeypatch.setattr(calendar_index, "mark_stale", lambda db, sources: marked.append(set(sources)))
+        session = sessionmaker(bind=create_engine("sqlite://"))()
+        session.execute(text("CREATE TABLE tasks (id TEXT, status TEXT)"))
+        session.execute(text("CREATE TABLE calendar_event_index (entity_id TEXT)"))
+        session.execute(text("INSERT INTO calendar_event_index VALUES ('t-1')"))
+        session.commit()
+
+        session.execute(text("INSERT INTO tasks VALUES ('t-1', 'done')"))
+        pending = calendar_index._new_pending()
+        pending["entities"]["task"] = {"t-1"}
+        session.connection().info[calendar_index._PENDING_KEY] = pending
+        session.commit()
+        assert session.execute(text("SELECT COUNT(*) FROM tasks")).scalar() == 1
+        assert session.execute(text("SELECT COUNT(*) FROM calendar_event_index")).scalar() == 1
+        assert marked == [{"task"}]
@@ -0,0 +1,163 @@
+"""
+Chat State & Push Tests
+Tests for:
+1. record_message: channel snapshot + unread counters (DM - members only), recipients for push
+2. channel_payload: one-row format of GET /api/chat/channels (DM members, preview, no messages)
+3. ChatHub: messages / thread replies / read events reach recipients on another worker,
+   author gets unread_delta 0, DM events go to members only
+4. publish_soon from a threadpool thread goes through the loop captured at hub start
+"""
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services import chat_state
+from services.realtime_backplane import MemoryBackplane
+from routes.team_chat import ChatHub, _message_event
+
+
+class FakeResult:
+    def __init__(self, rows=()):
+        self._rows = list(rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeDB:
+    def __init__(self, channel_type):
+        self.channel_type = channel_type
+        self.statements = []
+
+    def execute(self, stmt, params=None):
+        sql = " ".join(str(stmt).split())
+        self.statements.append((sql, params or {}))
+        if sql.startswith("SELECT cm.id"):
+            return FakeResult([(7, 3, 10, "Олена", "Коваль", "manager", "Привіт " * 60, None,
+                                datetime(2026, 5, 1, 9, 30), None, None, None, self.channel_type)])
+        if sql.startswith("SELECT user_id FROM chat_channel_members"):
+            return FakeResult([(10,), (20,)])
+        return FakeResult()
+
+    def sql(self, prefix):
+        return [s for s, _ in self.statements if s.startswith(prefix)]
+
+
+class TestRecordMessage:
+
+    @pytest.fixture(autouse=True)
+    def tables_ready(self, monkeypatch):
+        monkeypatch.setattr(chat_state, "_tables_ready", True)
+
+    def test_public_channel(self):
+        db = FakeDB("general")
+        message, recipients = chat_state.record_message(db, 7)
+        assert recipients is None
+        assert (message["user_name"], message["created_at"]) == ("Олена Коваль", "2026-05-01T09:30:00")
+        [state] = [p for s, p in db.statements if s.startswith("INSERT INTO chat_channel_state")]
+        assert state["ch_id"] == 3 and len(state["text"]) == chat_state.SNAPSHOT_TEXT_LENGTH
+        [unread] = db.sql("INSERT INTO chat_channel_unread")
+        assert "unread = unread + 1" in unread and "chat_channel_members" not in unread
+
+    def test_dm_counts_members_only(self):
+        db = FakeDB("dm")
+        _, recipients = chat_state.record_message(db, 7)
+        assert recipients == [10, 20]
+        [unread] = db.sql("INSERT INTO chat_channel_unread")
+        assert "chat_channel_members" in unread
+
+    def test_mark_read_resets_counter(self):
+        db = FakeDB("general")
+        chat_state.mark_read(db, 10, 3)
+        assert db.sql("INSERT INTO chat_read_status")
+        assert "unread = 0" in db.sql("INSERT INTO chat_channel_unread")[0]
+
+
+class TestChannelPayload:
+
+    def test_dm_with_last_message(self):
+        row = (5, "Олена & Петро", "dm", None, 0, datetime(2026, 1, 1), datetime(2026, 5, 1),
+               "x" * 100, "Петро", datetime(2026, 5, 1, 10), json.dumps([{"id": 10, "name": "Олена"}]), 3)
+        payload = chat_state.channel_payload(row)
+        assert payload["members"] == [{"id": 10, "name": "Олена"}]
+        assert payload["unread"] == 3 and len(payload["last_message"]["text"]) == chat_state.PREVIEW_LENGTH
+        assert payload["updated_at"] == "2026-05-01T00:00:00"
+
+    def test_channel_without_messages(self):
+        row = (1, "Загальний", "general", "", 1, datetime(2026, 1, 1), None, None, None, None, None, 0)
+        payload = chat_state.channel_payload(row)
+        assert payload["last_message"] is None and payload["members"] == [] and payload["pinned"]
+        assert payload["updated_at"] == "2026-01-01T00:00:00"
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        self.sent.append(json.loads(data))
+
+    async def close(self, code=1000):
+        pass
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestChatHub:
+
+    def test_push_across_workers(self):
+        async def scenario():
+            bus = []
+            a, b = ChatHub(MemoryBackplane("a", hub=bus)), ChatHub(MemoryBackplane("b", hub=bus))
+            olena, petro, ivan = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+            await a.connect(olena, 10)
+            await b.connect(petro, 20)
+            await b.connect(ivan, 30)
+            message = {"id": 1, "channel_id": 3, "user_id": 10, "reply_to": None}
+            await a.publish(_message_event(message), recipients=None, author_id=10)
+            await a.publish(_message_event(dict(message, id=2, channel_id=5, reply_to=1)), recipients=[10, 20],
+                            author_id=10)
+            await b.publish({"type": "chat.read", "channel_id": 3, "unread": 0, "total_unread": 0}, recipients=[20])
+            await settle()
+            b.disconnect(ivan, 30)
+            return olena.sent, petro.sent, ivan.sent, b.connections
+
+        olena, petro, ivan, connections = asyncio.run(scenario())
+        assert [(m["type"], m["unread_delta"]) for m in olena] == [("chat.message", 0), ("chat.thread_reply", 0)]
+        assert [m["type"] for m in petro] == ["chat.message", "chat.thread_reply", "chat.read"]
+        assert petro[0]["unread_delta"] == 1
+        assert [m["type"] for m in ivan] == ["chat.message"]
+        assert 30 not in connections
+
+    def test_publish_soon_from_worker_thread(self):
+        async def scenario():
+            hub = ChatHub(MemoryBackplane("a", hub=[]))
+            olena = FakeWebSocket()
+            await hub.connect(olena, 10)
+            # sync-роут / задача в потоці threadpool: running loop немає
+            await asyncio.to_thread(hub.publish_soon, _message_event({"id": 1, "channel_id": 3, "user_id": 20,
+                                                                      "reply_to": None}), [10], 20)
+            await settle()
+            return olena.sent
+
+        assert [(m["type"], m["unread_delta"]) for m in asyncio.run(scenario())] == [("chat.message", 1)]
+
+    def test_publish_soon_before_start_is_logged(self, caplog):
+        hub = ChatHub(MemoryBackplane("a", hub=[]))
+        hub.publish_soon({"type": "chat.message"}, [10])
+        assert "not pushed" in caplog.text
@@ -0,0 +1,221 @@
+"""
+Client Summary Projection Tests
+Tests for:
+1. Normalized search keys: phone digits, lowercased email, transliterated names
+2. Query tokens and prefix search condition over client_search_terms; phone digits also match
+   in the middle of the number
+3. compute_rows aggregates orders / payers / active agreement per client
+4. Write tracking: which statements mark which clients for refresh
+5. Failed refresh before commit rolls back to a savepoint, the author's write is kept
+6. Periodic full rebuild is started through the _spawn hook (no stray threads in tests)
+"""
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import services.client_summary as client_summary
+import utils.commit_tracking as commit_tracking
+from services.client_summary import (
+    SORT_AT_FLOOR, TERM_EMAIL, TERM_NAME, TERM_PHONE, _PENDING_KEY, compute_rows, is_agreement_active,
+    note_write, phone_key, query_tokens, search_condition, search_terms, transliterate,
+)
+
+
+class TestNormalization:
+
+    def test_transliteration(self):
+        assert transliterate("Олександр Щербина") == "oleksandr shcherbyna"
+        assert transliterate("Ґалаґан Юлія") == "galagan iuliia"
+
+    def test_search_terms(self):
+        terms = search_terms("Іван Петренко", " Ivan.P@Gmail.com ", "+38 (067) 123-45-67", company="ТОВ Декор")
+        assert ("ivan", TERM_NAME) in terms and ("petrenko", TERM_NAME) in terms
+        assert ("ivan.p@gmail.com", TERM_EMAIL) in terms and ("gmail.com", TERM_EMAIL) in terms
+        assert {("671234567", TERM_PHONE), ("0671234567", TERM_PHONE), ("380671234567", TERM_PHONE)} <= terms
+        assert ("dekor", "company") in terms
+        assert phone_key("067-123-45-67") == phone_key("+380671234567") == "671234567"
+
+    def test_query_tokens(self):
+        assert query_tokens("Іван") == query_tokens("ivan") == ["ivan"]
+        assert query_tokens("+38 (067) 123") == ["38067123"]
+        assert query_tokens("Петренко IVAN.P@gmail") == ["petrenko", "ivan.p@gmail"]
+        assert query_tokens("  ") == []
+
+    def test_search_condition(self):
+        where, params = search_condition("петр a_b@x", kinds=(TERM_NAME,))
+        assert where.count("client_search_terms") == 2
+        assert params == {"term_0": "petr%", "term_1": "a\\_b@x%", "term_kinds": ("name",)}
+        assert search_condition("") == ("", {})
+
+    def test_phone_search_matches_middle_digits(self):
+        from sqlalchemy import create_engine, text
+
+        engine = create_engine("sqlite://")
+        with engine.connect() as conn:
+            conn.execute(text("CREATE TABLE client_summary (client_user_id INTEGER, phone_key TEXT)"))
+            conn.execute(text("CREATE TABLE client_search_terms (term TEXT, kind TEXT, client_user_id INTEGER)"))
+            conn.execute(text("INSERT INTO client_summary VALUES (1, '671234567'), (2, '501112233')"))
+            for term, _ in search_terms(phone="067-123-45-67"):
+                conn.execute(text("INSERT INTO client_search_terms VALUES (:t, 'phone', 1)"), {"t": term})
+
+            def found(query):
+                where, params = search_condition(query)
+                return [r[0] for r in conn.execute(
+                    text(f"SELECT cs.client_user_id FROM client_summary cs WHERE {where}"), params)]
+
+            assert found("45-67") == [1]
+            assert found("067 123") == [1]
+            assert found("+380671234567") == [1]
+            assert found("1122") == [2]
+            assert found("999") == []
+        # пошук лише по імені телефон не зачіпає
+        assert "phone_key" not in search_condition("123", kinds=(TERM_NAME,))[0]
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class FakeDB:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        for marker, rows in self.tables.items():
+            if marker in sql:
+                return FakeResult(rows)
+        raise AssertionError(sql)
+
+
+class TestComputeRows:
+
+    def test_aggregates(self):
+        updated = datetime(2026, 5, 1, 10, 0)
+        db = FakeDB({
+            "FROM client_users c": [
+                (1, "A@x.com", "Іван", "0671234567", None, None, "@ivan_decor", 1, "rentalhub", updated),
+                (2, "b@x.com", "Олена", None, None, None, None, 0, "opencart", None),
+            ],
+            "FROM orders o": [(1, 3, 4500.0, datetime(2026, 4, 20, 9, 0))],
+            "FROM client_payer_links cpl": [(1, 10, 0, "ФОП Іван"), (1, 11, 1, "ТОВ Декор")],
+            "FROM master_agreements ma": [
+                (1, 7, "MA-2026-007", "signed", date(2026, 12, 31)),
+                (1, 5, "MA-2025-005", "signed", date(2025, 12, 31)),
+            ],
+        })
+        summary, terms = compute_rows(db, [1, 2])
+        first, second = summary
+        assert (first["orders_count"], first["payers_count"], first["total_revenue"]) == (3, 2, 4500.0)
+        assert (first["default_payer_id"], first["default_payer_name"]) == (11, "ТОВ Декор")
+        assert (first["ma_id"], first["ma_number"]) == (7, "MA-2026-007")
+        assert first["last_order_date"] == date(2026, 4, 20)
+        assert (first["email_key"], first["phone_key"], first["sort_at"]) == ("a@x.com", "671234567", updated)
+        assert (second["orders_count"], second["payers_count"], second["is_active"]) == (0, 0, 0)
+        assert second["sort_at"] == SORT_AT_FLOOR  # без дат - не NULL, інакше курсор його пропускає
+        assert {"term": "ivan_decor", "kind": "instagram", "client_user_id": 1} in terms
+
+    def test_agreement_validity(self):
+        assert is_agreement_active("signed", None)
+        assert is_agreement_active("sent", date(2026, 1, 1), today=date(2026, 1, 1))
+        assert not is_agreement_active("signed", date(2025, 12, 31), today=date(2026, 1, 1))
+        assert not is_agreement_active("cancelled", None)
+
+
+class TestWriteTracking:
+
+    def pending(self, *writes):
+        info = {}
+        for write in writes:
+            note_write(info, *write)
+        return info.get(_PENDING_KEY)
+
+    def test_orders(self):
+        assert self.pending(("UPDATE orders SET notes = :notes WHERE order_id = :order_id",
+                             {"notes": "x", "order_id": 1})) is None
+        pending = self.pending(
+            ("UPDATE orders SET status = 'cancelled' WHERE order_id = :order_id", {"order_id": 5}),
+            ("UPDATE orders SET client_user_id = :cid WHERE order_id = :oid", {"cid": 9, "oid": 6}),
+        )
+        assert (pending["clients"], pending["orders"], pending["all"]) == ({9}, {5, 6}, False)
+        assert self.pending(("UPDATE orders SET status = 'archived' WHERE rental_end_date < NOW()", {}))["all"]
+
+    def test_clients_payers_agreements(self):
+        pending = self.pending(
+            ("INSERT INTO client_users (email) VALUES (:email)", {"email": "a@x.com"}, 42),
+            ("UPDATE client_users SET phone = :phone WHERE id = :id", {"phone": "1", "id": 3}),
+            ("DELETE FROM client_payer_links WHERE client_user_id = :client AND payer_profile_id = :payer",
+             {"client": 4, "payer": 8}),
+            ("UPDATE payer_profiles SET is_active = FALSE WHERE id = :id", {"id": 8}),
+            ("UPDATE master_agreements SET status = 'signed' WHERE id = :id", {"id": 12}),
+        )
+        assert pending["clients"] == {42, 3, 4}
+        assert (pending["payers"], pending["agreements"], pending["all"]) == ({8}, {12}, False)
+
+    def test_ignores_other_tables(self):
+        assert self.pending(("UPDATE order_items SET quantity = 1 WHERE id = :id", {"id": 1})) is None
+        assert self.pending(("INSERT INTO client_summary (client_user_id) VALUES (:id)", {"id": 1})) is None
+
+
+class TestRefreshBeforeCommit:
+
+    def test_failed_refresh_keeps_terms_and_author_write(self, monkeypatch):
+        from sqlalchemy import create_engine, text
+        from sqlalchemy.orm import sessionmaker
+
+        def failing_refresh(db, client_ids):
+            db.execute(text("DELETE FROM client_search_terms WHERE client_user_id = 1"))
+            raise RuntimeError("lock wait timeout")
+
+        monkeypatch.setitem(commit_tracking._before_commit_handlers, client_summary._PENDING_KEY,
+                            (client_summary._refresh_pending_clients, False))
+        monkeypatch.setattr(client_summary, "_resolve_clients", lambda db, pending: {1})
+        monkeypatch.setattr(client_summary, "refresh_clients", failing_refresh)
+        session = sessionmaker(bind=create_engine("sqlite://"))()
+        session.execute(text("CREATE TABLE client_users (id INTEGER, phone TEXT)"))
+        session.execute(text("CREATE TABLE client_search_terms (term TEXT, client_user_id INTEGER)"))
+        session.execute(text("INSERT INTO client_search_terms VALUES ('ivan', 1)"))
+        session.commit()
+
+        session.execute(text("INSERT INTO client_users VALUES (1, '067')"))
+        session.connection().info[_PENDING_KEY] = {"clients": {1}, "all": False}
+        session.commit()
+        assert session.execute(text("SELECT COUNT(*) FROM client_users")).scalar() == 1
+        assert session.execute(text("SELECT COUNT(*) FROM client_search_terms")).scalar() == 1
+        assert _PENDING_KEY not in session.connection().info
+
+
+class TestBackgroundRebuild:
+
+    def test_stale_projection_rebuilds_through_spawn_hook(self, monkeypatch):
+        from datetime import timedelta
+
+        class StateDB:
+            commits = 0
+
+            def execute(self, stmt, params=None):
+                return self
+
+            def scalar(self):
+                return datetime.now() - timedelta(hours=client_summary.REBUILD_HOURS + 1)
+
+            def commit(self):
+                StateDB.commits += 1
+
+        spawned = []
+        monkeypatch.setattr(client_summary, "_spawn", lambda target, name: spawned.append(name))
+        monkeypatch.setattr(client_summary, "_install_change_tracking", lambda: None)
+        monkeypatch.setattr(client_summary, "ensure_summary_tables", lambda db: None)
+        monkeypatch.setattr(client_summary, "reconcile", lambda db: 0)
+        monkeypatch.setattr(client_summary, "_built", False)
+        monkeypatch.setattr(client_summary, "_reconciled_at", 0.0)
+
+        client_summary.ensure_fresh(StateDB())
+        assert spawned == ["client-summary-rebuild"]
+        assert StateDB.commits == 1
@@ -0,0 +1,98 @@
+"""
+Company Config Cache Tests
+Tests for:
+1. system_settings is read once per process until TTL / invalidate(), once per session (memo)
+2. Invalidation bumps the version: memoized sessions and the process snapshot reload
+3. get_company_config / get_landlord_config defaults and hit-rate stats
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services import company_config
+from services.company_config import SettingsCache, get_company_config, get_landlord_config
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeDB:
+    def __init__(self, settings):
+        self.settings = settings
+        self.info = {}
+        self.reads = 0
+
+    def execute(self, stmt, params=None):
+        self.reads += 1
+        return FakeResult(list(self.settings.items()))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSettingsCache:
+
+    def test_memo_and_process_hits(self):
+        settings = {"short_name": "Farfor"}
+        cache = SettingsCache(ttl=60, clock=Clock())
+        first, second = FakeDB(settings), FakeDB(settings)
+        for _ in range(3):
+            assert cache.get(first).get("short_name") == "Farfor"
+        cache.get(second)
+        assert (first.reads, second.reads) == (1, 0)
+        assert cache.stats()["misses"] == 1 and cache.stats()["memo_hits"] == 2 and cache.stats()["hits"] == 1
+        assert cache.stats()["hit_rate"] == 0.75
+
+    def test_invalidate_and_ttl_reload(self):
+        settings, clock = {"phone": "1"}, Clock()
+        cache = SettingsCache(ttl=60, clock=clock)
+        db = FakeDB(settings)
+        cache.get(db)
+        settings["phone"] = "2"
+        assert cache.get(db).get("phone") == "1"
+        cache.invalidate()
+        assert cache.get(db).get("phone") == "2" and db.reads == 2
+        settings["phone"] = "3"
+        clock.now = 61
+        assert cache.get(FakeDB(settings)).get("phone") == "3"
+
+    def test_failed_read_falls_back_to_defaults(self, monkeypatch):
+        class BrokenDB:
+            info = {}
+
+            def execute(self, stmt, params=None):
+                raise RuntimeError("no table")
+
+        monkeypatch.setattr(company_config, "settings_cache", SettingsCache())
+        company = get_company_config(BrokenDB())
+        assert company["name"] == company_config.DEFAULTS["short_name"]
+        assert company["mfo"] == "322001"
+
+
+class TestCompanyConfig:
+
+    def test_render_reads_settings_once(self, monkeypatch):
+        monkeypatch.setattr(company_config, "settings_cache", SettingsCache())
+        db = FakeDB({"name": "ФОП Тест", "signer_name": "Тест Т.Т."})
+        company, landlord = get_company_config(db), get_landlord_config(db)
+        assert (company["legal_name"], company["director_name"]) == ("ФОП Тест", "Тест Т.Т.")
+        assert landlord["iban"] == company_config.DEFAULTS["iban"]
+        assert db.reads == 1
+
+    def test_invalidate_everywhere(self, monkeypatch):
+        cache = SettingsCache()
+        monkeypatch.setattr(company_config, "settings_cache", cache)
+        asyncio.run(company_config.invalidate_everywhere())
+        assert cache.version == 1
@@ -0,0 +1,171 @@
+"""
+Dashboard Snapshot Tests
+Tests for:
+1. Sections run concurrently, each in its own session, with per-section timings
+2. TTL cache and single-flight de-duplication of concurrent callers
+3. Failed section falls back to its default
+4. Invalidation by write statements (order status transitions), after the DBAPI COMMIT
+5. Per-user snapshots are bounded (LRU)
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.dashboard_snapshot import DashboardSnapshots
+
+
+class FakeSession:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make(clock=None, ttl=15, max_entries=512):
+    return DashboardSnapshots(ttl=ttl, workers=4, session_factory=FakeSession, clock=clock or Clock(),
+                              max_entries=max_entries)
+
+
+class TestBuild:
+
+    def test_sections_run_concurrently(self):
+        barrier = threading.Barrier(3, timeout=2)
+
+        def section(value):
+            def run(db, uid):
+                barrier.wait()  # зависне, якщо секції виконуються послідовно
+                return (value, uid)
+            return run
+
+        snapshots = make()
+        snapshots.register("v", {"a": section("a"), "b": section("b"), "c": section("c")})
+        result = snapshots.get("v", key=1, uid=1)
+        assert (result["a"], result["c"]) == (("a", 1), ("c", 1))
+        meta = result["_snapshot"]
+        assert not meta["cached"] and set(meta["sections"]) == {"a", "b", "c"}
+
+    def test_failed_section_uses_default(self):
+        def broken(db):
+            raise RuntimeError("table missing")
+
+        snapshots = make()
+        snapshots.register("v", {"ok": lambda db: 1, "bad": broken}, defaults={"bad": []},
+                           finalize=lambda p: {**p, "extra": True})
+        result = snapshots.get("v")
+        assert (result["ok"], result["bad"], result["extra"]) == (1, [], True)
+        assert result["_snapshot"]["errors"] == {"bad": "table missing"}
+
+
+class TestCache:
+
+    def test_ttl(self):
+        clock = Clock()
+        calls = []
+        snapshots = make(clock, ttl=10)
+        snapshots.register("v", {"n": lambda db: calls.append(1) or len(calls)})
+        assert snapshots.get("v")["n"] == 1
+        clock.now += 5
+        cached = snapshots.get("v")
+        assert cached["n"] == 1 and cached["_snapshot"]["cached"] and cached["_snapshot"]["age_ms"] == 5000
+        clock.now += 6
+        assert snapshots.get("v")["n"] == 2
+
+    def test_single_flight(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow(db):
+            calls.append(1)
+            started.set()
+            release.wait(2)
+            return "done"
+
+        snapshots = make()
+        snapshots.register("v", {"s": slow})
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(snapshots.get("v"))) for _ in range(5)]
+        threads[0].start()
+        started.wait(2)
+        for t in threads[1:]:
+            t.start()
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join(2)
+        assert len(calls) == 1 and [r["s"] for r in results] == ["done"] * 5
+        assert sum(not r["_snapshot"]["cached"] for r in results) == 1
+
+    def test_per_user_cache_is_bounded(self):
+        clock = Clock()
+        calls = []
+        snapshots = make(clock, max_entries=3)
+        snapshots.register("v", {"n": lambda db, uid: calls.append(uid) or uid})
+        for uid in (1, 2, 3):
+            snapshots.get("v", key=uid, uid=uid)
+        snapshots.get("v", key=1, uid=1)  # 1 - найсвіжіше використаний
+        snapshots.get("v", key=4, uid=4)
+        assert len(snapshots._cache) == 3 and ("v", 2) not in snapshots._cache
+        assert snapshots.get("v", key=1, uid=1)["_snapshot"]["cached"]
+        assert calls == [1, 2, 3, 4]
+
+
+class TestInvalidation:
+
+    def test_views_for_write(self):
+        snapshots = make()
+        snapshots.register("overview", {}, tables={"orders": ("status", "is_archived"), "issue_cards": None})
+        snapshots.register("focus", {}, tables={"tasks": None})
+        assert snapshots.views_for_write("UPDATE orders SET status = :s WHERE order_id = :id") == {"overview"}
+        assert snapshots.views_for_write("UPDATE orders SET manager_notes = :n WHERE order_id = :id") == set()
+        assert snapshots.views_for_write("INSERT INTO orders (order_id) VALUES (1)") == {"overview"}
+        assert snapshots.views_for_write("UPDATE tasks SET status = 'done' WHERE id = :id") == {"focus"}
+        assert snapshots.views_for_write("SELECT * FROM orders") == set()
+
+    def test_invalidate_drops_cache(self):
+        calls = []
+        snapshots = make()
+        snapshots.register("v", {"n": lambda db: calls.append(1) or len(calls)})
+        snapshots.get("v", key=1)
+        snapshots.get("v", key=1)
+        snapshots.invalidate(["v"])
+        assert snapshots.get("v", key=1)["n"] == 2
+
+    def test_invalidated_after_dbapi_commit(self):
+        from sqlalchemy import create_engine, event, text
+        from sqlalchemy.orm import sessionmaker
+        from services.dashboard_snapshot import install_change_tracking
+
+        calls = []
+        snapshots = make()
+        snapshots.register("v", {"n": lambda db: calls.append(1) or len(calls)}, tables={"tasks": None})
+        sa_engine = create_engine("sqlite://")
+        install_change_tracking(sa_engine, snapshots)
+        cached_at_commit = []
+
+        @event.listens_for(sa_engine, "commit")
+        def _before_dbapi_commit(conn):
+            cached_at_commit.append(bool(snapshots._cache))
+
+        session = sessionmaker(bind=sa_engine)()
+        session.execute(text("CREATE TABLE tasks (id INTEGER, status TEXT)"))
+        session.commit()
+        snapshots.get("v")
+        session.execute(text("UPDATE tasks SET status = 'done' WHERE id = 1"))
+        session.rollback()
+        assert snapshots.get("v")["n"] == 1
+        session.execute(text("UPDATE tasks SET status = 'done' WHERE id = 1"))
+        session.commit()
+        assert cached_at_commit == [False, True]
+        assert snapshots.get("v")["n"] == 2
@@ -0,0 +1,87 @@
+"""
+DB Threadpool Offload Tests
+Tests for:
+1. async handlers without await run in the threadpool (event loop stays free)
+2. handlers that await / need the running loop stay on the event loop
+3. DB_THREADPOOL_ROUTERS parsing and signature/dependency preservation
+"""
+import asyncio
+import os
+import sys
+import threading
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi import APIRouter, Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+
+from utils.db_offload import can_offload, enabled_router_names, offload_blocking_routers
+
+
+def get_fake_db():
+    yield {"thread": threading.current_thread().name}
+
+
+def make_module():
+    module = types.ModuleType("routes.fake_orders")
+    router = APIRouter(prefix="/api/fake")
+
+    async def blocking(order_id: int, limit: int = 10, db: dict = Depends(get_fake_db)):
+        return {"order_id": order_id, "limit": limit, "thread": threading.current_thread().name}
+
+    async def awaiting(request: Request):
+        body = await request.json()
+        return {"body": body, "thread": threading.current_thread().name}
+
+    async def uses_loop():
+        asyncio.get_running_loop()
+        return {"thread": threading.current_thread().name}
+
+    for fn in (blocking, awaiting, uses_loop):
+        fn.__module__ = module.__name__
+    router.add_api_route("/{order_id}", blocking, methods=["GET"])
+    router.add_api_route("/echo", awaiting, methods=["POST"])
+    router.add_api_route("/loop/check", uses_loop, methods=["GET"])
+    module.router = router
+    return module
+
+
+class TestDbOffload:
+
+    def test_setting_parsing(self):
+        assert enabled_router_names("*") is None
+        assert enabled_router_names("off") == set()
+        assert enabled_router_names("") == set()
+        assert enabled_router_names("orders, routes.finance") == {"orders", "finance"}
+
+    def test_can_offload_detects_awaits(self):
+        module = make_module()
+        endpoints = {r.path: r.endpoint for r in module.router.routes}
+        assert can_offload(endpoints["/api/fake/{order_id}"])
+        assert not can_offload(endpoints["/api/fake/echo"])
+        assert not can_offload(endpoints["/api/fake/loop/check"])
+
+    def test_offloaded_handlers_run_in_threadpool(self):
+        module = make_module()
+        report = offload_blocking_routers("fake_orders", modules=[module])
+        assert report == ["fake_orders: 1/3"]
+
+        app = FastAPI()
+        app.include_router(module.router)
+        client = TestClient(app)
+
+        echo = client.post("/api/fake/echo", json={"a": 1}).json()
+        assert echo["body"] == {"a": 1}
+        loop_thread = echo["thread"]
+
+        res = client.get("/api/fake/5", params={"limit": 3}).json()
+        assert res["order_id"] == 5 and res["limit"] == 3
+        assert res["thread"] != loop_thread
+        loop_res = client.get("/api/fake/loop/check")
+        assert loop_res.status_code == 200
+
+    def test_disabled_setting_leaves_routes(self):
+        module = make_module()
+        assert offload_blocking_routers("off", modules=[module]) == []
+        assert offload_blocking_routers("finance", modules=[module]) == []
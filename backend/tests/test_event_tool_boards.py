@@ -0,0 +1,148 @@
+"""
+Event Tool Principal Cache & Board Hydration Tests
+Tests for:
+1. PrincipalCache: token -> customer without DB round trip, TTL bounded by token exp, invalidation
+2. hydrate_board_items: all board items in one IN (...) query, grouped per board in position order
+3. GET /boards/{id}: ETag from updated_at + product fields, If-None-Match -> 304, product edits change it
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from routes import event_tool
+from routes.event_tool import PrincipalCache, board_etag, create_access_token, get_board, get_current_customer, hydrate_board_items
+
+UPDATED = datetime(2026, 5, 1, 10, 0, 0)
+
+
+def board_row(board_id, updated_at=UPDATED):
+    return (board_id, 7, f"Борд {board_id}", None, "wedding", None, None, None, "draft",
+            None, None, 0, None, None, datetime(2026, 4, 1), updated_at, None)
+
+
+def item_row(item_id, board_id, position):
+    return (item_id, board_id, 100 + position, 1, None, None, position, None,
+            f"SKU-{item_id}", "Ваза", 150, "static/images/vase.png", "білий", "скло")
+
+
+class FakeResult:
+    def __init__(self, rows=()):
+        self._rows = list(rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeDB:
+    def __init__(self, boards=(), items=()):
+        self.boards = list(boards)
+        self.items = list(items)
+        self.statements = []
+
+    def execute(self, stmt, params=None):
+        sql = " ".join(str(stmt).split())
+        self.statements.append((sql, params or {}))
+        if "FROM event_customers" in sql:
+            return FakeResult([(7, "decor@example.com", "Олена", "Коваль", "067")])
+        if "FROM event_board_items" in sql:
+            ids = params["board_ids"]
+            return FakeResult([i for i in self.items if i[1] in ids])
+        if "FROM event_boards" in sql:
+            return FakeResult(self.boards)
+        return FakeResult()
+
+    def count(self, fragment):
+        return sum(1 for sql, _ in self.statements if fragment in sql)
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestPrincipalCache:
+
+    def test_second_call_skips_db(self, monkeypatch):
+        monkeypatch.setattr(event_tool, "principal_cache", PrincipalCache(ttl=60))
+        token = create_access_token({"sub": 7})
+        db = FakeDB()
+        first = get_current_customer(token, db)
+        second = get_current_customer(token, db)
+        assert first == second and first["firstname"] == "Олена"
+        assert db.count("FROM event_customers") == 1
+
+    def test_ttl_bounded_by_token_exp_and_invalidation(self):
+        clock = Clock()
+        cache = PrincipalCache(ttl=60, clock=clock)
+        customer = {"customer_id": 7, "email": "a"}
+        cache.put("t1", customer, token_exp=clock.now + 10)
+        cache.put("t2", customer)
+        clock.now += 11
+        assert cache.get("t1") is None and cache.get("t2") == customer
+        cache.invalidate_customer(7)
+        assert cache.get("t2") is None
+
+    def test_size_bound(self):
+        cache = PrincipalCache(ttl=60, max_size=2)
+        for n in range(3):
+            cache.put(f"t{n}", {"customer_id": n})
+        assert cache.get("t0") is None and cache.get("t2") == {"customer_id": 2}
+
+    def test_invalid_token_not_cached(self, monkeypatch):
+        monkeypatch.setattr(event_tool, "principal_cache", PrincipalCache(ttl=60))
+        with pytest.raises(HTTPException):
+            get_current_customer("not-a-jwt", FakeDB())
+
+
+class TestBoardHydration:
+
+    def test_one_query_for_all_boards(self):
+        db = FakeDB(items=[item_row("i1", "b1", 0), item_row("i3", "b2", 0), item_row("i2", "b1", 1)])
+        boards = hydrate_board_items(db, [{"id": "b1"}, {"id": "b2"}, {"id": "b3"}])
+        assert db.count("FROM event_board_items") == 1
+        assert [i["id"] for i in boards[0]["items"]] == ["i1", "i2"]
+        assert [i["id"] for i in boards[1]["items"]] == ["i3"] and boards[2]["items"] == []
+        assert boards[0]["items"][0]["product"]["rental_price"] == 150.0
+
+    def test_no_boards_no_query(self):
+        db = FakeDB()
+        assert hydrate_board_items(db, []) == [] and not db.statements
+
+
+class TestBoardETag:
+
+    def test_conditional_get(self, monkeypatch):
+        monkeypatch.setattr(event_tool, "principal_cache", PrincipalCache(ttl=60))
+        token = create_access_token({"sub": 7})
+        db = FakeDB(boards=[board_row("b1")], items=[item_row("i1", "b1", 0)])
+        response = Response()
+        board = asyncio.run(get_board("b1", response=response, if_none_match=None, db=db, token=token))
+        etag = response.headers["ETag"]
+        assert etag == board_etag("b1", UPDATED, board["items"]) and len(board["items"]) == 1
+
+        cached = asyncio.run(get_board("b1", response=Response(), if_none_match=f'"x", {etag}', db=db, token=token))
+        assert cached.status_code == 304 and cached.headers["ETag"] == etag
+
+        # товар перейменовано в products - борд не чіпали, але відповідь інша
+        db.items = [item_row("i1", "b1", 0)[:9] + ("Ваза висока",) + item_row("i1", "b1", 0)[10:]]
+        changed = Response()
+        board = asyncio.run(get_board("b1", response=changed, if_none_match=etag, db=db, token=token))
+        assert board["items"][0]["product"]["name"] == "Ваза висока" and changed.headers["ETag"] != etag
+
+    def test_etag_changes_with_updated_at(self):
+        assert board_etag("b1", UPDATED) != board_etag("b1", datetime(2026, 5, 1, 10, 0, 1))
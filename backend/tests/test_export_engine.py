@@ -0,0 +1,162 @@
+"""
+Export Engine Tests
+Tests for:
+1. CSV stream: BOM + header first, then one block per chunk of rows
+2. Write-only XLSX round-trip (header, rows, illegal characters stripped)
+3. stream_rows: chunked fetchmany on a dedicated connection, invalidated on abort
+4. Builder registry and format validation
+5. Export handlers are plain def (XLSX is built synchronously, in the threadpool)
+6. Jobs left queued / running by a restarted worker are marked failed
+"""
+import inspect
+import io
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi import HTTPException
+
+from services.export_engine import (
+    ExportJobs, ExportSpec, build_spec, check_format, content_disposition, csv_chunks,
+    export_builder, stream_rows, write_csv, write_xlsx
+)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.fetches = []
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        self.fetches.append(len(chunk))
+        return chunk
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.result = FakeResult(rows)
+        self.options = None
+        self.statements = []
+        self.invalidated = False
+        self.closed = False
+
+    def execution_options(self, **options):
+        self.options = options
+        return self
+
+    def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+        return self.result
+
+    def invalidate(self):
+        self.invalidated = True
+
+    def close(self):
+        self.closed = True
+
+
+def spec(**kwargs):
+    return ExportSpec(name="t", sql="SELECT a, b FROM t", columns=["A", "B"], **kwargs)
+
+
+class TestStreamRows:
+
+    def test_chunks_with_stream_results(self):
+        conn = FakeConnection([(i, f"r{i}") for i in range(5)])
+        chunks = list(stream_rows(spec(row=lambda r: [r[0] * 10, r[1]]), chunk_rows=2, connect=lambda: conn))
+        assert [len(c) for c in chunks] == [2, 2, 1]
+        assert chunks[0][1] == [10, "r1"]
+        assert conn.options == {"stream_results": True, "max_row_buffer": 2}
+        assert "net_write_timeout" in conn.statements[0]
+        assert conn.closed and not conn.invalidated
+
+    def test_abort_invalidates_connection(self):
+        conn = FakeConnection([(i, i) for i in range(10)])
+        gen = stream_rows(spec(), chunk_rows=3, connect=lambda: conn)
+        next(gen)
+        gen.close()  # клієнт обірвав завантаження
+        assert conn.invalidated and conn.closed
+        assert conn.result.fetches == [3]
+
+
+class TestWriters:
+
+    def test_csv_blocks(self):
+        blocks = list(csv_chunks(spec(), iter([[[1, "a"]], [[2, "б,в"]]])))
+        assert blocks[0] == "\ufeffA,B\r\n".encode("utf-8")
+        assert blocks[1:] == [b"1,a\r\n", '2,"б,в"\r\n'.encode("utf-8")]
+
+    def test_write_csv_counts_rows(self):
+        out = io.BytesIO()
+        assert write_csv(spec(), iter([[[1, "a"], [2, "b"]], [[3, "c"]]]), out) == 3
+        assert out.getvalue().decode("utf-8-sig").splitlines() == ["A,B", "1,a", "2,b", "3,c"]
+
+    def test_xlsx_round_trip(self):
+        openpyxl = pytest.importorskip("openpyxl")
+        out = io.BytesIO()
+        count = write_xlsx(spec(sheet_title="Дані"), iter([[[1, "ok"]], [[2, "bad\x01char"]]]), out)
+        assert count == 2
+        out.seek(0)
+        ws = openpyxl.load_workbook(out)["Дані"]
+        assert [list(r) for r in ws.iter_rows(values_only=True)] == [["A", "B"], [1, "ok"], [2, "badchar"]]
+        assert ws["A1"].font.bold and ws.freeze_panes == "A2"
+
+
+class TestRegistry:
+
+    def test_builder_and_format(self):
+        @export_builder("test_registry")
+        def builder(db, month=None):
+            return spec(params={"month": month})
+
+        assert build_spec(None, "test_registry", month="2026-05").params == {"month": "2026-05"}
+        with pytest.raises(HTTPException) as e:
+            build_spec(None, "missing")
+        assert e.value.status_code == 404
+        assert check_format("XLSX") == "xlsx"
+        with pytest.raises(HTTPException):
+            check_format("pdf")
+
+    def test_content_disposition(self):
+        assert content_disposition("ledger_all.csv") == "attachment; filename=ledger_all.csv"
+        assert content_disposition("Звіт.xlsx").startswith("attachment; filename*=UTF-8''%D0%97")
+
+
+class TestHandlers:
+
+    def test_export_handlers_run_in_threadpool(self):
+        from routes import analytics, export
+
+        endpoints = [route.endpoint for route in export.router.routes]
+        endpoints += [route.endpoint for route in analytics.router.routes if route.path.startswith("/api/analytics/export")]
+        assert len(endpoints) > 8
+        assert not [e.__name__ for e in endpoints if inspect.iscoroutinefunction(e)]
+
+
+class TestJobs:
+
+    def test_interrupted_jobs_marked_failed(self):
+        from sqlalchemy import create_engine, text
+        from sqlalchemy.orm import sessionmaker
+
+        db = sessionmaker(bind=create_engine("sqlite://"))()
+        db.execute(text("""
+            CREATE TABLE export_jobs (id TEXT, status TEXT, error TEXT, created_at DATETIME, finished_at DATETIME)
+        """))
+        now = datetime.now()
+        for job_id, status, age in (("old-queued", "queued", 120), ("old-running", "running", 90),
+                                    ("fresh", "running", 5), ("done", "done", 120)):
+            db.execute(text("INSERT INTO export_jobs (id, status, created_at) VALUES (:id, :status, :created)"),
+                       {"id": job_id, "status": status, "created": now - timedelta(minutes=age)})
+        jobs = ExportJobs(directory="/tmp")
+        jobs._table_ready = True
+
+        assert jobs.fail_interrupted(db) == 2
+        statuses = dict(db.execute(text("SELECT id, status FROM export_jobs")).fetchall())
+        assert statuses == {"old-queued": "failed", "old-running": "failed", "fresh": "running", "done": "done"}
+        assert db.execute(text("SELECT error FROM export_jobs WHERE id = 'old-queued'")).scalar()
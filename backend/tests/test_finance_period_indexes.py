@@ -0,0 +1,101 @@
+"""
+Finance Period Ranges & Indexes Tests
+Tests for:
+1. period_range / month_range / day_range produce half-open datetime ranges
+2. Finance and analytics routes no longer wrap date columns in MONTH()/YEAR()/DATE() filters
+3. EXPLAIN: period queries can use the finance-period-indexes-v1 indexes
+   (needs the RentalHub DB with the migration applied: EXPLAIN_TESTS=1)
+"""
+import os
+import re
+import sys
+from datetime import date, datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.period_range import day_range, month_range, period_filter, period_range
+
+ROUTES_DIR = os.path.join(os.path.dirname(__file__), '..', 'routes')
+
+
+class TestPeriodRange:
+
+    def test_month_range(self):
+        assert month_range(2026, 5) == (datetime(2026, 5, 1), datetime(2026, 6, 1))
+        assert month_range(2026, 12) == (datetime(2026, 12, 1), datetime(2027, 1, 1))
+
+    def test_day_range_is_half_open(self):
+        assert day_range(date(2026, 5, 1), "2026-05-31") == (datetime(2026, 5, 1), datetime(2026, 6, 1))
+
+    def test_named_periods(self):
+        today = date(2026, 5, 31)
+        assert period_range("day", today) == (datetime(2026, 5, 31), None)
+        assert period_range("week", today) == (datetime(2026, 5, 24), None)
+        assert period_range("month", today) == (datetime(2026, 5, 1), datetime(2026, 6, 1))
+        assert period_range("quarter", today) == (datetime(2026, 2, 28), None)
+        assert period_range("year", today) == (datetime(2026, 1, 1), datetime(2027, 1, 1))
+        assert period_range("all", today) == (None, None)
+
+    def test_period_filter_sql(self):
+        sql, params = period_filter("e.occurred_at", "month", prefix="exp", today=date(2026, 1, 15))
+        assert sql == "AND e.occurred_at >= :exp_start AND e.occurred_at < :exp_end"
+        assert params == {"exp_start": datetime(2026, 1, 1), "exp_end": datetime(2026, 2, 1)}
+        assert period_filter("e.occurred_at", "all") == ("", {})
+
+
+class TestNoFunctionWrappedDateFilters:
+
+    @pytest.mark.parametrize("module", ["finance.py", "analytics.py"])
+    def test_no_month_year_or_date_filters(self, module):
+        with open(os.path.join(ROUTES_DIR, module), encoding="utf-8") as f:
+            source = f.read()
+        assert not re.search(r"(MONTH|YEAR)\(\w*\.?(occurred_at|created_at|paid_at|rental_start_date)\)\s*=", source)
+        assert not re.search(r"DATE\(\w*\.?created_at\)\s+BETWEEN", source)
+
+
+EXPLAIN_QUERIES = [
+    ("idx_payments_status_occurred", """
+        SELECT COALESCE(SUM(amount), 0) FROM fin_payments
+        WHERE status IN ('completed', 'confirmed')
+        AND payment_type IN ('rent', 'additional', 'damage', 'late')
+        AND occurred_at >= :period_start AND occurred_at < :period_end
+    """),
+    ("idx_payments_status_created", """
+        SELECT payment_type, method, COUNT(*), SUM(amount) FROM fin_payments
+        WHERE status = 'completed' AND created_at >= :period_start AND created_at < :period_end
+        GROUP BY payment_type, method
+    """),
+    ("idx_expenses_status_occurred", """
+        SELECT COALESCE(SUM(amount), 0) FROM fin_expenses
+        WHERE status = 'posted' AND occurred_at >= :period_start AND occurred_at < :period_end
+    """),
+    ("idx_orders_created_status", """
+        SELECT status, COUNT(*) FROM orders
+        WHERE created_at >= :period_start AND created_at < :period_end GROUP BY status
+    """),
+    ("idx_pdh_created_fee", """
+        SELECT COALESCE(SUM(fee), 0) FROM product_damage_history
+        WHERE created_at >= :period_start AND created_at < :period_end
+    """),
+]
+
+
+@pytest.mark.skipif(os.environ.get("EXPLAIN_TESTS") != "1", reason="EXPLAIN_TESTS=1 and RentalHub DB required")
+class TestExplainUsesIndexes:
+
+    @pytest.mark.parametrize("index_name,sql", EXPLAIN_QUERIES)
+    def test_index_is_usable(self, index_name, sql):
+        from sqlalchemy import text
+        from database_rentalhub import get_rh_db_sync
+
+        start, end = month_range(date.today().year, date.today().month)
+        db = get_rh_db_sync()
+        try:
+            rows = db.execute(text("EXPLAIN " + sql), {"period_start": start, "period_end": end}).mappings().fetchall()
+        finally:
+            db.close()
+        possible = ",".join(str(r.get("possible_keys") or "") for r in rows)
+        assert index_name in possible, f"{index_name} not usable: {rows}"
+        assert all(r.get("type") != "ALL" or r.get("key") for r in rows), f"full scan: {rows}"
@@ -0,0 +1,225 @@
+"""
+Finance Daily Rollups Tests
+Tests for:
+1. fin_daily_rollups build history up to yesterday, today is read live from raw tables
+2. Range totals (month / kasa periods) match raw SUM(...) filters
+3. mark_dirty / mark_payment_dirty refresh past days on commit
+4. check_consistency detects and repairs drift
+5. Readers never build or commit: before the first build everything is read live,
+   the build is started in the background and skipped when another worker holds the lock
+(SQLite in-memory stands in for the RentalHub MySQL tables)
+"""
+import os
+import sys
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services import finance_rollup
+from services.finance_rollup import (
+    EXPENSE_SOURCE, PAYMENT_SOURCE, check_consistency, ensure_built, mark_dirty,
+    mark_payment_dirty, rollup_totals, sum_totals, totals_by,
+)
+
+TODAY = date.today()
+YESTERDAY = TODAY - timedelta(days=1)
+LAST_WEEK = TODAY - timedelta(days=6)
+
+
+def at(day, hour=12):
+    return datetime(day.year, day.month, day.day, hour)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(finance_rollup, "_tables_ready", False)
+    monkeypatch.setattr(finance_rollup, "_built_through", None)
+    monkeypatch.setattr(finance_rollup, "_build_thread", None)
+    spawned = []
+    monkeypatch.setattr(finance_rollup, "_spawn", lambda target, name: spawned.append(name))
+    engine = create_engine("sqlite://")
+    session = sessionmaker(bind=engine)()
+    session.execute(text("""
+        CREATE TABLE fin_payments (id INTEGER PRIMARY KEY, payment_type TEXT, method TEXT,
+            amount NUMERIC, currency TEXT, status TEXT, occurred_at DATETIME)
+    """))
+    session.execute(text("""
+        CREATE TABLE fin_expenses (id INTEGER PRIMARY KEY, expense_type TEXT, category_id INTEGER,
+            amount NUMERIC, currency TEXT, method TEXT, status TEXT, occurred_at DATETIME)
+    """))
+    session.execute(text("CREATE TABLE fin_categories (id INTEGER PRIMARY KEY, code TEXT)"))
+    session.execute(text("INSERT INTO fin_categories (id, code) VALUES (1, 'RENT_CASH_EXPENSE'), (2, 'COLLECTION')"))
+    payments = [
+        ("rent", "cash", 100, "completed", at(LAST_WEEK)),
+        ("rent", "bank", 250, "confirmed", at(YESTERDAY)),
+        ("rent", "cash", 40, "pending", at(YESTERDAY)),
+        ("damage", None, 70, "completed", at(YESTERDAY, 23)),
+        ("rent", "cash", 30, "completed", at(TODAY, 9)),
+        ("deposit", "cash", 500, "completed", None),
+    ]
+    for ptype, method, amount, status, occurred in payments:
+        session.execute(text("""
+            INSERT INTO fin_payments (payment_type, method, amount, currency, status, occurred_at)
+            VALUES (:t, :m, :a, 'UAH', :s, :o)
+        """), {"t": ptype, "m": method, "a": amount, "s": status, "o": occurred})
+    expenses = [
+        ("expense", 1, 20, "cash", at(LAST_WEEK)),
+        ("collection", 2, 60, "cash", at(YESTERDAY)),
+        ("expense", 1, 5, "cash", at(TODAY, 10)),
+    ]
+    for etype, cat, amount, method, occurred in expenses:
+        session.execute(text("""
+            INSERT INTO fin_expenses (expense_type, category_id, amount, currency, method, status, occurred_at)
+            VALUES (:t, :c, :a, 'UAH', :m, 'posted', :o)
+        """), {"t": etype, "c": cat, "a": amount, "m": method, "o": occurred})
+    session.commit()
+    session.info["spawned"] = spawned
+    yield session
+    session.close()
+
+
+def raw_sum(db, sql, **params):
+    return float(db.execute(text(sql), params).scalar() or 0)
+
+
+class TestRollupBuild:
+
+    def test_builds_through_yesterday_and_reads_today_live(self, db):
+        assert ensure_built(db) == YESTERDAY
+        stored_days = {str(r[0])[:10] for r in db.execute(text("SELECT DISTINCT day FROM fin_daily_rollups"))}
+        assert TODAY.isoformat() not in stored_days
+        assert "1970-01-01" in stored_days  # occurred_at IS NULL
+
+        payments = rollup_totals(db, PAYMENT_SOURCE)
+        assert sum_totals(payments, kinds=["rent"], methods=["cash"], statuses=["completed", "confirmed"]) == 130
+        assert sum_totals(payments, kinds=["rent"], methods=["card", "bank"], statuses=["completed", "confirmed"]) == 250
+        assert sum_totals(payments) == raw_sum(db, "SELECT SUM(amount) FROM fin_payments")
+        assert sum_totals(payments, kinds=["rent"], field=1) == 4
+
+    def test_expense_categories_and_kinds(self, db):
+        expenses = rollup_totals(db, EXPENSE_SOURCE)
+        assert sum_totals(expenses, categories=["RENT_CASH_EXPENSE"], methods=["cash"]) == 25
+        assert totals_by(expenses, "method", kinds=["collection"], statuses=["posted"]) == {"cash": 60}
+
+    def test_range_totals_match_raw(self, db):
+        start = datetime(YESTERDAY.year, YESTERDAY.month, YESTERDAY.day)
+        payments = rollup_totals(db, PAYMENT_SOURCE, start=start)
+        expected = raw_sum(db, "SELECT SUM(amount) FROM fin_payments WHERE occurred_at >= :s", s=start)
+        assert sum_totals(payments) == expected
+
+        end = start + timedelta(days=1)
+        only_yesterday = rollup_totals(db, PAYMENT_SOURCE, start=start, end=end)
+        assert totals_by(only_yesterday, "method") == {"bank": 250, "cash": 40, "": 70}
+
+    def test_bounds_must_be_midnight(self, db):
+        with pytest.raises(ValueError):
+            rollup_totals(db, PAYMENT_SOURCE, start=datetime.now().replace(hour=10, minute=5))
+
+
+class TestRollupReaders:
+
+    def test_read_before_build_is_live_and_starts_background_build(self, db):
+        payments = rollup_totals(db, PAYMENT_SOURCE)
+        assert sum_totals(payments) == raw_sum(db, "SELECT SUM(amount) FROM fin_payments")
+        assert db.execute(text("SELECT COUNT(*) FROM fin_daily_rollups")).scalar() == 0
+        assert db.info["spawned"] == ["finance-rollups"]
+        assert check_consistency(db)["consistent"]
+
+    def test_stale_rollups_read_tail_live(self, db):
+        ensure_built(db, today=LAST_WEEK)
+        finance_rollup._built_through = None
+        payments = rollup_totals(db, PAYMENT_SOURCE)
+        assert sum_totals(payments) == raw_sum(db, "SELECT SUM(amount) FROM fin_payments")
+        assert db.info["spawned"] == ["finance-rollups"]
+
+    def test_build_skipped_while_other_worker_holds_lock(self, db, monkeypatch):
+        @contextmanager
+        def busy(session, name, timeout=0):
+            yield False
+
+        monkeypatch.setattr(finance_rollup, "named_lock", busy)
+        assert ensure_built(db) is None
+        assert db.execute(text("SELECT COUNT(*) FROM fin_daily_rollups")).scalar() == 0
+
+
+class TestRollupMaintenance:
+
+    def test_mark_dirty_refreshes_past_day_on_commit(self, db):
+        ensure_built(db)
+        db.execute(text("""
+            INSERT INTO fin_payments (payment_type, method, amount, currency, status, occurred_at)
+            VALUES ('rent', 'cash', 15, 'UAH', 'completed', :o)
+        """), {"o": at(LAST_WEEK, 15)})
+        mark_dirty(db, at(LAST_WEEK, 15))
+        db.commit()
+        payments = rollup_totals(db, PAYMENT_SOURCE)
+        assert sum_totals(payments, kinds=["rent"], methods=["cash"], statuses=["completed"]) == 145
+
+    def test_mark_payment_dirty_before_update(self, db):
+        ensure_built(db)
+        pending_id = db.execute(text("SELECT id FROM fin_payments WHERE status = 'pending'")).scalar()
+        mark_payment_dirty(db, pending_id)
+        db.execute(text("UPDATE fin_payments SET status = 'confirmed' WHERE id = :id"), {"id": pending_id})
+        db.commit()
+        payments = rollup_totals(db, PAYMENT_SOURCE)
+        assert sum_totals(payments, statuses=["pending"]) == 0
+        assert sum_totals(payments, kinds=["rent"], statuses=["confirmed"]) == 290
+
+    def test_consistency_check_detects_and_repairs_drift(self, db):
+        ensure_built(db)
+        assert check_consistency(db)["consistent"]
+
+        # запис у минулий день без mark_dirty
+        db.execute(text("""
+            INSERT INTO fin_expenses (expense_type, category_id, amount, currency, method, status, occurred_at)
+            VALUES ('expense', 1, 7, 'UAH', 'cash', 'posted', :o)
+        """), {"o": at(YESTERDAY)})
+        db.commit()
+
+        report = check_consistency(db, repair=True)
+        assert not report["consistent"]
+        assert report["mismatched_days"] == 1
+        assert report["mismatches"][0]["raw_total"] - report["mismatches"][0]["rollup_total"] == 7
+        assert report["repaired_days"] == 1
+        assert check_consistency(db)["consistent"]
+
+    def test_failed_refresh_keeps_day_and_author_write(self, db, monkeypatch):
+        ensure_built(db)
+        real_rebuild = finance_rollup.rebuild_range
+
+        def broken_rebuild(session, start, end, today=None):
+            session.execute(text("DELETE FROM fin_daily_rollups WHERE day = :day"), {"day": start})
+            raise RuntimeError("lock wait timeout")
+
+        monkeypatch.setattr(finance_rollup, "rebuild_range", broken_rebuild)
+        db.execute(text("""
+            INSERT INTO fin_payments (payment_type, method, amount, currency, status, occurred_at)
+            VALUES ('rent', 'cash', 15, 'UAH', 'completed', :o)
+        """), {"o": at(LAST_WEEK, 15)})
+        mark_dirty(db, at(LAST_WEEK, 15))
+        db.commit()
+        monkeypatch.setattr(finance_rollup, "rebuild_range", real_rebuild)
+
+        assert raw_sum(db, "SELECT SUM(amount) FROM fin_payments WHERE amount = 15") == 15
+        payments = rollup_totals(db, PAYMENT_SOURCE, start=at(LAST_WEEK, 0), end=at(LAST_WEEK + timedelta(days=1), 0))
+        assert sum_totals(payments) == 100  # попередній стан дня, а не порожній день
+
+    def test_rename_shared_category_code_rebuilds_days(self, db):
+        ensure_built(db)
+        db.execute(text("INSERT INTO fin_categories (id, code) VALUES (3, 'RENT_CASH_EXPENSE')"))
+        db.execute(text("INSERT INTO fin_expenses (expense_type, category_id, amount, currency, method, status, occurred_at) "
+                        "VALUES ('expense', 3, 9, 'UAH', 'cash', 'posted', :o)"), {"o": at(LAST_WEEK)})
+        mark_dirty(db, at(LAST_WEEK))
+        db.commit()
+        db.execute(text("UPDATE fin_categories SET code = 'SUPPLIES' WHERE id = 3"))
+        finance_rollup.rename_category(db, 3, "RENT_CASH_EXPENSE", "SUPPLIES")
+        db.commit()
+        expenses = rollup_totals(db, EXPENSE_SOURCE)
+        assert totals_by(expenses, "category")["SUPPLIES"] == 9
+        assert totals_by(expenses, "category")["RENT_CASH_EXPENSE"] == 25
+        assert check_consistency(db)["consistent"]
@@ -0,0 +1,216 @@
+"""
+Image Derivatives Tests
+Tests for:
+1. Width ladder never upscales, WebP variants keyed by content hash
+2. Legacy thumbnails/ and medium/ JPEGs are still produced (in the worker)
+3. srcset map and smallest suitable variant selection
+4. Service queue: deduplicates in-flight hashes, bounded, reports results
+5. Duplicate upload reports the stored asset status; failed asset goes back to pending
+6. Backfill records image_url values without a file so they are not re-selected every batch
+"""
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import services.image_derivatives as image_derivatives
+from services.image_derivatives import (
+    ImageDerivativeService, backfill_assets, build_derivatives, content_hash, image_map, ladder_widths,
+    pick_variant, store_original,
+)
+
+WIDTHS = (160, 320, 640, 1024, 1600)
+
+
+def make_image(path, size=(1200, 800), mode="RGB"):
+    Image.new(mode, size, (200, 120, 40) if mode == "RGB" else (200, 120, 40, 128)).save(path)
+    with open(path, "rb") as f:
+        return content_hash(f.read())
+
+
+class TestBuildDerivatives:
+
+    def test_ladder_widths(self):
+        assert ladder_widths(1200, WIDTHS) == [160, 320, 640, 1024, 1200]
+        assert ladder_widths(4000, WIDTHS) == [160, 320, 640, 1024, 1600]
+        assert ladder_widths(100, WIDTHS) == [100]
+
+    def test_webp_ladder_and_legacy_thumbnails(self, tmp_path):
+        source = tmp_path / "SKU1_1.jpg"
+        digest = make_image(source)
+        out_dir = tmp_path / "variants"
+        result = build_derivatives(str(source), digest, str(out_dir), WIDTHS, ("webp",), legacy_dir=str(tmp_path))
+
+        assert (result["width"], result["height"]) == (1200, 800)
+        assert [v["width"] for v in result["variants"]] == [160, 320, 640, 1024, 1200]
+        for v in result["variants"]:
+            assert v["path"].startswith(f"{digest[:2]}/{digest}/")
+            with Image.open(out_dir / v["path"]) as img:
+                assert img.format == "WEBP"
+                assert img.size == (v["width"], v["height"])
+        with Image.open(tmp_path / "thumbnails" / "SKU1_1_thumb.jpg") as thumb:
+            assert max(thumb.size) == 300
+        assert (tmp_path / "medium" / "SKU1_1_medium.jpg").exists()
+
+    def test_transparent_png(self, tmp_path):
+        source = tmp_path / "logo.png"
+        digest = make_image(source, size=(300, 300), mode="RGBA")
+        result = build_derivatives(str(source), digest, str(tmp_path / "v"), WIDTHS, ("webp",), legacy_dir=str(tmp_path))
+        assert [v["width"] for v in result["variants"]] == [160, 300]
+        assert (tmp_path / "thumbnails" / "logo_thumb.png").exists()
+
+
+class TestVariantMap:
+
+    def test_srcset_and_pick(self):
+        variants = [
+            {"format": "webp", "width": w, "height": w, "path": f"ab/abc/{w}.webp"} for w in (640, 160, 320)
+        ]
+        mapping = image_map("uploads/products/a.jpg", 640, 640, variants)
+        assert mapping["srcset"]["webp"] == (
+            "uploads/products/variants/ab/abc/160.webp 160w, "
+            "uploads/products/variants/ab/abc/320.webp 320w, "
+            "uploads/products/variants/ab/abc/640.webp 640w"
+        )
+        assert pick_variant(mapping, 200) == "uploads/products/variants/ab/abc/320.webp"
+        assert pick_variant(mapping, 2000) == "uploads/products/variants/ab/abc/640.webp"
+        assert pick_variant(mapping, 200, formats=("avif",)) == "uploads/products/a.jpg"
+        assert pick_variant(None, 200) is None
+
+
+class TestService:
+
+    def test_dedup_and_results(self):
+        release = threading.Event()
+        done = []
+
+        def build(source_file, digest, out_dir, legacy_dir=None):
+            release.wait(5)
+            if digest == "bad":
+                raise ValueError("broken image")
+            return {"width": 10, "height": 10, "variants": []}
+
+        service = ImageDerivativeService(
+            workers=1, max_queue=1,
+            executor_factory=lambda: ThreadPoolExecutor(max_workers=1),
+            build_func=build,
+            on_done=lambda digest, result, error: done.append((digest, result is not None, error)),
+        )
+        assert service.submit("a", "/tmp/a.jpg")
+        assert service.submit("a", "/tmp/a.jpg")  # вже в черзі
+        assert service.submit("bad", "/tmp/b.jpg")
+        assert not service.submit("c", "/tmp/c.jpg")  # черга повна
+        assert service.stats()["inflight"] == 2
+
+        release.set()
+        service.executor.shutdown(wait=True)
+        assert sorted(done) == [("a", True, None), ("bad", False, "broken image")]
+        assert service.stats()["inflight"] == 0
+        assert (service.completed, service.failed) == (1, 1)
+
+
+class FakeResult:
+    def __init__(self, row=None, rows=None):
+        self.row = row
+        self.rows = rows or []
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return self.rows
+
+
+class AssetDB:
+    """image_assets з одним рядком: content_hash -> (source_path, status)"""
+
+    def __init__(self, assets):
+        self.assets = dict(assets)
+        self.statements = []
+
+    def execute(self, stmt, params=None):
+        sql = " ".join(str(stmt).split())
+        self.statements.append(sql)
+        if sql.startswith("SELECT source_path, status FROM image_assets"):
+            return FakeResult(self.assets.get(params["hash"]))
+        if sql.startswith("UPDATE image_assets SET status = 'pending'"):
+            path, _ = self.assets[params["hash"]]
+            self.assets[params["hash"]] = (path, "pending")
+        return FakeResult()
+
+
+class TestStoreOriginal:
+
+    @pytest.fixture(autouse=True)
+    def tables_ready(self, monkeypatch):
+        monkeypatch.setattr(image_derivatives, "_tables_ready", True)
+
+    @pytest.mark.parametrize("stored, expected", [("ready", "ready"), ("pending", "pending"), ("failed", "pending")])
+    def test_duplicate_reports_stored_status(self, tmp_path, stored, expected):
+        data = b"same image bytes"
+        (tmp_path / "SKU1_1_abc.jpg").write_bytes(data)
+        db = AssetDB({content_hash(data): ("uploads/products/SKU1_1_abc.jpg", stored)})
+
+        path, _, duplicate, status = store_original(db, data, "SKU2", ".jpg", str(tmp_path))
+        assert (path, duplicate, status) == ("uploads/products/SKU1_1_abc.jpg", True, expected)
+        resets = [s for s in db.statements if s.startswith("UPDATE image_assets")]
+        assert len(resets) == (1 if stored == "failed" else 0)
+        if resets:
+            assert "attempts = 0" in resets[0]
+
+    def test_new_content_is_pending(self, tmp_path):
+        db = AssetDB({})
+        path, digest, duplicate, status = store_original(db, b"new bytes", "SKU 1", ".png", str(tmp_path))
+        assert (duplicate, status) == (False, "pending")
+        assert path == f"uploads/products/{os.path.basename(path)}" and path.endswith(f"_{digest[:8]}.png")
+        assert (tmp_path / os.path.basename(path)).read_bytes() == b"new bytes"
+
+
+class BackfillDB:
+    """products.image_url без image_asset_sources; image_asset_missing - множина шляхів"""
+
+    def __init__(self, image_urls):
+        self.image_urls = list(image_urls)
+        self.sources = {}
+        self.missing = set()
+        self.commits = 0
+
+    def execute(self, stmt, params=None):
+        sql = " ".join(str(stmt).split())
+        if sql.startswith("SELECT DISTINCT p.image_url"):
+            assert "image_asset_missing" in sql
+            rows = [(u,) for u in self.image_urls if u not in self.sources and u not in self.missing]
+            return FakeResult(rows=rows[:params["limit"]])
+        if sql.startswith("INSERT INTO image_asset_missing"):
+            self.missing.add(params["path"])
+        elif sql.startswith("INSERT INTO image_asset_sources"):
+            self.sources[params["path"]] = params["hash"]
+        elif sql.startswith("DELETE FROM image_asset_missing"):
+            self.missing.discard(params["path"])
+        return FakeResult()
+
+    def commit(self):
+        self.commits += 1
+
+
+class TestBackfill:
+
+    @pytest.fixture(autouse=True)
+    def tables_ready(self, monkeypatch):
+        monkeypatch.setattr(image_derivatives, "_tables_ready", True)
+
+    def test_missing_files_do_not_block_later_batches(self, tmp_path):
+        (tmp_path / "present.jpg").write_bytes(b"present")
+        urls = [f"uploads/products/gone_{i}.jpg" for i in range(3)] + ["uploads/products/present.jpg"]
+        db = BackfillDB(urls)
+
+        assert backfill_assets(db, str(tmp_path), limit=3) == 0
+        assert len(db.missing) == 3
+        assert backfill_assets(db, str(tmp_path), limit=3) == 1
+        assert list(db.sources) == ["uploads/products/present.jpg"]
+        assert backfill_assets(db, str(tmp_path), limit=3) == 0
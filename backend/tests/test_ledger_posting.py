@@ -0,0 +1,153 @@
+"""
+Ledger Posting Tests
+Tests for:
+1. post_transactions takes tx ids from each INSERT (no consecutive id assumption),
+   ledger entries go in one multi-row INSERT
+2. fin_accounts code -> id map is cached between calls
+3. Validation before writing (amounts rounded to cents for both legs) and D/C check before commit
+"""
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.ledger_posting import (
+    AccountCache, LedgerImbalance, LedgerPosting, post_transactions, validate_postings,
+)
+
+ACCOUNTS = [("CASH", 1), ("BANK", 2), ("RENT_REV", 3), ("DEP_LIAB", 4)]
+
+
+class FakeResult:
+    def __init__(self, rows=None, scalar=None, lastrowid=None):
+        self._rows = rows or []
+        self._scalar = scalar
+        self.lastrowid = lastrowid
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def scalar(self):
+        return self._scalar
+
+
+class FakeDB:
+    """Імітує fin_accounts / fin_transactions / fin_ledger_entries на рівні SQL"""
+
+    def __init__(self, drop_entries=0, misattribute=False):
+        self.statements = []
+        self.next_id = 100
+        self.transactions = {}
+        self.entries = []
+        self.drop_entries = drop_entries
+        self.misattribute = misattribute
+
+    def execute(self, stmt, params=None):
+        sql = " ".join(str(stmt).split())
+        params = params or {}
+        self.statements.append(sql)
+        if sql.startswith("SELECT code, id FROM fin_accounts"):
+            return FakeResult(ACCOUNTS)
+        if sql.startswith("INSERT INTO fin_transactions"):
+            # auto_increment_increment = 2: id не послідовні
+            tx_id = self.next_id
+            self.next_id += 2
+            self.transactions[tx_id] = params["amount"]
+            return FakeResult(lastrowid=tx_id)
+        if sql.startswith("INSERT INTO fin_ledger_entries"):
+            i = 0
+            while f"tx_id_{i}" in params:
+                tx_id = params[f"tx_id_{i}"] + (2 if self.misattribute and i < 2 else 0)
+                self.entries.append((tx_id, params[f"direction_{i}"], params[f"amount_{i}"]))
+                i += 1
+            if self.drop_entries:
+                self.entries = self.entries[:-self.drop_entries]
+            return FakeResult()
+        if "FROM fin_transactions t" in sql:
+            rows = []
+            for tx_id in params["tx_ids"]:
+                entries = [e for e in self.entries if e[0] == tx_id]
+                debit = sum(Decimal(str(a)) for _, d, a in entries if d == "D")
+                credit = sum(Decimal(str(a)) for _, d, a in entries if d == "C")
+                rows.append((tx_id, self.transactions[tx_id], len(entries), debit, credit))
+            return FakeResult(rows)
+        raise AssertionError(f"unexpected SQL: {sql}")
+
+    def count(self, prefix):
+        return sum(1 for s in self.statements if s.startswith(prefix))
+
+
+def postings(n):
+    return [LedgerPosting("rent_payment", 100 + i, "CASH", "RENT_REV", order_id=i) for i in range(n)]
+
+
+class TestPostTransactions:
+
+    def test_ids_from_each_insert_and_multi_row_entries(self):
+        db = FakeDB()
+        tx_ids = post_transactions(db, postings(50), cache=AccountCache())
+        assert tx_ids == list(range(100, 200, 2))
+        assert db.count("INSERT INTO fin_transactions") == 50
+        assert db.count("INSERT INTO fin_ledger_entries") == 1
+        assert db.count("SELECT LAST_INSERT_ID()") == 0
+        assert len(db.entries) == 100
+        assert {tx_id for tx_id, _, _ in db.entries} == set(tx_ids)
+
+    def test_account_map_is_cached(self):
+        db = FakeDB()
+        cache = AccountCache()
+        post_transactions(db, postings(2), cache=cache)
+        post_transactions(db, [LedgerPosting("deposit_refund", 10, "DEP_LIAB", "BANK")], cache=cache)
+        assert db.count("SELECT code, id FROM fin_accounts") == 1
+
+    def test_cursor_lookup_shares_cache(self):
+        class Cursor:
+            executed = 0
+
+            def execute(self, sql, params=None):
+                self.executed += 1
+
+            def fetchall(self):
+                return [{"code": "CASH", "id": 1}, {"code": "RENT_REV", "id": 7}]
+
+        cursor, cache = Cursor(), AccountCache()
+        assert cache.resolve_cursor(cursor, ("CASH", "RENT_REV")) == {"CASH": 1, "RENT_REV": 7}
+        cache.resolve_cursor(cursor, ("RENT_REV",))
+        assert cursor.executed == 1
+        with pytest.raises(ValueError, match="Account not found: BANK"):
+            cache.resolve_cursor(cursor, ("BANK",))
+
+    def test_unknown_account_is_rejected_before_writing(self):
+        db = FakeDB()
+        with pytest.raises(ValueError, match="Account not found: NOPE"):
+            post_transactions(db, [LedgerPosting("x", 10, "CASH", "NOPE")], cache=AccountCache())
+        assert db.count("INSERT") == 0
+
+    def test_validation(self):
+        with pytest.raises(ValueError):
+            validate_postings([LedgerPosting("x", -5, "CASH", "BANK")])
+        with pytest.raises(ValueError):
+            validate_postings([LedgerPosting("x", 5, "CASH", "CASH")])
+        assert validate_postings(postings(3)) == [Decimal("100.00"), Decimal("101.00"), Decimal("102.00")]
+
+    def test_both_legs_and_transaction_use_rounded_amount(self):
+        db = FakeDB()
+        tx_ids = post_transactions(db, [LedgerPosting("x", 10.005, "CASH", "BANK")], cache=AccountCache())
+        assert db.transactions[tx_ids[0]] == Decimal("10.01")
+        assert [amount for _, _, amount in db.entries] == [Decimal("10.01"), Decimal("10.01")]
+
+    def test_missing_entries_fail_before_commit(self):
+        db = FakeDB(drop_entries=1)
+        with pytest.raises(LedgerImbalance):
+            post_transactions(db, postings(3), cache=AccountCache())
+
+    def test_entries_on_wrong_transaction_fail_before_commit(self):
+        db = FakeDB(misattribute=True)
+        with pytest.raises(LedgerImbalance, match="tx 100: 0 entries"):
+            post_transactions(db, postings(3), cache=AccountCache())
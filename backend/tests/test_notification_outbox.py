@@ -0,0 +1,265 @@
+"""
+Notification Outbox Tests
+Tests for:
+1. Retry schedule: exponential backoff, retry_after, permanent errors, max attempts
+2. Per-provider token bucket rate limiting
+3. Delivery through DummyEmailProvider (local stand-in for SMTP / Resend / SendGrid)
+4. SMTP session reuse and reconnect, Telegram error classification
+5. Enqueue payload and result hooks
+6. Order confirmation endpoint queues email and Telegram messages instead of sending inline
+"""
+import asyncio
+import json
+import os
+import smtplib
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import services.notification_outbox as outbox
+from services.email_provider import DummyEmailProvider
+from services.notification_outbox import (
+    DeliveryError, DeliveryOutcome, NotificationDispatcher, OutboxMessage, PermanentDeliveryError,
+    ProviderTransport, RateLimiter, SmtpTransport, TelegramTransport, backoff_delay, enqueue_email,
+    parse_rate_limits, resolve_failure, result_hook,
+)
+
+
+def email(message_id=1, provider="dummy", **payload):
+    return OutboxMessage(
+        id=message_id, channel="email", provider=provider, recipient="client@example.com",
+        subject="Кошторис", payload={"html": "<p>x</p>", **payload},
+    )
+
+
+class TestRetryPolicy:
+
+    def test_backoff(self):
+        assert [backoff_delay(n) for n in (1, 2, 3)] == [30, 60, 120]
+        assert backoff_delay(20) == outbox.OUTBOX_MAX_BACKOFF_SECONDS
+
+    def test_resolve_failure(self):
+        assert resolve_failure(1, DeliveryError("timeout")) == ("pending", 30)
+        assert resolve_failure(1, DeliveryError("429", retry_after=90)) == ("pending", 90)
+        assert resolve_failure(1, PermanentDeliveryError("bad address")) == ("failed", None)
+        assert resolve_failure(outbox.OUTBOX_MAX_ATTEMPTS, DeliveryError("timeout")) == ("failed", None)
+
+
+class TestRateLimiter:
+
+    def test_token_bucket(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        limiter = RateLimiter(2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            limiter.acquire()
+        assert sleeps == [0.5, 0.5]
+        assert parse_rate_limits("smtp=5, Telegram=25,bad") == {"smtp": 5.0, "telegram": 25.0}
+
+
+class TestDelivery:
+
+    def test_dummy_provider(self):
+        dispatcher = NotificationDispatcher(
+            transport_factory=lambda name: ProviderTransport(DummyEmailProvider()), rate_limits={},
+        )
+        outcome = dispatcher.deliver(email())
+        assert outcome.success and outcome.provider == "dummy"
+        assert outcome.provider_message_id.startswith("dummy_")
+
+    def test_transport_exceptions_become_retryable(self):
+        class Broken:
+            def send(self, message):
+                raise ConnectionResetError("reset")
+
+        dispatcher = NotificationDispatcher(transport_factory=lambda name: Broken(), rate_limits={})
+        with pytest.raises(DeliveryError) as error:
+            dispatcher.deliver(email())
+        assert not error.value.permanent and "reset" in str(error.value)
+
+
+class FakeSmtp:
+    def __init__(self, log):
+        self.log = log
+        self.alive = True
+        log.append("connect")
+
+    def noop(self):
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected()
+        return (250, b"OK")
+
+    def sendmail(self, sender, recipients, body):
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected()
+        self.log.append(("send", tuple(recipients)))
+
+    def quit(self):
+        self.log.append("quit")
+
+
+class TestSmtpTransport:
+
+    def test_session_reused_and_reconnected(self):
+        log, servers = [], []
+
+        def connect():
+            servers.append(FakeSmtp(log))
+            return servers[-1]
+
+        transport = SmtpTransport(connect=connect, idle_seconds=60, clock=lambda: 0)
+        transport.send(email(1, "smtp"))
+        transport.send(email(2, "smtp", cc="boss@example.com"))
+        assert log.count("connect") == 1
+
+        servers[0].alive = False
+        transport.send(email(3, "smtp"))
+        assert log.count("connect") == 2
+        assert log[-1] == ("send", ("client@example.com",))
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self._body
+
+
+class FakeHttp:
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def post(self, url, json=None, timeout=None):
+        self.calls.append(json)
+        return self.response
+
+
+class TestTelegramTransport:
+
+    def telegram(self, response):
+        message = OutboxMessage(id=1, channel="telegram", provider="telegram", recipient="42",
+                                subject=None, payload={"text": "hi", "parse_mode": "HTML"})
+        return TelegramTransport(token="t", session=FakeHttp(response)).send(message)
+
+    def test_success(self):
+        assert self.telegram(FakeResponse(200, {"ok": True, "result": {"message_id": 7}})) == "7"
+
+    def test_rate_limited_and_rejected(self):
+        with pytest.raises(DeliveryError) as limited:
+            self.telegram(FakeResponse(429, {"parameters": {"retry_after": 12}}))
+        assert not limited.value.permanent and limited.value.retry_after == 12
+        with pytest.raises(PermanentDeliveryError):
+            self.telegram(FakeResponse(400, {"description": "chat not found"}))
+
+
+class FakeResult:
+    lastrowid = 17
+
+
+class FakeDB:
+    def __init__(self):
+        self.info = {}
+        self.params = []
+
+    def execute(self, stmt, params=None):
+        self.params.append(params)
+        return FakeResult()
+
+    def commit(self):
+        pass
+
+
+class TestEnqueueAndHooks:
+
+    def test_enqueue_email(self):
+        outbox._table_ready = True
+        db = FakeDB()
+        outbox_id = enqueue_email(db, "client@example.com", "Рахунок", "<p>x</p>",
+                                  attachments=[{"filename": "a.pdf", "content": b"%PDF"}],
+                                  result_hook="document_emails", hook_data={"document_id": "D-1"})
+        assert outbox_id == 17 and db.info[outbox._WAKE_KEY]
+        params = db.params[-1]
+        payload = json.loads(params["payload"])
+        assert payload["attachments"] == [
+            {"filename": "a.pdf", "content": "JVBERg==", "content_type": "application/octet-stream"}
+        ]
+        assert json.loads(params["hook_data"]) == {"document_id": "D-1"}
+
+    def test_final_failure_runs_hook(self):
+        outcomes = []
+
+        @result_hook("test_hook")
+        def remember(db, message, outcome):
+            outcomes.append((message.id, outcome.success, outcome.error))
+
+        dispatcher = NotificationDispatcher(rate_limits={})
+        message = email(5)
+        message.result_hook = "test_hook"
+        dispatcher.fail(FakeDB(), message, DeliveryError("timeout"))
+        assert outcomes == []  # ще буде повтор
+        dispatcher.fail(FakeDB(), message, PermanentDeliveryError("rejected"))
+        dispatcher.complete(FakeDB(), email(6), DeliveryOutcome(success=True, provider="dummy"))
+        assert outcomes == [(5, False, "rejected")]
+
+
+class OrderDB(FakeDB):
+    """orders -> один рядок, INSERT у notification_outbox -> FakeResult"""
+
+    def __init__(self, email="client@example.com"):
+        super().__init__()
+        self.email = email
+        self.commits = 0
+
+    def execute(self, stmt, params=None):
+        if "FROM orders WHERE order_id" in str(stmt):
+            row = (7, "OC-7", "Іван", self.email, date(2026, 5, 1), date(2026, 5, 3), 2, 1000, 400, 100, 50)
+
+            class Row:
+                def fetchone(self):
+                    return row
+            return Row()
+        return super().execute(stmt, params)
+
+    def commit(self):
+        self.commits += 1
+
+
+class TestOrderConfirmation:
+
+    @pytest.fixture(autouse=True)
+    def order_items(self, monkeypatch):
+        import routes.orders as orders
+        outbox._table_ready = True
+        item = (1, 7, 11, "Келих", 4, 20, 80, "uploads/products/a.jpg", 300, 10, "GL-1")
+        monkeypatch.setattr(orders, "load_order_item_rows", lambda db, ids: {7: [item]})
+        self.orders = orders
+
+    def test_email_and_telegram_are_queued(self):
+        db = OrderDB()
+        result = asyncio.run(self.orders.send_confirmation_email(7, telegram_chat_id="555", db=db))
+        assert result["email_outbox_id"] == 17 and result["telegram_outbox_id"] == 17
+        assert db.commits == 1
+        email_row, telegram_row = [p for p in db.params if p and p.get("channel")]
+        assert (email_row["channel"], email_row["recipient"]) == ("email", "client@example.com")
+        assert "OC-7" in email_row["subject"]
+        assert (telegram_row["channel"], telegram_row["recipient"]) == ("telegram", "555")
+        assert "950.0" in json.loads(telegram_row["payload"])["text"]  # 1000 - 100 знижки + 50 послуги
+
+    def test_order_without_email_needs_chat_id(self):
+        from fastapi import HTTPException
+
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(self.orders.send_confirmation_email(7, db=OrderDB(email=None)))
+        assert exc.value.status_code == 400
@@ -0,0 +1,92 @@
+"""
+Order Hydrator Tests - bulk loading for order listings
+Tests for:
+1. hydrate_orders runs a fixed number of queries per page
+2. Bulk hydration produces the same order JSON as per-order parse_order_row
+3. include_items=False (fields=summary) skips item hydration
+"""
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.order_hydrator import hydrate_orders
+from routes.orders import parse_order_row
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+def item_row(item_id, order_id, product_id):
+    return (item_id, order_id, product_id, f"Item {product_id}", 2, 100, 200,
+            None, 500, 10, f"SKU{product_id}", "A", "1", "2", "clean", "shelf", "Посуд")
+
+
+class FakeDB:
+    def __init__(self, order_ids):
+        self.items = [item_row(o * 10 + i, o, o + i) for o in order_ids for i in range(3)]
+        self.damage = [(o, 900 + o, 'wash', 'note', None, 'pending', datetime(2026, 1, 1), 'chip', 'C1',
+                        None, 'return', f'OC-{o}', 1, 50, 'user') for o in order_ids]
+        self.cards = [(o, '[{"qty": 4, "picked_qty": 1}]') for o in order_ids]
+        self.payments = [(o, 100 * o, 10) for o in order_ids]
+        self.queries = 0
+
+    def execute(self, stmt, params=None):
+        self.queries += 1
+        sql = str(stmt)
+        params = params or {}
+        if "FROM order_items" in sql:
+            return FakeResult([r for r in self.items if r[1] in params["order_ids"]])
+        if "FROM product_damage_history" in sql:
+            return FakeResult([r for r in self.damage if r[0] in params["product_ids"]])
+        if "FROM issue_cards" in sql:
+            return FakeResult([r for r in self.cards if r[0] in params["order_ids"]])
+        if "FROM fin_transactions" in sql:
+            return FakeResult([r for r in self.payments if r[0] in params["order_ids"]])
+        raise AssertionError(f"Unexpected query: {sql}")
+
+
+def order_row(order_id):
+    return (order_id, f"OC-{order_id}", 1, "Client", "+380", "c@example.com",
+            date(2026, 5, 1), date(2026, 5, 3), date(2026, 5, 1), date(2026, 5, 3),
+            "processing", 1000, 500, None, datetime(2026, 4, 1), 0,
+            datetime(2026, 4, 2), 0, 0)
+
+
+class TestOrderHydrator:
+
+    def test_constant_queries_per_page(self):
+        for size in (1, 20, 100):
+            order_ids = list(range(1, size + 1))
+            db = FakeDB(order_ids)
+            hydrate_orders(db, order_ids)
+            assert db.queries == 4
+
+    def test_bulk_matches_single_order_parse(self):
+        order_ids = list(range(1, 11))
+        db = FakeDB(order_ids)
+        hydrated = hydrate_orders(db, order_ids)
+        for order_id in order_ids:
+            row = order_row(order_id)
+            assert parse_order_row(row, db, hydrated=hydrated[order_id]) == parse_order_row(row, db)
+
+    def test_summary_mode_skips_items(self):
+        order_ids = [1, 2, 3]
+        db = FakeDB(order_ids)
+        hydrated = hydrate_orders(db, order_ids, include_items=False)
+        assert db.queries == 2
+        assert all(h["items"] == [] for h in hydrated.values())
+        assert hydrated[1]["packing_progress"] == 25
+        assert hydrated[2]["paid_rent"] == 200.0
@@ -0,0 +1,175 @@
+"""
+PDF Render Service Tests
+Tests for:
+1. Unchanged HTML is rendered once and then served from the file cache
+2. Bounded queue rejects work when full
+3. Per-job timeout and background job status polling
+4. Job status is readable from another worker (state on disk)
+5. Cache is capped by age and size
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.pdf_render_service import (
+    PdfFileCache, PdfQueueFull, PdfRenderService, PdfRenderTimeout, pdf_cache_key
+)
+
+
+class FakeRenderer:
+    def __init__(self, gate=None):
+        self.calls = 0
+        self.gate = gate
+
+    def __call__(self, html_content, css=None, base_url=None):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        return f"PDF:{html_content}:{css}".encode("utf-8")
+
+
+def make_service(tmp_path, renderer, workers=1, max_queue=0, timeout=5):
+    return PdfRenderService(
+        workers=workers,
+        max_queue=max_queue,
+        timeout=timeout,
+        cache=PdfFileCache(str(tmp_path)),
+        executor_factory=lambda: ThreadPoolExecutor(max_workers=workers),
+        render_func=renderer,
+    )
+
+
+class TestPdfRenderService:
+
+    def test_cache_hit_skips_render(self, tmp_path):
+        renderer = FakeRenderer()
+        service = make_service(tmp_path, renderer)
+
+        async def scenario():
+            first = await service.render("<p>1</p>", css="a")
+            second = await service.render("<p>1</p>", css="a")
+            other_css = await service.render("<p>1</p>", css="b")
+            return first, second, other_css
+
+        first, second, other_css = asyncio.run(scenario())
+        assert first == second != other_css
+        assert renderer.calls == 2
+        with open(first, "rb") as f:
+            assert f.read() == b"PDF:<p>1</p>:a"
+        assert os.path.basename(first) == f"{pdf_cache_key('<p>1</p>', 'a')}.pdf"
+
+    def test_concurrent_identical_renders_share_work(self, tmp_path):
+        renderer = FakeRenderer()
+        service = make_service(tmp_path, renderer)
+
+        async def scenario():
+            return await asyncio.gather(*[service.render("<p>same</p>") for _ in range(5)])
+
+        paths = asyncio.run(scenario())
+        assert len(set(paths)) == 1
+        assert renderer.calls == 1
+
+    def test_queue_full(self, tmp_path):
+        gate = threading.Event()
+        service = make_service(tmp_path, FakeRenderer(gate), workers=1, max_queue=0)
+
+        async def scenario():
+            first = asyncio.ensure_future(service.render("<p>1</p>"))
+            await asyncio.sleep(0.05)
+            try:
+                await service.render("<p>2</p>")
+                rejected = False
+            except PdfQueueFull:
+                rejected = True
+            gate.set()
+            await first
+            return rejected
+
+        assert asyncio.run(scenario()) is True
+
+    def test_timeout_then_result_cached(self, tmp_path):
+        gate = threading.Event()
+        renderer = FakeRenderer(gate)
+        service = make_service(tmp_path, renderer, timeout=0.05)
+
+        async def scenario():
+            try:
+                await service.render("<p>slow</p>")
+                timed_out = False
+            except PdfRenderTimeout:
+                timed_out = True
+            gate.set()
+            await asyncio.sleep(0.2)
+            return timed_out, await service.render("<p>slow</p>")
+
+        timed_out, path = asyncio.run(scenario())
+        assert timed_out
+        assert os.path.exists(path)
+        assert renderer.calls == 1
+
+    def test_background_job_status(self, tmp_path):
+        service = make_service(tmp_path, FakeRenderer())
+
+        async def scenario():
+            job = service.submit("<p>job</p>")
+            for _ in range(100):
+                if service.get_job(job.job_id).status == "done":
+                    break
+                await asyncio.sleep(0.01)
+            again = service.submit("<p>job</p>")
+            return job, again
+
+        job, again = asyncio.run(scenario())
+        assert job.status == "done" and os.path.exists(job.path)
+        assert again.status == "done" and again.cached
+
+    def test_job_status_visible_to_other_worker(self, tmp_path):
+        service = make_service(tmp_path, FakeRenderer())
+        other_worker = make_service(tmp_path, FakeRenderer())
+
+        async def scenario():
+            job = service.submit("<p>shared</p>")
+            for _ in range(100):
+                if job.status == "done":
+                    break
+                await asyncio.sleep(0.01)
+            return job
+
+        job = asyncio.run(scenario())
+        seen = other_worker.get_job(job.job_id)
+        assert seen is not None and seen.status == "done" and seen.path == job.path
+        assert other_worker.get_job("0" * 32) is None
+        assert other_worker.get_job("../../etc/passwd") is None
+
+
+class TestPdfFileCache:
+
+    def test_prune_by_age_and_size(self, tmp_path):
+        cache = PdfFileCache(str(tmp_path), max_bytes=25, max_age=3600)
+        old = cache.put("aa" + "0" * 62, b"x" * 10)
+        lru = cache.put("bb" + "0" * 62, b"x" * 10)
+        recent = cache.put("cc" + "0" * 62, b"x" * 10)
+        fresh = cache.put("dd" + "0" * 62, b"x" * 10)
+        now = time.time()
+        os.utime(old, (now - 7200, now - 7200))
+        os.utime(lru, (now - 60, now - 60))
+        os.utime(recent, (now - 30, now - 30))
+
+        assert cache.prune() == 2
+        assert not os.path.exists(old)      # старший за max_age
+        assert not os.path.exists(lru)      # найдавніше використаний понад max_bytes
+        assert os.path.exists(recent) and os.path.exists(fresh)
+
+    def test_get_marks_file_as_used(self, tmp_path):
+        cache = PdfFileCache(str(tmp_path))
+        key = "ee" + "0" * 62
+        path = cache.put(key, b"pdf")
+        os.utime(path, (1, 1))
+        assert cache.get(key) == path
+        assert os.path.getmtime(path) > 1
+        assert cache.get("ff" + "0" * 62) is None
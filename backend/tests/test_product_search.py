@@ -0,0 +1,247 @@
+"""
+Product Search Index Tests
+Tests for:
+1. Ukrainian-aware normalization and light stemming
+2. Exact / prefix / substring / fuzzy matching (1-2 char substrings too), SKU without separators,
+   ranking by field; empty id list in SQL IN
+3. Facets and filters (category, color, material, inactive products)
+4. Incremental refresh: product writes mark ids dirty, sync runs trigger a full reload
+5. p95 latency on 10k synthetic SKUs
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine
+
+from services.product_search import (
+    ProductSearch, ProductSearchIndex, _note_write, build_doc, normalize_text, search_text, tokenize,
+)
+
+
+def row(pid, sku, name, category="Посуд", subcategory="Келихи", color="", material="", description="", status=1):
+    return (pid, sku, name, category, subcategory, color, material, description, status)
+
+
+ROWS = [
+    row(1, "GL-001", "Келих для вина", color="прозорий", material="скло"),
+    row(2, "GL-002", "Келихи для шампанського", color="золотий", material="скло"),
+    row(3, "VS-010", "Ваза підлогова", category="Декор", subcategory="Вази", color="білий", material="кераміка"),
+    row(4, "TX-100", "Скатертина льняна", category="Текстиль", subcategory="Скатертини",
+        color="білий", material="льон", description="Підходить для келихів"),
+    row(5, "GL-003", "Ґранчак", color="прозорий", material="скло", status=0),
+]
+
+
+def make_index(rows=ROWS):
+    index = ProductSearchIndex()
+    for r in rows:
+        index.add(build_doc(r))
+    return index
+
+
+class TestNormalization:
+
+    def test_ukrainian_folding(self):
+        assert normalize_text("П'ЯТЬ Ґанок Їжак") == "пять ганок іжак"
+        assert normalize_text("м’ята") == normalize_text("мʼята") == "мята"
+
+    def test_stemming_groups_word_forms(self):
+        assert tokenize("келихи")[0] == tokenize("келиха")[0] == tokenize("келих")[0]
+        assert tokenize("скатертина")[0] == tokenize("скатертини")[0]
+        assert tokenize("GL-001") == ["gl", "001"]
+
+
+class TestMatching:
+
+    def test_ranking_prefers_name_over_description(self):
+        result = make_index().search("келихи")
+        assert result.ids[:2] == [1, 2]
+        assert 4 in result.ids  # лише опис
+        assert result.ids[-1] == 4
+
+    def test_prefix_substring_and_fuzzy(self):
+        index = make_index()
+        assert index.search("скатер").ids == [4]
+        assert index.search("логов").ids == [3]  # LIKE '%логов%'
+        assert index.search("скатретина").ids == [4]  # одруківка
+
+    def test_sku_with_and_without_separator(self):
+        index = make_index()
+        assert index.search("GL-002").ids == [2]
+        assert index.search("gl002").ids == [2]
+        assert set(index.search("gl").ids) == {1, 2}
+
+    def test_short_substring_like_fallback(self):
+        index = make_index()
+        # "01" - усередині "001" / "010" (як LIKE '%01%'), не лише префікс
+        assert set(index.search("01").ids) == {1, 3}
+        assert set(index.search("ли").ids) >= {1, 2, 4}
+
+    def test_search_text_handles_empty_ids(self):
+        engine = create_engine("sqlite://")
+        with engine.connect() as conn:
+            sql = "SELECT 1 WHERE 1 IN :search_ids"
+            assert conn.execute(search_text(sql, {"search_ids": []}), {"search_ids": []}).fetchall() == []
+            assert conn.execute(search_text(sql, {"search_ids": [1, 2]}), {"search_ids": [1, 2]}).fetchall() == [(1,)]
+
+    def test_all_tokens_required(self):
+        assert make_index().search("келих золотий").ids == [2]
+
+
+class TestFacetsAndFilters:
+
+    def test_facets(self):
+        result = make_index().search("")
+        assert result.total == 4  # неактивний товар приховано
+        assert result.facets["category"] == {"Посуд": 2, "Декор": 1, "Текстиль": 1}
+        assert result.facets["material"]["скло"] == 2
+
+    def test_filters(self):
+        index = make_index()
+        assert index.search("", colors=["Білий"]).ids == [3, 4]
+        assert index.search("", category="Посуд", materials=["скло"], limit=1).total == 2
+        assert index.search("гранчак").ids == []
+        assert index.search("гранчак", active_only=False).ids == [5]
+
+    def test_remove(self):
+        index = make_index()
+        index.remove(4)
+        assert index.search("скатертина").ids == []
+        assert "скатертин" not in index.postings
+
+
+class FakeResult:
+    def __init__(self, rows=None, scalar=None):
+        self._rows = rows or []
+        self._scalar = scalar
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def scalar(self):
+        return self._scalar
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = {r[0]: r for r in rows}
+        self.sync_run = 1
+        self.queries = []
+
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        self.queries.append(sql)
+        if "sync_runs" in sql:
+            return FakeResult(scalar=self.sync_run)
+        if "product_id IN" in sql:
+            return FakeResult([self.rows[p] for p in params["ids"] if p in self.rows])
+        return FakeResult(list(self.rows.values()))
+
+    def rollback(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.info = {}
+
+
+class TestRefresh:
+
+    def test_dirty_products_reloaded_incrementally(self):
+        db = FakeDB(ROWS)
+        search = ProductSearch(max_age=3600, check_seconds=3600)
+        assert search.search(db, "ваза").ids == [3]
+
+        db.rows[3] = row(3, "VS-010", "Глечик", category="Декор")
+        del db.rows[4]
+        search.invalidate_products([3, 4])
+        db.queries.clear()
+        assert search.search(db, "глечик").ids == [3]
+        assert search.search(db, "ваза").ids == []
+        assert search.search(db, "скатертина").ids == []
+        assert len(db.queries) == 1 and "product_id IN" in db.queries[0]
+
+    def test_new_sync_run_triggers_full_reload(self):
+        db = FakeDB(ROWS)
+        search = ProductSearch(max_age=3600, check_seconds=0)
+        search.search(db, "ваза")
+        db.rows[6] = row(6, "CN-001", "Свічник")
+        db.sync_run = 2
+        assert search.search(db, "свічник").ids == [6]
+
+    def test_write_detection(self):
+        conn = FakeConn()
+        _note_write(conn, "UPDATE products SET quantity = :q WHERE product_id = :product_id", {"product_id": 1})
+        assert "product_search_pending" not in conn.info
+
+        _note_write(conn, "UPDATE products SET name = :name WHERE product_id = :product_id",
+                    {"product_id": 1, "name": "x"})
+        _note_write(conn, "DELETE FROM products WHERE product_id = :pid", [{"pid": 2}, {"pid": 3}])
+        assert conn.info["product_search_pending"] == {"ids": {1, 2, 3}, "all": False}
+
+        _note_write(conn, "INSERT INTO products (sku, name) VALUES (:sku, :name)", {"sku": "a", "name": "b"})
+        assert conn.info["product_search_pending"]["all"] is True
+
+    def test_invalidation_after_dbapi_commit(self, monkeypatch):
+        from sqlalchemy import create_engine, event, text
+        from sqlalchemy.orm import sessionmaker
+        import services.product_search as product_search
+
+        search = ProductSearch()
+        search._dirty_all = False
+        monkeypatch.setattr(product_search, "_search_instance", search)
+        monkeypatch.setattr(product_search, "_tracking_installed", True)
+        sa_engine = create_engine("sqlite://")
+        product_search.install_change_tracking(sa_engine)
+        seen_at_commit = []
+
+        @event.listens_for(sa_engine, "commit")
+        def _before_dbapi_commit(conn):
+            seen_at_commit.append(search._dirty_all)
+
+        session = sessionmaker(bind=sa_engine)()
+        session.execute(text("CREATE TABLE products (product_id INTEGER, name TEXT)"))
+        session.execute(text("UPDATE products SET name = :name WHERE product_id = :product_id"),
+                        {"name": "x", "product_id": 7})
+        session.rollback()
+        assert not search._dirty_all
+        session.execute(text("UPDATE products SET name = :name WHERE product_id = :product_id"),
+                        {"name": "y", "product_id": 8})
+        session.commit()
+        assert seen_at_commit == [False]
+        assert search._dirty_all
+
+
+class TestLatency:
+
+    def test_p95_under_20ms_for_10k_skus(self):
+        rnd = random.Random(7)
+        words = ["келих", "ваза", "скатертина", "тарілка", "свічник", "стілець", "лампа",
+                 "підсвічник", "серветка", "рамка", "кошик", "глечик", "фужер", "арка"]
+        colors = ["червоний", "білий", "золотий", "срібний", "синій", "прозорий"]
+        materials = ["скло", "кераміка", "метал", "дерево", "текстиль"]
+        index = ProductSearchIndex()
+        for pid in range(10000):
+            index.add(build_doc(row(
+                pid, f"SKU-{pid:05d}", f"{rnd.choice(words)} {rnd.choice(words)} {rnd.choice(colors)}",
+                category=rnd.choice(["Посуд", "Декор", "Текстиль", "Меблі"]),
+                color=rnd.choice(colors), material=rnd.choice(materials),
+                description=f"опис {rnd.choice(words)}",
+            )))
+        index.search("")  # побудова порядку за назвою
+
+        queries = ["келих", "кел", "келихи червоні", "SKU-0012", "0012", "скатерт", "свічнк",
+                   "ваза золот", "тарілк скло", "фуж", "арка біла", ""]
+        timings = []
+        for _ in range(10):
+            for q in queries:
+                started = time.perf_counter()
+                index.search(q, limit=50)
+                timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        assert timings[int(len(timings) * 0.95)] < 20
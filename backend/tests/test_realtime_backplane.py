@@ -0,0 +1,218 @@
+"""
+Realtime Backplane Tests
+Tests for:
+1. Section updates, comments and presence reach sockets connected to another worker
+2. Send queue: coalescing of pending updates, overflow drops the slow socket
+3. A stalled socket does not block broadcast to the rest of the room
+4. DatabaseBackplane: events from other workers are polled, own events are not redelivered,
+   ids that commit out of order are still delivered exactly once
+5. Presence of a worker that stopped sending snapshots expires
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from routes.order_sync import OrderSyncManager
+from services.realtime_backplane import ConnectionSender, DatabaseBackplane, MemoryBackplane, PresenceRegistry
+
+
+class FakeWebSocket:
+    def __init__(self, gate: asyncio.Event = None):
+        self.sent = []
+        self.gate = gate
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        if self.gate is not None:
+            await self.gate.wait()
+        self.sent.append(json.loads(data))
+
+    async def close(self, code=1000):
+        self.closed = code
+
+    def types(self):
+        return [m["type"] for m in self.sent]
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def workers(n=2):
+    hub = []
+    return [OrderSyncManager(MemoryBackplane(f"worker-{i}", hub=hub)) for i in range(n)]
+
+
+class TestCrossWorker:
+
+    def test_events_and_presence_cross_workers(self):
+        async def scenario():
+            a, b = workers()
+            ws_a, ws_b = FakeWebSocket(), FakeWebSocket()
+            await a.connect(ws_a, 1, 10, "Олена")
+            await b.connect(ws_b, 1, 20, "Петро")
+            await a.notify_section_update(1, "items", 10, "Олена", 3)
+            await b.notify_comment_added(1, {"text": "готово"}, 20)
+            await settle()
+            users = ([u["user_id"] for u in a.get_active_users(1)], [u["user_id"] for u in b.get_active_users(1)])
+            b.disconnect(ws_b)
+            await settle()
+            left = [u["user_id"] for u in a.get_active_users(1)]
+            await a.stop()
+            await b.stop()
+            return ws_a, ws_b, users, left
+
+        ws_a, ws_b, users, left = asyncio.run(scenario())
+        assert sorted(users[0]) == sorted(users[1]) == [10, 20]
+        assert left == [10]
+        assert ws_b.types()[0] == "sync.connected" and "order.section.updated" in ws_b.types()
+        assert "user.joined" in ws_a.types() and "order.comment.added" in ws_a.types()
+        assert "user.left" in ws_a.types()
+        # автор оновлення теж отримує подію (як і раніше), приєднаний не бачить свого user.joined
+        assert "user.joined" not in ws_b.types()
+
+    def test_stalled_socket_does_not_block_broadcast(self):
+        async def scenario():
+            (manager,) = workers(1)
+            gate = asyncio.Event()
+            slow, fast = FakeWebSocket(gate), FakeWebSocket()
+            await manager.connect(slow, 5, 1, "slow")
+            await manager.connect(fast, 5, 2, "fast")
+            await asyncio.wait_for(manager.notify_comment_added(5, {"text": "x"}, 2), timeout=1)
+            await settle()
+            fast_types = fast.types()
+            gate.set()
+            await settle()
+            await manager.stop()
+            return fast_types, slow.types()
+
+        fast_types, slow_types = asyncio.run(scenario())
+        assert "order.comment.added" in fast_types
+        assert "order.comment.added" in slow_types
+
+
+class TestSendQueue:
+
+    def test_coalescing_keeps_latest_pending(self):
+        async def scenario():
+            gate = asyncio.Event()
+            ws = FakeWebSocket(gate)
+            sender = ConnectionSender(ws.send_text)
+            sender.start()
+            sender.push(json.dumps({"type": "order.section.updated", "v": 1}), ("section", "header"))
+            await settle()  # v1 вже у відправці
+            sender.push(json.dumps({"type": "order.comment.added"}))
+            sender.push(json.dumps({"type": "order.section.updated", "v": 2}), ("section", "header"))
+            sender.push(json.dumps({"type": "order.section.updated", "v": 3}), ("section", "header"))
+            gate.set()
+            await settle()
+            sender.close()
+            return ws.sent, sender.coalesced
+
+        sent, coalesced = asyncio.run(scenario())
+        assert [m.get("v") for m in sent] == [1, None, 3]
+        assert coalesced == 1
+
+    def test_overflow_drops_connection(self):
+        async def scenario():
+            dropped = []
+            ws = FakeWebSocket(asyncio.Event())
+            sender = ConnectionSender(ws.send_text, max_pending=3, on_overflow=lambda: dropped.append(True))
+            sender.start()
+            results = [sender.push(json.dumps({"n": i})) for i in range(5)]
+            return results, dropped, sender.closed
+
+        results, dropped, closed = asyncio.run(scenario())
+        assert results == [True, True, True, False, False]
+        assert dropped == [True] and closed
+
+
+class TestDatabaseBackplane:
+
+    def test_poll_delivers_other_workers_events(self):
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE realtime_events (id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT,
+                    origin TEXT, payload TEXT, created_at DATETIME)
+            """))
+
+        async def scenario():
+            received = {"a": [], "b": []}
+            a = DatabaseBackplane("a", engine=engine)
+            b = DatabaseBackplane("b", engine=engine)
+            for name, bp in (("a", a), ("b", b)):
+                bp._table_ready = True
+                bp.subscribe(lambda channel, message, name=name: received[name].append((channel, message["n"])))
+                bp.last_id = await asyncio.to_thread(bp._max_id)
+            await a.publish("order:1", {"n": 1})
+            await a.publish("order:1", {"n": 2})
+            delivered = (await b.poll_once(), await a.poll_once(), await b.poll_once())
+            return received, delivered
+
+        received, delivered = asyncio.run(scenario())
+        assert received["a"] == [("order:1", 1), ("order:1", 2)]  # локально, без повтору з таблиці
+        assert received["b"] == [("order:1", 1), ("order:1", 2)]
+        assert delivered == (2, 0, 0)
+
+    def test_out_of_order_commits_delivered_once(self):
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE realtime_events (id INTEGER PRIMARY KEY, channel TEXT,
+                    origin TEXT, payload TEXT, created_at DATETIME)
+            """))
+
+        def insert(*ids):
+            with engine.begin() as conn:
+                for event_id in ids:
+                    conn.execute(text("""
+                        INSERT INTO realtime_events VALUES (:id, 'order:1', 'a', :payload, CURRENT_TIMESTAMP)
+                    """), {"id": event_id, "payload": json.dumps({"n": event_id})})
+
+        async def scenario():
+            received = []
+            b = DatabaseBackplane("b", engine=engine, batch=2, window=5)
+            b._table_ready = True
+            b.subscribe(lambda channel, message: received.append(message["n"]))
+            insert(1)
+            await b.start()
+            b.started = False  # без фонового циклу, опитування вручну
+            insert(2, 4, 5)  # 3 ще не закомічений
+            first = await b.poll_once()
+            insert(3)
+            second = await b.poll_once()
+            third = await b.poll_once()
+            insert(*range(6, 20))
+            fourth = await b.poll_once()
+            await b.stop()
+            return received, (first, second, third, fourth), b
+
+        received, delivered, b = asyncio.run(scenario())
+        assert received == [2, 4, 5, 3] + list(range(6, 20))
+        assert delivered == (3, 1, 0, 14)
+        assert b.last_id == 19 and min(b._seen) > 19 - 5
+
+
+class TestPresence:
+
+    def test_dead_worker_expires(self):
+        now = [0.0]
+        presence = PresenceRegistry(ttl=90, clock=lambda: now[0])
+        presence.join("w1", 1, "c1", {"user_id": 1})
+        presence.join("w2", 1, "c2", {"user_id": 2})
+        now[0] = 60
+        presence.replace_worker("w1", {1: {"c1": {"user_id": 1}}})
+        now[0] = 100
+        assert presence.expire(keep="w1") == ["w2"]
+        assert presence.members(1) == [{"user_id": 1}]
@@ -0,0 +1,198 @@
+"""
+Soft Reservations Tests
+Tests for:
+1. sync_board_holds: one bulk upsert per board (create + renew), holds of removed products dropped
+2. sweep_expired: dead holds archived and deleted in committed batches
+3. SoftReservationSweeper: pass statistics, disabled with interval 0
+4. check_order_availability: soft holds reported to RentalHub, but do not block availability
+"""
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import services.availability_engine as availability_engine
+from services import soft_reservations
+from services.availability_engine import AvailabilityEngine
+from services.soft_reservations import SoftReservationSweeper, release_board_holds, sweep_expired, sync_board_holds
+from utils.availability_checker import check_order_availability
+
+
+class FakeResult:
+    def __init__(self, rows=(), rowcount=0):
+        self._rows = list(rows)
+        self.rowcount = rowcount
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    """Робоча таблиця резервів: id -> dead (прострочений / знятий)"""
+
+    def __init__(self, holds=None):
+        self.holds = dict(holds or {})
+        self.archive = []
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, stmt, params=None):
+        sql = " ".join(str(stmt).split())
+        params = params or {}
+        self.statements.append((sql, params))
+        if sql.startswith("SELECT id FROM event_soft_reservations"):
+            dead = [hold_id for hold_id, is_dead in self.holds.items() if is_dead]
+            return FakeResult([(hold_id,) for hold_id in dead[:params["limit"]]])
+        if sql.startswith("INSERT IGNORE INTO event_soft_reservations_archive"):
+            self.archive.extend(i for i in params["ids"] if self.holds.get(i))
+            return FakeResult()
+        if sql.startswith("DELETE FROM event_soft_reservations WHERE id IN"):
+            removed = [i for i in params["ids"] if self.holds.get(i)]
+            for hold_id in removed:
+                del self.holds[hold_id]
+            return FakeResult(rowcount=len(removed))
+        if sql.startswith("DELETE FROM event_soft_reservations_archive"):
+            return FakeResult(rowcount=0)
+        return FakeResult(rowcount=3)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def sql(self, prefix):
+        return [(s, p) for s, p in self.statements if s.startswith(prefix)]
+
+
+@pytest.fixture(autouse=True)
+def schema_ready(monkeypatch):
+    monkeypatch.setattr(soft_reservations, "_schema_ready", True)
+
+
+class TestBoardHolds:
+
+    def test_sync_is_one_bulk_upsert(self):
+        db = FakeDB()
+        assert sync_board_holds(db, "b1", ttl_minutes=45) == 3
+        [(drop, _)] = db.sql("DELETE FROM event_soft_reservations")
+        assert "NOT IN" in drop and "converted_to_order_id IS NULL" in drop
+        [(upsert, params)] = db.sql("INSERT INTO event_soft_reservations")
+        assert "SELECT UUID()" in upsert and "FROM event_board_items" in upsert
+        assert "ON DUPLICATE KEY UPDATE" in upsert and "reserved_from = VALUES(reserved_from)" in upsert
+        assert "status = 'active'" in upsert.split("ON DUPLICATE KEY UPDATE")[1]
+        assert params == {"board_id": "b1", "ttl": 45}
+        assert db.commits == 0  # коміт - на обробнику
+
+    def test_release(self):
+        db = FakeDB()
+        release_board_holds(db, "b1")
+        [(sql, params)] = db.sql("DELETE FROM event_soft_reservations")
+        assert sql.endswith("WHERE board_id = :board_id") and params == {"board_id": "b1"}
+
+
+class TestSweep:
+
+    def test_archives_dead_holds_in_batches(self):
+        holds = {f"h{n}": n % 4 != 0 for n in range(1200)}  # 900 мертвих, 300 активних
+        db = FakeDB(holds)
+        assert sweep_expired(db, batch_size=400) == 900
+        assert len(db.archive) == 900 and db.commits == 3
+        assert len(db.holds) == 300 and not any(db.holds.values())
+        [(select, _), *_] = db.sql("SELECT id FROM event_soft_reservations")
+        assert "expires_at <= NOW() OR status <> 'active'" in select
+
+    def test_renewed_hold_is_not_deleted(self):
+        db = FakeDB({"h1": True})
+        sweep_expired(db)
+        [(delete, _)] = db.sql("DELETE FROM event_soft_reservations WHERE id IN")
+        [(archive, _)] = db.sql("INSERT IGNORE INTO event_soft_reservations_archive")
+        for sql in (delete, archive):
+            assert "AND (expires_at <= NOW() OR status <> 'active')" in sql
+
+    def test_max_batches_bound(self):
+        db = FakeDB({f"h{n}": True for n in range(50)})
+        assert sweep_expired(db, batch_size=10, max_batches=2) == 20
+
+
+class TestSweeper:
+
+    def test_run_once_stats(self):
+        db = FakeDB({"h1": True, "h2": False})
+        sweeper = SoftReservationSweeper(session_factory=lambda: db, interval=60, batch_size=10)
+        assert sweeper.run_once(db) == 1
+        stats = sweeper.stats()
+        assert stats["passes"] == 1 and stats["archived"] == 1 and stats["last_run_at"]
+
+    def test_disabled_interval(self):
+        sweeper = SoftReservationSweeper(session_factory=FakeDB, interval=0)
+        sweeper.start()
+        assert sweeper._thread is None
+        sweeper.stop()
+
+
+class CheckerDB:
+    """Відповідає на запити availability checker та engine"""
+
+    def __init__(self, soft_rows):
+        self.soft_rows = soft_rows
+
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        params = params or {}
+        if "FROM order_items" in sql or "FROM partial_return_version_items" in sql:
+            return FakeResult()
+        if "FROM event_soft_reservations" in sql:
+            return FakeResult(self.soft_rows)
+        if "FROM product_damage_history" in sql:
+            return FakeResult() if "product_ids" in params else FakeResult([(0,)])
+        if "FROM products" in sql:
+            if "product_ids" in params:
+                return FakeResult([(pid, 5, f"SKU{pid}", f"Product {pid}", 0, 0, None) for pid in params["product_ids"]])
+            pid = params["product_id"]
+            return FakeResult([(0, 0, None)] if "frozen_quantity" in sql else [(5, f"SKU{pid}", f"Product {pid}")])
+        raise AssertionError(f"Unexpected query: {sql}")
+
+
+class TestAvailabilityReport:
+
+    def setup_method(self):
+        availability_engine._engine_instance = AvailabilityEngine()
+        availability_engine._tracking_installed = True
+
+    def teardown_method(self):
+        availability_engine.reset_availability_engine()
+        availability_engine._tracking_installed = False
+
+    def test_soft_holds_reported_not_blocking(self):
+        later = datetime.now() + timedelta(minutes=20)
+        earlier = datetime.now() - timedelta(minutes=1)
+        db = CheckerDB([
+            ("h1", "b1", 1, 3, date(2026, 6, 1), date(2026, 6, 5), later, 7),
+            ("h2", "b2", 1, 2, date(2026, 6, 4), date(2026, 6, 8), later, 8),
+            ("h3", "b3", 2, 4, date(2026, 6, 1), date(2026, 6, 5), earlier, 9),  # ще не підметений
+        ])
+        items = [{"product_id": 1, "quantity": 5}, {"product_id": 2, "quantity": 1}]
+        result = check_order_availability(db, items, "2026-06-03", "2026-06-06")
+        first, second = result["items"]
+        assert first["soft_reserved_quantity"] == 5 and first["has_soft_holds"]
+        assert first["is_available"] and first["available_quantity"] == 5
+        assert second["soft_reserved_quantity"] == 0 and not second["has_soft_holds"]
+        assert result["has_soft_holds"] and [r["product_id"] for r in result["soft_hold_items"]] == [1]
+        per_item = check_order_availability(db, items, "2026-06-03", "2026-06-06", batched=False)
+        assert per_item == result
@@ -0,0 +1,128 @@
+"""
+Static Asset Serving Tests
+Tests for:
+1. Strong ETag + 304 on If-None-Match / If-Modified-Since for /api/uploads handlers and mounts
+2. Immutable Cache-Control for content-addressed files
+3. HTTP Range (206 / 416 / If-Range)
+4. image-proxy placeholder is memoized and revalidated with 304
+"""
+import os
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from routes import image_proxy, uploads
+from utils.static_assets import IMMUTABLE_CACHE_CONTROL, CachedStaticFiles, is_content_addressed, parse_range
+
+DIGEST = "ab" * 32
+CONTENT = bytes(range(256)) * 8
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / "products" / "thumbnails").mkdir(parents=True)
+    (tmp_path / "products" / "thumbnails" / "SKU1_1700000000_thumb.jpg").write_bytes(CONTENT)
+    variant_dir = tmp_path / "products" / "variants" / DIGEST[:2] / DIGEST
+    variant_dir.mkdir(parents=True)
+    (variant_dir / "320.webp").write_bytes(b"RIFF....WEBP")
+    monkeypatch.setattr(uploads, "UPLOAD_ROOT", tmp_path)
+    monkeypatch.setattr(image_proxy, "LOCAL_UPLOADS", tmp_path)
+
+    app = FastAPI()
+    app.include_router(uploads.router)
+    app.include_router(image_proxy.router)
+    app.mount("/uploads", CachedStaticFiles(directory=str(tmp_path)), name="uploads")
+    return TestClient(app)
+
+
+THUMB_URLS = ["/api/uploads/products/thumbnails/SKU1_1700000000_thumb.jpg",
+              "/uploads/products/thumbnails/SKU1_1700000000_thumb.jpg"]
+
+
+class TestConditionalGet:
+
+    @pytest.mark.parametrize("url", THUMB_URLS)
+    def test_etag_and_304(self, client, url):
+        first = client.get(url)
+        assert first.status_code == 200
+        assert first.content == CONTENT
+        etag = first.headers["etag"]
+        assert etag.startswith('"') and not etag.startswith('W/')
+        assert first.headers["cache-control"] == "public, max-age=86400"
+
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+        assert client.get(url, headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+        assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+        since = first.headers["last-modified"]
+        assert client.get(url, headers={"If-Modified-Since": since}).status_code == 304
+
+    def test_content_addressed_variant_is_immutable(self, client):
+        url = f"/api/uploads/products/variants/{DIGEST[:2]}/{DIGEST}/320.webp"
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert response.headers["etag"] == f'"{DIGEST[:32]}-320.webp"'
+
+    def test_only_store_original_names_are_immutable(self):
+        assert is_content_addressed("uploads/products/SKU-1_1700000000_0badf00d.jpg")
+        assert not is_content_addressed("uploads/products/photo_20240115.jpg")
+        assert not is_content_addressed("uploads/products/banner_deadbeef.png")
+
+    def test_etag_follows_file_change_without_reading_it(self, client, tmp_path, monkeypatch):
+        url = THUMB_URLS[0]
+        path = tmp_path / "products" / "thumbnails" / "SKU1_1700000000_thumb.jpg"
+        etag = client.get(url).headers["etag"]
+        stat = path.stat()
+        assert etag == f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+        path.write_bytes(CONTENT + b"x")
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+class TestRange:
+
+    def test_parse_range(self):
+        assert parse_range("bytes=0-99", 1000) == (0, 99)
+        assert parse_range("bytes=900-", 1000) == (900, 999)
+        assert parse_range("bytes=-100", 1000) == (900, 999)
+        assert parse_range("bytes=0-5000", 1000) == (0, 999)
+        assert parse_range("bytes=0-1,5-6", 1000) is None
+        assert parse_range("items=0-1", 1000) is None
+        with pytest.raises(ValueError):
+            parse_range("bytes=1000-", 1000)
+
+    @pytest.mark.parametrize("url", THUMB_URLS)
+    def test_partial_content(self, client, url):
+        response = client.get(url, headers={"Range": "bytes=10-19"})
+        assert response.status_code == 206
+        assert response.content == CONTENT[10:20]
+        assert response.headers["content-range"] == f"bytes 10-19/{len(CONTENT)}"
+
+        assert client.get(url, headers={"Range": f"bytes={len(CONTENT)}-"}).status_code == 416
+
+        etag = client.get(url).headers["etag"]
+        assert client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+        assert client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'}).status_code == 200
+
+
+class TestImageProxy:
+
+    def test_serves_file_with_etag(self, client):
+        response = client.get("/api/image-proxy/uploads/products/thumbnails/SKU1_1700000000_thumb.jpg")
+        assert response.status_code == 200
+        assert response.content == CONTENT
+        assert "etag" in response.headers
+
+    def test_placeholder_memoized_and_revalidated(self, client):
+        image_proxy._placeholder_svg.cache_clear()
+        first = client.get("/api/image-proxy/uploads/products/missing.jpg")
+        assert first.headers["content-type"].startswith("image/svg+xml")
+        second = client.get("/api/image-proxy/uploads/products/missing.jpg",
+                            headers={"If-None-Match": first.headers["etag"]})
+        assert second.status_code == 304
+        assert image_proxy._placeholder_svg.cache_info().hits >= 1
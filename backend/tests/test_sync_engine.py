@@ -0,0 +1,119 @@
+"""
+Sync Engine Tests
+Tests for:
+1. keyset_batches walks (value, id) pages until a short page
+2. Block checksums: only changed / new blocks are re-read
+3. bulk_upsert / bulk_update build one statement per batch
+4. SyncRun records per-stage status, timings and row counts
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services import sync_engine
+from services.sync_engine import (
+    SyncRun, block_range, bulk_update, bulk_upsert, changed_blocks, keyset_batches,
+    parse_hwm_datetime,
+)
+
+
+class FakeCursor:
+    def __init__(self):
+        self.statements = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.statements.append((" ".join(sql.split()), list(params or [])))
+        self.rowcount = len(params or [])
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.cur = FakeCursor()
+        self.commits = 0
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.commits += 1
+
+
+class TestKeysetAndChecksums:
+
+    def test_keyset_batches(self):
+        rows = [{"modified": f"2024-01-0{1 + i // 3}", "id": i} for i in range(7)]
+        calls = []
+
+        def fetch(after_value, after_id, limit):
+            calls.append((after_value, after_id))
+            tail = [r for r in rows if (r["modified"], r["id"]) > (after_value, after_id)]
+            return tail[:limit]
+
+        batches = list(keyset_batches(fetch, "", 0, "modified", "id", batch_size=3))
+        assert [len(b) for b in batches] == [3, 3, 1]
+        assert calls == [("", 0), ("2024-01-01", 2), ("2024-01-02", 5)]
+
+    def test_changed_blocks(self):
+        stored = {0: "a", 1: "b", 2: "c"}
+        current = {0: "a", 1: "B", 2: "c", 3: "d"}
+        assert changed_blocks(stored, current) == [1, 3]
+        assert changed_blocks(current, current) == []
+        assert block_range(2) == (2 * sync_engine.CHECKSUM_BLOCK_SIZE, 3 * sync_engine.CHECKSUM_BLOCK_SIZE)
+
+    def test_parse_hwm_datetime(self):
+        assert parse_hwm_datetime(None) == sync_engine.EPOCH
+        assert parse_hwm_datetime("2024-05-01 10:20:30.000") == datetime(2024, 5, 1, 10, 20, 30)
+
+
+class TestBulkWrites:
+
+    def test_bulk_upsert_one_statement_per_batch(self):
+        cur = FakeCursor()
+        rows = [(i, f"P{i}") for i in range(5)]
+        written = bulk_upsert(cur, "products", ["product_id", "sku"], rows, ["sku"],
+                              raw_values={"synced_at": "NOW()"}, batch_size=2)
+        assert written == 5
+        assert len(cur.statements) == 3
+        sql, params = cur.statements[0]
+        assert sql == ("INSERT INTO products (product_id, sku, synced_at) VALUES (%s, %s, NOW()), (%s, %s, NOW()) "
+                       "ON DUPLICATE KEY UPDATE sku = VALUES(sku)")
+        assert params == [0, "P0", 1, "P1"]
+
+    def test_bulk_update_joins_derived_table(self):
+        cur = FakeCursor()
+        bulk_update(cur, "products", "product_id", ["quantity"], [(1, 5), (2, 7)], "t.quantity = v.quantity")
+        sql, params = cur.statements[0]
+        assert sql == ("UPDATE products t JOIN (SELECT %s AS product_id, %s AS quantity UNION ALL SELECT %s, %s) v "
+                       "ON v.product_id = t.product_id SET t.quantity = v.quantity")
+        assert params == [1, 5, 2, 7]
+
+
+class TestSyncRun:
+
+    def test_stage_stats_are_saved(self):
+        conn = FakeConn()
+        run = SyncRun(conn, log=lambda msg: None)
+        with run.stage("products") as stats:
+            stats.fetched, stats.written = 10, 4
+        with run.stage("quantities") as stats:
+            stats.error = "timeout"
+        with pytest.raises(RuntimeError):
+            with run.stage("orders"):
+                raise RuntimeError("boom")
+
+        assert [s.status for s in run.stages] == ["ok", "failed", "failed"]
+        assert run.stages[2].error == "boom"
+
+        run.finish()
+        assert conn.commits == 1
+        sql, params = conn.cur.statements[-1]
+        assert sql.startswith("INSERT INTO sync_runs (run_id, stage, status, started_at, duration_ms")
+        assert params[1:3] == ["products", "ok"] and params[5:7] == [10, 4]
@@ -0,0 +1,100 @@
+"""
+DBOverrideLoader Cache Tests
+Tests for:
+1. DB-overridden templates are compiled once and reused while unchanged
+2. invalidate_template_cache / version probe pick up saved and reset overrides
+3. precompile_templates warms the Jinja cache
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from jinja2 import DictLoader, Environment
+
+from services.template_loader import DBOverrideLoader, DBTemplateCache, precompile_templates
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+
+class FakeTemplatesDB:
+    """document_templates в пам'яті"""
+
+    def __init__(self):
+        self.rows = {}
+        self.queries = 0
+
+    def save(self, doc_type, content, updated_at=None):
+        self.rows[doc_type] = (content, updated_at or datetime(2026, 1, 1))
+
+    def execute(self, stmt, params=None):
+        self.queries += 1
+        sql = str(stmt)
+        if "COUNT(*)" in sql:
+            stamps = [r[1] for r in self.rows.values()]
+            return FakeResult([(len(self.rows), max(stamps) if stamps else None,
+                                sum(hash(r[0]) & 0xffffffff for r in self.rows.values()))])
+        if "FROM document_templates" in sql:
+            return FakeResult([(dt, c, u) for dt, (c, u) in self.rows.items()])
+        raise AssertionError(f"Unexpected query: {sql}")
+
+    def close(self):
+        pass
+
+
+def make_env(db, probe_interval=3600):
+    cache = DBTemplateCache(probe_interval=probe_interval, session_factory=lambda: db)
+    files = DictLoader({"quote/v1.html": "file {{ n }}", "_base.html": "base"})
+    env = Environment(loader=DBOverrideLoader(files, cache=cache))
+    return env, cache
+
+
+class TestTemplateCache:
+
+    def test_db_template_compiled_once(self):
+        db = FakeTemplatesDB()
+        db.save("quote", "db {{ n }}")
+        env, _ = make_env(db)
+        first = env.get_template("quote/v1.html")
+        queries = db.queries
+        for _ in range(10):
+            assert env.get_template("quote/v1.html") is first
+        assert db.queries == queries
+        assert first.render(n=1) == "db 1"
+
+    def test_save_and_reset_invalidate(self):
+        db = FakeTemplatesDB()
+        env, cache = make_env(db)
+        assert env.get_template("quote/v1.html").render(n=1) == "file 1"
+
+        db.save("quote", "db {{ n }}")
+        cache.invalidate("quote")
+        assert env.get_template("quote/v1.html").render(n=2) == "db 2"
+
+        del db.rows["quote"]
+        cache.invalidate("quote")
+        assert env.get_template("quote/v1.html").render(n=3) == "file 3"
+
+    def test_version_probe_detects_other_worker_changes(self):
+        db = FakeTemplatesDB()
+        db.save("quote", "old {{ n }}")
+        env, _ = make_env(db, probe_interval=0)
+        assert env.get_template("quote/v1.html").render(n=1) == "old 1"
+        db.save("quote", "new {{ n }}", datetime(2026, 1, 2))
+        assert env.get_template("quote/v1.html").render(n=1) == "new 1"
+
+    def test_precompile(self):
+        db = FakeTemplatesDB()
+        env, _ = make_env(db)
+        results = precompile_templates(env, ["quote/v1.html", "missing/v1.html"])
+        assert results == {"quote/v1.html": "ok", "missing/v1.html": "not found"}
@@ -4,6 +4,14 @@ Utility для перевірки доступності товарів
 """
 from sqlalchemy import text
 from typing import List, Dict, Optional
+from datetime import date
+
+from services.availability_engine import (
+    get_availability_engine,
+    to_ordinal,
+    STATUS_FROZEN,
+    STATUS_IN_RENT,
+)
 
 def check_product_availability(
     db,
@@ -32,6 +40,10 @@ def check_product_availability(
             "is_available": bool
         }
     """
+    # Деякі виклики передають id рядками - ключі індексу engine цілі
+    product_id = int(product_id)
+    exclude_order_id = int(exclude_order_id) if exclude_order_id not in (None, "") else None
+    
     # Отримати загальну кількість, SKU та назву
     total_result = db.execute(text("""
         SELECT quantity, sku, name FROM products WHERE product_id = :product_id
@@ -39,147 +51,208 @@ def check_product_availability(
     total_row = total_result.fetchone()
     total_result.close()  # Закрити результат
     
-    total_qty = int(total_row[0]) if total_row else 0
-    sku = total_row[1] if total_row else None
-    product_name = total_row[2] if total_row else None
+    engine = get_availability_engine()
     
     # Підрахувати зарезервовані (заморожені) товари
     # Перевірка по ДАТАХ - якщо дати не перетинаються, товар вільний
-    query = """
-        SELECT COALESCE(SUM(oi.quantity), 0) as reserved
-        FROM order_items oi
-        JOIN orders o ON oi.order_id = o.order_id
-        WHERE oi.product_id = :product_id
-        AND o.status IN ('processing', 'ready_for_issue', 'issued', 'on_rent')
-        AND o.rental_start_date <= :end_date 
-        AND o.rental_end_date >= :start_date
-    """
-    
-    params = {
-        "product_id": product_id,
-        "start_date": start_date,
-        "end_date": end_date
-    }
-    
-    # Виключити поточне замовлення (якщо потрібно)
-    if exclude_order_id:
-        query += " AND o.order_id != :exclude_order_id"
-        params["exclude_order_id"] = exclude_order_id
-    
-    reserved_result = db.execute(text(query), params)
-    reserved_qty = int(reserved_result.fetchone()[0])
-    reserved_result.close()  # Закрити результат
+    # Рахуємо максимальну ОДНОЧАСНУ кількість у періоді (а не суму всіх замовлень)
+    reserved_qty = engine.max_reserved(
+        db, [product_id], start_date, end_date, STATUS_FROZEN, exclude_order_id
+    ).get(product_id, 0)
     
     # Підрахувати кількість товару що саме "в оренді" (статус issued або on_rent)
     # Тільки для того періоду який перевіряємо
-    on_rent_query = """
-        SELECT COALESCE(SUM(oi.quantity), 0) as on_rent
-        FROM order_items oi
-        JOIN orders o ON oi.order_id = o.order_id
-        WHERE oi.product_id = :product_id
-        AND o.status IN ('issued', 'on_rent')
-        AND o.rental_start_date <= :end_date 
-        AND o.rental_end_date >= :start_date
-    """
-    
-    on_rent_params = {
-        "product_id": product_id,
-        "start_date": start_date,
-        "end_date": end_date
-    }
+    on_rent_qty = engine.max_reserved(
+        db, [product_id], start_date, end_date, STATUS_IN_RENT, exclude_order_id
+    ).get(product_id, 0)
     
-    if exclude_order_id:
-        on_rent_query += " AND o.order_id != :exclude_order_id"
-        on_rent_params["exclude_order_id"] = exclude_order_id
-    
-    on_rent_result = db.execute(text(on_rent_query), on_rent_params)
-    on_rent_qty = int(on_rent_result.fetchone()[0])
-    on_rent_result.close()  # Закрити результат
+    # Soft-резерви мудбордів Event Tool - попит декораторів (з індексу engine, без запиту)
+    soft_reserved_qty = engine.max_soft_reserved(db, [product_id], start_date, end_date).get(product_id, 0)
     
     # Отримати близькі замовлення (попередження про можливий конфлікт)
     # Шукаємо замовлення що:
     # 1. Перетинаються з датами (конфлікт)
     # 2. Завершуються за день до початку (мало часу на підготовку)
     # 3. Зараз у статусі issued/on_rent (може запізнитися з поверненням)
-    nearby_orders_query = """
-        SELECT o.order_id, o.order_number, o.status, o.rental_start_date, o.rental_end_date, oi.quantity,
-               DATEDIFF(:start_date, o.rental_end_date) as days_gap
-        FROM order_items oi
-        JOIN orders o ON oi.order_id = o.order_id
-        WHERE oi.product_id = :product_id
-        AND o.status IN ('processing', 'ready_for_issue', 'issued', 'on_rent')
-        AND (
-            (o.rental_start_date <= :end_date AND o.rental_end_date >= :start_date)
-            OR (o.rental_end_date >= DATE_SUB(:start_date, INTERVAL 1 DAY) 
-                AND o.rental_end_date < :start_date)
-        )
-        ORDER BY o.rental_start_date
+    # Без дати початку (замовлення ще без дат) вікна "близьких" немає - як і в SQL-версії
+    start_ordinal = to_ordinal(start_date)
+    nearby_intervals = engine.order_intervals(
+        db, [product_id], date.fromordinal(start_ordinal - 1), end_date, STATUS_FROZEN, exclude_order_id
+    ).get(product_id, []) if start_ordinal is not None else []
+    
+    # Товари в активних версіях часткових повернень (ще не повернуті)
+    partial_holds = engine.partial_returns(db, [product_id]).get(product_id, [])
+    
+    processing_query = """
+        SELECT
+            p.frozen_quantity,
+            p.in_laundry,
+            p.state
+        FROM products p
+        WHERE p.product_id = :product_id
     """
+    processing_result = db.execute(text(processing_query), {"product_id": product_id})
+    processing_row = processing_result.fetchone()
+    processing_result.close()
     
-    nearby_params = {
-        "product_id": product_id,
-        "start_date": start_date,
-        "end_date": end_date
-    }
+    # Також перевіряємо product_damage_history на товари awaiting_assignment
+    awaiting_query = """
+        SELECT COALESCE(SUM(pdh.qty), 0) as awaiting_qty
+        FROM product_damage_history pdh
+        WHERE pdh.product_id = :product_id
+        AND pdh.processing_type = 'awaiting_assignment'
+        AND pdh.processing_status = 'pending'
+    """
+    awaiting_result = db.execute(text(awaiting_query), {"product_id": product_id})
+    awaiting_row = awaiting_result.fetchone()
+    awaiting_result.close()
+    awaiting_qty = int(awaiting_row[0]) if awaiting_row and awaiting_row[0] else 0
+    
+    return _build_availability_result(
+        product_id=product_id,
+        quantity=quantity,
+        total_row=total_row,
+        processing_row=processing_row,
+        awaiting_qty=awaiting_qty,
+        reserved_qty=reserved_qty,
+        on_rent_qty=on_rent_qty,
+        soft_reserved_qty=soft_reserved_qty,
+        nearby_intervals=nearby_intervals,
+        partial_holds=partial_holds,
+        start_ordinal=start_ordinal
+    )
+
+
+def check_products_availability_batch(
+    db,
+    items: List[Dict],
+    start_date: str,
+    end_date: str,
+    exclude_order_id: Optional[int] = None
+) -> List[Dict]:
+    """
+    Set-based варіант check_product_availability для багатьох товарів одразу.
     
-    if exclude_order_id:
-        nearby_orders_query += " AND o.order_id != :exclude_order_id"
-        nearby_params["exclude_order_id"] = exclude_order_id
+    Фіксована кількість запитів незалежно від кількості позицій:
+    - products (кількість, SKU, назва, стан обробки) - один IN (...)
+    - product_damage_history awaiting_assignment - один IN (...) з GROUP BY
+    - резерви, оренда, soft-резерви мудбордів, близькі замовлення, часткові повернення - з availability engine
+    
+    Returns:
+        [result як у check_product_availability, ...] у порядку items
+    """
+    if not items:
+        return []
+    
+    product_ids = list({int(item["product_id"]) for item in items})
+    exclude_order_id = int(exclude_order_id) if exclude_order_id not in (None, "") else None
+    engine = get_availability_engine()
+    start_ordinal = to_ordinal(start_date)
+    
+    product_rows = {}
+    products_result = db.execute(text("""
+        SELECT product_id, quantity, sku, name, frozen_quantity, in_laundry, state
+        FROM products
+        WHERE product_id IN :product_ids
+    """), {"product_ids": tuple(product_ids)})
+    for row in products_result:
+        product_rows[row[0]] = row
+    products_result.close()
+    
+    awaiting_result = db.execute(text("""
+        SELECT pdh.product_id, COALESCE(SUM(pdh.qty), 0) as awaiting_qty
+        FROM product_damage_history pdh
+        WHERE pdh.product_id IN :product_ids
+        AND pdh.processing_type = 'awaiting_assignment'
+        AND pdh.processing_status = 'pending'
+        GROUP BY pdh.product_id
+    """), {"product_ids": tuple(product_ids)})
+    awaiting_dict = {row[0]: int(row[1]) if row[1] else 0 for row in awaiting_result}
+    awaiting_result.close()
+    
+    reserved_dict = engine.max_reserved(
+        db, product_ids, start_date, end_date, STATUS_FROZEN, exclude_order_id
+    )
+    on_rent_dict = engine.max_reserved(
+        db, product_ids, start_date, end_date, STATUS_IN_RENT, exclude_order_id
+    )
+    soft_dict = engine.max_soft_reserved(db, product_ids, start_date, end_date)
+    nearby_dict = engine.order_intervals(
+        db, product_ids, date.fromordinal(start_ordinal - 1), end_date, STATUS_FROZEN, exclude_order_id
+    ) if start_ordinal is not None else {}
+    partial_dict = engine.partial_returns(db, product_ids)
+    
+    results = []
+    for item in items:
+        product_id = int(item["product_id"])
+        row = product_rows.get(product_id)
+        results.append(_build_availability_result(
+            product_id=product_id,
+            quantity=item["quantity"],
+            total_row=(row[1], row[2], row[3]) if row else None,
+            processing_row=(row[4], row[5], row[6]) if row else None,
+            awaiting_qty=awaiting_dict.get(product_id, 0),
+            reserved_qty=reserved_dict.get(product_id, 0),
+            on_rent_qty=on_rent_dict.get(product_id, 0),
+            soft_reserved_qty=soft_dict.get(product_id, 0),
+            nearby_intervals=nearby_dict.get(product_id, []),
+            partial_holds=partial_dict.get(product_id, []),
+            start_ordinal=start_ordinal
+        ))
+    return results
+
+
+def _build_availability_result(
+    product_id: int,
+    quantity: int,
+    total_row,
+    processing_row,
+    awaiting_qty: int,
+    reserved_qty: int,
+    on_rent_qty: int,
+    nearby_intervals: List,
+    partial_holds: List,
+    start_ordinal: int,
+    soft_reserved_qty: int = 0
+) -> Dict:
+    """Зібрати результат перевірки одного товару з уже отриманих даних"""
+    total_qty = int(total_row[0]) if total_row else 0
+    sku = total_row[1] if total_row else None
+    product_name = total_row[2] if total_row else None
     
-    nearby_result = db.execute(text(nearby_orders_query), nearby_params)
     nearby_orders = []
-    for row in nearby_result:
+    for interval in nearby_intervals:
         nearby_orders.append({
-            "order_id": row[0],
-            "order_number": row[1],
-            "status": row[2],
-            "rental_start_date": row[3].isoformat() if row[3] else None,
-            "rental_end_date": row[4].isoformat() if row[4] else None,
-            "quantity": row[5],
-            "days_gap": row[6] if row[6] is not None else None
+            "order_id": interval.order_id,
+            "order_number": interval.order_number,
+            "status": interval.status,
+            "rental_start_date": interval.rental_start_date.isoformat() if interval.rental_start_date else None,
+            "rental_end_date": interval.rental_end_date.isoformat() if interval.rental_end_date else None,
+            "quantity": interval.quantity,
+            "days_gap": start_ordinal - interval.end
         })
-    nearby_result.close()
     
     # ========== ПЕРЕВІРКА ЧАСТКОВИХ ПОВЕРНЕНЬ ==========
     # Товари в активних версіях часткових повернень (ще не повернуті)
     # Це ПОПЕРЕДЖЕННЯ - товар формально вільний, але фактично ще у клієнта
-    # Використовуємо таблиці: partial_return_versions + partial_return_version_items
-    partial_return_query = """
-        SELECT 
-            prv.parent_order_id,
-            prv.display_number,
-            prvi.qty,
-            prv.rental_end_date,
-            DATEDIFF(CURDATE(), prv.rental_end_date) as days_overdue,
-            prvi.daily_rate,
-            prv.created_at,
-            prv.version_id
-        FROM partial_return_version_items prvi
-        JOIN partial_return_versions prv ON prvi.version_id = prv.version_id
-        WHERE prvi.product_id = :product_id
-        AND prvi.status = 'pending'
-        AND prv.status = 'active'
-        ORDER BY prv.rental_end_date DESC
-    """
-    
-    partial_return_result = db.execute(text(partial_return_query), {"product_id": product_id})
+    # Джерело: partial_return_versions + partial_return_version_items (індекс engine)
     partial_return_warnings = []
     partial_return_qty = 0  # Кількість товару що "зависла" в частковому поверненні
+    today_ordinal = date.today().toordinal()
     
-    for row in partial_return_result:
-        days_overdue = row[4] if row[4] else 0
-        partial_return_qty += row[2]  # qty
+    for hold in partial_holds:
+        days_overdue = (today_ordinal - hold.rental_end_date.toordinal()) if hold.rental_end_date else 0
+        partial_return_qty += hold.qty
         partial_return_warnings.append({
-            "order_id": row[0],
-            "order_number": row[1],  # display_number: OC-7304(1)
-            "qty": row[2],
-            "original_end_date": row[3].isoformat() if row[3] else None,
+            "order_id": hold.parent_order_id,
+            "order_number": hold.display_number,  # display_number: OC-7304(1)
+            "qty": hold.qty,
+            "original_end_date": hold.rental_end_date.isoformat() if hold.rental_end_date else None,
             "days_overdue": days_overdue,
-            "daily_rate": float(row[5]) if row[5] else 0,
-            "version_id": row[7],
+            "daily_rate": hold.daily_rate,
+            "version_id": hold.version_id,
             "warning": f"⚠️ Товар ще НЕ ПОВЕРНУТО! Прострочка {days_overdue} дн. Дата повернення невідома."
         })
-    partial_return_result.close()
     
     has_partial_return_risk = len(partial_return_warnings) > 0
     # ========== КІНЕЦЬ ПЕРЕВІРКИ ЧАСТКОВИХ ПОВЕРНЕНЬ ==========
@@ -188,18 +261,6 @@ def check_product_availability(
     # Товари на обробці НЕ БЛОКУЮТЬ видачу, але показують ПОПЕРЕДЖЕННЯ
     # Менеджер може видати, але має знати що потрібно поторопитися з обробкою
     
-    processing_query = """
-        SELECT 
-            p.frozen_quantity,
-            p.in_laundry,
-            p.state
-        FROM products p
-        WHERE p.product_id = :product_id
-    """
-    processing_result = db.execute(text(processing_query), {"product_id": product_id})
-    processing_row = processing_result.fetchone()
-    processing_result.close()
-    
     frozen_qty = int(processing_row[0]) if processing_row and processing_row[0] else 0
     in_laundry_qty = int(processing_row[1]) if processing_row and processing_row[1] else 0
     product_state = processing_row[2] if processing_row else None
@@ -233,7 +294,7 @@ def check_product_availability(
             })
         elif product_state == 'on_laundry':
             processing_warnings.append({
-                "type": "on_laundry", 
+                "type": "on_laundry",
                 "qty": frozen_qty,
                 "message": f"⚠️ {frozen_qty} шт на хімчистці/пранні - потрібно поторопитися з обробкою"
             })
@@ -251,19 +312,7 @@ def check_product_availability(
                 "message": f"⚠️ {frozen_qty} шт заморожено - перевірте статус в кабінеті шкоди"
             })
     
-    # Також перевіряємо product_damage_history на товари awaiting_assignment
-    awaiting_query = """
-        SELECT COALESCE(SUM(pdh.qty), 0) as awaiting_qty
-        FROM product_damage_history pdh
-        WHERE pdh.product_id = :product_id
-        AND pdh.processing_type = 'awaiting_assignment'
-        AND pdh.processing_status = 'pending'
-    """
-    awaiting_result = db.execute(text(awaiting_query), {"product_id": product_id})
-    awaiting_row = awaiting_result.fetchone()
-    awaiting_result.close()
-    awaiting_qty = int(awaiting_row[0]) if awaiting_row and awaiting_row[0] else 0
-    
+    # Товари awaiting_assignment з product_damage_history
     if awaiting_qty > 0 and awaiting_qty != on_processing_qty:
         # Є товари що очікують розподілу в damage history
         if not any(w['type'] == 'awaiting_assignment' for w in processing_warnings):
@@ -322,7 +371,10 @@ def check_product_availability(
         # Нові поля для товарів на обробці
         "has_processing_warning": has_processing_warning,
         "needs_processing_rush": needs_processing_rush,
-        "processing_warnings": processing_warnings
+        "processing_warnings": processing_warnings,
+        # Soft-резерви мудбордів Event Tool: інформують, але не блокують
+        "soft_reserved_quantity": soft_reserved_qty,
+        "has_soft_holds": soft_reserved_qty > 0
     }
 
 
@@ -331,7 +383,8 @@ def check_order_availability(
     items: List[Dict],
     start_date: str,
     end_date: str,
-    exclude_order_id: Optional[int] = None
+    exclude_order_id: Optional[int] = None,
+    batched: bool = True
 ) -> Dict:
     """
     Перевірити доступність для всіх товарів замовлення
@@ -341,6 +394,8 @@ def check_order_availability(
         start_date: YYYY-MM-DD
         end_date: YYYY-MM-DD
         exclude_order_id: ID замовлення для виключення (при оновленні)
+        batched: True - фіксована кількість запитів на замовлення (check_products_availability_batch),
+                 False - check_product_availability по кожній позиції
     
     Returns:
         {
@@ -349,23 +404,28 @@ def check_order_availability(
             "unavailable_items": [...]
         }
     """
-    results = []
-    unavailable = []
-    
-    for item in items:
-        result = check_product_availability(
+    if batched:
+        results = check_products_availability_batch(
             db,
-            product_id=item["product_id"],
-            quantity=item["quantity"],
+            items,
             start_date=start_date,
             end_date=end_date,
             exclude_order_id=exclude_order_id
         )
-        
-        results.append(result)
-        
-        if not result["is_available"]:
-            unavailable.append(result)
+    else:
+        results = [
+            check_product_availability(
+                db,
+                product_id=item["product_id"],
+                quantity=item["quantity"],
+                start_date=start_date,
+                end_date=end_date,
+                exclude_order_id=exclude_order_id
+            )
+            for item in items
+        ]
+    
+    unavailable = [r for r in results if not r["is_available"]]
     
     # Збираємо товари з ризиком часткового повернення
     partial_return_risks = [r for r in results if r.get("has_partial_return_risk")]
@@ -374,6 +434,9 @@ def check_order_availability(
     processing_warning_items = [r for r in results if r.get("has_processing_warning")]
     needs_processing_rush_items = [r for r in results if r.get("needs_processing_rush")]
     
+    # Товари, які декоратори тримають у мудбордах на ці дати
+    soft_hold_items = [r for r in results if r.get("has_soft_holds")]
+    
     return {
         "all_available": len(unavailable) == 0,
         "has_partial_return_risks": len(partial_return_risks) > 0,
@@ -383,5 +446,7 @@ def check_order_availability(
         "unavailable_items": unavailable,
         "partial_return_risk_items": partial_return_risks,
         "processing_warning_items": processing_warning_items,
-        "processing_rush_items": needs_processing_rush_items
+        "processing_rush_items": needs_processing_rush_items,
+        "has_soft_holds": len(soft_hold_items) > 0,
+        "soft_hold_items": soft_hold_items
     }
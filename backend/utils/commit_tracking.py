@@ -0,0 +1,219 @@
+"""
+Інвалідація in-memory індексів ПІСЛЯ фактичного COMMIT.
+
+Подія рушія SQLAlchemy "commit" спрацьовує ДО commit() DBAPI: паралельний читач,
+що встиг перезавантажити індекс між інвалідацією і комітом, бачить старі дані,
+і цей застарілий стан лишається в кеші до наступного запису.
+
+Тому записи, як і раніше, позначаються в conn.info (after_cursor_execute рушія),
+а обробник викликається з Session "after_commit" - коли COMMIT усіх з'єднань сесії
+вже завершено. Коміт SAVEPOINT (begin_nested) обробники не викликає.
+
+Usage:
+    @event.listens_for(sa_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("my_pending", set()).add(...)
+
+    on_commit("my_pending", lambda pending: index.invalidate(pending))
+
+Похідні таблиці, що перераховуються в транзакції автора запису (DELETE + INSERT ... SELECT),
+реєструють before_commit(key, handler) - один слухач Session "before_commit" на всіх;
+run_in_savepoint() - для таких обробників. Розбір записів для них - track_writes(),
+parse_write(), param_values():
+
+    _WRITE_RE = write_pattern("orders", "tasks")
+
+    def note_write(info, statement, parameters, lastrowid=None):
+        parsed = parse_write(_WRITE_RE, statement, parameters)
+        ...
+
+    track_writes(rh_engine, "my_pending", note_write)
+    before_commit("my_pending", lambda session, pending: run_in_savepoint(session, ..., ...))
+"""
+import logging
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_CONNECTIONS_KEY = "commit_tracking_connections"
+
+_handlers: Dict[str, Callable[[Any], None]] = {}
+# key -> (handler(session, pending), чи лежить pending у session.info, а не в conn.info)
+_before_commit_handlers: Dict[str, Tuple[Callable[[Session, Any], None], bool]] = {}
+
+
+def on_commit(key: str, handler: Callable[[Any], None]) -> None:
+    """Після COMMIT сесії передати handler значення conn.info[key] (і прибрати його)"""
+    _handlers[key] = handler
+
+
+def before_commit(key: str, handler: Callable[[Session, Any], None], session_info: bool = False) -> None:
+    """
+    Перед COMMIT сесії передати handler(session, pending) значення conn.info[key] кожного
+    з'єднання сесії (session_info=True - session.info[key]). Обробник пише в ту саму
+    транзакцію; його помилка зриває COMMIT - тож обробники загортаються в run_in_savepoint.
+    """
+    _before_commit_handlers[key] = (handler, session_info)
+
+
+def discard_pending(conn, key: str) -> None:
+    """Відкат з'єднання: позначені записи не потрапили в БД"""
+    conn.info.pop(key, None)
+
+
+def dispatch(connections) -> None:
+    for conn in connections:
+        for key, handler in list(_handlers.items()):
+            try:
+                pending = conn.info.pop(key, None)
+            except Exception:
+                # З'єднання вже інвалідоване пулом
+                continue
+            if not pending:
+                continue
+            try:
+                handler(pending)
+            except Exception as e:
+                logger.warning(f"Commit handler {key} failed: {e}")
+
+
+@event.listens_for(Session, "after_begin")
+def _remember_connection(session, transaction, connection):
+    session.info.setdefault(_CONNECTIONS_KEY, set()).add(connection)
+
+
+def _pop_pending(session, connections, key: str, session_info: bool) -> list:
+    if session_info:
+        return [session.info.pop(key, None)]
+    pending_list = []
+    for conn in connections:
+        try:
+            pending_list.append(conn.info.pop(key, None))
+        except Exception:
+            # З'єднання вже інвалідоване пулом
+            continue
+    return pending_list
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session):
+    # commit SAVEPOINT (зокрема run_in_savepoint усередині обробника) теж викликає before_commit -
+    # обробники працюють лише перед COMMIT зовнішньої транзакції
+    if not _before_commit_handlers or not session.in_transaction() or session.in_nested_transaction():
+        return
+    connections = list(session.info.get(_CONNECTIONS_KEY, ()))
+    for key, (handler, session_info) in list(_before_commit_handlers.items()):
+        try:
+            for pending in _pop_pending(session, connections, key, session_info):
+                if pending:
+                    handler(session, pending)
+        finally:
+            # записи самого обробника не мають перейти в наступну транзакцію
+            _pop_pending(session, connections, key, session_info)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.in_nested_transaction():
+        return
+    dispatch(session.info.pop(_CONNECTIONS_KEY, ()))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_connections(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_CONNECTIONS_KEY, None)
+
+
+def run_in_savepoint(session: Session, label: str, fn: Callable[[], Any]) -> bool:
+    """
+    Виконати fn() у SAVEPOINT (для before_commit hooks похідних таблиць).
+    Збій fn відкочує лише його записи - DELETE без відповідного INSERT не потрапить у COMMIT,
+    а запис автора зберігається. Якщо не вдалося відкотити і сам SAVEPOINT (наприклад,
+    InnoDB відкотив усю транзакцію після deadlock) - помилка йде далі, і COMMIT не відбувається.
+    """
+    savepoint = session.begin_nested()
+    try:
+        fn()
+    except Exception as e:
+        savepoint.rollback()
+        logger.warning(f"{label} failed, rolled back to savepoint: {e}")
+        return False
+    savepoint.commit()
+    return True
+
+
+# ============================================================
+# РОЗБІР ЗАПИСІВ (after_cursor_execute)
+# ============================================================
+
+def write_pattern(*tables: str) -> "re.Pattern":
+    """INSERT / REPLACE / UPDATE / DELETE у одну з таблиць: group(1) - дієслово, group(2) - таблиця"""
+    return re.compile(
+        r"^\s*(INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?"
+        r"(" + "|".join(tables) + r")`?\b",
+        re.IGNORECASE
+    )
+
+
+def parse_write(pattern: "re.Pattern", statement: str, parameters) -> Optional[Tuple[str, str, List[dict]]]:
+    """(дієслово INSERT/REPLACE/UPDATE/DELETE, таблиця, список dict-параметрів) або None"""
+    match = pattern.match(statement or "")
+    if not match:
+        return None
+    params_list = [p for p in (parameters if isinstance(parameters, (list, tuple)) else [parameters])
+                   if isinstance(p, dict)]
+    return match.group(1).split()[0].upper(), match.group(2).lower(), params_list
+
+
+def set_clause(statement: str) -> str:
+    """Частина UPDATE до WHERE - які колонки змінюються"""
+    return re.split(r"\bWHERE\b", statement, maxsplit=1, flags=re.IGNORECASE)[0]
+
+
+def param_values(params_list: List[dict], keys: Iterable[str],
+                 cast: Optional[Callable[[Any], Any]] = int) -> Set:
+    """
+    Значення першого з keys у кожному наборі параметрів (списки - поелементно).
+    cast=int - лише id, що приводяться до цілого ("12" -> 12); cast=None - int і str як є.
+    """
+    def usable(value):
+        if isinstance(value, bool) or value is None or value == "":
+            return None
+        if cast is None:
+            return value if isinstance(value, (int, str)) else None
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    values = set()
+    for params in params_list:
+        for key in keys:
+            value = params.get(key)
+            if isinstance(value, (list, tuple, set)):
+                values.update(v for v in map(usable, value) if v is not None)
+                break
+            value = usable(value)
+            if value is not None:
+                values.add(value)
+                break
+    return values
+
+
+def track_writes(sa_engine, key: str, note: Callable[[dict, str, Any, Optional[int]], None]) -> None:
+    """
+    Кожен запис через sa_engine -> note(conn.info, statement, parameters, lastrowid);
+    відкат з'єднання прибирає conn.info[key]
+    """
+    @event.listens_for(sa_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        note(conn.info, statement, parameters, getattr(cursor, "lastrowid", None))
+
+    @event.listens_for(sa_engine, "rollback")
+    def _on_rollback(conn):
+        discard_pending(conn, key)
@@ -0,0 +1,126 @@
+"""
+Threadpool offload для роутерів з синхронною БД.
+
+Більшість handlers оголошені як `async def`, але всередині викликають синхронну
+SQLAlchemy сесію (get_rh_db) - кожен запит до RH_DB_HOST блокує event loop uvicorn
+(разом з websocket-ами order_sync).
+
+offload_blocking_routers() проходить по роутерах з DB_THREADPOOL_ROUTERS і підміняє
+`async def` handlers, які нічого не await-ять, на sync-обгортку. FastAPI виконує sync
+handlers у threadpool, тож event loop лишається вільним. Handlers з await (websocket,
+request.json(), бродкаст order_sync, ...) не чіпаємо.
+
+DB_THREADPOOL_ROUTERS:
+    "orders,finance,catalog,audit,dashboard_overview,cabinet"  - модулі routes.* через кому
+                                                               (за замовчуванням)
+    "*"                                                        - усі роутери
+    "" / "off"                                                 - вимкнено
+"""
+import dis
+import functools
+import inspect
+import os
+import sys
+from types import CodeType
+from typing import Iterable, List, Optional, Set
+
+from fastapi import APIRouter
+from fastapi.routing import APIRoute
+
+DEFAULT_THREADPOOL_ROUTERS = "orders,finance,catalog,audit,dashboard_overview,cabinet"
+
+# Опкоди, що означають реальну взаємодію з event loop
+_ASYNC_OPNAMES = {"GET_AWAITABLE", "GET_AITER", "GET_ANEXT", "BEFORE_ASYNC_WITH", "SEND"}
+# Виклики, що потребують running loop у поточному потоці
+_LOOP_NAMES = {"create_task", "ensure_future", "get_event_loop", "get_running_loop"}
+
+
+def enabled_router_names(value: Optional[str] = None) -> Optional[Set[str]]:
+    """Множина імен модулів або None якщо увімкнено для всіх"""
+    if value is None:
+        value = os.environ.get("DB_THREADPOOL_ROUTERS", DEFAULT_THREADPOOL_ROUTERS)
+    value = value.strip()
+    if value == "*":
+        return None
+    if value.lower() in ("", "off", "0", "false", "none"):
+        return set()
+    return {name.strip().replace("routes.", "") for name in value.split(",") if name.strip()}
+
+
+def _uses_event_loop(code: CodeType) -> bool:
+    for instr in dis.get_instructions(code):
+        if instr.opname in _ASYNC_OPNAMES:
+            return True
+    if _LOOP_NAMES & set(code.co_names):
+        return True
+    return any(_uses_event_loop(c) for c in code.co_consts if isinstance(c, CodeType))
+
+
+def can_offload(endpoint) -> bool:
+    """async def handler без await - можна безпечно виконати в потоці"""
+    if not inspect.iscoroutinefunction(endpoint):
+        return False
+    return not _uses_event_loop(endpoint.__code__)
+
+
+def run_coroutine_sync(coro):
+    """Довиконати корутину, яка ніколи не призупиняється"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("Offloaded handler tried to suspend on the event loop")
+
+
+def to_threadpool_endpoint(endpoint):
+    """Sync-обгортка над `async def` handler (сигнатура зберігається для FastAPI)"""
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        return run_coroutine_sync(endpoint(*args, **kwargs))
+
+    wrapper.__offloaded__ = True
+    return wrapper
+
+
+def offload_router(router: APIRouter, module_name: Optional[str] = None) -> int:
+    """
+    Підмінити endpoint-и роутера. Викликати ДО app.include_router -
+    include_router будує маршрути застосунку з route.endpoint.
+
+    module_name - чіпати лише handlers, визначені в цьому модулі
+    """
+    count = 0
+    for route in router.routes:
+        if not isinstance(route, APIRoute) or getattr(route.endpoint, "__offloaded__", False):
+            continue
+        if module_name and getattr(route.endpoint, "__module__", None) != module_name:
+            continue
+        if can_offload(route.endpoint):
+            route.endpoint = to_threadpool_endpoint(route.endpoint)
+            count += 1
+    return count
+
+
+def offload_blocking_routers(setting: Optional[str] = None, modules: Iterable = None) -> List[str]:
+    """
+    Застосувати offload до роутерів модулів routes.* згідно з DB_THREADPOOL_ROUTERS.
+
+    Returns:
+        ["orders: 12/15", ...] - скільки handlers переведено в threadpool
+    """
+    enabled = enabled_router_names(setting)
+    if enabled is not None and not enabled:
+        return []
+    if modules is None:
+        modules = [m for name, m in list(sys.modules.items()) if name.startswith("routes.") and m]
+    report = []
+    for module in modules:
+        short_name = module.__name__.replace("routes.", "")
+        if enabled is not None and short_name not in enabled:
+            continue
+        for attr in vars(module).values():
+            if isinstance(attr, APIRouter):
+                total = sum(1 for r in attr.routes if isinstance(r, APIRoute))
+                report.append(f"{short_name}: {offload_router(attr, module.__name__)}/{total}")
+    return report
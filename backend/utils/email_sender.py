@@ -92,41 +92,24 @@ class EmailSender:
             logger.error(f"❌ Помилка відправки email до {to_email}: {str(e)}")
             return False
     
-    def send_order_confirmation(
-        self,
-        to_email: str,
-        to_name: str,
-        order_data: dict
-    ) -> bool:
+    def render_order_confirmation(self, to_name: str, order_data: dict):
         """
-        Відправити email підтвердження замовлення
-        
-        Args:
-            to_email: Email клієнта
-            to_name: Ім'я клієнта
-            order_data: Дані замовлення для template
-            
-        Returns:
-            bool: True якщо успішно
+        (тема, HTML, текст) листа підтвердження замовлення або None, якщо template відсутній
         """
-        print(f"[EMAIL SENDER] send_order_confirmation викликано для {to_email}")
-        print(f"[EMAIL SENDER] order_data keys: {list(order_data.keys())}")
-        try:
-            # Завантажити template
-            template_path = Path(__file__).parent.parent / 'email_templates' / 'order_confirmation_v2.html'
-            print(f"[EMAIL SENDER] Template path: {template_path}")
-            
-            if not template_path.exists():
-                logger.error(f"❌ Template не знайдено: {template_path}")
-                return False
-            
-            with open(template_path, 'r', encoding='utf-8') as f:
-                template_content = f.read()
-                template = Template(template_content)
-                html_content = template.render(**order_data)
-            
-            # Створити text version (fallback)
-            text_content = f"""
+        template_path = Path(__file__).parent.parent / 'email_templates' / 'order_confirmation_v2.html'
+        print(f"[EMAIL SENDER] Template path: {template_path}")
+        
+        if not template_path.exists():
+            logger.error(f"❌ Template не знайдено: {template_path}")
+            return None
+        
+        with open(template_path, 'r', encoding='utf-8') as f:
+            template_content = f.read()
+            template = Template(template_content)
+            html_content = template.render(**order_data)
+        
+        # Створити text version (fallback)
+        text_content = f"""
 Підтвердження замовлення #{order_data.get('order_number')}
 
 Вітаємо, {to_name}!
@@ -145,9 +128,35 @@ class EmailSender:
 Команда FarforRent
 https://farforrent.com.ua
 +38 (097) 123 09 93
-            """
+        """
+        
+        subject = f"Підтвердження замовлення #{order_data.get('order_number')} — FarforRent"
+        return subject, html_content, text_content
+    
+    def send_order_confirmation(
+        self,
+        to_email: str,
+        to_name: str,
+        order_data: dict
+    ) -> bool:
+        """
+        Відправити email підтвердження замовлення
+        
+        Args:
+            to_email: Email клієнта
+            to_name: Ім'я клієнта
+            order_data: Дані замовлення для template
             
-            subject = f"Підтвердження замовлення #{order_data.get('order_number')} — FarforRent"
+        Returns:
+            bool: True якщо успішно
+        """
+        print(f"[EMAIL SENDER] send_order_confirmation викликано для {to_email}")
+        print(f"[EMAIL SENDER] order_data keys: {list(order_data.keys())}")
+        try:
+            rendered = self.render_order_confirmation(to_name, order_data)
+            if not rendered:
+                return False
+            subject, html_content, text_content = rendered
             
             return self.send_email(
                 to_email=to_email,
@@ -160,6 +169,21 @@ https://farforrent.com.ua
         except Exception as e:
             logger.error(f"❌ Помилка відправки підтвердження замовлення: {str(e)}")
             return False
+    
+    def queue_order_confirmation(self, db, to_email: str, to_name: str, order_data: dict):
+        """
+        Поставити email підтвердження в чергу notification_outbox (без SMTP в запиті)
+        
+        Returns:
+            id рядка outbox або None
+        """
+        from services.notification_outbox import enqueue_email
+        
+        rendered = self.render_order_confirmation(to_name, order_data)
+        if not rendered:
+            return None
+        subject, html_content, text_content = rendered
+        return enqueue_email(db, to_email, subject, html_content, plain_content=text_content)
 
 
 # Singleton instance
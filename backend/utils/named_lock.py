@@ -0,0 +1,39 @@
+"""
+Міжпроцесний лок для фонових побудов похідних таблиць.
+
+Кожен воркер uvicorn при старті (або першому читанні) довів би fin_daily_rollups /
+analytics_daily_* до вчора - кілька однакових DELETE + INSERT ... SELECT по всій історії
+паралельно. MySQL GET_LOCK пропускає лише одного; решта не чекають, а читають
+уже побудовану частину + сирий "хвіст".
+
+Лок тримає окреме з'єднання (не з'єднання сесії): сесія повертає своє з'єднання в пул
+після кожного commit, а GET_LOCK прив'язаний до з'єднання.
+
+Usage:
+    with named_lock(db, "fin_daily_rollups_build") as acquired:
+        if acquired:
+            ...
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+@contextmanager
+def named_lock(db: Session, name: str, timeout: int = 0):
+    """yield True, якщо лок взято; не-MySQL (тести на SQLite) - завжди True"""
+    bind = db.get_bind()
+    engine = getattr(bind, "engine", bind)
+    if engine.dialect.name != "mysql":
+        yield True
+        return
+    with engine.connect() as conn:
+        acquired = conn.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": timeout}
+        ).scalar() == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
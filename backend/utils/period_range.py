@@ -0,0 +1,100 @@
+"""
+Period ranges для фінансових та аналітичних запитів.
+
+MONTH(col) = ... AND YEAR(col) = ... та DATE(col) BETWEEN ... не можуть використати індекс -
+таблиці сканувалися повністю. Тут період перетворюється на напіввідкритий діапазон
+[start, end) з datetime, а умова пишеться як `col >= :start AND col < :end`.
+
+    start, end = month_range(2026, 5)           # [2026-05-01 00:00, 2026-06-01 00:00)
+    sql, params = period_filter("e.occurred_at", "month", prefix="exp")
+    # sql    = "AND e.occurred_at >= :exp_start AND e.occurred_at < :exp_end"
+    # params = {"exp_start": ..., "exp_end": ...}
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+DateRange = Tuple[Optional[datetime], Optional[datetime]]
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    return value
+
+
+def _midnight(value) -> datetime:
+    d = _as_date(value)
+    return datetime(d.year, d.month, d.day)
+
+
+def month_range(year: int, month: int) -> Tuple[datetime, datetime]:
+    """Календарний місяць [1-ше число, 1-ше число наступного)"""
+    start = datetime(int(year), int(month), 1)
+    if start.month == 12:
+        return start, datetime(start.year + 1, 1, 1)
+    return start, datetime(start.year, start.month + 1, 1)
+
+
+def year_range(year: int) -> Tuple[datetime, datetime]:
+    return datetime(int(year), 1, 1), datetime(int(year) + 1, 1, 1)
+
+
+def day_range(start_date, end_date) -> Tuple[datetime, datetime]:
+    """Включні дати [start_date, end_date] -> [start 00:00, end+1 00:00)"""
+    return _midnight(start_date), _midnight(end_date) + timedelta(days=1)
+
+
+def period_range(period: str, today: Optional[date] = None) -> DateRange:
+    """
+    Назва періоду -> (start, end). end=None - без верхньої межі (лише >= start),
+    (None, None) - без фільтра (period="all" або невідомий).
+
+    day      - з початку сьогодні
+    week     - останні 7 днів
+    month    - поточний календарний місяць
+    quarter  - останні 3 місяці
+    year     - поточний календарний рік
+    """
+    today = _as_date(today or date.today())
+    midnight = _midnight(today)
+    if period == "day":
+        return midnight, None
+    if period == "week":
+        return midnight - timedelta(days=7), None
+    if period == "month":
+        return month_range(today.year, today.month)
+    if period == "quarter":
+        month = today.month - 3
+        year = today.year
+        if month < 1:
+            month += 12
+            year -= 1
+        # як DATE_SUB(CURDATE(), INTERVAL 3 MONTH): день обрізається до кінця місяця
+        day = min(today.day, (month_range(year, month)[1] - timedelta(days=1)).day)
+        return datetime(year, month, day), None
+    if period == "year":
+        return year_range(today.year)
+    return None, None
+
+
+def range_filter(column: str, start: Optional[datetime], end: Optional[datetime], prefix: str = "period") -> Tuple[str, Dict]:
+    """SQL-умова (з префіксом AND) + параметри для діапазону; порожня якщо меж немає"""
+    parts = []
+    params = {}
+    if start is not None:
+        parts.append(f"{column} >= :{prefix}_start")
+        params[f"{prefix}_start"] = start
+    if end is not None:
+        parts.append(f"{column} < :{prefix}_end")
+        params[f"{prefix}_end"] = end
+    if not parts:
+        return "", {}
+    return "AND " + " AND ".join(parts), params
+
+
+def period_filter(column: str, period: str, prefix: str = "period", today: Optional[date] = None) -> Tuple[str, Dict]:
+    """period_range + range_filter"""
+    start, end = period_range(period, today)
+    return range_filter(column, start, end, prefix)
@@ -0,0 +1,184 @@
+"""
+Роздача файлів (uploads, static, image-proxy) з кешуванням на боці клієнта.
+
+FileResponse сам по собі не відповідає 304 і не підтримує Range (starlette < 0.39), а
+/api/uploads/* handlers не ставили Cache-Control - кожен скрол каталогу в Event Tool
+перекачував сотні мініатюр. Тут:
+
+- сильний ETag без читання файлу: для variants/<hash>/ - з імені, для інших - з (mtime, size)
+  (як у nginx); хеш вмісту в event loop блокував би всі запити на час читання великого файлу
+- If-None-Match / If-Modified-Since -> 304
+- файли з хешем в імені (uploads/products/variants/<hash>/..., оригінали store_original
+  <sku>_<timestamp>_<hash8>.ext) кешуються як immutable на рік, решта - на ASSET_MAX_AGE з ревалідацією
+- Range: bytes=a-b / a- / -n (один діапазон) -> 206, If-Range, 416 для недосяжного діапазону
+- CachedStaticFiles - те саме для app.mount("/static" | "/uploads" | "/api/uploads")
+
+Usage:
+    return serve_file(request, file_path)
+    return serve_bytes(request, svg_bytes, "image/svg+xml")
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterator, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+
+ASSET_MAX_AGE = int(os.environ.get("ASSET_MAX_AGE", "86400"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 64 * 1024
+
+_HASH_DIR_RE = re.compile(r"(?:^|/)([0-9a-f]{64})/")
+# Лише імена, які дає store_original: <sku>_<unix timestamp>_<sha256[:8]>.<ext>
+# (не будь-який 8-символьний суфікс - photo_20240115.jpg може бути перезаписаний)
+_HASH_SUFFIX_RE = re.compile(r"(?:^|/)[^/]+_\d{10}_([0-9a-f]{8})\.\w+$")
+
+
+def default_cache_control() -> str:
+    return f"public, max-age={ASSET_MAX_AGE}"
+
+
+def is_content_addressed(path: str) -> bool:
+    """Вміст файлу з таким іменем ніколи не змінюється"""
+    path = path.replace(os.sep, "/")
+    return bool(_HASH_DIR_RE.search(path) or _HASH_SUFFIX_RE.search(path))
+
+
+def file_etag(path: str, stat_result: os.stat_result) -> str:
+    normalized = path.replace(os.sep, "/")
+    match = _HASH_DIR_RE.search(normalized)
+    if match:
+        # variants/<hh>/<hash>/<width>.<fmt>: хеш оригіналу + ім'я варіанта
+        return f'"{match.group(1)[:32]}-{os.path.basename(normalized)}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match - слабке порівняння (RFC 9110 13.1.2)
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def is_not_modified(request_headers: Headers, etag: str, mtime: float) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match має пріоритет над If-Modified-Since
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Один діапазон bytes=... -> (start, end) включно. None - віддати весь файл
+    (немає/невалідний/кілька діапазонів). ValueError - діапазон поза файлом (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, sep, end_s = header[len("bytes="):].strip().partition("-")
+    if not sep or not (start_s or end_s) or not all(p.isdigit() for p in (start_s, end_s) if p):
+        return None
+    if not start_s:
+        # bytes=-n: останні n байт
+        length = int(end_s)
+        if length == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - length), size - 1
+    start = int(start_s)
+    end = int(end_s) if end_s else size - 1
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _read_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(
+    request_headers: Headers,
+    path: str,
+    stat_result: Optional[os.stat_result] = None,
+    media_type: Optional[str] = None,
+    cache_control: Optional[str] = None,
+    status_code: int = 200,
+) -> Response:
+    path = str(path)
+    stat_result = stat_result or os.stat(path)
+    etag = file_etag(path, stat_result)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": cache_control or (
+            IMMUTABLE_CACHE_CONTROL if is_content_addressed(path) else default_cache_control()
+        ),
+        "accept-ranges": "bytes",
+    }
+    media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    if status_code == 200 and is_not_modified(request_headers, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if status_code == 200 and range_header and (not if_range or if_range.strip() == etag):
+        size = stat_result.st_size
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            headers["content-length"] = str(end - start + 1)
+            return StreamingResponse(
+                _read_range(path, start, end), status_code=206, media_type=media_type, headers=headers
+            )
+
+    return FileResponse(path, status_code=status_code, media_type=media_type,
+                        stat_result=stat_result, headers=headers)
+
+
+def serve_file(request: Request, path, media_type: Optional[str] = None,
+               cache_control: Optional[str] = None) -> Response:
+    return file_response(request.headers, str(path), media_type=media_type, cache_control=cache_control)
+
+
+def serve_bytes(request: Request, content: bytes, media_type: str,
+                cache_control: Optional[str] = None, headers: Optional[dict] = None) -> Response:
+    """Згенерований вміст (placeholder-и) з ETag і 304"""
+    etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+    response_headers = {"etag": etag, "cache-control": cache_control or default_cache_control(), **(headers or {})}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=response_headers)
+    return Response(content, media_type=media_type, headers=response_headers)
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles із сильними ETag, immutable для content-addressed файлів і Range"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        return file_response(Headers(scope=scope), str(full_path), stat_result, status_code=status_code)
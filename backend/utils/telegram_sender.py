@@ -3,7 +3,63 @@ Telegram sender utility for sending order confirmations
 """
 import os
 import requests
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+
+
+def build_order_confirmation_message(order_data: Dict[str, Any]) -> Tuple[str, dict]:
+    """
+    Текст (HTML) і інлайн клавіатура повідомлення про замовлення
+    """
+    # Формуємо повідомлення
+    message = f"""
+🎉 <b>Замовлення підтверджено!</b>
+
+📋 Номер: <b>#{order_data.get('order_number')}</b>
+👤 Клієнт: {order_data.get('client_name')}
+
+📅 Дата видачі: <b>{order_data.get('issue_date')}</b>
+📅 Дата повернення: <b>{order_data.get('return_date')}</b>
+⏱ Кількість діб: <b>{order_data.get('rental_days')}</b>
+
+📦 <b>Товари:</b>
+"""
+    
+    # Додати список товарів (макс 5)
+    items = order_data.get('items', [])
+    for i, item in enumerate(items[:5]):
+        message += f"{i+1}. {item.get('name')} x{item.get('quantity')}\n"
+    
+    if len(items) > 5:
+        message += f"... і ще {len(items) - 5} товарів\n"
+    
+    message += f"""
+💰 <b>Вартість оренди:</b> {order_data.get('total_rental')} грн
+🛡 <b>Застава:</b> {order_data.get('total_deposit')} грн
+💵 <b>Передоплата (50%):</b> {order_data.get('prepayment')} грн
+"""
+    
+    # Додати зміни якщо є
+    changes = order_data.get('changes', [])
+    if changes:
+        message += "\n⚠️ <b>Внесені зміни:</b>\n"
+        for change in changes[:3]:
+            message += f"• {change}\n"
+    
+    message += "\n📧 Детальний лист відправлено на email"
+    
+    # Інлайн кнопка "Підтвердити"
+    keyboard = {
+        "inline_keyboard": [
+            [
+                {
+                    "text": "✅ Підтвердити замовлення",
+                    "callback_data": f"confirm_order_{order_data.get('order_id')}"
+                }
+            ]
+        ]
+    }
+    
+    return message, keyboard
 
 
 def send_order_confirmation_telegram(
@@ -31,54 +87,7 @@ def send_order_confirmation_telegram(
         return False
     
     try:
-        # Формуємо повідомлення
-        message = f"""
-🎉 <b>Замовлення підтверджено!</b>
-
-📋 Номер: <b>#{order_data.get('order_number')}</b>
-👤 Клієнт: {order_data.get('client_name')}
-
-📅 Дата видачі: <b>{order_data.get('issue_date')}</b>
-📅 Дата повернення: <b>{order_data.get('return_date')}</b>
-⏱ Кількість діб: <b>{order_data.get('rental_days')}</b>
-
-📦 <b>Товари:</b>
-"""
-        
-        # Додати список товарів (макс 5)
-        items = order_data.get('items', [])
-        for i, item in enumerate(items[:5]):
-            message += f"{i+1}. {item.get('name')} x{item.get('quantity')}\n"
-        
-        if len(items) > 5:
-            message += f"... і ще {len(items) - 5} товарів\n"
-        
-        message += f"""
-💰 <b>Вартість оренди:</b> {order_data.get('total_rental')} грн
-🛡 <b>Застава:</b> {order_data.get('total_deposit')} грн
-💵 <b>Передоплата (50%):</b> {order_data.get('prepayment')} грн
-"""
-        
-        # Додати зміни якщо є
-        changes = order_data.get('changes', [])
-        if changes:
-            message += "\n⚠️ <b>Внесені зміни:</b>\n"
-            for change in changes[:3]:
-                message += f"• {change}\n"
-        
-        message += "\n📧 Детальний лист відправлено на email"
-        
-        # Інлайн кнопка "Підтвердити"
-        keyboard = {
-            "inline_keyboard": [
-                [
-                    {
-                        "text": "✅ Підтвердити замовлення",
-                        "callback_data": f"confirm_order_{order_data.get('order_id')}"
-                    }
-                ]
-            ]
-        }
+        message, keyboard = build_order_confirmation_message(order_data)
         
         # Відправити через Telegram Bot API
         url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
@@ -101,3 +110,26 @@ def send_order_confirmation_telegram(
     except Exception as e:
         print(f"[TELEGRAM] ❌ Exception: {str(e)}")
         return False
+
+
+
+def queue_order_confirmation_telegram(
+    db,
+    chat_id: str,
+    order_data: Dict[str, Any]
+) -> Optional[int]:
+    """
+    Поставити повідомлення про замовлення в чергу notification_outbox
+    (відправить фоновий диспетчер після коміту db)
+    
+    Returns:
+        id рядка outbox або None якщо chat_id не вказаний
+    """
+    from services.notification_outbox import enqueue_telegram
+    
+    if not chat_id:
+        print("[TELEGRAM] ⚠️ chat_id не вказаний")
+        return None
+    
+    message, keyboard = build_order_confirmation_message(order_data)
+    return enqueue_telegram(db, chat_id, message, reply_markup=keyboard)